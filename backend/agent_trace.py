@@ -1,14 +1,15 @@
 """
 Agent Trace — Observability context manager for the Data Team agents.
 Logs every agent invocation to the agent_traces table.
-Uses fire-and-forget pattern: tracing failures never break agent logic.
+Rows are buffered in the telemetry sink and bulk-inserted in the background:
+tracing failures never break agent logic.
 """
 
-import asyncio
 import logging
 import time
 from uuid import uuid4
 
+from telemetry import get_sink
 from token_logger import calculate_cost
 
 logger = logging.getLogger(__name__)
@@ -42,12 +43,8 @@ class AgentTrace:
             if not self.error_message:
                 self.error_message = str(exc_val)[:500] if exc_val else exc_type.__name__
 
-        # Fire-and-forget insert
-        try:
-            asyncio.create_task(self._insert_trace(duration_ms))
-        except RuntimeError:
-            # No event loop — log and move on
-            logger.debug("No event loop for agent trace logging")
+        # Buffered insert (flushed by the telemetry sink)
+        self._insert_trace(duration_ms)
 
         # Don't suppress exceptions
         return False
@@ -65,10 +62,12 @@ class AgentTrace:
         self.success = False
         self.error_message = str(error_message)[:500]
 
-    async def _insert_trace(self, duration_ms: int):
-        """Insert trace row into agent_traces table."""
+    def _insert_trace(self, duration_ms: int):
+        """Queue the trace row for the agent_traces table."""
         try:
-            self.supabase.table("agent_traces").insert({
+            sink = get_sink()
+            sink.bind(self.supabase)
+            sink.enqueue("agent_traces", {
                 "tenant_id": self.tenant_id,
                 "request_id": self.request_id,
                 "agent_name": self.agent_name,
@@ -79,6 +78,6 @@ class AgentTrace:
                 "duration_ms": duration_ms,
                 "success": self.success,
                 "error_message": self.error_message,
-            }).execute()
+            })
         except Exception as e:
-            logger.error(f"Failed to insert agent trace: {e}")
+            logger.error(f"Failed to queue agent trace: {e}")
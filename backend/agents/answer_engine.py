@@ -0,0 +1,761 @@
+"""
+Answer Engine — deterministic, zero-LLM answers for common analytics questions.
+===============================================================================
+Most dashboard chat questions are one aggregate over one CRM entity:
+"how many deals did Aziz close this month", "top 5 deals", "leads by source
+this month". This engine parses the message into an AnalyticsIntent
+
+    entity     crm_deals / crm_leads / ...  (synonyms + SchemaProfile labels)
+    measure    count | sum | avg            (sum/avg over the AMOUNT field)
+    dimension  "by <x>" → field             (aliases + SchemaContext fields)
+    bucket     by day / week / month        (time series)
+    timeframe  today, this month, last N days, ...
+    top_n      "top 5" → ranked breakdown or biggest records
+    filters    won / open deals, rep name, activity type
+
+scores how completely it understood the question, and — above
+MIN_CONFIDENCE — answers from a SQL template (validated and run through
+sql_engine, so results share its cache) or, for all-time breakdowns, from the
+precomputed crm_context summary. Anything it does not fully understand
+(comparisons, "why", rates, multiple entities, unresolved "by" phrases,
+date phrases parse_timeframe does not know such as "in march" or "q3")
+returns None and goes to the agentic loop.
+
+Cost: $0 (pure Python + at most one Supabase query).
+
+Public surface
+--------------
+    intent = parse_intent(message, schema_ctx, rep_name_map=None, today=None)
+    sql    = build_sql(intent)
+    is_qualified(message)            # bare KPI question or not (short-circuit guard)
+    unparsed_timeframe(msg)          # a date phrase parse_timeframe cannot honour
+    answer = await try_answer(supabase, tenant_id, crm_source, message,
+                              schema_ctx, rep_name_map=None)
+             # → {reply, charts, response_type, agent_used, sql, entity, timeframe} or None
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from agents.bobur_tools import resolve_rep_name
+from agents.schema_context import SchemaContext
+from agents.sql_engine import execute_sql, validate_sql
+
+logger = logging.getLogger(__name__)
+
+MIN_CONFIDENCE = 0.75
+DEFAULT_TOP_N = 5
+BREAKDOWN_LIMIT = 10
+MAX_TOP_N = 50
+
+# Default window for time-series questions without an explicit timeframe
+_BUCKET_DEFAULT_DAYS = {"day": 30, "week": 84, "month": 365}
+_BUCKET_FORMAT = {"day": "YYYY-MM-DD", "week": "IYYY-\"W\"IW", "month": "YYYY-MM"}
+
+_ENTITY_TERMS = {
+    "crm_deals": r"deals?|opportunit(?:y|ies)",
+    "crm_leads": r"leads?",
+    "crm_contacts": r"contacts?|customers?|clients?",
+    "crm_companies": r"compan(?:y|ies)|accounts?|organi[sz]ations?",
+    "crm_activities": r"activit(?:y|ies)|calls?|meetings?|tasks?|emails?",
+}
+
+# Activity words that also narrow the activity type
+_ACTIVITY_TYPES = {"call": "call", "meeting": "meeting", "task": "task", "email": "email"}
+
+# Dimension phrase → field. "@owner" / "@stage" resolve through SchemaProfile roles.
+_DIMENSION_ALIASES = {
+    "rep": "@owner", "reps": "@owner", "owner": "@owner", "owners": "@owner",
+    "sales rep": "@owner", "sales reps": "@owner", "salesperson": "@owner",
+    "manager": "@owner", "managers": "@owner", "employee": "@owner",
+    "assignee": "@owner", "user": "@owner", "agent": "@owner", "responsible": "@owner",
+    "stage": "@stage", "stages": "@stage", "pipeline stage": "@stage",
+    "pipeline": "@stage", "phase": "@stage", "funnel": "@stage",
+    "source": "source", "sources": "source", "lead source": "source",
+    "channel": "source", "channels": "source", "origin": "source",
+    "status": "status", "statuses": "status", "state": "status",
+    "type": "type", "types": "type", "activity type": "type", "kind": "type",
+    "industry": "industry", "industries": "industry", "sector": "industry",
+    "company": "company", "currency": "currency",
+}
+
+# Default entity when only a dimension is named ("top 5 reps", "top sources")
+_DIMENSION_DEFAULT_ENTITY = {
+    "@owner": "crm_deals", "@stage": "crm_deals",
+    "source": "crm_leads", "status": "crm_leads", "type": "crm_activities",
+    "industry": "crm_companies",
+}
+
+_BUCKETS = {"day": "day", "days": "day", "daily": "day",
+            "week": "week", "weeks": "week", "weekly": "week",
+            "month": "month", "months": "month", "monthly": "month"}
+
+_MEASURE_WORDS = {"value", "revenue", "amount", "size", "count", "number", "total", "volume", "worth"}
+
+_COUNT = re.compile(r"\b(?:how many|number of|count|# of|total number)\b")
+_SUM = re.compile(
+    r"\b(?:how much|revenue|sum of|(?:total|pipeline|combined)\s+(?:value|amount|worth|revenue)"
+    r"|value of|worth|by (?:value|revenue|amount))\b"
+)
+_AVG = re.compile(r"\b(?:average|avg|mean)\b")
+_TOP = re.compile(r"\b(?:top|biggest|largest|highest)\b(?:\s+(\d{1,3}))?")
+_BY = re.compile(
+    r"\b(?:by|per|for each|across|broken down by|split by|grouped by)\s+"
+    r"(?:each\s+|the\s+)?([a-z][a-z _]*?)(?=\s+(?:this|last|in|over|for|during|since|past|today|yesterday)\b|[?.!,]|$)"
+)
+_WON = re.compile(r"\b(?:won|closed|sold|win|wins)\b|\bdid\b.*\bclose\b")
+_OPEN = re.compile(r"\b(?:open|active|in progress)\b")
+
+# Anything here means the question needs reasoning, not a template
+_COMPLEX = re.compile(
+    r"\b(?:why|how come|compare|compared|comparison|vs|versus|against|correlat\w*|predict\w*|"
+    r"forecast\w*|should|recommend\w*|suggest\w*|explain|insight\w*|growth|grow|change|"
+    r"conversion|convert\w*|rate|ratio|percent\w*|share|lost|lose|churn\w*|stale|stuck|"
+    r"without|except|between|median|cycle|velocity|how long|duration|after|before|"
+    r"closing|expected)\b|%"
+)
+_TREND = re.compile(r"\b(?:trend\w*|over time)\b")
+
+
+@dataclass
+class AnalyticsIntent:
+    """One aggregate question over one CRM table."""
+
+    table: Optional[str] = None
+    entity_label: str = ""
+    measure: str = "count"  # count | sum | avg
+    measure_explicit: bool = False
+    amount_field: Optional[str] = None
+    dimension: Optional[str] = None
+    bucket: Optional[str] = None  # day | week | month
+    top_n: Optional[int] = None
+    date_field: Optional[str] = None
+    start: Optional[date] = None
+    end: Optional[date] = None  # exclusive
+    timeframe_label: str = ""
+    won: Optional[bool] = None  # True = won, False = open (not won)
+    rep_name: Optional[str] = None
+    rep_ids: list[str] = field(default_factory=list)
+    owner_field: Optional[str] = None
+    activity_type: Optional[str] = None
+    label_field: Optional[str] = None  # record title for "top N <records>"
+    confidence: float = 0.0
+    notes: list[str] = field(default_factory=list)
+
+    @property
+    def kind(self) -> str:
+        """scalar | breakdown | records"""
+        if self.dimension or self.bucket:
+            return "breakdown"
+        if self.top_n:
+            return "records"
+        return "scalar"
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def _label_pattern(label: str) -> str:
+    words = re.escape(label.lower().rstrip("s"))
+    return rf"{words}s?"
+
+
+def _entity_patterns(schema_ctx: SchemaContext) -> dict[str, re.Pattern]:
+    patterns = {}
+    labels = schema_ctx.get_entity_labels()
+    for table, terms in _ENTITY_TERMS.items():
+        label = labels.get(table)
+        if label and label.lower().rstrip("s") != table[4:].rstrip("s"):
+            terms = f"{terms}|{_label_pattern(label)}"
+        patterns[table] = re.compile(rf"\b(?:{terms})\b")
+    return patterns
+
+
+def _entity_label(schema_ctx: SchemaContext, table: str) -> str:
+    return schema_ctx.get_entity_labels().get(table) or table[4:].capitalize()
+
+
+def _valid(schema_ctx: SchemaContext, table: str, fname: Optional[str]) -> Optional[str]:
+    return fname if fname and schema_ctx.validate_field(table, fname) else None
+
+
+def _owner_field(schema_ctx: SchemaContext, table: str) -> Optional[str]:
+    return (
+        _valid(schema_ctx, table, schema_ctx.get_semantic_field("owner"))
+        or _valid(schema_ctx, table, "assigned_to")
+        or _valid(schema_ctx, table, "employee_id")
+    )
+
+
+def _resolve_dimension(schema_ctx: SchemaContext, table: str, alias: str) -> Optional[str]:
+    if alias == "@owner":
+        return _owner_field(schema_ctx, table)
+    if alias == "@stage":
+        return (
+            _valid(schema_ctx, table, schema_ctx.get_semantic_field("stage"))
+            or _valid(schema_ctx, table, "stage")
+            or _valid(schema_ctx, table, "status")
+        )
+    return _valid(schema_ctx, table, alias)
+
+
+def _dimension_alias(phrase: str) -> Optional[str]:
+    phrase = phrase.strip()
+    if phrase in _DIMENSION_ALIASES:
+        return _DIMENSION_ALIASES[phrase]
+    return phrase.replace(" ", "_") or None
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def parse_timeframe(msg: str, today: date) -> Optional[tuple[date, Optional[date], str]]:
+    """(start, end_exclusive or None, label) for the first timeframe phrase in msg."""
+    if re.search(r"\btoday\b", msg):
+        return today, None, "today"
+    if re.search(r"\byesterday\b", msg):
+        return today - timedelta(days=1), today, "yesterday"
+    week_start = today - timedelta(days=today.weekday())
+    if re.search(r"\bthis week\b", msg):
+        return week_start, None, "this week"
+    if re.search(r"\blast week\b", msg):
+        return week_start - timedelta(days=7), week_start, "last week"
+    if re.search(r"\bthis month\b", msg):
+        return _month_start(today), None, "this month"
+    if re.search(r"\blast month\b", msg):
+        return _add_months(today, -1), _month_start(today), "last month"
+    if re.search(r"\bthis quarter\b", msg):
+        return today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1), None, "this quarter"
+    if re.search(r"\bthis year\b", msg):
+        return today.replace(month=1, day=1), None, "this year"
+    if re.search(r"\blast year\b", msg):
+        start = today.replace(year=today.year - 1, month=1, day=1)
+        return start, today.replace(month=1, day=1), "last year"
+    m = re.search(r"\b(?:last|past|previous)\s+(\d{1,3})\s+(day|week|month|year)s?\b", msg)
+    if m:
+        n, unit = int(m.group(1)), m.group(2)
+        days = n * {"day": 1, "week": 7, "month": 30, "year": 365}[unit]
+        return today - timedelta(days=days), None, f"last {n} {unit}{'s' if n != 1 else ''}"
+    return None
+
+
+# Every phrase parse_timeframe understands (keep in sync with it)
+_KNOWN_TIMEFRAME = re.compile(
+    r"\b(?:today|yesterday|(?:this|last) (?:week|month|year)|this quarter"
+    r"|(?:last|past|previous)\s+\d{1,3}\s+(?:day|week|month|year)s?)\b"
+)
+# Date words parse_timeframe does not understand: months, years, quarters,
+# weekdays, "since ...", spelled-out or open-ended periods, numeric dates
+_OTHER_DATE_WORDS = re.compile(
+    r"\b(?:january|february|march|april|june|july|august|september|october|november|december"
+    r"|jan|feb|mar|apr|jun|jul|aug|sept?|oct|nov|dec)\b"
+    r"|\b(?:in|since|during|until|of)\s+may\b|\bmay\s+\d"
+    r"|\b(?:19|20)\d{2}\b|\bq[1-4]\b|\bh[12]\b|\bquarters?\b|\b(?:ytd|mtd|qtd|fiscal)\b"
+    r"|\b(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend)s?\b"
+    r"|\b(?:since|until|till|ago|tomorrow)\b"
+    r"|\b(?:last|past|previous|next|recent|this|these|those)\s+(?:[a-z0-9]+\s+)?(?:days?|weeks?|months?|years?)\b"
+    r"|\b\d{1,2}[/.]\d{1,2}\b"
+)
+
+
+def unparsed_timeframe(msg: str) -> bool:
+    """True when msg names a period parse_timeframe would drop or misread —
+    an unknown date phrase, or more than one known one."""
+    if len(_KNOWN_TIMEFRAME.findall(msg)) > 1:
+        return True
+    return bool(_OTHER_DATE_WORDS.search(_KNOWN_TIMEFRAME.sub(" ", msg)))
+
+
+def is_qualified(message: str) -> bool:
+    """True when a question carries a timeframe, breakdown, ranking or won/open filter —
+    more than a bare "how many deals" KPI lookup can answer."""
+    msg = " ".join(message.lower().split())
+    return bool(
+        parse_timeframe(msg, date.today()) or unparsed_timeframe(msg) or _BY.search(msg)
+        or _TOP.search(msg) or _WON.search(msg) or _OPEN.search(msg)
+    )
+
+
+def _match_rep(msg: str, rep_name_map: dict[str, str]) -> tuple[Optional[str], list[str]]:
+    """Find a rep named in the message: full name, else a unique first name."""
+    by_name: dict[str, list[str]] = {}
+    for rep_id, name in (rep_name_map or {}).items():
+        by_name.setdefault(name.strip(), []).append(str(rep_id))
+    for name, ids in by_name.items():
+        if len(name) >= 3 and re.search(rf"\b{re.escape(name.lower())}\b", msg):
+            return name, ids
+    first_names: dict[str, list[str]] = {}
+    for name in by_name:
+        first = name.split()[0].lower() if name.split() else ""
+        if len(first) >= 3:
+            first_names.setdefault(first, []).append(name)
+    for first, names in first_names.items():
+        if len(names) == 1 and re.search(rf"\b{re.escape(first)}\b", msg):
+            return names[0], by_name[names[0]]
+    return None, []
+
+
+def _date_field(schema_ctx: SchemaContext, table: str, won: Optional[bool]) -> Optional[str]:
+    candidates = ["created_at"]
+    if table == "crm_deals" and won:
+        candidates = ["closed_at", "modified_at", "created_at"]
+    elif table == "crm_activities":
+        candidates = ["started_at", "created_at"]
+    for fname in candidates:
+        if schema_ctx.validate_field(table, fname):
+            return fname
+    return None
+
+
+def _label_field(schema_ctx: SchemaContext, table: str) -> Optional[str]:
+    for fname in ("title", "name", "contact_name", "subject"):
+        if schema_ctx.validate_field(table, fname):
+            return fname
+    return None
+
+
+def parse_intent(
+    message: str,
+    schema_ctx: SchemaContext,
+    rep_name_map: Optional[dict[str, str]] = None,
+    today: Optional[date] = None,
+) -> AnalyticsIntent:
+    """Parse a chat message into an AnalyticsIntent with a confidence score (pure)."""
+    today = today or datetime.now(timezone.utc).date()
+    msg = " ".join(message.lower().split())
+    intent = AnalyticsIntent()
+    score = 0.0
+
+    # Rep names are masked first so they can't be read as entities or dimensions
+    rep_name, rep_ids = _match_rep(msg, rep_name_map or {})
+    masked = msg
+    if rep_name:
+        masked = re.sub(rf"\b{re.escape(rep_name.lower())}\b|\b{re.escape(rep_name.split()[0].lower())}\b", " ", masked)
+
+    # Top-N, then "by <dimension>" (masked out before entity matching)
+    top = _TOP.search(masked)
+    if top:
+        intent.top_n = min(int(top.group(1)), MAX_TOP_N) if top.group(1) else DEFAULT_TOP_N
+
+    dim_alias = None
+    by = _BY.search(masked)
+    if by:
+        phrase = by.group(1).strip()
+        words = phrase.split()
+        if phrase in _BUCKETS:
+            intent.bucket = _BUCKETS[phrase]
+        elif words and all(w in _MEASURE_WORDS for w in words):
+            pass  # "top 5 deals by value" — a ranking measure, handled below
+        else:
+            dim_alias = _dimension_alias(phrase)
+        masked = masked[:by.start()] + " " + masked[by.end():]
+    if top and not dim_alias and not intent.bucket:
+        # "top 5 reps" / "top sources" — the ranked word is the dimension
+        after = masked[top.end():].split()
+        for n in (2, 1):
+            phrase = " ".join(after[:n])
+            if phrase in _DIMENSION_ALIASES:
+                dim_alias = _DIMENSION_ALIASES[phrase]
+                masked = masked[:top.end()] + " " + " ".join(after[n:])
+                break
+
+    # Entity
+    patterns = _entity_patterns(schema_ctx)
+    found: list[tuple[int, str, str]] = []
+    for table, pattern in patterns.items():
+        m = pattern.search(masked)
+        if m:
+            found.append((m.start(), table, m.group(0)))
+    found.sort()
+    if found:
+        _, intent.table, word = found[0]
+        score += 0.5
+        if len({t for _, t, _ in found}) > 1:
+            score -= 0.4
+            intent.notes.append("multiple entities")
+        activity = word.rstrip("s")
+        if intent.table == "crm_activities" and activity in _ACTIVITY_TYPES:
+            intent.activity_type = _ACTIVITY_TYPES[activity]
+    elif dim_alias in _DIMENSION_DEFAULT_ENTITY:
+        intent.table = _DIMENSION_DEFAULT_ENTITY[dim_alias]
+        score += 0.4
+    else:
+        intent.notes.append("no entity")
+        return intent
+
+    table = intent.table
+    intent.entity_label = _entity_label(schema_ctx, table)
+
+    # Dimension
+    if dim_alias:
+        intent.dimension = _resolve_dimension(schema_ctx, table, dim_alias)
+        if dim_alias == "@owner":
+            intent.owner_field = intent.dimension
+        if intent.dimension:
+            score += 0.2
+        else:
+            score -= 0.4
+            intent.notes.append(f"unknown dimension '{dim_alias}'")
+    else:
+        score += 0.2
+
+    # Measure
+    intent.amount_field = (
+        _valid(schema_ctx, table, schema_ctx.get_semantic_field("amount"))
+        or _valid(schema_ctx, table, "value")
+    )
+    if _AVG.search(msg):
+        intent.measure, intent.measure_explicit = "avg", True
+    elif _SUM.search(msg):
+        intent.measure, intent.measure_explicit = "sum", True
+    elif _COUNT.search(msg):
+        intent.measure_explicit = True
+    if intent.measure != "count" and not intent.amount_field:
+        score -= 0.5
+        intent.notes.append("no amount field")
+    if intent.measure_explicit or intent.kind != "scalar":
+        score += 0.3
+
+    if intent.kind == "records":
+        intent.label_field = _label_field(schema_ctx, table)
+        if not intent.amount_field or not intent.label_field:
+            score -= 0.5
+            intent.notes.append("cannot rank records")
+
+    # Filters
+    if table == "crm_deals" and schema_ctx.validate_field(table, "won"):
+        if _WON.search(msg) or (intent.measure == "sum" and "revenue" in msg):
+            intent.won = True
+        elif _OPEN.search(msg):
+            intent.won = False
+    if intent.activity_type and not schema_ctx.validate_field(table, "type"):
+        intent.activity_type = None
+    if rep_name:
+        intent.owner_field = _owner_field(schema_ctx, table)
+        if intent.owner_field:
+            intent.rep_name, intent.rep_ids = rep_name, rep_ids
+        else:
+            score -= 0.5
+            intent.notes.append("rep filter unsupported")
+
+    # Timeframe
+    intent.date_field = _date_field(schema_ctx, table, intent.won)
+    timeframe = parse_timeframe(msg, today)
+    if timeframe:
+        if intent.date_field:
+            intent.start, intent.end, intent.timeframe_label = timeframe
+        else:
+            score -= 0.5
+            intent.notes.append("no date field")
+    elif intent.bucket:
+        if intent.date_field:
+            days = _BUCKET_DEFAULT_DAYS[intent.bucket]
+            intent.start = today - timedelta(days=days)
+            intent.timeframe_label = f"last {days} days"
+        else:
+            score -= 0.5
+    if unparsed_timeframe(masked):  # rep names masked: a rep called May is not a month
+        # Answering without the period the user asked for would be a wrong number
+        score -= 0.6
+        intent.notes.append("unparsed timeframe")
+
+    # Reasoning-style questions go to the LLM
+    if _COMPLEX.search(msg):
+        score -= 0.6
+        intent.notes.append("complex")
+    if _TREND.search(msg) and not intent.bucket:
+        score -= 0.6
+        intent.notes.append("trend without bucket")
+    if len(msg.split()) > 25:
+        score -= 0.2
+
+    intent.confidence = round(max(0.0, min(1.0, score)), 2)
+    return intent
+
+
+# ---------------------------------------------------------------------------
+# SQL templates
+# ---------------------------------------------------------------------------
+
+_IDENT = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def _ident(name: str) -> str:
+    if not _IDENT.match(name or ""):
+        raise ValueError(f"unsafe identifier: {name!r}")
+    return name
+
+
+def _literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _aggregate(intent: AnalyticsIntent) -> str:
+    if intent.measure == "sum":
+        return f"COALESCE(SUM({_ident(intent.amount_field)}), 0)"
+    if intent.measure == "avg":
+        return f"AVG({_ident(intent.amount_field)})"
+    return "COUNT(*)"
+
+
+def _where(intent: AnalyticsIntent) -> list[str]:
+    clauses = []
+    if intent.start and intent.date_field:
+        clauses.append(f"{_ident(intent.date_field)} >= {_literal(intent.start.isoformat())}")
+    if intent.end and intent.date_field:
+        clauses.append(f"{_ident(intent.date_field)} < {_literal(intent.end.isoformat())}")
+    if intent.won is True:
+        clauses.append("won IS TRUE")
+    elif intent.won is False:
+        clauses.append("won IS NOT TRUE")
+    if intent.rep_ids and intent.owner_field:
+        ids = ", ".join(_literal(i) for i in intent.rep_ids)
+        clauses.append(f"CAST({_ident(intent.owner_field)} AS TEXT) IN ({ids})")
+    if intent.activity_type:
+        clauses.append(f"LOWER(CAST(type AS TEXT)) LIKE {_literal('%' + intent.activity_type + '%')}")
+    if intent.kind == "records" or intent.measure != "count":
+        clauses.append(f"{_ident(intent.amount_field)} IS NOT NULL")
+    return clauses
+
+
+def build_sql(intent: AnalyticsIntent) -> str:
+    """Render the SQL template for an intent (identifiers come from the schema whitelist)."""
+    table = _ident(intent.table)
+    clauses = _where(intent)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    agg = _aggregate(intent)
+
+    if intent.kind == "scalar":
+        return f"SELECT {agg} AS value FROM {table}{where}"
+
+    if intent.kind == "breakdown":
+        if intent.bucket:
+            label = (
+                f"TO_CHAR(DATE_TRUNC({_literal(intent.bucket)}, {_ident(intent.date_field)}), "
+                f"{_literal(_BUCKET_FORMAT[intent.bucket])})"
+            )
+            return f"SELECT {label} AS label, {agg} AS value FROM {table}{where} GROUP BY 1 ORDER BY 1"
+        limit = intent.top_n or BREAKDOWN_LIMIT
+        label = f"COALESCE(CAST({_ident(intent.dimension)} AS TEXT), 'Unknown')"
+        return (
+            f"SELECT {label} AS label, {agg} AS value FROM {table}{where} "
+            f"GROUP BY 1 ORDER BY 2 DESC LIMIT {int(limit)}"
+        )
+
+    columns = [_ident(intent.label_field), _ident(intent.amount_field)]
+    return (
+        f"SELECT {', '.join(columns)} FROM {table}{where} "
+        f"ORDER BY {_ident(intent.amount_field)} DESC LIMIT {int(intent.top_n)}"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Precomputed crm_context (dashboard_configs.crm_context, refreshed per sync)
+# ---------------------------------------------------------------------------
+
+# (table, dimension) → (section, list key, label key, list cap in compute_crm_context)
+_CONTEXT_BREAKDOWNS = {
+    ("crm_leads", "source"): ("leads", "by_source", "source", 8),
+    ("crm_leads", "status"): ("leads", "by_status", "status", 8),
+    ("crm_deals", "stage"): ("pipeline", "by_stage", "stage", 10),
+    ("crm_activities", "type"): ("activities", "by_type", "type", 6),
+}
+
+
+def _context_eligible(intent: AnalyticsIntent) -> bool:
+    """All-time, unfiltered count questions can come from the precomputed summary."""
+    return (
+        intent.measure == "count" and not intent.start and intent.won is None
+        and not intent.rep_ids and not intent.activity_type and not intent.bucket
+        and intent.kind != "records"
+    )
+
+
+def _answer_from_context(intent: AnalyticsIntent, ctx: dict) -> Optional[list[dict]]:
+    """Rows [{label, value}] (breakdown) or [{value}] (scalar) from crm_context, or None."""
+    if not ctx:
+        return None
+    if intent.kind == "scalar":
+        count = (ctx.get("counts") or {}).get(intent.table[4:])
+        return [{"value": count}] if isinstance(count, (int, float)) else None
+
+    spec = _CONTEXT_BREAKDOWNS.get((intent.table, intent.dimension))
+    if not spec:
+        return None
+    section, key, label_key, cap = spec
+    items = (ctx.get(section) or {}).get(key) or []
+    limit = intent.top_n or BREAKDOWN_LIMIT
+    if not items or (len(items) >= cap and limit > len(items)):
+        return None  # summary list was truncated — not a complete answer
+    ranked = sorted(items, key=lambda x: x.get("count") or 0, reverse=True)[:limit]
+    return [{"label": str(i.get(label_key) or "Unknown"), "value": i.get("count") or 0} for i in ranked]
+
+
+def _load_crm_context(supabase, tenant_id: str) -> dict:
+    try:
+        result = supabase.table("dashboard_configs").select(
+            "crm_context"
+        ).eq("tenant_id", tenant_id).limit(1).execute()
+        ctx = result.data[0].get("crm_context") if result.data else None
+        return ctx if isinstance(ctx, dict) else {}
+    except Exception as e:
+        logger.debug("Answer engine: crm_context load failed: %s", e)
+        return {}
+
+
+# ---------------------------------------------------------------------------
+# Formatting
+# ---------------------------------------------------------------------------
+
+def _num(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _fmt(value, intent: AnalyticsIntent, currency: Optional[str]) -> str:
+    num = _num(value)
+    if intent.measure == "count" and intent.kind != "records":
+        return f"{int(num):,}"
+    text = f"{num:,.0f}" if abs(num) >= 100 else f"{num:,.2f}"
+    return f"{text} {currency}" if currency else text
+
+
+def _is_owner_dimension(intent: AnalyticsIntent) -> bool:
+    return bool(intent.dimension) and intent.dimension in {intent.owner_field, "assigned_to", "employee_id"}
+
+
+def _title(intent: AnalyticsIntent) -> str:
+    label = intent.entity_label
+    if intent.won is True:
+        label = f"Won {label}"
+    elif intent.won is False:
+        label = f"Open {label}"
+    if intent.activity_type:
+        label = f"{label} ({intent.activity_type}s)"
+
+    if intent.kind == "records":
+        title = f"Top {intent.top_n} {label} by Value"
+    else:
+        prefix = {"sum": "Total Value of ", "avg": "Average Value of "}.get(intent.measure, "")
+        title = f"{prefix}{label}"
+        if intent.bucket:
+            title += f" by {intent.bucket.capitalize()}"
+        elif intent.dimension:
+            dim = "Rep" if _is_owner_dimension(intent) else intent.dimension.replace("_", " ").title()
+            title = f"{'Top ' + str(intent.top_n) + ' ' if intent.top_n else ''}{title} by {dim}"
+    if intent.rep_name:
+        title += f" — {intent.rep_name}"
+    if intent.timeframe_label:
+        title += f" ({intent.timeframe_label})"
+    return title
+
+
+def _render(
+    intent: AnalyticsIntent, rows: list[dict], currency: Optional[str], rep_name_map: dict[str, str]
+) -> tuple[str, list[dict]]:
+    title = _title(intent)
+
+    if intent.kind == "scalar":
+        value = _fmt(rows[0].get("value") if rows else 0, intent, currency)
+        return f"**{title}**: {value}", [{"type": "kpi", "title": title, "value": value}]
+
+    if not rows:
+        scope = f" for {intent.timeframe_label}" if intent.timeframe_label else ""
+        return f"**{title}**\n\nNo matching {intent.entity_label.lower()} found{scope}.", []
+
+    if intent.kind == "breakdown":
+        owner = _is_owner_dimension(intent)
+        data = []
+        for row in rows:
+            label = str(row.get("label") or "Unknown")
+            if owner:
+                label = resolve_rep_name(label, rep_name_map)
+            data.append({"label": label, "value": round(_num(row.get("value")), 2)})
+        lines = [f"**{title}**\n"]
+        lines += [f"- **{d['label']}**: {_fmt(d['value'], intent, currency)}" for d in data]
+        chart_type = "line" if intent.bucket else "bar"
+        return "\n".join(lines), [{"type": chart_type, "title": title, "data": data}]
+
+    # records
+    data = [
+        {"label": str(row.get(intent.label_field) or "(Untitled)"), "value": round(_num(row.get(intent.amount_field)), 2)}
+        for row in rows
+    ]
+    lines = [f"**{title}**\n"]
+    lines += [f"{i}. **{d['label']}** — {_fmt(d['value'], intent, currency)}" for i, d in enumerate(data, 1)]
+    return "\n".join(lines), [{"type": "bar", "title": title, "data": data}]
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+async def try_answer(
+    supabase,
+    tenant_id: str,
+    crm_source: str,
+    message: str,
+    schema_ctx: SchemaContext,
+    rep_name_map: Optional[dict[str, str]] = None,
+) -> Optional[dict]:
+    """Answer without an LLM when the question is understood well enough, else None."""
+    rep_name_map = rep_name_map or {}
+    try:
+        intent = parse_intent(message, schema_ctx, rep_name_map)
+    except Exception as e:
+        logger.warning("Answer engine: parse failed: %s", e)
+        return None
+    if intent.confidence < MIN_CONFIDENCE:
+        logger.debug("Answer engine: low confidence %.2f (%s)", intent.confidence, ", ".join(intent.notes))
+        return None
+
+    rows = None
+    sql = None
+    if _context_eligible(intent):
+        ctx = await asyncio.to_thread(_load_crm_context, supabase, tenant_id)
+        rows = _answer_from_context(intent, ctx)
+
+    if rows is None:
+        try:
+            sql = build_sql(intent)
+        except ValueError as e:
+            logger.debug("Answer engine: %s", e)
+            return None
+        is_valid, error, cleaned = validate_sql(sql, schema_ctx)
+        if not is_valid:
+            logger.info("Answer engine: template rejected (%s): %s", error, sql)
+            return None
+        result = await execute_sql(supabase, tenant_id, crm_source, cleaned, rep_name_map)
+        if result.get("error"):
+            return None
+        rows, sql = result.get("rows", []), cleaned
+
+    reply, charts = _render(intent, rows, schema_ctx.get_currency(), rep_name_map)
+    logger.info(
+        "Answer engine: %s on %s (confidence=%.2f, source=%s)",
+        intent.kind, intent.table, intent.confidence, "sql" if sql else "crm_context",
+    )
+    return {
+        "reply": reply,
+        "charts": charts,
+        "response_type": "deterministic",
+        "agent_used": "answer_engine",
+        "sql": sql,
+        "entity": intent.table,
+        "timeframe": intent.timeframe_label or None,
+    }
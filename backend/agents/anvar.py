@@ -5,12 +5,12 @@ Zero LLM cost. Pure SQL builder with field whitelisting for security.
 """
 
 import logging
-import time
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 from collections import Counter
 
 from agents import ChartConfig, ChartResult
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -53,39 +53,35 @@ ALLOWED_FIELDS = DEFAULT_ALLOWED_FIELDS
 
 # ── Dynamic field loading from crm_field_registry ──
 
-# In-memory cache: {(tenant_id, crm_source): (fields_dict, timestamp)}
-_field_cache: dict[tuple, tuple] = {}
+# In-memory cache: {(tenant_id, crm_source): fields_dict}
 FIELD_CACHE_TTL = 300  # 5 minutes
+_field_cache = TTLCache("anvar_allowed_fields", ttl=FIELD_CACHE_TTL, max_entries=4096)
 
 
 async def load_allowed_fields(supabase, tenant_id: str, crm_source: str) -> dict:
     """Load per-tenant field whitelist from crm_field_registry.
     Falls back to DEFAULT_ALLOWED_FIELDS if registry is empty."""
-    cache_key = (tenant_id, crm_source)
-    now = time.time()
-    if cache_key in _field_cache:
-        cached, ts = _field_cache[cache_key]
-        if now - ts < FIELD_CACHE_TTL:
-            return cached
 
-    try:
+    async def _load() -> Optional[dict]:
         result = supabase.table("crm_field_registry").select(
             "entity,field_name"
         ).eq("tenant_id", tenant_id).eq("crm_source", crm_source).execute()
 
         if not result.data:
             logger.info(f"No field registry for {tenant_id}/{crm_source}, using defaults")
-            return DEFAULT_ALLOWED_FIELDS
+            return None  # not cached — the registry may be populated by the next sync
 
         # Group by entity → list of field names
         fields = {}
         for row in result.data:
             table = f"crm_{row['entity']}"
             fields.setdefault(table, []).append(row["field_name"])
-
-        _field_cache[cache_key] = (fields, now)
         return fields
 
+    try:
+        fields = await _field_cache.get_or_load((tenant_id, crm_source), _load)
+        return fields or DEFAULT_ALLOWED_FIELDS
+
     except Exception as e:
         logger.warning(f"load_allowed_fields failed ({e}), using defaults")
         return DEFAULT_ALLOWED_FIELDS
@@ -2,6 +2,8 @@
 Bobur — Revenue Analyst Router + Orchestrator (v3)
 ====================================================
 Two-tier routing: regex patterns ($0) then GPT-4o-mini (~$0.0003).
+The regex tier is compiled into one combined pattern per tenant and cached;
+get_router_stats() reports regex hits vs LLM fallbacks per intent.
 Dispatches to:
   • Revenue tools       (get_revenue_overview, list_revenue_alerts, query_metric)
   • KPI Resolver        (simple numeric KPIs)
@@ -28,9 +30,10 @@ import logging
 import re
 from typing import Optional
 
-from llm_service import client as openai_client
+from llm_gateway import get_gateway
 from token_logger import log_token_usage_fire_and_forget
 from agent_trace import AgentTrace
+from ttl_cache import TTLCache
 from agents import RouterResult, CRMProfile, SchemaProfile
 from agents import kpi_resolver
 from agents import dima
@@ -354,173 +357,268 @@ def _extract_timeframe(message: str) -> str:
 
 
 # ── Tier 0 router ──────────────────────────────────────────────────────────
+# All Tier 0 patterns for a tenant are compiled into ONE regex, built once per
+# (tenant, entity_labels) and cached. Each route is a lookahead alternative
+# with a named group, tried in priority order from position 0, so the first
+# route whose pattern occurs anywhere in the message wins — exactly the same
+# result as the ordered re.search() checks it replaces, in a single C-level
+# match instead of ~60 Python-level searches.
+
+# (pattern, route kind, payload) in priority order — dynamic label routes are
+# prepended per tenant by CompiledRouter.
+_STATIC_ROUTES: list[tuple[str, str, Optional[str]]] = (
+    [(p, "revenue_overview", None) for p in REVENUE_OVERVIEW_PATTERNS]
+    + [(p, "revenue_alerts", None) for p in REVENUE_ALERT_PATTERNS]
+    + [(p, "insight_query", None) for p in INSIGHT_PATTERNS]
+    + [(p, "kpi_query", kpi_key) for p, _agent, kpi_key in KPI_PATTERNS]
+    + [(p, "activity_metric", None) for p in ACTIVITY_METRIC_PATTERNS]
+    + [(p, "rep_performance", None) for p in REP_PERFORMANCE_PATTERNS]
+    + [(p, "conversion", None) for p in CONVERSION_PATTERNS]
+    + [(p, "deal_query", None) for p in DEAL_QUERY_PATTERNS]
+    + [(p, "record_query", entity) for p, entity in ENTITY_QUERY_PATTERNS]
+    + [(p, "temporal_comparison", None) for p in TEMPORAL_COMPARISON_PATTERNS]
+    + [(p, "chart_request", None) for p in CHART_PATTERNS]
+)
 
-async def route_message(message: str, entity_labels: dict = None, metric_keys: list = None) -> RouterResult:
-    """Route a user message to the appropriate agent. Two-tier: regex then LLM.
+_ROUTER_CACHE_MAX = 1024
 
-    Phase 3: Accepts optional entity_labels and metric_keys for dynamic pattern matching.
-    """
-    msg_lower = message.lower().strip()
+# In-memory cache: {tenant_id (or label fingerprint): CompiledRouter}; LRU, no TTL
+_router_cache = TTLCache("bobur_routers", ttl=None, max_entries=_ROUTER_CACHE_MAX)
 
-    # Phase 3: Dynamic patterns from schema entity_labels (checked FIRST)
-    if entity_labels:
-        dynamic_patterns = _build_dynamic_patterns(entity_labels, metric_keys)
-        for pattern, intent, entity in dynamic_patterns:
-            if re.search(pattern, msg_lower):
-                if intent == "record_query":
-                    return RouterResult(
-                        intent="record_query",
-                        agent="bobur",
-                        filters={"entity": entity},
-                        confidence=0.90,
-                    )
-                elif intent == "kpi_query":
-                    return RouterResult(
-                        intent="kpi_query",
-                        agent="kpi_resolver",
-                        filters={"kpi_pattern": f"total_{entity}", "time_range_days": _extract_time_range(msg_lower)},
-                        confidence=0.92,
-                    )
-                elif intent == "chart_request":
-                    return RouterResult(
-                        intent="chart_request",
-                        agent="dima",
-                        filters={"entity": entity},
-                        confidence=0.88,
-                    )
+# Routing counters: {intent: {"regex": n, "llm": n}}
+_route_stats: dict[str, dict[str, int]] = {}
+
+
+def _labels_fingerprint(entity_labels: Optional[dict]) -> tuple:
+    """Schema version of a tenant's routing table (label order is priority order)."""
+    return tuple((str(k), str(v)) for k, v in (entity_labels or {}).items())
+
+
+class CompiledRouter:
+    """Tier 0 routing table for one tenant, compiled into a single regex."""
+
+    def __init__(self, entity_labels: Optional[dict] = None):
+        self.fingerprint = _labels_fingerprint(entity_labels)
+        dynamic = [
+            (pattern, f"dynamic_{intent}", entity)
+            for pattern, intent, entity in _build_dynamic_patterns(entity_labels)
+        ]
+        self._routes = dynamic + _STATIC_ROUTES
+        self._regex = re.compile("|".join(
+            rf"(?=(?s:.*?)(?P<r{i}>{pattern}))" for i, (pattern, _, _) in enumerate(self._routes)
+        ))
+
+    def match(self, msg_lower: str) -> Optional[tuple[str, Optional[str]]]:
+        """Return (route kind, payload) of the highest-priority matching route, or None."""
+        m = self._regex.match(msg_lower)
+        if not m:
+            return None
+        for name, value in m.groupdict().items():
+            if value is not None:
+                _, kind, payload = self._routes[int(name[1:])]
+                return kind, payload
+        return None
+
+
+def _get_router(tenant_id: Optional[str], entity_labels: Optional[dict]) -> CompiledRouter:
+    """Cached CompiledRouter; rebuilt only when the tenant's entity_labels change."""
+    fingerprint = _labels_fingerprint(entity_labels)
+    key = tenant_id or fingerprint
+    router = _router_cache.get(key)
+    if router is not None and router.fingerprint == fingerprint:
+        return router
+    router = CompiledRouter(entity_labels)
+    _router_cache.set(key, router)
+    return router
+
+
+def _record_route(intent: str, tier: str) -> None:
+    counts = _route_stats.setdefault(intent, {"regex": 0, "llm": 0})
+    counts[tier] += 1
+
+
+def get_router_stats() -> dict:
+    """
+    Routing counters since process start: per-intent regex hits vs LLM
+    classifier fallbacks (a regex miss), plus totals. Intents with a high
+    "llm" count are the candidates for new Tier 0 patterns.
+    """
+    regex = sum(c["regex"] for c in _route_stats.values())
+    llm = sum(c["llm"] for c in _route_stats.values())
+    return {
+        "intents": {intent: dict(c) for intent, c in _route_stats.items()},
+        "regex": regex,
+        "llm_classifier": llm,
+        "llm_rate": round(llm / (regex + llm), 4) if regex + llm else 0.0,
+        "compiled_routers": len(_router_cache),
+    }
+
+
+def _route_result(kind: str, payload: Optional[str], message: str, msg_lower: str) -> RouterResult:
+    """Build the RouterResult for a Tier 0 route match."""
+    if kind == "dynamic_record_query":
+        return RouterResult(
+            intent="record_query",
+            agent="bobur",
+            filters={"entity": payload},
+            confidence=0.90,
+        )
+    if kind == "dynamic_kpi_query":
+        return RouterResult(
+            intent="kpi_query",
+            agent="kpi_resolver",
+            filters={"kpi_pattern": f"total_{payload}", "time_range_days": _extract_time_range(msg_lower)},
+            confidence=0.92,
+        )
+    if kind == "dynamic_chart_request":
+        return RouterResult(
+            intent="chart_request",
+            agent="dima",
+            filters={"entity": payload},
+            confidence=0.88,
+        )
 
     # Revenue overview (check before KPI patterns — these are broader)
-    for pattern in REVENUE_OVERVIEW_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="revenue_overview",
-                agent="bobur",
-                filters={"timeframe": _extract_timeframe(message)},
-                confidence=0.92,
-            )
+    if kind == "revenue_overview":
+        return RouterResult(
+            intent="revenue_overview",
+            agent="bobur",
+            filters={"timeframe": _extract_timeframe(message)},
+            confidence=0.92,
+        )
 
     # Revenue alerts / risks
-    for pattern in REVENUE_ALERT_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="revenue_alerts",
-                agent="bobur",
-                filters={},
-                confidence=0.90,
-            )
+    if kind == "revenue_alerts":
+        return RouterResult(
+            intent="revenue_alerts",
+            agent="bobur",
+            filters={},
+            confidence=0.90,
+        )
 
     # Insight / recommendation queries (route to Nilufar)
-    for pattern in INSIGHT_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="insight_query",
-                agent="nilufar",
-                filters={},
-                confidence=0.92,
-            )
+    if kind == "insight_query":
+        return RouterResult(
+            intent="insight_query",
+            agent="nilufar",
+            filters={},
+            confidence=0.92,
+        )
 
     # Specific KPI lookups (narrow patterns, after revenue to avoid conflict)
-    for pattern, agent, kpi_key in KPI_PATTERNS:
-        if re.search(pattern, msg_lower):
-            time_range = _extract_time_range(msg_lower)
-            return RouterResult(
-                intent="kpi_query",
-                agent=agent,
-                filters={"kpi_pattern": kpi_key, "time_range_days": time_range},
-                confidence=0.95,
-            )
+    if kind == "kpi_query":
+        return RouterResult(
+            intent="kpi_query",
+            agent="kpi_resolver",
+            filters={"kpi_pattern": payload, "time_range_days": _extract_time_range(msg_lower)},
+            confidence=0.95,
+        )
 
     # Activity metrics (check before deal/chart — more specific)
-    for pattern in ACTIVITY_METRIC_PATTERNS:
-        if re.search(pattern, msg_lower):
-            # Detect if asking "by rep" or "by type" dimension
-            dimension = None
-            if re.search(r"by\s+(?:rep|owner|person|assignee|team|agent)", msg_lower):
-                dimension = "assigned_to"
-            elif re.search(r"by\s+(?:type|kind|category)", msg_lower):
-                dimension = "type"
-            return RouterResult(
-                intent="metric_query",
-                agent="bobur",
-                filters={
-                    "metric_key": "rep_activity_count",
-                    "dimension": dimension,
-                    "time_range_days": _extract_time_range(msg_lower),
-                },
-                confidence=0.92,
-            )
+    if kind == "activity_metric":
+        # Detect if asking "by rep" or "by type" dimension
+        dimension = None
+        if re.search(r"by\s+(?:rep|owner|person|assignee|team|agent)", msg_lower):
+            dimension = "assigned_to"
+        elif re.search(r"by\s+(?:type|kind|category)", msg_lower):
+            dimension = "type"
+        return RouterResult(
+            intent="metric_query",
+            agent="bobur",
+            filters={
+                "metric_key": "rep_activity_count",
+                "dimension": dimension,
+                "time_range_days": _extract_time_range(msg_lower),
+            },
+            confidence=0.92,
+        )
 
     # Rep performance comparisons → metric query with assigned_to dimension
-    for pattern in REP_PERFORMANCE_PATTERNS:
-        if re.search(pattern, msg_lower):
-            metric_key = "pipeline_value"  # default
-            if re.search(r"win\s*rate|conversion|close\s*rate", msg_lower):
-                metric_key = "win_rate"
-            elif re.search(r"deals?\s*count|number|most\s+deals", msg_lower):
-                metric_key = "new_deals"
-            return RouterResult(
-                intent="metric_query",
-                agent="bobur",
-                filters={
-                    "metric_key": metric_key,
-                    "dimension": "assigned_to",
-                    "time_range_days": _extract_time_range(msg_lower),
-                },
-                confidence=0.92,
-            )
+    if kind == "rep_performance":
+        metric_key = "pipeline_value"  # default
+        if re.search(r"win\s*rate|conversion|close\s*rate", msg_lower):
+            metric_key = "win_rate"
+        elif re.search(r"deals?\s*count|number|most\s+deals", msg_lower):
+            metric_key = "new_deals"
+        return RouterResult(
+            intent="metric_query",
+            agent="bobur",
+            filters={
+                "metric_key": metric_key,
+                "dimension": "assigned_to",
+                "time_range_days": _extract_time_range(msg_lower),
+            },
+            confidence=0.92,
+        )
 
     # Lead source conversion → general_chat (CRM context has source_conversion data)
-    for pattern in CONVERSION_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="general_chat",
-                agent="bobur",
-                filters={},
-                confidence=0.90,
-            )
+    if kind == "conversion":
+        return RouterResult(
+            intent="general_chat",
+            agent="bobur",
+            filters={},
+            confidence=0.90,
+        )
 
     # Deal drilldown (check before chart patterns — more specific)
-    for pattern in DEAL_QUERY_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="deal_query",
-                agent="bobur",
-                filters={},
-                confidence=0.90,
-            )
+    if kind == "deal_query":
+        return RouterResult(
+            intent="deal_query",
+            agent="bobur",
+            filters={},
+            confidence=0.90,
+        )
 
     # Entity record queries (contacts, companies, leads, activities)
-    for pattern, entity in ENTITY_QUERY_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="record_query",
-                agent="bobur",
-                filters={"entity": entity},
-                confidence=0.90,
-            )
+    if kind == "record_query":
+        return RouterResult(
+            intent="record_query",
+            agent="bobur",
+            filters={"entity": payload},
+            confidence=0.90,
+        )
 
     # Temporal comparison (check before chart — more specific)
-    for pattern in TEMPORAL_COMPARISON_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="temporal_comparison",
-                agent="bobur",
-                filters={"time_range_days": _extract_time_range(msg_lower)},
-                confidence=0.90,
-            )
+    if kind == "temporal_comparison":
+        return RouterResult(
+            intent="temporal_comparison",
+            agent="bobur",
+            filters={"time_range_days": _extract_time_range(msg_lower)},
+            confidence=0.90,
+        )
 
     # Chart / visualization
-    for pattern in CHART_PATTERNS:
-        if re.search(pattern, msg_lower):
-            return RouterResult(
-                intent="chart_request",
-                agent="dima",
-                filters={},
-                confidence=0.88,
-            )
+    return RouterResult(
+        intent="chart_request",
+        agent="dima",
+        filters={},
+        confidence=0.88,
+    )
+
+
+async def route_message(
+    message: str,
+    entity_labels: dict = None,
+    metric_keys: list = None,
+    tenant_id: str = None,
+) -> RouterResult:
+    """Route a user message to the appropriate agent. Two-tier: regex then LLM.
+
+    Phase 3: Accepts optional entity_labels and metric_keys for dynamic pattern matching.
+    Tier 0 runs the tenant's compiled router (cached per tenant_id + entity_labels).
+    """
+    msg_lower = message.lower().strip()
+
+    hit = _get_router(tenant_id, entity_labels).match(msg_lower)
+    if hit is not None:
+        result = _route_result(hit[0], hit[1], message, msg_lower)
+        _record_route(result.intent, "regex")
+        return result
 
     # LLM classifier fallback (uses dynamic prompt if entity_labels available)
-    return await _classify_intent(message, entity_labels, metric_keys)
+    result = await _classify_intent(message, entity_labels, metric_keys)
+    _record_route(result.intent, "llm")
+    return result
 
 
 # ── Tier 1: LLM classifier ────────────────────────────────────────────────
@@ -580,8 +678,9 @@ async def _classify_intent(message: str, entity_labels: dict = None, metric_keys
         else:
             system_prompt = _CLASSIFIER_SYSTEM_PROMPT
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            purpose="bobur_classify_intent",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"<user_message>{message}</user_message>"},
@@ -944,8 +1043,10 @@ async def _interpret_results(
         if len(results_text) > 3000:
             results_text = results_text[:3000] + "..."
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            tenant_id=tenant_id,
+            purpose="bobur_interpret_results",
             messages=[
                 {
                     "role": "system",
@@ -1027,8 +1128,10 @@ async def _revenue_narrative_reply(
             "content": f"User asked: \"{message}\"\n\nData:\n{data_context}",
         })
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            tenant_id=tenant_id,
+            purpose="bobur_revenue_narrative_reply",
             messages=messages,
             temperature=0.5,
             max_tokens=180,
@@ -1056,8 +1159,10 @@ async def _conversational_error(
 ) -> str:
     """Turn a raw error into a friendly, helpful response via GPT-4o-mini."""
     try:
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            tenant_id=tenant_id,
+            purpose="bobur_conversational_error",
             messages=[
                 {
                     "role": "system",
@@ -1097,8 +1202,9 @@ async def _conversational_error(
 async def _extract_comparison_periods(message: str) -> dict:
     """Use GPT-4o-mini to extract two comparison periods and a metric from the message."""
     try:
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            purpose="bobur_extract_comparison_periods",
             messages=[
                 {
                     "role": "system",
@@ -1405,9 +1511,11 @@ async def handle_chat_message(
     history: list = None,
     crm_profile: CRMProfile = None,
     conversation_state: dict = None,
+    on_event=None,
 ) -> dict:
     """
     Main entry point. Routes to Bobur v4 (agentic loop) with v3 fallback.
+    ``on_event`` is forwarded to v4 for streaming progress (v3 does not emit).
 
     Returns
     -------
@@ -1419,6 +1527,7 @@ async def handle_chat_message(
         return await bobur_v4.handle_chat_message(
             supabase, tenant_id, crm_source,
             message, history, crm_profile, conversation_state,
+            on_event=on_event,
         )
     except Exception as e:
         logger.error("Bobur v4 failed, falling back to v3: %s", e, exc_info=True)
@@ -1460,7 +1569,7 @@ async def _legacy_handle_chat_message(
         crm_context_text = _format_context_for_prompt(crm_ctx)
 
         # 1. Route (with optional dynamic patterns)
-        route = await route_message(message, entity_labels=entity_labels)
+        route = await route_message(message, entity_labels=entity_labels, tenant_id=tenant_id)
         logger.info(
             "Bobur routed '%.50s' -> %s (%s, conf=%.2f)",
             message, route.agent, route.intent, route.confidence,
@@ -1804,8 +1913,10 @@ async def _conversational_reply(
             "content": f"User asked: \"{message}\"\n\nData: {chr(10).join(data_summary)}",
         })
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            tenant_id=tenant_id,
+            purpose="bobur_conversational_reply",
             messages=messages,
             temperature=0.6,
             max_tokens=180,
@@ -1948,8 +2059,9 @@ async def _generate_structured_query(
         if entity_hint:
             hint_line = f"\nThe user is likely asking about crm_{entity_hint}.\n"
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            purpose="bobur_generate_structured_query",
             messages=[
                 {
                     "role": "system",
@@ -2118,8 +2230,10 @@ async def _context_aware_chat(
 
         messages.append({"role": "user", "content": f"<user_message>{message}</user_message>"})
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            tenant_id=tenant_id,
+            purpose="bobur_context_aware_chat",
             messages=messages,
             temperature=0.5,
             max_tokens=300,
@@ -2154,8 +2268,10 @@ async def _context_aware_chat(
                             f"Additional query result ({len(rows)} records):\n{rows_text}"
                         ),
                     }
-                    response2 = await openai_client.chat.completions.create(
+                    response2 = await get_gateway().chat_completion(
                         model="gpt-4o-mini",
+                        tenant_id=tenant_id,
+                        purpose="bobur_context_aware_chat",
                         messages=messages,
                         temperature=0.5,
                         max_tokens=300,
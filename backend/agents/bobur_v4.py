@@ -11,6 +11,8 @@ Architecture:
       ↓
   [Short-circuit check] ← KPI patterns, revenue overview ($0)
       ↓ (miss)
+  [Answer engine] ← entity/measure/dimension/timeframe/top-N templates ($0)
+      ↓ (low confidence)
   [Agentic ReAct Loop] ← GPT-4o-mini with function calling
       ├── run_sql()           → SQL generation + validation + execution
       ├── get_metric()        → Existing metric catalog (12 metrics)
@@ -22,6 +24,15 @@ Architecture:
       ↓
   {reply, charts, response_type, agent_used}
 
+Non-terminal tool calls from one model turn run concurrently, each with its
+own timeout. Results are memoized for the rest of the turn, keyed by tool
+name + canonicalized arguments, so a repeated run_sql / get_metric in a
+later iteration does not hit the database again.
+
+With ``on_event`` set (the /dashboard/chat/stream endpoint), progress is
+pushed as it happens — status, tool_start, tool_result, sql, chart — and the
+final reply text streams token by token from the OpenAI stream ("token").
+
 Max 5 iterations, ~$0.001 avg cost per request.
 """
 
@@ -32,15 +43,18 @@ import json
 import logging
 import re
 import time
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
 
-from llm_service import client as openai_client
+from llm_gateway import get_gateway
 from token_logger import log_token_usage_fire_and_forget
 from agent_trace import AgentTrace
+from reply_streaming import JsonStringFieldStreamer
 from agents import (
     RouterResult, CRMProfile, SchemaProfile,
     ChartConfig, DynamicMetricResult, AlertResult,
 )
+from agents import answer_engine
 from agents import kpi_resolver
 from agents import dima
 from agents import anvar
@@ -48,7 +62,7 @@ from agents import nilufar
 from agents.schema_context import SchemaContext
 from agents.conversation_state import ConversationState
 from agents.sql_engine import (
-    validate_sql, execute_sql, format_sql_results_for_llm,
+    validate_sql, execute_sql, format_sql_results_for_llm, canonical_sql,
 )
 from agents.bobur_tools import (
     get_revenue_overview,
@@ -67,6 +81,14 @@ MAX_ITERATIONS = 5
 LOOP_TIMEOUT_S = 15.0
 MODEL = "gpt-4o-mini"
 
+# Per-tool wall-clock limits; each is also capped by the remaining loop budget
+TOOL_TIMEOUT_S = {"run_sql": 8.0, "design_chart": 10.0}
+DEFAULT_TOOL_TIMEOUT_S = 8.0
+MIN_TOOL_TIMEOUT_S = 1.0
+
+# async (event_name, payload) -> None; see handle_chat_message
+EventCallback = Callable[[str, dict], Awaitable[None]]
+
 # ── Short-circuit regex patterns ($0) ─────────────────────────────────────
 
 _KPI_SHORT_CIRCUITS = [
@@ -430,6 +452,192 @@ async def _execute_tool(
         return {"error": f"Unknown tool: {tool_name}"}
 
 
+def _tool_cache_key(tool_name: str, tool_args: dict) -> str:
+    """Memo key: tool name + canonical JSON args (SQL normalized for run_sql)."""
+    args = dict(tool_args)
+    if tool_name == "run_sql":
+        args["sql"] = canonical_sql(args.get("sql", ""))
+    return tool_name + ":" + json.dumps(args, sort_keys=True, default=str)
+
+
+async def _execute_tool_timed(tool_name: str, tool_args: dict, timeout_s: float, *ctx) -> dict:
+    """_execute_tool with a timeout; failures become {"error": ...} for the LLM."""
+    try:
+        return await asyncio.wait_for(_execute_tool(tool_name, tool_args, *ctx), timeout=timeout_s)
+    except asyncio.TimeoutError:
+        logger.warning("Bobur v4: tool %s timed out after %.1fs", tool_name, timeout_s)
+        return {"error": f"{tool_name} timed out after {timeout_s:.0f}s. Try a narrower query."}
+    except Exception as e:
+        logger.warning("Bobur v4: tool %s failed: %s", tool_name, e)
+        return {"error": str(e)}
+
+
+async def _execute_tool_calls(
+    calls: list[tuple[str, dict]],
+    memo: dict,
+    remaining_s: float,
+    *ctx,
+    on_event: Optional[EventCallback] = None,
+) -> list[tuple[dict, bool]]:
+    """
+    Run one turn's non-terminal tool calls concurrently.
+
+    Returns (result, cached) per call, in order. Calls already in ``memo`` (or
+    duplicated within this batch) are served without re-executing; successful
+    results are added to ``memo``. A tool_result event is emitted as each
+    executed call finishes.
+    """
+    keys = [_tool_cache_key(name, args) for name, args in calls]
+    budget = max(remaining_s, MIN_TOOL_TIMEOUT_S)
+
+    pending: dict[str, tuple[str, dict]] = {}
+    for (name, args), key in zip(calls, keys):
+        if key not in memo and key not in pending:
+            pending[key] = (name, args)
+
+    async def _run(name: str, args: dict) -> dict:
+        result = await _execute_tool_timed(
+            name, args, min(TOOL_TIMEOUT_S.get(name, DEFAULT_TOOL_TIMEOUT_S), budget), *ctx,
+        )
+        await _emit(on_event, "tool_result", _tool_event(name, result, cached=False))
+        return result
+
+    results = await asyncio.gather(*(_run(name, args) for name, args in pending.values()))
+    fresh = dict(zip(pending, results))
+    for key, result in fresh.items():
+        if not result.get("error"):
+            memo[key] = result
+
+    outcomes = []
+    first_seen: set[str] = set()
+    for key in keys:
+        if key in fresh and key not in first_seen:
+            first_seen.add(key)
+            outcomes.append((fresh[key], False))
+        else:
+            outcomes.append((fresh[key] if key in fresh else memo[key], True))
+    return outcomes
+
+
+# ── Streaming helpers ─────────────────────────────────────────────────────
+
+async def _emit(on_event: Optional[EventCallback], event: str, data: dict) -> None:
+    """Deliver a progress event; a failing consumer never breaks the loop."""
+    if on_event is None:
+        return
+    try:
+        await on_event(event, data)
+    except Exception as e:
+        logger.debug("Bobur v4: event consumer failed (%s): %s", event, e)
+
+
+def _tool_event(tool_name: str, result: dict, cached: bool) -> dict:
+    event = {"tool": tool_name, "cached": cached, "ok": not result.get("error")}
+    if result.get("error"):
+        event["error"] = str(result["error"])[:200]
+    if tool_name == "run_sql":
+        event["row_count"] = result.get("row_count", 0)
+    if tool_name == "design_chart":
+        event["count"] = result.get("count", 0)
+    return event
+
+
+@dataclass
+class _ToolCall:
+    id: str
+    name: str
+    arguments: str
+
+
+@dataclass
+class _LLMTurn:
+    """One model response, normalized across blocking and streamed calls."""
+
+    content: str = ""
+    tool_calls: list[_ToolCall] = field(default_factory=list)
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def assistant_message(self) -> dict:
+        message = {"role": "assistant", "content": self.content or None}
+        if self.tool_calls:
+            message["tool_calls"] = [
+                {"id": tc.id, "type": "function", "function": {"name": tc.name, "arguments": tc.arguments}}
+                for tc in self.tool_calls
+            ]
+        return message
+
+
+_COMPLETION_KWARGS = dict(
+    model=MODEL,
+    tools=TOOL_DEFINITIONS,
+    tool_choice="auto",
+    temperature=0.1,
+    max_tokens=1500,
+)
+
+
+async def _complete(messages: list, tenant_id: Optional[str] = None) -> _LLMTurn:
+    response = await get_gateway().chat_completion(
+        messages=messages, tenant_id=tenant_id, purpose="bobur_v4", **_COMPLETION_KWARGS,
+    )
+    message = response.choices[0].message
+    usage = response.usage
+    return _LLMTurn(
+        content=message.content or "",
+        tool_calls=[
+            _ToolCall(tc.id, tc.function.name, tc.function.arguments)
+            for tc in (message.tool_calls or [])
+        ],
+        input_tokens=usage.prompt_tokens if usage else 0,
+        output_tokens=usage.completion_tokens if usage else 0,
+    )
+
+
+async def _complete_streaming(
+    messages: list, on_event: EventCallback, tenant_id: Optional[str] = None,
+) -> _LLMTurn:
+    """Streamed completion: direct content and respond() reply text go out as token events."""
+    stream = await get_gateway().chat_completion(
+        messages=messages, tenant_id=tenant_id, purpose="bobur_v4",
+        stream=True, stream_options={"include_usage": True},
+        **_COMPLETION_KWARGS,
+    )
+    turn = _LLMTurn()
+    content: list[str] = []
+    calls: dict[int, dict] = {}
+    replies: dict[int, JsonStringFieldStreamer] = {}
+
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            turn.input_tokens = chunk.usage.prompt_tokens or 0
+            turn.output_tokens = chunk.usage.completion_tokens or 0
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            await _emit(on_event, "token", {"text": delta.content})
+        for tc in delta.tool_calls or []:
+            entry = calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+            if tc.id:
+                entry["id"] = tc.id
+            if not tc.function:
+                continue
+            if tc.function.name:
+                entry["name"] += tc.function.name
+            if tc.function.arguments:
+                entry["arguments"] += tc.function.arguments
+                if entry["name"] == "respond":
+                    text = replies.setdefault(tc.index, JsonStringFieldStreamer("reply")).feed(tc.function.arguments)
+                    if text:
+                        await _emit(on_event, "token", {"text": text})
+
+    turn.content = "".join(content)
+    turn.tool_calls = [_ToolCall(c["id"], c["name"], c["arguments"]) for _, c in sorted(calls.items())]
+    return turn
+
+
 # ── Short-circuit handlers ($0) ───────────────────────────────────────────
 
 async def _try_short_circuit(
@@ -439,9 +647,10 @@ async def _try_short_circuit(
     """Try to answer with $0 cost handlers. Returns None if no match."""
     msg_lower = message.lower().strip()
 
-    # KPI patterns
+    # KPI patterns — bare questions only; a timeframe, breakdown or filter
+    # ("how many deals did Aziz close this month") is the answer engine's job
     for pattern, kpi_key in _KPI_SHORT_CIRCUITS:
-        if re.search(pattern, msg_lower):
+        if re.search(pattern, msg_lower) and not answer_engine.is_qualified(msg_lower):
             result = await kpi_resolver.resolve_kpi(
                 supabase, tenant_id, crm_source, kpi_key,
             )
@@ -497,6 +706,8 @@ async def _agentic_loop(
     schema: Optional[SchemaProfile],
     crm_context_text: str,
     conv_state: ConversationState,
+    on_event: Optional[EventCallback] = None,
+    rep_name_map: Optional[dict] = None,
 ) -> dict:
     """Run the agentic ReAct loop with function calling."""
 
@@ -515,12 +726,14 @@ async def _agentic_loop(
     messages.append({"role": "user", "content": message})
 
     # Pre-build rep name map for SQL results
-    rep_name_map = await build_rep_name_map(supabase, tenant_id, crm_source)
+    if rep_name_map is None:
+        rep_name_map = await build_rep_name_map(supabase, tenant_id, crm_source)
 
     start_time = time.time()
     last_sql = None
     last_tool = None
     charts_collected = []
+    tool_memo: dict[str, dict] = {}  # per-turn tool results, see _tool_cache_key
 
     for iteration in range(MAX_ITERATIONS):
         # Timeout guard
@@ -535,15 +748,12 @@ async def _agentic_loop(
                 "conversation_state": conv_state.to_dict(),
             }
 
+        await _emit(on_event, "status", {"stage": "thinking", "iteration": iteration})
         try:
-            response = await openai_client.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                tools=TOOL_DEFINITIONS,
-                tool_choice="auto",
-                temperature=0.1,
-                max_tokens=1500,
-            )
+            if on_event is not None:
+                turn = await _complete_streaming(messages, on_event, tenant_id)
+            else:
+                turn = await _complete(messages, tenant_id)
         except Exception as e:
             logger.error("Bobur v4: OpenAI call failed: %s", e)
             return {
@@ -554,22 +764,20 @@ async def _agentic_loop(
                 "conversation_state": conv_state.to_dict(),
             }
 
-        choice = response.choices[0]
-
         # Log token usage
-        if response.usage:
+        if turn.input_tokens or turn.output_tokens:
             log_token_usage_fire_and_forget(
                 tenant_id=tenant_id,
-                agent="bobur_v4",
                 model=MODEL,
-                input_tokens=response.usage.prompt_tokens,
-                output_tokens=response.usage.completion_tokens,
+                request_type="crm_chat",
+                input_tokens=turn.input_tokens,
+                output_tokens=turn.output_tokens,
             )
 
         # If no tool calls — model responded directly
-        if not choice.message.tool_calls:
+        if not turn.tool_calls:
             return {
-                "reply": choice.message.content or "I couldn't generate a response.",
+                "reply": turn.content or "I couldn't generate a response.",
                 "charts": charts_collected,
                 "response_type": "chat",
                 "agent_used": "bobur_v4",
@@ -577,12 +785,15 @@ async def _agentic_loop(
             }
 
         # Process tool calls
-        messages.append(choice.message)
+        messages.append(turn.assistant_message())
 
-        for tool_call in choice.message.tool_calls:
-            fn_name = tool_call.function.name
+        # Everything before the first respond() runs concurrently
+        calls = []
+        respond_args = None
+        for tool_call in turn.tool_calls:
+            fn_name = tool_call.name
             try:
-                fn_args = json.loads(tool_call.function.arguments)
+                fn_args = json.loads(tool_call.arguments or "{}")
             except json.JSONDecodeError:
                 fn_args = {}
 
@@ -591,41 +802,36 @@ async def _agentic_loop(
                 iteration, fn_name, json.dumps(fn_args)[:200],
             )
 
-            # Terminal tool — respond
             if fn_name == "respond":
-                reply = fn_args.get("reply", "")
-                resp_charts = fn_args.get("charts", [])
-                charts_collected.extend(resp_charts)
-
-                # Update conversation state
-                conv_state.turn_count += 1
-                conv_state.last_tool = last_tool
-                conv_state.last_sql = last_sql
-                if reply:
-                    conv_state.last_result_summary = reply[:200]
-
-                return {
-                    "reply": reply,
-                    "charts": charts_collected,
-                    "response_type": "analysis",
-                    "agent_used": "bobur_v4",
-                    "conversation_state": conv_state.to_dict(),
-                }
-
-            # Execute non-terminal tool
-            tool_result = await _execute_tool(
-                fn_name, fn_args,
-                supabase, tenant_id, crm_source,
-                schema_ctx, crm_profile, schema, rep_name_map,
-            )
+                respond_args = fn_args
+                break
+            calls.append((tool_call, fn_name, fn_args))
+            await _emit(on_event, "tool_start", {"tool": fn_name, "iteration": iteration})
+
+        outcomes = await _execute_tool_calls(
+            [(fn_name, fn_args) for _, fn_name, fn_args in calls],
+            tool_memo,
+            LOOP_TIMEOUT_S - (time.time() - start_time),
+            supabase, tenant_id, crm_source,
+            schema_ctx, crm_profile, schema, rep_name_map,
+            on_event=on_event,
+        )
 
+        for (tool_call, fn_name, _), (tool_result, cached) in zip(calls, outcomes):
             last_tool = fn_name
+            if cached:
+                await _emit(on_event, "tool_result", _tool_event(fn_name, tool_result, cached=True))
             if fn_name == "run_sql" and tool_result.get("sql_executed"):
                 last_sql = tool_result["sql_executed"]
+                await _emit(on_event, "sql", {
+                    "sql": last_sql, "row_count": tool_result.get("row_count", 0), "cached": cached,
+                })
 
-            # Collect charts from design_chart
-            if fn_name == "design_chart" and tool_result.get("charts"):
+            # Collect charts from design_chart (once per distinct request)
+            if fn_name == "design_chart" and tool_result.get("charts") and not cached:
                 charts_collected.extend(tool_result["charts"])
+                for chart in tool_result["charts"]:
+                    await _emit(on_event, "chart", {"chart": chart})
 
             # Append tool result to messages
             messages.append({
@@ -634,6 +840,27 @@ async def _agentic_loop(
                 "content": json.dumps(tool_result, default=str)[:3000],
             })
 
+        # Terminal tool — respond
+        if respond_args is not None:
+            reply = respond_args.get("reply", "")
+            resp_charts = respond_args.get("charts", [])
+            charts_collected.extend(resp_charts)
+
+            # Update conversation state
+            conv_state.turn_count += 1
+            conv_state.last_tool = last_tool
+            conv_state.last_sql = last_sql
+            if reply:
+                conv_state.last_result_summary = reply[:200]
+
+            return {
+                "reply": reply,
+                "charts": charts_collected,
+                "response_type": "analysis",
+                "agent_used": "bobur_v4",
+                "conversation_state": conv_state.to_dict(),
+            }
+
     # Exhausted iterations
     logger.warning("Bobur v4: exhausted %d iterations", MAX_ITERATIONS)
     return {
@@ -655,10 +882,15 @@ async def handle_chat_message(
     history: list = None,
     crm_profile: CRMProfile = None,
     conversation_state: dict = None,
+    on_event: Optional[EventCallback] = None,
 ) -> dict:
     """
     Bobur v4 main entry point.
 
+    ``on_event`` receives progress events while the loop runs:
+    status {stage, iteration}, tool_start {tool}, tool_result {tool, ok, cached, ...},
+    sql {sql, row_count}, chart {chart}, token {text}.
+
     Returns
     -------
     {reply: str, charts: list, response_type: str, agent_used: str, conversation_state: dict}
@@ -678,14 +910,34 @@ async def handle_chat_message(
     from agents import SchemaProfile as SP
     schema = await _load_schema_profile(supabase, tenant_id, crm_source)
     schema_ctx = await SchemaContext.create(supabase, tenant_id, crm_source, schema)
+    rep_name_map = await build_rep_name_map(supabase, tenant_id, crm_source)
+
+    # 3. Deterministic answer engine ($0) — templated SQL / precomputed context
+    answer = await answer_engine.try_answer(
+        supabase, tenant_id, crm_source, message, schema_ctx, rep_name_map,
+    )
+    if answer:
+        conv_state.turn_count += 1
+        conv_state.last_tool = "answer_engine"
+        conv_state.last_sql = answer.pop("sql", None) or conv_state.last_sql
+        conv_state.last_entity = answer.pop("entity", None)
+        conv_state.last_timeframe = answer.pop("timeframe", None)
+        conv_state.last_result_summary = answer["reply"][:200]
+        for chart in answer["charts"]:
+            await _emit(on_event, "chart", {"chart": chart})
+        answer["conversation_state"] = conv_state.to_dict()
+        return answer
+
     crm_context_text = await _load_crm_context_text(supabase, tenant_id)
 
-    # 3. Run agentic loop
+    # 4. Run agentic loop
     return await _agentic_loop(
         supabase, tenant_id, crm_source,
         message, history,
         schema_ctx, crm_profile, schema,
         crm_context_text, conv_state,
+        on_event=on_event,
+        rep_name_map=rep_name_map,
     )
 
 
@@ -19,20 +19,20 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import time
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 
 from pydantic import BaseModel, Field
 
 from agents.bobur_tools import build_rep_name_map, resolve_rep_name
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 # ── Cache ──────────────────────────────────────────────────────────────
 
-_correlation_cache: dict[str, tuple[list, float]] = {}
 CACHE_TTL = 900  # 15 minutes
+_correlation_cache = TTLCache("correlations", ttl=CACHE_TTL, max_entries=1024)
 
 
 # ── Data Model ─────────────────────────────────────────────────────────
@@ -57,13 +57,12 @@ async def compute_correlations(
     Run all 6 correlation analyses. Returns up to 6 results sorted by
     confidence descending. Cached for 15 minutes per tenant.
     """
-    cache_key = f"{tenant_id}:{crm_source}"
-    now = time.time()
-    if cache_key in _correlation_cache:
-        cached, ts = _correlation_cache[cache_key]
-        if now - ts < CACHE_TTL:
-            return cached
+    return await _correlation_cache.get_or_load(
+        f"{tenant_id}:{crm_source}", lambda: _compute_all(supabase, tenant_id, crm_source)
+    )
 
+
+async def _compute_all(supabase, tenant_id: str, crm_source: str) -> list[CorrelationResult]:
     # Build rep name map once
     rep_map = await build_rep_name_map(supabase, tenant_id, crm_source)
 
@@ -87,10 +86,7 @@ async def compute_correlations(
             logger.debug("Correlation function failed: %s", r)
 
     results.sort(key=lambda x: x.confidence, reverse=True)
-    results = results[:6]
-
-    _correlation_cache[cache_key] = (results, now)
-    return results
+    return results[:6]
 
 
 # ── 1. Rep Performance Matrix ─────────────────────────────────────────
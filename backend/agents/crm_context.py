@@ -19,6 +19,7 @@ from collections import defaultdict
 from datetime import datetime, timezone, timedelta
 
 from agents.bobur_tools import build_rep_name_map, resolve_rep_name
+from row_counts import CountMode, count_tables
 
 logger = logging.getLogger(__name__)
 
@@ -97,16 +98,12 @@ async def compute_crm_context(
 # ---------------------------------------------------------------------------
 
 async def _compute_counts(supabase, tenant_id, crm_source) -> dict:
-    counts = {}
-    for entity in ("leads", "deals", "contacts", "companies", "activities"):
-        try:
-            result = supabase.table(f"crm_{entity}").select(
-                "*", count="exact"
-            ).eq("tenant_id", tenant_id).eq("crm_source", crm_source).limit(0).execute()
-            counts[entity] = result.count or 0
-        except Exception:
-            counts[entity] = 0
-    return counts
+    entities = ("leads", "deals", "contacts", "companies", "activities")
+    counts = await count_tables(
+        supabase, tenant_id, [f"crm_{e}" for e in entities],
+        crm_source=crm_source, mode=CountMode.CACHED,
+    )
+    return {e: counts[f"crm_{e}"] for e in entities}
 
 
 async def _compute_pipeline(supabase, tenant_id, crm_source, rep_map) -> dict:
@@ -9,7 +9,7 @@ import json
 import logging
 from typing import Optional
 
-from llm_service import client as openai_client
+from llm_gateway import get_gateway, served_model
 from token_logger import log_token_usage_fire_and_forget
 from agent_trace import AgentTrace
 from agents import ChartConfig, CRMProfile
@@ -109,8 +109,10 @@ async def generate_chart_from_request(
             } if crm_profile.entities else {},
         }
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o",
+            tenant_id=tenant_id,
+            purpose="dima_generate_chart_from_request",
             messages=[
                 {"role": "system", "content": DIMA_SYSTEM_PROMPT},
                 {"role": "user", "content": json.dumps(prompt_data)},
@@ -123,7 +125,7 @@ async def generate_chart_from_request(
 
         log_token_usage_fire_and_forget(
             tenant_id=tenant_id,
-            model="gpt-4o",
+            model=served_model(response, "gpt-4o"),
             request_type="dashboard_chart_design",
             input_tokens=response.usage.prompt_tokens,
             output_tokens=response.usage.completion_tokens,
@@ -13,7 +13,7 @@ import json
 import logging
 from typing import Optional
 
-from llm_service import client as openai_client
+from llm_gateway import get_gateway, served_model
 from agent_trace import AgentTrace
 from token_logger import log_token_usage_fire_and_forget
 from agents import (
@@ -125,8 +125,10 @@ async def discover_schema(
                 "entities": entities_summary,
             }
 
-            response = await openai_client.chat.completions.create(
+            response = await get_gateway().chat_completion(
                 model="gpt-4o",
+                tenant_id=tenant_id,
+                purpose="farid_discover_schema",
                 messages=[
                     {"role": "system", "content": DISCOVERY_SYSTEM_PROMPT},
                     {"role": "user", "content": json.dumps(prompt_data)},
@@ -139,7 +141,7 @@ async def discover_schema(
 
             log_token_usage_fire_and_forget(
                 tenant_id=tenant_id,
-                model="gpt-4o",
+                model=served_model(response, "gpt-4o"),
                 request_type="farid_schema_discovery",
                 input_tokens=response.usage.prompt_tokens,
                 output_tokens=response.usage.completion_tokens,
@@ -360,8 +362,10 @@ async def discover_and_plan(
         }
 
         async with AgentTrace(supabase, tenant_id, "farid", model="gpt-4o") as trace:
-            response = await openai_client.chat.completions.create(
+            response = await get_gateway().chat_completion(
                 model="gpt-4o",
+                tenant_id=tenant_id,
+                purpose="farid_discover_and_plan",
                 messages=[
                     {"role": "system", "content": DISCOVER_AND_PLAN_PROMPT},
                     {"role": "user", "content": json.dumps(prompt_data)},
@@ -374,7 +378,7 @@ async def discover_and_plan(
 
             log_token_usage_fire_and_forget(
                 tenant_id=tenant_id,
-                model="gpt-4o",
+                model=served_model(response, "gpt-4o"),
                 request_type="farid_discover_and_plan",
                 input_tokens=response.usage.prompt_tokens,
                 output_tokens=response.usage.completion_tokens,
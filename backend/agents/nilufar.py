@@ -17,11 +17,10 @@ Cost: ~$0.001 per analyze_and_recommend() call (1 GPT-4o-mini call).
 
 import json
 import logging
-import time
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 
-from llm_service import client as openai_client
+from llm_gateway import get_gateway
 from token_logger import log_token_usage_fire_and_forget
 from agent_trace import AgentTrace
 from agents import (
@@ -32,13 +31,14 @@ from agents import (
     Recommendation,
 )
 from agents.bobur_tools import build_rep_name_map, resolve_rep_name
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 # ── Caching ──────────────────────────────────────────────────────────
 
-_recommendation_cache: dict[str, tuple] = {}  # key -> (recommendations, timestamp)
 CACHE_TTL = 900  # 15 minutes
+_recommendation_cache = TTLCache("nilufar_recommendations", ttl=CACHE_TTL, max_entries=1024)
 
 
 # ── Main API ─────────────────────────────────────────────────────────
@@ -61,16 +61,14 @@ async def analyze_and_recommend(
     """
     # Check cache
     cache_key = f"{tenant_id}:{crm_source}"
-    now = time.time()
-    if cache_key in _recommendation_cache:
-        cached, ts = _recommendation_cache[cache_key]
-        if now - ts < CACHE_TTL:
-            return cached
+    cached = _recommendation_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
     # If no alerts fired and no correlations, return positive summary
     if not alert_results and not correlation_results:
         recs = _build_all_clear(metric_results, schema_profile)
-        _recommendation_cache[cache_key] = (recs, now)
+        _recommendation_cache.set(cache_key, recs)
         return recs
 
     # Build context for GPT-4o-mini
@@ -80,8 +78,10 @@ async def analyze_and_recommend(
 
     try:
         async with AgentTrace(supabase, tenant_id, "nilufar", model="gpt-4o-mini") as trace:
-            response = await openai_client.chat.completions.create(
+            response = await get_gateway().chat_completion(
                 model="gpt-4o-mini",
+                tenant_id=tenant_id,
+                purpose="nilufar_analyze_and_recommend",
                 messages=[
                     {"role": "system", "content": RECOMMENDATION_SYSTEM_PROMPT},
                     {"role": "user", "content": json.dumps(context)},
@@ -106,7 +106,7 @@ async def analyze_and_recommend(
             except json.JSONDecodeError:
                 logger.error(f"Nilufar returned invalid JSON: {content[:200]}")
                 recs = _fallback_recommendations(alert_results, schema_profile)
-                _recommendation_cache[cache_key] = (recs, now)
+                _recommendation_cache.set(cache_key, recs)
                 return recs
 
             # Parse recommendations
@@ -124,7 +124,7 @@ async def analyze_and_recommend(
     severity_order = {"critical": 0, "warning": 1, "opportunity": 2, "info": 3}
     recs.sort(key=lambda r: severity_order.get(r.severity, 4))
 
-    _recommendation_cache[cache_key] = (recs, now)
+    _recommendation_cache.set(cache_key, recs)
     return recs
 
 
@@ -656,8 +656,10 @@ async def _check_team_imbalance(supabase, tenant_id, crm_source) -> list[Insight
 
 async def _enrich_critical(supabase, tenant_id, insight: InsightResult, trace) -> InsightResult:
     try:
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            tenant_id=tenant_id,
+            purpose="nilufar_enrich_critical",
             messages=[
                 {
                     "role": "system",
@@ -13,17 +13,17 @@ Cost: $0 (pure Python, no LLM). Two Supabase queries, cached 5 min.
 """
 
 import logging
-import time
 from typing import Optional
 
 from agents import SchemaProfile
 from agents.anvar import load_allowed_fields, DEFAULT_ALLOWED_FIELDS
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
-# In-memory cache: {(tenant_id, crm_source): (SchemaContext, timestamp)}
-_ctx_cache: dict[tuple, tuple] = {}
+# In-memory cache: {(tenant_id, crm_source): SchemaContext}
 _CTX_CACHE_TTL = 300  # 5 minutes
+_ctx_cache = TTLCache("schema_context", ttl=_CTX_CACHE_TTL, max_entries=2048)
 
 # System columns always available (not in crm_field_registry)
 _SYSTEM_COLUMNS = ["id", "external_id"]
@@ -69,13 +69,18 @@ class SchemaContext:
         schema: SchemaProfile,
     ) -> "SchemaContext":
         """Async factory — loads field registry + record counts. Cached 5 min."""
-        cache_key = (tenant_id, crm_source)
-        now = time.time()
-        if cache_key in _ctx_cache:
-            cached, ts = _ctx_cache[cache_key]
-            if now - ts < _CTX_CACHE_TTL:
-                return cached
+        return await _ctx_cache.get_or_load(
+            (tenant_id, crm_source), lambda: cls._load(supabase, tenant_id, crm_source, schema)
+        )
 
+    @classmethod
+    async def _load(
+        cls,
+        supabase,
+        tenant_id: str,
+        crm_source: str,
+        schema: SchemaProfile,
+    ) -> "SchemaContext":
         # 1. Load full field registry
         entities: dict[str, list[FieldInfo]] = {}
         try:
@@ -123,14 +128,12 @@ class SchemaContext:
         # 3. Load allowed fields (for validation whitelist)
         allowed = await load_allowed_fields(supabase, tenant_id, crm_source)
 
-        ctx = cls(
+        return cls(
             schema=schema,
             entities=entities,
             record_counts=record_counts,
             allowed_fields=allowed,
         )
-        _ctx_cache[cache_key] = (ctx, now)
-        return ctx
 
     # ── Prompt formatters ──────────────────────────────────────────────
 
@@ -233,6 +236,17 @@ class SchemaContext:
             return self._schema.owner_field
         return None
 
+    def get_entity_labels(self) -> dict[str, str]:
+        """Business labels per table: {"crm_leads": "Students", ...} (may be empty)."""
+        return {
+            f"crm_{entity}": label
+            for entity, label in (self._schema.entity_labels or {}).items()
+            if label
+        }
+
+    def get_currency(self) -> Optional[str]:
+        return self._schema.currency
+
     def get_fields_by_type(self, table: str, field_type: str) -> list[str]:
         """Return field names matching a given type (e.g., 'timestamp')."""
         return [
@@ -4,6 +4,13 @@ SQL Engine — Validation + safe execution pipeline for Bobur v4.
 LLM generates SQL → parse (sqlglot) → read-only check → column whitelist
 → complexity guard → execute via Supabase RPC → truncate + format results.
 
+Parses are memoized (lru_cache). Successful results are cached in an LRU
+keyed on tenant, CRM source, the tenant's sync data version and the
+normalized AST of the cleaned SQL (identifier case, keyword case, whitespace
+and AND-conjunct order unified). The sync engine calls bump_data_version()
+after writing rows, so a new sync invalidates that tenant's cached results
+on every worker (the bump is broadcast through shared_state pub/sub).
+
 Security: Tenant isolation is enforced by the RPC function, NOT the LLM.
 The LLM writes clean analytics SQL — the database layer enforces tenant filters.
 
@@ -12,6 +19,9 @@ Cost: $0 (pure Python + Supabase RPC).
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
 import json
 import logging
 import re
@@ -19,6 +29,10 @@ from typing import Optional
 
 import sqlglot
 from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+from shared_state import get_shared_state, subscribe
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +42,12 @@ MAX_ROWS = 100
 MAX_JOINS = 3
 MAX_SUBQUERIES = 2
 
+# Result cache — keyed on (tenant, source, data version, normalized SQL)
+SQL_CACHE_MAX_ENTRIES = 512
+SQL_CACHE_MAX_BYTES = 64 * 1024 * 1024  # result rows can be large; bound memory too
+SQL_CACHE_TTL = 600  # seconds; backstop when no distributed shared-state backend carries bumps
+PARSE_CACHE_SIZE = 1024
+
 # Tables the LLM is allowed to query
 ALLOWED_TABLES = {
     "crm_deals", "crm_leads", "crm_contacts",
@@ -66,13 +86,10 @@ def validate_sql(
     if match:
         return False, f"Write operations are not allowed: {match.group(1)}", None
 
-    # 2. Parse with sqlglot
-    try:
-        parsed = sqlglot.parse_one(sql, dialect="postgres")
-    except sqlglot.errors.ParseError as e:
-        return False, f"SQL syntax error: {e}", None
-    except Exception as e:
-        return False, f"Failed to parse SQL: {e}", None
+    # 2. Parse with sqlglot (memoized — the tree is shared, never mutate it)
+    parsed, parse_error = _parse(sql)
+    if parse_error:
+        return False, parse_error, None
 
     # 3. Verify it's a SELECT statement
     if not isinstance(parsed, exp.Select):
@@ -189,6 +206,106 @@ def _resolve_table_alias(parsed: exp.Select, alias: str) -> Optional[str]:
     return None
 
 
+# ── Parsing + canonical form ──────────────────────────────────────────────
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(sql: str) -> tuple[Optional[exp.Expression], Optional[str]]:
+    """Memoized sqlglot parse. Returns (tree, None) or (None, error message)."""
+    try:
+        return sqlglot.parse_one(sql, dialect="postgres"), None
+    except sqlglot.errors.ParseError as e:
+        return None, f"SQL syntax error: {e}"
+    except Exception as e:
+        return None, f"Failed to parse SQL: {e}"
+
+
+def _conjuncts(node: exp.Expression) -> list[exp.Expression]:
+    if isinstance(node, exp.Paren) and isinstance(node.this, exp.And):
+        return _conjuncts(node.this)
+    if isinstance(node, exp.And):
+        return _conjuncts(node.left) + _conjuncts(node.right)
+    return [node]
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def canonical_sql(sql: str) -> str:
+    """
+    Normalize SQL so equivalent queries compare equal: identifier and keyword
+    case, whitespace, trailing semicolons and the order of AND-ed predicates
+    in WHERE / HAVING are unified; literals and output aliases are untouched.
+    Falls back to whitespace collapsing if sqlglot cannot parse it.
+    """
+    text = (sql or "").strip().rstrip(";").strip()
+    parsed, error = _parse(text)
+    if error or parsed is None:
+        return re.sub(r"\s+", " ", text)
+    try:
+        tree = normalize_identifiers(parsed.copy(), dialect="postgres")
+        for clause in list(tree.find_all(exp.Where, exp.Having)):
+            parts = _conjuncts(clause.this)
+            if len(parts) > 1:
+                parts.sort(key=lambda p: p.sql(dialect="postgres"))
+                clause.set("this", exp.and_(*parts, copy=False))
+        return tree.sql(dialect="postgres")
+    except Exception:
+        return re.sub(r"\s+", " ", text)
+
+
+# ── Result cache ──────────────────────────────────────────────────────────
+
+# (tenant_id, crm_source) -> version; bumped by the sync engine
+_data_versions: dict[tuple[str, str], int] = {}
+# key -> result
+_result_cache = TTLCache(
+    "sql_results", ttl=SQL_CACHE_TTL, max_entries=SQL_CACHE_MAX_ENTRIES, max_bytes=SQL_CACHE_MAX_BYTES,
+)
+
+
+DATA_VERSION_CHANNEL = "sql_data_version"
+
+
+def bump_data_version(tenant_id: str, crm_source: str) -> None:
+    """Invalidate cached SQL results for a tenant/source after new CRM data lands,
+    here and (via shared-state pub/sub) on every other worker."""
+    _bump(tenant_id, crm_source)
+    get_shared_state().publish_nowait(DATA_VERSION_CHANNEL, {"tenant_id": tenant_id, "crm_source": crm_source})
+
+
+def _bump(tenant_id: str, crm_source: str) -> None:
+    key = (tenant_id, crm_source)
+    _data_versions[key] = _data_versions.get(key, 0) + 1
+
+
+def _on_remote_bump(data: dict) -> None:
+    if data.get("tenant_id") and data.get("crm_source"):
+        _bump(data["tenant_id"], data["crm_source"])
+
+
+subscribe(DATA_VERSION_CHANNEL, _on_remote_bump)
+
+
+def _result_key(tenant_id: str, crm_source: str, sql: str, rep_name_map: Optional[dict]) -> tuple:
+    version = _data_versions.get((tenant_id, crm_source), 0)
+    # Rep-name resolution changes the rows, so the map's contents are part of the key
+    reps = ""
+    if rep_name_map:
+        items = sorted((str(k), str(v)) for k, v in rep_name_map.items())
+        reps = hashlib.sha256(json.dumps(items).encode()).hexdigest()
+    return (tenant_id, crm_source, version, reps, canonical_sql(sql))
+
+
+def _cache_get(key: tuple) -> Optional[dict]:
+    return _result_cache.get(key)
+
+
+def _cache_put(key: tuple, result: dict) -> None:
+    _result_cache.set(key, result)
+
+
+def get_sql_cache_stats() -> dict:
+    return {**_result_cache.stats(), "parse": _parse.cache_info()._asdict()}
+
+
 # ── Execution ─────────────────────────────────────────────────────────────
 
 async def execute_sql(
@@ -210,12 +327,20 @@ async def execute_sql(
         error: str | None,
     }
     """
+    key = _result_key(tenant_id, crm_source, sql, rep_name_map)
+    cached = _cache_get(key)
+    if cached is not None:
+        return {**cached, "rows": list(cached["rows"])}
+
     try:
-        result = supabase.rpc("exec_readonly_sql", {
-            "p_tenant_id": tenant_id,
-            "p_crm_source": crm_source,
-            "p_query": sql,
-        }).execute()
+        # supabase-py is synchronous — keep the event loop free for concurrent tools
+        result = await asyncio.to_thread(
+            lambda: supabase.rpc("exec_readonly_sql", {
+                "p_tenant_id": tenant_id,
+                "p_crm_source": crm_source,
+                "p_query": sql,
+            }).execute()
+        )
 
         rows = result.data if result.data else []
 
@@ -229,12 +354,14 @@ async def execute_sql(
         if rep_name_map and rows:
             rows = _resolve_rep_names_in_rows(rows, rep_name_map)
 
-        return {
+        result = {
             "rows": rows[:MAX_ROWS],
             "row_count": len(rows),
             "truncated": truncated,
             "error": None,
         }
+        _cache_put(key, result)
+        return {**result, "rows": list(result["rows"])}
 
     except Exception as e:
         error_msg = str(e)
@@ -0,0 +1,418 @@
+"""
+App Core — shared state and dependencies for server.py and routers/.
+=====================================================================
+Everything a feature router needs from the application lives here rather
+than in server.py, so routers import it without importing the whole app:
+
+    supabase / crm_manager / telemetry_sink   process-wide clients (DB calls
+                                              instrumented by db_metrics)
+    db_rest_select / _insert / _update        HTTP/1.1 PostgREST helpers
+    get_current_user / require_super_admin    auth dependencies
+    create_access_token / verify_token /      JWT issue, check and revocation
+    is_token_revoked / revoke_token
+    sanitize_html / clamp_* / redact_* /      request helpers
+    now_iso
+    _get_tenant_crm_source / _cleanup_crm_data
+
+Importing this module validates the required environment and builds the
+Supabase client; it pulls in nothing heavier than supabase-py and httpx.
+
+Public surface
+--------------
+    from app_core import supabase, get_current_user, db_rest_select, now_iso
+"""
+
+import asyncio
+import hashlib
+import html
+import logging
+import os
+import re
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+import bcrypt as _bcrypt_lib  # for password hashing upgrade
+import httpx
+import jwt
+from dotenv import load_dotenv
+from fastapi import Header, HTTPException
+from supabase import Client, create_client
+
+from crm_manager import CRMManager
+from db_metrics import instrument_http_client, instrument_supabase
+from shared_state import get_shared_state
+from telemetry import get_sink
+from ttl_cache import TTLCache
+
+# No-op when server.py already loaded it; needed when a script imports this first
+load_dotenv(Path(__file__).parent / '.env')
+
+logger = logging.getLogger(__name__)
+
+# ============ Startup Validation ============
+REQUIRED_ENV = ['SUPABASE_URL', 'SUPABASE_SERVICE_KEY', 'JWT_SECRET']
+_missing_env = [k for k in REQUIRED_ENV if not (os.environ.get(k) or '').strip()]
+if _missing_env:
+    raise RuntimeError(f"Missing required environment variables: {', '.join(_missing_env)}")
+
+# ============ Clients ============
+# Initialize Supabase client (strip to remove any accidental newlines from env vars)
+supabase_url = (os.environ.get('SUPABASE_URL') or '').strip()
+supabase_key = (os.environ.get('SUPABASE_SERVICE_KEY') or '').strip()
+supabase: Client = create_client(supabase_url, supabase_key)
+instrument_supabase(supabase)  # per-request DB call counts / timings (db_metrics.py)
+
+# Buffered writer for token usage, agent traces and event logs
+telemetry_sink = get_sink()
+telemetry_sink.bind(supabase)
+
+# Initialize CRM Manager
+crm_manager = CRMManager(supabase)
+
+# Create HTTP/1.1 client for direct REST API calls (avoids HTTP/2 StreamReset issues)
+_rest_client = httpx.Client(
+    http2=False,
+    timeout=30.0,
+    headers={
+        "apikey": supabase_key,
+        "Authorization": f"Bearer {supabase_key}",
+        "Content-Type": "application/json",
+        "Prefer": "return=representation"
+    }
+)
+instrument_http_client(_rest_client)
+
+# Allowed REST API table names (prevents injection via db_rest_select)
+ALLOWED_REST_TABLES = {
+    'tenants', 'users', 'tenant_configs', 'telegram_bots', 'leads', 'customers',
+    'conversations', 'messages', 'documents', 'event_logs', 'token_usage_logs',
+    'token_blacklist', 'instagram_accounts', 'dashboard_configs',
+    'dashboard_widgets', 'dashboard_chat_messages', 'crm_data_cache',
+    'media_library', 'crm_sync_status',
+}
+
+def _validate_table_name(table: str):
+    """Validate table name against whitelist to prevent injection."""
+    if table not in ALLOWED_REST_TABLES:
+        raise ValueError(f"Invalid table name: {table}")
+
+def _db_rest_select_sync(table: str, query_params: dict = None):
+    """Synchronous REST select — use db_rest_select() in async contexts."""
+    _validate_table_name(table)
+    url = f"{supabase_url}/rest/v1/{table}"
+    params = query_params or {}
+    params["select"] = params.get("select", "*")
+    response = _rest_client.get(url, params=params)
+    response.raise_for_status()
+    return response.json()
+
+def _db_rest_insert_sync(table: str, data: dict):
+    """Synchronous REST insert — use db_rest_insert() in async contexts."""
+    _validate_table_name(table)
+    url = f"{supabase_url}/rest/v1/{table}"
+    response = _rest_client.post(url, json=data)
+    response.raise_for_status()
+    return response.json()
+
+def _db_rest_update_sync(table: str, data: dict, eq_column: str, eq_value: str):
+    """Synchronous REST update — use db_rest_update() in async contexts."""
+    _validate_table_name(table)
+    from urllib.parse import quote
+    url = f"{supabase_url}/rest/v1/{table}?{eq_column}=eq.{quote(str(eq_value), safe='')}"
+    response = _rest_client.patch(url, json=data)
+    response.raise_for_status()
+    return response.json()
+
+async def db_rest_select(table: str, query_params: dict = None):
+    """Non-blocking REST select — runs in thread pool to avoid blocking the event loop."""
+    return await asyncio.to_thread(_db_rest_select_sync, table, query_params)
+
+async def db_rest_insert(table: str, data: dict):
+    """Non-blocking REST insert — runs in thread pool to avoid blocking the event loop."""
+    return await asyncio.to_thread(_db_rest_insert_sync, table, data)
+
+async def db_rest_update(table: str, data: dict, eq_column: str, eq_value: str):
+    """Non-blocking REST update — runs in thread pool to avoid blocking the event loop."""
+    return await asyncio.to_thread(_db_rest_update_sync, table, data, eq_column, eq_value)
+
+# ============ Configuration ============
+# Strip env vars to remove accidental newlines
+SENDER_EMAIL = (os.environ.get('SENDER_EMAIL') or 'noreply@leadrelay.net').strip()
+FRONTEND_URL = (os.environ.get('FRONTEND_URL') or 'https://leadrelay.net').strip()
+BACKEND_PUBLIC_URL = (os.environ.get('BACKEND_PUBLIC_URL') or os.environ.get('RENDER_EXTERNAL_URL') or '').strip()
+if not BACKEND_PUBLIC_URL:
+    logger.warning("BACKEND_PUBLIC_URL not set — webhook URLs will default to localhost (set BACKEND_PUBLIC_URL for production)")
+
+JWT_SECRET = (os.environ.get('JWT_SECRET') or '').strip()
+if not JWT_SECRET:
+    raise RuntimeError("JWT_SECRET environment variable is required")
+JWT_ALGORITHM = "HS256"
+JWT_EXPIRATION_HOURS = 24
+
+# Super-admin user IDs (comma-separated in env, e.g. "uuid1,uuid2")
+SUPER_ADMIN_IDS = set(
+    uid.strip() for uid in (os.environ.get('SUPER_ADMIN_IDS') or '').split(',') if uid.strip()
+)
+
+def require_super_admin(current_user: Dict):
+    """Raise 403 if the user is not a platform super-admin."""
+    user_id = current_user.get("user_id", "")
+    if not SUPER_ADMIN_IDS:
+        raise HTTPException(status_code=403, detail="No platform administrators configured")
+    if user_id not in SUPER_ADMIN_IDS:
+        raise HTTPException(status_code=403, detail="Platform administrator access required")
+
+# ============ Input Sanitization ============
+def sanitize_html(text: str) -> str:
+    """Remove HTML tags and escape special characters to prevent XSS attacks."""
+    if not text or not isinstance(text, str):
+        return text
+    # Remove script tags and their contents
+    text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.IGNORECASE | re.DOTALL)
+    # Remove style tags and their contents
+    text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.IGNORECASE | re.DOTALL)
+    # Remove all HTML tags
+    text = re.sub(r'<[^>]+>', '', text)
+    # Escape HTML entities
+    text = html.escape(text)
+    return text.strip()
+
+def sanitize_dict(data: dict, fields_to_sanitize: list) -> dict:
+    """Sanitize specific string fields in a dictionary."""
+    sanitized = data.copy()
+    for field in fields_to_sanitize:
+        if field in sanitized and isinstance(sanitized[field], str):
+            sanitized[field] = sanitize_html(sanitized[field])
+    return sanitized
+
+# Fields that should be sanitized before storage
+SANITIZE_FIELDS = [
+    'business_name', 'business_description', 'products_services',
+    'faq_objections', 'greeting_message', 'closing_message', 'name'
+]
+
+# ============ Query Parameter Clamping ============
+def clamp_limit(limit: int, default: int = 50, maximum: int = 500) -> int:
+    """Clamp a limit parameter to a safe range [1, maximum]."""
+    return min(max(1, limit), maximum)
+
+def clamp_days(days: int, default: int = 7, maximum: int = 365) -> int:
+    """Clamp a days parameter to a safe range [1, maximum]."""
+    return min(max(1, days), maximum)
+
+def clamp_page(page: int) -> int:
+    """Clamp page number to minimum 1."""
+    return max(1, page)
+
+def clamp_offset(offset: int) -> int:
+    """Clamp offset to minimum 0."""
+    return max(0, offset)
+
+# ============ Auth Helpers ============
+def validate_password_strength(password: str) -> None:
+    """Enforce minimum password complexity requirements."""
+    if len(password) < 8:
+        raise HTTPException(status_code=400, detail="Password must be at least 8 characters.")
+    if not any(c.isupper() for c in password):
+        raise HTTPException(status_code=400, detail="Password must contain at least one uppercase letter.")
+    if not any(c.islower() for c in password):
+        raise HTTPException(status_code=400, detail="Password must contain at least one lowercase letter.")
+    if not any(c.isdigit() for c in password):
+        raise HTTPException(status_code=400, detail="Password must contain at least one number.")
+
+def hash_password(password: str) -> str:
+    """Hash password using bcrypt."""
+    return _bcrypt_lib.hashpw(password.encode(), _bcrypt_lib.gensalt()).decode()
+
+def verify_password(password: str, stored_hash: str) -> bool:
+    """Verify password against stored hash (supports bcrypt and legacy SHA256)."""
+    try:
+        if stored_hash.startswith('$2b$'):
+            return _bcrypt_lib.checkpw(password.encode(), stored_hash.encode())
+        # Legacy SHA256 format: salt:hash
+        if ':' in stored_hash:
+            salt, hash_value = stored_hash.split(":", 1)
+            return hashlib.sha256(f"{salt}{password}".encode()).hexdigest() == hash_value
+        return False
+    except Exception:
+        return False
+
+def _needs_password_rehash(stored_hash: str) -> bool:
+    """Check if hash needs upgrade to bcrypt."""
+    return not stored_hash.startswith('$2b$')
+
+def create_access_token(user_id: str, tenant_id: str, email: str) -> str:
+    expiration = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+    jti = secrets.token_hex(16)
+    # Use int for exp claim per RFC 7519 (NumericDate must be integer seconds)
+    return jwt.encode({"user_id": user_id, "tenant_id": tenant_id, "email": email, "jti": jti, "exp": int(expiration.timestamp())}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+# In-memory token blacklist: {jti: expiry_timestamp} (supplemented by DB for persistence).
+# Never evicted early — dropping an entry would un-revoke the token. With a
+# distributed shared-state backend, revocations by other workers are read
+# from the revoked_jwt:{jti} keys and mirrored here.
+_token_blacklist: dict = {}
+
+
+async def is_token_revoked(jti: str) -> bool:
+    if jti in _token_blacklist:
+        return True
+    state = get_shared_state()
+    if state.distributed and await state.exists(f"revoked_jwt:{jti}"):
+        _token_blacklist[jti] = time.time() + JWT_EXPIRATION_HOURS * 3600
+        return True
+    return False
+
+
+async def revoke_token(jti: str, exp_timestamp: float) -> None:
+    _token_blacklist[jti] = exp_timestamp
+    await get_shared_state().set(f"revoked_jwt:{jti}", "1", ttl=max(1.0, exp_timestamp - time.time()))
+
+def verify_token(token: str) -> Optional[Dict]:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        # Check if token has been revoked
+        jti = payload.get("jti")
+        if jti and jti in _token_blacklist:
+            return None
+        return payload
+    except Exception:
+        return None
+
+def generate_confirmation_token() -> str:
+    return secrets.token_urlsafe(32)
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ============ PII Redaction Helpers ============
+def redact_email(email: str) -> str:
+    if not email or '@' not in email:
+        return '***'
+    local, domain = email.split('@', 1)
+    return f"{local[:2]}***@{domain}"
+
+def redact_id(value: str) -> str:
+    if not value:
+        return '***'
+    return f"{str(value)[:8]}***"
+
+
+# ============ Auth Middleware ============
+# Lightweight cache: user_id present = user still existed in the DB within the TTL.
+_USER_EXISTS_TTL = 60  # seconds
+_user_exists_cache = TTLCache("user_exists", ttl=_USER_EXISTS_TTL, max_entries=50_000)
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict:
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+    try:
+        scheme, token = authorization.split()
+        if scheme.lower() != "bearer":
+            raise HTTPException(status_code=401, detail="Invalid authentication scheme")
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+
+    token_data = verify_token(token)
+    if not token_data:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    jti = token_data.get("jti")
+    if jti and await is_token_revoked(jti):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    # Verify user still exists in DB (cached for 60s to avoid hammering)
+    user_id = token_data.get("user_id")
+    if user_id:
+        if user_id not in _user_exists_cache:
+            try:
+                rows = await db_rest_select('users', {'id': f'eq.{user_id}', 'select': 'id'})
+                if not rows:
+                    raise HTTPException(status_code=401, detail="User account no longer exists")
+                _user_exists_cache.set(user_id, True)
+            except HTTPException:
+                raise
+            except Exception as e:
+                # On DB error, allow request through (fail-open) but log it
+                logger.warning(f"User existence check failed (allowing request): {e}")
+
+    return token_data
+
+
+# Helper function to execute Supabase operations with retry
+def db_execute_with_retry(operation, max_retries=3):
+    """Execute a Supabase operation with retry logic for connection issues."""
+    import time
+    last_error = None
+    for attempt in range(max_retries):
+        try:
+            return operation()
+        except Exception as e:
+            last_error = e
+            error_str = str(e).lower()
+            # Retry on connection errors
+            if 'streamreset' in error_str or 'connection' in error_str or 'timeout' in error_str:
+                if attempt < max_retries - 1:
+                    time.sleep(0.5 * (attempt + 1))  # Exponential backoff
+                    continue
+            raise
+    raise last_error
+
+
+# ============ Tenant CRM Helpers ============
+async def _get_tenant_crm_source(supabase, tenant_id: str) -> Optional[str]:
+    """Get the primary CRM source for a tenant from active connections."""
+    try:
+        result = (
+            supabase.table("crm_connections")
+            .select("crm_type")
+            .eq("tenant_id", tenant_id)
+            .eq("is_active", True)
+            .limit(1)
+            .execute()
+        )
+        if result.data:
+            return result.data[0]["crm_type"]
+    except Exception as e:
+        logger.warning(f"Failed to get CRM source for tenant {tenant_id}: {e}")
+    return None
+
+
+async def _cleanup_crm_data(tenant_id: str, crm_source: str = None):
+    """Delete all CRM synced data and dashboard config for a tenant.
+    If crm_source is provided, only delete data for that CRM type."""
+    # Tables that have crm_source column — can be filtered per-CRM
+    crm_tables = [
+        'crm_leads', 'crm_deals', 'crm_contacts', 'crm_companies', 'crm_activities',
+        'crm_sync_status', 'crm_users', 'crm_field_registry',
+        # Revenue / metric tables (Phase 2)
+        'tenant_metrics', 'tenant_alert_rules',
+        'revenue_models', 'revenue_snapshots', 'revenue_alerts',
+    ]
+    # Tables keyed only by tenant_id (no crm_source) — always fully cleaned
+    tenant_only_tables = [
+        'dashboard_widgets', 'dashboard_chat_messages', 'dashboard_configs',
+        'agent_traces', 'data_access_logs', 'crm_analytics_context',
+    ]
+
+    for table in crm_tables:
+        try:
+            q = supabase.table(table).delete().eq('tenant_id', tenant_id)
+            if crm_source:
+                q = q.eq('crm_source', crm_source)
+            q.execute()
+        except Exception as e:
+            logger.warning(f"Could not clean {table} for tenant {tenant_id}: {e}")
+
+    # Only clean tenant-only tables on full wipe (no crm_source filter)
+    if not crm_source:
+        for table in tenant_only_tables:
+            try:
+                supabase.table(table).delete().eq('tenant_id', tenant_id).execute()
+            except Exception as e:
+                logger.warning(f"Could not clean {table} for tenant {tenant_id}: {e}")
+
+    logger.info(f"CRM data cleanup complete for tenant {tenant_id} (crm_source={crm_source})")
@@ -0,0 +1,19 @@
+"""
+Performance benchmarks for the revenue / analytics compute modules.
+===================================================================
+Runs every compute entry point (metric catalog, snapshots, alerts, dynamic
+metrics, correlations, CRM context, chart queries) against a deterministic
+synthetic CRM at 1k / 10k / 100k / 1m deals and activities, and records
+time, peak memory, query count and rows read per entry point against a
+saved baseline.
+
+    synthetic_crm   the dataset generator
+    sqlite_backend  PostgREST subset over SQLite (schema from migrations/)
+    cases           one Case per entry point
+    runner          measurement, dataset cache, baseline comparison
+
+Usage (from backend/):
+    python -m benchmarks --size 10k
+    python -m benchmarks --size 1k 10k --compare
+    python -m benchmarks --size 100k --case compute_snapshot --save-baseline
+"""
@@ -0,0 +1,126 @@
+"""Benchmark the analytics entry points and compare with (or save) the per-size baseline.
+
+Usage (from backend/):
+    python -m benchmarks --size 10k
+    python -m benchmarks --size 1k 10k 100k --compare
+    python -m benchmarks --size 1m --repeat 1 --case crm_context --case correlations
+    python -m benchmarks --size 10k --max-rows 1000       # hosted Supabase row cap
+    python -m benchmarks --size 10k --supabase-url http://127.0.0.1:54321 --supabase-key <service key>
+
+Datasets are built once per size / seed / day and cached (BENCHMARK_CACHE_DIR,
+default <tmp>/crm-benchmarks); 1m takes ~4 minutes and ~1.8 GB of disk.
+--supabase-url runs against a real PostgREST (e.g. a local Supabase stack with
+the migrations applied) and loads the dataset into it first unless --no-load.
+Baselines are machine-specific: record them on the machine that compares.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from supabase import create_client  # noqa: E402
+
+from benchmarks.cases import select_cases  # noqa: E402
+from benchmarks.runner import (  # noqa: E402
+    BASELINE_DIR, BENCHMARK_KEY, compare, dataset_path, load_baseline, load_dataset, run, save_baseline,
+)
+from benchmarks.sqlite_backend import SqliteBackend  # noqa: E402
+from benchmarks.synthetic_crm import SIZES  # noqa: E402
+
+# settings that change the numbers; a baseline is only comparable when they match
+CONFIG_KEYS = ("seed", "repeat", "warmup", "max_rows", "supabase_url")
+
+
+def _summary(report):
+    lines = [f"size {report['size']}: {len(report['cases'])} cases, {report['total_seconds']}s total"]
+    lines.append(f"  {'case':<52} {'ms':>9} {'db ms':>9} {'queries':>8} {'rows':>9} {'KB read':>9} {'peak KB':>10}")
+    for name, r in report["cases"].items():
+        if "error" in r:
+            lines.append(f"  {name:<52} ERROR {r['error']}")
+            continue
+        lines.append(
+            f"  {name:<52} {r['seconds'] * 1000:>9.1f} {r['db_seconds'] * 1000:>9.1f} {r['queries']:>8}"
+            f" {r['rows_read']:>9} {r['kb_read']:>9.1f} {r['peak_kb']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def _run_size(args, size):
+    cases = select_cases(args.case)
+    if args.supabase_url:
+        supabase = create_client(args.supabase_url, args.supabase_key or BENCHMARK_KEY)
+        if not args.no_load:
+            load_dataset(supabase, size, seed=args.seed)
+        return asyncio.run(run(supabase, size, cases, repeat=args.repeat, warmup=args.warmup))
+
+    source = dataset_path(size, seed=args.seed, cache_dir=args.cache_dir)
+    with tempfile.TemporaryDirectory() as scratch:
+        working = Path(scratch) / source.name
+        shutil.copyfile(source, working)
+        with SqliteBackend(working, max_rows=args.max_rows) as backend:
+            supabase = create_client(backend.url, BENCHMARK_KEY)
+            return asyncio.run(run(supabase, size, cases, repeat=args.repeat, warmup=args.warmup))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", nargs="+", choices=list(SIZES), default=["10k"])
+    parser.add_argument("--case", action="append", help="only cases whose name contains this (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per case (median reported)")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-rows", type=int, help="cap rows per read like PostgREST db-max-rows")
+    parser.add_argument("--cache-dir", type=Path, help="where generated datasets are kept")
+    parser.add_argument("--supabase-url", help="real PostgREST / Supabase instead of the SQLite backend")
+    parser.add_argument("--supabase-key", help="service key for --supabase-url")
+    parser.add_argument("--no-load", action="store_true", help="with --supabase-url: dataset already loaded")
+    parser.add_argument("--baseline-dir", type=Path, default=BASELINE_DIR)
+    parser.add_argument("--compare", action="store_true", help="exit 1 on a regression against the baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed growth of rows read / peak memory")
+    parser.add_argument("--time-tolerance", type=float, default=1.0, help="allowed growth of the fastest call")
+    parser.add_argument("--json", type=Path, help="also write the full reports here")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR, format="%(levelname)s %(name)s: %(message)s")
+    logging.getLogger("benchmarks").setLevel(logging.INFO)
+
+    reports, failed = [], False
+    for size in args.size:
+        report = _run_size(args, size)
+        report["config"] = {k: getattr(args, k) for k in CONFIG_KEYS}
+        reports.append(report)
+        print(_summary(report))
+
+        path = args.baseline_dir / f"{size}.json"
+        if args.save_baseline:
+            baseline = load_baseline(path) if args.case else None
+            if baseline is not None:  # a partial run only replaces its own cases
+                baseline["cases"].update(report["cases"])
+                report = {**baseline, "config": report["config"]}
+            save_baseline(report, path)
+            print(f"\nbaseline saved to {path}\n")
+            continue
+        baseline = load_baseline(path)
+        if baseline is None:
+            print(f"\nno baseline at {path} (run with --save-baseline)\n")
+            continue
+        if baseline.get("config") != report["config"]:
+            print("\nnote: baseline was recorded with different settings")
+        regressions = compare(report, baseline, args.tolerance, args.time_tolerance)
+        print(f"\nagainst {path}: " + ("\n  ".join(["", *regressions]) if regressions else "no regressions") + "\n")
+        failed = failed or bool(regressions)
+
+    if args.json:
+        args.json.write_text(json.dumps(reports, indent=2, sort_keys=True) + "\n")
+    if failed and args.compare:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark cases — one per analytics compute entry point.
+========================================================
+Each Case calls a public entry point for the synthetic tenant the way its
+router / job does. `prepare` runs first, outside the measurement (inputs
+that come from an earlier step, like the metric results alert rules are
+evaluated against); `run` is what gets timed and traced.
+
+    revenue.metric_catalog   get_catalog_with_trust, compute_metric (x12)
+    revenue.compute          compute_alerts, compute_snapshot, compute_snapshots
+    revenue.alerts           evaluate_alert_rules, compute_adhoc_health_check
+    revenue.dynamic_compute  compute_tenant_snapshot (fused),
+                             compute_metric (per recipe, every tenant metric)
+    agents.correlations      compute_correlations
+    agents.crm_context       compute_crm_context
+    agents.anvar             execute_chart_query (five dashboard charts)
+
+Public surface
+--------------
+    CASES                     [Case(name, run, prepare)]
+    select_cases(patterns)    cases whose name contains any pattern
+"""
+
+from __future__ import annotations
+
+import warnings
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from agents import ChartConfig
+from agents.anvar import execute_chart_query
+from agents.correlations import compute_correlations
+from agents.crm_context import compute_crm_context
+from benchmarks.synthetic_crm import CRM_SOURCE, TENANT_ID, TENANT_METRICS
+from revenue import dynamic_compute, metric_catalog
+from revenue.alerts import compute_adhoc_health_check, evaluate_alert_rules
+from revenue.compute import compute_alerts, compute_snapshot, compute_snapshots
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[Any, Any], Awaitable[Any]]                  # (supabase, prepared) -> result
+    prepare: Optional[Callable[[Any], Awaitable[Any]]] = None  # (supabase) -> prepared
+
+
+def _deprecated_ok(fn):
+    """The legacy metric_catalog entry points warn on every call; benchmarks still cover them."""
+    async def call(*args, **kwargs):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return await fn(*args, **kwargs)
+    return call
+
+
+async def _catalog(sb, _):
+    return await _deprecated_ok(metric_catalog.get_catalog_with_trust)(sb, TENANT_ID, CRM_SOURCE)
+
+
+def _catalog_metric(key: str) -> Case:
+    async def run(sb, _):
+        compute = _deprecated_ok(metric_catalog.compute_metric)
+        return await compute(key, sb, TENANT_ID, CRM_SOURCE, time_range_days=90)
+    return Case(f"metric_catalog.compute_metric[{key}]", run)
+
+
+async def _alerts(sb, _):
+    return await compute_alerts(sb, TENANT_ID, CRM_SOURCE, "30d")
+
+
+async def _snapshot(sb, _):
+    return await compute_snapshot(sb, TENANT_ID, CRM_SOURCE, "30d")
+
+
+async def _snapshots(sb, _):
+    return await compute_snapshots(sb, TENANT_ID, CRM_SOURCE)
+
+
+async def _tenant_snapshot(sb, _):
+    return await dynamic_compute.compute_tenant_snapshot(sb, TENANT_ID, CRM_SOURCE, timeframe_days=30)
+
+
+async def _recipes(sb, _):
+    return [await dynamic_compute.compute_metric(sb, TENANT_ID, CRM_SOURCE, dict(metric_def), timeframe_days=30)
+            for metric_def in TENANT_METRICS]
+
+
+async def _rules(sb, metric_results):
+    return await evaluate_alert_rules(sb, TENANT_ID, CRM_SOURCE, metric_results)
+
+
+async def _health_check(sb, _):
+    return await compute_adhoc_health_check(sb, TENANT_ID, CRM_SOURCE)
+
+
+async def _correlations(sb, _):
+    return await compute_correlations(sb, TENANT_ID, CRM_SOURCE)
+
+
+async def _crm_context(sb, _):
+    return await compute_crm_context(sb, TENANT_ID, CRM_SOURCE)
+
+
+CHARTS = (
+    {"chart_type": "bar", "title": "Deals by stage", "data_source": "crm_deals", "x_field": "stage"},
+    {"chart_type": "bar", "title": "Won value by rep", "data_source": "crm_deals", "x_field": "assigned_to",
+     "y_field": "value", "aggregation": "sum", "filter_field": "won", "filter_value": "true",
+     "time_range_days": 365},
+    {"chart_type": "line", "title": "New deals", "data_source": "crm_deals", "x_field": "created_at",
+     "time_range_days": 90},
+    {"chart_type": "pie", "title": "Activities by type", "data_source": "crm_activities", "x_field": "type"},
+    {"chart_type": "bar", "title": "Leads by source", "data_source": "crm_leads", "x_field": "source",
+     "time_range_days": 30},
+)
+
+
+async def _charts(sb, _):
+    return [await execute_chart_query(sb, TENANT_ID, CRM_SOURCE, ChartConfig(**chart)) for chart in CHARTS]
+
+
+CASES: list[Case] = [
+    Case("metric_catalog.get_catalog_with_trust", _catalog),
+    *(_catalog_metric(key) for key in metric_catalog.METRIC_CATALOG),
+    Case("compute.compute_alerts", _alerts),
+    Case("compute.compute_snapshot", _snapshot),
+    Case("compute.compute_snapshots", _snapshots),
+    Case("alerts.evaluate_alert_rules", _rules, prepare=lambda sb: _tenant_snapshot(sb, None)),
+    Case("alerts.compute_adhoc_health_check", _health_check),
+    Case("dynamic_compute.compute_tenant_snapshot", _tenant_snapshot),
+    Case("dynamic_compute.compute_metric", _recipes),
+    Case("correlations.compute_correlations", _correlations),
+    Case("crm_context.compute_crm_context", _crm_context),
+    Case("anvar.execute_chart_query", _charts),
+]
+
+
+def select_cases(patterns: Optional[list[str]] = None) -> list[Case]:
+    if not patterns:
+        return list(CASES)
+    return [case for case in CASES if any(p in case.name for p in patterns)]
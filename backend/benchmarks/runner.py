@@ -0,0 +1,248 @@
+"""
+Benchmark runner — times every case against one dataset size.
+==============================================================
+Per case, after a warm-up call (lazy imports, SQLite page cache):
+
+    seconds        median wall time of `repeat` calls (min_seconds too)
+    db_seconds     time spent waiting on the backend, from db_metrics
+    queries        PostgREST round trips (db_metrics scope), of which
+    blocking       ran on the event loop thread rather than in to_thread,
+    max_repeats    and the most often one query shape was issued
+    rows_read      rows the backend returned (Content-Range) and
+    kb_read        response bytes — flat while a limit() cap is hit
+    peak_kb        tracemalloc peak of one extra call, run separately so
+                   tracing overhead does not inflate the timings
+
+Module caches (ttl_cache registry) are cleared before every call, so each
+one computes from scratch. The supabase-py client is a real one pointed at
+the benchmark backend; the built-in backend serves a per-run copy of the
+cached dataset, so snapshot / alert writes never leak into the next run.
+
+Public surface
+--------------
+    path = dataset_path("10k", seed=0, cache_dir=None)   # build + cache
+    load_dataset(supabase, "10k")                        # into a real PostgREST
+    report = await run(supabase, size, cases, repeat=3, warmup=1)
+    regressions = compare(report, baseline, tolerance=0.25, time_tolerance=1.0)
+    save_baseline(report, path) / load_baseline(path)
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+import db_metrics
+import ttl_cache
+from benchmarks.cases import Case
+from benchmarks.sqlite_backend import build_database
+from benchmarks.synthetic_crm import TENANT_ID, default_now, generate
+
+logger = logging.getLogger(__name__)
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+CACHE_DIR = Path(os.environ.get("BENCHMARK_CACHE_DIR") or Path(tempfile.gettempdir()) / "crm-benchmarks")
+# supabase-py only checks the shape of the key
+BENCHMARK_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.benchmark"
+
+# metric -> (which tolerance applies, absolute slack); a case regresses when
+# new > old * (1 + tolerance) + slack. Query counts must not grow at all and
+# rows / memory are near-deterministic, so they get the tight tolerance; time
+# is judged on the fastest repeat with its own, looser one, since wall clock
+# on a shared machine drifts by tens of percent between runs.
+COMPARED = {
+    "min_seconds": ("time", 0.005),
+    "peak_kb": ("size", 256.0),
+    "queries": ("exact", 0.0),
+    "rows_read": ("size", 0.0),
+}
+
+
+# ---------------------------------------------------------------------------
+# Dataset cache
+# ---------------------------------------------------------------------------
+
+def dataset_path(size: str, seed: int = 0, cache_dir: Optional[Path] = None) -> Path:
+    """SQLite file holding generate(size, seed) for today; built on first use, older days removed."""
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    now = default_now()
+    path = cache_dir / f"crm-{size}-seed{seed}-{now:%Y%m%d}.sqlite"
+    if path.exists():
+        return path
+    for stale in cache_dir.glob(f"crm-{size}-seed{seed}-*.sqlite"):
+        stale.unlink()
+    building = path.with_suffix(".building")
+    building.unlink(missing_ok=True)
+    started = time.perf_counter()
+    counts = build_database(building, generate(size, seed=seed, now=now))
+    building.rename(path)
+    logger.info(f"Built {size} dataset in {time.perf_counter() - started:.1f}s: {counts}")
+    return path
+
+
+def load_dataset(supabase, size: str, seed: int = 0) -> dict[str, int]:
+    """Upsert generate(size, seed) into a real PostgREST (local Supabase with the migrations applied)."""
+    try:
+        supabase.table("tenants").upsert({"id": TENANT_ID, "name": "Benchmark tenant"}).execute()
+    except Exception as e:
+        logger.warning(f"Could not create the benchmark tenant row ({e}); CRM rows reference tenants(id)")
+    counts: dict[str, int] = {}
+    for table, rows in generate(size, seed=seed):
+        supabase.table(table).upsert(rows).execute()
+        counts[table] = counts.get(table, 0) + len(rows)
+    return counts
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+class MeteredTransport(httpx.BaseTransport):
+    """Counts rows (from Content-Range) and bytes the backend returns."""
+
+    def __init__(self, inner: httpx.BaseTransport):
+        self.inner = inner
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.rows = 0
+        self.bytes = 0
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self.inner.handle_request(request)
+        body = b"".join(response.stream)
+        response.close()
+        span = response.headers.get("content-range", "*").split("/")[0]
+        rows = 0
+        if "-" in span:
+            first, last = span.split("-")
+            rows = int(last) - int(first) + 1
+        with self._lock:
+            self.rows += rows
+            self.bytes += len(body)
+        return httpx.Response(response.status_code, headers=response.headers, stream=httpx.ByteStream(body),
+                              extensions=response.extensions)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+def meter(supabase) -> MeteredTransport:
+    """Instrument supabase's PostgREST session (db_metrics) with a MeteredTransport under it."""
+    db_metrics.instrument_supabase(supabase)
+    instrumented = supabase.postgrest.session._transport
+    if not isinstance(instrumented.inner, MeteredTransport):
+        instrumented.inner = MeteredTransport(instrumented.inner)
+    return instrumented.inner
+
+
+def clear_caches() -> None:
+    for name in ttl_cache.all_cache_stats():
+        cache = ttl_cache.get_cache(name)
+        if cache is not None:
+            cache.clear()
+
+
+async def measure(case: Case, supabase, metered: MeteredTransport, repeat: int = 3, warmup: int = 1) -> dict:
+    prepared = await case.prepare(supabase) if case.prepare else None
+    for _ in range(warmup):
+        clear_caches()
+        await case.run(supabase, prepared)
+
+    timings, scopes = [], []
+    for _ in range(repeat):
+        clear_caches()
+        metered.reset()
+        with db_metrics.db_scope(f"bench:{case.name}", repeat_threshold=None) as scope:
+            started = time.perf_counter()
+            await case.run(supabase, prepared)
+            timings.append(time.perf_counter() - started)
+        scopes.append(scope)
+    rows, read = metered.rows, metered.bytes
+
+    clear_caches()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await case.run(supabase, prepared)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    scope = scopes[-1]
+    return {
+        "seconds": round(statistics.median(timings), 4),
+        "min_seconds": round(min(timings), 4),
+        "db_seconds": round(statistics.median(s.total_seconds for s in scopes), 4),
+        "queries": scope.call_count,
+        "blocking": scope.blocking_calls,
+        "max_repeats": max(scope.shapes.values(), default=0),
+        "rows_read": rows,
+        "kb_read": round(read / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+async def run(supabase, size: str, cases: list[Case], repeat: int = 3, warmup: int = 1) -> dict:
+    """Measure each case in order; a case that raises is reported with its error and skipped."""
+    metered = meter(supabase)
+    results: dict[str, dict] = {}
+    for case in cases:
+        try:
+            results[case.name] = await measure(case, supabase, metered, repeat=repeat, warmup=warmup)
+        except Exception as e:
+            logger.exception(f"Benchmark {case.name} failed")
+            results[case.name] = {"error": f"{type(e).__name__}: {e}"}
+    return {
+        "size": size,
+        "repeat": repeat,
+        "cases": results,
+        "total_seconds": round(sum(r.get("seconds", 0.0) for r in results.values()), 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Baselines
+# ---------------------------------------------------------------------------
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.25, time_tolerance: float = 1.0) -> list[str]:
+    """Per-case regressions of report against baseline; cases missing from either side are skipped."""
+    tolerances = {"time": time_tolerance, "size": tolerance, "exact": 0.0}
+    regressions = []
+    for name, old in baseline.get("cases", {}).items():
+        new = report.get("cases", {}).get(name)
+        if new is None:
+            continue
+        if "error" in new and "error" not in old:
+            regressions.append(f"{name}: {new['error']}")
+            continue
+        for metric, (kind, slack) in COMPARED.items():
+            if not isinstance(new.get(metric), (int, float)) or not isinstance(old.get(metric), (int, float)):
+                continue
+            if new[metric] > old[metric] * (1 + tolerances[kind]) + slack:
+                regressions.append(f"{name} {metric}: {old[metric]} -> {new[metric]}")
+    return regressions
+
+
+def save_baseline(report: dict, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+
+
+def load_baseline(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,475 @@
+"""
+SQLite-backed PostgREST subset for the analytics benchmarks.
+============================================================
+The compute modules talk to Supabase through supabase-py, so the benchmark
+backend speaks the same HTTP: a PostgREST subset over a SQLite database,
+served from a child process (loadtest.fakes.FakeProcess) so that the app
+side's time and tracemalloc peak are not mixed up with the database's.
+
+Tables, column types, defaults and indexes are read from migrations/*.sql,
+so the benchmark schema cannot drift from the real one. Supported:
+
+    GET/HEAD /rest/v1/<table>   select=<columns>, eq/neq/gt/gte/lt/lte/in/is/
+                                like/ilike (and not.*), order (with
+                                nullsfirst/nullslast), limit/offset,
+                                Prefer: count=exact|planned|estimated,
+                                single-object Accept
+    POST / PATCH / DELETE       insert, upsert (on_conflict + resolution=...),
+                                update, delete; return=representation|minimal
+    POST /rest/v1/rpc/exec_readonly_sql
+                                the fused-metric / batched-count SQL, with
+                                Postgres casts rewritten for SQLite and the
+                                CRM tables shadowed by tenant-scoped CTEs
+                                (what the RLS policies in migration 016 do)
+
+max_rows mimics PostgREST's db-max-rows (1000 on hosted Supabase by
+default): every read is capped at that many rows whatever limit() asked.
+Booleans are stored as 0/1 and JSON/array columns as text; both are
+converted back in responses.
+
+Public surface
+--------------
+    schema = load_schema()                       # {table: {column: Column}}
+    build_database(path, generate("10k"))        # (table, rows) batches
+    sql = translate_sql(postgres_sql)
+    with SqliteBackend(path, max_rows=None) as db:
+        db.url                                   # SUPABASE_URL for create_client
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import re
+import sqlite3
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Optional
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from loadtest.fakes import FakeProcess, HttpFake, _json
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+# Tables exec_readonly_sql scopes to the caller's tenant (RLS policies, migration 016)
+SCOPED_TABLES = ("crm_deals", "crm_leads", "crm_contacts", "crm_companies", "crm_activities", "crm_users")
+
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+_WRITE_SQL = re.compile(r"\b(INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|CREATE|GRANT|REVOKE|MERGE|ATTACH|PRAGMA)\b", re.I)
+_OPS = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+# ---------------------------------------------------------------------------
+# Schema from migrations
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Column:
+    kind: str                 # text | real | integer | boolean | json | timestamp
+    default: Any = None       # python value, or "uuid" / "now" markers
+    key: str = ""             # "PRIMARY KEY" / "UNIQUE" when declared inline
+
+    @property
+    def sqlite_type(self) -> str:
+        return {"real": "REAL", "integer": "INTEGER", "boolean": "INTEGER"}.get(self.kind, "TEXT")
+
+
+_TYPE_KINDS = (
+    (re.compile(r"^(UUID|TEXT|VARCHAR|CHAR)\b(?!\[)", re.I), "text"),
+    (re.compile(r"^(NUMERIC|DECIMAL|FLOAT|REAL|DOUBLE)\b", re.I), "real"),
+    (re.compile(r"^(INTEGER|INT|BIGINT|SMALLINT|SERIAL|BIGSERIAL)\b", re.I), "integer"),
+    (re.compile(r"^BOOLEAN\b", re.I), "boolean"),
+    (re.compile(r"^(JSONB?|TEXT\[\]|UUID\[\])", re.I), "json"),
+    (re.compile(r"^(TIMESTAMPTZ|TIMESTAMP|DATE)\b", re.I), "timestamp"),
+)
+_COLUMN = re.compile(r"^\s*(\w+)\s+([A-Za-z]+(?:\[\])?(?:\s*\([\d,\s]+\))?(?:\s+PRECISION)?)(.*)$")
+_DEFAULT = re.compile(r"\bDEFAULT\s+('(?:[^']|'')*'(?:::\w+(?:\[\])?)?|[\w.]+\(\)|[-\w.]+)", re.I)
+_INLINE_KEY = re.compile(r"\b(PRIMARY KEY|UNIQUE)\b", re.I)
+_TABLE_KEY = re.compile(r"^\s*(PRIMARY KEY|UNIQUE)\s*\(([^)]*)\)", re.I)
+_TABLE = re.compile(r"CREATE TABLE (?:IF NOT EXISTS )?(\w+)\s*\((.*?)\n\);", re.S | re.I)
+_INDEX = re.compile(
+    r"CREATE (UNIQUE )?INDEX (?:IF NOT EXISTS )?(\w+)\s+ON (\w+)\s*(?:USING \w+\s*)?\(([^;]*?)\)\s*(WHERE [^;]*)?;",
+    re.S | re.I,
+)
+
+
+def _parse_default(raw: str, kind: str, array: bool) -> Any:
+    if re.search(r"uuid_generate_v4|gen_random_uuid", raw, re.I):
+        return "uuid"
+    if raw.upper() in ("NOW()", "CURRENT_TIMESTAMP"):
+        return "now"
+    if raw.upper() in ("TRUE", "FALSE"):
+        return raw.upper() == "TRUE"
+    if raw.upper() == "NULL":
+        return None
+    if raw.startswith("'"):
+        text = raw[1:raw.rindex("'")].replace("''", "'")
+        if array:
+            return [v for v in text.strip("{}").split(",") if v]
+        if kind == "json":
+            return json.loads(text)
+        return text
+    try:
+        return int(raw) if kind == "integer" else float(raw)
+    except ValueError:
+        return None
+
+
+def _kind(sql_type: str) -> Optional[str]:
+    for pattern, kind in _TYPE_KINDS:
+        if pattern.match(sql_type):
+            return kind
+    return None
+
+
+@lru_cache(maxsize=1)
+def _migrations() -> str:
+    return "\n".join(p.read_text() for p in sorted(MIGRATIONS_DIR.glob("*.sql")))
+
+
+def load_schema() -> dict[str, dict[str, Column]]:
+    """Every CREATE TABLE in migrations/, as {table: {column: Column}}."""
+    schema: dict[str, dict[str, Column]] = {}
+    for table, body in _TABLE.findall(_migrations()):
+        columns = {}
+        for line in body.splitlines():
+            line = line.split("--", 1)[0].rstrip().rstrip(",")
+            match = _COLUMN.match(line)
+            if not match or match.group(1).upper() in ("CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN"):
+                continue
+            name, sql_type, rest = match.groups()
+            kind = _kind(sql_type)
+            if kind is None:
+                continue
+            default = _DEFAULT.search(rest)
+            value = _parse_default(default.group(1), kind, sql_type.endswith("[]")) if default else None
+            key = _INLINE_KEY.search(rest)
+            columns[name] = Column(kind, value, key.group(1).upper() if key else "")
+        schema[table] = columns
+    return schema
+
+
+def _table_keys() -> dict[str, list[str]]:
+    """Table-level PRIMARY KEY (...) / UNIQUE (...) constraints, as SQLite clauses per table."""
+    keys: dict[str, list[str]] = {}
+    for table, body in _TABLE.findall(_migrations()):
+        for line in body.splitlines():
+            match = _TABLE_KEY.match(line)
+            if match:
+                keys.setdefault(table, []).append(f"{match.group(1).upper()} ({match.group(2)})")
+    return keys
+
+
+def _index_statements(tables: Iterable[str]) -> list[str]:
+    wanted = set(tables)
+    return [
+        f"CREATE {unique or ''}INDEX IF NOT EXISTS {name} ON {table} ({' '.join(cols.split())}) {where or ''}".strip()
+        for unique, name, table, cols, where in _INDEX.findall(_migrations())
+        if table in wanted
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Value conversion
+# ---------------------------------------------------------------------------
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _to_db(value: Any, column: Column) -> Any:
+    if value is None:
+        return None
+    if column.kind == "json":
+        return json.dumps(value)
+    if column.kind == "boolean":
+        return int(bool(value))
+    return value
+
+
+def _from_db(value: Any, column: Optional[Column]) -> Any:
+    if value is None or column is None:
+        return value
+    if column.kind == "boolean":
+        return bool(value)
+    if column.kind == "json" and isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _arg(raw: str, column: Column) -> Any:
+    """A filter argument from the query string, typed for comparison with the column."""
+    if column.kind == "boolean":
+        return {"true": 1, "false": 0}.get(raw.lower(), raw)
+    if column.kind in ("real", "integer"):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def build_database(path: Path, batches: Iterable[tuple[str, list[dict]]]) -> dict[str, int]:
+    """Create every migration table (with its indexes) at path and load the batches; returns row counts."""
+    schema = load_schema()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    counts: dict[str, int] = {}
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        keys = _table_keys()
+        for table, columns in schema.items():
+            cols = [f"{name} {col.sqlite_type} {col.key}".rstrip() for name, col in columns.items()]
+            conn.execute(f"CREATE TABLE {table} ({', '.join(cols + keys.get(table, []))})")
+        for table, rows in batches:
+            columns = schema[table]
+            names = list(columns)
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                [tuple(_to_db(_default(row, name, col), col) for name, col in columns.items()) for row in rows],
+            )
+            counts[table] = counts.get(table, 0) + len(rows)
+        for statement in _index_statements(schema):
+            try:
+                conn.execute(statement)
+            except sqlite3.Error as e:
+                logger.debug(f"Skipping index SQLite cannot build ({e}): {statement}")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+def _default(row: dict, name: str, column: Column) -> Any:
+    if name in row:
+        return row[name]
+    if column.default == "uuid":
+        return str(uuid.uuid4())
+    if column.default == "now":
+        return _now_iso()
+    return column.default
+
+
+# ---------------------------------------------------------------------------
+# exec_readonly_sql
+# ---------------------------------------------------------------------------
+
+_CASTS = {"numeric": "REAL", "decimal": "REAL", "float": "REAL", "double precision": "REAL", "real": "REAL",
+          "int": "INTEGER", "integer": "INTEGER", "bigint": "INTEGER",
+          "text": "TEXT", "uuid": "TEXT", "varchar": "TEXT", "timestamptz": "TEXT"}
+_CAST = re.compile(r"(\((?:[^()]|\([^()]*\))*\)|'(?:[^']|'')*'|[\w.]+)::(double precision|\w+)", re.I)
+
+
+def translate_sql(query: str) -> str:
+    """Rewrite the Postgres the compute modules send to exec_readonly_sql into SQLite."""
+    def cast(match: re.Match) -> str:
+        target = _CASTS.get(match.group(2).lower())
+        if target is None:
+            raise ValueError(f"unsupported cast ::{match.group(2)}")
+        return f"CAST({match.group(1)} AS {target})"
+
+    query = _CAST.sub(cast, query)
+    query = re.sub(r"\bILIKE\b", "LIKE", query, flags=re.I)
+    return re.sub(r"\bNOW\(\)", "strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now')", query, flags=re.I)
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+def _error(status: int, code: str, message: str):
+    return _json(status, {"code": code, "details": None, "hint": None, "message": message})
+
+
+class SqlitePostgrest(HttpFake):
+    def __init__(self, path: str, max_rows: Optional[int] = None):
+        self.schema = load_schema()
+        self.max_rows = max_rows
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA synchronous = OFF")
+
+    async def handle(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        path = unquote(url.path)
+        if not path.startswith("/rest/v1/"):
+            return _error(404, "PGRST000", f"no route for {path}")
+        name = path[len("/rest/v1/"):]
+        try:
+            if name.startswith("rpc/"):
+                return self._rpc(name[4:], json.loads(body or b"{}"))
+            if name not in self.schema:
+                return _error(404, "42P01", f'relation "public.{name}" does not exist')
+            return self._table(method, name, parse_qsl(url.query, keep_blank_values=True), headers, body)
+        except (ValueError, sqlite3.Error) as e:
+            return _error(400, "PGRST100", str(e))
+        finally:
+            self.conn.commit()
+
+    # -- reads / writes --------------------------------------------------
+
+    def _where(self, table: str, params: list[tuple[str, str]]) -> tuple[str, list]:
+        columns = self.schema[table]
+        clauses, args = [], []
+        for key, raw in params:
+            if key in _RESERVED:
+                continue
+            if key in ("or", "and"):
+                raise ValueError(f"{key}= filters are not supported by the benchmark backend")
+            if key not in columns:
+                raise ValueError(f"column {table}.{key} does not exist")
+            negate = raw.startswith("not.")
+            op, _, value = (raw[4:] if negate else raw).partition(".")
+            column = columns[key]
+            if op in _OPS:
+                clause = f"{key} {_OPS[op]} ?"
+                args.append(_arg(value, column))
+            elif op == "is":
+                literal = {"null": "NULL", "true": "1", "false": "0"}.get(value.lower())
+                if literal is None:
+                    raise ValueError(f"invalid is. value {value!r}")
+                clause = f"{key} IS {literal}"
+            elif op == "in":
+                values = next(csv.reader([value.strip()[1:-1]])) if value.strip("()") else []
+                clause = f"{key} IN ({', '.join('?' * len(values))})"
+                args.extend(_arg(v, column) for v in values)
+            elif op == "like":
+                clause = f"{key} GLOB ?"
+                args.append(value.replace("%", "*"))
+            elif op == "ilike":
+                clause = f"{key} LIKE ?"
+                args.append(value.replace("*", "%"))
+            else:
+                raise ValueError(f"unsupported operator {op!r}")
+            clauses.append(f"NOT ({clause})" if negate else clause)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def _columns(self, table: str, select: str) -> list[str]:
+        if select in ("", "*"):
+            return list(self.schema[table])
+        names = [c.strip() for c in select.split(",") if c.strip()]
+        for name in names:
+            if name not in self.schema[table]:
+                raise ValueError(f"column {table}.{name} does not exist")
+        return list(dict.fromkeys(names))
+
+    def _order(self, table: str, order: str) -> str:
+        terms = []
+        for term in (t for t in order.split(",") if t):
+            col, *mods = term.split(".")
+            if col not in self.schema[table]:
+                raise ValueError(f"column {table}.{col} does not exist")
+            desc = "desc" in mods
+            nulls_first = "nullsfirst" in mods or (desc and "nullslast" not in mods)  # Postgres defaults
+            terms.append(f"{col} {'DESC' if desc else 'ASC'} NULLS {'FIRST' if nulls_first else 'LAST'}")
+        return " ORDER BY " + ", ".join(terms) if terms else ""
+
+    def _rows(self, table: str, cursor: sqlite3.Cursor) -> list[dict]:
+        columns = self.schema[table]
+        names = [d[0] for d in cursor.description]
+        return [{n: _from_db(v, columns.get(n)) for n, v in zip(names, row)} for row in cursor.fetchall()]
+
+    def _table(self, method: str, table: str, params: list[tuple[str, str]], headers: dict, body: bytes):
+        query = dict(params)
+        prefer = headers.get("prefer", "")
+        where, args = self._where(table, params)
+        returning = " RETURNING *" if "return=representation" in prefer else ""
+
+        if method in ("GET", "HEAD"):
+            columns = self._columns(table, query.get("select", "*"))
+            limit = int(query["limit"]) if "limit" in query else -1
+            if self.max_rows is not None:
+                limit = self.max_rows if limit < 0 else min(limit, self.max_rows)
+            offset = int(query.get("offset", 0))
+            cursor = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table}{where}{self._order(table, query.get('order', ''))}"
+                f" LIMIT ? OFFSET ?", [*args, limit, offset])
+            rows = self._rows(table, cursor)
+            total = None
+            if "count=" in prefer:
+                total = self.conn.execute(f"SELECT COUNT(*) FROM {table}{where}", args).fetchone()[0]
+            return self._respond(rows, headers, offset=offset, total=total, head=method == "HEAD")
+
+        columns = self.schema[table]
+        payload = json.loads(body or b"null")
+        if method == "POST":
+            items = payload if isinstance(payload, list) else [payload]
+            written = []
+            for item in items:
+                unknown = set(item) - set(columns)
+                if unknown:
+                    raise ValueError(f"columns {sorted(unknown)} of {table} do not exist")
+                names = list(columns) if not query.get("columns") else [c for c in columns if c in item]
+                names = [n for n in names if n in item or columns[n].default is not None]
+                sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+                if "on_conflict" in query or "resolution=" in prefer:
+                    target = query.get("on_conflict", "id")
+                    if "resolution=ignore-duplicates" in prefer:
+                        sql += f" ON CONFLICT ({target}) DO NOTHING"
+                    else:
+                        updates = ", ".join(f"{n} = excluded.{n}" for n in names if n in item)
+                        sql += f" ON CONFLICT ({target}) DO UPDATE SET {updates}"
+                cursor = self.conn.execute(sql + returning,
+                                           [_to_db(_default(item, n, columns[n]), columns[n]) for n in names])
+                if returning:
+                    written.extend(self._rows(table, cursor))
+            return self._respond(written, headers, status=201, minimal=not returning)
+
+        if method == "PATCH":
+            sets = ", ".join(f"{name} = ?" for name in payload)
+            cursor = self.conn.execute(f"UPDATE {table} SET {sets}{where}{returning}",
+                                       [*(_to_db(v, columns[k]) for k, v in payload.items()), *args])
+        elif method == "DELETE":
+            cursor = self.conn.execute(f"DELETE FROM {table}{where}{returning}", args)
+        else:
+            return _error(405, "PGRST117", f"unsupported method {method}")
+        rows = self._rows(table, cursor) if returning else []
+        return self._respond(rows, headers, minimal=not returning)
+
+    @staticmethod
+    def _respond(rows, headers, status=200, offset=0, total=None, head=False, minimal=False):
+        span = f"{offset}-{offset + len(rows) - 1}" if rows else "*"
+        extra = {"content-range": f"{span}/{'*' if total is None else total}"}
+        if "vnd.pgrst.object" in headers.get("accept", ""):
+            if len(rows) != 1:
+                return _json(406, {"code": "PGRST116", "details": f"The result contains {len(rows)} rows",
+                                   "hint": None, "message": "JSON object requested, multiple (or no) rows returned"})
+            return _json(status, rows[0], extra)
+        if head:
+            return status, extra, b""
+        if minimal:
+            return (201 if status == 201 else 204), extra, b""
+        return _json(status, rows, extra)
+
+    # -- rpc -------------------------------------------------------------
+
+    def _rpc(self, function: str, params: dict):
+        if function != "exec_readonly_sql":
+            return _error(404, "PGRST202", f"Could not find the function public.{function}")
+        query = params.get("p_query") or ""
+        if _WRITE_SQL.search(query):
+            return _error(400, "P0001", "Write operations are not allowed")
+        scoped = ", ".join(
+            f"{t} AS (SELECT * FROM main.{t} WHERE tenant_id = :tenant AND crm_source = :source)" for t in SCOPED_TABLES
+        )
+        sql = f"WITH {scoped} SELECT * FROM ({translate_sql(query)})"
+        cursor = self.conn.execute(sql, {"tenant": params.get("p_tenant_id"), "source": params.get("p_crm_source")})
+        names = [d[0] for d in cursor.description]
+        return _json(200, [dict(zip(names, row)) for row in cursor.fetchall()])
+
+
+class SqliteBackend(FakeProcess):
+    """SqlitePostgrest over the database at path, in a child process."""
+
+    def __init__(self, path: Path, max_rows: Optional[int] = None):
+        super().__init__(SqlitePostgrest, str(path), max_rows)
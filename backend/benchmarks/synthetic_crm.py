@@ -0,0 +1,329 @@
+"""
+Deterministic synthetic CRM data for the analytics benchmarks.
+==============================================================
+One tenant's Bitrix24-shaped CRM at a chosen size — deals and activities
+scale together, the other tables in proportion:
+
+    size    deals / activities   leads     contacts   companies   users
+    1k            1,000             500        250         25          8
+    10k          10,000           5,000      2,500        250          8
+    100k        100,000          50,000     25,000      2,500         50
+    1m        1,000,000         500,000    250,000     25,000        250
+
+Distributions follow what synced tenants look like: two years of history
+skewed towards recent months, ~30% won / ~35% lost deals, log-normal deal
+values and cycle times, a few reps owning most of the pipeline (Zipf), stale
+open deals, and a few percent of NULLs in the fields metrics read. The
+tenant also gets a confirmed revenue model, a field registry, a set of
+tenant_metrics recipes (fusable and per-recipe) and one alert rule per
+pattern, so every compute entry point has real work to do.
+
+Every table draws from its own RNG seeded by (seed, table), and timestamps
+are offsets from `now` (default: today 00:00 UTC), so a (size, seed, day)
+triple always yields the same rows and "last 30 days" windows always hold
+data.
+
+Public surface
+--------------
+    SIZES                                 "1k" | "10k" | "100k" | "1m" -> deals
+    TENANT_ID, CRM_SOURCE
+    spec = dataset_spec("10k")            # row counts per table
+    for table, rows in generate("10k", seed=0, now=None): ...   # batches
+"""
+
+from __future__ import annotations
+
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+TENANT_ID = "5e1f0000-0000-4000-8000-00000000be01"
+CRM_SOURCE = "bitrix24"
+BATCH = 10_000
+HISTORY_DAYS = 730
+
+OPEN_STAGES = ("NEW", "PREPARATION", "PREPAYMENT_INVOICE", "EXECUTING", "FINAL_INVOICE")
+WON_STAGES = ("WON",)
+LOST_STAGES = ("LOSE", "APOLOGY")
+STAGE_WEIGHTS = {"NEW": 10, "PREPARATION": 8, "PREPAYMENT_INVOICE": 6, "EXECUTING": 6, "FINAL_INVOICE": 5,
+                 "WON": 30, "LOSE": 28, "APOLOGY": 7}
+ACTIVITY_TYPES = {"call": 40, "email": 30, "task": 20, "meeting": 10}
+LEAD_STATUSES = {"NEW": 20, "IN_PROCESS": 25, "PROCESSED": 15, "CONVERTED": 22, "JUNK": 18}
+LEAD_SOURCES = {"CALL": 25, "WEB": 30, "ADVERTISING": 15, "PARTNER": 10, "RECOMMENDATION": 12, "EMAIL": 8}
+INDUSTRIES = ("IT", "RETAIL", "MANUFACTURING", "FINANCE", "LOGISTICS", "EDUCATION", "HORECA")
+FIRST_NAMES = ("Aziz", "Dilnoza", "Jasur", "Malika", "Sardor", "Nodira", "Bekzod", "Kamila", "Timur", "Zarina",
+               "Anna", "Ivan", "Olga", "Sergey", "Maria", "John", "Emma", "Lucas", "Sofia", "Omar")
+LAST_NAMES = ("Karimov", "Rashidova", "Tursunov", "Yusupova", "Aliyev", "Petrova", "Ivanov", "Smith", "Garcia",
+              "Nazarov", "Ismoilova", "Kim", "Sokolov", "Haydarov", "Lee", "Brown")
+
+# Columns metrics may read, per registry entity -> field type (crm_field_registry rows)
+REGISTRY_FIELDS = {
+    "deals": {"title": "string", "stage": "string", "value": "number", "currency": "string",
+              "assigned_to": "string", "contact_id": "string", "company_id": "string", "won": "boolean",
+              "created_at": "timestamp", "closed_at": "timestamp", "modified_at": "timestamp"},
+    "leads": {"title": "string", "status": "string", "source": "string", "assigned_to": "string",
+              "contact_name": "string", "value": "number", "currency": "string",
+              "created_at": "timestamp", "modified_at": "timestamp"},
+    "contacts": {"name": "string", "company": "string", "created_at": "timestamp", "modified_at": "timestamp"},
+    "companies": {"name": "string", "industry": "string", "employee_count": "number", "revenue": "number",
+                  "created_at": "timestamp", "modified_at": "timestamp"},
+    "activities": {"type": "string", "subject": "string", "employee_id": "string", "employee_name": "string",
+                   "duration_seconds": "number", "completed": "boolean", "started_at": "timestamp",
+                   "modified_at": "timestamp"},
+}
+
+
+def _metric(key: str, title: str, table: str, computation: dict, fmt: str = "number",
+            required: tuple = (), core: bool = False) -> dict:
+    return {"metric_key": key, "title": title, "source_table": table, "computation": computation,
+            "required_fields": list(required), "display_format": fmt, "is_core": core, "is_kpi": core,
+            "confidence": 0.9, "generated_by": "benchmark", "active": True}
+
+
+TENANT_METRICS = (
+    _metric("total_deals", "Total Deals", "crm_deals", {"type": "count", "table": "crm_deals", "filters": {}},
+            core=True),
+    _metric("won_revenue", "Won Revenue", "crm_deals",
+            {"type": "sum", "table": "crm_deals", "field": "value", "filters": {"won": True}},
+            "currency", ("value", "won"), core=True),
+    _metric("avg_deal_size", "Average Deal Size", "crm_deals",
+            {"type": "avg", "table": "crm_deals", "field": "value", "filters": {"won": True}},
+            "currency", ("value", "won")),
+    _metric("win_rate", "Win Rate", "crm_deals",
+            {"type": "ratio", "multiply": 100,
+             "numerator": {"table": "crm_deals", "agg": "count", "filter": {"won": True}},
+             "denominator": {"table": "crm_deals", "agg": "count", "filter": {"stage__in": list(WON_STAGES + LOST_STAGES)}}},
+            "percentage", ("won", "stage"), core=True),
+    _metric("open_pipeline", "Open Pipeline", "crm_deals",
+            {"type": "sum", "table": "crm_deals", "field": "value", "filters": {"stage__in": list(OPEN_STAGES)}},
+            "currency", ("value", "stage")),
+    _metric("active_reps", "Active Reps", "crm_deals",
+            {"type": "distinct_count", "table": "crm_deals", "field": "assigned_to", "filters": {}},
+            required=("assigned_to",)),
+    _metric("sales_cycle", "Sales Cycle", "crm_deals",
+            {"type": "duration", "table": "crm_deals", "start_field": "created_at", "end_field": "closed_at",
+             "unit": "days", "filters": {"won": True}},
+            "days", ("created_at", "closed_at", "won")),
+    _metric("total_leads", "Total Leads", "crm_leads", {"type": "count", "table": "crm_leads", "filters": {}}),
+    _metric("lead_conversion", "Lead Conversion", "crm_leads",
+            {"type": "ratio", "multiply": 100,
+             "numerator": {"table": "crm_leads", "agg": "count", "filter": {"status": "CONVERTED"}},
+             "denominator": {"table": "crm_leads", "agg": "count", "filter": {}}},
+            "percentage", ("status",)),
+    _metric("web_leads", "Web Leads", "crm_leads",
+            {"type": "count", "table": "crm_leads", "filters": {"source": "WEB"}}, required=("source",)),
+    _metric("avg_lead_value", "Average Lead Value", "crm_leads",
+            {"type": "avg", "table": "crm_leads", "field": "value", "filters": {"value__gt": 0}},
+            "currency", ("value",)),
+)
+
+ALERT_RULES = (
+    {"pattern": "trend_decline", "metric_key": "total_deals", "entity": None,
+     "config": {"threshold_pct": 10}, "severity_rules": {"warning": {"drop_pct": 10}, "critical": {"drop_pct": 25}}},
+    {"pattern": "stagnation", "metric_key": None, "entity": "deals", "config": {"modified_field": "modified_at"},
+     "severity_rules": {"warning": {"stale_days": 14}, "critical": {"stale_days": 30}}},
+    {"pattern": "concentration", "metric_key": "won_revenue", "entity": "deals",
+     "config": {"dimension_field": "assigned_to"}, "severity_rules": {"warning": {"share_pct": 40}}},
+    {"pattern": "missing_data", "metric_key": "won_revenue", "entity": "deals",
+     "config": {"field": "value", "current_fill_rate": 0.6}, "severity_rules": {}},
+    {"pattern": "divergence", "metric_key": None, "entity": None,
+     "config": {"metric_a": "total_leads", "metric_b": "total_deals", "expected_correlation": "positive"},
+     "severity_rules": {}},
+)
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    deals: int
+    activities: int
+    leads: int
+    contacts: int
+    companies: int
+    users: int
+
+
+def dataset_spec(size: str) -> DatasetSpec:
+    try:
+        n = SIZES[size]
+    except KeyError:
+        raise ValueError(f"Unknown size {size!r}; choose from {', '.join(SIZES)}") from None
+    return DatasetSpec(deals=n, activities=n, leads=n // 2, contacts=n // 4, companies=max(1, n // 40),
+                       users=min(250, max(8, n // 4000)))
+
+
+def default_now() -> datetime:
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ts(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime("%Y-%m-%dT%H:%M:%S+00:00") if value is not None else None
+
+
+class _Table:
+    """Per-table RNG plus the samplers every table shares."""
+
+    def __init__(self, seed: int, table: str, now: datetime):
+        self.rng = random.Random(f"{seed}:{table}")
+        self.now = now
+
+    def past(self, skew: float = 1.5) -> datetime:
+        """A moment in the last HISTORY_DAYS, denser towards now."""
+        return self.now - timedelta(seconds=int(HISTORY_DAYS * 86400 * self.rng.random() ** skew) + 1)
+
+    def between(self, start: datetime, end: datetime) -> datetime:
+        return start + (end - start) * self.rng.random()
+
+    def pick(self, weights: dict) -> str:
+        return self.rng.choices(tuple(weights), tuple(weights.values()))[0]
+
+    def uid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+
+def _batched(rows: Iterator[dict]) -> Iterator[list[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _scoped(t: _Table, external_id, now: datetime) -> dict:
+    return {"id": t.uid(), "tenant_id": TENANT_ID, "crm_source": CRM_SOURCE, "external_id": str(external_id),
+            "synced_at": _ts(now)}
+
+
+def _users(spec: DatasetSpec, t: _Table) -> list[dict]:
+    rows = []
+    for i in range(spec.users):
+        first, last = t.rng.choice(FIRST_NAMES), t.rng.choice(LAST_NAMES)
+        row = _scoped(t, i + 1, t.now)
+        row.update(name=f"{first} {last}", email=f"{first.lower()}.{last.lower()}{i}@example.com",
+                   is_active=t.rng.random() < 0.9)
+        rows.append(row)
+    return rows
+
+
+def _deals(spec: DatasetSpec, t: _Table, owners: list[str], owner_weights: list[float]) -> Iterator[dict]:
+    for i in range(spec.deals):
+        stage = t.pick(STAGE_WEIGHTS)
+        created = t.past()
+        if stage in OPEN_STAGES:
+            closed = t.now + timedelta(days=t.rng.uniform(-20, 60)) if t.rng.random() < 0.7 else None
+            modified = t.between(created, t.now)
+        else:
+            closed = min(t.now, created + timedelta(days=t.rng.lognormvariate(3.0, 0.8)))
+            modified = closed
+        row = _scoped(t, i + 1, t.now)
+        row.update(
+            title=f"Deal #{i + 1}", stage=stage,
+            value=round(t.rng.lognormvariate(7.0, 1.1), 2) if t.rng.random() > 0.04 else None,
+            currency="USD" if t.rng.random() < 0.85 else "UZS",
+            assigned_to=t.rng.choices(owners, owner_weights)[0] if t.rng.random() > 0.02 else None,
+            contact_id=str(t.rng.randint(1, max(1, spec.contacts))),
+            company_id=str(t.rng.randint(1, spec.companies)) if t.rng.random() < 0.6 else None,
+            won=stage in WON_STAGES, created_at=_ts(created), closed_at=_ts(closed), modified_at=_ts(modified),
+        )
+        yield row
+
+
+def _activities(spec: DatasetSpec, t: _Table, users: list[dict], owner_weights: list[float]) -> Iterator[dict]:
+    for i in range(spec.activities):
+        kind = t.pick(ACTIVITY_TYPES)
+        user = t.rng.choices(users, owner_weights)[0]
+        started = t.past()
+        row = _scoped(t, i + 1, t.now)
+        row.update(
+            type=kind, subject=f"{kind.title()} #{i + 1}", employee_id=user["external_id"],
+            employee_name=user["name"] if t.rng.random() < 0.6 else None,
+            duration_seconds=int(t.rng.lognormvariate(5.0, 0.7)) if kind == "call" else None,
+            completed=t.rng.random() < 0.8, started_at=_ts(started),
+            modified_at=_ts(min(t.now, started + timedelta(hours=t.rng.uniform(0, 72)))),
+        )
+        yield row
+
+
+def _leads(spec: DatasetSpec, t: _Table, owners: list[str]) -> Iterator[dict]:
+    for i in range(spec.leads):
+        first, last = t.rng.choice(FIRST_NAMES), t.rng.choice(LAST_NAMES)
+        created = t.past()
+        row = _scoped(t, i + 1, t.now)
+        row.update(
+            title=f"Lead #{i + 1}", status=t.pick(LEAD_STATUSES), source=t.pick(LEAD_SOURCES),
+            assigned_to=t.rng.choice(owners), contact_name=f"{first} {last}",
+            contact_phone=f"+9989{t.rng.randint(10_000_000, 99_999_999)}",
+            contact_email=f"lead{i + 1}@example.com" if t.rng.random() < 0.5 else None,
+            value=round(t.rng.lognormvariate(6.5, 1.0), 2) if t.rng.random() < 0.5 else None,
+            currency="USD", created_at=_ts(created), modified_at=_ts(t.between(created, t.now)),
+        )
+        yield row
+
+
+def _contacts(spec: DatasetSpec, t: _Table) -> Iterator[dict]:
+    for i in range(spec.contacts):
+        first, last = t.rng.choice(FIRST_NAMES), t.rng.choice(LAST_NAMES)
+        created = t.past(1.2)
+        row = _scoped(t, i + 1, t.now)
+        row.update(
+            name=f"{first} {last}", phone=f"+9989{t.rng.randint(10_000_000, 99_999_999)}",
+            email=f"contact{i + 1}@example.com" if t.rng.random() < 0.6 else None,
+            company=str(t.rng.randint(1, spec.companies)) if t.rng.random() < 0.5 else None,
+            created_at=_ts(created), modified_at=_ts(t.between(created, t.now)),
+        )
+        yield row
+
+
+def _companies(spec: DatasetSpec, t: _Table) -> Iterator[dict]:
+    for i in range(spec.companies):
+        created = t.past(1.0)
+        row = _scoped(t, i + 1, t.now)
+        row.update(
+            name=f"Company {i + 1} LLC", industry=t.rng.choice(INDUSTRIES),
+            employee_count=int(t.rng.lognormvariate(3.5, 1.2)),
+            revenue=round(t.rng.lognormvariate(13.0, 1.5), 2) if t.rng.random() < 0.7 else None,
+            created_at=_ts(created), modified_at=_ts(t.between(created, t.now)),
+        )
+        yield row
+
+
+def _tenant_config(t: _Table) -> dict[str, list[dict]]:
+    scope = {"tenant_id": TENANT_ID, "crm_source": CRM_SOURCE}
+    model = {"id": t.uid(), **scope, "won_stage_values": list(WON_STAGES), "lost_stage_values": list(LOST_STAGES),
+             "stage_order": list(OPEN_STAGES), "confidence_json": {}, "rationale_json": {},
+             "confirmed_at": _ts(t.now - timedelta(days=30)), "created_at": _ts(t.now - timedelta(days=31)),
+             "updated_at": _ts(t.now - timedelta(days=30))}
+    registry = [{"id": t.uid(), **scope, "entity": entity, "field_name": name, "field_type": kind,
+                 "sample_values": [], "discovered_at": _ts(t.now), "updated_at": _ts(t.now)}
+                for entity, fields in REGISTRY_FIELDS.items() for name, kind in fields.items()]
+    metrics = [{"id": t.uid(), **scope, **m, "created_at": _ts(t.now)} for m in TENANT_METRICS]
+    rules = [{"id": t.uid(), **scope, **r, "active": True, "created_at": _ts(t.now)} for r in ALERT_RULES]
+    return {"revenue_models": [model], "crm_field_registry": registry, "tenant_metrics": metrics,
+            "tenant_alert_rules": rules}
+
+
+def generate(size: str, seed: int = 0, now: Optional[datetime] = None) -> Iterator[tuple[str, list[dict]]]:
+    """Yield (table, rows) batches of at most BATCH rows for one tenant's CRM."""
+    spec = dataset_spec(size)
+    now = now or default_now()
+
+    for table, rows in _tenant_config(_Table(seed, "config", now)).items():
+        yield table, rows
+
+    users = _users(spec, _Table(seed, "crm_users", now))
+    yield "crm_users", users
+    owners = [u["external_id"] for u in users]
+    owner_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(owners))]
+
+    yield from (("crm_companies", b) for b in _batched(_companies(spec, _Table(seed, "crm_companies", now))))
+    yield from (("crm_contacts", b) for b in _batched(_contacts(spec, _Table(seed, "crm_contacts", now))))
+    yield from (("crm_leads", b) for b in _batched(_leads(spec, _Table(seed, "crm_leads", now), owners)))
+    yield from (("crm_deals", b) for b in _batched(
+        _deals(spec, _Table(seed, "crm_deals", now), owners, owner_weights)))
+    yield from (("crm_activities", b) for b in _batched(
+        _activities(spec, _Table(seed, "crm_activities", now), users, owner_weights)))
@@ -10,13 +10,12 @@ Provides full CRM access via webhook URL for:
 
 import httpx
 import logging
-import asyncio
-import time
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone, timedelta
-from collections import defaultdict
 import json
 
+from rate_limiter import TokenBucketLimiter
+
 logger = logging.getLogger(__name__)
 
 # Bitrix24 REST API timeout
@@ -27,40 +26,11 @@ BITRIX_MAX_REQUESTS_PER_SECOND = 4
 BITRIX_RATE_LIMIT_WINDOW = 1.0  # seconds
 
 
-class BitrixRateLimiter:
-    """Rate limiter for Bitrix24 API calls to prevent hitting rate limits"""
-
-    def __init__(self, max_requests: int = BITRIX_MAX_REQUESTS_PER_SECOND, window: float = BITRIX_RATE_LIMIT_WINDOW):
-        self.max_requests = max_requests
-        self.window = window
-        self._requests = defaultdict(list)
-        self._lock = asyncio.Lock()
-
-    async def acquire(self, webhook_url: str):
-        """Wait until we can make a request without hitting rate limit.
-
-        Sleeps OUTSIDE the lock so concurrent entity syncs aren't blocked.
-        """
-        while True:
-            async with self._lock:
-                now = time.time()
-                # Clean old entries
-                self._requests[webhook_url] = [t for t in self._requests[webhook_url] if now - t < self.window]
-
-                if len(self._requests[webhook_url]) < self.max_requests:
-                    self._requests[webhook_url].append(now)
-                    return  # Got a slot
-
-                oldest = min(self._requests[webhook_url])
-                wait_time = self.window - (now - oldest) + 0.01
-
-            # Sleep outside the lock so other coroutines can proceed
-            logger.debug(f"Bitrix rate limit: waiting {wait_time:.2f}s")
-            await asyncio.sleep(wait_time)
-
-
-# Global rate limiter instance
-_bitrix_rate_limiter = BitrixRateLimiter()
+_bitrix_rate_limiter = TokenBucketLimiter(
+    "bitrix24",
+    rate=BITRIX_MAX_REQUESTS_PER_SECOND / BITRIX_RATE_LIMIT_WINDOW,
+    capacity=BITRIX_MAX_REQUESTS_PER_SECOND,
+)
 
 
 class BitrixCRMClient:
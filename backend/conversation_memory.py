@@ -0,0 +1,306 @@
+"""
+Conversation Memory — rolling summaries that bound the sales prompt size.
+=========================================================================
+The sales pipeline sends the most recent messages verbatim. Older messages
+used to fall off the end of a fixed window and were lost; enlarging the
+window instead grows prompt tokens and latency with conversation length.
+
+Each long conversation now has one conversation_memories row: a short
+running summary plus a dict of key facts (budget, products of interest,
+objections, commitments), covering every message up to summarized_until.
+The prompt is built from that memory plus the unsummarized tail:
+
+    [summary + facts][messages newer than summarized_until]
+
+The hot path loads the last FETCH_WINDOW messages. When all of them are
+still unsummarized, a background task folds everything older than the
+last RECENT_WINDOW messages into the memory (one gpt-4o-mini call that
+updates the previous summary incrementally), so the verbatim tail stays
+between RECENT_WINDOW and FETCH_WINDOW messages however long the chat
+runs. Conversations shorter than FETCH_WINDOW never touch the table.
+
+Folding is single-flight per conversation and fails open — on any error
+the turn simply proceeds with the window it already has.
+
+Public surface
+--------------
+    window, memory = await build_context(supabase, tenant_id, conv_id, history)
+    section = memory.prompt_section() if memory else None
+    memory = await load_memory(supabase, conv_id)
+    memory = await refresh_memory(supabase, tenant_id, conv_id, cutoff, memory)
+    get_memory_stats()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+from llm_gateway import get_gateway
+from token_logger import cached_prompt_tokens, log_token_usage_fire_and_forget
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TABLE = "conversation_memories"
+
+RECENT_WINDOW = 10  # messages always kept verbatim after a fold
+FETCH_WINDOW = 16  # messages loaded per turn; a full unsummarized window triggers a fold
+MAX_FOLD_MESSAGES = 200  # newest messages considered when summarizing a backlog
+MAX_SUMMARY_CHARS = 1500
+MAX_FACTS = 20
+MAX_FACT_CHARS = 200
+
+SUMMARY_MODEL = "gpt-4o-mini"
+
+_SUMMARY_PROMPT = """You maintain the running memory of a sales chat between a customer and a business's assistant.
+You get the previous summary and key facts (possibly empty) plus the next messages of the conversation.
+Return a JSON object with:
+- "summary": the updated summary, at most 6 sentences, in English. Keep what still matters for selling:
+  the customer's needs, products discussed, prices quoted, objections raised and how they were handled,
+  promises made by either side, and where the conversation stands.
+- "facts": an object of short key facts about the customer (e.g. name, budget, product_interest,
+  preferred_contact_time, delivery_city, objections, commitments). Keep previous facts unless the
+  new messages change them. At most 20 keys, values under 200 characters.
+Do not invent facts that are not in the messages."""
+
+_inflight: set[str] = set()
+_tasks: set[asyncio.Task] = set()
+_stats = {"loads": 0, "scheduled": 0, "folds": 0, "folded_messages": 0, "failed": 0}
+
+
+@dataclass
+class ConversationMemory:
+    conversation_id: str
+    summary: str = ""
+    facts: dict = field(default_factory=dict)
+    summarized_until: Optional[str] = None  # created_at of the last folded message
+    summarized_count: int = 0
+
+    @classmethod
+    def from_row(cls, row: dict) -> "ConversationMemory":
+        return cls(
+            conversation_id=row["conversation_id"],
+            summary=row.get("summary") or "",
+            facts=row.get("key_facts") or {},
+            summarized_until=row.get("summarized_until"),
+            summarized_count=row.get("summarized_count") or 0,
+        )
+
+    def prompt_section(self) -> Optional[str]:
+        """Prompt block for the sales agent, or None when there is nothing to say."""
+        summary = _clean(self.summary, MAX_SUMMARY_CHARS)
+        facts = {
+            _clean(k, 50): _clean(v, MAX_FACT_CHARS)
+            for k, v in list((self.facts if isinstance(self.facts, dict) else {}).items())[:MAX_FACTS]
+            if v not in (None, "", [], {})
+        }
+        if not summary and not facts:
+            return None
+        lines = ["## EARLIER IN THIS CONVERSATION (summarized)"]
+        if summary:
+            lines.append(summary)
+        if facts:
+            lines.append("Key facts:")
+            lines.extend(f"- {k}: {v}" for k, v in facts.items())
+        return "\n".join(lines)
+
+
+def _clean(value, limit: int) -> str:
+    """Flatten a model-produced value to one prompt-safe line."""
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False)
+    return " ".join(value.split())[:limit]
+
+
+def get_memory_stats() -> dict:
+    return {**_stats, "inflight": len(_inflight)}
+
+
+# ---------------------------------------------------------------------------
+# Hot path
+# ---------------------------------------------------------------------------
+
+async def load_memory(supabase, conversation_id: str) -> Optional[ConversationMemory]:
+    """Fetch the conversation's memory row. None if absent or on error."""
+    _stats["loads"] += 1
+    try:
+        result = await asyncio.to_thread(
+            lambda: supabase.table(MEMORY_TABLE).select("*")
+            .eq("conversation_id", conversation_id).limit(1).execute()
+        )
+    except Exception as e:
+        logger.warning(f"Conversation memory load failed for {conversation_id}: {e}")
+        return None
+    return ConversationMemory.from_row(result.data[0]) if result.data else None
+
+
+def _unsummarized(history: list[dict], memory: Optional[ConversationMemory]) -> list[dict]:
+    if not memory or not memory.summarized_until:
+        return history
+    return [m for m in history if (m.get("created_at") or "") > memory.summarized_until]
+
+
+async def build_context(
+    supabase,
+    tenant_id: str,
+    conversation_id: str,
+    history: list[dict],
+) -> tuple[list[dict], Optional[ConversationMemory]]:
+    """
+    Pick the verbatim message window for this turn and the memory that covers
+    everything before it. `history` is the last FETCH_WINDOW message rows,
+    oldest first. Schedules a background fold when the window is saturated.
+    """
+    if len(history) < FETCH_WINDOW:
+        return history, None  # whole conversation fits
+
+    memory = await load_memory(supabase, conversation_id)
+    window = _unsummarized(history, memory)
+    if len(window) >= FETCH_WINDOW:
+        cutoff = window[-RECENT_WINDOW].get("created_at")
+        if cutoff:
+            schedule_refresh(supabase, tenant_id, conversation_id, cutoff, memory)
+    if memory is None:
+        # No summary yet (first fold in flight) — the full fetched window
+        # still carries the most context available
+        return history, None
+    return window, memory
+
+
+def schedule_refresh(
+    supabase,
+    tenant_id: str,
+    conversation_id: str,
+    cutoff: str,
+    memory: Optional[ConversationMemory],
+) -> bool:
+    """Fold messages older than `cutoff` in the background. False if one is already running."""
+    if conversation_id in _inflight:
+        return False
+    _inflight.add(conversation_id)
+    _stats["scheduled"] += 1
+
+    async def _run():
+        try:
+            await refresh_memory(supabase, tenant_id, conversation_id, cutoff, memory)
+        finally:
+            _inflight.discard(conversation_id)
+
+    task = asyncio.create_task(_run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Background fold
+# ---------------------------------------------------------------------------
+
+async def _summarize(
+    memory: Optional[ConversationMemory],
+    rows: list[dict],
+    tenant_id: str,
+    conversation_id: str,
+) -> dict:
+    transcript = "\n".join(
+        f"{'assistant' if m.get('sender_type') == 'agent' else 'customer'}: {m.get('text') or ''}"
+        for m in rows
+    )
+    previous = {
+        "summary": memory.summary if memory else "",
+        "facts": memory.facts if memory else {},
+    }
+    response = await get_gateway().chat_completion(
+        model=SUMMARY_MODEL,
+        tenant_id=tenant_id,
+        purpose="conversation_summary",
+        messages=[
+            {"role": "system", "content": _SUMMARY_PROMPT},
+            {"role": "user", "content": (
+                f"PREVIOUS MEMORY:\n{json.dumps(previous, ensure_ascii=False)}\n\n"
+                f"NEXT MESSAGES:\n{transcript}"
+            )},
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.2,
+        max_tokens=600,
+    )
+    usage = getattr(response, "usage", None)
+    if tenant_id and usage:
+        log_token_usage_fire_and_forget(
+            tenant_id=tenant_id,
+            model=SUMMARY_MODEL,
+            request_type="conversation_summary",
+            input_tokens=usage.prompt_tokens,
+            output_tokens=usage.completion_tokens,
+            conversation_id=conversation_id,
+            cached_input_tokens=cached_prompt_tokens(usage),
+        )
+    parsed = json.loads(response.choices[0].message.content or "{}")
+    facts = parsed.get("facts")
+    return {
+        "summary": str(parsed.get("summary") or "")[:MAX_SUMMARY_CHARS * 2],
+        "facts": dict(list(facts.items())[:MAX_FACTS]) if isinstance(facts, dict) else {},
+    }
+
+
+async def refresh_memory(
+    supabase,
+    tenant_id: str,
+    conversation_id: str,
+    cutoff: str,
+    memory: Optional[ConversationMemory] = None,
+) -> Optional[ConversationMemory]:
+    """
+    Fold every unsummarized message created before `cutoff` into the memory
+    and persist it. Returns the new memory, or None if nothing was written.
+    On a first fold of a very long conversation only the newest
+    MAX_FOLD_MESSAGES are read.
+    """
+    try:
+        def _fetch():
+            query = (
+                supabase.table("messages").select("sender_type,text,created_at")
+                .eq("conversation_id", conversation_id).lt("created_at", cutoff)
+            )
+            if memory and memory.summarized_until:
+                query = query.gt("created_at", memory.summarized_until)
+            return query.order("created_at", desc=True).limit(MAX_FOLD_MESSAGES).execute()
+
+        rows = list(reversed((await asyncio.to_thread(_fetch)).data or []))
+        if not rows:
+            return None
+
+        folded = await _summarize(memory, rows, tenant_id, conversation_id)
+        updated = ConversationMemory(
+            conversation_id=conversation_id,
+            summary=folded["summary"],
+            facts=folded["facts"],
+            summarized_until=rows[-1]["created_at"],
+            summarized_count=(memory.summarized_count if memory else 0) + len(rows),
+        )
+        row = {
+            "conversation_id": conversation_id,
+            "tenant_id": tenant_id,
+            "summary": updated.summary,
+            "key_facts": updated.facts,
+            "summarized_until": updated.summarized_until,
+            "summarized_count": updated.summarized_count,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await asyncio.to_thread(
+            lambda: supabase.table(MEMORY_TABLE).upsert(row, on_conflict="conversation_id").execute()
+        )
+        _stats["folds"] += 1
+        _stats["folded_messages"] += len(rows)
+        logger.info(f"Conversation memory for {conversation_id}: folded {len(rows)} messages "
+                    f"(total {updated.summarized_count})")
+        return updated
+    except Exception as e:
+        _stats["failed"] += 1
+        logger.warning(f"Conversation memory fold failed for {conversation_id}: {e}")
+        return None
@@ -5,14 +5,15 @@ Provides a single interface for the lead sync system.
 """
 
 import logging
-import time
 from typing import Optional, Dict, List, Any
 
+from ttl_cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
-# In-memory cache: {tenant_id: {"connections": [...], "cached_at": float}}
-_crm_connections_cache: Dict[str, Dict] = {}
+# In-memory cache: {tenant_id: [connection rows]}
 CRM_CACHE_TTL = 300  # 5 minutes
+_crm_connections_cache = TTLCache("crm_connections", ttl=CRM_CACHE_TTL, max_entries=10_000)
 
 
 class CRMManager:
@@ -35,25 +36,15 @@ class CRMManager:
 
     async def get_active_connections(self, tenant_id: str) -> List[Dict]:
         """Get all active CRM connections for a tenant, with caching."""
-        now = time.time()
-
-        # Check cache
-        if tenant_id in _crm_connections_cache:
-            entry = _crm_connections_cache[tenant_id]
-            if now - entry.get("cached_at", 0) < CRM_CACHE_TTL:
-                return entry["connections"]
 
-        # Query DB
-        try:
+        async def _load() -> List[Dict]:
             result = self.supabase.table('crm_connections').select('*').eq(
                 'tenant_id', tenant_id
             ).eq('is_active', True).execute()
-            connections = result.data or []
-            _crm_connections_cache[tenant_id] = {
-                "connections": connections,
-                "cached_at": now,
-            }
-            return connections
+            return result.data or []
+
+        try:
+            return await _crm_connections_cache.get_or_load(tenant_id, _load)
         except Exception as e:
             logger.warning(f"Failed to get CRM connections for tenant {tenant_id}: {e}")
             return []
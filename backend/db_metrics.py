@@ -0,0 +1,364 @@
+"""
+DB Metrics — per-request / per-job database call instrumentation.
+================================================================
+Every Supabase round trip goes through an httpx client: supabase-py's
+PostgREST session and app_core's HTTP/1.1 `_rest_client`. instrument_*()
+wraps their transports, so each call is recorded without touching call sites:
+
+    table     from the PostgREST path (`leads`, `rpc/acquire_worker_lease`)
+    shape     method + table + query with filter values stripped —
+              `GET leads?id=eq&select=*&tenant_id=eq` — so one query issued
+              in a loop shows up as one shape with a count
+    seconds   time to response headers
+    blocking  True when the call ran on the event loop thread (a sync
+              supabase-py call inside an async handler) rather than via
+              asyncio.to_thread
+
+Calls are attributed to the innermost db_scope() — the HTTP middleware opens
+one per request (named by route template), background jobs open their own
+via db_scope() / @db_job. A scope that issues one shape more than
+N_PLUS_ONE_THRESHOLD times logs a warning once per shape (the classic N+1).
+Closed scopes are folded into bounded process-wide aggregates for stats().
+
+Public surface
+--------------
+    instrument_supabase(supabase); instrument_http_client(client)
+
+    with db_scope("GET /api/leads") as scope:     # sync or async code
+        ...
+    scope.calls / scope.total_seconds / scope.server_timing()
+
+    @db_job("telegram_message")                  # async function
+    async def process(...): ...
+
+    stats()                                      # /api/admin/db-stats
+
+    with query_budget(max_calls=3, max_repeats=1) as budget:   # tests
+        client.get("/api/conversations", headers=auth)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+from urllib.parse import parse_qsl
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("DB_N_PLUS_ONE_THRESHOLD", "5"))
+MAX_CALLS_PER_SCOPE = 500  # detail kept per scope; counts continue past it
+MAX_TRACKED = 500  # distinct scope names / shapes in the aggregates
+
+UNSCOPED = "unscoped"
+_KEEP_VALUE_PARAMS = {"select", "order", "on_conflict", "columns"}
+
+
+@dataclass
+class DbCall:
+    method: str
+    table: str
+    shape: str
+    seconds: float
+    blocking: bool
+    status: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class DbScope:
+    name: str
+    repeat_threshold: Optional[int] = N_PLUS_ONE_THRESHOLD
+    calls: list[DbCall] = field(default_factory=list)
+    call_count: int = 0
+    total_seconds: float = 0.0
+    blocking_seconds: float = 0.0
+    blocking_calls: int = 0
+    shapes: Counter = field(default_factory=Counter)
+    repeated: list[str] = field(default_factory=list)
+    closed: bool = False
+
+    def record(self, call: DbCall) -> None:
+        self.call_count += 1
+        self.total_seconds += call.seconds
+        if call.blocking:
+            self.blocking_calls += 1
+            self.blocking_seconds += call.seconds
+        if len(self.calls) < MAX_CALLS_PER_SCOPE:
+            self.calls.append(call)
+        self.shapes[call.shape] += 1
+        if self.repeat_threshold is not None and self.shapes[call.shape] == self.repeat_threshold + 1:
+            self.repeated.append(call.shape)
+            logger.warning(
+                f"Possible N+1 in {self.name}: {call.shape} issued more than "
+                f"{self.repeat_threshold} times"
+            )
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: total and loop-blocking DB time."""
+        value = f'db;dur={self.total_seconds * 1000:.1f};desc="{self.call_count} calls"'
+        if self.blocking_calls:
+            value += (
+                f', db-blocking;dur={self.blocking_seconds * 1000:.1f};'
+                f'desc="{self.blocking_calls} calls on event loop"'
+            )
+        return value
+
+
+_current: contextvars.ContextVar[Optional[DbScope]] = contextvars.ContextVar("db_scope", default=None)
+_lock = threading.Lock()
+_scope_stats: dict[str, dict] = {}
+_shape_stats: dict[str, dict] = {}
+_observers: list[Callable[[DbScope], None]] = []
+
+
+# ----------------------------------------------------------------------
+# Call classification
+# ----------------------------------------------------------------------
+
+def query_shape(method: str, url: httpx.URL) -> tuple[str, str]:
+    """(table, shape) for a PostgREST request; filter values are dropped."""
+    path = url.path
+    table = path.split("/rest/v1/", 1)[1] if "/rest/v1/" in path else path
+    parts = []
+    for key, value in sorted(parse_qsl(url.query.decode(), keep_blank_values=True)):
+        if key in _KEEP_VALUE_PARAMS:
+            parts.append(f"{key}={value}")
+        elif key in ("limit", "offset"):
+            parts.append(key)
+        else:
+            parts.append(f"{key}={value.split('.', 1)[0]}")
+    shape = f"{method} {table}"
+    return table, f"{shape}?{'&'.join(parts)}" if parts else shape
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+# ----------------------------------------------------------------------
+# Recording
+# ----------------------------------------------------------------------
+
+def _bump(stats: dict, key: str, default: Callable[[], dict]) -> dict:
+    entry = stats.get(key)
+    if entry is None:
+        if len(stats) >= MAX_TRACKED:
+            key = "other"
+            entry = stats.get(key)
+        if entry is None:
+            entry = stats[key] = default()
+    return entry
+
+
+def _new_shape() -> dict:
+    return {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "blocking_calls": 0, "errors": 0}
+
+
+def _new_scope() -> dict:
+    return {
+        "scopes": 0, "calls": 0, "max_calls": 0, "total_seconds": 0.0,
+        "blocking_calls": 0, "n_plus_one": 0, "tables": Counter(),
+    }
+
+
+def _record(call: DbCall) -> None:
+    scope = _current.get()
+    with _lock:
+        shape = _bump(_shape_stats, call.shape, _new_shape)
+        shape["calls"] += 1
+        shape["total_seconds"] += call.seconds
+        shape["max_seconds"] = max(shape["max_seconds"], call.seconds)
+        shape["blocking_calls"] += call.blocking
+        shape["errors"] += call.error is not None
+        if scope is not None and not scope.closed:
+            scope.record(call)
+            return
+        # No open scope (startup, or a task that outlived its request)
+        entry = _bump(_scope_stats, UNSCOPED, _new_scope)
+        entry["calls"] += 1
+        entry["total_seconds"] += call.seconds
+        entry["blocking_calls"] += call.blocking
+        entry["tables"][call.table] += 1
+
+
+def _fold(scope: DbScope) -> None:
+    with _lock:
+        entry = _bump(_scope_stats, scope.name, _new_scope)
+        entry["scopes"] += 1
+        entry["calls"] += scope.call_count
+        entry["max_calls"] = max(entry["max_calls"], scope.call_count)
+        entry["total_seconds"] += scope.total_seconds
+        entry["blocking_calls"] += scope.blocking_calls
+        entry["n_plus_one"] += len(scope.repeated)
+        for call in scope.calls:
+            entry["tables"][call.table] += 1
+    for observer in list(_observers):
+        observer(scope)
+
+
+@contextmanager
+def db_scope(name: str, repeat_threshold: Optional[int] = N_PLUS_ONE_THRESHOLD) -> Iterator[DbScope]:
+    """Attribute DB calls made inside the block (and its to_thread calls) to `name`."""
+    scope = DbScope(name, repeat_threshold)
+    token = _current.set(scope)
+    try:
+        yield scope
+    finally:
+        _current.reset(token)
+        scope.closed = True
+        _fold(scope)
+
+
+def db_job(name: str, repeat_threshold: Optional[int] = N_PLUS_ONE_THRESHOLD):
+    """Decorator: run an async background job in its own db_scope("job:<name>")."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with db_scope(f"job:{name}", repeat_threshold):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_scope() -> Optional[DbScope]:
+    return _current.get()
+
+
+# ----------------------------------------------------------------------
+# Transport instrumentation
+# ----------------------------------------------------------------------
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """Delegating transport that records every request it sends."""
+
+    def __init__(self, inner: httpx.BaseTransport):
+        self.inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        table, shape = query_shape(request.method, request.url)
+        blocking = _on_event_loop()
+        started = time.perf_counter()
+        status = error = None
+        try:
+            response = self.inner.handle_request(request)
+            status = response.status_code
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            try:
+                _record(DbCall(request.method, table, shape, time.perf_counter() - started, blocking, status, error))
+            except Exception as e:  # instrumentation must never fail a query
+                logger.warning(f"DB call instrumentation failed: {e}")
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+def instrument_http_client(client: httpx.Client) -> httpx.Client:
+    """Wrap `client`'s transport in place (idempotent)."""
+    if not isinstance(client._transport, InstrumentedTransport):
+        client._transport = InstrumentedTransport(client._transport)
+    return client
+
+
+def instrument_supabase(supabase) -> None:
+    """Instrument a supabase-py client's PostgREST session; fail open."""
+    try:
+        instrument_http_client(supabase.postgrest.session)
+    except Exception as e:
+        logger.warning(f"Could not instrument Supabase client: {e}")
+
+
+# ----------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------
+
+def stats(top: int = 25) -> dict:
+    with _lock:
+        scopes = {
+            name: {
+                **{k: v for k, v in entry.items() if k != "tables"},
+                "total_seconds": round(entry["total_seconds"], 4),
+                "avg_calls": round(entry["calls"] / entry["scopes"], 2) if entry["scopes"] else None,
+                "tables": dict(entry["tables"].most_common(10)),
+            }
+            for name, entry in _scope_stats.items()
+        }
+        shapes = sorted(_shape_stats.items(), key=lambda kv: -kv[1]["total_seconds"])[:top]
+        return {
+            "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+            "scopes": dict(sorted(scopes.items(), key=lambda kv: -kv[1]["calls"])),
+            "top_shapes": {
+                shape: {
+                    **entry,
+                    "total_seconds": round(entry["total_seconds"], 4),
+                    "max_seconds": round(entry["max_seconds"], 4),
+                }
+                for shape, entry in shapes
+            },
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _scope_stats.clear()
+        _shape_stats.clear()
+
+
+# ----------------------------------------------------------------------
+# Test helper
+# ----------------------------------------------------------------------
+
+@dataclass
+class QueryBudget:
+    scopes: list[DbScope] = field(default_factory=list)
+
+    @property
+    def calls(self) -> list[DbCall]:
+        return [call for scope in self.scopes for call in scope.calls]
+
+    @property
+    def shapes(self) -> Counter:
+        return sum((scope.shapes for scope in self.scopes), Counter())
+
+
+@contextmanager
+def query_budget(max_calls: Optional[int] = None, max_repeats: Optional[int] = None) -> Iterator[QueryBudget]:
+    """Assert DB call budgets for everything that runs inside the block.
+
+    Each scope closed inside the block (one per request handled by the app,
+    plus the block's own scope for direct calls) must make at most
+    `max_calls` calls and issue no shape more than `max_repeats` times.
+    """
+    budget = QueryBudget()
+    _observers.append(budget.scopes.append)
+    try:
+        with db_scope("query_budget", repeat_threshold=None):
+            yield budget
+    finally:
+        _observers.remove(budget.scopes.append)
+
+    for scope in budget.scopes:
+        listing = "\n".join(f"  {n} x {shape}" for shape, n in scope.shapes.most_common())
+        if max_calls is not None and scope.call_count > max_calls:
+            raise AssertionError(f"{scope.name}: {scope.call_count} DB calls > budget {max_calls}\n{listing}")
+        repeated = [s for s, n in scope.shapes.items() if max_repeats is not None and n > max_repeats]
+        if repeated:
+            raise AssertionError(f"{scope.name}: shapes repeated more than {max_repeats} times\n{listing}")
@@ -2,32 +2,21 @@
 Document Processing & RAG Module for TeleAgent
 Handles file upload, smart chunking, embedding generation, and semantic search
 """
-import os
 import io
 import re
 import uuid
 import logging
-import tiktoken
+from functools import lru_cache
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timezone
-import fitz  # PyMuPDF
-from docx import Document as DocxDocument
-import pandas as pd
-from openai import AsyncOpenAI
-
+from llm_gateway import get_gateway, get_openai_client as _pooled_openai_client
 from token_logger import log_token_usage_fire_and_forget
 
 logger = logging.getLogger(__name__)
 
-# Lazy initialization of OpenAI client
-_openai_client = None
-
 def get_openai_client():
-    """Get or create OpenAI client with lazy initialization"""
-    global _openai_client
-    if _openai_client is None:
-        _openai_client = AsyncOpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
-    return _openai_client
+    """Shared pooled OpenAI client (owned by llm_gateway)"""
+    return _pooled_openai_client()
 
 # Embedding model config
 EMBEDDING_MODEL = "text-embedding-3-small"
@@ -38,13 +27,20 @@ MAX_CHUNK_TOKENS = 500
 CHUNK_OVERLAP_TOKENS = 100
 MIN_CHUNK_TOKENS = 50
 
-# Initialize tokenizer for chunk size calculation
-tokenizer = tiktoken.encoding_for_model("gpt-4")
+# tiktoken and the PDF/DOCX/Excel parsers are imported on first use: loading
+# them (and the tokenizer's BPE file, fetched over the network on a cold
+# cache) at import time cost every worker boot, even ones that never see a file.
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """Tokenizer for chunk size calculation, loaded on first use"""
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-4")
 
 
 def count_tokens(text: str) -> int:
     """Count tokens in text using tiktoken"""
-    return len(tokenizer.encode(text))
+    return len(get_tokenizer().encode(text))
 
 
 def split_into_sentences(text: str) -> List[str]:
@@ -174,6 +170,8 @@ def process_pdf(file_content: bytes, filename: str) -> List[Dict]:
     Extract text from PDF with structure preservation.
     Returns chunks with section awareness.
     """
+    import fitz  # PyMuPDF
+
     chunks = []
     try:
         doc = fitz.open(stream=file_content, filetype="pdf")
@@ -204,6 +202,8 @@ def process_docx(file_content: bytes, filename: str) -> List[Dict]:
     """
     Extract text from DOCX with paragraph and table handling.
     """
+    from docx import Document as DocxDocument
+
     chunks = []
     try:
         doc = DocxDocument(io.BytesIO(file_content))
@@ -274,6 +274,8 @@ def process_excel(file_content: bytes, filename: str) -> List[Dict]:
     Process Excel/CSV files - great for product catalogs.
     Each row becomes a searchable chunk with column context.
     """
+    import pandas as pd
+
     chunks = []
     try:
         # Try to read as Excel first, fall back to CSV
@@ -341,8 +343,10 @@ async def process_image(file_content: bytes, filename: str) -> List[Dict]:
             media_type = "image/jpeg"
         
         # Call GPT-4V for description
-        response = await get_openai_client().chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o",
+            purpose="image_description",
+            single_flight=False,
             messages=[
                 {
                     "role": "user",
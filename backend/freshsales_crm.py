@@ -5,11 +5,10 @@ API key authentication (no OAuth required).
 
 import httpx
 import logging
-import asyncio
-import time
 import re
 from typing import Optional, Dict, Any, List
-from collections import defaultdict
+
+from rate_limiter import TokenBucketLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -18,30 +17,11 @@ FRESHSALES_MAX_REQUESTS_PER_SECOND = 5
 FRESHSALES_RATE_LIMIT_WINDOW = 1.0
 
 
-class FreshsalesRateLimiter:
-    """Rate limiter for Freshsales API calls."""
-
-    def __init__(self, max_requests: int = FRESHSALES_MAX_REQUESTS_PER_SECOND, window: float = FRESHSALES_RATE_LIMIT_WINDOW):
-        self.max_requests = max_requests
-        self.window = window
-        self._requests = defaultdict(list)
-        self._lock = asyncio.Lock()
-
-    async def acquire(self, key: str = "default"):
-        async with self._lock:
-            now = time.time()
-            self._requests[key] = [t for t in self._requests[key] if now - t < self.window]
-            if len(self._requests[key]) >= self.max_requests:
-                oldest = min(self._requests[key])
-                wait_time = self.window - (now - oldest)
-                if wait_time > 0:
-                    await asyncio.sleep(wait_time)
-                    now = time.time()
-                    self._requests[key] = [t for t in self._requests[key] if now - t < self.window]
-            self._requests[key].append(now)
-
-
-_freshsales_rate_limiter = FreshsalesRateLimiter()
+_freshsales_rate_limiter = TokenBucketLimiter(
+    "freshsales",
+    rate=FRESHSALES_MAX_REQUESTS_PER_SECOND / FRESHSALES_RATE_LIMIT_WINDOW,
+    capacity=FRESHSALES_MAX_REQUESTS_PER_SECOND,
+)
 
 
 class FreshsalesAPIError(Exception):
@@ -1,14 +1,17 @@
 """Google Sheets read+write service using gspread + service account."""
 
+from __future__ import annotations
+
 import os
 import json
 import logging
 import time
 from typing import Optional, Dict, List, Any
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import gspread
-from google.oauth2.service_account import Credentials
+if TYPE_CHECKING:
+    import gspread
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +42,8 @@ FIELD_LABEL_MAP = {
     "collect_notes": "Extra Notes",
 }
 
-# Module-level gspread client (lazy-initialized)
+# Module-level gspread client (lazy-initialized; gspread and the Google auth
+# stack are imported with it, so tenants without Sheets never load them)
 _gspread_client: Optional[gspread.Client] = None
 _service_account_email: Optional[str] = None
 
@@ -77,6 +81,9 @@ def get_gspread_client() -> Optional[gspread.Client]:
         return None
 
     try:
+        import gspread
+        from google.oauth2.service_account import Credentials
+
         creds = Credentials.from_service_account_info(creds_info, scopes=SCOPES)
         _gspread_client = gspread.authorize(creds)
         logger.info("gspread client initialized with service account")
@@ -106,6 +113,8 @@ def verify_sheet_access(sheet_id: str) -> Dict[str, Any]:
     Verify the service account can access a sheet.
     Returns {"ok": True, "title": "...", "tabs": [...]} or {"ok": False, "error": "..."}.
     """
+    import gspread
+
     gc = get_gspread_client()
     if not gc:
         return {"ok": False, "error": "Google Sheets service not configured"}
@@ -185,6 +194,8 @@ def append_lead_row(sheet_id: str, row_data: List[str]) -> Dict[str, Any]:
     row_data must match the header column order.
     Returns {"ok": True, "row": row_number} or {"ok": False, "error": "..."}.
     """
+    import gspread
+
     gc = get_gspread_client()
     if not gc:
         return {"ok": False, "error": "Google Sheets service not configured"}
@@ -210,6 +221,8 @@ def update_lead_row(sheet_id: str, telegram_id: str, col_updates: Dict[int, str]
     col_updates: {column_index (1-based): new_value}
     Returns {"ok": True, "row": row_number} or {"ok": False, "error": "..."}.
     """
+    import gspread
+
     gc = get_gspread_client()
     if not gc:
         return {"ok": False, "error": "Google Sheets service not configured"}
@@ -5,11 +5,10 @@ OAuth 2.0 authorization code flow, contact + deal management.
 
 import httpx
 import logging
-import asyncio
-import time
 import os
 from typing import Optional, Dict, Any, List
-from collections import defaultdict
+
+from rate_limiter import TokenBucketLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -25,30 +24,11 @@ HUBSPOT_CLIENT_SECRET = os.environ.get("HUBSPOT_CLIENT_SECRET", "")
 HUBSPOT_SCOPES = "crm.objects.contacts.write crm.objects.contacts.read crm.objects.deals.write crm.objects.deals.read"
 
 
-class HubSpotRateLimiter:
-    """Rate limiter for HubSpot API calls."""
-
-    def __init__(self, max_requests: int = HUBSPOT_MAX_REQUESTS_PER_SECOND, window: float = HUBSPOT_RATE_LIMIT_WINDOW):
-        self.max_requests = max_requests
-        self.window = window
-        self._requests = defaultdict(list)
-        self._lock = asyncio.Lock()
-
-    async def acquire(self, key: str = "default"):
-        async with self._lock:
-            now = time.time()
-            self._requests[key] = [t for t in self._requests[key] if now - t < self.window]
-            if len(self._requests[key]) >= self.max_requests:
-                oldest = min(self._requests[key])
-                wait_time = self.window - (now - oldest)
-                if wait_time > 0:
-                    await asyncio.sleep(wait_time)
-                    now = time.time()
-                    self._requests[key] = [t for t in self._requests[key] if now - t < self.window]
-            self._requests[key].append(now)
-
-
-_hubspot_rate_limiter = HubSpotRateLimiter()
+_hubspot_rate_limiter = TokenBucketLimiter(
+    "hubspot",
+    rate=HUBSPOT_MAX_REQUESTS_PER_SECOND / HUBSPOT_RATE_LIMIT_WINDOW,
+    capacity=HUBSPOT_MAX_REQUESTS_PER_SECOND,
+)
 
 
 class HubSpotAPIError(Exception):
@@ -0,0 +1,218 @@
+"""
+Lead Field Extractor — layered CRM field extraction for the sales pipeline.
+==========================================================================
+Contact details used to be extracted by a second gpt-4o-mini call after
+every FAQ-routed reply, followed by its own leads update. Most of those
+extractions are trivial — a phone number, an email, "my name is …" — so
+extraction is now layered, cheapest first:
+
+    1. local     compiled regex detectors (UZ / RU / EN cues), phone numbers
+                 validated and normalized to E.164 (python-phonenumbers, or
+                 the UZ / RU / KZ numbering rules below without it)
+    2. model     the fields_collected object both responders already return
+                 as part of their JSON reply schema
+    3. fallback  extract_crm_fields() — only when the message carries cues
+                 for a field that neither layer above resolved
+
+The layers are merged into the single lead write for the turn
+(merge_extracted_fields: fallback < model < local for the same key, except
+names, where the model's reading of the dialogue beats a regex cue).
+
+Public surface
+--------------
+    local = extract_local_fields(text)          # LocalExtraction(fields, unresolved)
+    if needs_llm_fallback(local, model_fields): ...
+    fields = merge_extracted_fields(model_fields, local, fallback_fields)
+    get_extractor_stats()
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+try:
+    import phonenumbers
+except ImportError:  # in requirements.txt; the regex rules below keep dev setups working
+    phonenumbers = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PHONE_REGION = "UZ"
+
+# Uzbek mobile / fixed-line operator prefixes (after +998)
+_UZ_PREFIXES = {
+    "20", "33", "50", "55", "61", "62", "65", "66", "67", "69", "70", "71", "72",
+    "73", "74", "75", "76", "77", "78", "79", "88", "90", "91", "93", "94", "95",
+    "97", "98", "99",
+}
+
+_PHONE_CANDIDATE = re.compile(r"(?<![\w+])(\+?\d[\d\s\-().]{5,18}\d)(?!\w)")
+_AMOUNT = re.compile(r"^\d{1,3}(?:[ .,]\d{3})+$")  # 1 500 000 / 2.500.000
+_DATE = re.compile(r"^\d{1,4}[-./]\d{1,2}[-./]\d{1,4}$")
+_EMAIL = re.compile(r"(?<![\w.+-])([A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,})")
+
+_NAME_WORD = r"[^\W\d_][^\W\d_'’ʻʼ`-]*(?:['’ʻʼ`-][^\W\d_]+)*"
+_NAME_CUES = re.compile(
+    r"(?:\bmy name is|\bmy name's|\bменя зовут|\bмо[её] имя|"
+    r"\bmening ismim|\bismim|\bменинг исмим|\bисмим)"
+    rf"\s*[:\-—]?\s*(?P<name>{_NAME_WORD}(?:\s+{_NAME_WORD})?)?",
+    re.IGNORECASE,
+)
+# Free-text fields where the model's value beats the regex layer's
+_MODEL_PREFERRED = {"name"}
+# Words that can follow a name cue but are not part of the name
+_NAME_STOPWORDS = {
+    "and", "from", "is", "the", "not", "bo'ladi", "boladi", "bo‘ladi", "va", "edi",
+    "и", "а", "из", "не", "бўлади", "ва",
+}
+
+_BUDGET_CUE = re.compile(
+    r"\d[\d\s.,]*\s*(?:\$|usd|dollar|so['’ʻ]?m\b|sum\b|сум|руб|доллар|mln|млн|million|миллион|"
+    r"ming\b|тыс|k\b)|\$\s*\d|\bbudget|\bбюджет|\bbyudjet",
+    re.IGNORECASE,
+)
+_TIMELINE_CUE = re.compile(
+    r"\b(?:today|tomorrow|next (?:week|month)|this (?:week|month)|asap|"
+    r"сегодня|завтра|на (?:этой|следующей) неделе|в (?:этом|следующем) месяце|срочно|"
+    r"bugun|ertaga|shu hafta|keyingi (?:hafta|oy)|tezroq)\b",
+    re.IGNORECASE,
+)
+
+_stats = {"messages": 0, "local_fields": 0, "fallback_calls": 0}
+
+
+@dataclass
+class LocalExtraction:
+    fields: dict = field(default_factory=dict)
+    unresolved: set = field(default_factory=set)  # fields with cues the regex layer couldn't settle
+
+
+def get_extractor_stats() -> dict:
+    messages = _stats["messages"]
+    return {
+        **_stats,
+        "fallback_rate": round(_stats["fallback_calls"] / messages, 4) if messages else 0.0,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Phone numbers
+# ---------------------------------------------------------------------------
+
+def normalize_phone_number(candidate: str, region: str = DEFAULT_PHONE_REGION) -> Optional[str]:
+    """E.164 form of a phone number as typed in chat, or None if it isn't one."""
+    if phonenumbers is not None:
+        try:
+            parsed = phonenumbers.parse(candidate, region)
+        except phonenumbers.NumberParseException:
+            return None
+        if not phonenumbers.is_valid_number(parsed):
+            return None
+        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+    digits = re.sub(r"\D", "", candidate)
+    international = candidate.lstrip().startswith("+")
+    if digits.startswith("998") and len(digits) == 12 and digits[3:5] in _UZ_PREFIXES:
+        return "+" + digits
+    if not international and len(digits) == 9 and digits[:2] in _UZ_PREFIXES:
+        return "+998" + digits
+    if len(digits) == 11 and digits[0] in "78" and digits[1] in "3479":
+        return "+7" + digits[1:]  # RU / KZ, incl. the domestic 8 prefix
+    if international and 10 <= len(digits) <= 15:
+        return "+" + digits
+    return None
+
+
+def _extract_phone(text: str, result: LocalExtraction) -> None:
+    for match in _PHONE_CANDIDATE.finditer(text):
+        candidate = match.group(1).strip()
+        if _AMOUNT.match(candidate) or _DATE.match(candidate):
+            continue
+        if len(re.sub(r"\D", "", candidate)) < 7:
+            continue
+        phone = normalize_phone_number(candidate)
+        if phone:
+            result.fields["phone"] = phone
+            result.unresolved.discard("phone")
+            return
+        result.unresolved.add("phone")
+
+
+# ---------------------------------------------------------------------------
+# Layers
+# ---------------------------------------------------------------------------
+
+def extract_local_fields(text: str) -> LocalExtraction:
+    """Regex / phone-library layer. Only explicit, unambiguous statements count."""
+    result = LocalExtraction()
+    if not text:
+        return result
+    _stats["messages"] += 1
+
+    _extract_phone(text, result)
+
+    email = _EMAIL.search(text)
+    if email:
+        result.fields["email"] = email.group(1).lower()
+
+    for match in _NAME_CUES.finditer(text):
+        words = (match.group("name") or "").split()
+        while words and words[-1].lower() in _NAME_STOPWORDS:
+            words.pop()
+        if words and words[0].lower() not in _NAME_STOPWORDS and 2 <= len(" ".join(words)) <= 40:
+            result.fields["name"] = " ".join(w[:1].upper() + w[1:] for w in words)
+            result.unresolved.discard("name")
+            break
+        result.unresolved.add("name")
+
+    if _BUDGET_CUE.search(text):
+        result.unresolved.add("budget")
+    if _TIMELINE_CUE.search(text):
+        result.unresolved.add("timeline")
+
+    _stats["local_fields"] += len(result.fields)
+    return result
+
+
+def _present(fields: Optional[dict], key: str) -> bool:
+    return bool(fields) and fields.get(key) not in (None, "")
+
+
+def needs_llm_fallback(local: LocalExtraction, model_fields: Optional[dict], existing_fields: Optional[dict] = None) -> bool:
+    """
+    True when the message mentions a field that neither the regex layer nor
+    the responder's structured output resolved. Budget / timeline cues are
+    ignored once the lead already has that field.
+    """
+    for key in local.unresolved:
+        if _present(model_fields, key):
+            continue
+        if key in ("budget", "timeline") and _present(existing_fields, key):
+            continue
+        _stats["fallback_calls"] += 1
+        return True
+    return False
+
+
+def merge_extracted_fields(
+    model_fields: Optional[dict],
+    local: Optional[LocalExtraction] = None,
+    fallback_fields: Optional[dict] = None,
+) -> dict:
+    """Combine the layers for one lead write; empty values never overwrite."""
+    merged: dict = {}
+    for layer in (fallback_fields, model_fields, local.fields if local else None):
+        if not isinstance(layer, dict):
+            continue
+        for key, value in layer.items():
+            if value not in (None, ""):
+                merged[key] = value
+            else:
+                merged.setdefault(key, None)
+    for key in _MODEL_PREFERRED:
+        if isinstance(model_fields, dict) and _present(model_fields, key):
+            merged[key] = model_fields[key]
+    return merged
@@ -0,0 +1,261 @@
+"""
+Leader Election — one worker runs the singleton background jobs.
+================================================================
+Startup handlers used to launch the Instagram token refresher and one CRM
+incremental sync loop per tenant in every worker process, so N workers
+synced every CRM N times concurrently and blew through the CRMs' rate
+limits. Now exactly one worker — the holder of a lease — runs them.
+
+The lease is a row in worker_leases (migration 023), taken and renewed with
+acquire_worker_lease(): an upsert that only succeeds when the row is free,
+expired, or already ours. A session advisory lock would need a dedicated
+Postgres connection, which the PostgREST client does not have.
+
+    ttl             LEASE_TTL — a leader that stops renewing loses the lease
+                    this long after its last renewal
+    renew_interval  every worker calls acquire on this cadence; the holder
+                    renews, the others take over as soon as it has expired
+    release         a leader that shuts down cleanly deletes its row and
+                    broadcasts LEADER_RELEASED_CHANNEL (shared_state), so the
+                    others retry immediately instead of waiting out the TTL
+
+On election the registered singleton jobs start as tasks (so slow job setup
+never delays lease renewal); on losing the lease they are cancelled and the
+on_demoted hooks run. If the lease RPC is unavailable (migration not applied
+yet) the worker runs the jobs itself, as before, and keeps retrying; a leader
+that cannot reach the database steps down before its lease would expire.
+
+Public surface
+--------------
+    elector = LeaderElector(supabase)
+    elector.singleton("instagram_token_refresh", refresh_loop)   # async factory
+    elector.on_demoted(hook)                                     # async cleanup hook
+    await elector.start() / await elector.stop()
+    set_elector(elector); is_leader(); get_leader_stats()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from shared_state import get_shared_state, subscribe
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "background_jobs"
+LEASE_TTL = 30  # seconds
+RENEW_INTERVAL = 10  # seconds
+LEADER_RELEASED_CHANNEL = "leader_released"
+
+JobFactory = Callable[[], Awaitable[None]]
+Hook = Callable[[], Awaitable[None]]
+
+_elector: Optional["LeaderElector"] = None
+
+
+class LeaderElector:
+    def __init__(
+        self,
+        supabase,
+        name: str = LEASE_NAME,
+        ttl: float = LEASE_TTL,
+        renew_interval: float = RENEW_INTERVAL,
+        holder_id: Optional[str] = None,
+    ):
+        self.supabase = supabase
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.holder_id = holder_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+        self._jobs: dict[str, JobFactory] = {}
+        self._running: dict[str, asyncio.Task] = {}
+        self._demoted_hooks: list[Hook] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._lease_supported: Optional[bool] = None  # None until the first RPC answers
+        self._lease_valid_until = 0.0
+        self._stats = {"elections": 0, "demotions": 0, "renewals": 0, "errors": 0}
+
+    # ------------------------------------------------------------------
+    # Registration
+    # ------------------------------------------------------------------
+
+    def singleton(self, name: str, factory: JobFactory) -> None:
+        """Run `await factory()` as a task while this worker leads; cancel it on demotion."""
+        self._jobs[name] = factory
+        if self.is_leader and name not in self._running:
+            self._start_job(name)
+
+    def on_demoted(self, hook: Hook) -> None:
+        self._demoted_hooks.append(hook)
+
+    # ------------------------------------------------------------------
+    # Lease
+    # ------------------------------------------------------------------
+
+    async def _acquire(self) -> bool:
+        result = await asyncio.to_thread(
+            lambda: self.supabase.rpc("acquire_worker_lease", {
+                "p_name": self.name, "p_holder": self.holder_id, "p_ttl_seconds": int(self.ttl),
+            }).execute()
+        )
+        return result.data is True
+
+    async def _release(self) -> None:
+        await asyncio.to_thread(
+            lambda: self.supabase.rpc("release_worker_lease", {
+                "p_name": self.name, "p_holder": self.holder_id,
+            }).execute()
+        )
+
+    async def _tick(self) -> None:
+        """One acquire/renew attempt and the resulting state transition."""
+        started = time.monotonic()
+        try:
+            held = await self._acquire()
+        except Exception as e:
+            self._stats["errors"] += 1
+            if self._lease_supported is None:
+                # Lease RPC never answered (migration missing / DB down at boot):
+                # behave like a single worker rather than run nothing
+                if not self.is_leader:
+                    logger.warning(f"Leader election unavailable, running background jobs on this worker: {e}")
+                    await self._become_leader()
+                return
+            # The next attempt would come after expiry, when another worker may already lead
+            if self.is_leader and time.monotonic() + self.renew_interval >= self._lease_valid_until:
+                logger.warning(f"Leader lease could not be renewed before expiry, stepping down: {e}")
+                await self._step_down()
+            else:
+                logger.warning(f"Leader lease check failed: {e}")
+            return
+
+        self._lease_supported = True
+        if held:
+            self._lease_valid_until = started + self.ttl
+            self._stats["renewals"] += 1
+            if not self.is_leader:
+                await self._become_leader()
+        elif self.is_leader:
+            logger.warning(f"Leader lease {self.name} lost to another worker")
+            await self._step_down()
+
+    async def _become_leader(self) -> None:
+        self.is_leader = True
+        self._stats["elections"] += 1
+        logger.info(f"Worker {self.holder_id} elected leader for {self.name}")
+        for name in self._jobs:
+            self._start_job(name)
+
+    async def _step_down(self) -> None:
+        self.is_leader = False
+        self._stats["demotions"] += 1
+        logger.info(f"Worker {self.holder_id} stepped down as leader for {self.name}")
+        for task in self._running.values():
+            task.cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        self._running.clear()
+        for hook in self._demoted_hooks:
+            await self._run_hook(hook)
+
+    def _start_job(self, name: str) -> None:
+        async def _guarded():
+            try:
+                await self._jobs[name]()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Singleton job {name} crashed: {e}")
+            finally:
+                self._running.pop(name, None)
+
+        self._running[name] = asyncio.create_task(_guarded())
+
+    async def _run_hook(self, hook: Hook) -> None:
+        try:
+            await hook()
+        except Exception as e:
+            logger.warning(f"Leader election hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            await self._tick()
+            self._wake.clear()
+            # Followers poll with jitter so they don't hit the lease row in lockstep
+            delay = self.renew_interval if self.is_leader else self.renew_interval * random.uniform(0.8, 1.2)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def wake(self) -> None:
+        """Retry the lease now (e.g. the leader announced it is leaving)."""
+        if self._wake is not None and not self.is_leader:
+            self._wake.set()
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the election loop and, if leading, hand the lease back."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._step_down()
+            if self._lease_supported:
+                try:
+                    await self._release()
+                    await get_shared_state().publish(LEADER_RELEASED_CHANNEL, {"name": self.name})
+                except Exception as e:
+                    logger.warning(f"Leader lease release failed (expires in {self.ttl:.0f}s): {e}")
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "holder_id": self.holder_id,
+            "is_leader": self.is_leader,
+            "lease_supported": self._lease_supported,
+            "jobs": sorted(self._running),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Process-wide elector
+# ---------------------------------------------------------------------------
+
+def set_elector(elector: Optional[LeaderElector]) -> None:
+    global _elector
+    _elector = elector
+
+
+def is_leader() -> bool:
+    """True on the current leader — and everywhere when no election runs (scripts, tests)."""
+    return _elector is None or _elector.is_leader
+
+
+def get_leader_stats() -> dict:
+    return _elector.stats() if _elector else {"is_leader": True, "election": "disabled"}
+
+
+def _on_leader_released(data: dict) -> None:
+    if _elector is not None and data.get("name") == _elector.name:
+        _elector.wake()
+
+
+subscribe(LEADER_RELEASED_CHANNEL, _on_leader_released)
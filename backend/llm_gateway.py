@@ -0,0 +1,569 @@
+"""
+LLM Gateway — one front door for every LLM call.
+=================================================
+Call sites used to talk to the OpenAI SDK / litellm directly, each with its
+own timeout and no shared retry policy. The gateway owns:
+
+    Pooled clients      one AsyncOpenAI on a bounded keep-alive httpx pool
+                        (SDK retries off — the gateway retries), and a shared
+                        httpx session for litellm.
+    Concurrency budgets a global semaphore plus one per tenant, so one noisy
+                        tenant can't take every connection. Time spent waiting
+                        is reported as queue time.
+    Single-flight       identical in-flight requests (same tenant, provider,
+                        model, messages, params) share one upstream call.
+                        Only the leader's response carries token usage;
+                        coalesced callers get a copy with zero usage, so
+                        each upstream call is billed once.
+    Hedging             opt-in: if the first attempt hasn't answered after the
+                        model's observed p95 (or HEDGE_DELAY), a second
+                        attempt races it; the first success wins.
+    Circuit breakers    per model: BREAKER_FAILURES consecutive transient
+                        failures open the breaker for BREAKER_COOLDOWN s, then
+                        one probe call decides whether it closes.
+    Fallback            when the primary's breaker is open, or its rolling p95
+                        / error rate passes its threshold, the call goes to
+                        FALLBACK_MODELS[primary] (a faster model of the same
+                        provider family, so prompt format is unchanged).
+    Metrics             every call records latency, queue time, tokens and
+                        outcome per model in one place — see stats().
+
+Streaming calls (stream=True) share budgets, breakers and fallback but are
+never coalesced or hedged; their latency is time to the first byte.
+
+`timeout` bounds each attempt. `deadline`, when given, bounds the whole call
+— queueing, retries, backoff and hedges included — and raises
+asyncio.TimeoutError when it passes.
+
+Public surface
+--------------
+    from llm_gateway import get_gateway, get_openai_client
+
+    response = await get_gateway().chat_completion(
+        model="gpt-4o-mini", messages=[...], tenant_id=tid, purpose="intent",
+        timeout=10.0, deadline=10.0, hedge=True, temperature=0,
+    )
+    response = await get_gateway().chat_completion(..., provider="litellm")
+    text = await get_gateway().transcribe(tenant_id=tid, model="whisper-1", file=f)
+    get_gateway().stats()
+    served_model(response, requested_model)   # model that actually answered
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+import httpx
+
+from token_logger import cached_prompt_tokens
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60.0  # seconds per attempt
+GLOBAL_CONCURRENCY = int(os.environ.get("LLM_GLOBAL_CONCURRENCY", "64"))
+TENANT_CONCURRENCY = int(os.environ.get("LLM_TENANT_CONCURRENCY", "8"))
+POOL_MAX_CONNECTIONS = 100
+POOL_KEEPALIVE = 20
+
+MAX_RETRIES = 2  # transient failures only
+RETRY_BACKOFF = 0.5  # seconds, doubled per retry
+HEDGE_DELAY = 8.0  # hedge delay until a model has MIN_SAMPLES of latency data
+
+LATENCY_WINDOW = 200  # samples kept per model
+WINDOW_SECONDS = 300  # ...and only the last 5 minutes of them count
+MIN_SAMPLES = 20
+ERROR_RATE_THRESHOLD = 0.25
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30.0
+
+# p95 (seconds) above which a model is considered degraded
+P95_THRESHOLDS = {
+    "gpt-4o": 20.0,
+    "gpt-4.1": 20.0,
+    "claude-sonnet-4-20250514": 25.0,
+    "claude-3-5-sonnet-20241022": 25.0,
+}
+DEFAULT_P95_THRESHOLD = 15.0
+
+# Degraded primary → faster model of the same provider family
+FALLBACK_MODELS = {
+    "gpt-4o": "gpt-4o-mini",
+    "gpt-4.1": "gpt-4.1-mini",
+    "claude-sonnet-4-20250514": "claude-haiku-4-5-20251001",
+    "claude-3-5-sonnet-20241022": "claude-3-5-haiku-20241022",
+}
+
+_TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_TRANSIENT_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ServiceUnavailableError", "Timeout", "APIError",
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """The model's breaker is open and no healthy fallback is configured."""
+
+
+def _is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in _TRANSIENT_STATUS
+    return type(exc).__name__ in _TRANSIENT_ERRORS
+
+
+def _split_provider(model: str) -> tuple[str, str]:
+    """'anthropic/claude-x' → ('anthropic/', 'claude-x')."""
+    prefix, _, bare = model.rpartition("/")
+    return (prefix + "/" if prefix else ""), bare
+
+
+def _without_usage(response: Any) -> Any:
+    """Shallow copy of a coalesced response whose usage counts are zero (billed by the leader)."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return response
+    clone, usage = copy.copy(response), copy.copy(usage)
+    for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        if hasattr(usage, name):
+            setattr(usage, name, 0)
+    for name in ("prompt_tokens_details", "completion_tokens_details"):
+        if hasattr(usage, name):
+            setattr(usage, name, None)
+    clone.usage = usage
+    return clone
+
+
+def served_model(response: Any, requested: str) -> str:
+    """
+    The model that actually produced `response` — the fallback when the
+    gateway switched away from `requested`, else `requested`. Used so token
+    billing is priced for the model that ran.
+    """
+    fallback = FALLBACK_MODELS.get(_split_provider(requested)[1])
+    returned = str(getattr(response, "model", "") or "")
+    if fallback and returned.startswith(fallback):
+        return fallback
+    return requested
+
+
+# ---------------------------------------------------------------------------
+# Per-model health
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ModelHealth:
+    """Rolling latency / error window and circuit breaker for one model."""
+
+    model: str
+    samples: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None
+    probing: bool = False
+    calls: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    queue_time: float = 0.0
+
+    def _recent(self) -> list[tuple[float, float, bool]]:
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        return [s for s in self.samples if s[0] >= cutoff]
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(lat for _, lat, ok in self._recent() if ok)
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def error_rate(self) -> Optional[float]:
+        recent = self._recent()
+        if len(recent) < MIN_SAMPLES:
+            return None
+        return sum(1 for _, _, ok in recent if not ok) / len(recent)
+
+    def degraded(self) -> bool:
+        p95 = self.p95()
+        threshold = P95_THRESHOLDS.get(_split_provider(self.model)[1], DEFAULT_P95_THRESHOLD)
+        if p95 is not None and p95 > threshold:
+            return True
+        rate = self.error_rate()
+        return rate is not None and rate > ERROR_RATE_THRESHOLD
+
+    def breaker_state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < BREAKER_COOLDOWN:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """May a call go to this model now? Half-open admits a single probe."""
+        state = self.breaker_state()
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record(self, latency: float, ok: bool, transient: bool = True) -> None:
+        self.calls += 1
+        self.samples.append((time.monotonic(), latency, ok))
+        if ok:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probing = False
+            return
+        self.errors += 1
+        if not transient:
+            return
+        self.consecutive_failures += 1
+        if self.probing or self.consecutive_failures >= BREAKER_FAILURES:
+            if self.opened_at is None or self.probing:
+                logger.warning(f"LLM circuit breaker opened for {self.model} "
+                               f"after {self.consecutive_failures} failures")
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+# ---------------------------------------------------------------------------
+# Gateway
+# ---------------------------------------------------------------------------
+
+_openai_client: Optional[AsyncOpenAI] = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """The process-wide pooled OpenAI client (SDK retries disabled)."""
+    global _openai_client
+    if _openai_client is None:
+        # Imported here: the SDK costs ~1s of worker boot and not every process calls OpenAI
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        _openai_client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            max_retries=0,
+            timeout=DEFAULT_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_KEEPALIVE,
+            )),
+        )
+    return _openai_client
+
+
+class LLMGateway:
+    """Budgets, single-flight, hedging, breakers and metrics for LLM calls."""
+
+    def __init__(
+        self,
+        global_concurrency: int = GLOBAL_CONCURRENCY,
+        tenant_concurrency: int = TENANT_CONCURRENCY,
+    ):
+        self.global_concurrency = global_concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self._global: Optional[asyncio.Semaphore] = None
+        self._tenants: dict[str, asyncio.Semaphore] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._health: dict[str, ModelHealth] = {}
+        self._litellm_ready = False
+        self._stats = {"calls": 0, "coalesced": 0, "hedges": 0, "hedge_wins": 0,
+                       "fallbacks": 0, "retries": 0, "rejected": 0}
+
+    # ------------------------------------------------------------------
+    # Providers
+    # ------------------------------------------------------------------
+
+    def _litellm(self):
+        import litellm
+
+        if not self._litellm_ready:
+            litellm.drop_params = True  # silently drop params a provider doesn't support
+            if getattr(litellm, "aclient_session", None) is None:
+                litellm.aclient_session = httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_KEEPALIVE,
+                ))
+            self._litellm_ready = True
+        return litellm
+
+    def _send(self, provider: str, model: str, messages: list, params: dict) -> Awaitable:
+        if provider == "litellm":
+            return self._litellm().acompletion(model=model, messages=messages, **params)
+        return get_openai_client().chat.completions.create(model=model, messages=messages, **params)
+
+    # ------------------------------------------------------------------
+    # Health / routing
+    # ------------------------------------------------------------------
+
+    def health(self, model: str) -> ModelHealth:
+        if model not in self._health:
+            self._health[model] = ModelHealth(model)
+        return self._health[model]
+
+    def _fallback_for(self, model: str) -> Optional[str]:
+        prefix, bare = _split_provider(model)
+        fallback = FALLBACK_MODELS.get(bare)
+        return prefix + fallback if fallback else None
+
+    def select_model(self, model: str) -> str:
+        """Primary if healthy; otherwise its fallback if that is healthier."""
+        primary = self.health(model)
+        if primary.breaker_state() == "closed" and not primary.degraded():
+            return model
+        fallback = self._fallback_for(model)
+        if fallback:
+            backup = self.health(fallback)
+            if backup.breaker_state() != "open" and not backup.degraded():
+                self._stats["fallbacks"] += 1
+                logger.info(f"LLM gateway routing {model} → {fallback} "
+                            f"(breaker={primary.breaker_state()}, p95={primary.p95()}, "
+                            f"error_rate={primary.error_rate()})")
+                return fallback
+        return model
+
+    # ------------------------------------------------------------------
+    # Budgets
+    # ------------------------------------------------------------------
+
+    def _semaphores(self, tenant_id: Optional[str]) -> list[asyncio.Semaphore]:
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.global_concurrency)
+        sems = [self._global]
+        if tenant_id:
+            if tenant_id not in self._tenants:
+                self._tenants[tenant_id] = asyncio.Semaphore(self.tenant_concurrency)
+            sems.insert(0, self._tenants[tenant_id])  # tenant first: don't hold a global slot while queued
+        return sems
+
+    async def _with_budget(self, tenant_id: Optional[str], fn: Callable[[float], Awaitable]):
+        sems = self._semaphores(tenant_id)
+        queued_at = time.monotonic()
+        acquired = []
+        try:
+            for sem in sems:
+                await sem.acquire()
+                acquired.append(sem)
+            return await fn(time.monotonic() - queued_at)
+        finally:
+            for sem in reversed(acquired):
+                sem.release()
+
+    # ------------------------------------------------------------------
+    # Attempts
+    # ------------------------------------------------------------------
+
+    async def _attempt(self, provider, model, messages, params, timeout, queue_time, purpose):
+        health = self.health(model)
+        if not health.allow():
+            self._stats["rejected"] += 1
+            raise CircuitOpenError(f"circuit open for {model}")
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self._send(provider, model, messages, params), timeout=timeout)
+        except asyncio.CancelledError:
+            health.probing = False
+            raise
+        except Exception as e:
+            health.record(time.monotonic() - started, ok=False, transient=_is_transient(e))
+            raise
+        latency = time.monotonic() - started
+        health.record(latency, ok=True)
+        usage = getattr(response, "usage", None)
+        tokens_in = getattr(usage, "prompt_tokens", 0) or 0
+        tokens_out = getattr(usage, "completion_tokens", 0) or 0
+        health.input_tokens += tokens_in
+        health.cached_input_tokens += cached_prompt_tokens(usage)
+        health.output_tokens += tokens_out
+        health.queue_time += queue_time
+        logger.debug(f"LLM call purpose={purpose} model={model} latency={latency:.2f}s "
+                     f"queue={queue_time:.2f}s tokens_in={tokens_in} tokens_out={tokens_out}")
+        return response
+
+    async def _hedged(self, make_attempt: Callable[[], Awaitable], delay: float):
+        """Race a second attempt if the first hasn't finished after `delay`."""
+        first = asyncio.ensure_future(make_attempt())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        self._stats["hedges"] += 1
+        second = asyncio.ensure_future(make_attempt())
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, provider, model, messages, params, tenant_id, purpose, timeout, hedge, hedge_after):
+        async def run(queue_time: float):
+            attempt_no = 0
+            while True:
+                chosen = self.select_model(model)
+                delay = hedge_after or self.health(chosen).p95() or HEDGE_DELAY
+
+                def make_attempt():
+                    return self._attempt(provider, chosen, messages, params, timeout, queue_time, purpose)
+
+                try:
+                    if hedge:
+                        return await self._hedged(make_attempt, delay)
+                    return await make_attempt()
+                except Exception as e:
+                    if attempt_no >= MAX_RETRIES or not (_is_transient(e) or isinstance(e, CircuitOpenError)):
+                        raise
+                    if isinstance(e, CircuitOpenError) and self.select_model(model) == chosen:
+                        raise  # nothing healthier to switch to
+                    attempt_no += 1
+                    self._stats["retries"] += 1
+                    await asyncio.sleep(RETRY_BACKOFF * (2 ** (attempt_no - 1)))
+
+        return await self._with_budget(tenant_id, run)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: list,
+        tenant_id: Optional[str] = None,
+        purpose: str = "",
+        provider: str = "openai",
+        timeout: float = DEFAULT_TIMEOUT,
+        deadline: Optional[float] = None,
+        hedge: bool = False,
+        hedge_after: Optional[float] = None,
+        single_flight: bool = True,
+        **params,
+    ):
+        """
+        Chat completion through the gateway. `params` are passed to the
+        provider unchanged (temperature, max_tokens, response_format, tools,
+        stream, ...). Returns the provider response (or stream).
+        """
+        self._stats["calls"] += 1
+        call = self._chat(provider, model, messages, params, tenant_id, purpose,
+                          timeout, hedge, hedge_after, single_flight)
+        if deadline is None:
+            return await call
+        return await asyncio.wait_for(call, timeout=deadline)
+
+    async def _chat(self, provider, model, messages, params, tenant_id, purpose,
+                    timeout, hedge, hedge_after, single_flight):
+        if params.get("stream"):
+            return await self._call(provider, model, messages, params, tenant_id, purpose,
+                                    timeout, hedge=False, hedge_after=None)
+        if not single_flight:
+            return await self._call(provider, model, messages, params, tenant_id, purpose,
+                                    timeout, hedge, hedge_after)
+
+        key = hashlib.sha256(json.dumps(
+            [tenant_id, provider, model, messages, params], sort_keys=True, default=str,
+        ).encode()).hexdigest()
+        while True:
+            leader = self._inflight.get(key)
+            if leader is None:
+                break
+            self._stats["coalesced"] += 1
+            try:
+                return _without_usage(await asyncio.shield(leader))
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise  # this caller was cancelled (or hit its deadline), not the leader
+            # the leader was cancelled (e.g. its own deadline): take over the call
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await self._call(provider, model, messages, params, tenant_id, purpose,
+                                        timeout, hedge, hedge_after)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved — followers may not exist
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def transcribe(self, *, model: str, tenant_id: Optional[str] = None,
+                         timeout: float = DEFAULT_TIMEOUT, **params):
+        """Audio transcription (Whisper) under the same budgets, breaker and metrics."""
+        self._stats["calls"] += 1
+
+        async def run(queue_time: float):
+            health = self.health(model)
+            if not health.allow():
+                self._stats["rejected"] += 1
+                raise CircuitOpenError(f"circuit open for {model}")
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    get_openai_client().audio.transcriptions.create(model=model, **params), timeout=timeout,
+                )
+            except Exception as e:
+                health.record(time.monotonic() - started, ok=False, transient=_is_transient(e))
+                raise
+            health.record(time.monotonic() - started, ok=True)
+            health.queue_time += queue_time
+            return result
+
+        return await self._with_budget(tenant_id, run)
+
+    def stats(self) -> dict:
+        """Counters plus per-model latency, error rate, tokens and breaker state."""
+        models = {}
+        for model, h in self._health.items():
+            models[model] = {
+                "calls": h.calls,
+                "errors": h.errors,
+                "p95": h.p95(),
+                "error_rate": h.error_rate(),
+                "breaker": h.breaker_state(),
+                "input_tokens": h.input_tokens,
+                "cached_input_ratio": round(h.cached_input_tokens / h.input_tokens, 4) if h.input_tokens else 0.0,
+                "output_tokens": h.output_tokens,
+                "avg_queue_time": round(h.queue_time / h.calls, 4) if h.calls else 0.0,
+            }
+        return {**self._stats, "inflight": len(self._inflight), "models": models}
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_gateway() -> LLMGateway:
+    """Process-wide gateway singleton."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
@@ -4,8 +4,7 @@ import logging
 from typing import Optional, List, Dict
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
-
+from llm_gateway import get_gateway, get_openai_client
 from token_logger import log_token_usage_fire_and_forget
 
 ROOT_DIR = Path(__file__).parent
@@ -13,11 +12,17 @@ load_dotenv(ROOT_DIR / '.env')
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
 _openai_api_key = os.environ.get('OPENAI_API_KEY')
 if not _openai_api_key:
     logger.warning("OPENAI_API_KEY not set - LLM calls will fail at runtime")
-client = AsyncOpenAI(api_key=_openai_api_key)
+
+
+def __getattr__(name: str):
+    # Shared pooled OpenAI client (owned by llm_gateway), created on first
+    # access so importing this module does not load the OpenAI SDK
+    if name == "client":
+        return get_openai_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 async def summarize_conversation(messages: List[Dict[str, str]], tenant_id: Optional[str] = None) -> str:
@@ -25,8 +30,10 @@ async def summarize_conversation(messages: List[Dict[str, str]], tenant_id: Opti
     try:
         conversation_text = "\n".join([f"{m['role']}: {m['text']}" for m in messages])
 
-        response = await client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
+            tenant_id=tenant_id,
+            purpose="summarization",
             messages=[
                 {
                     "role": "system",
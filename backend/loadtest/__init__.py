@@ -0,0 +1,16 @@
+"""
+Synthetic load tests for the Telegram webhook pipeline.
+=======================================================
+Replays generated Telegram updates against server.app with every upstream
+replaced by a local fake, and reports throughput, latency percentiles, DB
+calls per message and memory growth against a saved baseline.
+
+    fakes      LLM / Telegram Bot API / PostgREST stand-ins (child process)
+    scenarios  text, voice, burst, many_chats, many_tenants, mixed
+    runner     ASGI driver, measurement, baseline comparison
+
+Usage (from backend/):
+    python -m loadtest --scenario text
+    python -m loadtest --scenario mixed --llm-latency-ms 1500 --compare
+    python -m loadtest --scenario many_chats --save-baseline
+"""
@@ -0,0 +1,110 @@
+"""Run one load-test scenario and compare it with (or save it as) the baseline.
+
+Usage (from backend/):
+    python -m loadtest --scenario text
+    python -m loadtest --scenario mixed --scale 2 --speed 1.5 --compare
+    python -m loadtest --scenario voice --llm-latency-ms 1200 --save-baseline
+    python -m loadtest --scenario text --supabase-url http://127.0.0.1:3000 --supabase-key <jwt>
+
+--supabase-url points DB traffic at a real PostgREST (e.g. a local Supabase
+stack with the migrations applied) instead of the in-memory fake; the
+scenario's tenants and bots are still seeded into the fake only, so create
+them there first.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from loadtest.fakes import FakeServices  # noqa: E402
+from loadtest.runner import BASELINE_DIR, compare, configure_environment, load_baseline, run, save_baseline  # noqa: E402
+from loadtest.scenarios import SCENARIOS, build  # noqa: E402
+
+# settings that change the numbers; a baseline is only comparable when they match
+CONFIG_KEYS = ("scenario", "scale", "speed", "seed", "warmup", "llm_latency_ms", "llm_jitter_ms",
+               "db_latency_ms", "full_ratio", "supabase_url", "no_rate_limits")
+
+
+def _summary(report):
+    ack, e2e, mem = report["ack_ms"], report["e2e_ms"], report["memory"]
+    lines = [
+        f"scenario {report['scenario']}: {report['messages']} updates {report['kinds']} in {report['wall_s']}s "
+        f"(speed x{report['speed']})",
+        f"  throughput   {report['throughput_per_s']} msg/s, {report['replies']} replies, {report['errors']} errors",
+        f"  ack          p50 {ack.get('p50')}ms  p95 {ack.get('p95')}ms  p99 {ack.get('p99')}ms",
+        f"  end to end   p50 {e2e.get('p50')}ms  p95 {e2e.get('p95')}ms  p99 {e2e.get('p99')}ms",
+        f"  routes       {report['routes']}",
+        f"  db calls     {report['db']['calls_per_message']} per message",
+        f"  memory       {mem['rss_start_mb']} -> {mem['rss_end_mb']} MB ({mem['growth_kb_per_message']} KB/message)",
+    ]
+    for stage, routes in sorted(report["stages"].items()):
+        cells = ", ".join(f"{route} p50 {e['p50_ms']} / p95 {e['p95_ms']}ms (n={e['count']})" for route, e in routes.items())
+        lines.append(f"    {stage:<16} {cells}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="text")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies chats, tenants and arrival rate")
+    parser.add_argument("--speed", type=float, default=1.0, help="compresses the arrival schedule")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=600.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="added to every fake PostgREST request")
+    parser.add_argument("--full-ratio", type=float, default=0.0, help="share of messages routed to the full model")
+    parser.add_argument("--supabase-url", help="real PostgREST / Supabase instead of the fake")
+    parser.add_argument("--supabase-key", help="service key for --supabase-url")
+    parser.add_argument("--no-rate-limits", action="store_true", help="lift per-user / per-tenant message limits")
+    parser.add_argument("--baseline", type=Path, help=f"baseline file (default {BASELINE_DIR}/<scenario>.json)")
+    parser.add_argument("--compare", action="store_true", help="exit 1 on a regression against the baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--json", type=Path, help="also write the full report here")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+
+    scenario = build(args.scenario, scale=args.scale, seed=args.seed)
+    with FakeServices(llm_latency_ms=args.llm_latency_ms, llm_jitter_ms=args.llm_jitter_ms,
+                      db_latency_ms=args.db_latency_ms, full_ratio=args.full_ratio, seed=args.seed) as fakes:
+        configure_environment(fakes.url)
+        if args.supabase_url:
+            os.environ["SUPABASE_URL"] = args.supabase_url
+            os.environ["SUPABASE_SERVICE_KEY"] = args.supabase_key or os.environ["SUPABASE_SERVICE_KEY"]
+        import server
+
+        if args.no_rate_limits:
+            for limiter in (server.message_rate_limiter, server.llm_rate_limiter):
+                limiter.max_requests = 10**9
+        report = asyncio.run(run(scenario, server.app, fakes, warmup=args.warmup, speed=args.speed))
+
+    report["config"] = {k: getattr(args, k) for k in CONFIG_KEYS}
+    print(_summary(report))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+
+    path = args.baseline or BASELINE_DIR / f"{args.scenario}.json"
+    if args.save_baseline:
+        save_baseline(report, path)
+        print(f"\nbaseline saved to {path}")
+        return
+    baseline = load_baseline(path)
+    if baseline is None:
+        print(f"\nno baseline at {path} (run with --save-baseline)")
+        return
+    if baseline.get("config") != report["config"]:
+        print("\nnote: baseline was recorded with different settings")
+    regressions = compare(report, baseline, args.tolerance)
+    print(f"\nagainst {path}: " + ("; ".join(regressions) if regressions else "no regressions"))
+    if regressions and args.compare:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""
+Fake upstreams for load tests — LLM, Telegram Bot API, PostgREST.
+=================================================================
+One small asyncio HTTP/1.1 server, run in a child process so that the
+synchronous supabase-py calls the app makes on its event loop cannot
+deadlock against fakes living on the same loop. Routes by path:
+
+    /v1/chat/completions        OpenAI-compatible, JSON or SSE stream, after
+    /v1/embeddings              a configurable latency (mean ± jitter)
+    /v1/audio/transcriptions
+    /bot<token>/<method>        Telegram Bot API: sendMessage, getFile, ...
+    /file/bot<token>/<path>     file downloads (voice notes)
+    /rest/v1/<table>            PostgREST subset over in-memory tables:
+    /rest/v1/rpc/<fn>           eq/neq/gt/gte/lt/lte/in/is/like/ilike filters,
+                                order, limit/offset, single-object Accept,
+                                upsert via on_conflict; RPCs return null
+    /__seed /__stats /__reset   control endpoints for the harness
+
+The chat completion answer is one JSON object that satisfies every
+structured prompt in the pipeline (classifier, FAQ responder, sales agent);
+`route_to` comes from the `full_ratio` setting so runs can mix mini and
+full-model replies deterministically.
+
+Public surface
+--------------
+    with FakeServices(llm_latency_ms=600, llm_jitter_ms=200) as fakes:
+        fakes.url                       # http://127.0.0.1:<port>
+        fakes.seed({"telegram_bots": [...]})
+        fakes.stats()                   # calls by upstream / table / method
+        fakes.reset()
+
+    HttpFake / FakeProcess            # the HTTP/1.1 server and child-process
+                                      # runner, reused by benchmarks/
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import hashlib
+import json
+import logging
+import multiprocessing
+import random
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FakeConfig:
+    llm_latency_ms: float = 600.0   # mean time to a full completion
+    llm_jitter_ms: float = 200.0    # uniform ± around the mean
+    llm_ttft_ratio: float = 0.3     # share of the latency before the first streamed token
+    embedding_latency_ms: float = 50.0
+    transcription_latency_ms: float = 400.0
+    telegram_latency_ms: float = 20.0
+    db_latency_ms: float = 0.0      # added per PostgREST request
+    full_ratio: float = 0.0         # share of classifications routed to the full model
+    seed: int = 0
+
+
+# ---------------------------------------------------------------------------
+# Responses
+# ---------------------------------------------------------------------------
+
+_REPLY = "Thanks for reaching out! We are open 9 to 6 every day. What are you looking for?"
+
+
+def _completion_content(messages: list, full_ratio: float) -> str:
+    digest = hashlib.sha1(json.dumps(messages[-1:], sort_keys=True, default=str).encode()).digest()
+    route = "full" if digest[0] / 255 < full_ratio else "mini"
+    return json.dumps({
+        "category": "faq" if route == "mini" else "buying",
+        "confidence": 0.9,
+        "route_to": route,
+        "reply_text": _REPLY,
+        "fields_collected": {},
+        "sales_stage": "interest",
+        "hotness": "warm",
+        "score": 40,
+        "needs_human_handoff": False,
+    })
+
+
+def _usage(content: str) -> dict:
+    completion = max(1, len(content) // 4)
+    return {"prompt_tokens": 400, "completion_tokens": completion, "total_tokens": 400 + completion}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _json(status: int, body: Any, headers: Optional[dict] = None) -> tuple[int, dict, bytes]:
+    return status, {"content-type": "application/json", **(headers or {})}, json.dumps(body, default=str).encode()
+
+
+# ---------------------------------------------------------------------------
+# PostgREST subset
+# ---------------------------------------------------------------------------
+
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns", "or", "and"}
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _compare(value: Any, op: str, arg: str) -> bool:
+    if op == "is":
+        return _as_text(value) == arg.lower()
+    if op == "in":
+        return _as_text(value) in {a.strip().strip('"') for a in arg.strip("()").split(",")}
+    if op in ("like", "ilike"):
+        text, pattern = _as_text(value), arg.replace("*", "%").replace("%", "*")
+        return fnmatch.fnmatch(text.lower(), pattern.lower()) if op == "ilike" else fnmatch.fnmatchcase(text, pattern)
+    if op in ("eq", "neq"):
+        return (_as_text(value) == arg) == (op == "eq")
+    if value is None:
+        return False
+    try:
+        left, right = float(value), float(arg)
+    except (TypeError, ValueError):
+        left, right = _as_text(value), arg
+    return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}.get(op, True)
+
+
+def _filters(params: list[tuple[str, str]]) -> list[tuple[str, bool, str, str]]:
+    out = []
+    for key, raw in params:
+        if key in _RESERVED or "." not in raw:
+            continue
+        negate = raw.startswith("not.")
+        op, _, arg = raw[4:].partition(".") if negate else raw.partition(".")
+        out.append((key, negate, op, arg))
+    return out
+
+
+def _match(row: dict, filters) -> bool:
+    return all(_compare(row.get(col), op, arg) != negate for col, negate, op, arg in filters)
+
+
+def _ordered(rows: list[dict], order: str) -> list[dict]:
+    for term in reversed([t for t in order.split(",") if t]):
+        col, *mods = term.split(".")
+        desc = "desc" in mods
+        present = [r for r in rows if r.get(col) is not None]
+        missing = [r for r in rows if r.get(col) is None]
+        present.sort(key=lambda r: _as_text(r.get(col)) if not isinstance(r.get(col), (int, float)) else r.get(col),
+                     reverse=desc)
+        rows = present + missing
+    return rows
+
+
+class Tables:
+    def __init__(self):
+        self.rows: dict[str, list[dict]] = defaultdict(list)
+
+    def seed(self, tables: dict[str, list[dict]]) -> None:
+        for name, rows in tables.items():
+            self.rows[name] = [dict(r) for r in rows]
+
+    def handle(self, method: str, table: str, params: list[tuple[str, str]], headers: dict, body: bytes):
+        prefer = headers.get("prefer", "")
+        filters = _filters(params)
+        query = dict(params)
+        rows = self.rows[table]
+
+        if method in ("GET", "HEAD"):
+            found = [r for r in rows if _match(r, filters)]
+            total = len(found)
+            if query.get("order"):
+                found = _ordered(found, query["order"])
+            offset = int(query.get("offset", 0))
+            found = found[offset:offset + int(query["limit"])] if "limit" in query else found[offset:]
+            return self._respond(found, headers, total=total, head=method == "HEAD")
+
+        payload = json.loads(body or b"null")
+        if method == "POST":
+            items = payload if isinstance(payload, list) else [payload]
+            keys = [k for k in query.get("on_conflict", "id").split(",") if k]
+            merge = "resolution=merge-duplicates" in prefer
+            ignore = "resolution=ignore-duplicates" in prefer
+            written = []
+            for item in items:
+                existing = next((r for r in rows if all(k in item and r.get(k) == item[k] for k in keys)), None)
+                if existing is not None and (merge or ignore):
+                    if merge:
+                        existing.update(item)
+                        written.append(existing)
+                    continue
+                row = {"id": str(uuid.uuid4()), "created_at": _now_iso(), **item}
+                rows.append(row)
+                written.append(row)
+            return self._respond(written, headers, status=201, minimal="return=minimal" in prefer)
+
+        matched = [r for r in rows if _match(r, filters)]
+        if method == "PATCH":
+            for row in matched:
+                row.update(payload or {})
+        elif method == "DELETE":
+            self.rows[table] = [r for r in rows if not _match(r, filters)]
+        return self._respond(matched, headers, minimal="return=minimal" in prefer)
+
+    @staticmethod
+    def _respond(rows, headers, status=200, total=None, head=False, minimal=False):
+        total = len(rows) if total is None else total
+        extra = {"content-range": f"0-{max(len(rows) - 1, 0)}/{total}" if rows else f"*/{total}"}
+        if "vnd.pgrst.object" in headers.get("accept", ""):
+            if len(rows) != 1:
+                return _json(406, {"code": "PGRST116", "details": f"The result contains {len(rows)} rows",
+                                   "hint": None, "message": "JSON object requested, multiple (or no) rows returned"})
+            return _json(status, rows[0], extra)
+        if head:
+            return status, extra, b""
+        if minimal:
+            return (201 if status == 201 else 204), extra, b""
+        return _json(status, rows, extra)
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class HttpFake(ABC):
+    """Minimal asyncio HTTP/1.1 server; subclasses implement handle().
+
+    handle(method, target, headers, body) returns (status, headers, payload)
+    where payload is bytes or an async iterator of chunks (sent chunked).
+    """
+
+    @abstractmethod
+    async def handle(self, method: str, target: str, headers: dict, body: bytes):
+        ...
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                if headers.get("transfer-encoding", "").lower() == "chunked":
+                    body = b""
+                    while size := int((await reader.readline()).split(b";")[0], 16):
+                        body += await reader.readexactly(size)
+                        await reader.readline()
+                    await reader.readline()
+                else:
+                    body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                try:
+                    status, out_headers, payload = await self.handle(method, target, headers, body)
+                except Exception as e:  # a broken fake must not look like a slow upstream
+                    logger.exception("Fake upstream failed")
+                    status, out_headers, payload = _json(500, {"error": str(e)})
+                await self._write(writer, status, out_headers, payload)
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer, status, headers, payload) -> None:
+        head = [f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}"]
+        head += [f"{k}: {v}" for k, v in headers.items()]
+        if isinstance(payload, bytes):
+            head.append(f"content-length: {len(payload)}")
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+            await writer.drain()
+            return
+        head.append("transfer-encoding: chunked")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+        async for chunk in payload:
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+class FakeUpstreams(HttpFake):
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.tables = Tables()
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts: Counter = Counter()
+        self.db: Counter = Counter()
+        self.sent_per_chat: Counter = Counter()
+        self.message_id = 0
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.counts),
+            "db": dict(self.db),
+            "replies": sum(self.sent_per_chat.values()),
+            "chats_replied": len(self.sent_per_chat),
+        }
+
+    async def _sleep(self, mean_ms: float, jitter_ms: float = 0.0) -> float:
+        delay = max(0.0, mean_ms + self.random.uniform(-jitter_ms, jitter_ms)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    async def handle(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        path = unquote(url.path)
+        params = parse_qsl(url.query, keep_blank_values=True)
+
+        if path.startswith("/rest/v1/"):
+            name = path[len("/rest/v1/"):]
+            self.db[f"{method} {name}"] += 1
+            self.counts["postgrest"] += 1
+            await self._sleep(self.config.db_latency_ms)
+            if name.startswith("rpc/"):
+                return _json(200, None)
+            return self.tables.handle(method, name, params, headers, body)
+        if path.startswith("/v1/") or path.startswith("/chat/") or path.startswith("/embeddings"):
+            return await self._openai(path.removeprefix("/v1"), body)
+        if path.startswith("/file/bot"):
+            self.counts["telegram:file"] += 1
+            await self._sleep(self.config.telegram_latency_ms)
+            return 200, {"content-type": "audio/ogg"}, b"OggS" + b"\0" * 2048
+        if path.startswith("/bot"):
+            return await self._telegram(path.rsplit("/", 1)[-1], body)
+        if path == "/__seed":
+            self.tables.seed(json.loads(body))
+            return _json(200, {"ok": True})
+        if path == "/__stats":
+            return _json(200, self.stats())
+        if path == "/__reset":
+            self.reset()
+            return _json(200, {"ok": True})
+        return _json(404, {"error": f"no fake for {path}"})
+
+    async def _openai(self, path: str, body: bytes):
+        if path.startswith("/embeddings"):
+            self.counts["llm:embeddings"] += 1
+            request = json.loads(body or b"{}")
+            inputs = request.get("input") or [""]
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            dims = request.get("dimensions") or 1536
+            await self._sleep(self.config.embedding_latency_ms)
+            data = [{"object": "embedding", "index": i,
+                     "embedding": [((hash((i, j)) % 1000) / 1000) for j in range(dims)]} for i in range(len(inputs))]
+            return _json(200, {"object": "list", "data": data, "model": request.get("model", "fake"),
+                               "usage": {"prompt_tokens": 8, "total_tokens": 8}})
+        if path.startswith("/audio/transcriptions"):
+            self.counts["llm:transcriptions"] += 1
+            await self._sleep(self.config.transcription_latency_ms)
+            return _json(200, {"text": "Hello, what are your opening hours?"})
+        if not path.startswith("/chat/completions"):
+            return _json(404, {"error": {"message": f"no fake for {path}"}})
+
+        request = json.loads(body or b"{}")
+        content = _completion_content(request.get("messages") or [], self.config.full_ratio)
+        model = request.get("model", "fake")
+        created = int(datetime.now().timestamp())
+        if not request.get("stream"):
+            self.counts["llm:chat"] += 1
+            await self._sleep(self.config.llm_latency_ms, self.config.llm_jitter_ms)
+            return _json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": created,
+                "model": model, "usage": _usage(content),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            })
+
+        self.counts["llm:chat_stream"] += 1
+        return 200, {"content-type": "text/event-stream"}, self._stream(content, model, created)
+
+    async def _stream(self, content: str, model: str, created: int):
+        total = max(0.0, self.config.llm_latency_ms + self.random.uniform(-self.config.llm_jitter_ms,
+                                                                          self.config.llm_jitter_ms)) / 1000
+        pieces = [content[i:i + 24] for i in range(0, len(content), 24)]
+        await asyncio.sleep(total * self.config.llm_ttft_ratio)
+        step = total * (1 - self.config.llm_ttft_ratio) / max(1, len(pieces))
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+                "created": created, "model": model}
+        for piece in pieces:
+            chunk = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+            await asyncio.sleep(step)
+        yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n".encode()
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': _usage(content)})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    async def _telegram(self, method: str, body: bytes):
+        self.counts[f"telegram:{method}"] += 1
+        await self._sleep(self.config.telegram_latency_ms)
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+        if method == "getFile":
+            return _json(200, {"ok": True, "result": {"file_id": "f", "file_path": "voice/file_0.oga"}})
+        if method in ("sendMessage", "sendPhoto", "editMessageText"):
+            if method != "editMessageText":
+                self.sent_per_chat[str(payload.get("chat_id"))] += 1
+            self.message_id += 1
+            return _json(200, {"ok": True, "result": {"message_id": self.message_id,
+                                                      "chat": {"id": payload.get("chat_id")}, "date": 0}})
+        return _json(200, {"ok": True, "result": True})
+
+def _serve(factory, args: tuple, ready) -> None:
+    async def main():
+        fake = factory(*args)
+        server = await asyncio.start_server(fake.serve_connection, "127.0.0.1", 0, backlog=1024)
+        ready.send(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+class FakeProcess:
+    """Runs factory(*args) — an HttpFake — in a child process for the duration of a `with` block."""
+
+    def __init__(self, factory, *args):
+        self.factory = factory
+        self.args = args
+        self.url: Optional[str] = None
+        self._process: Optional[multiprocessing.Process] = None
+        self._client: Optional[httpx.Client] = None
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context("spawn")
+        receiver, sender = ctx.Pipe(duplex=False)
+        self._process = ctx.Process(target=_serve, args=(self.factory, self.args, sender), daemon=True)
+        self._process.start()
+        if not receiver.poll(30):
+            self._process.kill()
+            raise RuntimeError(f"{self.factory.__name__} did not start within 30s")
+        self.url = f"http://127.0.0.1:{receiver.recv()}"
+        self._client = httpx.Client(base_url=self.url, timeout=30.0)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._client is not None:
+            self._client.close()
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join(5)
+
+
+class FakeServices(FakeProcess):
+    """Runs FakeUpstreams in a child process for the duration of a `with` block."""
+
+    def __init__(self, **config):
+        self.config = FakeConfig(**config)
+        super().__init__(FakeUpstreams, self.config)
+
+    def seed(self, tables: dict[str, list[dict]]) -> None:
+        self._client.post("/__seed", json=tables).raise_for_status()
+
+    def stats(self) -> dict:
+        return self._client.get("/__stats").json()
+
+    def reset(self) -> None:
+        self._client.post("/__reset").raise_for_status()
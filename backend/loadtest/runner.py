@@ -0,0 +1,322 @@
+"""
+Load-test runner — replays a Scenario against the ASGI app in-process.
+======================================================================
+Each delivery is a POST to /api/telegram/webhook/{bot_id} driven straight
+through the ASGI interface (no sockets, no uvicorn), so two times fall out
+of one call:
+
+    ack    until the response body is sent — what Telegram waits for
+    e2e    until the app call returns — Starlette runs BackgroundTasks
+           after the response inside the same call, so this includes the
+           whole reply pipeline (LLM, send, persistence)
+
+The app is started with its real lifespan (startup hooks, telemetry sink,
+leader election) and talks to the fakes over HTTP, so what is measured is
+the production code path minus the real upstreams. DB calls per message
+come from db_metrics scopes (the webhook route plus the telegram jobs),
+per-stage latency from pipeline_trace, memory from the process RSS.
+
+Public surface
+--------------
+    configure_environment(upstream_url)     # before importing server
+    report = await run(scenario, app, fakes, warmup=3, speed=1.0)
+    regressions = compare(report, baseline, tolerance=0.2)
+    save_baseline(report, path) / load_baseline(path)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import db_metrics
+import pipeline_trace
+from loadtest.fakes import FakeServices
+from loadtest.scenarios import WEBHOOK_SECRET, Delivery, Scenario
+
+logger = logging.getLogger(__name__)
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+WEBHOOK_PATH = "/api/telegram/webhook/{bot_id}"
+MESSAGE_SCOPES = (f"POST {WEBHOOK_PATH}", "job:telegram_message", "job:telegram_voice_message")
+
+# metric path -> (higher is better, absolute slack added to the relative tolerance)
+COMPARED = {
+    "throughput_per_s": (True, 0.0),
+    "ack_ms.p95": (False, 5.0),
+    "e2e_ms.p50": (False, 25.0),
+    "e2e_ms.p95": (False, 50.0),
+    "db.calls_per_message": (False, 0.25),
+    "memory.growth_kb_per_message": (False, 64.0),
+}
+
+
+def configure_environment(upstream_url: str) -> None:
+    """Point every upstream the pipeline calls at the fakes. Must run before `import server`."""
+    os.environ.update({
+        "SUPABASE_URL": upstream_url,
+        # supabase-py only checks the shape of the key
+        "SUPABASE_SERVICE_KEY": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.loadtest",
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_BASE_URL": f"{upstream_url}/v1",
+        "TELEGRAM_API_URL": upstream_url,
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+        "REDIS_URL": "",
+    })
+    os.environ.setdefault("JWT_SECRET", "loadtest-jwt-secret-not-for-production-use")
+
+
+# ---------------------------------------------------------------------------
+# ASGI driving
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Sample:
+    kind: str
+    status: int = 0
+    ack: Optional[float] = None   # seconds
+    e2e: Optional[float] = None
+    error: Optional[str] = None
+
+
+async def deliver(app, delivery: Delivery) -> Sample:
+    body = json.dumps(delivery.update).encode()
+    path = WEBHOOK_PATH.format(bot_id=delivery.bot_id)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"loadtest"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-telegram-bot-api-secret-token", WEBHOOK_SECRET.encode())],
+        "client": ("127.0.0.1", 40000), "server": ("loadtest", 80),
+    }
+    sample = Sample(delivery.kind)
+    responded = asyncio.Event()
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await responded.wait()
+        return {"type": "http.disconnect"}
+
+    started = time.perf_counter()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            sample.status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            sample.ack = time.perf_counter() - started
+            responded.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception as e:
+        sample.error = type(e).__name__
+        logger.warning(f"Delivery of update {delivery.update.get('update_id')} raised {e!r}")
+    sample.e2e = time.perf_counter() - started
+    return sample
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Run the app's ASGI lifespan (startup hooks on enter, shutdown on exit)."""
+    inbox: asyncio.Queue = asyncio.Queue()
+    events = {name: asyncio.Event() for name in ("startup", "shutdown")}
+    failures: list[str] = []
+
+    async def send(message):
+        kind = message["type"].split(".")
+        if kind[-1] == "failed":
+            failures.append(message.get("message", ""))
+        events[kind[1]].set()
+
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, inbox.get, send))
+    await inbox.put({"type": "lifespan.startup"})
+    await events["startup"].wait()
+    if failures:
+        raise RuntimeError(f"app startup failed: {failures[0]}")
+    try:
+        yield
+    finally:
+        await inbox.put({"type": "lifespan.shutdown"})
+        try:
+            await asyncio.wait_for(events["shutdown"].wait(), 30)
+        except asyncio.TimeoutError:
+            logger.warning("App shutdown did not complete within 30s")
+        task.cancel()
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def rss_mb() -> float:
+    """Current resident set size; peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(seconds: list[float]) -> dict:
+    if not seconds:
+        return {"count": 0}
+    ms = sorted(s * 1000 for s in seconds)
+
+    def q(p: float) -> float:
+        return round(ms[min(len(ms) - 1, int(p * len(ms)))], 1)
+
+    return {"count": len(ms), "mean": round(statistics.fmean(ms), 1), "p50": q(0.50), "p90": q(0.90),
+            "p95": q(0.95), "p99": q(0.99), "max": round(ms[-1], 1)}
+
+
+async def _settle(background: set, timeout: float) -> None:
+    """Wait for tasks the pipeline spawned (extraction, telemetry) to finish, up to timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        pending = asyncio.all_tasks() - background - {asyncio.current_task()}
+        if not pending:
+            return
+        await asyncio.sleep(0.05)
+
+
+def _db_report(messages: int) -> dict:
+    scopes = db_metrics.stats()["scopes"]
+    per_scope = {
+        name: {k: scopes[name][k] for k in ("scopes", "calls", "avg_calls", "max_calls", "blocking_calls", "n_plus_one")
+               if k in scopes[name]}
+        for name in MESSAGE_SCOPES if name in scopes
+    }
+    calls = sum(entry["calls"] for entry in per_scope.values())
+    return {
+        "calls_per_message": round(calls / messages, 2) if messages else None,
+        "scopes": per_scope,
+        "other_scopes": {name: entry["calls"] for name, entry in scopes.items() if name not in MESSAGE_SCOPES},
+    }
+
+
+def _stage_report() -> tuple[dict, dict]:
+    by_route = pipeline_trace.get_pipeline_stats()["by_route"]
+    stages = {
+        stage: {route: {k: entry[k] for k in ("count", "p50_ms", "p95_ms", "max_ms")} for route, entry in routes.items()}
+        for stage, routes in by_route.items()
+    }
+    routes = {route: entry["count"] for route, entry in by_route.get("message", {}).items()}
+    return stages, routes
+
+
+async def run(scenario: Scenario, app, fakes: FakeServices, warmup: int = 3, speed: float = 1.0,
+              settle: float = 10.0) -> dict:
+    """Replay scenario against app; returns the report dict (see module docstring)."""
+    fakes.seed(scenario.seed_tables())
+    async with lifespan(app):
+        # Warm lazy imports, pools and caches outside the measured window
+        first_bot = scenario.bot_id(scenario.tenants[0])
+        for i in range(warmup):
+            update = {"update_id": 1 + i, "message": {
+                "message_id": 1, "text": "warmup", "chat": {"id": 4_000_000 + i, "type": "private"},
+                "from": {"id": 4_000_000 + i, "first_name": "Warmup"}}}
+            await deliver(app, Delivery(0.0, first_bot, update))
+        background = asyncio.all_tasks()
+        await _settle(background, settle)
+        db_metrics.reset()
+        pipeline_trace.reset_pipeline_stats()
+        fakes.reset()
+        rss_start = rss_mb()
+
+        started = time.perf_counter()
+
+        async def scheduled(delivery: Delivery) -> Sample:
+            delay = started + delivery.at / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await deliver(app, delivery)
+
+        samples = await asyncio.gather(*(scheduled(d) for d in scenario.updates))
+        wall = time.perf_counter() - started
+        await _settle(background, settle)
+        rss_end = rss_mb()
+        upstream = fakes.stats()
+        stages, routes = _stage_report()
+        db = _db_report(len(samples))
+
+    ok = [s for s in samples if s.status == 200 and not s.error]
+    return {
+        "scenario": scenario.name,
+        "messages": len(samples),
+        "kinds": dict(Counter(s.kind for s in samples)),
+        "speed": speed,
+        "wall_s": round(wall, 2),
+        "throughput_per_s": round(len(ok) / wall, 2) if wall else None,
+        "replies": upstream["replies"],
+        "errors": len(samples) - len(ok),
+        "status": dict(Counter(s.status for s in samples)),
+        "ack_ms": percentiles([s.ack for s in samples if s.ack is not None]),
+        "e2e_ms": percentiles([s.e2e for s in ok]),
+        "by_kind": {kind: percentiles([s.e2e for s in ok if s.kind == kind]) for kind in sorted({s.kind for s in ok})},
+        "routes": routes,
+        "stages": stages,
+        "db": db,
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_end, 1),
+            "growth_mb": round(rss_end - rss_start, 2),
+            "growth_kb_per_message": round((rss_end - rss_start) * 1024 / len(samples), 1) if samples else None,
+        },
+        "upstream_calls": upstream["calls"],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Baselines
+# ---------------------------------------------------------------------------
+
+def _metric(report: dict, path: str) -> Optional[float]:
+    value = report
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.2) -> list[str]:
+    """Regressions of report against baseline beyond tolerance (relative) plus each metric's slack."""
+    regressions = []
+    for path, (higher_is_better, slack) in COMPARED.items():
+        new, old = _metric(report, path), _metric(baseline, path)
+        if new is None or old is None:
+            continue
+        if higher_is_better:
+            worse = new < old * (1 - tolerance) - slack
+        else:
+            worse = new > old * (1 + tolerance) + slack
+        if worse:
+            regressions.append(f"{path}: {old} -> {new}")
+    return regressions
+
+
+def save_baseline(report: dict, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+
+
+def load_baseline(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
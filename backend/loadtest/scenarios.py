@@ -0,0 +1,188 @@
+"""
+Synthetic Telegram traffic for load tests.
+==========================================
+A Scenario is a deterministic schedule of webhook deliveries
+(offset seconds, bot id, Telegram update) plus the rows the fake PostgREST
+needs to answer for its tenants and bots. Arrivals are open-loop — sent
+on schedule whether or not earlier updates have been answered — which is
+how Telegram delivers webhooks.
+
+    text          steady text messages from many private chats
+    voice         voice notes (getFile + download + transcription)
+    burst         a few chats each sending several messages back to back
+                  (exercises dedup and the per-user rate limiter)
+    many_chats    one message each from a large number of chats
+    many_tenants  traffic spread over many tenants / bots
+    mixed         text with 10% voice and occasional bursts
+
+Volumes are sized so that production limits (10 messages per user and
+20 LLM calls per tenant per minute) are only hit by `burst`; pass
+--no-rate-limits to the runner to measure raw pipeline capacity instead.
+
+Public surface
+--------------
+    SCENARIOS                       name -> builder(scale=1.0, seed=0)
+    build(name, scale=1.0, seed=0)  -> Scenario
+    Scenario.updates / .seed_tables()
+"""
+
+from __future__ import annotations
+
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable
+
+TEXTS = (
+    "Hi, when are you open?",
+    "How much does delivery cost?",
+    "Do you have this in size M?",
+    "Salom, narxi qancha?",
+    "Здравствуйте, есть в наличии?",
+    "Can I pay in installments?",
+    "I'd like to order two of these",
+    "What is the warranty period?",
+    "Is there a discount for wholesale?",
+    "Where is your store located?",
+)
+LANGUAGES = ("en", "ru", "uz")
+WEBHOOK_SECRET = "loadtest-webhook-secret"  # sent as X-Telegram-Bot-Api-Secret-Token
+
+
+@dataclass
+class Delivery:
+    at: float            # seconds after the run starts
+    bot_id: str
+    update: dict
+    kind: str = "text"   # text | voice | burst
+
+
+@dataclass
+class Scenario:
+    name: str
+    tenants: list[str]
+    updates: list[Delivery] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return max((d.at for d in self.updates), default=0.0)
+
+    def bot_id(self, tenant: str) -> str:
+        return f"bot-{tenant[:8]}"
+
+    def seed_tables(self) -> dict[str, list[dict]]:
+        """Tenants, each with an active bot and a business config."""
+        bots, configs, tenants = [], [], []
+        for i, tenant in enumerate(self.tenants):
+            tenants.append({"id": tenant, "name": f"Load Test Shop {i}"})
+            bots.append({"id": self.bot_id(tenant), "tenant_id": tenant, "bot_token": f"{1000 + i}:loadtest",
+                         "bot_username": f"loadtest_{i}_bot", "is_active": True, "webhook_secret": WEBHOOK_SECRET})
+            configs.append({"tenant_id": tenant, "business_name": f"Load Test Shop {i}",
+                            "business_description": "Clothing and accessories", "sales_model": "gpt-4o",
+                            "greeting_message": "Welcome!", "image_responses_enabled": False})
+        return {"tenants": tenants, "telegram_bots": bots, "tenant_configs": configs}
+
+
+class _Builder:
+    def __init__(self, name: str, tenants: int, seed: int):
+        self.rng = random.Random(seed)
+        self.scenario = Scenario(name, [str(uuid.UUID(int=self.rng.getrandbits(128))) for _ in range(tenants)])
+        self.update_id = 100_000
+        self.message_ids: dict[int, int] = {}
+
+    def add(self, at: float, tenant: str, chat_id: int, kind: str = "text") -> None:
+        self.update_id += 1
+        self.message_ids[chat_id] = self.message_ids.get(chat_id, 0) + 1
+        user = {"id": chat_id, "is_bot": False, "first_name": f"Customer{chat_id}",
+                "username": f"customer{chat_id}", "language_code": LANGUAGES[chat_id % len(LANGUAGES)]}
+        message = {"message_id": self.message_ids[chat_id], "date": 1_700_000_000 + int(at),
+                   "chat": {"id": chat_id, "type": "private"}, "from": user}
+        if kind == "voice":
+            message["voice"] = {"file_id": f"voice-{self.update_id}", "file_unique_id": f"u{self.update_id}",
+                                "duration": self.rng.randint(2, 20), "mime_type": "audio/ogg", "file_size": 24_000}
+        else:
+            message["text"] = self.rng.choice(TEXTS)
+        self.scenario.updates.append(
+            Delivery(round(at, 4), self.scenario.bot_id(tenant), {"update_id": self.update_id, "message": message}, kind))
+
+    def chats(self, count: int) -> list[tuple[str, int]]:
+        """(tenant, chat id) pairs, chats dealt round-robin across tenants."""
+        tenants = self.scenario.tenants
+        return [(tenants[i % len(tenants)], 5_000_000 + i) for i in range(count)]
+
+    def steady(self, chats: list[tuple[str, int]], per_chat: int, rate: float, voice_ratio: float = 0.0) -> None:
+        """per_chat messages from each chat, interleaved, arriving at `rate` per second (Poisson)."""
+        at = 0.0
+        for _ in range(per_chat):
+            for tenant, chat_id in self.rng.sample(chats, len(chats)):
+                at += self.rng.expovariate(rate)
+                self.add(at, tenant, chat_id, "voice" if self.rng.random() < voice_ratio else "text")
+
+    def done(self) -> Scenario:
+        self.scenario.updates.sort(key=lambda d: d.at)
+        return self.scenario
+
+
+def _n(value: float, scale: float) -> int:
+    return max(1, round(value * scale))
+
+
+def text(scale: float = 1.0, seed: int = 0) -> Scenario:
+    b = _Builder("text", tenants=_n(20, scale), seed=seed)
+    b.steady(b.chats(_n(100, scale)), per_chat=2, rate=10 * scale)
+    return b.done()
+
+
+def voice(scale: float = 1.0, seed: int = 0) -> Scenario:
+    b = _Builder("voice", tenants=_n(5, scale), seed=seed)
+    b.steady(b.chats(_n(40, scale)), per_chat=1, rate=5 * scale, voice_ratio=1.0)
+    return b.done()
+
+
+def burst(scale: float = 1.0, seed: int = 0) -> Scenario:
+    b = _Builder("burst", tenants=_n(2, scale), seed=seed)
+    for i, (tenant, chat_id) in enumerate(b.chats(_n(10, scale))):
+        start = i * 0.5
+        for j in range(12):  # two more than the per-user limit
+            b.add(start + j * 0.05, tenant, chat_id, "burst")
+    return b.done()
+
+
+def many_chats(scale: float = 1.0, seed: int = 0) -> Scenario:
+    b = _Builder("many_chats", tenants=_n(25, scale), seed=seed)
+    b.steady(b.chats(_n(400, scale)), per_chat=1, rate=20 * scale)
+    return b.done()
+
+
+def many_tenants(scale: float = 1.0, seed: int = 0) -> Scenario:
+    b = _Builder("many_tenants", tenants=_n(100, scale), seed=seed)
+    b.steady(b.chats(_n(200, scale)), per_chat=1, rate=20 * scale)
+    return b.done()
+
+
+def mixed(scale: float = 1.0, seed: int = 0) -> Scenario:
+    b = _Builder("mixed", tenants=_n(30, scale), seed=seed)
+    chats = b.chats(_n(150, scale))
+    b.steady(chats, per_chat=2, rate=10 * scale, voice_ratio=0.1)
+    for tenant, chat_id in b.rng.sample(chats, max(1, len(chats) // 30)):
+        start = b.rng.uniform(0, max(b.scenario.duration, 1.0))
+        for j in range(4):
+            b.add(start + j * 0.1, tenant, chat_id, "burst")
+    return b.done()
+
+
+SCENARIOS: dict[str, Callable[..., Scenario]] = {
+    "text": text,
+    "voice": voice,
+    "burst": burst,
+    "many_chats": many_chats,
+    "many_tenants": many_tenants,
+    "mixed": mixed,
+}
+
+
+def build(name: str, scale: float = 1.0, seed: int = 0) -> Scenario:
+    try:
+        return SCENARIOS[name](scale=scale, seed=seed)
+    except KeyError:
+        raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}") from None
@@ -0,0 +1,252 @@
+"""
+Loop Watchdog — event-loop stall detection with call-site attribution.
+======================================================================
+A synchronous supabase-py, gspread or bcrypt call inside an `async def`
+handler stops the event loop for every other request until it returns.
+db_metrics flags blocking DB calls; this catches everything else too.
+
+Two cooperating parts, enabled with LOOP_WATCHDOG_MS=<stall threshold>:
+
+    heartbeat   a task on the loop that sleeps `interval` seconds and
+                records how late it woke up (loop lag) into a histogram
+    sampler     a daemon thread that notices when the heartbeat has not
+                run for `threshold` seconds and snapshots the loop thread's
+                stack (sys._current_frames) — while the stall is happening,
+                so the blocking call is still on the stack
+
+Each sampled stall is attributed to the innermost frame in application
+code (file:line function, skipping stdlib and site-packages) and folded
+into per-site counts and stall time; the full stack of the latest sample is
+kept per site. A long stall is re-sampled every `threshold`, so one stall
+spanning several calls credits each of them. Off by default: the heartbeat
+costs a wakeup every `interval` and sampling briefly holds the GIL.
+
+Public surface
+--------------
+    watchdog = LoopWatchdog(threshold=0.1, interval=0.05)
+    await watchdog.start() / await watchdog.stop()
+    watchdog.stats()
+
+    await start_watchdog() / await stop_watchdog()   # from LOOP_WATCHDOG_MS
+    get_loop_stats()                                 # /api/admin/loop-stats
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INTERVAL = 0.05  # seconds between heartbeats
+LAG_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+MAX_SITES = 200
+STACK_DEPTH = 12  # frames kept per site sample
+
+
+@dataclass
+class _Site:
+    samples: int = 0
+    stalls: int = 0
+    stall_seconds: float = 0.0
+    max_stall_seconds: float = 0.0
+    last_seen: float = 0.0
+    stack: list[str] = field(default_factory=list)
+
+
+def _is_app_frame(filename: str) -> bool:
+    return filename.startswith(APP_DIR) and "site-packages" not in filename
+
+
+def attribute(frames: traceback.StackSummary) -> tuple[str, list[str]]:
+    """(call site, formatted stack) — the innermost application frame of a sample."""
+    stack = [f"{os.path.relpath(f.filename, APP_DIR) if _is_app_frame(f.filename) else f.filename}:{f.lineno} {f.name}"
+             for f in frames]
+    for frame, line in zip(reversed(frames), reversed(stack)):
+        if _is_app_frame(frame.filename):
+            return line, stack[-STACK_DEPTH:]
+    return (stack[-1] if stack else "unknown"), stack[-STACK_DEPTH:]
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float, interval: float = DEFAULT_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._beat_at = time.monotonic()
+        self._beat = 0  # heartbeat counter; identifies the current stall
+        self._stall_sites: dict[int, set[str]] = {}  # beat -> sites sampled during it
+        self._sites: dict[str, _Site] = {}
+        self._histogram = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self._stats = {"beats": 0, "stalls": 0, "samples": 0, "max_lag_seconds": 0.0, "total_lag_seconds": 0.0}
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+
+    # ------------------------------------------------------------------
+    # Heartbeat (event loop)
+    # ------------------------------------------------------------------
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._record_lag(max(0.0, now - expected), now)
+
+    def _record_lag(self, lag: float, now: float) -> None:
+        lag_ms = lag * 1000
+        bucket = next((i for i, edge in enumerate(LAG_BUCKETS_MS) if lag_ms <= edge), len(LAG_BUCKETS_MS))
+        with self._lock:
+            self._histogram[bucket] += 1
+            self._stats["beats"] += 1
+            self._stats["total_lag_seconds"] += lag
+            self._stats["max_lag_seconds"] = max(self._stats["max_lag_seconds"], lag)
+            sites = self._stall_sites.pop(self._beat, None)
+            if lag >= self.threshold:
+                self._stats["stalls"] += 1
+                for name in sites or ():
+                    site = self._sites.get(name)
+                    if site is not None:
+                        site.stalls += 1
+                        site.stall_seconds += lag
+                        site.max_stall_seconds = max(site.max_stall_seconds, lag)
+            self._beat += 1
+            self._beat_at = now
+
+    # ------------------------------------------------------------------
+    # Sampler (daemon thread)
+    # ------------------------------------------------------------------
+
+    def _sampler(self) -> None:
+        poll = min(self.interval, self.threshold / 2)
+        last_sample = 0.0
+        while not self._stop.wait(poll):
+            now = time.monotonic()
+            with self._lock:
+                stalled_for = now - self._beat_at - self.interval
+                beat = self._beat
+            if stalled_for >= self.threshold and now - last_sample >= self.threshold:
+                self._sample(beat, now)
+                last_sample = now
+
+    def _sample(self, beat: int, now: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        name, stack = attribute(traceback.extract_stack(frame))
+        del frame
+        with self._lock:
+            self._stats["samples"] += 1
+            site = self._sites.get(name)
+            if site is None:
+                if len(self._sites) >= MAX_SITES:
+                    return
+                site = self._sites[name] = _Site()
+            site.samples += 1
+            site.last_seen = time.time()
+            site.stack = stack
+            self._stall_sites.setdefault(beat, set()).add(name)
+        logger.warning(f"Event loop stalled >{self.threshold * 1000:.0f}ms at {name}")
+
+    # ------------------------------------------------------------------
+    # Lifecycle / reporting
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._sampler, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Loop watchdog started (stall threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(self._thread.join, 1.0)
+        self._task = self._thread = None
+
+    def stats(self, top: int = 25) -> dict:
+        with self._lock:
+            labels = [f"<={edge}ms" for edge in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}ms"]
+            sites = sorted(self._sites.items(), key=lambda kv: (-kv[1].stall_seconds, -kv[1].samples))[:top]
+            beats = self._stats["beats"]
+            return {
+                "enabled": True,
+                "threshold_ms": round(self.threshold * 1000),
+                "interval_ms": round(self.interval * 1000),
+                **{k: v for k, v in self._stats.items() if k not in ("max_lag_seconds", "total_lag_seconds")},
+                "max_lag_ms": round(self._stats["max_lag_seconds"] * 1000, 1),
+                "avg_lag_ms": round(self._stats["total_lag_seconds"] / beats * 1000, 2) if beats else None,
+                "lag_histogram": dict(zip(labels, self._histogram)),
+                "sites": {
+                    name: {
+                        "samples": site.samples,
+                        "stalls": site.stalls,
+                        "stall_ms": round(site.stall_seconds * 1000, 1),
+                        "max_stall_ms": round(site.max_stall_seconds * 1000, 1),
+                        "last_seen": site.last_seen,
+                        "stack": site.stack,
+                    }
+                    for name, site in sites
+                },
+            }
+
+
+# ---------------------------------------------------------------------------
+# Process-wide watchdog (opt-in)
+# ---------------------------------------------------------------------------
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+def _threshold_from_env() -> Optional[float]:
+    raw = (os.environ.get("LOOP_WATCHDOG_MS") or "").strip()
+    if not raw:
+        return None
+    try:
+        threshold_ms = float(raw)
+    except ValueError:
+        logger.warning(f"Ignoring invalid LOOP_WATCHDOG_MS={raw!r}")
+        return None
+    return threshold_ms / 1000 if threshold_ms > 0 else None
+
+
+async def start_watchdog() -> None:
+    """Start the watchdog when LOOP_WATCHDOG_MS is set; no-op otherwise."""
+    global _watchdog
+    threshold = _threshold_from_env()
+    if threshold is None or _watchdog is not None:
+        return
+    _watchdog = LoopWatchdog(threshold, interval=min(DEFAULT_INTERVAL, threshold / 2))
+    await _watchdog.start()
+
+
+async def stop_watchdog() -> None:
+    global _watchdog
+    if _watchdog is not None:
+        await _watchdog.stop()
+        _watchdog = None
+
+
+def get_loop_stats() -> dict:
+    return _watchdog.stats() if _watchdog else {"enabled": False, "hint": "set LOOP_WATCHDOG_MS to enable"}
@@ -0,0 +1,134 @@
+-- Migration 018: token usage rollups
+-- Pre-aggregated usage so /usage/* endpoints and the monthly cost cap read a
+-- bounded number of rows instead of scanning token_usage_logs.
+--
+--   token_usage_daily_rollups   (tenant, day, model, request_type) → tokens, cost, requests
+--   token_usage_monthly_totals  (tenant, month) → running month-to-date cost / requests
+--
+-- record_token_usage() inserts the raw log row and bumps both rollups in one
+-- transaction, so the ledger never drifts from token_usage_logs.
+
+CREATE TABLE IF NOT EXISTS token_usage_daily_rollups (
+    tenant_id      UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    day            DATE NOT NULL,
+    model          TEXT NOT NULL,
+    request_type   TEXT NOT NULL DEFAULT '',
+    input_tokens   BIGINT NOT NULL DEFAULT 0,
+    output_tokens  BIGINT NOT NULL DEFAULT 0,
+    cost_usd       NUMERIC(14,6) NOT NULL DEFAULT 0,
+    request_count  BIGINT NOT NULL DEFAULT 0,
+    updated_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, day, model, request_type)
+);
+
+CREATE TABLE IF NOT EXISTS token_usage_monthly_totals (
+    tenant_id      UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    month          DATE NOT NULL,  -- first day of the month (UTC)
+    cost_usd       NUMERIC(14,6) NOT NULL DEFAULT 0,
+    request_count  BIGINT NOT NULL DEFAULT 0,
+    updated_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, month)
+);
+
+ALTER TABLE token_usage_daily_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE token_usage_monthly_totals ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_policies WHERE policyname = 'tenant_isolation_usage_daily') THEN
+        CREATE POLICY "tenant_isolation_usage_daily" ON token_usage_daily_rollups
+            FOR ALL USING (tenant_id = (current_setting('request.jwt.claims', true)::json ->> 'tenant_id')::uuid);
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_policies WHERE policyname = 'tenant_isolation_usage_monthly') THEN
+        CREATE POLICY "tenant_isolation_usage_monthly" ON token_usage_monthly_totals
+            FOR ALL USING (tenant_id = (current_setting('request.jwt.claims', true)::json ->> 'tenant_id')::uuid);
+    END IF;
+END $$;
+
+
+CREATE OR REPLACE FUNCTION record_token_usage(
+    p_id                  UUID,
+    p_tenant_id           UUID,
+    p_model               TEXT,
+    p_request_type        TEXT,
+    p_input_tokens        BIGINT,
+    p_output_tokens       BIGINT,
+    p_cost_usd            NUMERIC,
+    p_created_at          TIMESTAMPTZ DEFAULT NOW(),
+    p_agent_id            UUID DEFAULT NULL,
+    p_customer_id         UUID DEFAULT NULL,
+    p_conversation_id     UUID DEFAULT NULL,
+    p_route_decision      TEXT DEFAULT NULL,
+    p_classifier_category TEXT DEFAULT NULL
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_day DATE := (p_created_at AT TIME ZONE 'UTC')::date;
+BEGIN
+    INSERT INTO token_usage_logs (
+        id, tenant_id, model, request_type, input_tokens, output_tokens, cost_usd,
+        created_at, agent_id, customer_id, conversation_id, route_decision, classifier_category
+    ) VALUES (
+        p_id, p_tenant_id, p_model, p_request_type, p_input_tokens, p_output_tokens, p_cost_usd,
+        p_created_at, p_agent_id, p_customer_id, p_conversation_id, p_route_decision, p_classifier_category
+    );
+
+    INSERT INTO token_usage_daily_rollups AS r (
+        tenant_id, day, model, request_type, input_tokens, output_tokens, cost_usd, request_count
+    ) VALUES (
+        p_tenant_id, v_day, p_model, COALESCE(p_request_type, ''), p_input_tokens, p_output_tokens, p_cost_usd, 1
+    )
+    ON CONFLICT (tenant_id, day, model, request_type) DO UPDATE SET
+        input_tokens  = r.input_tokens  + EXCLUDED.input_tokens,
+        output_tokens = r.output_tokens + EXCLUDED.output_tokens,
+        cost_usd      = r.cost_usd      + EXCLUDED.cost_usd,
+        request_count = r.request_count + 1,
+        updated_at    = NOW();
+
+    INSERT INTO token_usage_monthly_totals AS m (tenant_id, month, cost_usd, request_count)
+    VALUES (p_tenant_id, date_trunc('month', v_day)::date, p_cost_usd, 1)
+    ON CONFLICT (tenant_id, month) DO UPDATE SET
+        cost_usd      = m.cost_usd + EXCLUDED.cost_usd,
+        request_count = m.request_count + 1,
+        updated_at    = NOW();
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION record_token_usage(UUID, UUID, TEXT, TEXT, BIGINT, BIGINT, NUMERIC, TIMESTAMPTZ, UUID, UUID, UUID, TEXT, TEXT) TO service_role;
+
+
+-- Backfill from existing raw logs (idempotent: recomputes each bucket)
+INSERT INTO token_usage_daily_rollups (
+    tenant_id, day, model, request_type, input_tokens, output_tokens, cost_usd, request_count
+)
+SELECT
+    tenant_id,
+    (created_at AT TIME ZONE 'UTC')::date,
+    model,
+    COALESCE(request_type, ''),
+    SUM(input_tokens),
+    SUM(output_tokens),
+    SUM(cost_usd),
+    COUNT(*)
+FROM token_usage_logs
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (tenant_id, day, model, request_type) DO UPDATE SET
+    input_tokens  = EXCLUDED.input_tokens,
+    output_tokens = EXCLUDED.output_tokens,
+    cost_usd      = EXCLUDED.cost_usd,
+    request_count = EXCLUDED.request_count,
+    updated_at    = NOW();
+
+INSERT INTO token_usage_monthly_totals (tenant_id, month, cost_usd, request_count)
+SELECT tenant_id, date_trunc('month', day)::date, SUM(cost_usd), SUM(request_count)
+FROM token_usage_daily_rollups
+GROUP BY 1, 2
+ON CONFLICT (tenant_id, month) DO UPDATE SET
+    cost_usd      = EXCLUDED.cost_usd,
+    request_count = EXCLUDED.request_count,
+    updated_at    = NOW();
@@ -0,0 +1,75 @@
+-- Migration 019: batched token usage writes
+-- record_token_usage_batch() takes a JSON array of token_usage_logs rows (as
+-- buffered by telemetry.py), bulk-inserts them and applies the aggregated
+-- deltas to the rollups from migration 018 — one round trip per flush.
+
+CREATE OR REPLACE FUNCTION record_token_usage_batch(p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    CREATE TEMP TABLE _usage_batch ON COMMIT DROP AS
+    SELECT
+        COALESCE(r.id, extensions.uuid_generate_v4()) AS id,
+        r.tenant_id,
+        r.model,
+        COALESCE(r.request_type, '') AS request_type,
+        COALESCE(r.input_tokens, 0) AS input_tokens,
+        COALESCE(r.output_tokens, 0) AS output_tokens,
+        COALESCE(r.cost_usd, 0) AS cost_usd,
+        COALESCE(r.created_at, NOW()) AS created_at,
+        r.agent_id,
+        r.customer_id,
+        r.conversation_id,
+        r.route_decision,
+        r.classifier_category
+    FROM jsonb_to_recordset(p_rows) AS r(
+        id UUID, tenant_id UUID, model TEXT, request_type TEXT,
+        input_tokens BIGINT, output_tokens BIGINT, cost_usd NUMERIC,
+        created_at TIMESTAMPTZ, agent_id UUID, customer_id UUID,
+        conversation_id UUID, route_decision TEXT, classifier_category TEXT
+    );
+
+    INSERT INTO token_usage_logs (
+        id, tenant_id, model, request_type, input_tokens, output_tokens, cost_usd,
+        created_at, agent_id, customer_id, conversation_id, route_decision, classifier_category
+    )
+    SELECT
+        id, tenant_id, model, request_type, input_tokens, output_tokens, cost_usd,
+        created_at, agent_id, customer_id, conversation_id, route_decision, classifier_category
+    FROM _usage_batch;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    INSERT INTO token_usage_daily_rollups AS d (
+        tenant_id, day, model, request_type, input_tokens, output_tokens, cost_usd, request_count
+    )
+    SELECT
+        tenant_id, (created_at AT TIME ZONE 'UTC')::date, model, request_type,
+        SUM(input_tokens), SUM(output_tokens), SUM(cost_usd), COUNT(*)
+    FROM _usage_batch
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (tenant_id, day, model, request_type) DO UPDATE SET
+        input_tokens  = d.input_tokens  + EXCLUDED.input_tokens,
+        output_tokens = d.output_tokens + EXCLUDED.output_tokens,
+        cost_usd      = d.cost_usd      + EXCLUDED.cost_usd,
+        request_count = d.request_count + EXCLUDED.request_count,
+        updated_at    = NOW();
+
+    INSERT INTO token_usage_monthly_totals AS m (tenant_id, month, cost_usd, request_count)
+    SELECT tenant_id, date_trunc('month', created_at AT TIME ZONE 'UTC')::date, SUM(cost_usd), COUNT(*)
+    FROM _usage_batch
+    GROUP BY 1, 2
+    ON CONFLICT (tenant_id, month) DO UPDATE SET
+        cost_usd      = m.cost_usd + EXCLUDED.cost_usd,
+        request_count = m.request_count + EXCLUDED.request_count,
+        updated_at    = NOW();
+
+    RETURN v_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION record_token_usage_batch(JSONB) TO service_role;
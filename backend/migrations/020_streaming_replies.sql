@@ -0,0 +1,5 @@
+-- Migration 020: per-tenant streamed reply delivery
+-- When enabled, full-model sales replies are shown in Telegram while they are
+-- generated (first sentence sent, then extended with throttled edits).
+ALTER TABLE tenant_configs
+ADD COLUMN IF NOT EXISTS streaming_replies BOOLEAN DEFAULT FALSE;
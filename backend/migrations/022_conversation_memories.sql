@@ -0,0 +1,27 @@
+-- Migration 022: rolling conversation memory
+-- One row per long sales conversation: a running summary plus key facts
+-- covering every message up to summarized_until (see conversation_memory.py).
+-- The sales prompt uses it together with the unsummarized recent messages.
+
+CREATE TABLE IF NOT EXISTS conversation_memories (
+    conversation_id   UUID PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+    tenant_id         UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    summary           TEXT NOT NULL DEFAULT '',
+    key_facts         JSONB NOT NULL DEFAULT '{}'::jsonb,
+    summarized_until  TIMESTAMPTZ,
+    summarized_count  INTEGER NOT NULL DEFAULT 0,
+    updated_at        TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_memories_tenant
+    ON conversation_memories (tenant_id);
+
+ALTER TABLE conversation_memories ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_policies WHERE policyname = 'tenant_isolation_conversation_memories') THEN
+        CREATE POLICY "tenant_isolation_conversation_memories" ON conversation_memories
+            FOR ALL USING (tenant_id = (current_setting('request.jwt.claims', true)::json ->> 'tenant_id')::uuid);
+    END IF;
+END $$;
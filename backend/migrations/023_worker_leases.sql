@@ -0,0 +1,57 @@
+-- Migration 023: leader lease for singleton background jobs
+-- Every API worker calls acquire_worker_lease() every few seconds; only the
+-- current holder (or anyone, once the lease has expired) gets TRUE back, so
+-- exactly one worker runs CRM sync loops and token refresh (see
+-- leader_election.py). release_worker_lease() hands the lease back on a
+-- clean shutdown.
+
+CREATE TABLE IF NOT EXISTS worker_leases (
+    name         TEXT PRIMARY KEY,
+    holder       TEXT NOT NULL,
+    expires_at   TIMESTAMPTZ NOT NULL,
+    acquired_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    renewed_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Service-role only: no tenant data, no client access
+ALTER TABLE worker_leases ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION acquire_worker_lease(p_name TEXT, p_holder TEXT, p_ttl_seconds INTEGER)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_holder TEXT;
+BEGIN
+    INSERT INTO worker_leases AS l (name, holder, expires_at)
+    VALUES (p_name, p_holder, NOW() + make_interval(secs => p_ttl_seconds))
+    ON CONFLICT (name) DO UPDATE SET
+        holder      = EXCLUDED.holder,
+        expires_at  = EXCLUDED.expires_at,
+        renewed_at  = NOW(),
+        acquired_at = CASE WHEN l.holder = EXCLUDED.holder THEN l.acquired_at ELSE NOW() END
+    WHERE l.holder = EXCLUDED.holder OR l.expires_at < NOW()
+    RETURNING holder INTO v_holder;
+
+    RETURN v_holder IS NOT NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION release_worker_lease(p_name TEXT, p_holder TEXT)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    DELETE FROM worker_leases WHERE name = p_name AND holder = p_holder;
+    RETURN FOUND;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION acquire_worker_lease(TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION release_worker_lease(TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION acquire_worker_lease(TEXT, TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION release_worker_lease(TEXT, TEXT) TO service_role;
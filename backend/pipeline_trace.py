@@ -0,0 +1,400 @@
+"""
+Pipeline Trace — span tracing for the customer message pipeline.
+================================================================
+A Telegram reply takes 4–10 s end to end; AgentTrace only records totals
+for the analytics agents. This traces one customer message as a tree of
+spans from webhook to persistence:
+
+    message                         root: tenant_id, channel, route
+      webhook_ack / queue_wait      recorded retroactively from timestamps
+      config_lookup / customer_lookup / history
+      crm_match / crm_query / rag / media_context
+      classifier
+      llm → faq_responder | sales_agent → completion
+      extraction (runs alongside delivery) / extraction_wait
+      send / persistence / lead_update
+
+Spans nest through a ContextVar, so helpers called inside a stage (and
+tasks they create) attach to it without passing anything around; outside a
+trace span() is a no-op. Ids follow the W3C / OpenTelemetry format (32-hex
+trace id, 16-hex span id) and timestamps are epoch nanoseconds.
+
+When the root span ends, the finished trace goes to:
+
+    StageHistograms     always — per stage × route and stage × tenant
+                        latency buckets with p50/p95 estimates, plus SLO
+                        breach counts (PIPELINE_SLO_MS="message=8000,llm=6000")
+    InMemoryExporter    tests: add_exporter(InMemoryExporter())
+    OpenTelemetryExporter
+                        PIPELINE_TRACE_EXPORT=otel replays each trace through
+                        the opentelemetry-api tracer — shipped wherever the
+                        deployment's OTel SDK / OTLP exporter sends it (a
+                        no-op without an SDK; skipped if the API is missing)
+
+The root's `route` attribute is set while the pipeline runs (mini / full /
+escalated, or why it stopped early), so every stage is bucketed by the
+final route.
+
+Public surface
+--------------
+    with start_trace("message", tenant_id=..., channel="telegram"):
+        with span("rag"):
+            ...
+        annotate(route="mini")               # attributes on the root span
+    record_span("queue_wait", start_ns, end_ns)
+
+    @traced("classifier")                    # async function → span
+    async def classify(...): ...
+
+    @traced_pipeline("message", "tenant_id", "channel")   # root from kwargs
+    async def process_channel_message(...): ...
+    await process_channel_message(..., received_ns=..., enqueued_ns=...)
+
+    add_exporter(exporter) / remove_exporter(exporter)
+    get_pipeline_stats(tenant_id=None)       # /api/admin/pipeline-latency
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2000, 3000, 5000, 8000, 12000, 20000, 30000, 60000)
+MAX_TENANTS = 200  # tenants tracked per stage before folding into "other"
+MAX_SPANS_PER_TRACE = 200
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+@dataclass
+class _Trace:
+    root: Span
+    spans: list[Span] = field(default_factory=list)
+    finished: bool = False
+
+
+_current: contextvars.ContextVar[Optional[tuple[_Trace, Span]]] = contextvars.ContextVar(
+    "pipeline_span", default=None
+)
+
+
+# ---------------------------------------------------------------------------
+# Span API
+# ---------------------------------------------------------------------------
+
+def _add(trace: _Trace, span: Span) -> None:
+    if len(trace.spans) < MAX_SPANS_PER_TRACE:
+        trace.spans.append(span)
+
+
+@contextmanager
+def start_trace(name: str, **attributes) -> Iterator[Span]:
+    """Open a root span; the trace is exported when it closes."""
+    root = Span(name, secrets.token_hex(16), secrets.token_hex(8), None, time.time_ns(), attributes=attributes)
+    trace = _Trace(root, [root])
+    token = _current.set((trace, root))
+    try:
+        yield root
+    except BaseException as e:
+        root.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        root.end_ns = time.time_ns()
+        trace.finished = True
+        _export(trace)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Child of the current span; a no-op (yields None) outside a trace."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    child = Span(name, trace.root.trace_id, secrets.token_hex(8), parent.span_id, time.time_ns(), attributes=attributes)
+    _add(trace, child)
+    token = _current.set((trace, child))
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.end_ns = time.time_ns()
+        if trace.finished:  # outlived its trace (e.g. a task still running)
+            _histograms.observe(child, trace.root)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes) -> None:
+    """Add an already-finished span (e.g. queue wait measured from timestamps)."""
+    current = _current.get()
+    if current is None:
+        return
+    trace, parent = current
+    _add(trace, Span(name, trace.root.trace_id, secrets.token_hex(8), parent.span_id,
+                     start_ns, max(end_ns, start_ns), attributes=attributes))
+
+
+def annotate(**attributes) -> None:
+    """Set attributes on the current trace's root span (route, model, ...)."""
+    current = _current.get()
+    if current is not None:
+        current[0].root.attributes.update(attributes)
+
+
+def traced_pipeline(name: str, *attribute_names: str):
+    """Decorator: run an async pipeline entry point as the root of a trace.
+
+    Root attributes come from the named keyword arguments. Callers may pass
+    received_ns / enqueued_ns (epoch ns when the webhook arrived and when it
+    handed the update to the background); they are consumed here and
+    recorded as the webhook_ack and queue_wait spans.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, received_ns: Optional[int] = None, enqueued_ns: Optional[int] = None, **kwargs):
+            attributes = {key: kwargs[key] for key in attribute_names if key in kwargs}
+            with start_trace(name, **attributes):
+                if received_ns and enqueued_ns:
+                    record_span("webhook_ack", received_ns, enqueued_ns)
+                if enqueued_ns:
+                    record_span("queue_wait", enqueued_ns, time.time_ns())
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced(name: str):
+    """Decorator: run an async function inside span(name)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ---------------------------------------------------------------------------
+# Stage histograms + SLOs
+# ---------------------------------------------------------------------------
+
+def _parse_slos(raw: str) -> dict[str, float]:
+    slos = {}
+    for part in (raw or "").split(","):
+        stage, _, ms = part.partition("=")
+        try:
+            if stage.strip():
+                slos[stage.strip()] = float(ms)
+        except ValueError:
+            logger.warning(f"Ignoring invalid PIPELINE_SLO_MS entry {part!r}")
+    return slos
+
+
+@dataclass
+class _Histogram:
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS_MS) + 1))
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    slo_breaches: int = 0
+
+    def observe(self, ms: float, slo_ms: Optional[float]) -> None:
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if slo_ms is not None and ms > slo_ms:
+            self.slo_breaches += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bucket edge containing the q-quantile (max_ms for the overflow bucket)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": round(self.max_ms, 1),
+            "slo_breaches": self.slo_breaches,
+            "buckets": {
+                **{f"<={edge}ms": n for edge, n in zip(BUCKETS_MS, self.buckets)},
+                f">{BUCKETS_MS[-1]}ms": self.buckets[-1],
+            },
+        }
+
+
+class StageHistograms:
+    def __init__(self, slos: Optional[dict[str, float]] = None):
+        self.slos = slos if slos is not None else _parse_slos(os.environ.get("PIPELINE_SLO_MS", ""))
+        self._lock = threading.Lock()
+        self._by_route: dict[tuple[str, str], _Histogram] = {}
+        self._by_tenant: dict[tuple[str, str], _Histogram] = {}
+        self._tenants: set[str] = set()
+
+    def observe(self, span: Span, root: Span) -> None:
+        route = str(root.attributes.get("route", "unknown"))
+        tenant = str(root.attributes.get("tenant_id", "unknown"))
+        ms = span.duration_ms
+        slo = self.slos.get(span.name)
+        with self._lock:
+            if tenant not in self._tenants:
+                if len(self._tenants) >= MAX_TENANTS:
+                    tenant = "other"
+                self._tenants.add(tenant)
+            self._by_route.setdefault((span.name, route), _Histogram()).observe(ms, slo)
+            self._by_tenant.setdefault((span.name, tenant), _Histogram()).observe(ms, slo)
+        if slo is not None and ms > slo and span is root:
+            logger.warning(
+                f"Pipeline SLO breach: {span.name} took {ms:.0f}ms > {slo:.0f}ms "
+                f"(route={route}, trace={span.trace_id})"
+            )
+
+    def stats(self, tenant_id: Optional[str] = None) -> dict:
+        with self._lock:
+            by_route: dict[str, dict] = {}
+            for (stage, route), hist in sorted(self._by_route.items()):
+                by_route.setdefault(stage, {})[route] = hist.to_dict()
+            by_tenant: dict[str, dict] = {}
+            for (stage, tenant), hist in sorted(self._by_tenant.items()):
+                if tenant_id is None or tenant == tenant_id:
+                    by_tenant.setdefault(stage, {})[tenant] = hist.to_dict()
+            return {"slo_ms": dict(self.slos), "by_route": by_route, "by_tenant": by_tenant}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._by_route.clear()
+            self._by_tenant.clear()
+            self._tenants.clear()
+
+
+# ---------------------------------------------------------------------------
+# Exporters
+# ---------------------------------------------------------------------------
+
+class InMemoryExporter:
+    """Keeps finished traces in memory — for tests and local debugging."""
+
+    def __init__(self):
+        self.traces: list[list[Span]] = []
+
+    def export(self, spans: list[Span]) -> None:
+        self.traces.append(list(spans))
+
+    @property
+    def spans(self) -> list[Span]:
+        return [s for trace in self.traces for s in trace]
+
+    def names(self) -> list[str]:
+        return [s.name for s in self.spans]
+
+    def clear(self) -> None:
+        self.traces.clear()
+
+
+class OpenTelemetryExporter:
+    """Replays finished traces through the opentelemetry-api tracer."""
+
+    def __init__(self, tracer=None):
+        if tracer is None:
+            from opentelemetry import trace as otel_trace
+            tracer = otel_trace.get_tracer("teleagent.pipeline")
+        self.tracer = tracer
+
+    def export(self, spans: list[Span]) -> None:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.trace import Status, StatusCode
+
+        children: dict[Optional[str], list[Span]] = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+
+        def emit(s: Span, context) -> None:
+            attributes = {k: v for k, v in s.attributes.items() if isinstance(v, (str, bool, int, float))}
+            attributes["pipeline.trace_id"] = s.trace_id
+            otel_span = self.tracer.start_span(s.name, context=context, start_time=s.start_ns, attributes=attributes)
+            if s.error:
+                otel_span.set_status(Status(StatusCode.ERROR, s.error))
+            child_context = otel_trace.set_span_in_context(otel_span)
+            for child in children.get(s.span_id, ()):
+                emit(child, child_context)
+            otel_span.end(end_time=s.end_ns or s.start_ns)
+
+        for root in children.get(None, ()):
+            emit(root, None)
+
+
+_histograms = StageHistograms()
+_exporters: list = []
+
+
+def add_exporter(exporter) -> None:
+    _exporters.append(exporter)
+
+
+def remove_exporter(exporter) -> None:
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+
+
+def _export(trace: _Trace) -> None:
+    for s in trace.spans:
+        if s.end_ns is not None:
+            _histograms.observe(s, trace.root)
+    for exporter in list(_exporters):
+        try:
+            exporter.export(trace.spans)
+        except Exception as e:  # tracing never breaks the pipeline
+            logger.warning(f"Trace export via {type(exporter).__name__} failed: {e}")
+
+
+def get_pipeline_stats(tenant_id: Optional[str] = None) -> dict:
+    return _histograms.stats(tenant_id)
+
+
+def reset_pipeline_stats() -> None:
+    _histograms.reset()
+
+
+if (os.environ.get("PIPELINE_TRACE_EXPORT") or "").strip().lower() == "otel":
+    try:
+        add_exporter(OpenTelemetryExporter())
+    except ImportError:
+        logger.warning("PIPELINE_TRACE_EXPORT=otel but opentelemetry-api is not installed — export disabled")
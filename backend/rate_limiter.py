@@ -0,0 +1,269 @@
+"""
+Rate Limiter — shared keyed rate limiting with constant per-key state.
+=====================================================================
+The inbound message / LLM limiters and the outbound CRM client limiters
+used to keep a list of request timestamps per key, rebuilt with a list
+comprehension on every call and scanned with min() for the wait time.
+Memory grew with the limit and the key count, and waiting callers polled
+with asyncio.sleep under a shared lock.
+
+Two algorithms, both O(1) time and a fixed-size state per key:
+
+    TokenBucketLimiter       `capacity` tokens refilled at `rate` per second.
+                             Allows short bursts; used for outbound API calls
+                             (Bitrix24 / HubSpot / Zoho / Freshsales)
+    SlidingWindowLimiter     sliding-window counter: the previous fixed
+                             window's count is weighted by how much of it
+                             still overlaps the sliding window. Used for
+                             per-user / per-tenant flood limits
+
+Keys live in an LRU-ordered dict capped at max_keys; idle keys (whose state
+has returned to "empty") are dropped from the cold end by cleanup().
+
+acquire() is the async, waiting form: callers that cannot proceed join a
+per-key FIFO queue, and a single timer per key wakes them in arrival order
+exactly when the next slot opens — no per-caller polling.
+
+Public surface
+--------------
+    limiter = TokenBucketLimiter("bitrix", rate=4, capacity=4)
+    limiter = SlidingWindowLimiter("messages", max_requests=10, window=60)
+    if limiter.try_acquire(key[, limit]): ...         # non-blocking
+    seconds = limiter.wait_time(key[, limit])         # until the next slot
+    await limiter.acquire(key)                        # wait FIFO for a slot
+    limiter.cleanup() / limiter.stats()
+    sliding_window_wait(prev, curr, elapsed, window, limit)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_KEYS = 100_000
+
+
+def sliding_window_wait(prev: int, curr: int, elapsed: float, window: float, limit: float) -> float:
+    """
+    Seconds until one more request fits a sliding-window counter, given the
+    previous and current fixed-window counts and the time elapsed in the
+    current window. Shared with the Redis-backed limiter in shared_state.
+    """
+    if prev * (1 - elapsed / window) + curr + 1 <= limit + 1e-9:
+        return 0.0
+    if curr + 1 <= limit:
+        # prev's weight decays linearly; solve prev * (1 - t / window) + curr + 1 = limit
+        return max(0.0, window * (1 - (limit - curr - 1) / prev) - elapsed)
+    # Current window is full: wait for it to roll over and decay as the new prev
+    until_next = window - elapsed
+    if limit < 1:
+        return until_next
+    return until_next + window * (1 - (limit - 1) / curr)
+
+
+class _KeyedLimiter(ABC):
+    """Per-key state storage, FIFO waiting and stats shared by both algorithms."""
+
+    def __init__(self, name: str, max_keys: int = DEFAULT_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.max_keys = max_keys
+        self.clock = clock
+        self._state: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._waiters: dict[Hashable, deque] = {}
+        self._drainers: dict[Hashable, asyncio.Task] = {}
+        self._stats = {"allowed": 0, "limited": 0, "waited": 0, "evicted_keys": 0}
+
+    # Subclasses implement the algorithm on a mutable per-key state list
+    @abstractmethod
+    def _new_state(self, now: float) -> list:
+        ...
+
+    @abstractmethod
+    def _advance(self, state: list, now: float) -> None:
+        ...
+
+    @abstractmethod
+    def _wait(self, state: list, now: float, limit: Optional[float]) -> float:
+        ...
+
+    @abstractmethod
+    def _take(self, state: list) -> None:
+        ...
+
+    @abstractmethod
+    def _idle(self, state: list, now: float) -> bool:
+        ...
+
+    def _get_state(self, key: Hashable, now: float) -> list:
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = self._new_state(now)
+            if len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+                self._stats["evicted_keys"] += 1
+        else:
+            self._state.move_to_end(key)
+            self._advance(state, now)
+        return state
+
+    # ------------------------------------------------------------------
+    # Non-blocking API
+    # ------------------------------------------------------------------
+
+    def try_acquire(self, key: Hashable = "default", limit: Optional[float] = None) -> bool:
+        """Take one slot for key if available. `limit` overrides the configured limit."""
+        with self._lock:
+            now = self.clock()
+            state = self._get_state(key, now)
+            if self._wait(state, now, limit) > 0:
+                self._stats["limited"] += 1
+                return False
+            self._take(state)
+            self._stats["allowed"] += 1
+            return True
+
+    def wait_time(self, key: Hashable = "default", limit: Optional[float] = None) -> float:
+        """Seconds until try_acquire(key) would succeed (0.0 if it would now)."""
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                return 0.0
+            now = self.clock()
+            self._advance(state, now)
+            return self._wait(state, now, limit)
+
+    def retry_after(self, key: Hashable = "default", limit: Optional[float] = None) -> int:
+        """wait_time rounded up to whole seconds, for Retry-After headers and messages."""
+        return math.ceil(self.wait_time(key, limit))
+
+    # ------------------------------------------------------------------
+    # Waiting API
+    # ------------------------------------------------------------------
+
+    async def acquire(self, key: Hashable = "default") -> None:
+        """Wait for a slot. Waiters for the same key are served in arrival order."""
+        if not self._waiters.get(key) and self.try_acquire(key):
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        self._stats["waited"] += 1
+        drainer = self._drainers.get(key)
+        if drainer is None or drainer.done():
+            self._drainers[key] = asyncio.create_task(self._drain(key))
+        await future
+
+    async def _drain(self, key: Hashable) -> None:
+        queue = self._waiters[key]
+        try:
+            while queue:
+                if queue[0].done():  # cancelled waiter
+                    queue.popleft()
+                    continue
+                delay = self.wait_time(key)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                if self.try_acquire(key):
+                    queue.popleft().set_result(None)
+        finally:
+            if not queue:
+                self._waiters.pop(key, None)
+            self._drainers.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def cleanup(self) -> int:
+        """Drop keys whose state is back to empty, coldest first. Returns keys removed."""
+        removed = 0
+        with self._lock:
+            now = self.clock()
+            while self._state:
+                key, state = next(iter(self._state.items()))
+                self._advance(state, now)
+                if not self._idle(state, now):
+                    break
+                del self._state[key]
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        return {**self._stats, "keys": len(self._state), "waiting": sum(len(q) for q in self._waiters.values())}
+
+
+class TokenBucketLimiter(_KeyedLimiter):
+    """Token bucket: `capacity` burst, refilled continuously at `rate` tokens/second."""
+
+    def __init__(self, name: str, rate: float, capacity: Optional[float] = None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+
+    # state = [tokens, last_refill]
+    def _new_state(self, now: float) -> list:
+        return [float(self.capacity), now]
+
+    def _advance(self, state: list, now: float) -> None:
+        elapsed = now - state[1]
+        if elapsed > 0:
+            state[0] = min(self.capacity, state[0] + elapsed * self.rate)
+            state[1] = now
+
+    def _wait(self, state: list, now: float, limit: Optional[float]) -> float:
+        missing = 1.0 - state[0]
+        return missing / self.rate if missing > 1e-9 else 0.0
+
+    def _take(self, state: list) -> None:
+        state[0] -= 1.0
+
+    def _idle(self, state: list, now: float) -> bool:
+        return state[0] >= self.capacity
+
+
+class SlidingWindowLimiter(_KeyedLimiter):
+    """
+    Sliding-window counter: at most ~max_requests per `window` seconds.
+    The estimate is prev_count * (overlap of the previous fixed window) +
+    current_count, which smooths the burst a plain fixed window allows at
+    window boundaries while storing two counters per key.
+    """
+
+    def __init__(self, name: str, max_requests: int, window: float, **kwargs):
+        super().__init__(name, **kwargs)
+        self.max_requests = max_requests
+        self.window = window
+
+    # state = [window_index, prev_count, curr_count]
+    def _new_state(self, now: float) -> list:
+        return [int(now // self.window), 0, 0]
+
+    def _advance(self, state: list, now: float) -> None:
+        index = int(now // self.window)
+        if index == state[0]:
+            return
+        state[1] = state[2] if index == state[0] + 1 else 0
+        state[2] = 0
+        state[0] = index
+
+    def _wait(self, state: list, now: float, limit: Optional[float]) -> float:
+        index, prev, curr = state
+        return sliding_window_wait(
+            prev, curr, now - index * self.window, self.window,
+            self.max_requests if limit is None else limit,
+        )
+
+    def _take(self, state: list) -> None:
+        state[2] += 1
+
+    def _idle(self, state: list, now: float) -> bool:
+        return state[1] == 0 and state[2] == 0
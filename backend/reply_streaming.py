@@ -0,0 +1,323 @@
+"""
+Reply Streaming — progressive delivery of LLM replies while they generate.
+=========================================================================
+Two pieces shared by the streamed chat paths:
+
+    JsonStringFieldStreamer  incrementally decodes one string field (e.g.
+                             "reply_text") out of a JSON object that is still
+                             being streamed, so the text can be shown before
+                             the object is complete.
+
+    TelegramProgressiveReply sends the first sentence as soon as it exists,
+                             then grows that message with throttled
+                             editMessageText calls. Text beyond Telegram's
+                             4096-char limit continues in a new message.
+
+Rate limits: Telegram allows roughly one message/edit per second per chat.
+Intermediate edits are spaced at least EDIT_INTERVAL seconds apart and only
+sent once MIN_EDIT_GROWTH new characters have arrived; a 429 pauses
+intermediate edits for the returned retry_after. Intermediate text is sent as
+plain text with HTML tags stripped (a half-generated tag would fail to
+parse); finalize() sends the validated text as HTML, falling back to plain.
+
+Public surface
+--------------
+    streamer = JsonStringFieldStreamer("reply_text")
+    new_text = streamer.feed(fragment)
+
+    reply = TelegramProgressiveReply(bot_token, chat_id)
+    await reply.update(text_so_far)        # called as text streams in
+    ok = await reply.finalize(final_text)  # after validation / correction
+    reply.started                          # a message is already visible
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_BASE = ((os.environ.get("TELEGRAM_API_URL") or "").strip() or "https://api.telegram.org").rstrip("/") + "/bot"
+TELEGRAM_MAX_LENGTH = 4096
+
+EDIT_INTERVAL = 1.2  # seconds between intermediate edits
+MIN_EDIT_GROWTH = 40  # new characters before an intermediate edit is worth it
+FIRST_CHUNK_MIN = 20  # don't open the message with a fragment shorter than this
+FIRST_CHUNK_MAX = 200  # ...and don't wait for a sentence end beyond this
+
+_SENTENCE_END = re.compile(r"[.!?…。](?=\s)|\n")
+_TAG = re.compile(r"<[^>]*>")
+_PARTIAL_TAG = re.compile(r"<[^>]*$")
+
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+# ---------------------------------------------------------------------------
+# Incremental JSON string decoding
+# ---------------------------------------------------------------------------
+
+class JsonStringFieldStreamer:
+    """
+    Decodes the value of one top-level string field from JSON fragments as
+    they arrive. Escapes split across fragments (including surrogate pairs)
+    are held back until complete.
+    """
+
+    def __init__(self, key: str):
+        self._key = re.compile(r'"' + re.escape(key) + r'"\s*:\s*"')
+        self._buf = ""
+        self._pos: Optional[int] = None
+        self._done = False
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def feed(self, fragment: str) -> str:
+        """Append a fragment; return newly decoded field text."""
+        self._buf += fragment
+        if self._done:
+            return ""
+        if self._pos is None:
+            match = self._key.search(self._buf)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf, i, out = self._buf, self._pos, []
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._done = True
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            if i + 1 >= len(buf):
+                break  # escape split across fragments
+            esc = buf[i + 1]
+            if esc != "u":
+                out.append(_JSON_ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # Surrogate pair — wait for the low half
+                if i + 12 > len(buf):
+                    break
+                low = int(buf[i + 8:i + 12], 16)
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                i += 6
+            out.append(chr(code))
+            i += 6
+        self._pos = i
+        return "".join(out)
+
+
+# ---------------------------------------------------------------------------
+# Telegram progressive delivery
+# ---------------------------------------------------------------------------
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_LENGTH) -> list[str]:
+    """Split text into Telegram-sized chunks, preferring paragraph / line / word breaks."""
+    chunks = []
+    while len(text) > limit:
+        cut = max(text.rfind("\n\n", 0, limit), text.rfind("\n", 0, limit))
+        if cut < limit // 2:
+            cut = text.rfind(" ", 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+def _plain(text: str) -> str:
+    """Streaming preview text: drop complete and half-generated HTML tags."""
+    return _TAG.sub("", _PARTIAL_TAG.sub("", text))
+
+
+def _first_chunk_end(text: str) -> int:
+    """End index of the opening chunk worth sending, or 0 if not there yet."""
+    for match in _SENTENCE_END.finditer(text):
+        if match.end() >= FIRST_CHUNK_MIN:
+            return match.end()
+    if len(text) >= FIRST_CHUNK_MAX:
+        cut = text.rfind(" ", 0, FIRST_CHUNK_MAX)
+        return cut if cut > 0 else FIRST_CHUNK_MAX
+    return 0
+
+
+class TelegramProgressiveReply:
+    """One streamed bot reply, delivered as a growing Telegram message."""
+
+    def __init__(
+        self,
+        bot_token: str,
+        chat_id: int,
+        edit_interval: float = EDIT_INTERVAL,
+        min_growth: int = MIN_EDIT_GROWTH,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.min_growth = min_growth
+        self._client = http_client
+        self._message_ids: list[int] = []  # one per 4096-char chunk shown so far
+        self._shown: list[str] = []  # text currently displayed in each message
+        self._last_edit = 0.0
+        self._paused_until = 0.0
+        self._failed = False
+        self._lock = asyncio.Lock()
+        self.edits = 0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._message_ids)
+
+    # ------------------------------------------------------------------
+    # Telegram API
+    # ------------------------------------------------------------------
+
+    async def _call(self, method: str, payload: dict) -> Optional[dict]:
+        """POST to the Bot API. Returns the JSON body, or None on transport error."""
+        url = f"{TELEGRAM_API_BASE}{self.bot_token}/{method}"
+        try:
+            if self._client is not None:
+                response = await self._client.post(url, json=payload)
+            else:
+                async with httpx.AsyncClient(timeout=15.0) as client:
+                    response = await client.post(url, json=payload)
+            return response.json()
+        except Exception as e:
+            logger.warning(f"Telegram {method} failed during streamed reply: {e}")
+            return None
+
+    def _note_rate_limit(self, body: dict) -> None:
+        retry_after = (body.get("parameters") or {}).get("retry_after")
+        if retry_after:
+            self._paused_until = time.monotonic() + float(retry_after)
+            logger.info(f"Telegram rate limit on chat {self.chat_id}: pausing edits {retry_after}s")
+
+    async def _send(self, text: str, html: bool) -> Optional[int]:
+        payload = {"chat_id": self.chat_id, "text": text}
+        if html:
+            payload["parse_mode"] = "HTML"
+        body = await self._call("sendMessage", payload)
+        if body and not body.get("ok") and html and "parse" in str(body.get("description", "")).lower():
+            return await self._send(_plain(text), html=False)
+        if not body or not body.get("ok"):
+            if body:
+                self._note_rate_limit(body)
+                logger.warning(f"Telegram sendMessage failed during streamed reply: {body.get('description')}")
+            return None
+        return body["result"]["message_id"]
+
+    async def _edit(self, message_id: int, text: str, html: bool) -> bool:
+        payload = {"chat_id": self.chat_id, "message_id": message_id, "text": text}
+        if html:
+            payload["parse_mode"] = "HTML"
+        body = await self._call("editMessageText", payload)
+        self.edits += 1
+        if body is None:
+            return False
+        if body.get("ok"):
+            return True
+        description = str(body.get("description", ""))
+        if "message is not modified" in description:
+            return True
+        if html and "parse" in description.lower():
+            return await self._edit(message_id, _plain(text), html=False)
+        self._note_rate_limit(body)
+        logger.warning(f"Telegram editMessageText failed during streamed reply: {description}")
+        return False
+
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+
+    async def update(self, text: str) -> None:
+        """
+        Show the reply generated so far. Cheap to call on every delta: it only
+        talks to Telegram when the opening sentence is ready or an edit is due.
+        """
+        if self._failed or self._lock.locked():
+            return  # a request is in flight — the next delta will catch up
+        async with self._lock:
+            preview = _plain(text).strip()
+            if not self._message_ids:
+                end = _first_chunk_end(preview)
+                if not end:
+                    return
+                message_id = await self._send(preview[:end].strip(), html=False)
+                if message_id is None:
+                    self._failed = True  # fall back to one final send
+                    return
+                self._message_ids.append(message_id)
+                self._shown.append(preview[:end].strip())
+                self._last_edit = time.monotonic()
+                return
+
+            now = time.monotonic()
+            if now < self._paused_until or now - self._last_edit < self.edit_interval:
+                return
+            chunks = split_message(preview)
+            if len(chunks) > len(self._shown):
+                # Finish the current message, then open the next one
+                idx = len(self._shown) - 1
+                if chunks[idx] != self._shown[idx]:
+                    await self._edit(self._message_ids[idx], chunks[idx], html=False)
+                    self._shown[idx] = chunks[idx]
+                message_id = await self._send(chunks[idx + 1], html=False)
+                if message_id is not None:
+                    self._message_ids.append(message_id)
+                    self._shown.append(chunks[idx + 1])
+                self._last_edit = time.monotonic()
+                return
+
+            idx = len(self._shown) - 1
+            if len(chunks[idx]) - len(self._shown[idx]) < self.min_growth:
+                return
+            if await self._edit(self._message_ids[idx], chunks[idx], html=False):
+                self._shown[idx] = chunks[idx]
+            self._last_edit = time.monotonic()
+
+    async def finalize(self, text: str) -> bool:
+        """
+        Replace the streamed preview with the final (validated) reply as HTML.
+        Waits out an active rate-limit pause; sends fresh messages for any
+        chunks not yet shown. Returns True if every chunk was delivered.
+        """
+        async with self._lock:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(min(delay, 30.0))
+
+            ok = True
+            chunks = split_message(text)
+            for idx, chunk in enumerate(chunks):
+                if idx < len(self._message_ids):
+                    ok = await self._edit(self._message_ids[idx], chunk, html=True) and ok
+                else:
+                    message_id = await self._send(chunk, html=True)
+                    if message_id is None:
+                        ok = False
+                        continue
+                    self._message_ids.append(message_id)
+            # Stale overflow messages (final text shorter than the preview)
+            for message_id in self._message_ids[len(chunks):]:
+                await self._call("deleteMessage", {"chat_id": self.chat_id, "message_id": message_id})
+            return ok
@@ -3,11 +3,16 @@ Revenue Compute Engine
 ======================
 compute_snapshot(): runs all 12 metrics and persists to revenue_snapshots.
 compute_alerts():   deterministic 5-rule alert engine — no LLM calls.
+compute_snapshots(): batched recompute of several timeframes in one job.
 
 Both functions are called by POST /api/revenue/recompute.
 compute_snapshot() also invokes compute_alerts() internally so the snapshot
 and alert records are always in sync.
 
+Metrics are validated and computed concurrently (bounded by
+METRIC_CONCURRENCY) inside metric_catalog.shared_queries(), so row counts
+and samples shared between metrics hit the database once per job.
+
 Alert rules
 -----------
   pipeline_stall      — deals with modified_at older than p75 of all open deals
@@ -22,8 +27,10 @@ implicated entities, and a confidence score computed from the data signal.
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import statistics
+import time
 from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
 from typing import Any, Optional
@@ -38,6 +45,13 @@ TIMEFRAME_DAYS: dict[str, int] = {
     "365d": 365,
 }
 
+# Max metrics validated/computed at once inside one snapshot job
+METRIC_CONCURRENCY = 4
+
+# Union of the open-deal fields the three open-pipeline rules read, so
+# compute_alerts() can fetch the open pipeline once and share it.
+_OPEN_DEAL_FIELDS = ["stage", "modified_at", "won", "title", "value", "closed_at", "assigned_to"]
+
 
 # ---------------------------------------------------------------------------
 # Alert record
@@ -146,16 +160,18 @@ async def _alert_pipeline_stall(
     crm_source: str,
     won_stages: set[str],
     lost_stages: set[str],
+    open_deals: Optional[list[dict]] = None,
 ) -> Optional[AlertRecord]:
     """
     Open deals whose modified_at age exceeds the p75 of all open deal ages.
     Fired when at least 2 deals are stalled AND stalled count ≥ 15% of open pipeline.
     """
     now = datetime.now(timezone.utc)
-    fields = ["stage", "modified_at", "won", "title", "value"]
-    open_deals = await _fetch_open_deals(
-        supabase, tenant_id, crm_source, fields, won_stages, lost_stages
-    )
+    if open_deals is None:
+        fields = ["stage", "modified_at", "won", "title", "value"]
+        open_deals = await _fetch_open_deals(
+            supabase, tenant_id, crm_source, fields, won_stages, lost_stages
+        )
 
     if len(open_deals) < 3:
         return None
@@ -453,15 +469,17 @@ async def _alert_forecast_risk(
     won_stages: set[str],
     lost_stages: set[str],
     stage_order: list[str],
+    open_deals: Optional[list[dict]] = None,
 ) -> Optional[AlertRecord]:
     """
     Open deals in the final 25% of pipeline stages that are missing
     closed_at or value — these distort forecast accuracy.
     """
-    fields = ["stage", "value", "closed_at", "won", "title"]
-    open_deals = await _fetch_open_deals(
-        supabase, tenant_id, crm_source, fields, won_stages, lost_stages
-    )
+    if open_deals is None:
+        fields = ["stage", "value", "closed_at", "won", "title"]
+        open_deals = await _fetch_open_deals(
+            supabase, tenant_id, crm_source, fields, won_stages, lost_stages
+        )
 
     if not open_deals:
         return None
@@ -538,14 +556,16 @@ async def _alert_concentration_risk(
     crm_source: str,
     won_stages: set[str],
     lost_stages: set[str],
+    open_deals: Optional[list[dict]] = None,
 ) -> Optional[AlertRecord]:
     """
     A single deal or single rep accounts for > 60% of total open pipeline value.
     """
-    fields = ["title", "value", "won", "assigned_to"]
-    open_deals = await _fetch_open_deals(
-        supabase, tenant_id, crm_source, fields, won_stages, lost_stages
-    )
+    if open_deals is None:
+        fields = ["title", "value", "won", "assigned_to"]
+        open_deals = await _fetch_open_deals(
+            supabase, tenant_id, crm_source, fields, won_stages, lost_stages
+        )
 
     if len(open_deals) < 3:
         return None
@@ -637,44 +657,193 @@ async def compute_alerts(
     tenant_id: str,
     crm_source: str,
     timeframe: str = "30d",
+    revenue_model: Optional[dict] = None,
 ) -> list[AlertRecord]:
     """
-    Run all 5 alert rules and return fired alerts.
+    Run all 5 alert rules concurrently and return fired alerts (in rule order).
+
+    The open pipeline is fetched once and shared by the three rules that read
+    it. Pass revenue_model to skip reloading it (batched recompute).
 
     The caller is responsible for DB writes (delete open alerts → insert fresh).
     compute_snapshot() handles this automatically when it calls compute_alerts().
     """
     time_range_days = TIMEFRAME_DAYS.get(timeframe, 30)
-    revenue_model = await _load_revenue_model(supabase, tenant_id, crm_source)
+    if revenue_model is None:
+        revenue_model = await _load_revenue_model(supabase, tenant_id, crm_source)
     won_stages: set[str] = set(revenue_model.get("won_stage_values") or [])
     lost_stages: set[str] = set(revenue_model.get("lost_stage_values") or [])
     stage_order: list[str] = revenue_model.get("stage_order") or []
 
+    open_deals = await _fetch_open_deals(
+        supabase, tenant_id, crm_source, _OPEN_DEAL_FIELDS, won_stages, lost_stages
+    )
+
     rule_args = [
         # (coroutine, label)
-        (_alert_pipeline_stall(supabase, tenant_id, crm_source, won_stages, lost_stages), "pipeline_stall"),
+        (_alert_pipeline_stall(supabase, tenant_id, crm_source, won_stages, lost_stages, open_deals), "pipeline_stall"),
         (_alert_conversion_drop(supabase, tenant_id, crm_source, time_range_days), "conversion_drop"),
         (_alert_rep_slip(supabase, tenant_id, crm_source, time_range_days), "rep_slip"),
-        (_alert_forecast_risk(supabase, tenant_id, crm_source, won_stages, lost_stages, stage_order), "forecast_risk"),
-        (_alert_concentration_risk(supabase, tenant_id, crm_source, won_stages, lost_stages), "concentration_risk"),
+        (_alert_forecast_risk(supabase, tenant_id, crm_source, won_stages, lost_stages, stage_order, open_deals), "forecast_risk"),
+        (_alert_concentration_risk(supabase, tenant_id, crm_source, won_stages, lost_stages, open_deals), "concentration_risk"),
     ]
 
+    results = await asyncio.gather(*(coro for coro, _ in rule_args), return_exceptions=True)
+
     alerts: list[AlertRecord] = []
-    for coro, label in rule_args:
-        try:
-            result = await coro
-            if result:
-                alerts.append(result)
-        except Exception as e:
-            logger.error("compute_alerts rule '%s' failed: %s", label, e)
+    for (_, label), result in zip(rule_args, results):
+        if isinstance(result, BaseException):
+            logger.error("compute_alerts rule '%s' failed: %s", label, result)
+        elif result:
+            alerts.append(result)
 
     return alerts
 
 
+def _persist_alerts(supabase, tenant_id: str, crm_source: str, alerts: list[AlertRecord]) -> None:
+    """Replace the OPEN alert set: one delete + one bulk insert. Dismissed alerts are kept."""
+    try:
+        (
+            supabase.table("revenue_alerts")
+            .delete()
+            .eq("tenant_id", tenant_id)
+            .eq("crm_source", crm_source)
+            .eq("status", "open")
+            .execute()
+        )
+    except Exception as e:
+        logger.warning("compute_snapshot: failed to delete open alerts: %s", e)
+
+    if not alerts:
+        return
+
+    rows = [
+        {
+            "tenant_id": tenant_id,
+            "crm_source": crm_source,
+            "alert_type": alert.alert_type,
+            "severity": alert.severity,
+            "status": "open",
+            "summary": alert.summary,
+            "evidence_json": alert.evidence,
+            "recommended_actions_json": alert.recommended_actions,
+        }
+        for alert in alerts
+    ]
+    try:
+        supabase.table("revenue_alerts").insert(rows).execute()
+    except Exception as e:
+        logger.error(
+            "compute_snapshot: failed to insert %d alerts (%s): %s",
+            len(rows), ", ".join(a.alert_type for a in alerts), e,
+        )
+
+
 # ---------------------------------------------------------------------------
 # Public API: compute_snapshot
 # ---------------------------------------------------------------------------
 
+def _unavailable(reason: str) -> dict:
+    return {
+        "available": False,
+        "reason": reason,
+        "value": None,
+        "data": [],
+        "evidence": None,
+    }
+
+
+async def _compute_metric_entry(
+    supabase,
+    tenant_id: str,
+    crm_source: str,
+    metric_key: str,
+    time_range_days: int,
+    validator,
+    semaphore: asyncio.Semaphore,
+) -> dict:
+    """Validate + compute one metric into its snapshot_json entry (never raises)."""
+    from revenue.metric_catalog import compute_metric
+
+    async with semaphore:
+        started = time.perf_counter()
+        ok, reason, _ = await validator.validate(supabase, tenant_id, crm_source, metric_key)
+        if not ok:
+            entry = _unavailable(reason)
+        else:
+            try:
+                result = await compute_metric(
+                    metric_key=metric_key,
+                    supabase=supabase,
+                    tenant_id=tenant_id,
+                    crm_source=crm_source,
+                    time_range_days=time_range_days,
+                )
+                ev = result.evidence
+                entry = {
+                    "available": True,
+                    "value": result.value,
+                    "chart_type": result.chart_type,
+                    "data": result.data,
+                    "evidence": {
+                        "row_count": ev.row_count,
+                        "sampled_rows": ev.sampled_rows,
+                        "fields_evaluated": ev.fields_evaluated,
+                        "null_rates": ev.null_rates,
+                        "data_trust_score": ev.data_trust_score,
+                        "timeframe": ev.timeframe,
+                        "computation_notes": ev.computation_notes,
+                    },
+                    "warnings": result.warnings,
+                }
+            except Exception as e:
+                logger.error("compute_snapshot: metric '%s' failed: %s", metric_key, e)
+                entry = _unavailable(str(e))
+        entry["compute_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return entry
+
+
+async def _compute_snapshot_json(
+    supabase,
+    tenant_id: str,
+    crm_source: str,
+    time_range_days: int,
+    validator,
+) -> tuple[dict[str, dict], float]:
+    """Compute every catalog metric concurrently. Returns (snapshot_json, mean_trust)."""
+    from revenue.metric_catalog import METRIC_CATALOG
+
+    semaphore = asyncio.Semaphore(METRIC_CONCURRENCY)
+    keys = list(METRIC_CATALOG.keys())
+    entries = await asyncio.gather(*(
+        _compute_metric_entry(
+            supabase, tenant_id, crm_source, key, time_range_days, validator, semaphore,
+        )
+        for key in keys
+    ))
+    snapshot_json = dict(zip(keys, entries))
+
+    trust_scores = [
+        e["evidence"]["data_trust_score"] for e in entries if e.get("available")
+    ]
+    mean_trust = round(sum(trust_scores) / len(trust_scores), 3) if trust_scores else 0.0
+    return snapshot_json, mean_trust
+
+
+def _upsert_snapshot(supabase, snapshot_row: dict) -> dict:
+    try:
+        result = (
+            supabase.table("revenue_snapshots")
+            .upsert(snapshot_row, on_conflict="tenant_id,crm_source,timeframe")
+            .execute()
+        )
+        if result.data:
+            return result.data[0]
+    except Exception as e:
+        logger.error("compute_snapshot: upsert failed: %s", e)
+    return snapshot_row
+
+
 async def compute_snapshot(
     supabase,
     tenant_id: str,
@@ -685,125 +854,76 @@ async def compute_snapshot(
     Run all 12 metrics at scalar (no dimension) level and write results to
     revenue_snapshots (upsert by tenant+source+timeframe).
 
+    Metrics run concurrently; each snapshot_json entry records its own
+    ``compute_ms``.
+
     Also runs compute_alerts() and persists the fresh alert set:
     - Deletes all OPEN alerts for this tenant/source
-    - Inserts a fresh set from the 5 rules
+    - Inserts a fresh set from the 5 rules in one bulk write
     - Dismissed alerts are never touched
 
     Returns the snapshot row dict (from the upsert or the in-memory object).
     """
-    time_range_days = TIMEFRAME_DAYS.get(timeframe, 30)
-
-    from revenue.metric_catalog import METRIC_CATALOG, compute_metric, MetricValidator
-
-    validator = MetricValidator()
-    snapshot_json: dict[str, dict] = {}
-    trust_scores: list[float] = []
-
-    for metric_key, defn in METRIC_CATALOG.items():
-        ok, reason, _ = await validator.validate(supabase, tenant_id, crm_source, metric_key)
-        if not ok:
-            snapshot_json[metric_key] = {
-                "available": False,
-                "reason": reason,
-                "value": None,
-                "data": [],
-                "evidence": None,
-            }
-            continue
+    snapshots = await compute_snapshots(
+        supabase, tenant_id, crm_source, [timeframe], alert_timeframe=timeframe,
+    )
+    return snapshots[timeframe]
 
-        try:
-            result = await compute_metric(
-                metric_key=metric_key,
-                supabase=supabase,
-                tenant_id=tenant_id,
-                crm_source=crm_source,
-                time_range_days=time_range_days,
-            )
-            ev = result.evidence
-            snapshot_json[metric_key] = {
-                "available": True,
-                "value": result.value,
-                "chart_type": result.chart_type,
-                "data": result.data,
-                "evidence": {
-                    "row_count": ev.row_count,
-                    "sampled_rows": ev.sampled_rows,
-                    "fields_evaluated": ev.fields_evaluated,
-                    "null_rates": ev.null_rates,
-                    "data_trust_score": ev.data_trust_score,
-                    "timeframe": ev.timeframe,
-                    "computation_notes": ev.computation_notes,
-                },
-                "warnings": result.warnings,
-            }
-            trust_scores.append(ev.data_trust_score)
-        except Exception as e:
-            logger.error("compute_snapshot: metric '%s' failed: %s", metric_key, e)
-            snapshot_json[metric_key] = {
-                "available": False,
-                "reason": str(e),
-                "value": None,
-                "data": [],
-                "evidence": None,
-            }
 
-    mean_trust = round(sum(trust_scores) / len(trust_scores), 3) if trust_scores else 0.0
+async def compute_snapshots(
+    supabase,
+    tenant_id: str,
+    crm_source: str,
+    timeframes: Optional[list[str]] = None,
+    alert_timeframe: str = "30d",
+) -> dict[str, dict]:
+    """
+    Recompute snapshots for several timeframes (default: all four) as one job.
 
-    # --- Compute and persist alerts ---
-    alerts = await compute_alerts(supabase, tenant_id, crm_source, timeframe)
+    Table counts, row samples and the revenue model are loaded once and shared
+    by every timeframe. Alerts are tenant-wide, so they are computed once for
+    ``alert_timeframe`` and persisted once.
 
-    try:
-        # Delete open alerts (preserve dismissed ones)
-        (
-            supabase.table("revenue_alerts")
-            .delete()
-            .eq("tenant_id", tenant_id)
-            .eq("crm_source", crm_source)
-            .eq("status", "open")
-            .execute()
-        )
-    except Exception as e:
-        logger.warning("compute_snapshot: failed to delete open alerts: %s", e)
+    Returns {timeframe: snapshot row}.
+    """
+    from revenue.metric_catalog import MetricValidator, shared_queries
 
-    for alert in alerts:
-        try:
-            supabase.table("revenue_alerts").insert({
-                "tenant_id": tenant_id,
-                "crm_source": crm_source,
-                "alert_type": alert.alert_type,
-                "severity": alert.severity,
-                "status": "open",
-                "summary": alert.summary,
-                "evidence_json": alert.evidence,
-                "recommended_actions_json": alert.recommended_actions,
-            }).execute()
-        except Exception as e:
-            logger.error(
-                "compute_snapshot: failed to insert alert '%s': %s",
-                alert.alert_type, e,
+    timeframes = list(dict.fromkeys(timeframes or TIMEFRAME_DAYS.keys()))
+    validator = MetricValidator()
+    computed: dict[str, tuple[dict, float]] = {}
+
+    with shared_queries() as memo:
+        for timeframe in timeframes:
+            started = time.perf_counter()
+            computed[timeframe] = await _compute_snapshot_json(
+                supabase, tenant_id, crm_source,
+                TIMEFRAME_DAYS.get(timeframe, 30), validator,
+            )
+            logger.info(
+                "compute_snapshots: %s/%s %s in %.0fms (shared query hits=%d, misses=%d)",
+                tenant_id, crm_source, timeframe,
+                (time.perf_counter() - started) * 1000, memo.hits, memo.misses,
             )
 
-    # --- Upsert snapshot ---
-    snapshot_row = {
-        "tenant_id": tenant_id,
-        "crm_source": crm_source,
-        "timeframe": timeframe,
-        "computed_at": datetime.now(timezone.utc).isoformat(),
-        "snapshot_json": snapshot_json,
-        "trust_score": mean_trust,
-        "alert_count": len(alerts),
-    }
-
-    try:
-        result = (
-            supabase.table("revenue_snapshots")
-            .upsert(snapshot_row, on_conflict="tenant_id,crm_source,timeframe")
-            .execute()
-        )
-        if result.data:
-            return result.data[0]
-    except Exception as e:
-        logger.error("compute_snapshot: upsert failed: %s", e)
-
-    return snapshot_row
+    # --- Compute and persist alerts ---
+    revenue_model = await _load_revenue_model(supabase, tenant_id, crm_source)
+    alerts = await compute_alerts(
+        supabase, tenant_id, crm_source, alert_timeframe, revenue_model=revenue_model,
+    )
+    _persist_alerts(supabase, tenant_id, crm_source, alerts)
+
+    # --- Upsert snapshots ---
+    snapshots: dict[str, dict] = {}
+    for timeframe, (snapshot_json, mean_trust) in computed.items():
+        snapshot_row = {
+            "tenant_id": tenant_id,
+            "crm_source": crm_source,
+            "timeframe": timeframe,
+            "computed_at": datetime.now(timezone.utc).isoformat(),
+            "snapshot_json": snapshot_json,
+            "trust_score": mean_trust,
+            "alert_count": len(alerts),
+        }
+        snapshots[timeframe] = _upsert_snapshot(supabase, snapshot_row)
+
+    return snapshots
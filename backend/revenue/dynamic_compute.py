@@ -8,14 +8,25 @@ Supported recipe types: count, sum, avg, ratio, duration, distinct_count
 
 Every result includes DynamicMetricEvidence for provenance.
 Zero LLM cost — pure SQL.
+
+compute_tenant_snapshot() fuses recipes: count/sum/avg/distinct_count/ratio
+recipes are grouped by source table and compiled into one aggregate query per
+table (via the exec_readonly_sql RPC) with FILTER'd aggregates for both the
+current and the previous period. Recipes that cannot be fused (duration,
+unsupported filters) or groups whose fused query fails run per-recipe.
 """
 
+import asyncio
+import json
 import logging
+import re
+from dataclasses import dataclass, field as dc_field
 from datetime import datetime, timezone, timedelta
 from typing import Any, Optional
 
 from agents import DynamicMetricResult, DynamicMetricEvidence
 from agents.anvar import load_allowed_fields, DEFAULT_ALLOWED_FIELDS
+from row_counts import CountMode, count_query, run_count
 
 logger = logging.getLogger(__name__)
 
@@ -58,8 +69,6 @@ async def compute_metric(
     title = metric_def.get("title", metric_key)
     display_format = metric_def.get("display_format", "number")
     recipe = metric_def.get("computation", {})
-    required_fields = metric_def.get("required_fields", [])
-    source_table = metric_def.get("source_table", "")
 
     # Load allowed fields if not provided
     if allowed_fields is None:
@@ -68,19 +77,9 @@ async def compute_metric(
         except Exception:
             allowed_fields = DEFAULT_ALLOWED_FIELDS
 
-    # Validate source table
-    if source_table and source_table not in allowed_fields:
-        # For ratio type, check both numerator and denominator tables
-        if recipe.get("type") != "ratio":
-            return _error_result(metric_key, title, display_format,
-                                 f"Table '{source_table}' not in allowed fields")
-
-    # Validate required fields
-    if source_table and source_table in allowed_fields:
-        for field in required_fields:
-            if field not in allowed_fields[source_table]:
-                return _error_result(metric_key, title, display_format,
-                                     f"Field '{field}' not in whitelist for {source_table}")
+    error = _validate_metric_def(metric_def, allowed_fields)
+    if error:
+        return _error_result(metric_key, title, display_format, error)
 
     recipe_type = recipe.get("type", "count")
 
@@ -124,19 +123,7 @@ async def compute_metric(
             except Exception as e:
                 logger.debug(f"Comparison failed for {metric_key}: {e}")
 
-        # Build confidence from evidence
-        confidence = _compute_confidence(evidence, metric_def.get("confidence", 0.5))
-
-        return DynamicMetricResult(
-            metric_key=metric_key,
-            title=title,
-            value=value,
-            display_format=display_format,
-            currency=currency,
-            evidence=evidence,
-            confidence=confidence,
-            comparison=comparison,
-        )
+        return _metric_result(metric_def, value, evidence, comparison, currency)
 
     except Exception as e:
         logger.error(f"compute_metric failed for {metric_key}: {e}")
@@ -151,7 +138,10 @@ async def compute_tenant_snapshot(
 ) -> list[DynamicMetricResult]:
     """
     Compute all active tenant_metrics for a tenant.
-    Returns list of DynamicMetricResult.
+    Returns list of DynamicMetricResult (in tenant_metrics order).
+
+    Fusable recipes are evaluated with one aggregate query per source table
+    (see plan_recipes); everything else falls back to compute_metric().
     """
     try:
         result = supabase.table("tenant_metrics").select("*").eq(
@@ -162,17 +152,40 @@ async def compute_tenant_snapshot(
             logger.info(f"No tenant_metrics for {tenant_id}/{crm_source}")
             return []
 
+        metric_defs = result.data
         allowed_fields = await load_allowed_fields(supabase, tenant_id, crm_source)
-        results = []
+        results: list[Optional[DynamicMetricResult]] = [None] * len(metric_defs)
+
+        valid: list[tuple[int, dict]] = []
+        for i, metric_def in enumerate(metric_defs):
+            error = _validate_metric_def(metric_def, allowed_fields)
+            if error:
+                results[i] = _error_result(
+                    metric_def.get("metric_key", "unknown"),
+                    metric_def.get("title", metric_def.get("metric_key", "unknown")),
+                    metric_def.get("display_format", "number"),
+                    error,
+                )
+            else:
+                valid.append((i, metric_def))
 
-        for metric_def in result.data:
-            mr = await compute_metric(
-                supabase, tenant_id, crm_source, metric_def,
-                timeframe_days=timeframe_days,
-                allowed_fields=allowed_fields,
-            )
-            results.append(mr)
+        plan = plan_recipes([d for _, d in valid], timeframe_days)
+        fused = await execute_plan(supabase, tenant_id, crm_source, plan)
+
+        for pos, (i, metric_def) in enumerate(valid):
+            if pos in fused:
+                results[i] = fused[pos]
+            else:
+                results[i] = await compute_metric(
+                    supabase, tenant_id, crm_source, metric_def,
+                    timeframe_days=timeframe_days,
+                    allowed_fields=allowed_fields,
+                )
 
+        logger.info(
+            "compute_tenant_snapshot %s/%s: %d metrics, %d fused in %d queries",
+            tenant_id, crm_source, len(metric_defs), len(fused), len(plan.groups),
+        )
         return results
 
     except Exception as e:
@@ -180,6 +193,377 @@ async def compute_tenant_snapshot(
         return []
 
 
+def _validate_metric_def(metric_def: dict, allowed_fields: dict) -> Optional[str]:
+    """Return an error message if the recipe's table/fields are not whitelisted."""
+    recipe = metric_def.get("computation", {})
+    required_fields = metric_def.get("required_fields", [])
+    source_table = metric_def.get("source_table", "")
+
+    # Validate source table
+    if source_table and source_table not in allowed_fields:
+        # For ratio type, check both numerator and denominator tables
+        if recipe.get("type") != "ratio":
+            return f"Table '{source_table}' not in allowed fields"
+
+    # Validate required fields
+    if source_table and source_table in allowed_fields:
+        for field in required_fields:
+            if field not in allowed_fields[source_table]:
+                return f"Field '{field}' not in whitelist for {source_table}"
+
+    return None
+
+
+def _metric_result(
+    metric_def: dict,
+    value,
+    evidence: DynamicMetricEvidence,
+    comparison: Optional[dict],
+    currency: Optional[str] = None,
+) -> DynamicMetricResult:
+    metric_key = metric_def.get("metric_key", "unknown")
+    return DynamicMetricResult(
+        metric_key=metric_key,
+        title=metric_def.get("title", metric_key),
+        value=value,
+        display_format=metric_def.get("display_format", "number"),
+        currency=currency,
+        evidence=evidence,
+        confidence=_compute_confidence(evidence, metric_def.get("confidence", 0.5)),
+        comparison=comparison,
+    )
+
+
+# ── Recipe fusion planner ─────────────────────────────────────────────
+
+FUSABLE_TYPES = {"count", "sum", "avg", "distinct_count", "ratio"}
+
+_IDENT_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+_SQL_OPS = {
+    "eq": "=",
+    "neq": "<>",
+    "gt": ">",
+    "lt": "<",
+    "gte": ">=",
+    "lte": "<=",
+}
+
+
+class _NotFusable(Exception):
+    """Raised while compiling a recipe that has no SQL equivalent here."""
+
+
+@dataclass
+class _Aggregate:
+    """One output column pair (current + previous period) of a fused query."""
+    alias: str
+    expr: str            # aggregate over rows matching `where`, e.g. "SUM((value)::numeric)"
+    where: str           # recipe filter predicate, "TRUE" if none
+
+
+@dataclass
+class _TableGroup:
+    table: str
+    aggregates: list[_Aggregate] = dc_field(default_factory=list)
+    members: list[int] = dc_field(default_factory=list)   # plan positions using this group
+
+
+@dataclass
+class _PlannedMetric:
+    metric_def: dict
+    recipe_type: str
+    aliases: dict[str, str]          # role → aggregate alias
+    groups: set[str]                 # tables whose query this metric reads
+
+
+@dataclass
+class RecipePlan:
+    """Output of plan_recipes(): one _TableGroup per fused query."""
+    timeframe_days: Optional[int]
+    groups: dict[str, _TableGroup] = dc_field(default_factory=dict)
+    metrics: dict[int, _PlannedMetric] = dc_field(default_factory=dict)
+
+
+def _sql_literal(value) -> str:
+    if value is True:
+        return "TRUE"
+    if value is False:
+        return "FALSE"
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _ident(name: str) -> str:
+    if not isinstance(name, str) or not _IDENT_RE.match(name):
+        raise _NotFusable(f"unsupported identifier {name!r}")
+    return name
+
+
+def _compile_filters(filters: dict) -> str:
+    """SQL predicate equivalent to _apply_filters() for the same filters dict."""
+    clauses = []
+    for key, value in (filters or {}).items():
+        method = None
+        field_name = key
+        for suffix, m in sorted(FILTER_OPS.items(), key=lambda x: -len(x[0])):
+            if suffix and key.endswith(suffix):
+                field_name, method = key[:-len(suffix)], m
+                break
+        col = _ident(field_name)
+
+        if method is None:
+            if value is True or value is False:
+                clauses.append(f"{col} IS {_sql_literal(value)}")
+            elif value is None:
+                clauses.append(f"{col} IS NULL")
+            else:
+                clauses.append(f"{col} = {_sql_literal(value)}")
+        elif method == "is_":
+            if value is None or str(value).lower() == "null":
+                clauses.append(f"{col} IS NULL")
+            elif value in (True, False) or str(value).lower() in ("true", "false"):
+                clauses.append(f"{col} IS {str(value).upper()}")
+            else:
+                raise _NotFusable(f"unsupported IS value {value!r}")
+        elif method == "in_":
+            values = value if isinstance(value, list) else [value]
+            if not values:
+                clauses.append("FALSE")
+            else:
+                clauses.append(f"{col} IN ({', '.join(_sql_literal(v) for v in values)})")
+        else:
+            clauses.append(f"{col} {_SQL_OPS[method]} {_sql_literal(value)}")
+    return " AND ".join(clauses) if clauses else "TRUE"
+
+
+def _add_aggregate(plan: RecipePlan, table: str, expr: str, where: str) -> str:
+    """Register (or reuse) an aggregate on `table` and return its alias."""
+    group = plan.groups.setdefault(table, _TableGroup(table=_ident(table)))
+    for agg in group.aggregates:
+        if agg.expr == expr and agg.where == where:
+            return agg.alias
+    alias = f"a{len(group.aggregates)}"
+    group.aggregates.append(_Aggregate(alias=alias, expr=expr, where=where))
+    return alias
+
+
+def _plan_spec(plan: RecipePlan, table: str, agg: str, field: Optional[str], where: str) -> dict[str, str]:
+    """Aggregates needed for one count/sum/avg/distinct_count spec → {role: alias}."""
+    if agg == "count":
+        return {"value": _add_aggregate(plan, table, "COUNT(*)", where)}
+    if not field:
+        raise _NotFusable(f"{agg} requires a field")
+    col = _ident(field)
+    if agg == "sum":
+        return {
+            "value": _add_aggregate(plan, table, f"SUM(({col})::numeric)", where),
+            "n": _add_aggregate(plan, table, f"COUNT({col})", where),
+        }
+    if agg == "avg":
+        return {
+            "value": _add_aggregate(plan, table, f"AVG(({col})::numeric)", where),
+            "n": _add_aggregate(plan, table, f"COUNT({col})", where),
+        }
+    if agg == "distinct_count":
+        return {
+            "value": _add_aggregate(plan, table, f"COUNT(DISTINCT ({col})::text)", where),
+            "n": _add_aggregate(plan, table, "COUNT(*)", where),
+        }
+    raise _NotFusable(f"unsupported aggregate {agg!r}")
+
+
+def plan_recipes(metric_defs: list[dict], timeframe_days: Optional[int]) -> RecipePlan:
+    """
+    Group fusable recipes by source table. Each group becomes one query;
+    identical aggregates (same expression and filters) are computed once.
+    Metrics missing from plan.metrics must be computed per-recipe.
+    """
+    plan = RecipePlan(timeframe_days=timeframe_days)
+
+    for pos, metric_def in enumerate(metric_defs):
+        recipe = metric_def.get("computation") or {}
+        recipe_type = recipe.get("type", "count")
+        if recipe_type not in FUSABLE_TYPES:
+            continue
+
+        # Plan into a scratch copy so a half-compiled recipe leaves no aggregates behind
+        scratch = RecipePlan(
+            timeframe_days=timeframe_days,
+            groups={
+                t: _TableGroup(table=g.table, aggregates=list(g.aggregates), members=list(g.members))
+                for t, g in plan.groups.items()
+            },
+        )
+        try:
+            if recipe_type == "ratio":
+                aliases: dict[str, str] = {}
+                tables = set()
+                for role, spec in (("num", recipe.get("numerator") or {}), ("den", recipe.get("denominator") or {})):
+                    agg = spec.get("agg", "count")
+                    if agg not in ("count", "sum", "avg"):
+                        raise _NotFusable(f"unsupported ratio aggregate {agg!r}")
+                    table = spec.get("table", "")
+                    where = _compile_filters(spec.get("filter", {}))
+                    aliases[role] = _plan_spec(scratch, table, agg, spec.get("field"), where)["value"]
+                    tables.add(table)
+            else:
+                table = recipe.get("table", "")
+                where = _compile_filters(recipe.get("filters", {}))
+                aliases = _plan_spec(scratch, table, recipe_type, recipe.get("field"), where)
+                tables = {table}
+        except _NotFusable as e:
+            logger.debug("plan_recipes: %s not fusable: %s", metric_def.get("metric_key"), e)
+            continue
+
+        plan.groups = scratch.groups
+        for table in tables:
+            plan.groups[table].members.append(pos)
+        plan.metrics[pos] = _PlannedMetric(
+            metric_def=metric_def, recipe_type=recipe_type, aliases=aliases, groups=tables,
+        )
+
+    return plan
+
+
+def compile_group_sql(group: _TableGroup, timeframe_days: Optional[int], now: datetime) -> str:
+    """
+    One SELECT over `group.table` with a current-period and previous-period
+    FILTER'd column per aggregate: <alias>_cur, <alias>_prev.
+    Tenant scoping is enforced by exec_readonly_sql.
+    """
+    columns = []
+    if timeframe_days:
+        cur_start = now - timedelta(days=timeframe_days)
+        prev_start = cur_start - timedelta(days=timeframe_days)
+        cur = f"created_at >= {_sql_literal(cur_start.isoformat())}"
+        prev = f"created_at < {_sql_literal(cur_start.isoformat())}"
+        for agg in group.aggregates:
+            columns.append(f"{agg.expr} FILTER (WHERE {cur} AND ({agg.where})) AS {agg.alias}_cur")
+            columns.append(f"{agg.expr} FILTER (WHERE {prev} AND ({agg.where})) AS {agg.alias}_prev")
+        where = f" WHERE created_at >= {_sql_literal(prev_start.isoformat())}"
+    else:
+        for agg in group.aggregates:
+            columns.append(f"{agg.expr} FILTER (WHERE {agg.where}) AS {agg.alias}_cur")
+        where = ""
+    return f"SELECT {', '.join(columns)} FROM {group.table}{where}"
+
+
+async def _run_group(supabase, tenant_id: str, crm_source: str, sql: str) -> Optional[dict]:
+    try:
+        result = await asyncio.to_thread(
+            lambda: supabase.rpc("exec_readonly_sql", {
+                "p_tenant_id": tenant_id,
+                "p_crm_source": crm_source,
+                "p_query": sql,
+            }).execute()
+        )
+        rows = result.data
+        if isinstance(rows, str):
+            rows = json.loads(rows)
+        if isinstance(rows, list) and rows and isinstance(rows[0], dict):
+            return rows[0]
+        logger.warning("fused metric query returned no row: %r", rows)
+    except Exception as e:
+        logger.warning("fused metric query failed: %s", e)
+    return None
+
+
+def _num(row: dict, column: str) -> float:
+    value = row.get(column)
+    return float(value) if value is not None else 0.0
+
+
+def _fused_result(pm: _PlannedMetric, rows: dict[str, dict], timeframe_days: Optional[int]) -> DynamicMetricResult:
+    """Map fused aggregate columns back to the per-recipe value/evidence shape."""
+    recipe = pm.metric_def.get("computation") or {}
+    t = pm.recipe_type
+
+    def col(role: str, period: str = "cur", table: Optional[str] = None) -> float:
+        table = table or recipe.get("table", "")
+        return _num(rows[table], f"{pm.aliases[role]}_{period}")
+
+    if t == "ratio":
+        num, den = recipe.get("numerator") or {}, recipe.get("denominator") or {}
+        multiply = recipe.get("multiply", 1)
+        num_val = _num(rows[num.get("table", "")], f"{pm.aliases['num']}_cur")
+        den_val = _num(rows[den.get("table", "")], f"{pm.aliases['den']}_cur")
+        value = round((num_val / den_val) * multiply, 2) if den_val > 0 else 0
+        evidence = _build_evidence(
+            num.get("table", den.get("table", "unknown")), int(den_val), timeframe_days,
+            f"({num.get('agg', 'count')} / {den.get('agg', 'count')}) * {multiply}"
+        )
+        if den_val == 0:
+            evidence.caveats.append("Denominator is zero")
+        # Ratio comparison is not computed (matches the per-recipe path)
+        return _metric_result(pm.metric_def, value, evidence, None)
+
+    table = recipe.get("table", "")
+    field = recipe.get("field")
+    if t == "count":
+        value = int(col("value"))
+        evidence = _build_evidence(table, value, timeframe_days, f"COUNT(*) from {table}")
+    elif t == "sum":
+        value, n = round(col("value"), 2), int(col("n"))
+        evidence = _build_evidence(table, n, timeframe_days, f"SUM({field}) from {table}")
+        if n == 0:
+            evidence.caveats.append("No non-null values found")
+    elif t == "avg":
+        value, n = round(col("value"), 2), int(col("n"))
+        evidence = _build_evidence(table, n, timeframe_days, f"AVG({field}) from {table}")
+        if n < 10:
+            evidence.caveats.append(f"Low sample size (n={n})")
+    else:  # distinct_count
+        value, n = int(col("value")), int(col("n"))
+        evidence = _build_evidence(table, n, timeframe_days, f"COUNT(DISTINCT {field}) from {table}")
+
+    comparison = None
+    if timeframe_days:
+        prev_value = col("value", "prev")
+        if prev_value > 0:
+            comparison = {"previous_value": round(prev_value, 2)}
+
+    return _metric_result(pm.metric_def, value, evidence, comparison)
+
+
+async def execute_plan(
+    supabase,
+    tenant_id: str,
+    crm_source: str,
+    plan: RecipePlan,
+) -> dict[int, DynamicMetricResult]:
+    """
+    Run one query per table group concurrently. Returns {plan position: result}
+    for every metric whose groups all succeeded; the rest are left to the caller.
+    """
+    if not plan.groups:
+        return {}
+
+    now = datetime.now(timezone.utc)
+    tables = list(plan.groups)
+    group_rows = await asyncio.gather(*(
+        _run_group(
+            supabase, tenant_id, crm_source,
+            compile_group_sql(plan.groups[t], plan.timeframe_days, now),
+        )
+        for t in tables
+    ))
+    rows = {t: r for t, r in zip(tables, group_rows) if r is not None}
+
+    results: dict[int, DynamicMetricResult] = {}
+    for pos, pm in plan.metrics.items():
+        if not pm.groups.issubset(rows):
+            continue
+        try:
+            results[pos] = _fused_result(pm, rows, plan.timeframe_days)
+        except Exception as e:
+            logger.warning("fused result mapping failed for %s: %s", pm.metric_def.get("metric_key"), e)
+    return results
+
+
 # ── Recipe executors ──────────────────────────────────────────────────
 
 async def _compute_count(supabase, tenant_id, crm_source, recipe, timeframe_days):
@@ -187,13 +571,12 @@ async def _compute_count(supabase, tenant_id, crm_source, recipe, timeframe_days
     table = recipe.get("table", "")
     filters = recipe.get("filters", {})
 
-    query = supabase.table(table).select("*", count="exact")
+    query = count_query(supabase, table, CountMode.EXACT)
     query = query.eq("tenant_id", tenant_id).eq("crm_source", crm_source)
     query = _apply_filters(query, filters)
     query = _apply_time_range(query, timeframe_days)
-    result = query.limit(0).execute()
+    count = await run_count(query)
 
-    count = result.count or 0
     evidence = _build_evidence(table, count, timeframe_days, f"COUNT(*) from {table}")
     return count, evidence
 
@@ -400,12 +783,11 @@ async def _compute_single_agg(supabase, tenant_id, crm_source, spec, timeframe_d
     query = supabase.table(table)
 
     if agg == "count":
-        query = query.select("*", count="exact")
+        query = count_query(supabase, table, CountMode.EXACT)
         query = query.eq("tenant_id", tenant_id).eq("crm_source", crm_source)
         query = _apply_filters(query, filters)
         query = _apply_time_range(query, timeframe_days)
-        result = query.limit(0).execute()
-        return result.count or 0
+        return await run_count(query)
 
     elif agg in ("sum", "avg") and field:
         query = query.select(field)
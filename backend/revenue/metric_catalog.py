@@ -27,15 +27,23 @@ Public surface
     catalog = METRIC_CATALOG                                # dict[str, MetricDefinition]
     trust   = await get_catalog_with_trust(sb, tid, src)   # list[dict] for GET /metrics
     result  = await compute_metric(key, sb, tid, src, ...)  # MetricResult for POST /metrics/query
+
+Batch callers (compute_snapshot) wrap their metric loop in shared_queries()
+so row counts and row samples are fetched once and shared across metrics.
 """
 
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import logging
+from contextvars import ContextVar
 from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
 from typing import Any, Optional
 
+from row_counts import CountMode, count_rows
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -98,21 +106,86 @@ def _register(defn: MetricDefinition, fn):
 # Low-level helpers
 # ---------------------------------------------------------------------------
 
+@dataclass
+class QueryMemo:
+    """
+    Per-batch memo of row counts and row samples.
+
+    Several metrics read the same table with the same timeframe; inside a
+    shared_queries() block each distinct count/sample is fetched once and
+    concurrent callers await the same in-flight task.
+    """
+    counts: dict[tuple, asyncio.Future] = field(default_factory=dict)
+    samples: dict[tuple, asyncio.Future] = field(default_factory=dict)
+    hits: int = 0
+    misses: int = 0
+
+
+_ACTIVE_MEMO: ContextVar[Optional[QueryMemo]] = ContextVar("metric_query_memo", default=None)
+
+
+@contextlib.contextmanager
+def shared_queries(memo: Optional[QueryMemo] = None):
+    """Share counts/samples between all metric computations inside the block."""
+    memo = memo or QueryMemo()
+    token = _ACTIVE_MEMO.set(memo)
+    try:
+        yield memo
+    finally:
+        _ACTIVE_MEMO.reset(token)
+
+
+async def _memoized(bucket: dict, memo: QueryMemo, key: tuple, factory):
+    fut = bucket.get(key)
+    if fut is None:
+        memo.misses += 1
+        fut = asyncio.ensure_future(factory())
+        bucket[key] = fut
+    else:
+        memo.hits += 1
+    return await fut
+
+
+async def _count_rows_uncached(supabase, tenant_id: str, crm_source: str, table: str) -> int:
+    # Counts feed availability checks and evidence, not billing — ESTIMATED is
+    # exact for small tables and a planner estimate for large ones.
+    return await count_rows(
+        supabase, tenant_id, table, crm_source=crm_source, mode=CountMode.ESTIMATED,
+    )
+
+
 async def _count_rows(supabase, tenant_id: str, crm_source: str, table: str) -> int:
     """Return total row count for a tenant/source in a CRM table."""
-    try:
-        result = (
-            supabase.table(table)
-            .select("*", count="exact")
-            .eq("tenant_id", tenant_id)
-            .eq("crm_source", crm_source)
-            .limit(0)
-            .execute()
-        )
-        return result.count or 0
-    except Exception as e:
-        logger.warning("_count_rows(%s): %s", table, e)
-        return 0
+    memo = _ACTIVE_MEMO.get()
+    if memo is None:
+        return await _count_rows_uncached(supabase, tenant_id, crm_source, table)
+    return await _memoized(
+        memo.counts, memo, (tenant_id, crm_source, table),
+        lambda: _count_rows_uncached(supabase, tenant_id, crm_source, table),
+    )
+
+
+async def _select_sample(
+    supabase,
+    tenant_id: str,
+    crm_source: str,
+    table: str,
+    columns: str,
+    limit: int,
+    time_range_days: Optional[int],
+    time_field: str,
+) -> list[dict]:
+    q = (
+        supabase.table(table)
+        .select(columns)
+        .eq("tenant_id", tenant_id)
+        .eq("crm_source", crm_source)
+    )
+    if time_range_days:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=time_range_days)
+        q = q.gte(time_field, cutoff.isoformat())
+    result = await asyncio.to_thread(lambda: q.limit(limit).execute())
+    return result.data or []
 
 
 async def _fetch_sample(
@@ -128,25 +201,33 @@ async def _fetch_sample(
     """
     Fetch a sample of rows (for null-rate analysis) and total row count.
     Returns (rows, total_count).
+
+    Inside shared_queries() the sample is fetched once per
+    (table, window, limit) with all columns and projected to ``fields``.
     """
+    unique_fields = list(dict.fromkeys(fields))  # deduplicate, preserve order
+    memo = _ACTIVE_MEMO.get()
     try:
         # Total count
         total = await _count_rows(supabase, tenant_id, crm_source, table)
 
-        # Sample rows — select only needed fields
-        unique_fields = list(dict.fromkeys(fields))  # deduplicate, preserve order
-        q = (
-            supabase.table(table)
-            .select(",".join(unique_fields))
-            .eq("tenant_id", tenant_id)
-            .eq("crm_source", crm_source)
+        if memo is None:
+            # Sample rows — select only needed fields
+            rows = await _select_sample(
+                supabase, tenant_id, crm_source, table, ",".join(unique_fields),
+                limit, time_range_days, time_field,
+            )
+            return rows, total
+
+        key = (tenant_id, crm_source, table, limit, time_range_days, time_field)
+        rows = await _memoized(
+            memo.samples, memo, key,
+            lambda: _select_sample(
+                supabase, tenant_id, crm_source, table, "*",
+                limit, time_range_days, time_field,
+            ),
         )
-        if time_range_days:
-            cutoff = datetime.now(timezone.utc) - timedelta(days=time_range_days)
-            q = q.gte(time_field, cutoff.isoformat())
-
-        result = q.limit(limit).execute()
-        return result.data or [], total
+        return [{f: r.get(f) for f in unique_fields} for r in rows], total
     except Exception as e:
         logger.warning("_fetch_sample(%s): %s", table, e)
         return [], 0
@@ -16,7 +16,7 @@ import logging
 from datetime import datetime, timezone
 from typing import Optional
 
-from llm_service import client as openai_client
+from llm_gateway import get_gateway, served_model
 from agent_trace import AgentTrace
 from token_logger import log_token_usage_fire_and_forget
 from agents import SchemaProfile
@@ -154,8 +154,10 @@ async def generate_metrics(
 
     try:
         async with AgentTrace(supabase, tenant_id, "metric_generator", model="gpt-4o") as trace:
-            response = await openai_client.chat.completions.create(
+            response = await get_gateway().chat_completion(
                 model="gpt-4o",
+                tenant_id=tenant_id,
+                purpose="metric_generator_generate_metrics",
                 messages=[
                     {"role": "system", "content": METRIC_GENERATOR_SYSTEM_PROMPT},
                     {"role": "user", "content": json.dumps(prompt_data)},
@@ -168,7 +170,7 @@ async def generate_metrics(
 
             log_token_usage_fire_and_forget(
                 tenant_id=tenant_id,
-                model="gpt-4o",
+                model=served_model(response, "gpt-4o"),
                 request_type="metric_generation",
                 input_tokens=response.usage.prompt_tokens,
                 output_tokens=response.usage.completion_tokens,
@@ -0,0 +1,24 @@
+"""
+Feature routers split out of server.py.
+=======================================
+Each module owns one API area and defines `router = APIRouter(prefix="/api")`;
+shared clients and auth dependencies come from app_core, never from server.
+
+    auth      /auth/*
+    crm       /hubspot/*, /zoho/*, /freshsales/*, /crm/sync/*
+    usage     /usage/*
+    revenue   /revenue/*, /dashboard/analytics/*
+
+The split is partial: account, telegram, instagram, bitrix, dashboard
+(onboarding/widgets/insights), documents, leads, config and conversations
+endpoints are still defined on server.py's api_router. Move an area here
+when it is next touched; it must import from app_core, not server.
+
+Public surface
+--------------
+    FEATURE_ROUTERS   included by server.py after its own api_router
+"""
+
+from routers import auth, crm, revenue, usage
+
+FEATURE_ROUTERS = (auth.router, crm.router, usage.router, revenue.router)
@@ -0,0 +1,560 @@
+"""
+Auth Router — registration, email confirmation, password reset, login/logout.
+=============================================================================
+Custom auth over the users table (bcrypt hashes, HS256 JWTs) with Resend for
+confirmation and reset emails. The Resend SDK is imported on the first email,
+not at worker boot.
+
+Public surface
+--------------
+    router                                   included by server.py
+    auth_rate_limiter, AUTH_RATE_WINDOW,     swept by server.periodic_cleanup
+    AUTH_LOCKOUT_DURATION
+"""
+
+import asyncio
+import html
+import logging
+import os
+import re
+import secrets
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+import jwt
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from pydantic import BaseModel, EmailStr, Field
+
+from app_core import (
+    FRONTEND_URL, JWT_ALGORITHM, JWT_SECRET, SENDER_EMAIL,
+    _needs_password_rehash, _rest_client, _validate_table_name,
+    create_access_token, db_rest_insert, db_rest_select, db_rest_update,
+    get_current_user, hash_password, now_iso, redact_email, revoke_token,
+    sanitize_html, supabase, supabase_url, validate_password_strength, verify_password,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api")
+
+# Strip env vars to remove accidental newlines
+RESEND_API_KEY = (os.environ.get('RESEND_API_KEY') or '').strip()
+
+# Log Resend configuration status (without exposing key)
+if RESEND_API_KEY:
+    logger.info("Resend API configured")
+    logger.info(f"Sender email configured: {'yes' if SENDER_EMAIL else 'no'}")
+else:
+    logger.warning("RESEND_API_KEY not configured - email sending will fail!")
+
+
+def _resend():
+    """Resend SDK, imported and configured on first use."""
+    import resend
+    resend.api_key = RESEND_API_KEY
+    return resend
+
+
+# ============ Auth Rate Limiting ============
+auth_rate_limiter = {}  # ip -> {attempts, window_start, failures, locked_until}
+AUTH_RATE_LIMIT = 5       # max attempts per window
+AUTH_RATE_WINDOW = 300    # per 5-minute window
+AUTH_LOCKOUT_THRESHOLD = 10  # consecutive failures before lockout
+AUTH_LOCKOUT_DURATION = 900  # 15-minute lockout
+
+def check_auth_rate_limit(request: Request) -> None:
+    """IP-based rate limiting for auth endpoints to prevent brute force."""
+    ip = request.client.host if request.client else "unknown"
+    now = time.time()
+    entry = auth_rate_limiter.get(ip, {"attempts": 0, "window_start": now, "failures": 0, "locked_until": 0})
+
+    # Check lockout first
+    if now < entry.get("locked_until", 0):
+        remaining = int(entry["locked_until"] - now)
+        logger.warning(f"Auth lockout active for IP {ip[:8]}*** ({remaining}s remaining)")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Account temporarily locked due to too many failed attempts. Try again in {remaining} seconds.",
+            headers={"Retry-After": str(remaining)}
+        )
+
+    if now - entry["window_start"] > AUTH_RATE_WINDOW:
+        entry = {"attempts": 0, "window_start": now, "failures": entry.get("failures", 0), "locked_until": 0}
+    entry["attempts"] += 1
+    auth_rate_limiter[ip] = entry
+    if entry["attempts"] > AUTH_RATE_LIMIT:
+        logger.warning(f"Auth rate limit exceeded for IP {ip[:8]}***")
+        raise HTTPException(status_code=429, detail="Too many attempts. Please try again later.")
+
+def record_auth_failure(request: Request) -> None:
+    """Record a failed login attempt and trigger lockout if threshold exceeded."""
+    ip = request.client.host if request.client else "unknown"
+    now = time.time()
+    entry = auth_rate_limiter.get(ip, {"attempts": 0, "window_start": now, "failures": 0, "locked_until": 0})
+    entry["failures"] = entry.get("failures", 0) + 1
+    if entry["failures"] >= AUTH_LOCKOUT_THRESHOLD:
+        entry["locked_until"] = now + AUTH_LOCKOUT_DURATION
+        logger.warning(f"Auth lockout triggered for IP {ip[:8]}*** after {entry['failures']} failures")
+    auth_rate_limiter[ip] = entry
+
+def reset_auth_failures(request: Request) -> None:
+    """Reset failure counter on successful login."""
+    ip = request.client.host if request.client else "unknown"
+    entry = auth_rate_limiter.get(ip)
+    if entry:
+        entry["failures"] = 0
+        entry["locked_until"] = 0
+
+# ============ Email Service ============
+async def send_confirmation_email(email: str, name: str, token: str) -> bool:
+    """Send email confirmation link to new user"""
+    try:
+        confirmation_url = f"{FRONTEND_URL}/confirm-email?token={token}"
+        safe_name = html.escape(name) if name else "there"
+        
+        html_content = f"""
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="text-align: center; margin-bottom: 30px;">
+                <h1 style="color: #059669; margin: 0;">LeadRelay</h1>
+                <p style="color: #64748b; margin-top: 5px;">AI-Powered Sales Automation</p>
+            </div>
+
+            <h2 style="color: #1e293b;">Welcome, {safe_name}!</h2>
+
+            <p style="color: #475569; line-height: 1.6;">
+                Thank you for registering with LeadRelay. Please confirm your email address
+                by clicking the button below:
+            </p>
+
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="{confirmation_url}"
+                   style="background-color: #059669; color: white; padding: 12px 30px;
+                          text-decoration: none; border-radius: 6px; font-weight: bold;
+                          display: inline-block;">
+                    Confirm Email
+                </a>
+            </div>
+
+            <p style="color: #64748b; font-size: 14px;">
+                Or copy and paste this link into your browser:<br/>
+                <a href="{confirmation_url}" style="color: #059669; word-break: break-all;">
+                    {confirmation_url}
+                </a>
+            </p>
+
+            <hr style="border: none; border-top: 1px solid #e2e8f0; margin: 30px 0;"/>
+
+            <p style="color: #94a3b8; font-size: 12px; text-align: center;">
+                If you didn't create an account, you can safely ignore this email.
+            </p>
+        </div>
+        """
+
+        params = {
+            "from": SENDER_EMAIL,
+            "to": [email],
+            "subject": "Confirm your LeadRelay account",
+            "html": html_content
+        }
+        
+        # Run sync SDK in thread to keep FastAPI non-blocking
+        result = await asyncio.to_thread(_resend().Emails.send, params)
+        email_id = getattr(result, 'id', None) or (result.get('id') if isinstance(result, dict) else str(result))
+        logger.info(f"Confirmation email sent to {redact_email(email)}, id: {email_id}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to send confirmation email to {redact_email(email)}: {type(e).__name__}: {e}", exc_info=True)
+        return False
+
+
+async def send_password_reset_email(email: str, name: str, token: str) -> bool:
+    """Send password reset link"""
+    try:
+        reset_url = f"{FRONTEND_URL}/reset-password?token={token}"
+        safe_name = html.escape(name) if name else "there"
+
+        html_content = f"""
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="text-align: center; margin-bottom: 30px;">
+                <h1 style="color: #059669; margin: 0;">LeadRelay</h1>
+            </div>
+
+            <h2 style="color: #1e293b;">Password Reset Request</h2>
+
+            <p style="color: #475569; line-height: 1.6;">
+                Hi {safe_name}, we received a request to reset your password.
+                Click the button below to create a new password:
+            </p>
+
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="{reset_url}"
+                   style="background-color: #059669; color: white; padding: 12px 30px;
+                          text-decoration: none; border-radius: 6px; font-weight: bold;
+                          display: inline-block;">
+                    Reset Password
+                </a>
+            </div>
+
+            <p style="color: #64748b; font-size: 14px;">
+                This link expires in 1 hour. If you didn't request this, ignore this email.
+            </p>
+        </div>
+        """
+
+        params = {
+            "from": SENDER_EMAIL,
+            "to": [email],
+            "subject": "Reset your LeadRelay password",
+            "html": html_content
+        }
+        
+        result = await asyncio.to_thread(_resend().Emails.send, params)
+        logger.info(f"Password reset email sent to {redact_email(email)}")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Failed to send password reset email: {e}")
+        return False
+
+
+# ============ Pydantic Models ============
+class RegisterRequest(BaseModel):
+    email: EmailStr
+    password: str = Field(max_length=128)
+    name: str = Field(max_length=100)
+    business_name: str = Field(max_length=200)
+
+class LoginRequest(BaseModel):
+    email: EmailStr
+    password: str = Field(max_length=128)
+
+class AuthResponse(BaseModel):
+    token: Optional[str] = None
+    user: Dict[str, Any]
+    message: Optional[str] = None
+
+
+# ============ Auth Endpoints (Custom Auth with Resend) ============
+@router.post("/auth/register", response_model=AuthResponse)
+async def register(request: RegisterRequest, req: Request = None):
+    """
+    Register a new user with custom auth and Resend email verification.
+    Uses direct REST API calls to avoid HTTP/2 StreamReset issues on Render.
+    """
+    if req:
+        check_auth_rate_limit(req)
+    validate_password_strength(request.password)
+    try:
+        # Check if user already exists (using direct REST API - HTTP/1.1)
+        existing = await db_rest_select('users', {'email': f'eq.{request.email}'})
+        if existing:
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+        # Generate IDs and confirmation token
+        user_id = str(uuid.uuid4())
+        tenant_id = str(uuid.uuid4())
+        confirmation_token = secrets.token_urlsafe(32)
+
+        # Sanitize user input to prevent XSS attacks
+        safe_name = sanitize_html(request.name) if request.name else None
+        safe_business_name = sanitize_html(request.business_name) if request.business_name else None
+
+        # Create tenant (using direct REST API - HTTP/1.1)
+        tenant = {"id": tenant_id, "name": safe_business_name, "timezone": "Asia/Tashkent", "created_at": now_iso()}
+        await db_rest_insert('tenants', tenant)
+
+        # Token expires in 24 hours for email confirmation
+        token_expires = (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat()
+
+        # Create user record (using direct REST API - HTTP/1.1)
+        user = {
+            "id": user_id,
+            "email": request.email,
+            "password_hash": hash_password(request.password),
+            "name": safe_name,
+            "tenant_id": tenant_id,
+            "role": "admin",
+            "email_confirmed": False,
+            "confirmation_token": confirmation_token,
+            "token_expires_at": token_expires,
+            "created_at": now_iso()
+        }
+        await db_rest_insert('users', user)
+
+        # Create default config (using direct REST API - HTTP/1.1)
+        config = {
+            "tenant_id": tenant_id, "business_name": None, "collect_phone": True,
+            "agent_tone": "professional", "primary_language": "uz", "vertical": "default"
+        }
+        try:
+            await db_rest_insert('tenant_configs', config)
+        except Exception as e:
+            logger.warning(f"Could not create tenant config: {e}")
+
+        # Send confirmation email via async helper
+        email_sent = await send_confirmation_email(request.email, request.name, confirmation_token)
+        if not email_sent:
+            logger.error(f"Registration succeeded but confirmation email failed for {redact_email(request.email)}")
+            logger.error(f"Resend config - API key set: {bool(RESEND_API_KEY)}, Sender configured: {'yes' if SENDER_EMAIL else 'no'}")
+
+        return AuthResponse(
+            token=None,
+            user={
+                "id": user_id,
+                "email": request.email,
+                "name": request.name,
+                "tenant_id": tenant_id,
+                "business_name": request.business_name,
+                "email_confirmed": False
+            },
+            message="Account created! Please check your email to confirm your account before logging in."
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Registration error")
+        raise HTTPException(status_code=500, detail="An internal error occurred. Please try again.")
+
+
+@router.get("/auth/confirm-email")
+async def confirm_email(token: str = None, type: str = None, access_token: str = None):
+    """
+    Confirm user email using direct REST API to avoid HTTP/2 issues.
+    """
+    # Handle custom token confirmation (primary method now)
+    if token:
+        # Validate token format (URL-safe base64 from secrets.token_urlsafe)
+        if not re.match(r'^[A-Za-z0-9_\-]+$', token):
+            raise HTTPException(status_code=400, detail="Invalid or expired confirmation token")
+        result = await db_rest_select('users', {'confirmation_token': f'eq.{token}'})
+        if not result:
+            raise HTTPException(status_code=400, detail="Invalid or expired confirmation token")
+
+        user = result[0]
+        if user.get('email_confirmed'):
+            return {"message": "Email already confirmed", "redirect": "/login"}
+
+        # Check token expiration
+        token_expires = user.get('token_expires_at')
+        if token_expires:
+            expires_dt = datetime.fromisoformat(token_expires.replace('Z', '+00:00'))
+            if datetime.now(timezone.utc) > expires_dt:
+                raise HTTPException(status_code=400, detail="Confirmation token has expired. Please request a new confirmation email.")
+
+        await db_rest_update('users', {
+            "email_confirmed": True,
+            "confirmation_token": None,
+            "token_expires_at": None,
+            "email_confirmed_at": now_iso()
+        }, 'id', user['id'])
+
+        return {"message": "Email confirmed successfully! You can now log in.", "redirect": "/login"}
+
+    raise HTTPException(status_code=400, detail="Invalid confirmation request")
+
+
+@router.post("/auth/resend-confirmation")
+async def resend_confirmation(email: EmailStr, req: Request = None):
+    """Resend confirmation email via Resend using direct REST API"""
+    if req:
+        check_auth_rate_limit(req)
+    try:
+        # Find user using direct REST API (HTTP/1.1)
+        result = await db_rest_select('users', {'email': f'eq.{email}'})
+        if result and not result[0].get('email_confirmed'):
+            user = result[0]
+            confirmation_token = secrets.token_urlsafe(32)
+            # Token expires in 24 hours
+            token_expires = (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat()
+
+            # Update token with expiration using direct REST API
+            await db_rest_update('users', {
+                "confirmation_token": confirmation_token,
+                "token_expires_at": token_expires
+            }, 'id', user['id'])
+
+            # Send email via async helper
+            await send_confirmation_email(email, user.get('name', 'there'), confirmation_token)
+        return {"message": "If this email is registered, a confirmation link will be sent."}
+    except Exception as e:
+        logger.error(f"Resend confirmation error: {type(e).__name__}: {e}", exc_info=True)
+        logger.error(f"Resend config - API key set: {bool(RESEND_API_KEY)}, Sender: {SENDER_EMAIL}")
+        return {"message": "If this email is registered, a confirmation link will be sent."}
+
+
+@router.post("/auth/forgot-password")
+async def forgot_password(email: EmailStr, req: Request = None):
+    """Request password reset via Resend using direct REST API"""
+    if req:
+        check_auth_rate_limit(req)
+    try:
+        result = await db_rest_select('users', {'email': f'eq.{email}'})
+        if result:
+            user = result[0]
+            reset_token = secrets.token_urlsafe(32)
+            # Token expires in 1 hour
+            token_expires = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+
+            # Store reset token in separate field (doesn't interfere with email confirmation)
+            await db_rest_update('users', {
+                "password_reset_token": reset_token,
+                "password_reset_expires_at": token_expires
+            }, 'id', user['id'])
+
+            # Send email via async helper
+            await send_password_reset_email(email, user.get('name', 'there'), reset_token)
+        return {"message": "If this email is registered, a password reset link will be sent."}
+    except Exception as e:
+        logger.warning(f"Password reset error: {e}")
+        return {"message": "If this email is registered, a password reset link will be sent."}
+
+
+class ResetPasswordRequest(BaseModel):
+    token: str = Field(max_length=256)
+    new_password: str = Field(max_length=128)
+
+
+@router.post("/auth/reset-password")
+async def reset_password(request: ResetPasswordRequest):
+    """Reset password using custom token with direct REST API"""
+    validate_password_strength(request.new_password)
+    try:
+        # Validate token format before using in query (should be URL-safe base64 from token_urlsafe)
+        if not re.match(r'^[A-Za-z0-9_\-]+$', request.token):
+            raise HTTPException(status_code=400, detail="Invalid or expired reset token")
+
+        # First check token existence and expiration
+        result = await db_rest_select('users', {'password_reset_token': f'eq.{request.token}'})
+        if not result:
+            raise HTTPException(status_code=400, detail="Invalid or expired reset token")
+
+        user = result[0]
+
+        # Check token expiration
+        token_expires = user.get('password_reset_expires_at')
+        if token_expires:
+            expires_dt = datetime.fromisoformat(token_expires.replace('Z', '+00:00'))
+            if datetime.now(timezone.utc) > expires_dt:
+                raise HTTPException(status_code=400, detail="Reset token has expired. Please request a new password reset.")
+
+        # Atomic update: set password AND clear token in one operation, keyed on token.
+        # If two concurrent requests race, only one will match the WHERE clause.
+        new_hash = hash_password(request.new_password)
+        _validate_table_name('users')
+        from urllib.parse import quote
+        atomic_url = f"{supabase_url}/rest/v1/users?password_reset_token=eq.{quote(request.token, safe='')}"
+        atomic_resp = await asyncio.to_thread(lambda: _rest_client.patch(atomic_url, json={
+            "password_hash": new_hash,
+            "password_reset_token": None,
+            "password_reset_expires_at": None
+        }))
+        atomic_resp.raise_for_status()
+        updated_rows = atomic_resp.json()
+        if not updated_rows:
+            # Token was already consumed by a concurrent request
+            raise HTTPException(status_code=400, detail="Invalid or expired reset token")
+
+        return {"message": "Password reset successfully. You can now log in."}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Password reset error: {e}")
+        raise HTTPException(status_code=400, detail="Password reset failed. Please try again.")
+
+
+
+@router.post("/auth/login", response_model=AuthResponse)
+async def login(request: LoginRequest, req: Request = None):
+    """
+    Login using custom auth with direct REST API to avoid HTTP/2 StreamReset issues.
+    """
+    if req:
+        check_auth_rate_limit(req)
+    # Use direct REST API (HTTP/1.1) instead of supabase-py client
+    result = await db_rest_select('users', {'email': f'eq.{request.email}'})
+    if not result:
+        if req:
+            record_auth_failure(req)
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    user = result[0]
+    if not verify_password(request.password, user["password_hash"]):
+        if req:
+            record_auth_failure(req)
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    # Transparent bcrypt migration: re-hash old SHA256 passwords on successful login
+    if _needs_password_rehash(user["password_hash"]):
+        try:
+            await db_rest_update('users', {"password_hash": hash_password(request.password)}, 'id', user['id'])
+            logger.info(f"Upgraded password hash to bcrypt for user {user['id'][:8]}***")
+        except Exception as e:
+            logger.warning(f"Could not upgrade password hash: {e}")
+
+    # Check if email is confirmed
+    if not user.get('email_confirmed', False):
+        raise HTTPException(
+            status_code=403,
+            detail="Please confirm your email before logging in. Check your inbox or request a new confirmation link."
+        )
+
+    # Successful login — reset failure counter
+    if req:
+        reset_auth_failures(req)
+
+    tenant_result = await db_rest_select('tenants', {'id': f'eq.{user["tenant_id"]}'})
+    tenant = tenant_result[0] if tenant_result else None
+
+    token = create_access_token(user["id"], user["tenant_id"], user["email"])
+    return AuthResponse(
+        token=token,
+        user={"id": user["id"], "email": user["email"], "name": user.get("name"), "tenant_id": user["tenant_id"], "business_name": tenant["name"] if tenant else None, "email_confirmed": user.get("email_confirmed", False)}
+    )
+
+
+@router.post("/auth/logout")
+async def logout(authorization: Optional[str] = Header(None)):
+    """Revoke the current JWT token by adding its jti to the blacklist."""
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+    try:
+        scheme, token = authorization.split()
+        if scheme.lower() != "bearer":
+            raise HTTPException(status_code=401, detail="Invalid authentication scheme")
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        jti = payload.get("jti")
+        if jti:
+            exp_timestamp = payload.get("exp", 0)
+            await revoke_token(jti, exp_timestamp)
+            # Persist to DB for cross-restart durability
+            expires_at = datetime.fromtimestamp(exp_timestamp, tz=timezone.utc).isoformat()
+            try:
+                supabase.table('token_blacklist').insert({"jti": jti, "expires_at": expires_at}).execute()
+                # Cleanup expired entries
+                supabase.table('token_blacklist').delete().lt('expires_at', now_iso()).execute()
+            except Exception as e:
+                logger.warning(f"Could not persist token blacklist: {e}")
+        return {"message": "Logged out successfully"}
+    except Exception:
+        return {"message": "Logged out successfully"}
+
+
+@router.get("/auth/me")
+async def get_me(current_user: Dict = Depends(get_current_user)):
+    result = await db_rest_select('users', {'id': f'eq.{current_user["user_id"]}'})
+    if not result:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    user = result[0]
+    tenant_result = await db_rest_select('tenants', {'id': f'eq.{user["tenant_id"]}'})
+    tenant = tenant_result[0] if tenant_result else None
+
+    return {"id": user["id"], "email": user["email"], "name": user.get("name"), "tenant_id": user["tenant_id"], "business_name": tenant["name"] if tenant else None, "email_confirmed": user.get("email_confirmed", False)}
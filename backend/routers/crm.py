@@ -0,0 +1,406 @@
+"""
+CRM Router — HubSpot, Zoho and Freshsales connections plus CRM sync control.
+============================================================================
+OAuth/API-key connect, status, test, disconnect and pipeline endpoints for
+the CRMs that store their credentials in crm_connections, and the
+/crm/sync/* endpoints that drive the Karim sync engine. Bitrix24 still lives
+in server.py alongside its webhook-cache helpers.
+
+Public surface
+--------------
+    router      included by server.py
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+import jwt
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import RedirectResponse
+from pydantic import BaseModel, Field
+
+from app_core import (
+    FRONTEND_URL, JWT_SECRET, _cleanup_crm_data, crm_manager, get_current_user, supabase,
+)
+from crypto_utils import decrypt_value
+from freshsales_crm import FreshsalesCRM
+from hubspot_crm import HUBSPOT_CLIENT_ID, HubSpotCRM
+from sync_engine import is_sync_active, stop_all_syncs, trigger_full_sync_background
+from zoho_crm import ZOHO_CLIENT_ID, ZohoCRM
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api")
+
+
+# ============ HubSpot CRM Endpoints ============
+
+@router.get("/hubspot/auth-url")
+async def hubspot_auth_url(current_user: Dict = Depends(get_current_user)):
+    """Generate HubSpot OAuth authorization URL."""
+    if not HUBSPOT_CLIENT_ID:
+        raise HTTPException(status_code=500, detail="HubSpot integration not configured")
+    tenant_id = current_user["tenant_id"]
+    state = jwt.encode({"tenant_id": tenant_id, "purpose": "hubspot_oauth", "exp": datetime.now(timezone.utc) + timedelta(minutes=10)}, JWT_SECRET, algorithm="HS256")
+    backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
+    redirect_uri = f"{backend_url}/api/hubspot/callback"
+    url = HubSpotCRM.get_auth_url(redirect_uri, state)
+    return {"auth_url": url}
+
+
+@router.get("/hubspot/callback")
+async def hubspot_callback(code: str = None, state: str = None, error: str = None):
+    """OAuth callback from HubSpot. Exchange code for tokens."""
+    redirect_base = f"{FRONTEND_URL.rstrip('/')}/app/connections/hubspot"
+
+    if error:
+        return RedirectResponse(url=f"{redirect_base}?error={error}")
+    if not code or not state:
+        return RedirectResponse(url=f"{redirect_base}?error=missing_params")
+    try:
+        payload = jwt.decode(state, JWT_SECRET, algorithms=["HS256"])
+        if payload.get("purpose") != "hubspot_oauth":
+            return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
+        tenant_id = payload["tenant_id"]
+    except jwt.ExpiredSignatureError:
+        return RedirectResponse(url=f"{redirect_base}?error=expired")
+    except jwt.InvalidTokenError:
+        return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
+
+    try:
+        backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
+        redirect_uri = f"{backend_url}/api/hubspot/callback"
+        tokens = await HubSpotCRM.exchange_code(code, redirect_uri)
+
+        token_expires_at = (datetime.now(timezone.utc) + timedelta(seconds=tokens["expires_in"])).isoformat()
+        await crm_manager.store_connection(
+            tenant_id=tenant_id,
+            crm_type='hubspot',
+            credentials={
+                'access_token': tokens['access_token'],
+                'refresh_token': tokens['refresh_token'],
+                'token_expires_at': token_expires_at,
+            },
+        )
+        logger.info(f"HubSpot connected for tenant {tenant_id}")
+        # Auto-trigger full sync after successful connection
+        asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, 'hubspot'))
+        return RedirectResponse(url=f"{redirect_base}?success=true")
+    except Exception as e:
+        logger.exception(f"HubSpot OAuth callback error for tenant {tenant_id}: {e}")
+        return RedirectResponse(url=f"{redirect_base}?error=exchange_failed")
+
+
+@router.get("/hubspot/status")
+async def hubspot_status(current_user: Dict = Depends(get_current_user)):
+    """Check HubSpot connection status."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'hubspot')
+    if conn:
+        return {"connected": True, "connected_at": conn.get("connected_at")}
+    return {"connected": False}
+
+
+@router.post("/hubspot/test")
+async def hubspot_test(current_user: Dict = Depends(get_current_user)):
+    """Test HubSpot connection."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'hubspot')
+    if not conn:
+        raise HTTPException(status_code=404, detail="HubSpot not connected")
+    creds = conn.get("credentials", {})
+    access_token = decrypt_value(creds.get("access_token", ""))
+    client = HubSpotCRM(access_token=access_token)
+    return await client.test_connection()
+
+
+@router.post("/hubspot/disconnect")
+async def hubspot_disconnect(current_user: Dict = Depends(get_current_user)):
+    """Disconnect HubSpot CRM."""
+    tenant_id = current_user["tenant_id"]
+    await stop_all_syncs(tenant_id, crm_type='hubspot')
+    await crm_manager.remove_connection(tenant_id, 'hubspot')
+    await _cleanup_crm_data(tenant_id, 'hubspot')
+    return {"success": True, "message": "HubSpot disconnected"}
+
+
+@router.get("/hubspot/pipelines")
+async def hubspot_pipelines(current_user: Dict = Depends(get_current_user)):
+    """Get HubSpot deal pipelines."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'hubspot')
+    if not conn:
+        raise HTTPException(status_code=400, detail="HubSpot not connected")
+    creds = conn.get("credentials", {})
+    access_token = decrypt_value(creds.get("access_token", ""))
+    client = HubSpotCRM(access_token=access_token)
+    return {"pipelines": await client.get_pipelines()}
+
+
+# ============ Zoho CRM Endpoints ============
+
+@router.get("/zoho/auth-url")
+async def zoho_auth_url(datacenter: str = "us", current_user: Dict = Depends(get_current_user)):
+    """Generate Zoho OAuth authorization URL."""
+    if not ZOHO_CLIENT_ID:
+        raise HTTPException(status_code=500, detail="Zoho integration not configured")
+    tenant_id = current_user["tenant_id"]
+    state = jwt.encode(
+        {"tenant_id": tenant_id, "datacenter": datacenter, "purpose": "zoho_oauth", "exp": datetime.now(timezone.utc) + timedelta(minutes=10)},
+        JWT_SECRET, algorithm="HS256",
+    )
+    backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
+    redirect_uri = f"{backend_url}/api/zoho/callback"
+    url = ZohoCRM.get_auth_url(redirect_uri, state, datacenter)
+    return {"auth_url": url}
+
+
+@router.get("/zoho/callback")
+async def zoho_callback(code: str = None, state: str = None, error: str = None):
+    """OAuth callback from Zoho. Exchange code for tokens."""
+    redirect_base = f"{FRONTEND_URL.rstrip('/')}/app/connections/zoho"
+
+    if error:
+        return RedirectResponse(url=f"{redirect_base}?error={error}")
+    if not code or not state:
+        return RedirectResponse(url=f"{redirect_base}?error=missing_params")
+    try:
+        payload = jwt.decode(state, JWT_SECRET, algorithms=["HS256"])
+        if payload.get("purpose") != "zoho_oauth":
+            return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
+        tenant_id = payload["tenant_id"]
+        datacenter = payload.get("datacenter", "us")
+    except jwt.ExpiredSignatureError:
+        return RedirectResponse(url=f"{redirect_base}?error=expired")
+    except jwt.InvalidTokenError:
+        return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
+
+    try:
+        backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
+        redirect_uri = f"{backend_url}/api/zoho/callback"
+        tokens = await ZohoCRM.exchange_code(code, redirect_uri, datacenter)
+
+        token_expires_at = (datetime.now(timezone.utc) + timedelta(seconds=tokens["expires_in"])).isoformat()
+        await crm_manager.store_connection(
+            tenant_id=tenant_id,
+            crm_type='zoho',
+            credentials={
+                'access_token': tokens['access_token'],
+                'refresh_token': tokens['refresh_token'],
+                'token_expires_at': token_expires_at,
+                'api_domain': tokens.get('api_domain', ''),
+            },
+            config={'datacenter': datacenter},
+        )
+        logger.info(f"Zoho connected for tenant {tenant_id} (datacenter: {datacenter})")
+        # Auto-trigger full sync after successful connection
+        asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, 'zoho'))
+        return RedirectResponse(url=f"{redirect_base}?success=true")
+    except Exception as e:
+        logger.exception(f"Zoho OAuth callback error for tenant {tenant_id}: {e}")
+        return RedirectResponse(url=f"{redirect_base}?error=exchange_failed")
+
+
+@router.get("/zoho/status")
+async def zoho_status(current_user: Dict = Depends(get_current_user)):
+    """Check Zoho connection status."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'zoho')
+    if conn:
+        return {"connected": True, "connected_at": conn.get("connected_at"), "datacenter": (conn.get("config") or {}).get("datacenter", "us")}
+    return {"connected": False}
+
+
+@router.post("/zoho/test")
+async def zoho_test(current_user: Dict = Depends(get_current_user)):
+    """Test Zoho connection."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'zoho')
+    if not conn:
+        raise HTTPException(status_code=404, detail="Zoho not connected")
+    creds = conn.get("credentials", {})
+    config = conn.get("config", {})
+    client = ZohoCRM(
+        access_token=decrypt_value(creds.get("access_token", "")),
+        refresh_token=decrypt_value(creds.get("refresh_token", "")),
+        datacenter=config.get("datacenter", "us"),
+        api_domain=creds.get("api_domain"),
+    )
+    return await client.test_connection()
+
+
+@router.post("/zoho/disconnect")
+async def zoho_disconnect(current_user: Dict = Depends(get_current_user)):
+    """Disconnect Zoho CRM."""
+    tenant_id = current_user["tenant_id"]
+    await stop_all_syncs(tenant_id, crm_type='zoho')
+    await crm_manager.remove_connection(tenant_id, 'zoho')
+    await _cleanup_crm_data(tenant_id, 'zoho')
+    return {"success": True, "message": "Zoho disconnected"}
+
+
+@router.get("/zoho/pipelines")
+async def zoho_pipelines(current_user: Dict = Depends(get_current_user)):
+    """Get Zoho deal pipeline stages."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'zoho')
+    if not conn:
+        raise HTTPException(status_code=400, detail="Zoho not connected")
+    creds = conn.get("credentials", {})
+    config = conn.get("config", {})
+    client = ZohoCRM(
+        access_token=decrypt_value(creds.get("access_token", "")),
+        refresh_token=decrypt_value(creds.get("refresh_token", "")),
+        datacenter=config.get("datacenter", "us"),
+        api_domain=creds.get("api_domain"),
+    )
+    return {"pipelines": await client.get_pipelines()}
+
+
+# ============ Freshsales CRM Endpoints ============
+
+class FreshsalesConnectRequest(BaseModel):
+    domain: str = Field(..., description="Freshsales subdomain (e.g., 'mycompany')")
+    api_key: str = Field(..., description="API key from Freshsales Settings")
+
+
+@router.post("/freshsales/connect")
+async def freshsales_connect(request: FreshsalesConnectRequest, current_user: Dict = Depends(get_current_user)):
+    """Connect Freshsales CRM via API key."""
+    tenant_id = current_user["tenant_id"]
+
+    # Validate credentials by testing connection
+    client = FreshsalesCRM(domain=request.domain, api_key=request.api_key)
+    test_result = await client.test_connection()
+    if not test_result.get("ok"):
+        raise HTTPException(status_code=400, detail=f"Connection failed: {test_result.get('message')}")
+
+    await crm_manager.store_connection(
+        tenant_id=tenant_id,
+        crm_type='freshsales',
+        credentials={'api_key': request.api_key, 'domain': request.domain},
+    )
+    logger.info(f"Freshsales connected for tenant {tenant_id} (domain: {request.domain})")
+    # Auto-trigger full sync after successful connection
+    asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, 'freshsales'))
+    return {"success": True, "message": "Freshsales connected successfully!"}
+
+
+@router.get("/freshsales/status")
+async def freshsales_status(current_user: Dict = Depends(get_current_user)):
+    """Check Freshsales connection status."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'freshsales')
+    if conn:
+        domain = (conn.get("credentials") or {}).get("domain", "")
+        return {"connected": True, "connected_at": conn.get("connected_at"), "domain": domain}
+    return {"connected": False}
+
+
+@router.post("/freshsales/test")
+async def freshsales_test(current_user: Dict = Depends(get_current_user)):
+    """Test Freshsales connection."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'freshsales')
+    if not conn:
+        raise HTTPException(status_code=404, detail="Freshsales not connected")
+    creds = conn.get("credentials", {})
+    client = FreshsalesCRM(domain=creds.get("domain", ""), api_key=decrypt_value(creds.get("api_key", "")))
+    return await client.test_connection()
+
+
+@router.post("/freshsales/disconnect")
+async def freshsales_disconnect(current_user: Dict = Depends(get_current_user)):
+    """Disconnect Freshsales CRM."""
+    tenant_id = current_user["tenant_id"]
+    await stop_all_syncs(tenant_id, crm_type='freshsales')
+    await crm_manager.remove_connection(tenant_id, 'freshsales')
+    await _cleanup_crm_data(tenant_id, 'freshsales')
+    return {"success": True, "message": "Freshsales disconnected"}
+
+
+@router.get("/freshsales/pipelines")
+async def freshsales_pipelines(current_user: Dict = Depends(get_current_user)):
+    """Get Freshsales deal pipelines."""
+    conn = await crm_manager.get_connection(current_user["tenant_id"], 'freshsales')
+    if not conn:
+        raise HTTPException(status_code=400, detail="Freshsales not connected")
+    creds = conn.get("credentials", {})
+    client = FreshsalesCRM(domain=creds.get("domain", ""), api_key=decrypt_value(creds.get("api_key", "")))
+    return {"pipelines": await client.get_pipelines()}
+
+
+# ============ CRM Data Sync Endpoints (Karim) ============
+
+@router.post("/crm/sync/start")
+async def crm_sync_start(current_user: Dict = Depends(get_current_user)):
+    """Queue a full sync for all active CRM connections."""
+    tenant_id = current_user["tenant_id"]
+
+    connections = await crm_manager.get_active_connections(tenant_id)
+    if not connections:
+        raise HTTPException(status_code=400, detail="No active CRM connections")
+
+    started = []
+    for conn in connections:
+        crm_type = conn["crm_type"]
+        asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, crm_type))
+        started.append(crm_type)
+
+    return {"success": True, "syncing": started, "message": f"Full sync started for: {', '.join(started)}"}
+
+
+@router.get("/crm/sync/status")
+async def crm_sync_status(current_user: Dict = Depends(get_current_user)):
+    """Get sync progress per entity for all CRM connections."""
+    tenant_id = current_user["tenant_id"]
+
+    try:
+        result = supabase.table("crm_sync_status").select("*").eq(
+            "tenant_id", tenant_id
+        ).execute()
+
+        statuses = result.data or []
+        return {"statuses": statuses}
+    except Exception as e:
+        logger.error(f"Failed to get sync status: {e}")
+        return {"statuses": []}
+
+
+@router.post("/crm/sync/stop")
+async def crm_sync_stop(current_user: Dict = Depends(get_current_user)):
+    """Cancel all active syncs for a tenant (full + incremental)."""
+    tenant_id = current_user["tenant_id"]
+    cancelled = await stop_all_syncs(tenant_id)
+    return {"success": True, "cancelled": cancelled}
+
+
+@router.get("/crm/sync/active")
+async def crm_sync_is_active(current_user: Dict = Depends(get_current_user)):
+    """Check if any sync is currently running for this tenant."""
+    tenant_id = current_user["tenant_id"]
+    return {"active": is_sync_active(tenant_id)}
+
+
+@router.post("/crm/sync/refresh")
+async def crm_sync_refresh(current_user: Dict = Depends(get_current_user)):
+    """Force an immediate incremental sync for all active CRM connections."""
+    tenant_id = current_user["tenant_id"]
+
+    connections = await crm_manager.get_active_connections(tenant_id)
+    if not connections:
+        raise HTTPException(status_code=400, detail="No active CRM connections")
+
+    from sync_engine import SyncEngine, _decrypt_credentials
+    from crm_adapters import create_adapter
+
+    results = {}
+    for conn in connections:
+        crm_type = conn["crm_type"]
+        try:
+            credentials = _decrypt_credentials(conn.get("credentials", {}))
+            config = conn.get("config", {})
+            adapter = create_adapter(crm_type, credentials, config)
+            engine = SyncEngine(supabase, tenant_id, adapter, crm_type)
+            sync_result = await engine.incremental_sync()
+            results[crm_type] = sync_result
+        except Exception as e:
+            logger.error(f"Refresh sync failed for {crm_type}: {e}")
+            results[crm_type] = {"status": "error", "error": str(e)}
+
+    return {"success": True, "results": results}
@@ -0,0 +1,628 @@
+"""
+Revenue Router — revenue model, metrics and the analytics overview/alerts.
+==========================================================================
+/revenue/model/* proposes and confirms how a tenant's CRM stages map to
+won/lost, /revenue/metrics/* answers metric queries, and
+/dashboard/analytics/* serves the recompute/overview/alerts endpoints, with
+the legacy /revenue/* aliases returning deprecation headers.
+
+Public surface
+--------------
+    router      included by server.py
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from app_core import _get_tenant_crm_source, get_current_user, supabase
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api")
+
+
+# ============ Revenue Model Endpoints ============
+
+class RevenueModelConfirmRequest(BaseModel):
+    """Body for POST /revenue/model/confirm."""
+    won_stage_values: List[str] = Field(..., min_items=1, description="Stages that mean WON")
+    lost_stage_values: List[str] = Field(..., min_items=1, description="Stages that mean LOST")
+    stage_order: List[str] = Field(default_factory=list, description="Full ordered stage list")
+    # Optional field-name overrides (defaults match normalized crm_deals column names)
+    deal_stage_field: str = Field(default="stage")
+    amount_field: str = Field(default="value")
+    close_date_field: str = Field(default="closed_at")
+    created_date_field: str = Field(default="created_at")
+    owner_field: str = Field(default="assigned_to")
+    currency_field: str = Field(default="currency")
+    # Carry-forward confidence + rationale from the proposal so they're stored alongside the model
+    confidence_json: dict = Field(default_factory=dict)
+    rationale_json: dict = Field(default_factory=dict)
+
+
+@router.post("/revenue/model/propose")
+async def revenue_model_propose(current_user: Dict = Depends(get_current_user)):
+    """
+    Inspect this tenant's synced crm_deals and return a proposed revenue model.
+
+    Response shape:
+    {
+        "status": "confirmed" | "proposed",
+        "model": { ... }        # if already confirmed
+        "proposal": { ... }     # if freshly built (includes questions[] when confidence < threshold)
+    }
+
+    Hard rule: confidence below threshold → questions[] is non-empty →
+    the caller MUST surface those questions and call /revenue/model/confirm
+    with the user's explicit answers before treating any stage as won/lost.
+    """
+    tenant_id = current_user["tenant_id"]
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(
+            status_code=400,
+            detail="No active CRM connection found. Connect your CRM before building a revenue model."
+        )
+
+    # Return already-confirmed model immediately (no need to re-propose)
+    try:
+        existing = (
+            supabase.table("revenue_models")
+            .select("*")
+            .eq("tenant_id", tenant_id)
+            .eq("crm_source", crm_source)
+            .limit(1)
+            .execute()
+        )
+        if existing.data and existing.data[0].get("confirmed_at"):
+            return {"status": "confirmed", "model": existing.data[0]}
+    except Exception as e:
+        logger.warning("revenue_model_propose: could not check existing model: %s", e)
+
+    # Build fresh proposal from crm_deals
+    try:
+        from revenue.model_builder import build_proposal
+        from dataclasses import asdict as _asdict
+        proposal = await build_proposal(supabase, tenant_id, crm_source)
+        return {"status": "proposed", "proposal": _asdict(proposal)}
+    except Exception as e:
+        logger.exception("revenue_model_propose: build_proposal failed")
+        raise HTTPException(status_code=500, detail=f"Failed to build revenue model proposal: {e}")
+
+
+@router.post("/revenue/model/confirm")
+async def revenue_model_confirm(
+    body: RevenueModelConfirmRequest,
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Save a user-confirmed revenue model for this tenant.
+
+    Validation:
+    - won_stage_values must not be empty.
+    - lost_stage_values must not be empty.
+    - The two lists must not overlap (a stage cannot be both won and lost).
+
+    After a successful call, subsequent calls to /revenue/model/propose will
+    return status='confirmed' without rebuilding the proposal.
+    """
+    tenant_id = current_user["tenant_id"]
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(
+            status_code=400,
+            detail="No active CRM connection found."
+        )
+
+    # Overlap guard — hard rule: a stage cannot be both won and lost.
+    overlap = set(body.won_stage_values) & set(body.lost_stage_values)
+    if overlap:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Stages cannot be both WON and LOST: {sorted(overlap)}"
+        )
+
+    now_ts = datetime.now(timezone.utc).isoformat()
+    model_row = {
+        "tenant_id": tenant_id,
+        "crm_source": crm_source,
+        "deal_stage_field": body.deal_stage_field,
+        "amount_field": body.amount_field,
+        "close_date_field": body.close_date_field,
+        "created_date_field": body.created_date_field,
+        "owner_field": body.owner_field,
+        "currency_field": body.currency_field,
+        "won_stage_values": body.won_stage_values,
+        "lost_stage_values": body.lost_stage_values,
+        "stage_order": body.stage_order,
+        "confidence_json": body.confidence_json,
+        "rationale_json": body.rationale_json,
+        "confirmed_at": now_ts,
+        "updated_at": now_ts,
+    }
+
+    try:
+        result = (
+            supabase.table("revenue_models")
+            .upsert(model_row, on_conflict="tenant_id,crm_source")
+            .execute()
+        )
+        if not result.data:
+            raise HTTPException(status_code=500, detail="Failed to save revenue model.")
+        return {"status": "confirmed", "model": result.data[0]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("revenue_model_confirm: upsert failed")
+        raise HTTPException(status_code=500, detail=f"Failed to save revenue model: {e}")
+
+
+# ============ Revenue Metrics Endpoints ============
+
+class MetricQueryRequest(BaseModel):
+    """Body for POST /revenue/metrics/query."""
+    metric_key: str = Field(..., description="Metric key from GET /revenue/metrics")
+    dimension: Optional[str] = Field(default=None, description="Optional grouping dimension (e.g. 'assigned_to')")
+    time_range_days: Optional[int] = Field(default=None, ge=1, le=3650, description="Look-back window in days")
+    time_grain: Optional[str] = Field(default=None, description="Rollup grain: 'day' | 'week' | 'month' | 'quarter'")
+
+
+@router.get("/revenue/metrics")
+async def revenue_metrics_catalog(current_user: Dict = Depends(get_current_user)):
+    """
+    Return all 12 metric definitions with availability flags and data-trust scores.
+
+    Does NOT compute actual metric values — only metadata.  Callers should use
+    this endpoint to decide which metrics to surface in the UI and whether to
+    warn the user about data-quality issues before they see a number.
+
+    Response shape:
+    {
+        "metrics": [
+            {
+                "key": "win_rate",
+                "title": "Win Rate",
+                "description": "...",
+                "available": true,
+                "data_trust_score": 0.87,
+                "requires_revenue_model": false,
+                "allowed_dimensions": ["assigned_to"],
+                "allowed_time_grains": ["day", "week", "month", "quarter"],
+                "evidence": { "row_count": 245, "null_rates": {...} }
+            }, ...
+        ],
+        "revenue_model_confirmed": true,
+        "computed_at": "2026-02-19T..."
+    }
+    """
+    tenant_id = current_user["tenant_id"]
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(
+            status_code=400,
+            detail="No active CRM connection found. Connect your CRM before querying metrics."
+        )
+
+    try:
+        from revenue.metric_catalog import get_catalog_with_trust
+        from dataclasses import asdict as _asdict
+
+        metrics = await get_catalog_with_trust(supabase, tenant_id, crm_source)
+
+        # Check whether a confirmed revenue model exists
+        rev_model_row = (
+            supabase.table("revenue_models")
+            .select("confirmed_at")
+            .eq("tenant_id", tenant_id)
+            .eq("crm_source", crm_source)
+            .limit(1)
+            .execute()
+        )
+        revenue_model_confirmed = bool(
+            rev_model_row.data and rev_model_row.data[0].get("confirmed_at")
+        )
+
+        return {
+            "metrics": metrics,
+            "revenue_model_confirmed": revenue_model_confirmed,
+            "computed_at": datetime.now(timezone.utc).isoformat(),
+        }
+    except Exception as e:
+        logger.exception("revenue_metrics_catalog failed")
+        raise HTTPException(status_code=500, detail=f"Failed to build metrics catalog: {e}")
+
+
+@router.post("/revenue/metrics/query")
+async def revenue_metrics_query(
+    body: MetricQueryRequest,
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Execute a single metric computation and return the result with evidence.
+
+    Validation before any DB query:
+    - metric_key must be a known catalog entry.
+    - dimension (if provided) must be in the metric's allowed_dimensions.
+    - All required tables must have data for this tenant.
+
+    Response shape:
+    {
+        "metric_key": "win_rate",
+        "title": "Win Rate",
+        "value": "34.2%",
+        "chart_type": "kpi",
+        "data": [],
+        "dimension": null,
+        "evidence": {
+            "row_count": 245,
+            "sampled_rows": 245,
+            "timeframe": "Last 90 days",
+            "fields_evaluated": ["won", "created_at"],
+            "null_rates": {"won": 0.02},
+            "data_trust_score": 0.87,
+            "computation_notes": []
+        },
+        "warnings": [],
+        "errors": []
+    }
+    """
+    tenant_id = current_user["tenant_id"]
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(
+            status_code=400,
+            detail="No active CRM connection found."
+        )
+
+    try:
+        from revenue.metric_catalog import MetricValidator, compute_metric
+        from dataclasses import asdict as _asdict
+
+        validator = MetricValidator()
+        ok, reason, _ = await validator.validate(
+            supabase, tenant_id, crm_source,
+            body.metric_key, body.dimension,
+        )
+        if not ok:
+            raise HTTPException(status_code=422, detail=reason)
+
+        result = await compute_metric(
+            metric_key=body.metric_key,
+            supabase=supabase,
+            tenant_id=tenant_id,
+            crm_source=crm_source,
+            dimension=body.dimension,
+            time_range_days=body.time_range_days,
+            time_grain=body.time_grain,
+        )
+
+        return {
+            "metric_key": result.metric_key,
+            "title": result.title,
+            "value": result.value,
+            "chart_type": result.chart_type,
+            "data": result.data,
+            "dimension": result.dimension,
+            "evidence": {
+                "row_count": result.evidence.row_count,
+                "sampled_rows": result.evidence.sampled_rows,
+                "timeframe": result.evidence.timeframe,
+                "fields_evaluated": result.evidence.fields_evaluated,
+                "null_rates": result.evidence.null_rates,
+                "data_trust_score": result.evidence.data_trust_score,
+                "computation_notes": result.evidence.computation_notes,
+            },
+            "warnings": result.warnings,
+            "errors": result.errors,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("revenue_metrics_query failed for metric '%s'", body.metric_key)
+        raise HTTPException(status_code=500, detail=f"Metric computation failed: {e}")
+
+
+# ============ Revenue / Analytics: Shared handler logic ============
+
+# Deprecation header helper — adds Deprecation + Sunset to legacy responses
+_DEPRECATION_HEADERS = {"Deprecation": "true", "Sunset": "2026-04-01"}
+
+
+async def _do_recompute(tenant_id: str, timeframe: str):
+    """Shared handler body for revenue recompute. timeframe='all' runs one batched job."""
+    if timeframe not in ("7d", "30d", "90d", "365d", "all"):
+        raise HTTPException(status_code=422, detail="timeframe must be one of: 7d, 30d, 90d, 365d, all")
+
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(
+            status_code=400,
+            detail="No active CRM connection found. Connect your CRM first."
+        )
+
+    try:
+        if timeframe == "all":
+            from revenue.compute import compute_snapshots
+            snapshots = await compute_snapshots(supabase, tenant_id, crm_source)
+            return {
+                "status": "ok",
+                "timeframe": timeframe,
+                "snapshots": {
+                    tf: {
+                        "trust_score": snap.get("trust_score", 0.0),
+                        "alert_count": snap.get("alert_count", 0),
+                        "computed_at": snap.get("computed_at"),
+                    }
+                    for tf, snap in snapshots.items()
+                },
+            }
+
+        from revenue.compute import compute_snapshot
+        snapshot = await compute_snapshot(supabase, tenant_id, crm_source, timeframe)
+        return {
+            "status": "ok",
+            "timeframe": timeframe,
+            "trust_score": snapshot.get("trust_score", 0.0),
+            "alert_count": snapshot.get("alert_count", 0),
+            "computed_at": snapshot.get("computed_at"),
+        }
+    except Exception as e:
+        logger.exception("_do_recompute failed")
+        raise HTTPException(status_code=500, detail=f"Recompute failed: {e}")
+
+
+async def _do_overview(tenant_id: str, timeframe: str):
+    """Shared handler body for revenue/analytics overview."""
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(status_code=400, detail="No active CRM connection found.")
+
+    try:
+        result = (
+            supabase.table("revenue_snapshots")
+            .select("*")
+            .eq("tenant_id", tenant_id)
+            .eq("crm_source", crm_source)
+            .eq("timeframe", timeframe)
+            .limit(1)
+            .execute()
+        )
+        if not result.data:
+            raise HTTPException(
+                status_code=404,
+                detail="No snapshot found. Call POST /api/dashboard/analytics/recompute first."
+            )
+        return result.data[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("_do_overview failed")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch snapshot: {e}")
+
+
+async def _do_overview_live(tenant_id: str, from_date: Optional[str], to_date: Optional[str]):
+    """Compute KPIs live for a custom date range instead of looking up a pre-computed snapshot."""
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(status_code=400, detail="No active CRM connection found.")
+
+    try:
+        from agents.kpi_resolver import resolve_kpi
+
+        # Compute pipeline_value and conversion_rate on the fly
+        pipeline_result = await resolve_kpi(
+            supabase, tenant_id, crm_source, "pipeline_value",
+            from_date=from_date, to_date=to_date,
+        )
+        conversion_result = await resolve_kpi(
+            supabase, tenant_id, crm_source, "conversion_rate",
+            from_date=from_date, to_date=to_date,
+        )
+
+        metrics = {}
+        if pipeline_result and pipeline_result.value is not None:
+            metrics["pipeline_value"] = {
+                "title": "Pipeline Value",
+                "value": pipeline_result.value,
+                "display_format": "currency",
+            }
+        if conversion_result and conversion_result.value is not None:
+            metrics["conversion_rate"] = {
+                "title": "Win Rate",
+                "value": conversion_result.value,
+                "display_format": "percentage",
+            }
+
+        # Count open alerts
+        alert_count = 0
+        try:
+            alert_q = (
+                supabase.table("revenue_alerts")
+                .select("*", count="exact")
+                .eq("tenant_id", tenant_id)
+                .eq("crm_source", crm_source)
+                .eq("status", "open")
+                .limit(0)
+                .execute()
+            )
+            alert_count = alert_q.count or 0
+        except Exception:
+            pass
+
+        return {
+            "metrics": metrics,
+            "alert_count": alert_count,
+            "overall_trust": 0.6,
+            "snapshot": {"computed_at": None},
+            "currency": "USD",
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("_do_overview_live failed")
+        raise HTTPException(status_code=500, detail=f"Failed to compute live overview: {e}")
+
+
+async def _do_alerts_list(tenant_id: str, status: str):
+    """Shared handler body for revenue/analytics alerts list."""
+    if status not in ("open", "dismissed", "all"):
+        raise HTTPException(status_code=422, detail="status must be: open | dismissed | all")
+
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(status_code=400, detail="No active CRM connection found.")
+
+    try:
+        q = (
+            supabase.table("revenue_alerts")
+            .select("*")
+            .eq("tenant_id", tenant_id)
+            .eq("crm_source", crm_source)
+            .order("created_at", desc=True)
+            .limit(100)
+        )
+        if status != "all":
+            q = q.eq("status", status)
+
+        result = q.execute()
+        alerts = result.data or []
+
+        severity_rank = {"critical": 0, "warning": 1, "info": 2}
+        alerts.sort(key=lambda a: severity_rank.get(a.get("severity", "info"), 2))
+
+        return {"alerts": alerts, "total": len(alerts)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("_do_alerts_list failed")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch alerts: {e}")
+
+
+async def _do_alert_dismiss(tenant_id: str, alert_id: str):
+    """Shared handler body for revenue/analytics alert dismiss."""
+    try:
+        existing = (
+            supabase.table("revenue_alerts")
+            .select("id,tenant_id,status")
+            .eq("id", alert_id)
+            .eq("tenant_id", tenant_id)
+            .limit(1)
+            .execute()
+        )
+        if not existing.data:
+            raise HTTPException(status_code=404, detail="Alert not found.")
+
+        alert = existing.data[0]
+        if alert["status"] == "dismissed":
+            return {"status": "already_dismissed", "alert_id": alert_id}
+
+        now_ts = datetime.now(timezone.utc).isoformat()
+
+        supabase.table("revenue_alerts").update(
+            {"status": "dismissed", "dismissed_at": now_ts}
+        ).eq("id", alert_id).eq("tenant_id", tenant_id).execute()
+
+        return {
+            "status": "dismissed",
+            "alert_id": alert_id,
+            "dismissed_at": now_ts,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("_do_alert_dismiss failed for alert %s", alert_id)
+        raise HTTPException(status_code=500, detail=f"Failed to dismiss alert: {e}")
+
+
+# ── New canonical routes: /dashboard/analytics/* ──────────────────────────
+
+@router.post("/dashboard/analytics/recompute")
+async def analytics_recompute(
+    timeframe: str = "30d",
+    current_user: Dict = Depends(get_current_user),
+):
+    """Trigger a full analytics snapshot recompute for this tenant."""
+    return await _do_recompute(current_user["tenant_id"], timeframe)
+
+
+@router.get("/dashboard/analytics/overview")
+async def analytics_overview(
+    timeframe: str = "30d",
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    current_user: Dict = Depends(get_current_user),
+):
+    """Return analytics snapshot. When from_date/to_date provided, computes live KPIs."""
+    if from_date or to_date:
+        return await _do_overview_live(current_user["tenant_id"], from_date, to_date)
+    return await _do_overview(current_user["tenant_id"], timeframe)
+
+
+@router.get("/dashboard/analytics/alerts")
+async def analytics_alerts_list(
+    status: str = "open",
+    current_user: Dict = Depends(get_current_user),
+):
+    """Return analytics alerts for this tenant."""
+    return await _do_alerts_list(current_user["tenant_id"], status)
+
+
+@router.patch("/dashboard/analytics/alerts/{alert_id}/dismiss")
+async def analytics_alert_dismiss(
+    alert_id: str,
+    current_user: Dict = Depends(get_current_user),
+):
+    """Dismiss a single analytics alert."""
+    return await _do_alert_dismiss(current_user["tenant_id"], alert_id)
+
+
+# ── DEPRECATED Phase 3 — remove after 2026-04-01 ─────────────────────────
+# Legacy /revenue/* routes — kept as aliases with Deprecation headers.
+
+@router.post("/revenue/recompute")
+async def revenue_recompute(
+    timeframe: str = "30d",
+    current_user: Dict = Depends(get_current_user),
+):
+    """DEPRECATED: Use POST /dashboard/analytics/recompute instead."""
+    data = await _do_recompute(current_user["tenant_id"], timeframe)
+    return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
+
+
+@router.get("/revenue/overview")
+async def revenue_overview(
+    timeframe: str = "30d",
+    current_user: Dict = Depends(get_current_user),
+):
+    """DEPRECATED: Use GET /dashboard/analytics/overview instead."""
+    data = await _do_overview(current_user["tenant_id"], timeframe)
+    # _do_overview returns a dict (snapshot row) directly
+    if isinstance(data, dict):
+        return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
+    return data
+
+
+@router.get("/revenue/alerts")
+async def revenue_alerts_list(
+    status: str = "open",
+    current_user: Dict = Depends(get_current_user),
+):
+    """DEPRECATED: Use GET /dashboard/analytics/alerts instead."""
+    data = await _do_alerts_list(current_user["tenant_id"], status)
+    return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
+
+
+@router.patch("/revenue/alerts/{alert_id}/dismiss")
+async def revenue_alert_dismiss(
+    alert_id: str,
+    current_user: Dict = Depends(get_current_user),
+):
+    """DEPRECATED: Use PATCH /dashboard/analytics/alerts/{alert_id}/dismiss instead."""
+    data = await _do_alert_dismiss(current_user["tenant_id"], alert_id)
+    return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
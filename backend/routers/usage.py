@@ -0,0 +1,300 @@
+"""
+Usage Router — token usage logs, summaries and charts.
+======================================================
+Reads the per-call token_usage_logs and the daily usage rollups maintained
+by usage_ledger.
+
+Public surface
+--------------
+    router      included by server.py
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends
+
+from app_core import clamp_days, clamp_limit, clamp_page, get_current_user, supabase
+from row_counts import CountMode
+from usage_ledger import (
+    daily_series, fetch_daily_rollups, model_distribution, prompt_cache_ratios,
+    summarize_rollups, utc_today,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api")
+
+
+# ============ Token Usage Logs Endpoints ============
+
+# Map agent_type to the request_types that belong to that agent
+AGENT_TYPE_REQUEST_TYPES = {
+    'sales': ['sales_agent', 'sales_agent_faq', 'sales_agent_escalated', 'intent_classifier', 'embedding', 'summarization'],
+}
+
+@router.get("/usage/logs")
+async def get_usage_logs(
+    days: int = 7,
+    model: Optional[str] = None,
+    request_type: Optional[str] = None,
+    agent_type: Optional[str] = None,
+    page: int = 1,
+    limit: int = 50,
+    current_user: Dict = Depends(get_current_user)
+):
+    """Get paginated token usage logs for the tenant"""
+    days = clamp_days(days)
+    limit = clamp_limit(limit)
+    page = clamp_page(page)
+    tenant_id = current_user["tenant_id"]
+
+    try:
+        # Calculate date range
+        start_date = datetime.now(timezone.utc) - timedelta(days=days)
+
+        # Build query — use count='exact' to get total count and data in a single request
+        offset = (page - 1) * limit
+        query = supabase.table('token_usage_logs').select('*', count='exact').eq('tenant_id', tenant_id).gte('created_at', start_date.isoformat())
+
+        # Apply filters
+        if model:
+            query = query.eq('model', model)
+        if request_type:
+            query = query.eq('request_type', request_type)
+        if agent_type and agent_type in AGENT_TYPE_REQUEST_TYPES:
+            query = query.in_('request_type', AGENT_TYPE_REQUEST_TYPES[agent_type])
+
+        result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        total_count = result.count if result.count is not None else len(result.data or [])
+
+        logs = []
+        for log in (result.data or []):
+            logs.append({
+                "id": log["id"],
+                "model": log["model"],
+                "request_type": log["request_type"],
+                "input_tokens": log["input_tokens"],
+                "output_tokens": log["output_tokens"],
+                "total_tokens": log.get("total_tokens", log["input_tokens"] + log["output_tokens"]),
+                "cost_usd": float(log.get("cost_usd", 0)),
+                "created_at": log["created_at"]
+            })
+
+        return {
+            "logs": logs,
+            "pagination": {
+                "page": page,
+                "limit": limit,
+                "total": total_count,
+                "total_pages": (total_count + limit - 1) // limit
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"Error fetching usage logs: {e}")
+        return {"logs": [], "pagination": {"page": 1, "limit": limit, "total": 0, "total_pages": 0}}
+
+
+@router.get("/usage/summary")
+async def get_usage_summary(
+    days: int = 7,
+    agent_type: Optional[str] = None,
+    current_user: Dict = Depends(get_current_user)
+):
+    """Get usage summary stats for dashboard cards"""
+    days = clamp_days(days)
+    tenant_id = current_user["tenant_id"]
+
+    try:
+        # Rollup rows: current window is the last `days` UTC days including today
+        end_day = utc_today()
+        start_day = end_day - timedelta(days=days - 1)
+        prev_start = start_day - timedelta(days=days)
+        request_types = AGENT_TYPE_REQUEST_TYPES.get(agent_type) if agent_type else None
+
+        rows = await asyncio.to_thread(
+            fetch_daily_rollups, supabase, tenant_id, prev_start, end_day, request_types
+        )
+        start_iso = start_day.isoformat()
+        current = summarize_rollups(r for r in rows if str(r.get("day"))[:10] >= start_iso)
+        previous = summarize_rollups(r for r in rows if str(r.get("day"))[:10] < start_iso)
+
+        total_tokens, total_cost, total_requests = current.tokens, current.cost, current.requests
+        model_counts = current.model_counts
+        most_used_model, most_used_pct = current.most_used_model
+        prev_tokens, prev_cost, prev_requests = previous.tokens, previous.cost, previous.requests
+
+        # Calculate changes
+        tokens_change = round((total_tokens - prev_tokens) / prev_tokens * 100, 1) if prev_tokens > 0 else 0
+        cost_change = round((total_cost - prev_cost) / prev_cost * 100, 1) if prev_cost > 0 else 0
+        requests_change = round((total_requests - prev_requests) / prev_requests * 100, 1) if prev_requests > 0 else 0
+
+        return {
+            "total_tokens": {
+                "value": total_tokens,
+                "change": tokens_change
+            },
+            "total_cost": {
+                "value": round(total_cost, 4),
+                "change": cost_change
+            },
+            "total_requests": {
+                "value": total_requests,
+                "change": requests_change
+            },
+            "most_used_model": {
+                "name": most_used_model,
+                "percentage": most_used_pct
+            },
+            "model_breakdown": model_counts,
+            "period_days": days
+        }
+
+    except Exception as e:
+        logger.error(f"Error fetching usage summary: {e}")
+        return {
+            "total_tokens": {"value": 0, "change": 0},
+            "total_cost": {"value": 0, "change": 0},
+            "total_requests": {"value": 0, "change": 0},
+            "most_used_model": {"name": "None", "percentage": 0},
+            "model_breakdown": {},
+            "period_days": days
+        }
+
+
+@router.get("/usage/chart")
+async def get_usage_chart(
+    days: int = 7,
+    agent_type: Optional[str] = None,
+    current_user: Dict = Depends(get_current_user)
+):
+    """Get daily token usage for chart visualization"""
+    days = clamp_days(days)
+    tenant_id = current_user["tenant_id"]
+
+    try:
+        end_day = utc_today()
+        request_types = AGENT_TYPE_REQUEST_TYPES.get(agent_type) if agent_type else None
+        rows = await asyncio.to_thread(
+            fetch_daily_rollups, supabase, tenant_id, end_day - timedelta(days=days - 1), end_day, request_types
+        )
+        chart_data = daily_series(rows, end_day, days)
+
+        return {
+            "chart_data": chart_data,
+            "period_days": days
+        }
+
+    except Exception as e:
+        logger.error(f"Error fetching usage chart data: {e}")
+        return {
+            "chart_data": [],
+            "period_days": days
+        }
+
+
+@router.get("/usage/conversation-stats")
+async def get_conversation_stats(
+    days: int = 30,
+    page: int = 1,
+    limit: int = 20,
+    current_user: Dict = Depends(get_current_user)
+):
+    """Per-conversation cost metrics with customer info."""
+    tenant_id = current_user["tenant_id"]
+    # Validate and bound query parameters
+    days = max(1, min(days, 365))
+    page = max(1, page)
+    limit = max(1, min(limit, 100))
+    start_date = datetime.now(timezone.utc) - timedelta(days=days)
+
+    try:
+        # Query conversations with usage data, joined with customer name
+        result = supabase.table('conversations').select(
+            'id, customer_id, source_channel, started_at, message_count, total_input_tokens, total_output_tokens, total_cost_usd, customers(name, telegram_username)'
+        ).eq('tenant_id', tenant_id).gte(
+            'started_at', start_date.isoformat()
+        ).gt('message_count', 0).order(
+            'started_at', desc=True
+        ).range((page - 1) * limit, page * limit - 1).execute()
+
+        conversations = []
+        for c in (result.data or []):
+            customer = c.get('customers') or {}
+            conversations.append({
+                'conversation_id': c['id'],
+                'customer_name': customer.get('name') or customer.get('telegram_username') or 'Unknown',
+                'source_channel': c.get('source_channel', 'telegram'),
+                'message_count': c.get('message_count', 0),
+                'total_input_tokens': c.get('total_input_tokens', 0),
+                'total_output_tokens': c.get('total_output_tokens', 0),
+                'total_cost_usd': float(c.get('total_cost_usd') or 0),
+                'started_at': c['started_at'],
+            })
+
+        # Get total count
+        count_result = supabase.table('conversations').select(
+            'id', count=CountMode.ESTIMATED.postgrest
+        ).eq('tenant_id', tenant_id).gte(
+            'started_at', start_date.isoformat()
+        ).gt('message_count', 0).execute()
+        total = count_result.count or len(conversations)
+
+        return {
+            'conversations': conversations,
+            'pagination': {
+                'page': page,
+                'limit': limit,
+                'total': total,
+                'total_pages': (total + limit - 1) // limit
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"Error fetching conversation stats: {e}")
+        return {
+            'conversations': [],
+            'pagination': {'page': page, 'limit': limit, 'total': 0, 'total_pages': 0}
+        }
+
+
+@router.get("/usage/model-distribution")
+async def get_model_distribution(
+    days: int = 7,
+    agent_type: Optional[str] = None,
+    current_user: Dict = Depends(get_current_user)
+):
+    """Model usage breakdown with costs."""
+    tenant_id = current_user["tenant_id"]
+    days = max(1, min(days, 365))  # Bound days to 1-365
+    allowed_types = AGENT_TYPE_REQUEST_TYPES.get(agent_type) if agent_type else None
+
+    try:
+        end_day = utc_today()
+        rows = await asyncio.to_thread(
+            fetch_daily_rollups, supabase, tenant_id, end_day - timedelta(days=days - 1), end_day, allowed_types
+        )
+        models, routes = model_distribution(rows)
+
+        total_requests = sum(m['requests'] for m in models.values())
+
+        return {
+            'models': models,
+            'routes': routes,
+            'prompt_cache': prompt_cache_ratios(rows),
+            'total_requests': total_requests,
+            'period_days': days
+        }
+
+    except Exception as e:
+        logger.error(f"Error fetching model distribution: {e}")
+        return {
+            'models': {},
+            'routes': {'mini': 0, 'full': 0, 'escalated': 0},
+            'prompt_cache': {},
+            'total_requests': 0,
+            'period_days': days
+        }
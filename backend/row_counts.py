@@ -0,0 +1,264 @@
+"""
+Row Counts — tenant-scoped counting service with per-use-case modes.
+=====================================================================
+`count="exact"` + `limit(0)` is a full index scan per call. Callers pick the
+mode that matches what the number is used for:
+
+    EXACT      COUNT(*) on every call. Billing / quota / KPI values.
+    ESTIMATED  PostgREST "estimated": exact below the server threshold, planner
+               estimate above it. Evidence, trust scores, pagination totals.
+    PLANNED    Planner estimate only (EXPLAIN). Cheapest; never exact.
+    CACHED     Exact, memoized per (tenant, source, table) until a sync delta
+               for that table arrives (record_sync_delta) or COUNT_CACHE_TTL
+               expires. Entity totals on dashboards / CRM context.
+
+Syncs run only on the leader worker, so record_sync_delta also broadcasts the
+invalidation (COUNT_DELTA_CHANNEL) and every worker drops its cached count.
+Without a distributed shared-state backend the broadcast is a no-op and
+COUNT_CACHE_TTL bounds how stale another worker's count can be.
+
+count_tables() counts several CRM tables in one exec_readonly_sql round trip
+(falls back to concurrent per-table counts if the RPC is unavailable).
+
+Public surface
+--------------
+    n      = await count_rows(sb, tid, "crm_deals", crm_source=src, mode=CountMode.CACHED)
+    counts = await count_tables(sb, tid, ["crm_leads", "crm_deals"], crm_source=src)
+    q      = count_query(sb, "crm_deals", CountMode.EXACT).eq(...)   # custom filters
+    n      = await run_count(q)
+    record_sync_delta(tid, src, "crm_deals", changed=120)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+from enum import Enum
+from typing import Optional
+
+from shared_state import get_shared_state, subscribe
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Cached counts older than this are recomputed even without a sync delta
+COUNT_CACHE_TTL = 900  # seconds — one incremental sync interval
+COUNT_CACHE_MAX_ENTRIES = 10_000
+
+# Tables count_tables() may batch through exec_readonly_sql (RLS-covered)
+BATCHABLE_TABLES = {
+    "crm_leads", "crm_deals", "crm_contacts",
+    "crm_companies", "crm_activities", "crm_users",
+}
+
+_IDENT_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class CountMode(str, Enum):
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    PLANNED = "planned"
+    CACHED = "cached"
+
+    @property
+    def postgrest(self) -> str:
+        """PostgREST count method used for this mode."""
+        return "exact" if self is CountMode.CACHED else self.value
+
+
+# {(tenant_id, crm_source, table): count}
+_count_cache = TTLCache("row_counts", ttl=COUNT_CACHE_TTL, max_entries=COUNT_CACHE_MAX_ENTRIES)
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "batched": 0, "fallbacks": 0}
+COUNT_DELTA_CHANNEL = "row_count_delta"
+
+
+# ---------------------------------------------------------------------------
+# Query helpers
+# ---------------------------------------------------------------------------
+
+def count_query(supabase, table: str, mode: CountMode = CountMode.EXACT, columns: str = "*"):
+    """Start a count query; the caller adds filters and passes it to run_count()."""
+    return supabase.table(table).select(columns, count=mode.postgrest)
+
+
+async def run_count(query) -> int:
+    """Execute a count query (no rows transferred) off the event loop."""
+    result = await asyncio.to_thread(lambda: query.limit(0).execute())
+    return result.count or 0
+
+
+def _scoped(supabase, tenant_id: str, crm_source: Optional[str], table: str, mode: CountMode):
+    query = count_query(supabase, table, mode).eq("tenant_id", tenant_id)
+    if crm_source:
+        query = query.eq("crm_source", crm_source)
+    return query
+
+
+# ---------------------------------------------------------------------------
+# Cache maintenance
+# ---------------------------------------------------------------------------
+
+def _cache_get(key: tuple) -> Optional[int]:
+    return _count_cache.get(key)
+
+
+def _cache_put(key: tuple, count: int) -> None:
+    _count_cache.set(key, count)
+
+
+def record_sync_delta(tenant_id: str, crm_source: str, table: str, changed: int) -> None:
+    """
+    Called by the sync engine after upserting ``changed`` rows into ``table``.
+    Upserts cannot tell inserts from updates, so any non-zero delta drops the
+    cached count; the next CACHED read recounts exactly.
+    """
+    if changed <= 0:
+        return
+    _drop_count(tenant_id, crm_source, table)
+    get_shared_state().publish_nowait(
+        COUNT_DELTA_CHANNEL, {"tenant_id": tenant_id, "crm_source": crm_source, "table": table},
+    )
+
+
+def _drop_count(tenant_id: str, crm_source: str, table: str) -> None:
+    if _count_cache.pop((tenant_id, crm_source, table), None) is not None:
+        _stats["invalidations"] += 1
+    # Tenant-wide (crm_source=None) entries include this source too
+    _count_cache.pop((tenant_id, None, table), None)
+
+
+def _on_remote_delta(data: dict) -> None:
+    if data.get("tenant_id") and data.get("table"):
+        _drop_count(data["tenant_id"], data.get("crm_source"), data["table"])
+
+
+subscribe(COUNT_DELTA_CHANNEL, _on_remote_delta)
+
+
+def invalidate_counts(tenant_id: str, crm_source: Optional[str] = None) -> None:
+    """Drop every cached count for a tenant (optionally one CRM source)."""
+    _stats["invalidations"] += _count_cache.invalidate(
+        lambda k: k[0] == tenant_id and (crm_source is None or k[1] in (crm_source, None))
+    )
+
+
+def get_count_stats() -> dict:
+    return {**_stats, "cached_entries": len(_count_cache)}
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+async def count_rows(
+    supabase,
+    tenant_id: str,
+    table: str,
+    crm_source: Optional[str] = None,
+    mode: CountMode = CountMode.EXACT,
+) -> int:
+    """Tenant-scoped row count for one table. Returns 0 on error."""
+    key = (tenant_id, crm_source, table)
+    if mode is CountMode.CACHED:
+        cached = _cache_get(key)
+        if cached is not None:
+            _stats["hits"] += 1
+            return cached
+        _stats["misses"] += 1
+
+    try:
+        count = await run_count(_scoped(supabase, tenant_id, crm_source, table, mode))
+    except Exception as e:
+        logger.warning("count_rows(%s, %s): %s", table, mode.value, e)
+        return 0
+
+    if mode is CountMode.CACHED:
+        _cache_put(key, count)
+    return count
+
+
+def _batch_count_sql(tenant_id: str, crm_source: Optional[str], tables: list[str]) -> str:
+    def lit(v: str) -> str:
+        return "'" + str(v).replace("'", "''") + "'"
+
+    where = f"tenant_id = {lit(tenant_id)}"
+    if crm_source:
+        where += f" AND crm_source = {lit(crm_source)}"
+    parts = [f"(SELECT COUNT(*) FROM {t} WHERE {where}) AS {t}" for t in tables]
+    return "SELECT " + ", ".join(parts)
+
+
+async def _batch_exact(supabase, tenant_id: str, crm_source: Optional[str], tables: list[str]) -> Optional[dict[str, int]]:
+    """All counts in one exec_readonly_sql call, or None if it is unavailable."""
+    # RLS inside the RPC matches crm_source exactly, so tenant-wide counts can't batch
+    if not tables or not crm_source:
+        return None
+    if not all(t in BATCHABLE_TABLES and _IDENT_RE.match(t) for t in tables):
+        return None
+    try:
+        result = await asyncio.to_thread(
+            lambda: supabase.rpc("exec_readonly_sql", {
+                "p_tenant_id": tenant_id,
+                "p_crm_source": crm_source,
+                "p_query": _batch_count_sql(tenant_id, crm_source, tables),
+            }).execute()
+        )
+        rows = result.data
+        if isinstance(rows, str):
+            rows = json.loads(rows)
+        if isinstance(rows, list) and rows and isinstance(rows[0], dict):
+            _stats["batched"] += 1
+            return {t: int(rows[0].get(t) or 0) for t in tables}
+    except Exception as e:
+        logger.debug("batched count failed, falling back to per-table: %s", e)
+    _stats["fallbacks"] += 1
+    return None
+
+
+async def count_tables(
+    supabase,
+    tenant_id: str,
+    tables: list[str],
+    crm_source: Optional[str] = None,
+    mode: CountMode = CountMode.EXACT,
+) -> dict[str, int]:
+    """
+    Count several tables for one tenant. EXACT and CACHED misses are batched
+    into a single query; ESTIMATED/PLANNED run concurrently per table.
+    """
+    counts: dict[str, int] = {}
+    pending = list(dict.fromkeys(tables))
+
+    if mode is CountMode.CACHED:
+        for table in list(pending):
+            cached = _cache_get((tenant_id, crm_source, table))
+            if cached is not None:
+                _stats["hits"] += 1
+                counts[table] = cached
+                pending.remove(table)
+        _stats["misses"] += len(pending)
+
+    if pending and mode in (CountMode.EXACT, CountMode.CACHED):
+        batched = await _batch_exact(supabase, tenant_id, crm_source, pending)
+        if batched is not None:
+            counts.update(batched)
+            if mode is CountMode.CACHED:
+                for table, n in batched.items():
+                    _cache_put((tenant_id, crm_source, table), n)
+            pending = []
+
+    if pending:
+        # CACHED entries were already counted as misses above — count them exactly
+        per_table_mode = CountMode.EXACT if mode is CountMode.CACHED else mode
+        values = await asyncio.gather(*(
+            count_rows(supabase, tenant_id, t, crm_source=crm_source, mode=per_table_mode)
+            for t in pending
+        ))
+        for table, n in zip(pending, values):
+            counts[table] = n
+            if mode is CountMode.CACHED:
+                _cache_put((tenant_id, crm_source, table), n)
+
+    return {t: counts.get(t, 0) for t in tables}
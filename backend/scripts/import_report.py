@@ -0,0 +1,82 @@
+"""Import-time report: what each module costs a cold worker.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+prints:
+  - the modules imported directly by <module>, by cumulative time (who pays
+    for what at boot — a dependency is charged to the first module that
+    imports it), and
+  - third-party/top-level packages by total self time.
+
+Usage (from backend/):
+    python scripts/import_report.py                 # server
+    python scripts/import_report.py routers.usage --top 15
+    python scripts/import_report.py --placeholder-env   # no .env needed
+
+--placeholder-env fills SUPABASE_URL / SUPABASE_SERVICE_KEY / JWT_SECRET with
+dummies so the import succeeds without credentials (nothing connects at
+import time).
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PLACEHOLDER_ENV = {
+    "SUPABASE_URL": "https://placeholder.supabase.co",
+    "SUPABASE_SERVICE_KEY": "placeholder-service-key",
+    "JWT_SECRET": "placeholder-jwt-secret-for-import-report",
+}
+
+
+def run_importtime(module, placeholder_env):
+    env = dict(os.environ)
+    if placeholder_env:
+        for key, value in PLACEHOLDER_ENV.items():
+            env.setdefault(key, value)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), name.strip()))
+    if proc.returncode != 0:
+        tail = [l for l in proc.stderr.splitlines() if not l.startswith("import time:")][-5:]
+        sys.exit(f"import {module} failed:\n" + "\n".join(tail))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("module", nargs="?", default="server")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--placeholder-env", action="store_true")
+    args = parser.parse_args()
+
+    rows = run_importtime(args.module, args.placeholder_env)
+    total = next((r[2] for r in reversed(rows) if r[3] == args.module), sum(r[1] for r in rows))
+
+    direct = sorted((r for r in rows if r[0] == 1), key=lambda r: -r[2])
+    print(f"import {args.module}: {total / 1000:.0f} ms\n")
+    print(f"{'cumulative ms':>14}  {'share':>6}  direct import")
+    for _, _, cumulative, name in direct[:args.top]:
+        print(f"{cumulative / 1000:14.1f}  {cumulative / total:6.1%}  {name}")
+
+    by_package = defaultdict(int)
+    for _, self_us, _, name in rows:
+        by_package[name.split(".")[0]] += self_us
+    print(f"\n{'self ms':>14}  {'share':>6}  top-level package")
+    for name, self_us in sorted(by_package.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{self_us / 1000:14.1f}  {self_us / total:6.1%}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cold start: time from spawning a worker to its first healthy /api/health.
+
+Starts `uvicorn server:app` (or --command) in a fresh process, polls
+GET /api/health every --poll seconds until it returns 200, then stops the
+worker. Repeats --runs times and prints min / median / max.
+
+Usage (from backend/, with the usual .env):
+    python scripts/measure_cold_start.py
+    python scripts/measure_cold_start.py --runs 10
+    python scripts/measure_cold_start.py --command "gunicorn -k uvicorn.workers.UvicornWorker -b 127.0.0.1:{port} server:app"
+
+Recorded (1 CPU, Python 3.11, uvicorn 0.25, placeholder env, --runs 5):
+    after the router split / lazy imports   min 2.07s  median 2.15s  max 2.31s
+    before (parent commit)                  never healthy offline: importing
+        document_processor fetched the tiktoken encoding over the network, so
+        a worker without egress failed at boot instead of starting slowly
+`python scripts/import_report.py --placeholder-env` on the same machine:
+`import server` 1.5s after; before, the import raised ConnectionError ~2.9s
+in (same tiktoken fetch), so there is no comparable offline figure.
+"""
+import argparse
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_COMMAND = f"{sys.executable} -m uvicorn server:app --host 127.0.0.1 --port {{port}} --log-level warning"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_once(command, timeout, poll):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+    started = time.perf_counter()
+    proc = subprocess.Popen(shlex.split(command.format(port=port)), cwd=BACKEND_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - started < timeout:
+                if proc.poll() is not None:
+                    sys.exit(f"worker exited with {proc.returncode}:\n{proc.stderr.read()[-2000:]}")
+                try:
+                    if client.get(url).status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                time.sleep(poll)
+        sys.exit(f"no healthy response from {url} within {timeout:.0f}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--poll", type=float, default=0.05)
+    parser.add_argument("--command", default=DEFAULT_COMMAND, help="worker command; {port} is substituted")
+    args = parser.parse_args()
+
+    samples = []
+    for run in range(1, args.runs + 1):
+        seconds = measure_once(args.command, args.timeout, args.poll)
+        samples.append(seconds)
+        print(f"run {run}: {seconds:.2f}s")
+    print(f"\ncold start to healthy /api/health over {len(samples)} runs: "
+          f"min {min(samples):.2f}s  median {statistics.median(samples):.2f}s  max {max(samples):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
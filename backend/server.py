@@ -25,12 +25,12 @@ if _vertex_b64:
     except Exception as _e:
         print(f"WARNING: Failed to set up Vertex AI credentials: {_e}")
 
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, BackgroundTasks, UploadFile, File, Form
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, BackgroundTasks, UploadFile, File, Form
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 import logging
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any, Tuple
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable
 import uuid
 from datetime import datetime, timezone, timedelta
 import hashlib
@@ -41,9 +41,6 @@ import httpx
 import json
 import asyncio
 import re
-import html
-from supabase import create_client, Client
-import resend
 
 # Import document processor for RAG
 from document_processor import (
@@ -83,7 +80,7 @@ from google_sheets_service import (
 )
 
 # Import token usage logger for API billing/transparency
-from token_logger import log_token_usage_fire_and_forget, calculate_whisper_cost
+from token_logger import log_token_usage_fire_and_forget, calculate_whisper_cost, cached_prompt_tokens
 
 # Import Instagram Graph API service
 from instagram_service import (
@@ -101,15 +98,15 @@ from instagram_service import (
 from crypto_utils import encrypt_value, decrypt_value
 
 # Import CRM services
-from crm_manager import CRMManager
-from hubspot_crm import HubSpotCRM, HubSpotAPIError, HUBSPOT_CLIENT_ID
-from zoho_crm import ZohoCRM, ZohoAPIError, ZOHO_CLIENT_ID
+from hubspot_crm import HubSpotCRM, HubSpotAPIError
+from zoho_crm import ZohoCRM, ZohoAPIError
 from freshsales_crm import FreshsalesCRM, FreshsalesAPIError
 
 # Import CRM sync engine (Karim)
 from sync_engine import (
     trigger_full_sync_background,
-    resume_all_sync_loops,
+    run_sync_reconciler,
+    stop_local_sync_loops,
     stop_sync_loop,
     stop_all_syncs,
     is_sync_active,
@@ -117,6 +114,12 @@ from sync_engine import (
     _active_full_syncs,
 )
 from sync_status import SyncStatus
+from row_counts import CountMode, count_query, count_tables, run_count
+from ttl_cache import TTLCache, all_cache_stats, purge_all as purge_expired_caches
+from reply_streaming import JsonStringFieldStreamer, TelegramProgressiveReply
+from conversation_memory import FETCH_WINDOW as MEMORY_FETCH_WINDOW, build_context as build_conversation_context
+from lead_field_extractor import extract_local_fields, merge_extracted_fields, needs_llm_fallback
+from usage_ledger import get_month_to_date_cost
 
 # Import Data Team agents (Phase 2)
 from agents.bobur import handle_chat_message as dashboard_chat_handler
@@ -127,97 +130,20 @@ from agents import ChartConfig, CRMProfile
 # NOTE: farid.discover_and_plan() is called during onboarding via lazy import.
 # dima is used for chat-generated charts. Anvar executes widget queries.
 
-import bcrypt as _bcrypt_lib  # for password hashing upgrade
-
-# ============ Startup Validation ============
-REQUIRED_ENV = ['SUPABASE_URL', 'SUPABASE_SERVICE_KEY', 'JWT_SECRET']
-_missing_env = [k for k in REQUIRED_ENV if not (os.environ.get(k) or '').strip()]
-if _missing_env:
-    raise RuntimeError(f"Missing required environment variables: {', '.join(_missing_env)}")
-
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Supabase client (strip to remove any accidental newlines from env vars)
-supabase_url = (os.environ.get('SUPABASE_URL') or '').strip()
-supabase_key = (os.environ.get('SUPABASE_SERVICE_KEY') or '').strip()
-supabase: Client = create_client(supabase_url, supabase_key)
-
-# Initialize CRM Manager
-crm_manager = CRMManager(supabase)
-
-# Create HTTP/1.1 client for direct REST API calls (avoids HTTP/2 StreamReset issues)
-_rest_client = httpx.Client(
-    http2=False,
-    timeout=30.0,
-    headers={
-        "apikey": supabase_key,
-        "Authorization": f"Bearer {supabase_key}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation"
-    }
+# Supabase client, config and auth dependencies shared with the feature routers
+from app_core import (
+    BACKEND_PUBLIC_URL, FRONTEND_URL, JWT_ALGORITHM, JWT_SECRET, SANITIZE_FIELDS,
+    _cleanup_crm_data, _get_tenant_crm_source, _token_blacklist,
+    clamp_days, clamp_limit, clamp_offset, clamp_page, crm_manager, db_rest_select,
+    get_current_user, now_iso, redact_id, require_super_admin, sanitize_dict,
+    supabase, telemetry_sink, verify_password,
 )
-
-def _validate_table_name(table: str):
-    """Validate table name against whitelist to prevent injection."""
-    if table not in ALLOWED_REST_TABLES:
-        raise ValueError(f"Invalid table name: {table}")
-
-def _db_rest_select_sync(table: str, query_params: dict = None):
-    """Synchronous REST select — use db_rest_select() in async contexts."""
-    _validate_table_name(table)
-    url = f"{supabase_url}/rest/v1/{table}"
-    params = query_params or {}
-    params["select"] = params.get("select", "*")
-    response = _rest_client.get(url, params=params)
-    response.raise_for_status()
-    return response.json()
-
-def _db_rest_insert_sync(table: str, data: dict):
-    """Synchronous REST insert — use db_rest_insert() in async contexts."""
-    _validate_table_name(table)
-    url = f"{supabase_url}/rest/v1/{table}"
-    response = _rest_client.post(url, json=data)
-    response.raise_for_status()
-    return response.json()
-
-def _db_rest_update_sync(table: str, data: dict, eq_column: str, eq_value: str):
-    """Synchronous REST update — use db_rest_update() in async contexts."""
-    _validate_table_name(table)
-    from urllib.parse import quote
-    url = f"{supabase_url}/rest/v1/{table}?{eq_column}=eq.{quote(str(eq_value), safe='')}"
-    response = _rest_client.patch(url, json=data)
-    response.raise_for_status()
-    return response.json()
-
-async def db_rest_select(table: str, query_params: dict = None):
-    """Non-blocking REST select — runs in thread pool to avoid blocking the event loop."""
-    return await asyncio.to_thread(_db_rest_select_sync, table, query_params)
-
-async def db_rest_insert(table: str, data: dict):
-    """Non-blocking REST insert — runs in thread pool to avoid blocking the event loop."""
-    return await asyncio.to_thread(_db_rest_insert_sync, table, data)
-
-async def db_rest_update(table: str, data: dict, eq_column: str, eq_value: str):
-    """Non-blocking REST update — runs in thread pool to avoid blocking the event loop."""
-    return await asyncio.to_thread(_db_rest_update_sync, table, data, eq_column, eq_value)
-
-# Initialize Resend for email
-# Strip env vars to remove accidental newlines
-resend.api_key = (os.environ.get('RESEND_API_KEY') or '').strip()
-SENDER_EMAIL = (os.environ.get('SENDER_EMAIL') or 'noreply@leadrelay.net').strip()
-FRONTEND_URL = (os.environ.get('FRONTEND_URL') or 'https://leadrelay.net').strip()
-BACKEND_PUBLIC_URL = (os.environ.get('BACKEND_PUBLIC_URL') or os.environ.get('RENDER_EXTERNAL_URL') or '').strip()
-if not BACKEND_PUBLIC_URL:
-    logger.warning("BACKEND_PUBLIC_URL not set — webhook URLs will default to localhost (set BACKEND_PUBLIC_URL for production)")
-
-# Log Resend configuration status (without exposing key)
-if resend.api_key:
-    logger.info("Resend API configured")
-    logger.info(f"Sender email configured: {'yes' if SENDER_EMAIL else 'no'}")
-else:
-    logger.warning("RESEND_API_KEY not configured - email sending will fail!")
+from routers import FEATURE_ROUTERS
+from routers.auth import AUTH_LOCKOUT_DURATION, AUTH_RATE_WINDOW, auth_rate_limiter
 
 app = FastAPI(title="LeadRelay - AI Sales Automation")
 # NOTE: Error response format inconsistency across routes (tech debt):
@@ -227,12 +153,9 @@ app = FastAPI(title="LeadRelay - AI Sales Automation")
 api_router = APIRouter(prefix="/api")
 
 # ============ Configuration ============
-JWT_SECRET = (os.environ.get('JWT_SECRET') or '').strip()
-if not JWT_SECRET:
-    raise RuntimeError("JWT_SECRET environment variable is required")
-JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24
-TELEGRAM_API_BASE = "https://api.telegram.org/bot"
+# TELEGRAM_API_URL points the bot at a local Bot API server (or the load-test fake)
+TELEGRAM_API_URL = ((os.environ.get('TELEGRAM_API_URL') or '').strip() or "https://api.telegram.org").rstrip("/")
+TELEGRAM_API_BASE = f"{TELEGRAM_API_URL}/bot"
 
 # Shared LeadRelay bot for Telegram Business connections
 LEADRELAY_BOT_TOKEN = (os.environ.get('LEADRELAY_BOT_TOKEN') or '').strip() or None
@@ -243,26 +166,8 @@ META_APP_ID = (os.environ.get('META_APP_ID') or '').strip()
 META_APP_SECRET = (os.environ.get('META_APP_SECRET') or '').strip()
 INSTAGRAM_WEBHOOK_VERIFY_TOKEN = (os.environ.get('INSTAGRAM_WEBHOOK_VERIFY_TOKEN') or '').strip()
 
-# Super-admin user IDs (comma-separated in env, e.g. "uuid1,uuid2")
-SUPER_ADMIN_IDS = set(
-    uid.strip() for uid in (os.environ.get('SUPER_ADMIN_IDS') or '').split(',') if uid.strip()
-)
-
-def require_super_admin(current_user: Dict):
-    """Raise 403 if the user is not a platform super-admin."""
-    user_id = current_user.get("user_id", "")
-    if not SUPER_ADMIN_IDS:
-        raise HTTPException(status_code=403, detail="No platform administrators configured")
-    if user_id not in SUPER_ADMIN_IDS:
-        raise HTTPException(status_code=403, detail="Platform administrator access required")
-
-# OpenAI client
-from llm_service import client as _llm_client
-openai_client = _llm_client  # Reuse the singleton from llm_service
-
-# Multi-model support via litellm
-import litellm
-litellm.drop_params = True  # Silently drop unsupported params per provider
+# LLM calls go through the gateway, which imports the OpenAI SDK and litellm on first use
+from llm_gateway import get_gateway, served_model
 
 # Valid sales models and provider mapping
 VALID_SALES_MODELS = {
@@ -283,141 +188,34 @@ _anthropic_key = os.environ.get('ANTHROPIC_API_KEY', '').strip()
 if not _anthropic_key:
     logging.warning("ANTHROPIC_API_KEY not set — Claude models will not work")
 
-# ============ Input Sanitization ============
-def sanitize_html(text: str) -> str:
-    """Remove HTML tags and escape special characters to prevent XSS attacks."""
-    if not text or not isinstance(text, str):
-        return text
-    # Remove script tags and their contents
-    text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.IGNORECASE | re.DOTALL)
-    # Remove style tags and their contents
-    text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.IGNORECASE | re.DOTALL)
-    # Remove all HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-    # Escape HTML entities
-    text = html.escape(text)
-    return text.strip()
-
-def sanitize_dict(data: dict, fields_to_sanitize: list) -> dict:
-    """Sanitize specific string fields in a dictionary."""
-    sanitized = data.copy()
-    for field in fields_to_sanitize:
-        if field in sanitized and isinstance(sanitized[field], str):
-            sanitized[field] = sanitize_html(sanitized[field])
-    return sanitized
-
-# Fields that should be sanitized before storage
-SANITIZE_FIELDS = [
-    'business_name', 'business_description', 'products_services',
-    'faq_objections', 'greeting_message', 'closing_message', 'name'
-]
-
-# ============ Query Parameter Clamping ============
-def clamp_limit(limit: int, default: int = 50, maximum: int = 500) -> int:
-    """Clamp a limit parameter to a safe range [1, maximum]."""
-    return min(max(1, limit), maximum)
-
-def clamp_days(days: int, default: int = 7, maximum: int = 365) -> int:
-    """Clamp a days parameter to a safe range [1, maximum]."""
-    return min(max(1, days), maximum)
-
-def clamp_page(page: int) -> int:
-    """Clamp page number to minimum 1."""
-    return max(1, page)
-
-def clamp_offset(offset: int) -> int:
-    """Clamp offset to minimum 0."""
-    return max(0, offset)
-
 # ============ Rate Limiting ============
-# Simple in-memory rate limiter (for production, use Redis)
-from collections import defaultdict
+# Enforced across workers through the shared-state backend (in-memory unless REDIS_URL is set)
+from shared_state import SharedRateLimiter, get_shared_state, invalidate_everywhere
+from leader_election import LeaderElector, get_leader_stats, set_elector
+from startup_hooks import StartupHooks
+from db_metrics import db_job, db_scope, stats as get_db_stats
+from loop_watchdog import get_loop_stats, start_watchdog, stop_watchdog
+from pipeline_trace import annotate, get_pipeline_stats, span, traced, traced_pipeline
 import time
 
-class RateLimiter:
-    """Simple rate limiter to prevent message flooding"""
-    def __init__(self, max_requests: int = 10, window_seconds: int = 60):
-        self.max_requests = max_requests
-        self.window_seconds = window_seconds
-        self.requests = defaultdict(list)
-
-    def is_allowed(self, user_id: str) -> bool:
-        """Check if user is within rate limit"""
-        now = time.time()
-        # Clean old entries
-        self.requests[user_id] = [t for t in self.requests[user_id] if now - t < self.window_seconds]
-
-        if len(self.requests[user_id]) >= self.max_requests:
-            return False
-
-        self.requests[user_id].append(now)
-        return True
-
-    def get_wait_time(self, user_id: str) -> int:
-        """Get seconds until next request is allowed"""
-        if not self.requests[user_id]:
-            return 0
-        oldest = min(self.requests[user_id])
-        wait = self.window_seconds - (time.time() - oldest)
-        return max(0, int(wait))
-
-    def is_allowed_with_limit(self, user_id: str, max_requests: int) -> bool:
-        """Check if user is within a custom rate limit (overrides default max_requests)."""
-        now = time.time()
-        self.requests[user_id] = [t for t in self.requests[user_id] if now - t < self.window_seconds]
-
-        if len(self.requests[user_id]) >= max_requests:
-            return False
-
-        self.requests[user_id].append(now)
-        return True
-
-    def cleanup(self):
-        """Remove expired entries to prevent memory leak"""
-        now = time.time()
-        expired = [uid for uid, timestamps in self.requests.items()
-                   if all(now - t >= self.window_seconds for t in timestamps)]
-        for uid in expired:
-            del self.requests[uid]
-
 # Rate limiter: max 10 messages per minute per user
-message_rate_limiter = RateLimiter(max_requests=10, window_seconds=60)
+message_rate_limiter = SharedRateLimiter("messages", max_requests=10, window=60)
 
 # LLM rate limiter: max 20 LLM requests per minute per tenant (prevents cost abuse)
-llm_rate_limiter = RateLimiter(max_requests=20, window_seconds=60)
+llm_rate_limiter = SharedRateLimiter("llm_requests", max_requests=20, window=60)
 
 # Monthly cost cap for LLM usage per tenant (configurable via env)
 LLM_MONTHLY_COST_CAP = float(os.environ.get("LLM_MONTHLY_COST_CAP", "50"))  # $50 default
-_monthly_cost_cache: Dict[str, Tuple[float, float]] = {}  # tenant_id -> (total_cost, cache_expiry_ts)
-_MONTHLY_COST_CACHE_TTL = 300  # 5 minutes
 
 def _get_monthly_cost(tenant_id: str) -> float:
-    """Get current month's total LLM cost for a tenant, cached for 5 minutes."""
-    now = time.time()
-    cached = _monthly_cost_cache.get(tenant_id)
-    if cached and now < cached[1]:
-        return cached[0]
-
-    try:
-        month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        result = supabase.table('token_usage_logs').select('cost_usd').eq(
-            'tenant_id', tenant_id
-        ).gte('created_at', month_start.isoformat()).execute()
-        total = sum(float(r.get('cost_usd', 0)) for r in (result.data or []))
-    except Exception as e:
-        logger.warning(f"Monthly cost query failed for tenant {tenant_id[:8]}***: {e}")
-        # On error, use cached value if available, otherwise allow request (fail-open)
-        if cached:
-            return cached[0]
-        return 0.0
-
-    _monthly_cost_cache[tenant_id] = (total, now + _MONTHLY_COST_CACHE_TTL)
-    return total
+    """Current month's total LLM cost for a tenant from the usage ledger's running total."""
+    return get_month_to_date_cost(supabase, tenant_id)
 
-def check_llm_rate_limit(tenant_id: str):
+async def check_llm_rate_limit(tenant_id: str):
     """Check LLM rate limit and monthly cost cap for a tenant. Raises 429 if exceeded."""
-    if not llm_rate_limiter.is_allowed(tenant_id):
-        wait = llm_rate_limiter.get_wait_time(tenant_id)
+    limited = await llm_rate_limiter.hit(tenant_id)
+    if not limited:
+        wait = limited.retry_after_seconds
         raise HTTPException(
             status_code=429,
             detail=f"AI request rate limit exceeded. Please wait {wait} seconds.",
@@ -432,56 +230,6 @@ def check_llm_rate_limit(tenant_id: str):
             detail=f"Monthly AI usage limit reached (${LLM_MONTHLY_COST_CAP:.0f}). Usage resets on the 1st of next month.",
         )
 
-# ============ Auth Rate Limiting ============
-auth_rate_limiter = {}  # ip -> {attempts, window_start, failures, locked_until}
-AUTH_RATE_LIMIT = 5       # max attempts per window
-AUTH_RATE_WINDOW = 300    # per 5-minute window
-AUTH_LOCKOUT_THRESHOLD = 10  # consecutive failures before lockout
-AUTH_LOCKOUT_DURATION = 900  # 15-minute lockout
-
-def check_auth_rate_limit(request: Request) -> None:
-    """IP-based rate limiting for auth endpoints to prevent brute force."""
-    ip = request.client.host if request.client else "unknown"
-    now = time.time()
-    entry = auth_rate_limiter.get(ip, {"attempts": 0, "window_start": now, "failures": 0, "locked_until": 0})
-
-    # Check lockout first
-    if now < entry.get("locked_until", 0):
-        remaining = int(entry["locked_until"] - now)
-        logger.warning(f"Auth lockout active for IP {ip[:8]}*** ({remaining}s remaining)")
-        raise HTTPException(
-            status_code=429,
-            detail=f"Account temporarily locked due to too many failed attempts. Try again in {remaining} seconds.",
-            headers={"Retry-After": str(remaining)}
-        )
-
-    if now - entry["window_start"] > AUTH_RATE_WINDOW:
-        entry = {"attempts": 0, "window_start": now, "failures": entry.get("failures", 0), "locked_until": 0}
-    entry["attempts"] += 1
-    auth_rate_limiter[ip] = entry
-    if entry["attempts"] > AUTH_RATE_LIMIT:
-        logger.warning(f"Auth rate limit exceeded for IP {ip[:8]}***")
-        raise HTTPException(status_code=429, detail="Too many attempts. Please try again later.")
-
-def record_auth_failure(request: Request) -> None:
-    """Record a failed login attempt and trigger lockout if threshold exceeded."""
-    ip = request.client.host if request.client else "unknown"
-    now = time.time()
-    entry = auth_rate_limiter.get(ip, {"attempts": 0, "window_start": now, "failures": 0, "locked_until": 0})
-    entry["failures"] = entry.get("failures", 0) + 1
-    if entry["failures"] >= AUTH_LOCKOUT_THRESHOLD:
-        entry["locked_until"] = now + AUTH_LOCKOUT_DURATION
-        logger.warning(f"Auth lockout triggered for IP {ip[:8]}*** after {entry['failures']} failures")
-    auth_rate_limiter[ip] = entry
-
-def reset_auth_failures(request: Request) -> None:
-    """Reset failure counter on successful login."""
-    ip = request.client.host if request.client else "unknown"
-    entry = auth_rate_limiter.get(ip)
-    if entry:
-        entry["failures"] = 0
-        entry["locked_until"] = 0
-
 # ============ Sales Pipeline Constants ============
 SALES_STAGES = {
     "awareness": {"order": 1, "name": "Awareness", "goal": "Educate about products/services"},
@@ -719,208 +467,7 @@ def apply_hotness_rules(llm_hotness: str, score: int, stage: str, fields: Dict)
     return llm_hotness
 
 
-# ============ Auth Helpers ============
-def validate_password_strength(password: str) -> None:
-    """Enforce minimum password complexity requirements."""
-    if len(password) < 8:
-        raise HTTPException(status_code=400, detail="Password must be at least 8 characters.")
-    if not any(c.isupper() for c in password):
-        raise HTTPException(status_code=400, detail="Password must contain at least one uppercase letter.")
-    if not any(c.islower() for c in password):
-        raise HTTPException(status_code=400, detail="Password must contain at least one lowercase letter.")
-    if not any(c.isdigit() for c in password):
-        raise HTTPException(status_code=400, detail="Password must contain at least one number.")
-
-def hash_password(password: str) -> str:
-    """Hash password using bcrypt."""
-    return _bcrypt_lib.hashpw(password.encode(), _bcrypt_lib.gensalt()).decode()
-
-def verify_password(password: str, stored_hash: str) -> bool:
-    """Verify password against stored hash (supports bcrypt and legacy SHA256)."""
-    try:
-        if stored_hash.startswith('$2b$'):
-            return _bcrypt_lib.checkpw(password.encode(), stored_hash.encode())
-        # Legacy SHA256 format: salt:hash
-        if ':' in stored_hash:
-            salt, hash_value = stored_hash.split(":", 1)
-            return hashlib.sha256(f"{salt}{password}".encode()).hexdigest() == hash_value
-        return False
-    except Exception:
-        return False
-
-def _needs_password_rehash(stored_hash: str) -> bool:
-    """Check if hash needs upgrade to bcrypt."""
-    return not stored_hash.startswith('$2b$')
-
-def create_access_token(user_id: str, tenant_id: str, email: str) -> str:
-    expiration = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
-    jti = secrets.token_hex(16)
-    # Use int for exp claim per RFC 7519 (NumericDate must be integer seconds)
-    return jwt.encode({"user_id": user_id, "tenant_id": tenant_id, "email": email, "jti": jti, "exp": int(expiration.timestamp())}, JWT_SECRET, algorithm=JWT_ALGORITHM)
-
-# In-memory token blacklist: {jti: expiry_timestamp} (supplemented by DB for persistence)
-_token_blacklist: dict = {}
-
-def verify_token(token: str) -> Optional[Dict]:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        # Check if token has been revoked
-        jti = payload.get("jti")
-        if jti and jti in _token_blacklist:
-            return None
-        return payload
-    except Exception:
-        return None
-
-def generate_confirmation_token() -> str:
-    return secrets.token_urlsafe(32)
-
-def now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
-
-
-# ============ PII Redaction Helpers ============
-def redact_email(email: str) -> str:
-    if not email or '@' not in email:
-        return '***'
-    local, domain = email.split('@', 1)
-    return f"{local[:2]}***@{domain}"
-
-def redact_id(value: str) -> str:
-    if not value:
-        return '***'
-    return f"{str(value)[:8]}***"
-
-
-# ============ Email Service ============
-async def send_confirmation_email(email: str, name: str, token: str) -> bool:
-    """Send email confirmation link to new user"""
-    try:
-        confirmation_url = f"{FRONTEND_URL}/confirm-email?token={token}"
-        safe_name = html.escape(name) if name else "there"
-        
-        html_content = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="text-align: center; margin-bottom: 30px;">
-                <h1 style="color: #059669; margin: 0;">LeadRelay</h1>
-                <p style="color: #64748b; margin-top: 5px;">AI-Powered Sales Automation</p>
-            </div>
-
-            <h2 style="color: #1e293b;">Welcome, {safe_name}!</h2>
-
-            <p style="color: #475569; line-height: 1.6;">
-                Thank you for registering with LeadRelay. Please confirm your email address
-                by clicking the button below:
-            </p>
-
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{confirmation_url}"
-                   style="background-color: #059669; color: white; padding: 12px 30px;
-                          text-decoration: none; border-radius: 6px; font-weight: bold;
-                          display: inline-block;">
-                    Confirm Email
-                </a>
-            </div>
-
-            <p style="color: #64748b; font-size: 14px;">
-                Or copy and paste this link into your browser:<br/>
-                <a href="{confirmation_url}" style="color: #059669; word-break: break-all;">
-                    {confirmation_url}
-                </a>
-            </p>
-
-            <hr style="border: none; border-top: 1px solid #e2e8f0; margin: 30px 0;"/>
-
-            <p style="color: #94a3b8; font-size: 12px; text-align: center;">
-                If you didn't create an account, you can safely ignore this email.
-            </p>
-        </div>
-        """
-
-        params = {
-            "from": SENDER_EMAIL,
-            "to": [email],
-            "subject": "Confirm your LeadRelay account",
-            "html": html_content
-        }
-        
-        # Run sync SDK in thread to keep FastAPI non-blocking
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        email_id = getattr(result, 'id', None) or (result.get('id') if isinstance(result, dict) else str(result))
-        logger.info(f"Confirmation email sent to {redact_email(email)}, id: {email_id}")
-        return True
-
-    except Exception as e:
-        logger.error(f"Failed to send confirmation email to {redact_email(email)}: {type(e).__name__}: {e}", exc_info=True)
-        return False
-
-
-async def send_password_reset_email(email: str, name: str, token: str) -> bool:
-    """Send password reset link"""
-    try:
-        reset_url = f"{FRONTEND_URL}/reset-password?token={token}"
-        safe_name = html.escape(name) if name else "there"
-
-        html_content = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="text-align: center; margin-bottom: 30px;">
-                <h1 style="color: #059669; margin: 0;">LeadRelay</h1>
-            </div>
-
-            <h2 style="color: #1e293b;">Password Reset Request</h2>
-
-            <p style="color: #475569; line-height: 1.6;">
-                Hi {safe_name}, we received a request to reset your password.
-                Click the button below to create a new password:
-            </p>
-
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{reset_url}"
-                   style="background-color: #059669; color: white; padding: 12px 30px;
-                          text-decoration: none; border-radius: 6px; font-weight: bold;
-                          display: inline-block;">
-                    Reset Password
-                </a>
-            </div>
-
-            <p style="color: #64748b; font-size: 14px;">
-                This link expires in 1 hour. If you didn't request this, ignore this email.
-            </p>
-        </div>
-        """
-
-        params = {
-            "from": SENDER_EMAIL,
-            "to": [email],
-            "subject": "Reset your LeadRelay password",
-            "html": html_content
-        }
-        
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logger.info(f"Password reset email sent to {redact_email(email)}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send password reset email: {e}")
-        return False
-
-
 # ============ Pydantic Models ============
-class RegisterRequest(BaseModel):
-    email: EmailStr
-    password: str = Field(max_length=128)
-    name: str = Field(max_length=100)
-    business_name: str = Field(max_length=200)
-
-class LoginRequest(BaseModel):
-    email: EmailStr
-    password: str = Field(max_length=128)
-
-class AuthResponse(BaseModel):
-    token: Optional[str] = None
-    user: Dict[str, Any]
-    message: Optional[str] = None
-
 class TelegramBotCreate(BaseModel):
     bot_token: str = Field(..., max_length=100)
 
@@ -943,6 +490,7 @@ class TenantConfigUpdate(BaseModel):
     emoji_usage: Optional[str] = Field(None, max_length=50)
     response_length: Optional[str] = Field(None, max_length=50)
     min_response_delay: Optional[int] = None
+    streaming_replies: Optional[bool] = None
     max_messages_per_minute: Optional[int] = None
     objection_playbook: Optional[List[Dict]] = None
     closing_scripts: Optional[Dict] = None
@@ -1031,388 +579,6 @@ class LeadsPerDay(BaseModel):
     cold: int
 
 
-# ============ Auth Middleware ============
-# Lightweight cache: user_id -> expiry timestamp. Proves user still exists in DB.
-_user_exists_cache: Dict[str, float] = {}
-_USER_EXISTS_TTL = 60  # seconds
-
-async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict:
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header required")
-    try:
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            raise HTTPException(status_code=401, detail="Invalid authentication scheme")
-    except ValueError:
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-    token_data = verify_token(token)
-    if not token_data:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-
-    # Verify user still exists in DB (cached for 60s to avoid hammering)
-    user_id = token_data.get("user_id")
-    if user_id:
-        now = time.time()
-        cache_expiry = _user_exists_cache.get(user_id)
-        if cache_expiry is None or now > cache_expiry:
-            try:
-                rows = await db_rest_select('users', {'id': f'eq.{user_id}', 'select': 'id'})
-                if not rows:
-                    raise HTTPException(status_code=401, detail="User account no longer exists")
-                _user_exists_cache[user_id] = now + _USER_EXISTS_TTL
-            except HTTPException:
-                raise
-            except Exception as e:
-                # On DB error, allow request through (fail-open) but log it
-                logger.warning(f"User existence check failed (allowing request): {e}")
-
-    return token_data
-
-
-# Helper function to execute Supabase operations with retry
-def db_execute_with_retry(operation, max_retries=3):
-    """Execute a Supabase operation with retry logic for connection issues."""
-    import time
-    last_error = None
-    for attempt in range(max_retries):
-        try:
-            return operation()
-        except Exception as e:
-            last_error = e
-            error_str = str(e).lower()
-            # Retry on connection errors
-            if 'streamreset' in error_str or 'connection' in error_str or 'timeout' in error_str:
-                if attempt < max_retries - 1:
-                    time.sleep(0.5 * (attempt + 1))  # Exponential backoff
-                    continue
-            raise
-    raise last_error
-
-
-# ============ Auth Endpoints (Custom Auth with Resend) ============
-@api_router.post("/auth/register", response_model=AuthResponse)
-async def register(request: RegisterRequest, req: Request = None):
-    """
-    Register a new user with custom auth and Resend email verification.
-    Uses direct REST API calls to avoid HTTP/2 StreamReset issues on Render.
-    """
-    if req:
-        check_auth_rate_limit(req)
-    validate_password_strength(request.password)
-    try:
-        # Check if user already exists (using direct REST API - HTTP/1.1)
-        existing = await db_rest_select('users', {'email': f'eq.{request.email}'})
-        if existing:
-            raise HTTPException(status_code=400, detail="Email already registered")
-
-        # Generate IDs and confirmation token
-        user_id = str(uuid.uuid4())
-        tenant_id = str(uuid.uuid4())
-        confirmation_token = secrets.token_urlsafe(32)
-
-        # Sanitize user input to prevent XSS attacks
-        safe_name = sanitize_html(request.name) if request.name else None
-        safe_business_name = sanitize_html(request.business_name) if request.business_name else None
-
-        # Create tenant (using direct REST API - HTTP/1.1)
-        tenant = {"id": tenant_id, "name": safe_business_name, "timezone": "Asia/Tashkent", "created_at": now_iso()}
-        await db_rest_insert('tenants', tenant)
-
-        # Token expires in 24 hours for email confirmation
-        token_expires = (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat()
-
-        # Create user record (using direct REST API - HTTP/1.1)
-        user = {
-            "id": user_id,
-            "email": request.email,
-            "password_hash": hash_password(request.password),
-            "name": safe_name,
-            "tenant_id": tenant_id,
-            "role": "admin",
-            "email_confirmed": False,
-            "confirmation_token": confirmation_token,
-            "token_expires_at": token_expires,
-            "created_at": now_iso()
-        }
-        await db_rest_insert('users', user)
-
-        # Create default config (using direct REST API - HTTP/1.1)
-        config = {
-            "tenant_id": tenant_id, "business_name": None, "collect_phone": True,
-            "agent_tone": "professional", "primary_language": "uz", "vertical": "default"
-        }
-        try:
-            await db_rest_insert('tenant_configs', config)
-        except Exception as e:
-            logger.warning(f"Could not create tenant config: {e}")
-
-        # Send confirmation email via async helper
-        email_sent = await send_confirmation_email(request.email, request.name, confirmation_token)
-        if not email_sent:
-            logger.error(f"Registration succeeded but confirmation email failed for {redact_email(request.email)}")
-            logger.error(f"Resend config - API key set: {bool(resend.api_key)}, Sender configured: {'yes' if SENDER_EMAIL else 'no'}")
-
-        return AuthResponse(
-            token=None,
-            user={
-                "id": user_id,
-                "email": request.email,
-                "name": request.name,
-                "tenant_id": tenant_id,
-                "business_name": request.business_name,
-                "email_confirmed": False
-            },
-            message="Account created! Please check your email to confirm your account before logging in."
-        )
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("Registration error")
-        raise HTTPException(status_code=500, detail="An internal error occurred. Please try again.")
-
-
-@api_router.get("/auth/confirm-email")
-async def confirm_email(token: str = None, type: str = None, access_token: str = None):
-    """
-    Confirm user email using direct REST API to avoid HTTP/2 issues.
-    """
-    # Handle custom token confirmation (primary method now)
-    if token:
-        # Validate token format (URL-safe base64 from secrets.token_urlsafe)
-        if not re.match(r'^[A-Za-z0-9_\-]+$', token):
-            raise HTTPException(status_code=400, detail="Invalid or expired confirmation token")
-        result = await db_rest_select('users', {'confirmation_token': f'eq.{token}'})
-        if not result:
-            raise HTTPException(status_code=400, detail="Invalid or expired confirmation token")
-
-        user = result[0]
-        if user.get('email_confirmed'):
-            return {"message": "Email already confirmed", "redirect": "/login"}
-
-        # Check token expiration
-        token_expires = user.get('token_expires_at')
-        if token_expires:
-            expires_dt = datetime.fromisoformat(token_expires.replace('Z', '+00:00'))
-            if datetime.now(timezone.utc) > expires_dt:
-                raise HTTPException(status_code=400, detail="Confirmation token has expired. Please request a new confirmation email.")
-
-        await db_rest_update('users', {
-            "email_confirmed": True,
-            "confirmation_token": None,
-            "token_expires_at": None,
-            "email_confirmed_at": now_iso()
-        }, 'id', user['id'])
-
-        return {"message": "Email confirmed successfully! You can now log in.", "redirect": "/login"}
-
-    raise HTTPException(status_code=400, detail="Invalid confirmation request")
-
-
-@api_router.post("/auth/resend-confirmation")
-async def resend_confirmation(email: EmailStr, req: Request = None):
-    """Resend confirmation email via Resend using direct REST API"""
-    if req:
-        check_auth_rate_limit(req)
-    try:
-        # Find user using direct REST API (HTTP/1.1)
-        result = await db_rest_select('users', {'email': f'eq.{email}'})
-        if result and not result[0].get('email_confirmed'):
-            user = result[0]
-            confirmation_token = secrets.token_urlsafe(32)
-            # Token expires in 24 hours
-            token_expires = (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat()
-
-            # Update token with expiration using direct REST API
-            await db_rest_update('users', {
-                "confirmation_token": confirmation_token,
-                "token_expires_at": token_expires
-            }, 'id', user['id'])
-
-            # Send email via async helper
-            await send_confirmation_email(email, user.get('name', 'there'), confirmation_token)
-        return {"message": "If this email is registered, a confirmation link will be sent."}
-    except Exception as e:
-        logger.error(f"Resend confirmation error: {type(e).__name__}: {e}", exc_info=True)
-        logger.error(f"Resend config - API key set: {bool(resend.api_key)}, Sender: {SENDER_EMAIL}")
-        return {"message": "If this email is registered, a confirmation link will be sent."}
-
-
-@api_router.post("/auth/forgot-password")
-async def forgot_password(email: EmailStr, req: Request = None):
-    """Request password reset via Resend using direct REST API"""
-    if req:
-        check_auth_rate_limit(req)
-    try:
-        result = await db_rest_select('users', {'email': f'eq.{email}'})
-        if result:
-            user = result[0]
-            reset_token = secrets.token_urlsafe(32)
-            # Token expires in 1 hour
-            token_expires = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
-
-            # Store reset token in separate field (doesn't interfere with email confirmation)
-            await db_rest_update('users', {
-                "password_reset_token": reset_token,
-                "password_reset_expires_at": token_expires
-            }, 'id', user['id'])
-
-            # Send email via async helper
-            await send_password_reset_email(email, user.get('name', 'there'), reset_token)
-        return {"message": "If this email is registered, a password reset link will be sent."}
-    except Exception as e:
-        logger.warning(f"Password reset error: {e}")
-        return {"message": "If this email is registered, a password reset link will be sent."}
-
-
-class ResetPasswordRequest(BaseModel):
-    token: str = Field(max_length=256)
-    new_password: str = Field(max_length=128)
-
-
-@api_router.post("/auth/reset-password")
-async def reset_password(request: ResetPasswordRequest):
-    """Reset password using custom token with direct REST API"""
-    validate_password_strength(request.new_password)
-    try:
-        # Validate token format before using in query (should be URL-safe base64 from token_urlsafe)
-        if not re.match(r'^[A-Za-z0-9_\-]+$', request.token):
-            raise HTTPException(status_code=400, detail="Invalid or expired reset token")
-
-        # First check token existence and expiration
-        result = await db_rest_select('users', {'password_reset_token': f'eq.{request.token}'})
-        if not result:
-            raise HTTPException(status_code=400, detail="Invalid or expired reset token")
-
-        user = result[0]
-
-        # Check token expiration
-        token_expires = user.get('password_reset_expires_at')
-        if token_expires:
-            expires_dt = datetime.fromisoformat(token_expires.replace('Z', '+00:00'))
-            if datetime.now(timezone.utc) > expires_dt:
-                raise HTTPException(status_code=400, detail="Reset token has expired. Please request a new password reset.")
-
-        # Atomic update: set password AND clear token in one operation, keyed on token.
-        # If two concurrent requests race, only one will match the WHERE clause.
-        new_hash = hash_password(request.new_password)
-        _validate_table_name('users')
-        from urllib.parse import quote
-        atomic_url = f"{supabase_url}/rest/v1/users?password_reset_token=eq.{quote(request.token, safe='')}"
-        atomic_resp = await asyncio.to_thread(lambda: _rest_client.patch(atomic_url, json={
-            "password_hash": new_hash,
-            "password_reset_token": None,
-            "password_reset_expires_at": None
-        }))
-        atomic_resp.raise_for_status()
-        updated_rows = atomic_resp.json()
-        if not updated_rows:
-            # Token was already consumed by a concurrent request
-            raise HTTPException(status_code=400, detail="Invalid or expired reset token")
-
-        return {"message": "Password reset successfully. You can now log in."}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Password reset error: {e}")
-        raise HTTPException(status_code=400, detail="Password reset failed. Please try again.")
-
-
-
-@api_router.post("/auth/login", response_model=AuthResponse)
-async def login(request: LoginRequest, req: Request = None):
-    """
-    Login using custom auth with direct REST API to avoid HTTP/2 StreamReset issues.
-    """
-    if req:
-        check_auth_rate_limit(req)
-    # Use direct REST API (HTTP/1.1) instead of supabase-py client
-    result = await db_rest_select('users', {'email': f'eq.{request.email}'})
-    if not result:
-        if req:
-            record_auth_failure(req)
-        raise HTTPException(status_code=401, detail="Invalid email or password")
-
-    user = result[0]
-    if not verify_password(request.password, user["password_hash"]):
-        if req:
-            record_auth_failure(req)
-        raise HTTPException(status_code=401, detail="Invalid email or password")
-
-    # Transparent bcrypt migration: re-hash old SHA256 passwords on successful login
-    if _needs_password_rehash(user["password_hash"]):
-        try:
-            await db_rest_update('users', {"password_hash": hash_password(request.password)}, 'id', user['id'])
-            logger.info(f"Upgraded password hash to bcrypt for user {user['id'][:8]}***")
-        except Exception as e:
-            logger.warning(f"Could not upgrade password hash: {e}")
-
-    # Check if email is confirmed
-    if not user.get('email_confirmed', False):
-        raise HTTPException(
-            status_code=403,
-            detail="Please confirm your email before logging in. Check your inbox or request a new confirmation link."
-        )
-
-    # Successful login — reset failure counter
-    if req:
-        reset_auth_failures(req)
-
-    tenant_result = await db_rest_select('tenants', {'id': f'eq.{user["tenant_id"]}'})
-    tenant = tenant_result[0] if tenant_result else None
-
-    token = create_access_token(user["id"], user["tenant_id"], user["email"])
-    return AuthResponse(
-        token=token,
-        user={"id": user["id"], "email": user["email"], "name": user.get("name"), "tenant_id": user["tenant_id"], "business_name": tenant["name"] if tenant else None, "email_confirmed": user.get("email_confirmed", False)}
-    )
-
-
-@api_router.post("/auth/logout")
-async def logout(authorization: Optional[str] = Header(None)):
-    """Revoke the current JWT token by adding its jti to the blacklist."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header required")
-    try:
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            raise HTTPException(status_code=401, detail="Invalid authentication scheme")
-    except ValueError:
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        jti = payload.get("jti")
-        if jti:
-            exp_timestamp = payload.get("exp", 0)
-            _token_blacklist[jti] = exp_timestamp
-            # Persist to DB for cross-restart durability
-            expires_at = datetime.fromtimestamp(exp_timestamp, tz=timezone.utc).isoformat()
-            try:
-                supabase.table('token_blacklist').insert({"jti": jti, "expires_at": expires_at}).execute()
-                # Cleanup expired entries
-                supabase.table('token_blacklist').delete().lt('expires_at', now_iso()).execute()
-            except Exception as e:
-                logger.warning(f"Could not persist token blacklist: {e}")
-        return {"message": "Logged out successfully"}
-    except Exception:
-        return {"message": "Logged out successfully"}
-
-
-@api_router.get("/auth/me")
-async def get_me(current_user: Dict = Depends(get_current_user)):
-    result = await db_rest_select('users', {'id': f'eq.{current_user["user_id"]}'})
-    if not result:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    user = result[0]
-    tenant_result = await db_rest_select('tenants', {'id': f'eq.{user["tenant_id"]}'})
-    tenant = tenant_result[0] if tenant_result else None
-
-    return {"id": user["id"], "email": user["email"], "name": user.get("name"), "tenant_id": user["tenant_id"], "business_name": tenant["name"] if tenant else None, "email_confirmed": user.get("email_confirmed", False)}
-
-
 # ============ Telegram Service ============
 async def get_bot_info(bot_token: str) -> Optional[Dict]:
     try:
@@ -1684,9 +850,7 @@ async def delete_account(request: AccountDeleteRequest, current_user: Dict = Dep
         try:
             supabase.table('documents').delete().eq('tenant_id', tenant_id).execute()
             global document_embeddings_cache, _cache_loaded_tenants
-            keys_to_delete = [k for k in document_embeddings_cache if k.startswith(tenant_id)]
-            for k in keys_to_delete:
-                del document_embeddings_cache[k]
+            document_embeddings_cache.invalidate(lambda k: k.startswith(tenant_id))
             _cache_loaded_tenants.discard(tenant_id)
             logger.info(f"Deleted documents for tenant {tenant_id}")
         except Exception as e:
@@ -1752,8 +916,7 @@ async def delete_account(request: AccountDeleteRequest, current_user: Dict = Dep
             logger.warning(f"Could not delete tenant: {e}")
 
         # 13. Clear in-memory caches
-        if tenant_id in _bitrix_webhooks_cache:
-            del _bitrix_webhooks_cache[tenant_id]
+        invalidate_everywhere(_bitrix_webhooks_cache, tenant_id)
 
         logger.info(f"Successfully deleted account for user {user_id}, tenant {tenant_id}")
         return {"success": True, "message": "Account and all data deleted successfully"}
@@ -1810,9 +973,7 @@ async def delete_account_data(current_user: Dict = Depends(get_current_user)):
         try:
             supabase.table('documents').delete().eq('tenant_id', tenant_id).execute()
             global document_embeddings_cache, _cache_loaded_tenants
-            keys_to_delete = [k for k in document_embeddings_cache if k.startswith(tenant_id)]
-            for k in keys_to_delete:
-                del document_embeddings_cache[k]
+            document_embeddings_cache.invalidate(lambda k: k.startswith(tenant_id))
             _cache_loaded_tenants.discard(tenant_id)
         except Exception as e:
             logger.warning(f"Could not delete documents: {e}")
@@ -1860,6 +1021,7 @@ async def delete_account_data(current_user: Dict = Depends(get_current_user)):
                 "secondary_languages": None,
                 "min_response_delay": None,
                 "max_messages_per_minute": None,
+                "streaming_replies": False,
                 "vertical": None,
                 "prebuilt_type": None,
                 "google_sheet_id": None,
@@ -1882,6 +1044,7 @@ async def delete_account_data(current_user: Dict = Depends(get_current_user)):
                 "image_responses_enabled": False,
                 "hired_prebuilt": "[]",
             }).eq('tenant_id', tenant_id).execute()
+            invalidate_system_prompt_prefix(tenant_id)
         except Exception as e:
             logger.warning(f"Could not reset tenant config: {e}")
 
@@ -1895,8 +1058,7 @@ async def delete_account_data(current_user: Dict = Depends(get_current_user)):
             logger.warning(f"Could not disconnect telegram bot: {e}")
 
         # 11. Clear Bitrix cache
-        if tenant_id in _bitrix_webhooks_cache:
-            del _bitrix_webhooks_cache[tenant_id]
+        invalidate_everywhere(_bitrix_webhooks_cache, tenant_id)
 
         logger.info(f"Successfully deleted ALL data for tenant {tenant_id}")
         return {"success": True, "message": "All data deleted successfully. Your account is preserved."}
@@ -1964,7 +1126,7 @@ async def telegram_business_generate_code(current_user: Dict = Depends(get_curre
     tenant_id = current_user["tenant_id"]
     if not LEADRELAY_BOT_TOKEN:
         raise HTTPException(status_code=503, detail="Telegram Business integration is not configured")
-    code = generate_link_code(tenant_id)
+    code = await generate_link_code(tenant_id)
     return {"code": code, "expires_in": LINK_CODE_TTL, "bot_username": "TheLeadRelayBot"}
 
 
@@ -2097,18 +1259,25 @@ class GoogleSheetsConnect(BaseModel):
     sheet_url: str = Field(..., description="Google Sheets share link (Anyone with link can view)")
 
 
-# In-memory storage for Bitrix webhooks (fallback when DB columns don't exist)
-_bitrix_webhooks_cache = {}
+# In-memory storage for Bitrix webhooks (fallback when DB columns don't exist).
+# These per-tenant stores have no TTL (the DB may be their only other copy) —
+# they are bounded by entry count only.
+_bitrix_webhooks_cache = TTLCache("bitrix_webhooks", ttl=None, max_entries=20_000)
 
 # In-memory storage for payment credentials (fallback when DB columns don't exist)
 # NOTE: secret_key values are stored encrypted via encrypt_value() to avoid plaintext in memory
-_payme_credentials_cache = {}
-_click_credentials_cache = {}
-_google_sheets_cache = {}
+_payme_credentials_cache = TTLCache("payme_credentials", ttl=None, max_entries=20_000)
+_click_credentials_cache = TTLCache("click_credentials", ttl=None, max_entries=20_000)
+_google_sheets_cache = TTLCache("google_sheets_connections", ttl=None, max_entries=20_000)
 
-# Product catalog cache for CRM pricing queries {tenant_id: {"products": [...], "cached_at": timestamp}}
-_product_catalog_cache = {}
+# Product catalog cache for CRM pricing queries {tenant_id: [products]}; the
+# last catalog is still served for PRODUCT_STALE_TTL if Bitrix is unreachable
 PRODUCT_CACHE_TTL = 1800  # 30 minutes
+PRODUCT_STALE_TTL = 6 * 3600
+_product_catalog_cache = TTLCache(
+    "product_catalog", ttl=PRODUCT_CACHE_TTL, max_entries=5_000,
+    max_bytes=128 * 1024 * 1024, stale_ttl=PRODUCT_STALE_TTL,
+)
 
 # CRM realtime query timeout
 BITRIX_REALTIME_TIMEOUT = 5.0
@@ -2116,51 +1285,42 @@ BITRIX_REALTIME_TIMEOUT = 5.0
 # VIP customer threshold in UZS
 VIP_THRESHOLD_UZS = 10_000_000
 
-# Google Sheets data cache for product/pricing queries {tenant_id: {"headers": [...], "rows": [...], "cached_at": timestamp}}
-_google_sheets_data_cache = {}
+# Google Sheets data cache for product/pricing queries {tenant_id: {"headers": [...], "rows": [...]}}
 GOOGLE_SHEETS_DATA_CACHE_TTL = 600  # 10 minutes
+_google_sheets_data_cache = TTLCache(
+    "google_sheets_data", ttl=GOOGLE_SHEETS_DATA_CACHE_TTL, max_entries=5_000,
+    max_bytes=128 * 1024 * 1024, stale_ttl=6 * 3600,
+)
 GOOGLE_SHEETS_FETCH_TIMEOUT = 10.0  # 10 second timeout
 
-# Instagram webhook message dedup cache {message_id: timestamp}
-_instagram_dedup_cache = {}
+# Webhook dedup windows; markers live in shared state so a re-delivery to
+# another worker is still recognised
 INSTAGRAM_DEDUP_TTL = 300  # 5 minutes
-
-# Telegram webhook dedup cache {update_id: timestamp}
-_telegram_dedup_cache = {}
 TELEGRAM_DEDUP_TTL = 300  # 5 minutes
 
-# Telegram Business link codes {code: {"tenant_id": str, "created_at": float}}
-_telegram_link_codes = {}
+
+async def is_first_delivery(channel: str, event_id, ttl: float) -> bool:
+    """True the first time any worker sees this webhook event id within ttl."""
+    return await get_shared_state().set_if_absent(f"dedup:{channel}:{event_id}", ttl=ttl)
+
+
+# Telegram Business link codes, shared state key link_code:{code} -> {"tenant_id": str, "created_at": float}
 LINK_CODE_TTL = 600  # 10 minutes
 
 
-def generate_link_code(tenant_id: str) -> str:
+async def generate_link_code(tenant_id: str) -> str:
     """Generate a unique 6-char link code for tenant-to-Telegram mapping."""
-    now = time.time()
-    # Clean expired codes
-    expired = [k for k, v in _telegram_link_codes.items() if now - v["created_at"] > LINK_CODE_TTL]
-    for k in expired:
-        del _telegram_link_codes[k]
-    # Generate unique code
+    entry = json.dumps({"tenant_id": tenant_id, "created_at": time.time()})
     while True:
         code = secrets.token_urlsafe(6)[:6].upper()
-        if code not in _telegram_link_codes:
-            break
-    _telegram_link_codes[code] = {"tenant_id": tenant_id, "created_at": now}
-    return code
+        if await get_shared_state().set_if_absent(f"link_code:{code}", entry, ttl=LINK_CODE_TTL):
+            return code
 
 
-def verify_link_code(code: str) -> Optional[Dict]:
-    """Verify and consume a link code. Returns {"tenant_id": ...} or None."""
-    entry = _telegram_link_codes.get(code)
-    if not entry:
-        return None
-    if time.time() - entry["created_at"] > LINK_CODE_TTL:
-        del _telegram_link_codes[code]
-        return None
-    # Consume the code (one-time use)
-    del _telegram_link_codes[code]
-    return entry
+async def verify_link_code(code: str) -> Optional[Dict]:
+    """Verify and consume a link code (one-time use). Returns {"tenant_id": ...} or None."""
+    entry = await get_shared_state().pop(f"link_code:{code}")
+    return json.loads(entry) if entry else None
 
 
 async def fetch_google_sheet_csv(sheet_id: str) -> Optional[Dict]:
@@ -2229,62 +1389,41 @@ async def get_cached_sheets_data(tenant_id: str) -> Optional[Dict]:
     Get Google Sheets data with 10-min caching.
     Returns {"headers": [...], "rows": [...]} or None if not connected.
     """
-    import time
-
-    now = time.time()
-
-    # Check data cache
-    if tenant_id in _google_sheets_data_cache:
-        cache_entry = _google_sheets_data_cache[tenant_id]
-        if now - cache_entry.get("cached_at", 0) < GOOGLE_SHEETS_DATA_CACHE_TTL:
-            logger.debug(f"Google Sheets data cache hit for tenant {tenant_id}")
-            return {"headers": cache_entry.get("headers", []), "rows": cache_entry.get("rows", [])}
-
-    # Get sheet_id from connection cache or database
-    sheet_id = None
-
-    # Check memory cache first
-    if tenant_id in _google_sheets_cache:
-        sheet_id = _google_sheets_cache[tenant_id].get('sheet_id')
 
-    # Try database if not in memory
-    if not sheet_id:
-        try:
-            result = supabase.table('tenant_configs').select('google_sheet_id').eq('tenant_id', tenant_id).execute()
-            if result.data and result.data[0].get('google_sheet_id'):
-                sheet_id = result.data[0]['google_sheet_id']
-                # Populate connection cache from DB
-                _google_sheets_cache[tenant_id] = {
-                    'sheet_id': sheet_id,
-                    'sheet_url': result.data[0].get('google_sheet_url', ''),
-                    'connected_at': result.data[0].get('google_sheet_connected_at', '')
-                }
-        except Exception as e:
-            logger.debug(f"Could not check Google Sheets from database: {e}")
+    async def _load() -> Optional[Dict]:
+        # Get sheet_id from connection cache or database
+        sheet_id = (_google_sheets_cache.get(tenant_id) or {}).get('sheet_id')
 
-    if not sheet_id:
-        return None  # Not connected
+        # Try database if not in memory
+        if not sheet_id:
+            try:
+                result = supabase.table('tenant_configs').select('google_sheet_id').eq('tenant_id', tenant_id).execute()
+                if result.data and result.data[0].get('google_sheet_id'):
+                    sheet_id = result.data[0]['google_sheet_id']
+                    # Populate connection cache from DB
+                    _google_sheets_cache[tenant_id] = {
+                        'sheet_id': sheet_id,
+                        'sheet_url': result.data[0].get('google_sheet_url', ''),
+                        'connected_at': result.data[0].get('google_sheet_connected_at', '')
+                    }
+            except Exception as e:
+                logger.debug(f"Could not check Google Sheets from database: {e}")
 
-    # Fetch fresh data
-    data = await fetch_google_sheet_csv(sheet_id)
+        if not sheet_id:
+            return None  # Not connected (not cached)
 
-    if data:
-        # Cache the result
-        _google_sheets_data_cache[tenant_id] = {
-            "headers": data["headers"],
-            "rows": data["rows"],
-            "cached_at": now
-        }
+        data = await fetch_google_sheet_csv(sheet_id)
+        if not data:
+            # Lets the cache fall back to the stale copy (graceful degradation)
+            raise RuntimeError("Google Sheet fetch failed")
         logger.info(f"Cached {len(data['rows'])} Google Sheets rows for tenant {tenant_id}")
-        return data
+        return {"headers": data["headers"], "rows": data["rows"]}
 
-    # On error, return stale cache if available (graceful degradation)
-    if tenant_id in _google_sheets_data_cache:
-        logger.info(f"Returning stale Google Sheets cache for tenant {tenant_id}")
-        cache_entry = _google_sheets_data_cache[tenant_id]
-        return {"headers": cache_entry.get("headers", []), "rows": cache_entry.get("rows", [])}
-
-    return None
+    try:
+        return await _google_sheets_data_cache.get_or_load(tenant_id, _load)
+    except Exception as e:
+        logger.debug(f"Google Sheets data unavailable for tenant {tenant_id}: {e}")
+        return None
 
 
 def format_sheets_for_prompt(sheets_data: Dict, max_rows: int = 30) -> str:
@@ -2324,45 +1463,31 @@ async def get_cached_products(tenant_id: str) -> List[Dict]:
     """
     Get product catalog with 30-min caching.
     Returns list of products with pricing info from Bitrix CRM.
+    On a Bitrix error the last cached catalog is served (PRODUCT_STALE_TTL).
     """
-    import time
-
-    now = time.time()
 
-    # Check cache
-    if tenant_id in _product_catalog_cache:
-        cache_entry = _product_catalog_cache[tenant_id]
-        if now - cache_entry.get("cached_at", 0) < PRODUCT_CACHE_TTL:
-            logger.debug(f"Product catalog cache hit for tenant {tenant_id}")
-            return cache_entry.get("products", [])
-
-    # Fetch from Bitrix with timeout
-    try:
+    async def _load() -> Optional[List[Dict]]:
         bitrix_client = await get_bitrix_client(tenant_id)
         if not bitrix_client:
-            return []
-
+            return None
         products = await asyncio.wait_for(
             bitrix_client.list_products(limit=100),
             timeout=BITRIX_REALTIME_TIMEOUT
         )
-
-        # Cache the result
-        _product_catalog_cache[tenant_id] = {
-            "products": products,
-            "cached_at": now
-        }
         logger.info(f"Cached {len(products)} products for tenant {tenant_id}")
         return products
 
+    try:
+        return await _product_catalog_cache.get_or_load(tenant_id, _load) or []
     except asyncio.TimeoutError:
         logger.warning(f"Product catalog fetch timed out for tenant {tenant_id}")
-        return _product_catalog_cache.get(tenant_id, {}).get("products", [])
+        return []
     except Exception as e:
         logger.warning(f"Could not fetch product catalog: {e}")
-        return _product_catalog_cache.get(tenant_id, {}).get("products", [])
+        return []
 
 
+@traced("crm_match")
 async def match_customer_to_bitrix(tenant_id: str, customer_data: Dict) -> Optional[Dict]:
     """
     Match customer phone to Bitrix contact/lead and return CRM context.
@@ -2460,6 +1585,7 @@ async def match_customer_to_bitrix(tenant_id: str, customer_data: Dict) -> Optio
         return None
 
 
+@traced("crm_query")
 async def get_crm_context_for_query(tenant_id: str, user_message: str, customer_phone: str = None) -> Optional[str]:
     """
     Detect keywords and pre-fetch relevant CRM data for the query.
@@ -2691,43 +1817,6 @@ async def test_bitrix_webhook(current_user: Dict = Depends(get_current_user)):
     return await client.test_connection()
 
 
-async def _cleanup_crm_data(tenant_id: str, crm_source: str = None):
-    """Delete all CRM synced data and dashboard config for a tenant.
-    If crm_source is provided, only delete data for that CRM type."""
-    # Tables that have crm_source column — can be filtered per-CRM
-    crm_tables = [
-        'crm_leads', 'crm_deals', 'crm_contacts', 'crm_companies', 'crm_activities',
-        'crm_sync_status', 'crm_users', 'crm_field_registry',
-        # Revenue / metric tables (Phase 2)
-        'tenant_metrics', 'tenant_alert_rules',
-        'revenue_models', 'revenue_snapshots', 'revenue_alerts',
-    ]
-    # Tables keyed only by tenant_id (no crm_source) — always fully cleaned
-    tenant_only_tables = [
-        'dashboard_widgets', 'dashboard_chat_messages', 'dashboard_configs',
-        'agent_traces', 'data_access_logs', 'crm_analytics_context',
-    ]
-
-    for table in crm_tables:
-        try:
-            q = supabase.table(table).delete().eq('tenant_id', tenant_id)
-            if crm_source:
-                q = q.eq('crm_source', crm_source)
-            q.execute()
-        except Exception as e:
-            logger.warning(f"Could not clean {table} for tenant {tenant_id}: {e}")
-
-    # Only clean tenant-only tables on full wipe (no crm_source filter)
-    if not crm_source:
-        for table in tenant_only_tables:
-            try:
-                supabase.table(table).delete().eq('tenant_id', tenant_id).execute()
-            except Exception as e:
-                logger.warning(f"Could not clean {table} for tenant {tenant_id}: {e}")
-
-    logger.info(f"CRM data cleanup complete for tenant {tenant_id} (crm_source={crm_source})")
-
-
 async def _cleanup_media_storage(tenant_id: str):
     """Delete all media files from Supabase Storage and the media_library table for a tenant."""
     try:
@@ -2761,8 +1850,7 @@ async def disconnect_bitrix_webhook(current_user: Dict = Depends(get_current_use
     await stop_all_syncs(tenant_id, crm_type='bitrix24')
 
     # Clear from memory cache
-    if tenant_id in _bitrix_webhooks_cache:
-        del _bitrix_webhooks_cache[tenant_id]
+    if invalidate_everywhere(_bitrix_webhooks_cache, tenant_id) is not None:
         logger.info(f"Cleared Bitrix cache for tenant {tenant_id}")
 
     # Soft-delete in crm_connections (primary)
@@ -3056,9 +2144,11 @@ Language: Respond in the same language the user uses (English, Russian, or Uzbek
 
             messages.append({"role": "user", "content": request.message})
 
-            response = await openai_client.chat.completions.create(
+            response = await get_gateway().chat_completion(
                 model="gpt-4o-mini",
                 messages=messages,
+                tenant_id=tenant_id,
+                purpose="crm_chat",
                 temperature=0.3,
                 max_tokens=1500
             )
@@ -3186,9 +2276,11 @@ Language: Respond in the same language the user uses (English, Russian, or Uzbek
         messages.append({"role": "user", "content": request.message})
         
         # Call OpenAI
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o",
             messages=messages,
+            tenant_id=tenant_id,
+            purpose="crm_chat",
             temperature=0.3,
             max_tokens=1500
         )
@@ -3197,7 +2289,7 @@ Language: Respond in the same language the user uses (English, Russian, or Uzbek
         if hasattr(response, 'usage') and response.usage:
             log_token_usage_fire_and_forget(
                 tenant_id=tenant_id,
-                model="gpt-4o",
+                model=served_model(response, "gpt-4o"),
                 request_type="crm_chat",
                 input_tokens=response.usage.prompt_tokens,
                 output_tokens=response.usage.completion_tokens,
@@ -3336,429 +2428,38 @@ def _clean_chart_blocks(reply: str) -> str:
     return clean_reply
 
 
-# ============ HubSpot CRM Endpoints ============
-
-@api_router.get("/hubspot/auth-url")
-async def hubspot_auth_url(current_user: Dict = Depends(get_current_user)):
-    """Generate HubSpot OAuth authorization URL."""
-    if not HUBSPOT_CLIENT_ID:
-        raise HTTPException(status_code=500, detail="HubSpot integration not configured")
-    tenant_id = current_user["tenant_id"]
-    state = jwt.encode({"tenant_id": tenant_id, "purpose": "hubspot_oauth", "exp": datetime.now(timezone.utc) + timedelta(minutes=10)}, JWT_SECRET, algorithm="HS256")
-    backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
-    redirect_uri = f"{backend_url}/api/hubspot/callback"
-    url = HubSpotCRM.get_auth_url(redirect_uri, state)
-    return {"auth_url": url}
-
-
-@api_router.get("/hubspot/callback")
-async def hubspot_callback(code: str = None, state: str = None, error: str = None):
-    """OAuth callback from HubSpot. Exchange code for tokens."""
-    redirect_base = f"{FRONTEND_URL.rstrip('/')}/app/connections/hubspot"
-
-    if error:
-        return RedirectResponse(url=f"{redirect_base}?error={error}")
-    if not code or not state:
-        return RedirectResponse(url=f"{redirect_base}?error=missing_params")
-    try:
-        payload = jwt.decode(state, JWT_SECRET, algorithms=["HS256"])
-        if payload.get("purpose") != "hubspot_oauth":
-            return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
-        tenant_id = payload["tenant_id"]
-    except jwt.ExpiredSignatureError:
-        return RedirectResponse(url=f"{redirect_base}?error=expired")
-    except jwt.InvalidTokenError:
-        return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
-
-    try:
-        backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
-        redirect_uri = f"{backend_url}/api/hubspot/callback"
-        tokens = await HubSpotCRM.exchange_code(code, redirect_uri)
-
-        token_expires_at = (datetime.now(timezone.utc) + timedelta(seconds=tokens["expires_in"])).isoformat()
-        await crm_manager.store_connection(
-            tenant_id=tenant_id,
-            crm_type='hubspot',
-            credentials={
-                'access_token': tokens['access_token'],
-                'refresh_token': tokens['refresh_token'],
-                'token_expires_at': token_expires_at,
-            },
-        )
-        logger.info(f"HubSpot connected for tenant {tenant_id}")
-        # Auto-trigger full sync after successful connection
-        asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, 'hubspot'))
-        return RedirectResponse(url=f"{redirect_base}?success=true")
-    except Exception as e:
-        logger.exception(f"HubSpot OAuth callback error for tenant {tenant_id}: {e}")
-        return RedirectResponse(url=f"{redirect_base}?error=exchange_failed")
+# ============ Dashboard Agent Endpoints (Phase 2: Data Team) ============
 
+def _apply_refinement_to_widgets(widgets: list, answers: dict, default_time_range: int) -> list:
+    """Adjust widgets based on user refinement answers."""
+    time_horizon = answers.get("time_horizon")
+    if time_horizon:
+        effective_days = {"30d": 30, "90d": 90, "365d": 365}.get(time_horizon, default_time_range)
+    else:
+        effective_days = default_time_range
 
-@api_router.get("/hubspot/status")
-async def hubspot_status(current_user: Dict = Depends(get_current_user)):
-    """Check HubSpot connection status."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'hubspot')
-    if conn:
-        return {"connected": True, "connected_at": conn.get("connected_at")}
-    return {"connected": False}
+    for w in widgets:
+        # Apply time range to widgets that don't have an explicit override
+        if w.get("time_range_days") is None and w.get("chart_type") != "funnel":
+            w["time_range_days"] = effective_days
 
+    return widgets
 
-@api_router.post("/hubspot/test")
-async def hubspot_test(current_user: Dict = Depends(get_current_user)):
-    """Test HubSpot connection."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'hubspot')
-    if not conn:
-        raise HTTPException(status_code=404, detail="HubSpot not connected")
-    creds = conn.get("credentials", {})
-    access_token = decrypt_value(creds.get("access_token", ""))
-    client = HubSpotCRM(access_token=access_token)
-    return await client.test_connection()
 
+# ── Onboarding ──
 
-@api_router.post("/hubspot/disconnect")
-async def hubspot_disconnect(current_user: Dict = Depends(get_current_user)):
-    """Disconnect HubSpot CRM."""
-    tenant_id = current_user["tenant_id"]
-    await stop_all_syncs(tenant_id, crm_type='hubspot')
-    await crm_manager.remove_connection(tenant_id, 'hubspot')
-    await _cleanup_crm_data(tenant_id, 'hubspot')
-    return {"success": True, "message": "HubSpot disconnected"}
-
-
-@api_router.get("/hubspot/pipelines")
-async def hubspot_pipelines(current_user: Dict = Depends(get_current_user)):
-    """Get HubSpot deal pipelines."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'hubspot')
-    if not conn:
-        raise HTTPException(status_code=400, detail="HubSpot not connected")
-    creds = conn.get("credentials", {})
-    access_token = decrypt_value(creds.get("access_token", ""))
-    client = HubSpotCRM(access_token=access_token)
-    return {"pipelines": await client.get_pipelines()}
-
-
-# ============ Zoho CRM Endpoints ============
-
-@api_router.get("/zoho/auth-url")
-async def zoho_auth_url(datacenter: str = "us", current_user: Dict = Depends(get_current_user)):
-    """Generate Zoho OAuth authorization URL."""
-    if not ZOHO_CLIENT_ID:
-        raise HTTPException(status_code=500, detail="Zoho integration not configured")
+@api_router.post("/dashboard/onboarding/start")
+async def dashboard_onboarding_start(current_user: Dict = Depends(get_current_user)):
+    """
+    Start Revenue Analyst onboarding: build revenue model proposal + metric catalog trust.
+    Returns available revenue goals to choose from.
+    """
     tenant_id = current_user["tenant_id"]
-    state = jwt.encode(
-        {"tenant_id": tenant_id, "datacenter": datacenter, "purpose": "zoho_oauth", "exp": datetime.now(timezone.utc) + timedelta(minutes=10)},
-        JWT_SECRET, algorithm="HS256",
-    )
-    backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
-    redirect_uri = f"{backend_url}/api/zoho/callback"
-    url = ZohoCRM.get_auth_url(redirect_uri, state, datacenter)
-    return {"auth_url": url}
-
-
-@api_router.get("/zoho/callback")
-async def zoho_callback(code: str = None, state: str = None, error: str = None):
-    """OAuth callback from Zoho. Exchange code for tokens."""
-    redirect_base = f"{FRONTEND_URL.rstrip('/')}/app/connections/zoho"
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        raise HTTPException(status_code=400, detail="No active CRM connection found. Please connect your CRM first.")
 
-    if error:
-        return RedirectResponse(url=f"{redirect_base}?error={error}")
-    if not code or not state:
-        return RedirectResponse(url=f"{redirect_base}?error=missing_params")
-    try:
-        payload = jwt.decode(state, JWT_SECRET, algorithms=["HS256"])
-        if payload.get("purpose") != "zoho_oauth":
-            return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
-        tenant_id = payload["tenant_id"]
-        datacenter = payload.get("datacenter", "us")
-    except jwt.ExpiredSignatureError:
-        return RedirectResponse(url=f"{redirect_base}?error=expired")
-    except jwt.InvalidTokenError:
-        return RedirectResponse(url=f"{redirect_base}?error=invalid_state")
-
-    try:
-        backend_url = os.environ.get("BACKEND_URL", "").rstrip("/")
-        redirect_uri = f"{backend_url}/api/zoho/callback"
-        tokens = await ZohoCRM.exchange_code(code, redirect_uri, datacenter)
-
-        token_expires_at = (datetime.now(timezone.utc) + timedelta(seconds=tokens["expires_in"])).isoformat()
-        await crm_manager.store_connection(
-            tenant_id=tenant_id,
-            crm_type='zoho',
-            credentials={
-                'access_token': tokens['access_token'],
-                'refresh_token': tokens['refresh_token'],
-                'token_expires_at': token_expires_at,
-                'api_domain': tokens.get('api_domain', ''),
-            },
-            config={'datacenter': datacenter},
-        )
-        logger.info(f"Zoho connected for tenant {tenant_id} (datacenter: {datacenter})")
-        # Auto-trigger full sync after successful connection
-        asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, 'zoho'))
-        return RedirectResponse(url=f"{redirect_base}?success=true")
-    except Exception as e:
-        logger.exception(f"Zoho OAuth callback error for tenant {tenant_id}: {e}")
-        return RedirectResponse(url=f"{redirect_base}?error=exchange_failed")
-
-
-@api_router.get("/zoho/status")
-async def zoho_status(current_user: Dict = Depends(get_current_user)):
-    """Check Zoho connection status."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'zoho')
-    if conn:
-        return {"connected": True, "connected_at": conn.get("connected_at"), "datacenter": (conn.get("config") or {}).get("datacenter", "us")}
-    return {"connected": False}
-
-
-@api_router.post("/zoho/test")
-async def zoho_test(current_user: Dict = Depends(get_current_user)):
-    """Test Zoho connection."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'zoho')
-    if not conn:
-        raise HTTPException(status_code=404, detail="Zoho not connected")
-    creds = conn.get("credentials", {})
-    config = conn.get("config", {})
-    client = ZohoCRM(
-        access_token=decrypt_value(creds.get("access_token", "")),
-        refresh_token=decrypt_value(creds.get("refresh_token", "")),
-        datacenter=config.get("datacenter", "us"),
-        api_domain=creds.get("api_domain"),
-    )
-    return await client.test_connection()
-
-
-@api_router.post("/zoho/disconnect")
-async def zoho_disconnect(current_user: Dict = Depends(get_current_user)):
-    """Disconnect Zoho CRM."""
-    tenant_id = current_user["tenant_id"]
-    await stop_all_syncs(tenant_id, crm_type='zoho')
-    await crm_manager.remove_connection(tenant_id, 'zoho')
-    await _cleanup_crm_data(tenant_id, 'zoho')
-    return {"success": True, "message": "Zoho disconnected"}
-
-
-@api_router.get("/zoho/pipelines")
-async def zoho_pipelines(current_user: Dict = Depends(get_current_user)):
-    """Get Zoho deal pipeline stages."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'zoho')
-    if not conn:
-        raise HTTPException(status_code=400, detail="Zoho not connected")
-    creds = conn.get("credentials", {})
-    config = conn.get("config", {})
-    client = ZohoCRM(
-        access_token=decrypt_value(creds.get("access_token", "")),
-        refresh_token=decrypt_value(creds.get("refresh_token", "")),
-        datacenter=config.get("datacenter", "us"),
-        api_domain=creds.get("api_domain"),
-    )
-    return {"pipelines": await client.get_pipelines()}
-
-
-# ============ Freshsales CRM Endpoints ============
-
-class FreshsalesConnectRequest(BaseModel):
-    domain: str = Field(..., description="Freshsales subdomain (e.g., 'mycompany')")
-    api_key: str = Field(..., description="API key from Freshsales Settings")
-
-
-@api_router.post("/freshsales/connect")
-async def freshsales_connect(request: FreshsalesConnectRequest, current_user: Dict = Depends(get_current_user)):
-    """Connect Freshsales CRM via API key."""
-    tenant_id = current_user["tenant_id"]
-
-    # Validate credentials by testing connection
-    client = FreshsalesCRM(domain=request.domain, api_key=request.api_key)
-    test_result = await client.test_connection()
-    if not test_result.get("ok"):
-        raise HTTPException(status_code=400, detail=f"Connection failed: {test_result.get('message')}")
-
-    await crm_manager.store_connection(
-        tenant_id=tenant_id,
-        crm_type='freshsales',
-        credentials={'api_key': request.api_key, 'domain': request.domain},
-    )
-    logger.info(f"Freshsales connected for tenant {tenant_id} (domain: {request.domain})")
-    # Auto-trigger full sync after successful connection
-    asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, 'freshsales'))
-    return {"success": True, "message": "Freshsales connected successfully!"}
-
-
-@api_router.get("/freshsales/status")
-async def freshsales_status(current_user: Dict = Depends(get_current_user)):
-    """Check Freshsales connection status."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'freshsales')
-    if conn:
-        domain = (conn.get("credentials") or {}).get("domain", "")
-        return {"connected": True, "connected_at": conn.get("connected_at"), "domain": domain}
-    return {"connected": False}
-
-
-@api_router.post("/freshsales/test")
-async def freshsales_test(current_user: Dict = Depends(get_current_user)):
-    """Test Freshsales connection."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'freshsales')
-    if not conn:
-        raise HTTPException(status_code=404, detail="Freshsales not connected")
-    creds = conn.get("credentials", {})
-    client = FreshsalesCRM(domain=creds.get("domain", ""), api_key=decrypt_value(creds.get("api_key", "")))
-    return await client.test_connection()
-
-
-@api_router.post("/freshsales/disconnect")
-async def freshsales_disconnect(current_user: Dict = Depends(get_current_user)):
-    """Disconnect Freshsales CRM."""
-    tenant_id = current_user["tenant_id"]
-    await stop_all_syncs(tenant_id, crm_type='freshsales')
-    await crm_manager.remove_connection(tenant_id, 'freshsales')
-    await _cleanup_crm_data(tenant_id, 'freshsales')
-    return {"success": True, "message": "Freshsales disconnected"}
-
-
-@api_router.get("/freshsales/pipelines")
-async def freshsales_pipelines(current_user: Dict = Depends(get_current_user)):
-    """Get Freshsales deal pipelines."""
-    conn = await crm_manager.get_connection(current_user["tenant_id"], 'freshsales')
-    if not conn:
-        raise HTTPException(status_code=400, detail="Freshsales not connected")
-    creds = conn.get("credentials", {})
-    client = FreshsalesCRM(domain=creds.get("domain", ""), api_key=decrypt_value(creds.get("api_key", "")))
-    return {"pipelines": await client.get_pipelines()}
-
-
-# ============ CRM Data Sync Endpoints (Karim) ============
-
-@api_router.post("/crm/sync/start")
-async def crm_sync_start(current_user: Dict = Depends(get_current_user)):
-    """Queue a full sync for all active CRM connections."""
-    tenant_id = current_user["tenant_id"]
-
-    connections = await crm_manager.get_active_connections(tenant_id)
-    if not connections:
-        raise HTTPException(status_code=400, detail="No active CRM connections")
-
-    started = []
-    for conn in connections:
-        crm_type = conn["crm_type"]
-        asyncio.create_task(trigger_full_sync_background(supabase, tenant_id, crm_type))
-        started.append(crm_type)
-
-    return {"success": True, "syncing": started, "message": f"Full sync started for: {', '.join(started)}"}
-
-
-@api_router.get("/crm/sync/status")
-async def crm_sync_status(current_user: Dict = Depends(get_current_user)):
-    """Get sync progress per entity for all CRM connections."""
-    tenant_id = current_user["tenant_id"]
-
-    try:
-        result = supabase.table("crm_sync_status").select("*").eq(
-            "tenant_id", tenant_id
-        ).execute()
-
-        statuses = result.data or []
-        return {"statuses": statuses}
-    except Exception as e:
-        logger.error(f"Failed to get sync status: {e}")
-        return {"statuses": []}
-
-
-@api_router.post("/crm/sync/stop")
-async def crm_sync_stop(current_user: Dict = Depends(get_current_user)):
-    """Cancel all active syncs for a tenant (full + incremental)."""
-    tenant_id = current_user["tenant_id"]
-    cancelled = await stop_all_syncs(tenant_id)
-    return {"success": True, "cancelled": cancelled}
-
-
-@api_router.get("/crm/sync/active")
-async def crm_sync_is_active(current_user: Dict = Depends(get_current_user)):
-    """Check if any sync is currently running for this tenant."""
-    tenant_id = current_user["tenant_id"]
-    return {"active": is_sync_active(tenant_id)}
-
-
-@api_router.post("/crm/sync/refresh")
-async def crm_sync_refresh(current_user: Dict = Depends(get_current_user)):
-    """Force an immediate incremental sync for all active CRM connections."""
-    tenant_id = current_user["tenant_id"]
-
-    connections = await crm_manager.get_active_connections(tenant_id)
-    if not connections:
-        raise HTTPException(status_code=400, detail="No active CRM connections")
-
-    from sync_engine import SyncEngine, _decrypt_credentials
-    from crm_adapters import create_adapter
-
-    results = {}
-    for conn in connections:
-        crm_type = conn["crm_type"]
-        try:
-            credentials = _decrypt_credentials(conn.get("credentials", {}))
-            config = conn.get("config", {})
-            adapter = create_adapter(crm_type, credentials, config)
-            engine = SyncEngine(supabase, tenant_id, adapter, crm_type)
-            sync_result = await engine.incremental_sync()
-            results[crm_type] = sync_result
-        except Exception as e:
-            logger.error(f"Refresh sync failed for {crm_type}: {e}")
-            results[crm_type] = {"status": "error", "error": str(e)}
-
-    return {"success": True, "results": results}
-
-
-# ============ Dashboard Agent Endpoints (Phase 2: Data Team) ============
-
-async def _get_tenant_crm_source(supabase, tenant_id: str) -> Optional[str]:
-    """Get the primary CRM source for a tenant from active connections."""
-    try:
-        result = (
-            supabase.table("crm_connections")
-            .select("crm_type")
-            .eq("tenant_id", tenant_id)
-            .eq("is_active", True)
-            .limit(1)
-            .execute()
-        )
-        if result.data:
-            return result.data[0]["crm_type"]
-    except Exception as e:
-        logger.warning(f"Failed to get CRM source for tenant {tenant_id}: {e}")
-    return None
-
-
-
-
-
-def _apply_refinement_to_widgets(widgets: list, answers: dict, default_time_range: int) -> list:
-    """Adjust widgets based on user refinement answers."""
-    time_horizon = answers.get("time_horizon")
-    if time_horizon:
-        effective_days = {"30d": 30, "90d": 90, "365d": 365}.get(time_horizon, default_time_range)
-    else:
-        effective_days = default_time_range
-
-    for w in widgets:
-        # Apply time range to widgets that don't have an explicit override
-        if w.get("time_range_days") is None and w.get("chart_type") != "funnel":
-            w["time_range_days"] = effective_days
-
-    return widgets
-
-
-# ── Onboarding ──
-
-@api_router.post("/dashboard/onboarding/start")
-async def dashboard_onboarding_start(current_user: Dict = Depends(get_current_user)):
-    """
-    Start Revenue Analyst onboarding: build revenue model proposal + metric catalog trust.
-    Returns available revenue goals to choose from.
-    """
-    tenant_id = current_user["tenant_id"]
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(status_code=400, detail="No active CRM connection found. Please connect your CRM first.")
-
-    # Check sync status — deals MUST be synced (revenue model requires them)
+    # Check sync status — deals MUST be synced (revenue model requires them)
     try:
         import asyncio as _aio
         sync_status = await _aio.to_thread(
@@ -4770,7 +3471,7 @@ async def dashboard_drilldown(request: Request, current_user: Dict = Depends(get
     try:
         # Build base query
         select_cols = ",".join(columns)
-        query = supabase.table(data_source).select(select_cols, count="exact").eq("tenant_id", tenant_id).eq("crm_source", crm_source)
+        query = supabase.table(data_source).select(select_cols, count=CountMode.ESTIMATED.postgrest).eq("tenant_id", tenant_id).eq("crm_source", crm_source)
 
         # Filter by clicked label
         if clicked_label and x_field:
@@ -5193,25 +3894,16 @@ async def get_shared_dashboard(token: str):
 
 # ── Chat ──
 
-@api_router.post("/dashboard/chat")
-async def dashboard_chat(
-    request: DashboardChatRequest,
-    current_user: Dict = Depends(get_current_user),
-):
-    """
-    Send a message to the Data Team chat agent (Bobur → router → agents).
-    """
-    tenant_id = current_user["tenant_id"]
-    check_llm_rate_limit(tenant_id)
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        return {
-            "reply": "No CRM connected. Please connect your CRM and sync data first.",
-            "charts": [],
-            "response_type": "error",
-            "agent_used": None,
-        }
+_NO_CRM_CHAT_REPLY = {
+    "reply": "No CRM connected. Please connect your CRM and sync data first.",
+    "charts": [],
+    "response_type": "error",
+    "agent_used": None,
+}
+
 
+async def _load_dashboard_chat_context(tenant_id: str) -> Tuple[Optional[CRMProfile], Optional[dict]]:
+    """CRM profile and the latest assistant conversation_state for the chat agent."""
     # Load CRM profile if available
     crm_profile = None
     try:
@@ -5244,23 +3936,19 @@ async def dashboard_chat(
     except Exception:
         pass
 
-    # Route + execute via Bobur
-    result = await dashboard_chat_handler(
-        supabase, tenant_id, crm_source,
-        request.message, request.conversation_history, crm_profile,
-        conversation_state=conversation_state,
-    )
+    return crm_profile, conversation_state
 
-    # Persist to dashboard_chat_messages
+
+def _persist_dashboard_chat(tenant_id: str, message: str, result: dict) -> None:
+    """Save the user message and assistant response to dashboard_chat_messages."""
     try:
-        # Save user message
+        # Separate inserts keep created_at ordered (user before assistant)
         supabase.table("dashboard_chat_messages").insert({
             "tenant_id": tenant_id,
             "role": "user",
-            "content": request.message,
+            "content": message,
         }).execute()
 
-        # Save assistant response
         supabase.table("dashboard_chat_messages").insert({
             "tenant_id": tenant_id,
             "role": "assistant",
@@ -5272,9 +3960,103 @@ async def dashboard_chat(
     except Exception as e:
         logger.warning(f"Failed to persist chat messages: {e}")
 
+
+@api_router.post("/dashboard/chat")
+async def dashboard_chat(
+    request: DashboardChatRequest,
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Send a message to the Data Team chat agent (Bobur → router → agents).
+    """
+    tenant_id = current_user["tenant_id"]
+    await check_llm_rate_limit(tenant_id)
+    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+    if not crm_source:
+        return dict(_NO_CRM_CHAT_REPLY)
+
+    crm_profile, conversation_state = await _load_dashboard_chat_context(tenant_id)
+
+    # Route + execute via Bobur
+    result = await dashboard_chat_handler(
+        supabase, tenant_id, crm_source,
+        request.message, request.conversation_history, crm_profile,
+        conversation_state=conversation_state,
+    )
+
+    _persist_dashboard_chat(tenant_id, request.message, result)
     return result
 
 
+def _sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@api_router.post("/dashboard/chat/stream")
+async def dashboard_chat_stream(
+    request: DashboardChatRequest,
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Streaming variant of /dashboard/chat (Server-Sent Events).
+
+    Events: status, tool_start, tool_result, sql, chart, token (reply text
+    deltas), then exactly one of done (the same payload /dashboard/chat
+    returns) or error.
+    """
+    tenant_id = current_user["tenant_id"]
+    await check_llm_rate_limit(tenant_id)
+
+    async def event_stream():
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def on_event(event: str, data: dict) -> None:
+            await queue.put((event, data))
+
+        async def run() -> None:
+            try:
+                crm_source = await _get_tenant_crm_source(supabase, tenant_id)
+                if not crm_source:
+                    await queue.put(("done", dict(_NO_CRM_CHAT_REPLY)))
+                    return
+                crm_profile, conversation_state = await _load_dashboard_chat_context(tenant_id)
+                result = await dashboard_chat_handler(
+                    supabase, tenant_id, crm_source,
+                    request.message, request.conversation_history, crm_profile,
+                    conversation_state=conversation_state,
+                    on_event=on_event,
+                )
+                await queue.put(("done", result))
+                await asyncio.to_thread(_persist_dashboard_chat, tenant_id, request.message, result)
+            except Exception as e:
+                logger.error(f"Streaming dashboard chat failed: {e}")
+                await queue.put(("error", {"message": "Chat failed. Please try again."}))
+
+        # First byte goes out before any DB or LLM work
+        yield _sse("status", {"stage": "started"})
+        task = asyncio.create_task(run())
+        finished = False
+        try:
+            while True:
+                event, data = await queue.get()
+                yield _sse(event, data)
+                if event in ("done", "error"):
+                    finished = True
+                    break
+        finally:
+            # Client disconnected mid-answer — stop the agent. After "done",
+            # persistence keeps running in the background.
+            if not finished:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @api_router.get("/dashboard/chat/history")
 async def dashboard_chat_history(
     current_user: Dict = Depends(get_current_user),
@@ -5302,14 +4084,10 @@ async def dashboard_chat_history(
     messages.reverse()
 
     # Check if there are more
-    total_result = (
-        supabase.table("dashboard_chat_messages")
-        .select("*", count="exact")
+    total = await run_count(
+        count_query(supabase, "dashboard_chat_messages", CountMode.ESTIMATED)
         .eq("tenant_id", tenant_id)
-        .limit(0)
-        .execute()
     )
-    total = total_result.count or 0
 
     return {
         "messages": messages,
@@ -5503,25 +4281,12 @@ async def data_usage(current_user: Dict = Depends(get_current_user)):
     tenant_id = current_user["tenant_id"]
     crm_source = await _get_tenant_crm_source(supabase, tenant_id)
 
-    entities = {}
     tables = ["crm_leads", "crm_deals", "crm_contacts", "crm_companies", "crm_activities"]
-    total = 0
-
-    for table in tables:
-        try:
-            query = (
-                supabase.table(table)
-                .select("*", count="exact")
-                .eq("tenant_id", tenant_id)
-            )
-            if crm_source:
-                query = query.eq("crm_source", crm_source)
-            result = query.limit(0).execute()
-            count = result.count or 0
-            entities[table.replace("crm_", "")] = count
-            total += count
-        except Exception:
-            entities[table.replace("crm_", "")] = 0
+    counts = await count_tables(
+        supabase, tenant_id, tables, crm_source=crm_source, mode=CountMode.CACHED,
+    )
+    entities = {table.replace("crm_", ""): counts[table] for table in tables}
+    total = sum(counts.values())
 
     return {
         "entities": entities,
@@ -5760,8 +4525,7 @@ async def disconnect_payme(current_user: Dict = Depends(get_current_user)):
     tenant_id = current_user["tenant_id"]
 
     # Clear from memory cache
-    if tenant_id in _payme_credentials_cache:
-        del _payme_credentials_cache[tenant_id]
+    if invalidate_everywhere(_payme_credentials_cache, tenant_id) is not None:
         logger.info(f"Cleared Payme from cache for tenant {tenant_id}")
 
     # Try to clear from database
@@ -5872,8 +4636,7 @@ async def disconnect_click(current_user: Dict = Depends(get_current_user)):
     tenant_id = current_user["tenant_id"]
 
     # Clear from memory cache
-    if tenant_id in _click_credentials_cache:
-        del _click_credentials_cache[tenant_id]
+    if invalidate_everywhere(_click_credentials_cache, tenant_id) is not None:
         logger.info(f"Cleared Click from cache for tenant {tenant_id}")
 
     # Try to clear from database
@@ -6092,11 +4855,9 @@ async def disconnect_google_sheets(current_user: Dict = Depends(get_current_user
     tenant_id = current_user["tenant_id"]
 
     # Clear from memory caches (both connection and data cache)
-    if tenant_id in _google_sheets_cache:
-        del _google_sheets_cache[tenant_id]
+    if invalidate_everywhere(_google_sheets_cache, tenant_id) is not None:
         logger.info(f"Cleared Google Sheets connection from cache for tenant {tenant_id}")
-    if tenant_id in _google_sheets_data_cache:
-        del _google_sheets_data_cache[tenant_id]
+    if invalidate_everywhere(_google_sheets_data_cache, tenant_id) is not None:
         logger.info(f"Cleared Google Sheets data from cache for tenant {tenant_id}")
 
     # Try to clear from database
@@ -6226,16 +4987,19 @@ def get_industry_guidance(vertical: str) -> str:
     return guidance.get(vertical, "")
 
 
-def get_enhanced_system_prompt(
-    config: Dict,
-    lead_context: Dict = None,
-    crm_context: Dict = None,
-    detected_objection: Dict = None,
-    closing_script: Dict = None,
-    contact_urgency: str = None,
-    product_context: str = None
-) -> str:
-    """Generate comprehensive system prompt with sales pipeline, CRM awareness, and enforcement layers"""
+# ============ Sales prompt assembly ============
+# The sales system prompt is [stable per-tenant prefix][volatile tail]. The
+# prefix depends only on tenant config, so it is byte-identical across turns:
+# OpenAI reuses identical prompt prefixes automatically (>=1024 tokens), and
+# call_sales_agent marks the end of the prefix with an Anthropic cache_control
+# breakpoint. Anything per-message (lead status, detected objection, CRM
+# profile, RAG snippets, media list) goes after it.
+# tenant_id -> (config fingerprint, prefix)
+_prompt_prefix_cache = TTLCache("sales_prompt_prefix", ttl=6 * 3600, max_entries=5_000, max_bytes=64 * 1024 * 1024)
+
+
+def _build_static_system_prompt(config: Dict) -> str:
+    """Config-only part of the sales system prompt (identical on every turn)."""
 
     business_name = config.get('business_name', 'our company')
     business_description = config.get('business_description', '')
@@ -6307,21 +5071,6 @@ NEVER invent or assume products exist - only discuss what the customer mentions.
     required_fields = build_required_fields_from_config(config)
     required_text = "\n".join([f"- {field['label']}: {'REQUIRED' if field['required'] else 'Optional'}" for field in required_fields.values()])
 
-    # Current lead context
-    current_stage = lead_context.get('sales_stage', 'awareness') if lead_context else 'awareness'
-    raw_fields = lead_context.get('fields_collected', {}) if lead_context else {}
-    # Sanitize fields_collected before prompt injection: truncate values and strip control chars
-    fields_collected = {}
-    for k, v in (raw_fields if isinstance(raw_fields, dict) else {}).items():
-        key = str(k)[:50]
-        if v is None:
-            fields_collected[key] = None
-        else:
-            sanitized = str(v)[:200].replace('\n', ' ').replace('\r', ' ')
-            fields_collected[key] = sanitized
-
-    missing_required = [k for k, v in required_fields.items() if v['required'] and not fields_collected.get(k)]
-
     # Build dynamic fields_collected JSON template from enabled fields
     fields_json_lines = []
     for key in required_fields:
@@ -6383,18 +5132,11 @@ You must track and advance customers through these stages:
    → Goal: Close the sale, collect final details
    → Actions: Confirm order, get contact info, next steps
 
-## CURRENT STATUS
-- Current Stage: {current_stage.upper()}
-- Fields Collected: {json.dumps(fields_collected)}
-- Missing Required Fields: {', '.join(missing_required) if missing_required else 'None'}
-
 {get_hard_constraints_section(config)}
 
 {get_handoff_instructions(config)}
 
-{_build_dynamic_context_sections(detected_objection, closing_script, contact_urgency, product_context)}
-
-{_build_crm_context_section(crm_context)}## REQUIRED INFORMATION TO COLLECT
+## REQUIRED INFORMATION TO COLLECT
 {required_text}
 
 ## OBJECTION HANDLING PLAYBOOK
@@ -6476,37 +5218,119 @@ Example 3 - Customer ready to buy:
 {{"reply_text": "Ajoyib! Buyurtmangizni rasmiylashtiraman. Telefon raqamingizni aytasizmi?", "sales_stage": "purchase", "stage_change_reason": "Customer said they want to order", "hotness": "hot", "score": 92, "intent": "ready_to_purchase", "objection_detected": null, "closing_technique_used": "assumptive_close", "fields_collected": {{"name": "Sardor", "phone": null, "product": "Premium Package", "budget": "5 million", "timeline": "today"}}, "next_action": "Collect phone number to confirm order"}}"""
 
 
-async def get_business_context_semantic(tenant_id: str, query: str, top_k: int = 8) -> List[str]:
-    """
-    Semantic RAG - finds relevant context using embeddings.
-    Combines enabled global documents + tenant-specific documents.
-    """
-    try:
-        # Ensure embeddings are loaded from DB for this tenant
-        await load_embeddings_from_db(tenant_id)
 
-        # Ensure global embeddings are loaded
-        await load_global_embeddings()
 
-        # Get disabled global docs for this tenant
-        disabled_global_ids = await get_disabled_global_docs(tenant_id)
+def get_static_system_prompt(config: Dict, tenant_id: str = None) -> str:
+    """Stable per-tenant prompt prefix, memoized until the tenant config changes."""
+    if not tenant_id:
+        return _build_static_system_prompt(config)
+    fingerprint = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+    cached = _prompt_prefix_cache.get(tenant_id)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+    prefix = _build_static_system_prompt(config)
+    _prompt_prefix_cache.set(tenant_id, (fingerprint, prefix))
+    return prefix
 
-        # Collect all chunks from memory cache
-        all_chunks = []
 
-        # 1. Add enabled global document chunks
-        for doc_id, doc_data in global_document_embeddings_cache.items():
-            if doc_id not in disabled_global_ids:
-                all_chunks.extend(doc_data.get("chunks", []))
+def invalidate_system_prompt_prefix(tenant_id: str) -> None:
+    """Drop a tenant's memoized prompt prefix (called on /config updates)."""
+    invalidate_everywhere(_prompt_prefix_cache, tenant_id)
 
-        # 2. Add tenant-specific document chunks
-        for doc_id, doc_data in document_embeddings_cache.items():
-            if doc_data.get("tenant_id") == tenant_id:
-                all_chunks.extend(doc_data.get("chunks", []))
 
-        # If we have chunks with embeddings, use semantic search
-        if all_chunks and all_chunks[0].get("embedding"):
-            global_count = sum(1 for c in all_chunks if c.get('source', '').startswith('[Global]'))
+def get_volatile_prompt_sections(
+    config: Dict,
+    lead_context: Dict = None,
+    crm_context: Dict = None,
+    detected_objection: Dict = None,
+    closing_script: Dict = None,
+    contact_urgency: str = None,
+    product_context: str = None
+) -> str:
+    """Per-message prompt sections: lead status, objection/closing/urgency, CRM profile."""
+    required_fields = build_required_fields_from_config(config)
+
+    # Current lead context
+    current_stage = lead_context.get('sales_stage', 'awareness') if lead_context else 'awareness'
+    raw_fields = lead_context.get('fields_collected', {}) if lead_context else {}
+    # Sanitize fields_collected before prompt injection: truncate values and strip control chars
+    fields_collected = {}
+    for k, v in (raw_fields if isinstance(raw_fields, dict) else {}).items():
+        key = str(k)[:50]
+        if v is None:
+            fields_collected[key] = None
+        else:
+            sanitized = str(v)[:200].replace('\n', ' ').replace('\r', ' ')
+            fields_collected[key] = sanitized
+
+    missing_required = [k for k, v in required_fields.items() if v['required'] and not fields_collected.get(k)]
+
+    sections = [f"""## CURRENT STATUS
+- Current Stage: {current_stage.upper()}
+- Fields Collected: {json.dumps(fields_collected)}
+- Missing Required Fields: {', '.join(missing_required) if missing_required else 'None'}"""]
+    dynamic_sections = _build_dynamic_context_sections(detected_objection, closing_script, contact_urgency, product_context)
+    if dynamic_sections:
+        sections.append(dynamic_sections)
+    crm_section = _build_crm_context_section(crm_context).strip()
+    if crm_section:
+        sections.append(crm_section)
+    return "\n\n".join(sections)
+
+
+def get_enhanced_system_prompt(
+    config: Dict,
+    lead_context: Dict = None,
+    crm_context: Dict = None,
+    detected_objection: Dict = None,
+    closing_script: Dict = None,
+    contact_urgency: str = None,
+    product_context: str = None,
+    tenant_id: str = None,
+) -> str:
+    """Generate comprehensive system prompt with sales pipeline, CRM awareness, and enforcement layers.
+
+    Assembled as [stable per-tenant prefix][volatile per-message sections] so
+    provider prompt caching can reuse the prefix across turns."""
+    prefix = get_static_system_prompt(config, tenant_id)
+    volatile = get_volatile_prompt_sections(
+        config, lead_context, crm_context, detected_objection, closing_script, contact_urgency, product_context
+    )
+    return prefix + "\n\n" + volatile
+
+
+@traced("rag")
+async def get_business_context_semantic(tenant_id: str, query: str, top_k: int = 8) -> List[str]:
+    """
+    Semantic RAG - finds relevant context using embeddings.
+    Combines enabled global documents + tenant-specific documents.
+    """
+    try:
+        # Ensure embeddings are loaded from DB for this tenant
+        await load_embeddings_from_db(tenant_id)
+
+        # Ensure global embeddings are loaded
+        await load_global_embeddings()
+
+        # Get disabled global docs for this tenant
+        disabled_global_ids = await get_disabled_global_docs(tenant_id)
+
+        # Collect all chunks from memory cache
+        all_chunks = []
+
+        # 1. Add enabled global document chunks
+        for doc_id, doc_data in global_document_embeddings_cache.items():
+            if doc_id not in disabled_global_ids:
+                all_chunks.extend(doc_data.get("chunks", []))
+
+        # 2. Add tenant-specific document chunks
+        for doc_id, doc_data in document_embeddings_cache.items():
+            if doc_data.get("tenant_id") == tenant_id:
+                all_chunks.extend(doc_data.get("chunks", []))
+
+        # If we have chunks with embeddings, use semantic search
+        if all_chunks and all_chunks[0].get("embedding"):
+            global_count = sum(1 for c in all_chunks if c.get('source', '').startswith('[Global]'))
             local_count = len(all_chunks) - global_count
             logger.info(f"Performing semantic search over {len(all_chunks)} chunks ({global_count} global, {local_count} local) for tenant {tenant_id}")
 
@@ -6819,7 +5643,7 @@ async def log_handoff_request(
             },
             "created_at": now_iso()
         }
-        supabase.table('event_logs').insert(handoff_data).execute()
+        telemetry_sink.enqueue('event_logs', handoff_data)
         logger.info(f"Human handoff logged for tenant {tenant_id}: {reason}")
     except Exception as e:
         logger.error(f"Failed to log handoff request: {e}")
@@ -6918,6 +5742,7 @@ def correct_response_if_needed(response: str, violations: List[str], config: Dic
 
 
 # ============ Standalone CRM Field Extractor ============
+@traced("extraction")
 async def extract_crm_fields(
     user_message: str,
     conversation_history: List[Dict],
@@ -6976,9 +5801,12 @@ async def extract_crm_fields(
 
         messages.append({"role": "user", "content": user_message})
 
-        response = await openai_client.chat.completions.create(
+        response = await get_gateway().chat_completion(
             model="gpt-4o-mini",
             messages=messages,
+            tenant_id=tenant_id,
+            purpose="crm_extractor",
+            timeout=30.0,
             temperature=0.3,
             max_tokens=300,
             response_format={"type": "json_object"},
@@ -7085,6 +5913,50 @@ def get_hard_constraints_section(config: Dict) -> str:
     return "\n".join(constraints)
 
 
+async def _stream_sales_completion(
+    call_kwargs: Dict,
+    on_reply_text: Callable[[str], Awaitable[None]],
+    tenant_id: Optional[str] = None,
+    requested_model: Optional[str] = None,
+) -> Tuple[str, Any, Optional[str]]:
+    """Streamed litellm completion for call_sales_agent.
+
+    Decodes reply_text out of the JSON as it arrives and hands the text so far
+    to on_reply_text; a failing consumer never breaks the completion.
+    Returns (full content, usage or None, model that served the stream) —
+    the gateway may have fallen back from requested_model."""
+    stream = await get_gateway().chat_completion(
+        **call_kwargs, provider="litellm", tenant_id=tenant_id, purpose="sales_agent",
+        stream=True, stream_options={"include_usage": True},
+    )
+    parts: List[str] = []
+    usage = None
+    model = requested_model
+    reply = JsonStringFieldStreamer("reply_text")
+    reply_so_far = ""
+    async for chunk in stream:
+        if getattr(chunk, 'usage', None):
+            usage = chunk.usage
+        if requested_model and getattr(chunk, 'model', None):
+            model = served_model(chunk, requested_model)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parts.append(delta)
+        text = reply.feed(delta)
+        if not text:
+            continue
+        reply_so_far += text
+        try:
+            await on_reply_text(reply_so_far)
+        except Exception as e:
+            logger.warning(f"Streamed reply consumer failed: {e}")
+    return "".join(parts), usage, model
+
+
+@traced("sales_agent")
 async def call_sales_agent(
     messages: List[Dict],
     config: Dict,
@@ -7101,16 +5973,39 @@ async def call_sales_agent(
     media_context: str = None,
     conversation_id: str = None,
     sales_model: str = None,
+    on_reply_text: Optional[Callable[[str], Awaitable[None]]] = None,
+    conversation_memory: Optional[str] = None,
 ) -> Dict:
     """Call LLM with enhanced sales pipeline, CRM awareness, and enforcement layers.
-    Supports multiple LLM providers via litellm (OpenAI, Anthropic, Google)."""
+    Supports multiple LLM providers via litellm (OpenAI, Anthropic, Google).
+
+    With on_reply_text set the completion is streamed and the reply_text
+    decoded so far is passed to it as it grows (progressive Telegram delivery).
+    The returned dict is identical either way.
+
+    conversation_memory is the rolling summary of messages older than
+    `messages` (conversation_memory.py), if the chat is long enough to have one."""
     current_stage = lead_context.get('sales_stage', 'awareness') if lead_context else 'awareness'
     model = sales_model if sales_model in VALID_SALES_MODELS else DEFAULT_SALES_MODEL
     is_openai = model.startswith('gpt-')
 
     try:
-        # Generate system prompt with all dynamic enforcement sections
-        system_prompt = get_enhanced_system_prompt(
+        # Stable per-tenant prefix first (provider prompt caching), then the
+        # per-message sections
+        system_prefix = get_static_system_prompt(config, tenant_id)
+
+        # Non-OpenAI models don't support response_format=json_object reliably,
+        # so enforce JSON output via the system prompt instead
+        if not is_openai:
+            system_prefix += (
+                "\n\n## RESPONSE FORMAT\n"
+                "You MUST respond with a single valid JSON object (no markdown, no code fences, no extra text). "
+                "The JSON must contain these keys: reply_text, sales_stage, hotness, score, fields_collected, "
+                "needs_human_handoff, handoff_reason, objection_detected, closing_technique_used, "
+                "suggested_next_action, send_image."
+            )
+
+        volatile_prompt = get_volatile_prompt_sections(
             config,
             lead_context,
             crm_context,
@@ -7120,29 +6015,31 @@ async def call_sales_agent(
             product_context
         )
 
+        if conversation_memory:
+            volatile_prompt += "\n\n" + conversation_memory
+
         if business_context:
-            system_prompt += "\n\n## RELEVANT BUSINESS INFORMATION\n" + "\n".join(business_context)
+            volatile_prompt += "\n\n## RELEVANT BUSINESS INFORMATION\n" + "\n".join(business_context)
 
         # Add CRM query context (product pricing, order history) if available
         if crm_query_context:
-            system_prompt += "\n\n" + crm_query_context
+            volatile_prompt += "\n\n" + crm_query_context
 
         # Add media library context for image responses
         if media_context:
-            system_prompt += "\n\n" + media_context
-
-        # Non-OpenAI models don't support response_format=json_object reliably,
-        # so enforce JSON output via the system prompt instead
-        if not is_openai:
-            system_prompt += (
-                "\n\n## RESPONSE FORMAT\n"
-                "You MUST respond with a single valid JSON object (no markdown, no code fences, no extra text). "
-                "The JSON must contain these keys: reply_text, sales_stage, hotness, score, fields_collected, "
-                "needs_human_handoff, handoff_reason, objection_detected, closing_technique_used, "
-                "suggested_next_action, send_image."
-            )
+            volatile_prompt += "\n\n" + media_context
+
+        # Anthropic only caches up to an explicit breakpoint; OpenAI caches
+        # the identical leading text of a plain string automatically
+        if model.startswith('claude-'):
+            system_content = [
+                {"type": "text", "text": system_prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": volatile_prompt},
+            ]
+        else:
+            system_content = system_prefix + "\n\n" + volatile_prompt
 
-        api_messages = [{"role": "system", "content": system_prompt}]
+        api_messages = [{"role": "system", "content": system_content}]
         for msg in messages:
             role = "assistant" if msg.get("role") == "assistant" else "user"
             api_messages.append({"role": role, "content": msg.get("text", "")})
@@ -7160,26 +6057,40 @@ async def call_sales_agent(
             call_kwargs["response_format"] = {"type": "json_object"}
 
         # CRITICAL: Add timeout to prevent indefinite hangs
-        response = await asyncio.wait_for(
-            litellm.acompletion(**call_kwargs),
-            timeout=55.0  # 55s timeout (non-OpenAI providers may be slightly slower)
-        )
+        # 55s timeout (non-OpenAI providers may be slightly slower) — an
+        # overall deadline, so gateway retries/fallback must fit inside it
+        with span("completion", model=model, streamed=on_reply_text is not None):
+            if on_reply_text is None:
+                response = await asyncio.wait_for(
+                    get_gateway().chat_completion(
+                        **call_kwargs, provider="litellm", tenant_id=tenant_id,
+                        purpose="sales_agent", timeout=55.0,
+                    ),
+                    timeout=55.0,
+                )
+                content = response.choices[0].message.content
+                usage = getattr(response, 'usage', None)
+                model = served_model(response, model)
+            else:
+                content, usage, model = await asyncio.wait_for(
+                    _stream_sales_completion(call_kwargs, on_reply_text, tenant_id, model), timeout=55.0
+                )
 
         # Log token usage for billing/transparency (fire-and-forget)
-        if tenant_id and hasattr(response, 'usage') and response.usage:
+        cached_tokens = cached_prompt_tokens(usage)
+        if tenant_id and usage:
             log_token_usage_fire_and_forget(
                 tenant_id=tenant_id,
                 model=model,
                 request_type="sales_agent",
-                input_tokens=response.usage.prompt_tokens,
-                output_tokens=response.usage.completion_tokens,
+                input_tokens=usage.prompt_tokens,
+                output_tokens=usage.completion_tokens,
                 conversation_id=conversation_id,
+                cached_input_tokens=cached_tokens,
             )
 
-        content = response.choices[0].message.content
-        usage = getattr(response, 'usage', None)
         if usage:
-            logger.info(f"LLM Response: model={model} tokens_in={usage.prompt_tokens} tokens_out={usage.completion_tokens} len={len(content)}")
+            logger.info(f"LLM Response: model={model} tokens_in={usage.prompt_tokens} (cached={cached_tokens}) tokens_out={usage.completion_tokens} len={len(content)}")
         else:
             logger.info(f"LLM Response: model={model} len={len(content)} (usage data unavailable)")
 
@@ -7317,6 +6228,7 @@ def should_force_full_model(
     return False
 
 
+@traced("classifier")
 async def classify_message_intent(
     user_message: str,
     tenant_id: str = None,
@@ -7342,18 +6254,20 @@ async def classify_message_intent(
     )
 
     try:
-        response = await asyncio.wait_for(
-            openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message[:500]},  # Truncate for cost
-                ],
-                temperature=0.3,
-                max_tokens=50,
-                response_format={"type": "json_object"},
-            ),
+        response = await get_gateway().chat_completion(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message[:500]},  # Truncate for cost
+            ],
+            tenant_id=tenant_id,
+            purpose="intent_classifier",
             timeout=10.0,
+            deadline=10.0,  # retries and hedges included
+            hedge=True,
+            temperature=0.3,
+            max_tokens=50,
+            response_format={"type": "json_object"},
         )
 
         if tenant_id and hasattr(response, 'usage') and response.usage:
@@ -7396,6 +6310,7 @@ def route_message(category: str, confidence: float) -> str:
     return 'full'
 
 
+@traced("faq_responder")
 async def call_faq_responder(
     messages: List[Dict],
     config: Dict,
@@ -7502,7 +6417,9 @@ async def call_faq_responder(
             '"handoff_reason": null, '
             '"objection_detected": false, '
             '"closing_technique_used": null, '
-            '"send_image": null}'
+            '"send_image": null}\n'
+            'fields_collected: ONLY details the customer explicitly stated in their latest message '
+            '(name, phone, email, product, budget, timeline, location); {} if none. Never guess.'
         )
 
         system_prompt = "\n".join(prompt_parts)
@@ -7512,15 +6429,17 @@ async def call_faq_responder(
             role = "assistant" if msg.get("role") == "assistant" else "user"
             api_messages.append({"role": role, "content": msg.get("text", "")})
 
-        response = await asyncio.wait_for(
-            openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=api_messages,
-                temperature=0.5,
-                max_tokens=800,
-                response_format={"type": "json_object"},
-            ),
+        response = await get_gateway().chat_completion(
+            model="gpt-4o-mini",
+            messages=api_messages,
+            tenant_id=tenant_id,
+            purpose="sales_agent_faq",
             timeout=30.0,
+            deadline=30.0,  # retries and hedges included
+            hedge=True,
+            temperature=0.5,
+            max_tokens=800,
+            response_format={"type": "json_object"},
         )
 
         if tenant_id and hasattr(response, 'usage') and response.usage:
@@ -7578,6 +6497,7 @@ async def call_faq_responder(
 @api_router.post("/telegram/webhook/{bot_id}")
 async def telegram_webhook_with_bot_id(bot_id: str, request: Request, background_tasks: BackgroundTasks):
     """Handle incoming Telegram webhook updates with bot-specific URL (SECURE - multi-tenant safe)"""
+    received_ns = time.time_ns()  # webhook_ack / queue_wait spans (pipeline_trace.py)
     try:
         update = await request.json()
         logger.info(f"Received Telegram update for bot {redact_id(bot_id)}")
@@ -7623,18 +6543,9 @@ async def telegram_webhook_with_bot_id(bot_id: str, request: Request, background
 
         # Dedup: skip already-processed updates (Telegram may re-deliver on timeout)
         update_id = update.get("update_id")
-        if update_id is not None:
-            now_ts = time.time()
-            if update_id in _telegram_dedup_cache:
-                if now_ts - _telegram_dedup_cache[update_id] < TELEGRAM_DEDUP_TTL:
-                    logger.debug(f"Skipping duplicate Telegram update {update_id}")
-                    return {"ok": True}
-            _telegram_dedup_cache[update_id] = now_ts
-            # Prune expired entries when cache gets large
-            if len(_telegram_dedup_cache) > 1000:
-                expired = [k for k, v in _telegram_dedup_cache.items() if now_ts - v >= TELEGRAM_DEDUP_TTL]
-                for k in expired:
-                    del _telegram_dedup_cache[k]
+        if update_id is not None and not await is_first_delivery("telegram", update_id, TELEGRAM_DEDUP_TTL):
+            logger.debug(f"Skipping duplicate Telegram update {update_id}")
+            return {"ok": True}
 
         # ── Silently ignore stickers, GIFs, and video notes ──
         if message.get("sticker"):
@@ -7651,7 +6562,7 @@ async def telegram_webhook_with_bot_id(bot_id: str, request: Request, background
         if message.get("voice"):
             # Rate limit check BEFORE background dispatch (consistent with text path)
             voice_user_id = str(message.get("from", {}).get("id", "unknown"))
-            if not message_rate_limiter.is_allowed(voice_user_id):
+            if not await message_rate_limiter.hit(voice_user_id):
                 logger.warning(f"Rate limit exceeded for voice message from user {voice_user_id}")
                 return {"ok": True}
 
@@ -7687,8 +6598,9 @@ async def telegram_webhook_with_bot_id(bot_id: str, request: Request, background
 
         # CRITICAL: Rate limiting to prevent flooding
         user_id = str(message.get("from", {}).get("id", "unknown"))
-        if not message_rate_limiter.is_allowed(user_id):
-            wait_time = message_rate_limiter.get_wait_time(user_id)
+        limited = await message_rate_limiter.hit(user_id)
+        if not limited:
+            wait_time = limited.retry_after_seconds
             logger.warning(f"Rate limit exceeded for user {user_id}, wait {wait_time}s")
             return {"ok": True}
 
@@ -7720,7 +6632,10 @@ async def telegram_webhook_with_bot_id(bot_id: str, request: Request, background
             logger.warning(f"Could not update webhook timestamp: {e}")
 
         # Process message in background with correct tenant (decrypt bot_token)
-        background_tasks.add_task(process_telegram_message, bot["tenant_id"], decrypt_value(bot["bot_token"]), update)
+        background_tasks.add_task(
+            process_telegram_message, bot["tenant_id"], decrypt_value(bot["bot_token"]), update,
+            received_ns=received_ns, enqueued_ns=time.time_ns(),
+        )
         return {"ok": True}
 
     except json.JSONDecodeError as e:
@@ -7759,17 +6674,9 @@ async def telegram_business_webhook(request: Request, background_tasks: Backgrou
 
         # Dedup check (same pattern as BotFather webhook)
         update_id = update.get("update_id")
-        if update_id is not None:
-            now_ts = time.time()
-            if update_id in _telegram_dedup_cache:
-                if now_ts - _telegram_dedup_cache[update_id] < TELEGRAM_DEDUP_TTL:
-                    logger.debug(f"Skipping duplicate business update {update_id}")
-                    return {"ok": True}
-            _telegram_dedup_cache[update_id] = now_ts
-            if len(_telegram_dedup_cache) > 1000:
-                expired = [k for k, v in _telegram_dedup_cache.items() if now_ts - v >= TELEGRAM_DEDUP_TTL]
-                for k in expired:
-                    del _telegram_dedup_cache[k]
+        if update_id is not None and not await is_first_delivery("telegram", update_id, TELEGRAM_DEDUP_TTL):
+            logger.debug(f"Skipping duplicate business update {update_id}")
+            return {"ok": True}
 
         # Route by update type
         if "business_connection" in update:
@@ -7885,6 +6792,7 @@ async def handle_business_connection(connection_data: dict):
         logger.exception(f"Error handling business connection: {e}")
 
 
+@db_job("telegram_business_message")
 async def handle_business_message(message: dict):
     """Handle business_message updates -- customer DMs to a connected business."""
     try:
@@ -7941,7 +6849,7 @@ async def handle_business_message(message: dict):
 
             # Rate limit check
             voice_user_id = str(sender.get("id", "unknown"))
-            if not message_rate_limiter.is_allowed(voice_user_id):
+            if not await message_rate_limiter.hit(voice_user_id):
                 logger.warning(f"Rate limit exceeded for business voice from user {voice_user_id}")
                 return
 
@@ -7983,7 +6891,9 @@ async def handle_business_message(message: dict):
 
             # Transcribe via Whisper
             language_code = sender.get("language_code")
-            transcript, api_success = await transcribe_voice_message(audio_bytes, language=language_code)
+            transcript, api_success = await transcribe_voice_message(
+                audio_bytes, language=language_code, tenant_id=tenant_id
+            )
 
             # Log Whisper usage
             whisper_cost = calculate_whisper_cost(duration)
@@ -8076,7 +6986,7 @@ async def handle_shared_bot_dm(message: dict):
         # Check if this is a link code (6 alphanumeric characters)
         if len(text) == 6 and text.replace(" ", "").isalnum():
             code = text.upper().strip()
-            code_entry = verify_link_code(code)
+            code_entry = await verify_link_code(code)
 
             if code_entry:
                 tenant_id = code_entry["tenant_id"]
@@ -8148,6 +7058,7 @@ async def handle_shared_bot_dm(message: dict):
         logger.exception(f"Error handling shared bot DM: {e}")
 
 
+@traced_pipeline("message", "tenant_id", "channel")
 async def process_channel_message(
     tenant_id: str,
     channel: str,
@@ -8179,13 +7090,15 @@ async def process_channel_message(
         logger.info(f"[{channel}] Processing message from user_{redact_id(sender_id)} [len={len(text)}] for tenant {redact_id(tenant_id)}")
 
         # LLM rate limit / monthly cost cap check (non-raising version for background tasks)
-        if not llm_rate_limiter.is_allowed(tenant_id):
+        if not await llm_rate_limiter.hit(tenant_id):
             logger.warning(f"[{channel}] LLM rate limit exceeded for tenant {redact_id(tenant_id)}, dropping message")
+            annotate(route="rate_limited")
             await send_fn("Sorry, our system is temporarily unavailable. Please try again later.")
             return
         monthly_cost = _get_monthly_cost(tenant_id)
         if monthly_cost >= LLM_MONTHLY_COST_CAP:
             logger.warning(f"[{channel}] Monthly LLM cost cap reached for tenant {redact_id(tenant_id)} (${monthly_cost:.2f})")
+            annotate(route="cost_capped")
             await send_fn("Sorry, our system is temporarily unavailable. Please try again later.")
             return
 
@@ -8194,7 +7107,8 @@ async def process_channel_message(
             await typing_fn()
 
         # Get tenant config
-        config_result = supabase.table('tenant_configs').select('*').eq('tenant_id', tenant_id).execute()
+        with span("config_lookup"):
+            config_result = supabase.table('tenant_configs').select('*').eq('tenant_id', tenant_id).execute()
         config = config_result.data[0] if config_result.data else {}
 
         # Resolve tenant's preferred sales model
@@ -8203,56 +7117,58 @@ async def process_channel_message(
         # Per-tenant message rate limit (0 = unlimited)
         tenant_max = config.get('max_messages_per_minute', 0)
         if tenant_max and tenant_max > 0:
-            if not message_rate_limiter.is_allowed_with_limit(f"tenant_{tenant_id}", tenant_max):
+            if not await message_rate_limiter.hit(f"tenant_{tenant_id}", limit=tenant_max):
                 logger.warning(f"[{channel}] Tenant rate limit exceeded ({tenant_max}/min) for tenant {redact_id(tenant_id)}, dropping message")
+                annotate(route="rate_limited")
                 return
 
         now = now_iso()
 
-        # Channel-specific customer lookup
-        if channel in ("telegram", "telegram_business"):
-            customer_result = supabase.table('customers').select('*').eq('tenant_id', tenant_id).eq('telegram_user_id', sender_id).execute()
-        else:
-            customer_result = supabase.table('customers').select('*').eq('tenant_id', tenant_id).eq('instagram_user_id', sender_id).execute()
-
-        if not customer_result.data:
-            primary_lang = 'ru' if language_code and language_code.startswith('ru') else ('en' if language_code and language_code.startswith('en') else 'uz')
-            customer = {
-                "id": str(uuid.uuid4()), "tenant_id": tenant_id,
-                "name": sender_name, "primary_language": primary_lang,
-                "segments": [], "first_seen_at": now, "last_seen_at": now
-            }
+        with span("customer_lookup"):
+            # Channel-specific customer lookup
             if channel in ("telegram", "telegram_business"):
-                customer["telegram_user_id"] = sender_id
-                customer["telegram_username"] = sender_username
+                customer_result = supabase.table('customers').select('*').eq('tenant_id', tenant_id).eq('telegram_user_id', sender_id).execute()
             else:
-                customer["instagram_user_id"] = sender_id
-                customer["instagram_username"] = sender_username
-            supabase.table('customers').insert(customer).execute()
-            logger.info(f"Created new customer: {customer['id']} via {channel}")
-        else:
-            customer = customer_result.data[0]
-            supabase.table('customers').update({"last_seen_at": now}).eq('id', customer['id']).execute()
+                customer_result = supabase.table('customers').select('*').eq('tenant_id', tenant_id).eq('instagram_user_id', sender_id).execute()
+
+            if not customer_result.data:
+                primary_lang = 'ru' if language_code and language_code.startswith('ru') else ('en' if language_code and language_code.startswith('en') else 'uz')
+                customer = {
+                    "id": str(uuid.uuid4()), "tenant_id": tenant_id,
+                    "name": sender_name, "primary_language": primary_lang,
+                    "segments": [], "first_seen_at": now, "last_seen_at": now
+                }
+                if channel in ("telegram", "telegram_business"):
+                    customer["telegram_user_id"] = sender_id
+                    customer["telegram_username"] = sender_username
+                else:
+                    customer["instagram_user_id"] = sender_id
+                    customer["instagram_username"] = sender_username
+                supabase.table('customers').insert(customer).execute()
+                logger.info(f"Created new customer: {customer['id']} via {channel}")
+            else:
+                customer = customer_result.data[0]
+                supabase.table('customers').update({"last_seen_at": now}).eq('id', customer['id']).execute()
 
-        # Get or create conversation
-        conv_result = supabase.table('conversations').select('*').eq('tenant_id', tenant_id).eq('customer_id', customer['id']).eq('status', 'active').execute()
+            # Get or create conversation
+            conv_result = supabase.table('conversations').select('*').eq('tenant_id', tenant_id).eq('customer_id', customer['id']).eq('status', 'active').execute()
 
-        if not conv_result.data:
-            conversation = {
-                "id": str(uuid.uuid4()), "tenant_id": tenant_id,
-                "customer_id": customer['id'], "status": "active",
-                "source_channel": channel, "started_at": now, "last_message_at": now,
-            }
-            supabase.table('conversations').insert(conversation).execute()
-            logger.info(f"Created new conversation: {conversation['id']}")
-        else:
-            conversation = conv_result.data[0]
+            if not conv_result.data:
+                conversation = {
+                    "id": str(uuid.uuid4()), "tenant_id": tenant_id,
+                    "customer_id": customer['id'], "status": "active",
+                    "source_channel": channel, "started_at": now, "last_message_at": now,
+                }
+                supabase.table('conversations').insert(conversation).execute()
+                logger.info(f"Created new conversation: {conversation['id']}")
+            else:
+                conversation = conv_result.data[0]
 
-        # Save incoming message (include telegram_message_id in raw_payload if available)
-        msg_insert = {"id": str(uuid.uuid4()), "conversation_id": conversation['id'], "sender_type": "user", "text": text, "created_at": now}
-        if telegram_message_id:
-            msg_insert["raw_payload"] = {"telegram_message_id": telegram_message_id}
-        supabase.table('messages').insert(msg_insert).execute()
+            # Save incoming message (include telegram_message_id in raw_payload if available)
+            msg_insert = {"id": str(uuid.uuid4()), "conversation_id": conversation['id'], "sender_type": "user", "text": text, "created_at": now}
+            if telegram_message_id:
+                msg_insert["raw_payload"] = {"telegram_message_id": telegram_message_id}
+            supabase.table('messages').insert(msg_insert).execute()
 
         # ── Emoji-Only Message Handling ──────────────────────────────
         # Detect emoji-only messages BEFORE the LLM pipeline to avoid
@@ -8261,6 +7177,7 @@ async def process_channel_message(
         if emoji_class == 'ignore':
             # Random emoji (fish, guitar, etc.) or GIF — don't respond
             logger.info(f"[{channel}] Emoji-only message (ignore): '{text[:20]}' — skipping LLM pipeline")
+            annotate(route="emoji_ignored")
             return
         elif emoji_class in ('affirmative', 'negative'):
             # Context-aware rewriting: find last bot message for richer context
@@ -8285,25 +7202,36 @@ async def process_channel_message(
                 text = "No, I'm not interested in that"
                 logger.info(f"[{channel}] Negative emoji detected — rewriting as '{text}'")
 
-        # Get conversation history
-        history_result = supabase.table('messages').select('*').eq('conversation_id', conversation['id']).order('created_at', desc=True).limit(10).execute()
-        history = list(reversed(history_result.data or []))
-        messages_for_llm = [{"role": "assistant" if m["sender_type"] == "agent" else "user", "text": m["text"]} for m in history]
+        with span("history"):
+            # Get conversation history
+            history_result = supabase.table('messages').select('*').eq('conversation_id', conversation['id']).order('created_at', desc=True).limit(MEMORY_FETCH_WINDOW).execute()
+            history = list(reversed(history_result.data or []))
+            # Long chats: older messages are carried by a rolling summary instead
+            history, conversation_memory = await build_conversation_context(supabase, tenant_id, conversation['id'], history)
+            memory_section = conversation_memory.prompt_section() if conversation_memory else None
+            messages_for_llm = [{"role": "assistant" if m["sender_type"] == "agent" else "user", "text": m["text"]} for m in history]
 
-        # Get existing lead context
-        lead_result = supabase.table('leads').select('*').eq('tenant_id', tenant_id).eq('customer_id', customer['id']).execute()
-        existing_lead = lead_result.data[0] if lead_result.data else None
+            # Get existing lead context
+            lead_result = supabase.table('leads').select('*').eq('tenant_id', tenant_id).eq('customer_id', customer['id']).execute()
+            existing_lead = lead_result.data[0] if lead_result.data else None
 
         lead_context = {
             "sales_stage": existing_lead.get("sales_stage", "awareness") if existing_lead else "awareness",
             "fields_collected": existing_lead.get("fields_collected", {}) if existing_lead else {}
         }
 
+        # Cheap extraction layer first: contact details stated in this message
+        # count as collected for the prompt, urgency and CRM matching right away
+        local_fields = extract_local_fields(text)
+        if local_fields.fields:
+            lead_context["fields_collected"] = {**(lead_context["fields_collected"] or {}), **local_fields.fields}
+
         # Get customer phone for CRM matching
         customer_phone = (
             customer.get("phone") or
             (existing_lead.get("customer_phone") if existing_lead else None) or
-            (existing_lead.get("fields_collected", {}).get("phone") if existing_lead else None)
+            (existing_lead.get("fields_collected", {}).get("phone") if existing_lead else None) or
+            local_fields.fields.get("phone")
         )
 
         # CRM Integration: Match customer to Bitrix at conversation start
@@ -8403,56 +7331,56 @@ async def process_channel_message(
             route_decision = classification['route_to']
             logger.info(f"Routing: classified as {classifier_category} (confidence={classifier_confidence:.2f}) → {route_decision}")
 
-        crm_extraction_task = None  # Background CRM extraction for FAQ-routed messages
+        crm_extraction_task = None  # LLM extraction fallback, only when the cheap layers are ambiguous
 
-        if route_decision == 'mini':
-            # Step 3a: FAQ responder (gpt-4o-mini)
-            llm_result = await call_faq_responder(
-                messages_for_llm, config, lead_context, business_context,
-                tenant_id, text, crm_query_context, product_context,
-                media_context, conv_id,
-            )
+        # Progressive delivery (tenant opt-in): the full model's reply is shown
+        # in Telegram while it generates. Image replies keep the one-shot sender.
+        progressive_reply = None
+        if config.get('streaming_replies') and channel == "telegram" and bot_token and chat_id and not media_context:
+            progressive_reply = TelegramProgressiveReply(bot_token, chat_id)
+        on_reply_text = progressive_reply.update if progressive_reply else None
 
-            # Validate FAQ response
-            reply_text = llm_result.get("reply_text") or ""
-            is_valid, violations = validate_response_promises(reply_text, config, crm_product_names, kb_products)
+        with span("llm"):
+            if route_decision == 'mini':
+                # Step 3a: FAQ responder (gpt-4o-mini)
+                llm_result = await call_faq_responder(
+                    messages_for_llm, config, lead_context, business_context,
+                    tenant_id, text, crm_query_context, product_context,
+                    media_context, conv_id,
+                )
 
-            # Auto-escalate if validation fails or response too short
-            if not is_valid or len(reply_text.strip()) < 20:
-                escalation_reason = f"validation_violations={violations}" if not is_valid else f"too_short={len(reply_text)}"
-                logger.warning(f"FAQ response escalation: {escalation_reason}")
-                escalated = True
-                route_decision = 'full'
+                # Validate FAQ response
+                reply_text = llm_result.get("reply_text") or ""
+                is_valid, violations = validate_response_promises(reply_text, config, crm_product_names, kb_products)
+
+                # Auto-escalate if validation fails or response too short
+                if not is_valid or len(reply_text.strip()) < 20:
+                    escalation_reason = f"validation_violations={violations}" if not is_valid else f"too_short={len(reply_text)}"
+                    logger.warning(f"FAQ response escalation: {escalation_reason}")
+                    escalated = True
+                    route_decision = 'full'
+
+                    llm_result = await call_sales_agent(
+                        messages_for_llm, config, lead_context, business_context,
+                        tenant_id, text, crm_context, crm_query_context,
+                        detected_objection, closing_script, contact_urgency, product_context,
+                        media_context, conv_id, sales_model=tenant_sales_model,
+                        on_reply_text=on_reply_text, conversation_memory=memory_section,
+                    )
 
+            if route_decision == 'full' and not escalated:
+                # Step 3b: Full model (gpt-4o)
                 llm_result = await call_sales_agent(
                     messages_for_llm, config, lead_context, business_context,
                     tenant_id, text, crm_context, crm_query_context,
                     detected_objection, closing_script, contact_urgency, product_context,
                     media_context, conv_id, sales_model=tenant_sales_model,
+                    on_reply_text=on_reply_text, conversation_memory=memory_section,
                 )
-            else:
-                # Start CRM extraction as background task (non-blocking)
-                # Runs in parallel with response delivery instead of blocking it
-                crm_extraction_task = asyncio.create_task(
-                    extract_crm_fields(
-                        user_message=text,
-                        conversation_history=[{"role": m.get("role", "user"), "content": m.get("text", "")} for m in messages_for_llm[-6:]],
-                        existing_fields=fields_collected,
-                        tenant_id=tenant_id,
-                        conversation_id=conv_id,
-                    )
-                )
-
-        if route_decision == 'full' and not escalated:
-            # Step 3b: Full model (gpt-4o)
-            llm_result = await call_sales_agent(
-                messages_for_llm, config, lead_context, business_context,
-                tenant_id, text, crm_context, crm_query_context,
-                detected_objection, closing_script, contact_urgency, product_context,
-                media_context, conv_id, sales_model=tenant_sales_model,
-            )
+        annotate(route="escalated" if escalated else route_decision)
 
-        # Response Validation
+        # Response Validation (on the complete text — a streamed preview is
+        # replaced by the corrected reply in the final edit below)
         reply_text = llm_result.get("reply_text") or "I'm here to help! How can I assist you today?"
         is_valid, violations = validate_response_promises(reply_text, config, crm_product_names, kb_products)
         if not is_valid:
@@ -8460,6 +7388,22 @@ async def process_channel_message(
             reply_text = correct_response_if_needed(reply_text, violations, config)
             llm_result["reply_text"] = reply_text
 
+        # CRM field extraction: regex layer + the responder's fields_collected;
+        # the separate extractor call runs (alongside delivery) only for cues
+        # neither resolved
+        model_fields = llm_result.get("fields_collected") or {}
+        if needs_llm_fallback(local_fields, model_fields, fields_collected):
+            crm_extraction_task = asyncio.create_task(
+                extract_crm_fields(
+                    user_message=text,
+                    conversation_history=[{"role": m.get("role", "user"), "content": m.get("text", "")} for m in messages_for_llm[-6:]],
+                    existing_fields=fields_collected,
+                    tenant_id=tenant_id,
+                    customer_id=customer['id'],
+                    conversation_id=conv_id,
+                )
+            )
+
         # Human Handoff Handling
         if llm_result.get("needs_human_handoff"):
             customer_name = fields_collected.get('name') or customer.get('name') or sender_name
@@ -8474,33 +7418,53 @@ async def process_channel_message(
             )
             logger.info(f"Human handoff requested: {handoff_reason}")
 
-        # Update or create lead with enhanced data
-        await update_lead_from_llm(tenant_id, customer, existing_lead, llm_result, source_channel=channel)
-        supabase.table('messages').insert({"id": str(uuid.uuid4()), "conversation_id": conversation['id'], "sender_type": "agent", "text": reply_text, "created_at": now_iso()}).execute()
+        with span("persistence"):
+            supabase.table('messages').insert({"id": str(uuid.uuid4()), "conversation_id": conversation['id'], "sender_type": "agent", "text": reply_text, "created_at": now_iso()}).execute()
+
+            # Update conversation
+            supabase.table('conversations').update({"last_message_at": now_iso()}).eq('id', conversation['id']).execute()
 
-        # Update conversation
-        supabase.table('conversations').update({"last_message_at": now_iso()}).eq('id', conversation['id']).execute()
+        streamed = progressive_reply is not None and progressive_reply.started
 
-        # Enforce min_response_delay (simulate human typing speed)
+        # Enforce min_response_delay (simulate human typing speed) — pointless
+        # once the customer has watched the reply being written
         delay = config.get('min_response_delay', 0)
-        if delay and delay > 0:
+        if delay and delay > 0 and not streamed:
             await asyncio.sleep(min(delay, 30))
 
         # Send response via channel (with image support for Telegram if enabled)
-        if channel == "telegram" and media_context and bot_token and chat_id:
-            # Image responses enabled for Telegram - use image-aware sender
-            success = await send_telegram_response_with_images(bot_token, chat_id, reply_text, tenant_id)
-        else:
-            # Standard response via channel's send function
-            success = await send_fn(reply_text)
+        with span("send"):
+            if streamed:
+                success = await progressive_reply.finalize(sanitize_telegram_html(reply_text))
+            elif channel == "telegram" and media_context and bot_token and chat_id:
+                # Image responses enabled for Telegram - use image-aware sender
+                success = await send_telegram_response_with_images(bot_token, chat_id, reply_text, tenant_id)
+            else:
+                # Standard response via channel's send function
+                success = await send_fn(reply_text)
         if success:
             logger.info(f"[{channel}] Sent response to user_{redact_id(sender_id)} [len={len(reply_text)}]")
         else:
             logger.error(f"[{channel}] Failed to send message to user_{redact_id(sender_id)}")
 
-        # Log event (ignore errors)
+        # One lead write per turn, after delivery so a pending extractor
+        # fallback never delays the reply
+        fallback_fields = None
+        if crm_extraction_task:
+            try:
+                with span("extraction_wait"):
+                    extraction_result = await asyncio.wait_for(crm_extraction_task, timeout=10.0)
+                fallback_fields = (extraction_result or {}).get("fields_collected")
+            except asyncio.TimeoutError:
+                logger.warning("CRM extractor fallback timed out")
+            except Exception as ext_err:
+                logger.warning(f"CRM extractor fallback failed: {ext_err}")
+        llm_result["fields_collected"] = merge_extracted_fields(model_fields, local_fields, fallback_fields)
+        await update_lead_from_llm(tenant_id, customer, existing_lead, llm_result, source_channel=channel)
+
+        # Log event (buffered; ignore errors)
         try:
-            supabase.table('event_logs').insert({
+            telemetry_sink.enqueue('event_logs', {
                 "id": str(uuid.uuid4()), "tenant_id": tenant_id, "event_type": "message_processed",
                 "event_data": {
                     "customer_id": customer['id'], "conversation_id": conversation['id'],
@@ -8528,34 +7492,13 @@ async def process_channel_message(
                     "route_forced_full": force_full,
                 },
                 "created_at": now_iso()
-            }).execute()
+            })
         except Exception as e:
             logger.warning(f"Could not log event: {e}")
 
-        # Finalize background CRM extraction for FAQ-routed messages
-        # This runs AFTER the response is sent, so users don't wait for extraction
-        # NOTE: Extractor only updates fields_collected - never overwrites sales_stage/score/hotness
-        # set by the main pipeline to avoid race conditions
-        if crm_extraction_task:
-            try:
-                extraction_result = await asyncio.wait_for(crm_extraction_task, timeout=10.0)
-                if extraction_result and extraction_result.get("fields_collected"):
-                    merged_fields = dict(fields_collected)
-                    for k, v in extraction_result["fields_collected"].items():
-                        if v is not None and v != "":
-                            merged_fields[k] = v
-                    lead_update_data = {"fields_collected": merged_fields}
-                    # Update lead with extracted CRM fields only
-                    if existing_lead:
-                        supabase.table('leads').update(lead_update_data).eq('id', existing_lead['id']).execute()
-                    logger.info(f"CRM extractor updated lead with {len(extraction_result['fields_collected'])} fields")
-            except asyncio.TimeoutError:
-                logger.warning("CRM extractor timed out for FAQ-routed message")
-            except Exception as ext_err:
-                logger.warning(f"CRM extractor failed for FAQ-routed message: {ext_err}")
-
     except Exception as e:
         logger.exception(f"[{channel}] Error processing message")
+        annotate(route="error")
 
         # Send error message to user
         try:
@@ -8565,8 +7508,15 @@ async def process_channel_message(
             logger.error(f"Could not send error message: {send_error}")
 
 
-async def process_telegram_message(tenant_id: str, bot_token: str, update: Dict):
-    """Thin wrapper: parse Telegram update and delegate to process_channel_message."""
+@db_job("telegram_message")
+async def process_telegram_message(
+    tenant_id: str, bot_token: str, update: Dict,
+    received_ns: Optional[int] = None, enqueued_ns: Optional[int] = None,
+):
+    """Thin wrapper: parse Telegram update and delegate to process_channel_message.
+
+    received_ns / enqueued_ns (from the webhook) become the trace's
+    webhook_ack and queue_wait spans."""
     message = update.get("message", {})
     text = message.get("text", "")
     chat_id = message.get("chat", {}).get("id")
@@ -8622,6 +7572,8 @@ async def process_telegram_message(tenant_id: str, bot_token: str, update: Dict)
         bot_token=bot_token,
         chat_id=chat_id,
         telegram_message_id=tg_message_id,
+        received_ns=received_ns,
+        enqueued_ns=enqueued_ns,
     )
 
 
@@ -8644,7 +7596,7 @@ async def download_telegram_file(bot_token: str, file_id: str) -> Optional[bytes
         async with httpx.AsyncClient() as client:
             # Get file path
             resp = await client.get(
-                f"https://api.telegram.org/bot{bot_token}/getFile",
+                f"{TELEGRAM_API_BASE}{bot_token}/getFile",
                 params={"file_id": file_id},
                 timeout=30.0,
             )
@@ -8656,7 +7608,7 @@ async def download_telegram_file(bot_token: str, file_id: str) -> Optional[bytes
 
             # Download the file
             file_resp = await client.get(
-                f"https://api.telegram.org/file/bot{bot_token}/{file_path}",
+                f"{TELEGRAM_API_URL}/file/bot{bot_token}/{file_path}",
                 timeout=30.0,
             )
             if file_resp.status_code == 200:
@@ -8668,7 +7620,9 @@ async def download_telegram_file(bot_token: str, file_id: str) -> Optional[bytes
         return None
 
 
-async def transcribe_voice_message(audio_bytes: bytes, language: str = None) -> Tuple[str, bool]:
+async def transcribe_voice_message(
+    audio_bytes: bytes, language: str = None, tenant_id: str = None
+) -> Tuple[str, bool]:
     """Transcribe voice audio using OpenAI Whisper API.
 
     Returns:
@@ -8679,7 +7633,7 @@ async def transcribe_voice_message(audio_bytes: bytes, language: str = None) ->
         audio_file = _io.BytesIO(audio_bytes)
         audio_file.name = "voice.ogg"  # Telegram sends OGG format natively
 
-        kwargs = {"model": "whisper-1", "file": audio_file}
+        kwargs = {"file": audio_file}
         # Language hint for better accuracy
         if language:
             lang_map = {"uz": "uz", "ru": "ru", "en": "en", "tr": "tr", "ar": "ar"}
@@ -8687,9 +7641,8 @@ async def transcribe_voice_message(audio_bytes: bytes, language: str = None) ->
             if whisper_lang:
                 kwargs["language"] = whisper_lang
 
-        transcript = await asyncio.wait_for(
-            openai_client.audio.transcriptions.create(**kwargs),
-            timeout=30.0,
+        transcript = await get_gateway().transcribe(
+            model="whisper-1", tenant_id=tenant_id, timeout=30.0, **kwargs
         )
         text = transcript.text.strip() if transcript and transcript.text else ""
         return text, True
@@ -8723,6 +7676,7 @@ def validate_transcript(transcript: str, duration_seconds: int) -> tuple:
     return True, "ok"
 
 
+@db_job("telegram_voice_message")
 async def process_telegram_voice_message(tenant_id: str, bot_token: str, update: Dict):
     """Process a Telegram voice message: download, transcribe via Whisper, feed to sales agent."""
     try:
@@ -8776,7 +7730,9 @@ async def process_telegram_voice_message(tenant_id: str, bot_token: str, update:
             return
 
         # Transcribe
-        transcript, api_success = await transcribe_voice_message(audio_bytes, language=language_code)
+        transcript, api_success = await transcribe_voice_message(
+            audio_bytes, language=language_code, tenant_id=tenant_id
+        )
 
         # Log Whisper usage (even on failure — the API call was made)
         whisper_cost = calculate_whisper_cost(duration)
@@ -8843,6 +7799,7 @@ async def process_telegram_voice_message(tenant_id: str, bot_token: str, update:
             pass
 
 
+@db_job("telegram_reaction")
 async def process_telegram_reaction(tenant_id: str, bot_token: str, reaction_update: Dict):
     """Handle Telegram message_reaction updates — user reacted to a bot message with an emoji."""
     try:
@@ -8924,6 +7881,7 @@ async def process_telegram_reaction(tenant_id: str, bot_token: str, reaction_upd
         logger.exception(f"Error processing Telegram reaction: {e}")
 
 
+@db_job("instagram_message")
 async def process_instagram_message(tenant_id: str, access_token: str, sender_id: str, text: str):
     """Thin wrapper: process Instagram DM via process_channel_message."""
     try:
@@ -8950,6 +7908,7 @@ async def process_instagram_message(tenant_id: str, access_token: str, sender_id
         logger.error(f"Failed to process Instagram message from user_{redact_id(sender_id)} for tenant {redact_id(tenant_id)}: {e}")
 
 
+@traced("lead_update")
 async def update_lead_from_llm(tenant_id: str, customer: Dict, existing_lead: Optional[Dict], llm_result: Dict, source_channel: str = "telegram"):
     """Update lead with LLM analysis results"""
     now = now_iso()
@@ -9638,408 +8597,52 @@ async def get_agent_analytics(days: int = 7, current_user: Dict = Depends(get_cu
     }
 
 
-# ============ Token Usage Logs Endpoints ============
-
-# Map agent_type to the request_types that belong to that agent
-AGENT_TYPE_REQUEST_TYPES = {
-    'sales': ['sales_agent', 'sales_agent_faq', 'sales_agent_escalated', 'intent_classifier', 'embedding', 'summarization'],
-}
-
-@api_router.get("/usage/logs")
-async def get_usage_logs(
-    days: int = 7,
-    model: Optional[str] = None,
-    request_type: Optional[str] = None,
-    agent_type: Optional[str] = None,
-    page: int = 1,
-    limit: int = 50,
-    current_user: Dict = Depends(get_current_user)
-):
-    """Get paginated token usage logs for the tenant"""
-    days = clamp_days(days)
+# ============ Leads Endpoints ============
+@api_router.get("/leads")
+async def get_leads(status: Optional[str] = None, hotness: Optional[str] = None, stage: Optional[str] = None, search: Optional[str] = None, limit: int = 50, offset: int = 0, current_user: Dict = Depends(get_current_user)):
+    """Get leads with customer data - optimized to avoid N+1 queries"""
     limit = clamp_limit(limit)
-    page = clamp_page(page)
-    tenant_id = current_user["tenant_id"]
+    offset = clamp_offset(offset)
+    query = supabase.table('leads').select('*').eq('tenant_id', current_user["tenant_id"])
+    if status:
+        query = query.eq('status', status)
+    if hotness:
+        query = query.eq('final_hotness', hotness)
+    if stage:
+        query = query.eq('sales_stage', stage)
+    if search and search.strip():
+        search_term = search.strip()
+        # Use Supabase or_ filter for server-side search across customer_name and customer_phone
+        query = query.or_(f"customer_name.ilike.%{search_term}%,customer_phone.ilike.%{search_term}%")
 
     try:
-        # Calculate date range
-        start_date = datetime.now(timezone.utc) - timedelta(days=days)
-
-        # Build query — use count='exact' to get total count and data in a single request
-        offset = (page - 1) * limit
-        query = supabase.table('token_usage_logs').select('*', count='exact').eq('tenant_id', tenant_id).gte('created_at', start_date.isoformat())
-
-        # Apply filters
-        if model:
-            query = query.eq('model', model)
-        if request_type:
-            query = query.eq('request_type', request_type)
-        if agent_type and agent_type in AGENT_TYPE_REQUEST_TYPES:
-            query = query.in_('request_type', AGENT_TYPE_REQUEST_TYPES[agent_type])
-
         result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
-        total_count = result.count if result.count is not None else len(result.data or [])
-
-        logs = []
-        for log in (result.data or []):
-            logs.append({
-                "id": log["id"],
-                "model": log["model"],
-                "request_type": log["request_type"],
-                "input_tokens": log["input_tokens"],
-                "output_tokens": log["output_tokens"],
-                "total_tokens": log.get("total_tokens", log["input_tokens"] + log["output_tokens"]),
-                "cost_usd": float(log.get("cost_usd", 0)),
-                "created_at": log["created_at"]
-            })
-
-        return {
-            "logs": logs,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total": total_count,
-                "total_pages": (total_count + limit - 1) // limit
-            }
-        }
-
     except Exception as e:
-        logger.error(f"Error fetching usage logs: {e}")
-        return {"logs": [], "pagination": {"page": 1, "limit": limit, "total": 0, "total_pages": 0}}
+        logger.warning(f"Leads query error: {e}")
+        result = supabase.table('leads').select('*').eq('tenant_id', current_user["tenant_id"]).order('created_at', desc=True).range(offset, offset + limit - 1).execute()
 
+    leads = result.data or []
+    if not leads:
+        return []
 
-@api_router.get("/usage/summary")
-async def get_usage_summary(
-    days: int = 7,
-    agent_type: Optional[str] = None,
-    current_user: Dict = Depends(get_current_user)
-):
-    """Get usage summary stats for dashboard cards"""
-    days = clamp_days(days)
+    # Fetch all customers in ONE query instead of N queries (fixes N+1 problem)
+    # SECURITY: Include tenant_id filter for defense-in-depth
     tenant_id = current_user["tenant_id"]
+    customer_ids = list(set(lead['customer_id'] for lead in leads if lead.get('customer_id')))
+    customers_map = {}
+    if customer_ids:
+        try:
+            cust_result = supabase.table('customers').select('id, name, phone').in_('id', customer_ids).eq('tenant_id', tenant_id).execute()
+            customers_map = {c['id']: c for c in (cust_result.data or [])}
+        except Exception as e:
+            logger.warning(f"Failed to fetch customers: {e}")
 
-    try:
-        start_date = datetime.now(timezone.utc) - timedelta(days=days)
-        prev_start = start_date - timedelta(days=days)
-
-        # Current period stats
-        query = supabase.table('token_usage_logs').select('*').eq('tenant_id', tenant_id).gte('created_at', start_date.isoformat())
-        if agent_type and agent_type in AGENT_TYPE_REQUEST_TYPES:
-            query = query.in_('request_type', AGENT_TYPE_REQUEST_TYPES[agent_type])
-        result = query.execute()
-
-        current_logs = result.data or []
-
-        total_tokens = sum(log.get("total_tokens", log["input_tokens"] + log["output_tokens"]) for log in current_logs)
-        total_cost = sum(float(log.get("cost_usd", 0)) for log in current_logs)
-        total_requests = len(current_logs)
-
-        # Model breakdown
-        model_counts = {}
-        for log in current_logs:
-            model = log["model"]
-            model_counts[model] = model_counts.get(model, 0) + 1
-
-        most_used_model = max(model_counts.items(), key=lambda x: x[1])[0] if model_counts else "None"
-        most_used_pct = round(model_counts.get(most_used_model, 0) / total_requests * 100) if total_requests > 0 else 0
-
-        # Previous period for comparison
-        prev_query = supabase.table('token_usage_logs').select('*').eq('tenant_id', tenant_id).gte('created_at', prev_start.isoformat()).lt('created_at', start_date.isoformat())
-        if agent_type and agent_type in AGENT_TYPE_REQUEST_TYPES:
-            prev_query = prev_query.in_('request_type', AGENT_TYPE_REQUEST_TYPES[agent_type])
-        prev_result = prev_query.execute()
-
-        prev_logs = prev_result.data or []
-        prev_tokens = sum(log.get("total_tokens", log["input_tokens"] + log["output_tokens"]) for log in prev_logs)
-        prev_cost = sum(float(log.get("cost_usd", 0)) for log in prev_logs)
-        prev_requests = len(prev_logs)
-
-        # Calculate changes
-        tokens_change = round((total_tokens - prev_tokens) / prev_tokens * 100, 1) if prev_tokens > 0 else 0
-        cost_change = round((total_cost - prev_cost) / prev_cost * 100, 1) if prev_cost > 0 else 0
-        requests_change = round((total_requests - prev_requests) / prev_requests * 100, 1) if prev_requests > 0 else 0
-
-        return {
-            "total_tokens": {
-                "value": total_tokens,
-                "change": tokens_change
-            },
-            "total_cost": {
-                "value": round(total_cost, 4),
-                "change": cost_change
-            },
-            "total_requests": {
-                "value": total_requests,
-                "change": requests_change
-            },
-            "most_used_model": {
-                "name": most_used_model,
-                "percentage": most_used_pct
-            },
-            "model_breakdown": model_counts,
-            "period_days": days
-        }
-
-    except Exception as e:
-        logger.error(f"Error fetching usage summary: {e}")
-        return {
-            "total_tokens": {"value": 0, "change": 0},
-            "total_cost": {"value": 0, "change": 0},
-            "total_requests": {"value": 0, "change": 0},
-            "most_used_model": {"name": "None", "percentage": 0},
-            "model_breakdown": {},
-            "period_days": days
-        }
-
-
-@api_router.get("/usage/chart")
-async def get_usage_chart(
-    days: int = 7,
-    agent_type: Optional[str] = None,
-    current_user: Dict = Depends(get_current_user)
-):
-    """Get daily token usage for chart visualization"""
-    days = clamp_days(days)
-    tenant_id = current_user["tenant_id"]
-
-    try:
-        start_date = datetime.now(timezone.utc) - timedelta(days=days)
-
-        query = supabase.table('token_usage_logs').select('*').eq('tenant_id', tenant_id).gte('created_at', start_date.isoformat())
-        if agent_type and agent_type in AGENT_TYPE_REQUEST_TYPES:
-            query = query.in_('request_type', AGENT_TYPE_REQUEST_TYPES[agent_type])
-        result = query.execute()
-
-        logs = result.data or []
-
-        # Aggregate by day
-        daily_data = {}
-        for log in logs:
-            date_str = log["created_at"][:10]
-            if date_str not in daily_data:
-                daily_data[date_str] = {"tokens": 0, "cost": 0, "requests": 0}
-            daily_data[date_str]["tokens"] += log.get("total_tokens", log["input_tokens"] + log["output_tokens"])
-            daily_data[date_str]["cost"] += float(log.get("cost_usd", 0))
-            daily_data[date_str]["requests"] += 1
-
-        # Build chart data with all days (fill gaps with zeros)
-        chart_data = []
-        for i in range(days):
-            date = (datetime.now(timezone.utc) - timedelta(days=days - 1 - i)).strftime("%Y-%m-%d")
-            if date in daily_data:
-                chart_data.append({
-                    "date": date,
-                    "tokens": daily_data[date]["tokens"],
-                    "cost": round(daily_data[date]["cost"], 4),
-                    "requests": daily_data[date]["requests"]
-                })
-            else:
-                chart_data.append({
-                    "date": date,
-                    "tokens": 0,
-                    "cost": 0,
-                    "requests": 0
-                })
-
-        return {
-            "chart_data": chart_data,
-            "period_days": days
-        }
-
-    except Exception as e:
-        logger.error(f"Error fetching usage chart data: {e}")
-        return {
-            "chart_data": [],
-            "period_days": days
-        }
-
-
-@api_router.get("/usage/conversation-stats")
-async def get_conversation_stats(
-    days: int = 30,
-    page: int = 1,
-    limit: int = 20,
-    current_user: Dict = Depends(get_current_user)
-):
-    """Per-conversation cost metrics with customer info."""
-    tenant_id = current_user["tenant_id"]
-    # Validate and bound query parameters
-    days = max(1, min(days, 365))
-    page = max(1, page)
-    limit = max(1, min(limit, 100))
-    start_date = datetime.now(timezone.utc) - timedelta(days=days)
-
-    try:
-        # Query conversations with usage data, joined with customer name
-        result = supabase.table('conversations').select(
-            'id, customer_id, source_channel, started_at, message_count, total_input_tokens, total_output_tokens, total_cost_usd, customers(name, telegram_username)'
-        ).eq('tenant_id', tenant_id).gte(
-            'started_at', start_date.isoformat()
-        ).gt('message_count', 0).order(
-            'started_at', desc=True
-        ).range((page - 1) * limit, page * limit - 1).execute()
-
-        conversations = []
-        for c in (result.data or []):
-            customer = c.get('customers') or {}
-            conversations.append({
-                'conversation_id': c['id'],
-                'customer_name': customer.get('name') or customer.get('telegram_username') or 'Unknown',
-                'source_channel': c.get('source_channel', 'telegram'),
-                'message_count': c.get('message_count', 0),
-                'total_input_tokens': c.get('total_input_tokens', 0),
-                'total_output_tokens': c.get('total_output_tokens', 0),
-                'total_cost_usd': float(c.get('total_cost_usd') or 0),
-                'started_at': c['started_at'],
-            })
-
-        # Get total count
-        count_result = supabase.table('conversations').select(
-            'id', count='exact'
-        ).eq('tenant_id', tenant_id).gte(
-            'started_at', start_date.isoformat()
-        ).gt('message_count', 0).execute()
-        total = count_result.count or len(conversations)
-
-        return {
-            'conversations': conversations,
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total,
-                'total_pages': (total + limit - 1) // limit
-            }
-        }
-
-    except Exception as e:
-        logger.error(f"Error fetching conversation stats: {e}")
-        return {
-            'conversations': [],
-            'pagination': {'page': page, 'limit': limit, 'total': 0, 'total_pages': 0}
-        }
-
-
-@api_router.get("/usage/model-distribution")
-async def get_model_distribution(
-    days: int = 7,
-    agent_type: Optional[str] = None,
-    current_user: Dict = Depends(get_current_user)
-):
-    """Model usage breakdown with costs."""
-    tenant_id = current_user["tenant_id"]
-    days = max(1, min(days, 365))  # Bound days to 1-365
-    start_date = datetime.now(timezone.utc) - timedelta(days=days)
-    allowed_types = AGENT_TYPE_REQUEST_TYPES.get(agent_type) if agent_type else None
-
-    try:
-        # Use server-side aggregation via Supabase RPC to avoid PostgREST row limits
-        result = supabase.rpc('get_model_distribution_agg', {
-            'p_tenant_id': tenant_id,
-            'p_start_date': start_date.isoformat(),
-        }).execute()
-
-        rows = result.data or []
-
-        models = {}
-        routes = {'mini': 0, 'full': 0, 'escalated': 0}
-        for row in rows:
-            model = row.get('model', '')
-            rt = row.get('request_type', '') or ''
-            count = int(row.get('cnt', 0))
-            tokens = int(row.get('total_tokens', 0))
-            cost = float(row.get('total_cost', 0))
-
-            # Filter by agent_type if specified
-            if allowed_types and rt not in allowed_types:
-                continue
-
-            # Skip escalation markers from model counts (they have 0 tokens
-            # and would inflate request counts; actual tokens are in the
-            # 'sales_agent' entry from the escalated call_sales_agent)
-            if rt == 'sales_agent_escalated':
-                routes['escalated'] += count
-                continue
-
-            if model not in models:
-                models[model] = {'requests': 0, 'tokens': 0, 'cost': 0}
-            models[model]['requests'] += count
-            models[model]['tokens'] += tokens
-            models[model]['cost'] += cost
-
-            if rt == 'sales_agent_faq':
-                routes['mini'] += count
-            elif rt == 'sales_agent':
-                routes['full'] += count
-
-        # Round costs
-        for m in models:
-            models[m]['cost'] = round(models[m]['cost'], 4)
-
-        total_requests = sum(m['requests'] for m in models.values())
-
-        return {
-            'models': models,
-            'routes': routes,
-            'total_requests': total_requests,
-            'period_days': days
-        }
-
-    except Exception as e:
-        logger.error(f"Error fetching model distribution: {e}")
-        return {
-            'models': {},
-            'routes': {'mini': 0, 'full': 0, 'escalated': 0},
-            'total_requests': 0,
-            'period_days': days
-        }
-
-
-# ============ Leads Endpoints ============
-@api_router.get("/leads")
-async def get_leads(status: Optional[str] = None, hotness: Optional[str] = None, stage: Optional[str] = None, search: Optional[str] = None, limit: int = 50, offset: int = 0, current_user: Dict = Depends(get_current_user)):
-    """Get leads with customer data - optimized to avoid N+1 queries"""
-    limit = clamp_limit(limit)
-    offset = clamp_offset(offset)
-    query = supabase.table('leads').select('*').eq('tenant_id', current_user["tenant_id"])
-    if status:
-        query = query.eq('status', status)
-    if hotness:
-        query = query.eq('final_hotness', hotness)
-    if stage:
-        query = query.eq('sales_stage', stage)
-    if search and search.strip():
-        search_term = search.strip()
-        # Use Supabase or_ filter for server-side search across customer_name and customer_phone
-        query = query.or_(f"customer_name.ilike.%{search_term}%,customer_phone.ilike.%{search_term}%")
-
-    try:
-        result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
-    except Exception as e:
-        logger.warning(f"Leads query error: {e}")
-        result = supabase.table('leads').select('*').eq('tenant_id', current_user["tenant_id"]).order('created_at', desc=True).range(offset, offset + limit - 1).execute()
-
-    leads = result.data or []
-    if not leads:
-        return []
-
-    # Fetch all customers in ONE query instead of N queries (fixes N+1 problem)
-    # SECURITY: Include tenant_id filter for defense-in-depth
-    tenant_id = current_user["tenant_id"]
-    customer_ids = list(set(lead['customer_id'] for lead in leads if lead.get('customer_id')))
-    customers_map = {}
-    if customer_ids:
-        try:
-            cust_result = supabase.table('customers').select('id, name, phone').in_('id', customer_ids).eq('tenant_id', tenant_id).execute()
-            customers_map = {c['id']: c for c in (cust_result.data or [])}
-        except Exception as e:
-            logger.warning(f"Failed to fetch customers: {e}")
-
-    response = []
-    for lead in leads:
-        customer = customers_map.get(lead.get('customer_id'))
-        # Prefer lead's collected data, fallback to customer record
-        customer_name = lead.get("customer_name") or (customer.get("name") if customer else None)
-        customer_phone = lead.get("customer_phone") or (customer.get("phone") if customer else None)
+    response = []
+    for lead in leads:
+        customer = customers_map.get(lead.get('customer_id'))
+        # Prefer lead's collected data, fallback to customer record
+        customer_name = lead.get("customer_name") or (customer.get("name") if customer else None)
+        customer_phone = lead.get("customer_phone") or (customer.get("phone") if customer else None)
 
         response.append({
             "id": lead["id"],
@@ -10241,7 +8844,7 @@ async def list_conversations(
         # For simple filters (all, ongoing) we can paginate server-side with .range().
         needs_post_filter = bool(search) or filter in ('hot', 'warm', 'cold')
 
-        query = supabase.table('conversations').select('*', count='exact').eq('tenant_id', tenant_id)
+        query = supabase.table('conversations').select('*', count=CountMode.ESTIMATED.postgrest).eq('tenant_id', tenant_id)
 
         # Filter by ongoing (last_message_at within 15 minutes)
         if filter == "ongoing":
@@ -10443,6 +9046,7 @@ async def get_tenant_config(current_user: Dict = Depends(get_current_user)):
         "secondary_languages": config.get("secondary_languages"),
         "min_response_delay": config.get("min_response_delay"),
         "max_messages_per_minute": config.get("max_messages_per_minute"),
+        "streaming_replies": config.get("streaming_replies", False),
         # Data collection fields - Essential
         "collect_name": config.get("collect_name", True),
         "collect_phone": config.get("collect_phone", True),
@@ -10484,7 +9088,7 @@ async def update_tenant_config(request: TenantConfigUpdate, current_user: Dict =
         'business_name', 'business_description', 'products_services', 'vertical',
         'greeting_message', 'closing_message', 'agent_tone', 'response_length',
         'emoji_usage', 'primary_language', 'secondary_languages',
-        'min_response_delay', 'max_messages_per_minute', 'faq_objections',
+        'min_response_delay', 'max_messages_per_minute', 'streaming_replies', 'faq_objections',
         'lead_fields_json', 'qualification_rules_json',
         'bitrix_webhook_url', 'bitrix_connected_at',
         # Data collection fields
@@ -10520,7 +9124,8 @@ async def update_tenant_config(request: TenantConfigUpdate, current_user: Dict =
     else:
         update_data["tenant_id"] = current_user["tenant_id"]
         supabase.table('tenant_configs').insert(update_data).execute()
-    
+    invalidate_system_prompt_prefix(current_user["tenant_id"])
+
     return {"success": True, "tenant_id": current_user["tenant_id"]}
 
 
@@ -10566,15 +9171,6 @@ MAGIC_BYTES = {
 # Allowed document extensions for upload
 ALLOWED_DOCUMENT_EXTENSIONS = {'pdf', 'docx', 'xlsx', 'xls', 'csv', 'txt'}
 
-# Allowed REST API table names (prevents injection via db_rest_select)
-ALLOWED_REST_TABLES = {
-    'tenants', 'users', 'tenant_configs', 'telegram_bots', 'leads', 'customers',
-    'conversations', 'messages', 'documents', 'event_logs', 'token_usage_logs',
-    'token_blacklist', 'instagram_accounts', 'dashboard_configs',
-    'dashboard_widgets', 'dashboard_chat_messages', 'crm_data_cache',
-    'media_library', 'crm_sync_status',
-}
-
 def validate_file_magic(content: bytes, filename: str) -> bool:
     """Validate file content matches expected magic bytes for the file extension."""
     if not filename or '.' not in filename:
@@ -10589,7 +9185,28 @@ def validate_file_magic(content: bytes, filename: str) -> bool:
 
 # In-memory cache for document embeddings (per tenant)
 # This cache is populated from DB on first access
-document_embeddings_cache = {}
+EMBEDDINGS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+GLOBAL_EMBEDDINGS_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+
+def _embedding_entry_size(doc_data: Dict) -> int:
+    """Approximate in-memory size of one cached document: float lists dominate."""
+    size = 0
+    for chunk in doc_data.get("chunks") or []:
+        size += len(chunk.get("text") or "") + 32 * len(chunk.get("embedding") or ()) + 256
+    return size + 512
+
+
+def _on_tenant_embeddings_evicted(doc_id: str, doc_data: Dict) -> None:
+    # The tenant's set is now partial; reload it from DB on next use
+    _cache_loaded_tenants.discard(doc_data.get("tenant_id"))
+
+
+# doc_id -> {"chunks", "chunk_count", "tenant_id"}; no TTL, bounded by size (LRU)
+document_embeddings_cache = TTLCache(
+    "document_embeddings", ttl=None, max_entries=50_000, max_bytes=EMBEDDINGS_CACHE_MAX_BYTES,
+    sizeof=_embedding_entry_size, on_evict=_on_tenant_embeddings_evicted,
+)
 _cache_loaded_tenants = set()  # Track which tenants have been loaded
 
 
@@ -10963,8 +9580,7 @@ async def delete_document(doc_id: str, current_user: Dict = Depends(get_current_
     # SECURITY: Include tenant_id in delete for defense-in-depth against IDOR
     supabase.table('documents').delete().eq('id', doc_id).eq('tenant_id', tenant_id).execute()
     # Also remove from cache
-    if doc_id in document_embeddings_cache:
-        del document_embeddings_cache[doc_id]
+    document_embeddings_cache.pop(doc_id, None)
     return {"success": True}
 
 
@@ -11007,7 +9623,15 @@ async def search_documents(
 # ============ Global Knowledge Base Endpoints ============
 
 # Cache for global document embeddings
-global_document_embeddings_cache = {}
+def _on_global_embeddings_evicted(doc_id: str, doc_data: Dict) -> None:
+    global _global_cache_loaded
+    _global_cache_loaded = False
+
+
+global_document_embeddings_cache = TTLCache(
+    "global_document_embeddings", ttl=None, max_entries=5_000, max_bytes=GLOBAL_EMBEDDINGS_CACHE_MAX_BYTES,
+    sizeof=_embedding_entry_size, on_evict=_on_global_embeddings_evicted,
+)
 _global_cache_loaded = False
 
 
@@ -11301,8 +9925,7 @@ async def delete_global_document(doc_id: str, current_user: Dict = Depends(get_c
         supabase.table('documents').delete().eq('id', doc_id).execute()
 
         # Remove from cache
-        if doc_id in global_document_embeddings_cache:
-            del global_document_embeddings_cache[doc_id]
+        global_document_embeddings_cache.pop(doc_id, None)
 
         logger.info(f"Global document deleted: {doc_id}")
         return {"success": True}
@@ -11614,9 +10237,7 @@ async def delete_agent(agent_id: str, current_user: Dict = Depends(get_current_u
         try:
             supabase.table('documents').delete().eq('tenant_id', tenant_id).execute()
             global document_embeddings_cache, _cache_loaded_tenants
-            keys_to_delete = [k for k in document_embeddings_cache if k.startswith(tenant_id)]
-            for k in keys_to_delete:
-                del document_embeddings_cache[k]
+            document_embeddings_cache.invalidate(lambda k: k.startswith(tenant_id))
             _cache_loaded_tenants.discard(tenant_id)
             logger.info(f"Deleted documents for agent {agent_id}")
         except Exception as e:
@@ -11661,8 +10282,7 @@ async def delete_agent(agent_id: str, current_user: Dict = Depends(get_current_u
             logger.warning(f"Could not delete telegram bot: {e}")
 
         # 13. Clear Bitrix webhook from cache
-        if tenant_id in _bitrix_webhooks_cache:
-            del _bitrix_webhooks_cache[tenant_id]
+        invalidate_everywhere(_bitrix_webhooks_cache, tenant_id)
 
         # 14. Full config reset to factory defaults (complete fresh start)
         try:
@@ -11682,6 +10302,7 @@ async def delete_agent(agent_id: str, current_user: Dict = Depends(get_current_u
                 "secondary_languages": None,
                 "min_response_delay": None,
                 "max_messages_per_minute": None,
+                "streaming_replies": False,
                 "vertical": None,
                 "prebuilt_type": None,
                 "google_sheet_id": None,
@@ -11707,6 +10328,7 @@ async def delete_agent(agent_id: str, current_user: Dict = Depends(get_current_u
                 # Hired prebuilt employees
                 "hired_prebuilt": "[]",
             }).eq('tenant_id', tenant_id).execute()
+            invalidate_system_prompt_prefix(tenant_id)
             logger.info(f"Full config reset for agent {agent_id}")
         except Exception as e:
             logger.warning(f"Could not reset config: {e}")
@@ -11730,7 +10352,7 @@ async def test_chat(request: TestChatRequest, current_user: Dict = Depends(get_c
     """
     try:
         tenant_id = current_user["tenant_id"]
-        check_llm_rate_limit(tenant_id)
+        await check_llm_rate_limit(tenant_id)
 
         # Get config
         config_result = supabase.table('tenant_configs').select('*').eq('tenant_id', tenant_id).execute()
@@ -11840,7 +10462,7 @@ async def test_chat_media(
     """
     try:
         tenant_id = current_user["tenant_id"]
-        check_llm_rate_limit(tenant_id)
+        await check_llm_rate_limit(tenant_id)
 
         # Parse conversation history
         try:
@@ -11868,7 +10490,7 @@ async def test_chat_media(
                 raise HTTPException(status_code=400, detail=f"Unsupported audio format: .{ext}")
 
             # Transcribe via Whisper
-            text, api_success = await transcribe_voice_message(file_content)
+            text, api_success = await transcribe_voice_message(file_content, tenant_id=tenant_id)
             if not api_success or not text:
                 raise HTTPException(status_code=422, detail="Could not transcribe audio. Please try again or type your message.")
 
@@ -12153,8 +10775,6 @@ async def instagram_webhook_receive(request: Request, background_tasks: Backgrou
         if not messages:
             return {"ok": True}
 
-        now = datetime.now(timezone.utc).timestamp()
-
         for msg in messages:
             page_id = msg["page_id"]
             sender_id = msg["sender_id"]
@@ -12162,18 +10782,9 @@ async def instagram_webhook_receive(request: Request, background_tasks: Backgrou
             message_id = msg.get("message_id")
 
             # --- Deduplication ---
-            if message_id:
-                if message_id in _instagram_dedup_cache:
-                    cached_ts = _instagram_dedup_cache[message_id]
-                    if now - cached_ts < INSTAGRAM_DEDUP_TTL:
-                        logger.debug(f"Skipping duplicate Instagram message {message_id}")
-                        continue
-                _instagram_dedup_cache[message_id] = now
-                # Prune expired entries when cache gets large
-                if len(_instagram_dedup_cache) > 1000:
-                    expired = [k for k, v in _instagram_dedup_cache.items() if now - v >= INSTAGRAM_DEDUP_TTL]
-                    for k in expired:
-                        del _instagram_dedup_cache[k]
+            if message_id and not await is_first_delivery("instagram", message_id, INSTAGRAM_DEDUP_TTL):
+                logger.debug(f"Skipping duplicate Instagram message {message_id}")
+                continue
 
             # Truncate overly long messages
             if len(text) > 4000:
@@ -12181,7 +10792,7 @@ async def instagram_webhook_receive(request: Request, background_tasks: Backgrou
 
             # Rate limit
             rate_key = f"ig_{sender_id}"
-            if not message_rate_limiter.is_allowed(rate_key):
+            if not await message_rate_limiter.hit(rate_key):
                 logger.warning(f"Rate limit exceeded for IG user {redact_id(sender_id)}")
                 continue
 
@@ -12267,11 +10878,18 @@ async def refresh_instagram_tokens_loop():
             logger.error(f"Instagram token refresh loop error: {e}")
 
 
-@app.on_event("startup")
+# ============ Startup Hooks ============
+# Run concurrently from one startup handler (startup_hooks.py) instead of one after another
+startup = StartupHooks()
+
+
+@startup.hook
 async def load_token_blacklist():
     """Load persisted token blacklist from DB on startup."""
     try:
-        result = supabase.table('token_blacklist').select('jti, expires_at').gte('expires_at', now_iso()).execute()
+        result = await asyncio.to_thread(
+            lambda: supabase.table('token_blacklist').select('jti, expires_at').gte('expires_at', now_iso()).execute()
+        )
         if result.data:
             for row in result.data:
                 # Store with expiry for cleanup; parse ISO timestamp to epoch
@@ -12284,14 +10902,7 @@ async def load_token_blacklist():
     except Exception as e:
         logger.warning(f"Could not load token blacklist (table may not exist yet): {e}")
 
-@app.on_event("startup")
-async def start_instagram_token_refresh():
-    """Launch the Instagram token refresh background task."""
-    if META_APP_ID and META_APP_SECRET:
-        asyncio.create_task(refresh_instagram_tokens_loop())
-        logger.info("Instagram token refresh loop started")
-
-@app.on_event("startup")
+@startup.hook(background=True)
 async def register_shared_bot_webhook():
     """Register webhook for the shared LeadRelay bot used for Telegram Business connections."""
     if LEADRELAY_BOT_TOKEN:
@@ -12327,9 +10938,8 @@ async def periodic_cleanup():
         try:
             await asyncio.sleep(600)  # Every 10 minutes
 
-            # Clean rate limiters
-            message_rate_limiter.cleanup()
-            llm_rate_limiter.cleanup()
+            # Clean idle rate-limit keys (in-memory backend / Redis fallback)
+            get_shared_state().cleanup()
 
             # Clean expired token blacklist entries
             now = time.time()
@@ -12339,17 +10949,11 @@ async def periodic_cleanup():
             if expired_jtis:
                 logger.debug(f"Cleaned {len(expired_jtis)} expired blacklist entries")
 
-            # Clean Instagram dedup cache
-            expired_dedup = [mid for mid, ts in _instagram_dedup_cache.items()
-                            if now - ts > INSTAGRAM_DEDUP_TTL]
-            for mid in expired_dedup:
-                del _instagram_dedup_cache[mid]
-
-            # Clean Telegram dedup cache
-            expired_tg_dedup = [uid for uid, ts in _telegram_dedup_cache.items()
-                               if now - ts > TELEGRAM_DEDUP_TTL]
-            for uid in expired_tg_dedup:
-                del _telegram_dedup_cache[uid]
+            # Expire TTLCache entries (dedup, user-exists, catalogs, ...) —
+            # heap-ordered, so this only touches entries that are due
+            purged = purge_expired_caches()
+            if purged:
+                logger.debug(f"Purged {purged} expired cache entries")
 
             # Clean auth rate limiter (includes lockout entries)
             expired_auth = [ip for ip, entry in auth_rate_limiter.items()
@@ -12357,34 +10961,86 @@ async def periodic_cleanup():
             for ip in expired_auth:
                 del auth_rate_limiter[ip]
 
-            # Clean user-exists cache
-            expired_users = [uid for uid, exp in _user_exists_cache.items() if now > exp]
-            for uid in expired_users:
-                del _user_exists_cache[uid]
-
         except Exception as e:
             logger.warning(f"Periodic cleanup error: {e}")
 
 
-@app.on_event("startup")
+@startup.hook
 async def start_periodic_cleanup():
     """Launch periodic memory cleanup task."""
     asyncio.create_task(periodic_cleanup())
     logger.info("Periodic memory cleanup task started (every 10 minutes)")
 
 
+@startup.hook
+async def start_shared_state():
+    """Connect the cross-worker shared state and its pub/sub listener."""
+    state = get_shared_state()
+    await state.start()
+    logger.info(f"Shared state backend: {type(state).__name__}")
+
+
+@startup.hook
+async def start_telemetry_sink():
+    """Start the background flusher for buffered telemetry writes."""
+    await telemetry_sink.start()
+
+
+@app.on_event("shutdown")
+async def flush_telemetry_sink():
+    """Drain buffered token usage, traces and event logs before exit."""
+    await telemetry_sink.stop()
+    logger.info(f"Telemetry sink drained: {telemetry_sink.stats()}")
+
+
+# ============ Singleton Background Jobs ============
+# CRM sync loops and the Instagram token refresher run on the elected leader only,
+# so adding workers does not multiply background load (leader_election.py).
+leader_elector = LeaderElector(supabase)
+set_elector(leader_elector)
+
+
+@startup.hook
+async def start_leader_election():
+    """Register the singleton jobs and start competing for the leader lease."""
+    leader_elector.singleton("crm_sync_loops", lambda: run_sync_reconciler(supabase))
+    if META_APP_ID and META_APP_SECRET:
+        leader_elector.singleton("instagram_token_refresh", refresh_instagram_tokens_loop)
+    leader_elector.on_demoted(stop_local_sync_loops)
+    await leader_elector.start()
+    logger.info(f"Leader election started as {leader_elector.holder_id}")
+
+
 @app.on_event("startup")
-async def resume_crm_sync_loops():
-    """Resume incremental sync loops for all active CRM connections on startup."""
-    try:
-        await resume_all_sync_loops(supabase)
-        logger.info("CRM sync loops resumed on startup")
-    except Exception as e:
-        logger.warning(f"Failed to resume CRM sync loops: {e}")
+async def run_startup_hooks():
+    await startup.run()
+
+
+@app.on_event("shutdown")
+async def stop_leader_election():
+    """Hand the lease to another worker before exiting."""
+    await leader_elector.stop()
+
+
+@app.on_event("shutdown")
+async def close_shared_state():
+    await get_shared_state().close()
+
+
+@startup.hook
+async def start_loop_watchdog():
+    """Opt-in event-loop stall sampling (LOOP_WATCHDOG_MS); see /api/admin/loop-stats."""
+    await start_watchdog()
+
+
+@app.on_event("shutdown")
+async def stop_loop_watchdog():
+    await stop_watchdog()
 
 
 # ============ Media Library Functions ============
 
+@traced("media_context")
 async def get_media_context_for_ai(tenant_id: str) -> Optional[str]:
     """
     Get media library context for AI system prompt.
@@ -12737,601 +11393,49 @@ async def get_media_by_name(name: str, current_user: Dict = Depends(get_current_
         raise HTTPException(status_code=500, detail="An internal error occurred. Please try again.")
 
 
-# ============ Revenue Model Endpoints ============
-
-class RevenueModelConfirmRequest(BaseModel):
-    """Body for POST /revenue/model/confirm."""
-    won_stage_values: List[str] = Field(..., min_items=1, description="Stages that mean WON")
-    lost_stage_values: List[str] = Field(..., min_items=1, description="Stages that mean LOST")
-    stage_order: List[str] = Field(default_factory=list, description="Full ordered stage list")
-    # Optional field-name overrides (defaults match normalized crm_deals column names)
-    deal_stage_field: str = Field(default="stage")
-    amount_field: str = Field(default="value")
-    close_date_field: str = Field(default="closed_at")
-    created_date_field: str = Field(default="created_at")
-    owner_field: str = Field(default="assigned_to")
-    currency_field: str = Field(default="currency")
-    # Carry-forward confidence + rationale from the proposal so they're stored alongside the model
-    confidence_json: dict = Field(default_factory=dict)
-    rationale_json: dict = Field(default_factory=dict)
-
-
-@api_router.post("/revenue/model/propose")
-async def revenue_model_propose(current_user: Dict = Depends(get_current_user)):
-    """
-    Inspect this tenant's synced crm_deals and return a proposed revenue model.
-
-    Response shape:
-    {
-        "status": "confirmed" | "proposed",
-        "model": { ... }        # if already confirmed
-        "proposal": { ... }     # if freshly built (includes questions[] when confidence < threshold)
-    }
-
-    Hard rule: confidence below threshold → questions[] is non-empty →
-    the caller MUST surface those questions and call /revenue/model/confirm
-    with the user's explicit answers before treating any stage as won/lost.
-    """
-    tenant_id = current_user["tenant_id"]
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(
-            status_code=400,
-            detail="No active CRM connection found. Connect your CRM before building a revenue model."
-        )
-
-    # Return already-confirmed model immediately (no need to re-propose)
-    try:
-        existing = (
-            supabase.table("revenue_models")
-            .select("*")
-            .eq("tenant_id", tenant_id)
-            .eq("crm_source", crm_source)
-            .limit(1)
-            .execute()
-        )
-        if existing.data and existing.data[0].get("confirmed_at"):
-            return {"status": "confirmed", "model": existing.data[0]}
-    except Exception as e:
-        logger.warning("revenue_model_propose: could not check existing model: %s", e)
-
-    # Build fresh proposal from crm_deals
-    try:
-        from revenue.model_builder import build_proposal
-        from dataclasses import asdict as _asdict
-        proposal = await build_proposal(supabase, tenant_id, crm_source)
-        return {"status": "proposed", "proposal": _asdict(proposal)}
-    except Exception as e:
-        logger.exception("revenue_model_propose: build_proposal failed")
-        raise HTTPException(status_code=500, detail=f"Failed to build revenue model proposal: {e}")
-
-
-@api_router.post("/revenue/model/confirm")
-async def revenue_model_confirm(
-    body: RevenueModelConfirmRequest,
-    current_user: Dict = Depends(get_current_user),
-):
-    """
-    Save a user-confirmed revenue model for this tenant.
-
-    Validation:
-    - won_stage_values must not be empty.
-    - lost_stage_values must not be empty.
-    - The two lists must not overlap (a stage cannot be both won and lost).
-
-    After a successful call, subsequent calls to /revenue/model/propose will
-    return status='confirmed' without rebuilding the proposal.
-    """
-    tenant_id = current_user["tenant_id"]
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(
-            status_code=400,
-            detail="No active CRM connection found."
-        )
-
-    # Overlap guard — hard rule: a stage cannot be both won and lost.
-    overlap = set(body.won_stage_values) & set(body.lost_stage_values)
-    if overlap:
-        raise HTTPException(
-            status_code=422,
-            detail=f"Stages cannot be both WON and LOST: {sorted(overlap)}"
-        )
-
-    now_ts = datetime.now(timezone.utc).isoformat()
-    model_row = {
-        "tenant_id": tenant_id,
-        "crm_source": crm_source,
-        "deal_stage_field": body.deal_stage_field,
-        "amount_field": body.amount_field,
-        "close_date_field": body.close_date_field,
-        "created_date_field": body.created_date_field,
-        "owner_field": body.owner_field,
-        "currency_field": body.currency_field,
-        "won_stage_values": body.won_stage_values,
-        "lost_stage_values": body.lost_stage_values,
-        "stage_order": body.stage_order,
-        "confidence_json": body.confidence_json,
-        "rationale_json": body.rationale_json,
-        "confirmed_at": now_ts,
-        "updated_at": now_ts,
-    }
-
-    try:
-        result = (
-            supabase.table("revenue_models")
-            .upsert(model_row, on_conflict="tenant_id,crm_source")
-            .execute()
-        )
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Failed to save revenue model.")
-        return {"status": "confirmed", "model": result.data[0]}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("revenue_model_confirm: upsert failed")
-        raise HTTPException(status_code=500, detail=f"Failed to save revenue model: {e}")
-
-
-# ============ Revenue Metrics Endpoints ============
-
-class MetricQueryRequest(BaseModel):
-    """Body for POST /revenue/metrics/query."""
-    metric_key: str = Field(..., description="Metric key from GET /revenue/metrics")
-    dimension: Optional[str] = Field(default=None, description="Optional grouping dimension (e.g. 'assigned_to')")
-    time_range_days: Optional[int] = Field(default=None, ge=1, le=3650, description="Look-back window in days")
-    time_grain: Optional[str] = Field(default=None, description="Rollup grain: 'day' | 'week' | 'month' | 'quarter'")
-
-
-@api_router.get("/revenue/metrics")
-async def revenue_metrics_catalog(current_user: Dict = Depends(get_current_user)):
-    """
-    Return all 12 metric definitions with availability flags and data-trust scores.
-
-    Does NOT compute actual metric values — only metadata.  Callers should use
-    this endpoint to decide which metrics to surface in the UI and whether to
-    warn the user about data-quality issues before they see a number.
-
-    Response shape:
-    {
-        "metrics": [
-            {
-                "key": "win_rate",
-                "title": "Win Rate",
-                "description": "...",
-                "available": true,
-                "data_trust_score": 0.87,
-                "requires_revenue_model": false,
-                "allowed_dimensions": ["assigned_to"],
-                "allowed_time_grains": ["day", "week", "month", "quarter"],
-                "evidence": { "row_count": 245, "null_rates": {...} }
-            }, ...
-        ],
-        "revenue_model_confirmed": true,
-        "computed_at": "2026-02-19T..."
-    }
-    """
-    tenant_id = current_user["tenant_id"]
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(
-            status_code=400,
-            detail="No active CRM connection found. Connect your CRM before querying metrics."
-        )
-
-    try:
-        from revenue.metric_catalog import get_catalog_with_trust
-        from dataclasses import asdict as _asdict
-
-        metrics = await get_catalog_with_trust(supabase, tenant_id, crm_source)
-
-        # Check whether a confirmed revenue model exists
-        rev_model_row = (
-            supabase.table("revenue_models")
-            .select("confirmed_at")
-            .eq("tenant_id", tenant_id)
-            .eq("crm_source", crm_source)
-            .limit(1)
-            .execute()
-        )
-        revenue_model_confirmed = bool(
-            rev_model_row.data and rev_model_row.data[0].get("confirmed_at")
-        )
-
-        return {
-            "metrics": metrics,
-            "revenue_model_confirmed": revenue_model_confirmed,
-            "computed_at": datetime.now(timezone.utc).isoformat(),
-        }
-    except Exception as e:
-        logger.exception("revenue_metrics_catalog failed")
-        raise HTTPException(status_code=500, detail=f"Failed to build metrics catalog: {e}")
+# ============ Health Check ============
+@api_router.get("/")
+async def root():
+    return {"message": "LeadRelay API - AI Sales Automation", "version": "2.0", "features": ["sales_pipeline", "objection_handling", "closing_scripts", "bitrix24_oauth", "instagram_dm", "image_responses"]}
 
 
-@api_router.post("/revenue/metrics/query")
-async def revenue_metrics_query(
-    body: MetricQueryRequest,
-    current_user: Dict = Depends(get_current_user),
-):
-    """
-    Execute a single metric computation and return the result with evidence.
+@api_router.get("/health")
+async def health_check():
+    return {"status": "healthy", "timestamp": now_iso(), "database": "supabase"}
 
-    Validation before any DB query:
-    - metric_key must be a known catalog entry.
-    - dimension (if provided) must be in the metric's allowed_dimensions.
-    - All required tables must have data for this tenant.
 
-    Response shape:
-    {
-        "metric_key": "win_rate",
-        "title": "Win Rate",
-        "value": "34.2%",
-        "chart_type": "kpi",
-        "data": [],
-        "dimension": null,
-        "evidence": {
-            "row_count": 245,
-            "sampled_rows": 245,
-            "timeframe": "Last 90 days",
-            "fields_evaluated": ["won", "created_at"],
-            "null_rates": {"won": 0.02},
-            "data_trust_score": 0.87,
-            "computation_notes": []
-        },
-        "warnings": [],
-        "errors": []
+@api_router.get("/admin/cache-stats")
+async def admin_cache_stats(current_user: Dict = Depends(get_current_user)):
+    """Hit rates, sizes and evictions of every in-process TTLCache."""
+    require_super_admin(current_user)
+    return {
+        "timestamp": now_iso(),
+        "caches": all_cache_stats(),
+        "shared_state": get_shared_state().stats(),
+        "leader": get_leader_stats(),
+        "startup": startup.stats(),
     }
-    """
-    tenant_id = current_user["tenant_id"]
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(
-            status_code=400,
-            detail="No active CRM connection found."
-        )
-
-    try:
-        from revenue.metric_catalog import MetricValidator, compute_metric
-        from dataclasses import asdict as _asdict
-
-        validator = MetricValidator()
-        ok, reason, _ = await validator.validate(
-            supabase, tenant_id, crm_source,
-            body.metric_key, body.dimension,
-        )
-        if not ok:
-            raise HTTPException(status_code=422, detail=reason)
-
-        result = await compute_metric(
-            metric_key=body.metric_key,
-            supabase=supabase,
-            tenant_id=tenant_id,
-            crm_source=crm_source,
-            dimension=body.dimension,
-            time_range_days=body.time_range_days,
-            time_grain=body.time_grain,
-        )
-
-        return {
-            "metric_key": result.metric_key,
-            "title": result.title,
-            "value": result.value,
-            "chart_type": result.chart_type,
-            "data": result.data,
-            "dimension": result.dimension,
-            "evidence": {
-                "row_count": result.evidence.row_count,
-                "sampled_rows": result.evidence.sampled_rows,
-                "timeframe": result.evidence.timeframe,
-                "fields_evaluated": result.evidence.fields_evaluated,
-                "null_rates": result.evidence.null_rates,
-                "data_trust_score": result.evidence.data_trust_score,
-                "computation_notes": result.evidence.computation_notes,
-            },
-            "warnings": result.warnings,
-            "errors": result.errors,
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("revenue_metrics_query failed for metric '%s'", body.metric_key)
-        raise HTTPException(status_code=500, detail=f"Metric computation failed: {e}")
-
-
-# ============ Revenue / Analytics: Shared handler logic ============
-
-# Deprecation header helper — adds Deprecation + Sunset to legacy responses
-_DEPRECATION_HEADERS = {"Deprecation": "true", "Sunset": "2026-04-01"}
-
-
-async def _do_recompute(tenant_id: str, timeframe: str):
-    """Shared handler body for revenue recompute."""
-    if timeframe not in ("7d", "30d", "90d", "365d"):
-        raise HTTPException(status_code=422, detail="timeframe must be one of: 7d, 30d, 90d, 365d")
-
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(
-            status_code=400,
-            detail="No active CRM connection found. Connect your CRM first."
-        )
-
-    try:
-        from revenue.compute import compute_snapshot
-        snapshot = await compute_snapshot(supabase, tenant_id, crm_source, timeframe)
-        return {
-            "status": "ok",
-            "timeframe": timeframe,
-            "trust_score": snapshot.get("trust_score", 0.0),
-            "alert_count": snapshot.get("alert_count", 0),
-            "computed_at": snapshot.get("computed_at"),
-        }
-    except Exception as e:
-        logger.exception("_do_recompute failed")
-        raise HTTPException(status_code=500, detail=f"Recompute failed: {e}")
-
-
-async def _do_overview(tenant_id: str, timeframe: str):
-    """Shared handler body for revenue/analytics overview."""
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(status_code=400, detail="No active CRM connection found.")
-
-    try:
-        result = (
-            supabase.table("revenue_snapshots")
-            .select("*")
-            .eq("tenant_id", tenant_id)
-            .eq("crm_source", crm_source)
-            .eq("timeframe", timeframe)
-            .limit(1)
-            .execute()
-        )
-        if not result.data:
-            raise HTTPException(
-                status_code=404,
-                detail="No snapshot found. Call POST /api/dashboard/analytics/recompute first."
-            )
-        return result.data[0]
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("_do_overview failed")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch snapshot: {e}")
-
-
-async def _do_overview_live(tenant_id: str, from_date: Optional[str], to_date: Optional[str]):
-    """Compute KPIs live for a custom date range instead of looking up a pre-computed snapshot."""
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(status_code=400, detail="No active CRM connection found.")
-
-    try:
-        from agents.kpi_resolver import resolve_kpi
-
-        # Compute pipeline_value and conversion_rate on the fly
-        pipeline_result = await resolve_kpi(
-            supabase, tenant_id, crm_source, "pipeline_value",
-            from_date=from_date, to_date=to_date,
-        )
-        conversion_result = await resolve_kpi(
-            supabase, tenant_id, crm_source, "conversion_rate",
-            from_date=from_date, to_date=to_date,
-        )
-
-        metrics = {}
-        if pipeline_result and pipeline_result.value is not None:
-            metrics["pipeline_value"] = {
-                "title": "Pipeline Value",
-                "value": pipeline_result.value,
-                "display_format": "currency",
-            }
-        if conversion_result and conversion_result.value is not None:
-            metrics["conversion_rate"] = {
-                "title": "Win Rate",
-                "value": conversion_result.value,
-                "display_format": "percentage",
-            }
-
-        # Count open alerts
-        alert_count = 0
-        try:
-            alert_q = (
-                supabase.table("revenue_alerts")
-                .select("*", count="exact")
-                .eq("tenant_id", tenant_id)
-                .eq("crm_source", crm_source)
-                .eq("status", "open")
-                .limit(0)
-                .execute()
-            )
-            alert_count = alert_q.count or 0
-        except Exception:
-            pass
-
-        return {
-            "metrics": metrics,
-            "alert_count": alert_count,
-            "overall_trust": 0.6,
-            "snapshot": {"computed_at": None},
-            "currency": "USD",
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("_do_overview_live failed")
-        raise HTTPException(status_code=500, detail=f"Failed to compute live overview: {e}")
-
-
-async def _do_alerts_list(tenant_id: str, status: str):
-    """Shared handler body for revenue/analytics alerts list."""
-    if status not in ("open", "dismissed", "all"):
-        raise HTTPException(status_code=422, detail="status must be: open | dismissed | all")
-
-    crm_source = await _get_tenant_crm_source(supabase, tenant_id)
-    if not crm_source:
-        raise HTTPException(status_code=400, detail="No active CRM connection found.")
-
-    try:
-        q = (
-            supabase.table("revenue_alerts")
-            .select("*")
-            .eq("tenant_id", tenant_id)
-            .eq("crm_source", crm_source)
-            .order("created_at", desc=True)
-            .limit(100)
-        )
-        if status != "all":
-            q = q.eq("status", status)
-
-        result = q.execute()
-        alerts = result.data or []
-
-        severity_rank = {"critical": 0, "warning": 1, "info": 2}
-        alerts.sort(key=lambda a: severity_rank.get(a.get("severity", "info"), 2))
-
-        return {"alerts": alerts, "total": len(alerts)}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("_do_alerts_list failed")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch alerts: {e}")
-
-
-async def _do_alert_dismiss(tenant_id: str, alert_id: str):
-    """Shared handler body for revenue/analytics alert dismiss."""
-    try:
-        existing = (
-            supabase.table("revenue_alerts")
-            .select("id,tenant_id,status")
-            .eq("id", alert_id)
-            .eq("tenant_id", tenant_id)
-            .limit(1)
-            .execute()
-        )
-        if not existing.data:
-            raise HTTPException(status_code=404, detail="Alert not found.")
 
-        alert = existing.data[0]
-        if alert["status"] == "dismissed":
-            return {"status": "already_dismissed", "alert_id": alert_id}
 
-        now_ts = datetime.now(timezone.utc).isoformat()
-
-        supabase.table("revenue_alerts").update(
-            {"status": "dismissed", "dismissed_at": now_ts}
-        ).eq("id", alert_id).eq("tenant_id", tenant_id).execute()
-
-        return {
-            "status": "dismissed",
-            "alert_id": alert_id,
-            "dismissed_at": now_ts,
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("_do_alert_dismiss failed for alert %s", alert_id)
-        raise HTTPException(status_code=500, detail=f"Failed to dismiss alert: {e}")
-
-
-# ── New canonical routes: /dashboard/analytics/* ──────────────────────────
-
-@api_router.post("/dashboard/analytics/recompute")
-async def analytics_recompute(
-    timeframe: str = "30d",
-    current_user: Dict = Depends(get_current_user),
-):
-    """Trigger a full analytics snapshot recompute for this tenant."""
-    return await _do_recompute(current_user["tenant_id"], timeframe)
-
-
-@api_router.get("/dashboard/analytics/overview")
-async def analytics_overview(
-    timeframe: str = "30d",
-    from_date: Optional[str] = None,
-    to_date: Optional[str] = None,
-    current_user: Dict = Depends(get_current_user),
-):
-    """Return analytics snapshot. When from_date/to_date provided, computes live KPIs."""
-    if from_date or to_date:
-        return await _do_overview_live(current_user["tenant_id"], from_date, to_date)
-    return await _do_overview(current_user["tenant_id"], timeframe)
-
-
-@api_router.get("/dashboard/analytics/alerts")
-async def analytics_alerts_list(
-    status: str = "open",
-    current_user: Dict = Depends(get_current_user),
-):
-    """Return analytics alerts for this tenant."""
-    return await _do_alerts_list(current_user["tenant_id"], status)
-
-
-@api_router.patch("/dashboard/analytics/alerts/{alert_id}/dismiss")
-async def analytics_alert_dismiss(
-    alert_id: str,
-    current_user: Dict = Depends(get_current_user),
-):
-    """Dismiss a single analytics alert."""
-    return await _do_alert_dismiss(current_user["tenant_id"], alert_id)
-
-
-# ── DEPRECATED Phase 3 — remove after 2026-04-01 ─────────────────────────
-# Legacy /revenue/* routes — kept as aliases with Deprecation headers.
-
-@api_router.post("/revenue/recompute")
-async def revenue_recompute(
-    timeframe: str = "30d",
-    current_user: Dict = Depends(get_current_user),
-):
-    """DEPRECATED: Use POST /dashboard/analytics/recompute instead."""
-    data = await _do_recompute(current_user["tenant_id"], timeframe)
-    return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
-
-
-@api_router.get("/revenue/overview")
-async def revenue_overview(
-    timeframe: str = "30d",
-    current_user: Dict = Depends(get_current_user),
-):
-    """DEPRECATED: Use GET /dashboard/analytics/overview instead."""
-    data = await _do_overview(current_user["tenant_id"], timeframe)
-    # _do_overview returns a dict (snapshot row) directly
-    if isinstance(data, dict):
-        return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
-    return data
-
-
-@api_router.get("/revenue/alerts")
-async def revenue_alerts_list(
-    status: str = "open",
-    current_user: Dict = Depends(get_current_user),
-):
-    """DEPRECATED: Use GET /dashboard/analytics/alerts instead."""
-    data = await _do_alerts_list(current_user["tenant_id"], status)
-    return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
-
-
-@api_router.patch("/revenue/alerts/{alert_id}/dismiss")
-async def revenue_alert_dismiss(
-    alert_id: str,
-    current_user: Dict = Depends(get_current_user),
-):
-    """DEPRECATED: Use PATCH /dashboard/analytics/alerts/{alert_id}/dismiss instead."""
-    data = await _do_alert_dismiss(current_user["tenant_id"], alert_id)
-    return JSONResponse(content=data, headers=_DEPRECATION_HEADERS)
+@api_router.get("/admin/db-stats")
+async def admin_db_stats(current_user: Dict = Depends(get_current_user)):
+    """Supabase round trips per route / background job, slowest query shapes and N+1 counts."""
+    require_super_admin(current_user)
+    return {"timestamp": now_iso(), **get_db_stats()}
 
 
-# ============ Health Check ============
-@api_router.get("/")
-async def root():
-    return {"message": "LeadRelay API - AI Sales Automation", "version": "2.0", "features": ["sales_pipeline", "objection_handling", "closing_scripts", "bitrix24_oauth", "instagram_dm", "image_responses"]}
+@api_router.get("/admin/loop-stats")
+async def admin_loop_stats(current_user: Dict = Depends(get_current_user)):
+    """Event-loop lag histogram and the call sites that stalled it (LOOP_WATCHDOG_MS)."""
+    require_super_admin(current_user)
+    return {"timestamp": now_iso(), **get_loop_stats()}
 
 
-@api_router.get("/health")
-async def health_check():
-    return {"status": "healthy", "timestamp": now_iso(), "database": "supabase"}
+@api_router.get("/admin/pipeline-latency")
+async def admin_pipeline_latency(tenant_id: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+    """Per-stage message pipeline latency histograms by route and tenant, with SLO breach counts."""
+    require_super_admin(current_user)
+    return {"timestamp": now_iso(), **get_pipeline_stats(tenant_id)}
 
 
 # ============ Admin: Encrypt Existing Credentials ============
@@ -13431,8 +11535,10 @@ async def admin_reregister_webhooks(current_user: Dict = Depends(get_current_use
     return {"success": True, "results": results}
 
 
-# Include router and middleware
+# Include routers and middleware
 app.include_router(api_router)
+for feature_router in FEATURE_ROUTERS:
+    app.include_router(feature_router)
 
 cors_origins_raw = (os.environ.get('CORS_ORIGINS') or '').strip()
 if not cors_origins_raw:
@@ -13499,3 +11605,16 @@ async def csrf_origin_check(request: Request, call_next):
                 logger.warning(f"CSRF check failed: origin={origin[:50]}, path={path}")
                 return JSONResponse(status_code=403, content={"detail": "Origin not allowed"})
     return await call_next(request)
+
+# ============ DB Call Instrumentation ============
+@app.middleware("http")
+async def db_call_metrics(request: Request, call_next):
+    """Attribute the request's Supabase calls to its route; report them via Server-Timing."""
+    with db_scope(f"{request.method} {request.url.path}") as scope:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        scope.name = f"{request.method} {route.path}" if route is not None else f"{request.method} (unmatched)"
+    timing = scope.server_timing()
+    existing = response.headers.get("Server-Timing")
+    response.headers["Server-Timing"] = f"{existing}, {timing}" if existing else timing
+    return response
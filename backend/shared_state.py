@@ -0,0 +1,419 @@
+"""
+Shared State — cross-worker state for running more than one API process.
+========================================================================
+Rate limits, webhook dedup, Telegram link codes and revoked JWTs used to
+live only in process memory, so a second uvicorn worker (or replica) would
+re-process a re-delivered Telegram update and get its own rate-limit budget.
+This module puts that state behind one small interface:
+
+    set_if_absent(key, ttl)     atomic first-writer-wins (webhook dedup)
+    get / set / pop / exists    small string values with TTL (link codes,
+                                revoked tokens); pop is atomic get+delete
+    hit_sliding_window(...)     atomic sliding-window-counter rate limiting
+    publish / subscribe         fire-and-forget broadcasts to the *other*
+                                workers, e.g. local cache invalidation
+
+Backends:
+
+    InMemorySharedState   default; single-process semantics (TTLCache for
+                          keys, rate_limiter.SlidingWindowLimiter for limits)
+    RedisSharedState      REDIS_URL set and the `redis` package installed;
+                          any Redis-protocol server. Fails open: while Redis
+                          is unreachable each worker falls back to its own
+                          in-memory state and logs once per outage.
+
+Local TTLCaches stay per-process; invalidate_everywhere(cache, key) drops
+the key here and broadcasts the same pop to every other worker.
+
+Public surface
+--------------
+    state = get_shared_state()               # REDIS_URL decides the backend
+    await state.start() / await state.close()
+    first = await state.set_if_absent("dedup:telegram:123", ttl=300)
+    result = await SharedRateLimiter("messages", 10, 60).hit(key)   # RateLimitResult
+    subscribe("channel", handler)            # handler(data: dict) for other workers' messages
+    state.publish_nowait("channel", {...})
+    invalidate_everywhere(cache, key)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional
+
+from rate_limiter import SlidingWindowLimiter, sliding_window_wait
+from ttl_cache import TTLCache, get_cache
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional — only needed when REDIS_URL is configured
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.environ.get("REDIS_URL", "")
+KEY_PREFIX = os.environ.get("SHARED_STATE_PREFIX", "leadrelay:")
+CACHE_INVALIDATION_CHANNEL = "cache_invalidate"
+
+_handlers: dict[str, list[Callable[[dict], None]]] = {}
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    retry_after: float = 0.0
+
+    def __bool__(self) -> bool:
+        return self.allowed
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """retry_after rounded up, for Retry-After headers and user messages."""
+        return math.ceil(self.retry_after)
+
+
+def subscribe(channel: str, handler: Callable[[dict], None]) -> None:
+    """Run handler(data) for every message another worker publishes on channel."""
+    _handlers.setdefault(channel, []).append(handler)
+    if _state is not None:
+        _state._on_new_channel(channel)
+
+
+class SharedState(ABC):
+    """Interface shared by the backends. Keys and values are strings."""
+
+    distributed = False
+
+    def __init__(self):
+        self.instance_id = uuid.uuid4().hex[:12]
+        self._tasks: set[asyncio.Task] = set()
+        self._stats = {"published": 0, "received": 0, "handler_errors": 0}
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def set_if_absent(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        ...
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def pop(self, key: str) -> Optional[str]:
+        ...
+
+    async def exists(self, key: str) -> bool:
+        return await self.get(key) is not None
+
+    @abstractmethod
+    async def hit_sliding_window(self, key: str, limit: float, window: float) -> RateLimitResult:
+        ...
+
+    async def publish(self, channel: str, data: dict) -> None:
+        pass
+
+    def publish_nowait(self, channel: str, data: dict) -> None:
+        """Schedule publish() from sync code. No-op outside an event loop or when not distributed."""
+        if not self.distributed:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self.publish(channel, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def cleanup(self) -> int:
+        return 0
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "instance_id": self.instance_id, **self._stats}
+
+    def _on_new_channel(self, channel: str) -> None:
+        pass
+
+    def _dispatch(self, channel: str, raw: str) -> None:
+        try:
+            envelope = json.loads(raw)
+        except (TypeError, ValueError):
+            logger.warning(f"Shared state: malformed message on {channel}")
+            return
+        if envelope.get("origin") == self.instance_id:
+            return  # our own broadcast — already applied locally
+        self._stats["received"] += 1
+        for handler in _handlers.get(channel, ()):
+            try:
+                handler(envelope.get("data") or {})
+            except Exception as e:
+                self._stats["handler_errors"] += 1
+                logger.warning(f"Shared state handler for {channel} failed: {e}")
+
+
+class InMemorySharedState(SharedState):
+    """Single-process backend: correct for one worker, and the Redis fallback."""
+
+    def __init__(self, max_keys: int = 200_000):
+        super().__init__()
+        self._kv = TTLCache(f"shared_state_{self.instance_id}", ttl=None, max_entries=max_keys)
+        self._limiters: dict[float, SlidingWindowLimiter] = {}
+
+    async def set_if_absent(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        return self._kv.add(key, value, ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._kv.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._kv.set(key, value, ttl)
+
+    async def pop(self, key: str) -> Optional[str]:
+        return self._kv.pop(key)
+
+    async def hit_sliding_window(self, key: str, limit: float, window: float) -> RateLimitResult:
+        limiter = self._limiters.get(window)
+        if limiter is None:
+            limiter = self._limiters[window] = SlidingWindowLimiter(f"shared_{window}s", max_requests=1, window=window)
+        if limiter.try_acquire(key, limit):
+            return RateLimitResult(True)
+        return RateLimitResult(False, limiter.wait_time(key, limit))
+
+    def cleanup(self) -> int:
+        return self._kv.purge_expired() + sum(l.cleanup() for l in self._limiters.values())
+
+
+class RedisSharedState(SharedState):
+    """Redis-protocol backend (redis-py asyncio client)."""
+
+    distributed = True
+
+    def __init__(self, url: str, prefix: str = KEY_PREFIX, client: Any = None):
+        super().__init__()
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("REDIS_URL is set but the redis package is not installed")
+            client = aioredis.from_url(url, decode_responses=True, socket_timeout=2.0, health_check_interval=30)
+        self._redis = client
+        self._prefix = prefix
+        self._fallback = InMemorySharedState()
+        self._degraded = False
+        self._listener: Optional[asyncio.Task] = None
+        self._pending_channels: set[str] = set()
+        self._stats.update({"errors": 0, "fallbacks": 0})
+
+    def _k(self, key: str) -> str:
+        return self._prefix + key
+
+    async def _call(self, op: str, fn: Callable, fallback: Callable):
+        try:
+            result = await fn()
+        except Exception as e:
+            self._stats["errors"] += 1
+            self._stats["fallbacks"] += 1
+            if not self._degraded:
+                self._degraded = True
+                logger.warning(f"Shared state: Redis {op} failed, using per-worker state until it recovers: {e}")
+            return await fallback()
+        if self._degraded:
+            self._degraded = False
+            logger.info("Shared state: Redis reachable again")
+        return result
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+
+    async def set_if_absent(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        async def op():
+            return bool(await self._redis.set(self._k(key), value, nx=True, px=_ms(ttl)))
+        return await self._call("SET NX", op, lambda: self._fallback.set_if_absent(key, value, ttl))
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._call("GET", lambda: self._redis.get(self._k(key)), lambda: self._fallback.get(key))
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        await self._call(
+            "SET", lambda: self._redis.set(self._k(key), value, px=_ms(ttl)),
+            lambda: self._fallback.set(key, value, ttl),
+        )
+
+    async def pop(self, key: str) -> Optional[str]:
+        return await self._call("GETDEL", lambda: self._redis.getdel(self._k(key)), lambda: self._fallback.pop(key))
+
+    async def exists(self, key: str) -> bool:
+        async def op():
+            return bool(await self._redis.exists(self._k(key)))
+        return await self._call("EXISTS", op, lambda: self._fallback.exists(key))
+
+    async def hit_sliding_window(self, key: str, limit: float, window: float) -> RateLimitResult:
+        async def op():
+            # Wall clock, not monotonic: window boundaries must agree across hosts
+            now = time.time()
+            index = int(now // window)
+            curr_key = self._k(f"rl:{window:g}:{key}:{index}")
+            prev_key = self._k(f"rl:{window:g}:{key}:{index - 1}")
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.incr(curr_key)
+                pipe.pexpire(curr_key, _ms(window * 2) + 1000)
+                pipe.get(prev_key)
+                curr, _, prev = await pipe.execute()
+            # Count first, check after: concurrent hits all see each other
+            wait = sliding_window_wait(int(prev or 0), int(curr) - 1, now - index * window, window, limit)
+            if wait > 0:
+                await self._redis.decr(curr_key)
+                return RateLimitResult(False, wait)
+            return RateLimitResult(True)
+        return await self._call("rate limit", op, lambda: self._fallback.hit_sliding_window(key, limit, window))
+
+    # ------------------------------------------------------------------
+    # Pub/sub
+    # ------------------------------------------------------------------
+
+    async def publish(self, channel: str, data: dict) -> None:
+        message = json.dumps({"origin": self.instance_id, "data": data}, default=str)
+
+        async def op():
+            await self._redis.publish(self._k(channel), message)
+            self._stats["published"] += 1
+
+        async def skip():
+            return None  # other workers' local caches age out via their TTLs
+
+        await self._call("PUBLISH", op, skip)
+
+    def _on_new_channel(self, channel: str) -> None:
+        self._pending_channels.add(channel)
+
+    async def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._pending_channels.update(_handlers)
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            subscribed: set[str] = set()
+            try:
+                self._pending_channels.update(_handlers)
+                while True:
+                    new = self._pending_channels - subscribed
+                    if new:
+                        await pubsub.subscribe(*(self._k(c) for c in new))
+                        subscribed |= new
+                        self._pending_channels -= new
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._dispatch(message["channel"][len(self._prefix):], message["data"])
+                    backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Shared state: pub/sub listener error, reconnecting in {backoff:.0f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                self._pending_channels |= subscribed
+                try:
+                    await (getattr(pubsub, "aclose", None) or pubsub.close)()
+                except Exception:
+                    pass
+
+    async def close(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+        closer = getattr(self._redis, "aclose", None) or self._redis.close
+        await closer()
+
+    def cleanup(self) -> int:
+        return self._fallback.cleanup()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "degraded": self._degraded}
+
+
+def _ms(seconds: Optional[float]) -> Optional[int]:
+    return None if seconds is None else max(1, int(seconds * 1000))
+
+
+# ---------------------------------------------------------------------------
+# Process-wide instance and helpers
+# ---------------------------------------------------------------------------
+
+_state: Optional[SharedState] = None
+
+
+def _create_from_env() -> SharedState:
+    if REDIS_URL:
+        if aioredis is None:
+            logger.warning("REDIS_URL is set but the redis package is not installed; using in-memory shared state")
+        else:
+            logger.info("Shared state: Redis backend")
+            return RedisSharedState(REDIS_URL)
+    return InMemorySharedState()
+
+
+def get_shared_state() -> SharedState:
+    global _state
+    if _state is None:
+        _state = _create_from_env()
+    return _state
+
+
+def set_shared_state(state: Optional[SharedState]) -> Optional[SharedState]:
+    """Swap the process-wide backend (tests, custom wiring). Returns the previous one."""
+    global _state
+    previous, _state = _state, state
+    return previous
+
+
+class SharedRateLimiter:
+    """Sliding-window limit enforced across every worker sharing the backend."""
+
+    def __init__(self, name: str, max_requests: int, window: float):
+        self.name = name
+        self.max_requests = max_requests
+        self.window = window
+
+    async def hit(self, key: str, limit: Optional[float] = None) -> RateLimitResult:
+        """Count one request for key; `limit` overrides max_requests for this call."""
+        return await get_shared_state().hit_sliding_window(
+            f"{self.name}:{key}", self.max_requests if limit is None else limit, self.window,
+        )
+
+
+def invalidate_everywhere(cache: TTLCache, key: Hashable) -> Any:
+    """Pop key from a local TTLCache here and on every other worker. Returns the local value."""
+    value = cache.pop(key, None)
+    get_shared_state().publish_nowait(CACHE_INVALIDATION_CHANNEL, {"cache": cache.name, "key": key})
+    return value
+
+
+def _on_cache_invalidate(data: dict) -> None:
+    cache = get_cache(data.get("cache") or "")
+    if cache is not None:
+        cache.pop(data.get("key"), None)
+
+
+subscribe(CACHE_INVALIDATION_CHANNEL, _on_cache_invalidate)
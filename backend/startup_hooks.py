@@ -0,0 +1,116 @@
+"""
+Startup Hooks — worker startup work that runs concurrently.
+===========================================================
+Starlette awaits on_event("startup") handlers one after another, so a
+worker's time to first healthy request was the sum of every handler —
+including network round trips (token blacklist load, Telegram webhook
+registration) that have nothing to do with each other.
+
+Hooks registered here run together from a single startup handler:
+
+    blocking    gathered concurrently; the worker starts serving once all
+                have finished. A failure is re-raised after the others
+                finish, so a broken hook still fails the boot as before.
+    background  started as tasks and not awaited — for work requests never
+                depend on (e.g. registering a webhook with a third party).
+                Failures are logged.
+
+Every hook's duration and outcome is kept for stats(), so slow boots can be
+attributed to a hook.
+
+Public surface
+--------------
+    startup = StartupHooks()
+
+    @startup.hook                       # blocking
+    async def load_token_blacklist(): ...
+
+    @startup.hook(background=True)
+    async def register_shared_bot_webhook(): ...
+
+    await startup.run()                 # from one app startup handler
+    startup.stats()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+Hook = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class _HookResult:
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class StartupHooks:
+    def __init__(self):
+        self._hooks: list[tuple[str, Hook, bool]] = []
+        self._results: dict[str, _HookResult] = {}
+        self._background: set[asyncio.Task] = set()
+        self._total: Optional[float] = None
+
+    def hook(self, fn: Optional[Hook] = None, *, background: bool = False):
+        """Register `fn` (usable bare or as @hook(background=True)); returns it unchanged."""
+        def register(f: Hook) -> Hook:
+            self._hooks.append((f.__name__, f, background))
+            return f
+        return register(fn) if fn is not None else register
+
+    async def _timed(self, name: str, fn: Hook) -> None:
+        result = self._results[name] = _HookResult()
+        started = time.perf_counter()
+        try:
+            await fn()
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            result.seconds = round(time.perf_counter() - started, 4)
+
+    async def _background_hook(self, name: str, fn: Hook) -> None:
+        try:
+            await self._timed(name, fn)
+        except Exception as e:
+            logger.error(f"Background startup hook {name} failed: {e}")
+
+    async def run(self) -> None:
+        started = time.perf_counter()
+        for name, fn, background in self._hooks:
+            if background:
+                task = asyncio.create_task(self._background_hook(name, fn))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+
+        blocking = [(name, fn) for name, fn, background in self._hooks if not background]
+        results = await asyncio.gather(
+            *(self._timed(name, fn) for name, fn in blocking), return_exceptions=True,
+        )
+        self._total = round(time.perf_counter() - started, 4)
+        slowest = max(blocking, key=lambda h: self._results[h[0]].seconds or 0, default=None)
+        logger.info(
+            f"Startup hooks finished in {self._total:.2f}s ({len(blocking)} blocking, "
+            f"{len(self._hooks) - len(blocking)} background"
+            + (f", slowest {slowest[0]} {self._results[slowest[0]].seconds:.2f}s)" if slowest else ")")
+        )
+        for (name, _), result in zip(blocking, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Startup hook {name} failed: {result}")
+                raise result
+
+    def stats(self) -> dict:
+        return {
+            "total_seconds": self._total,
+            "hooks": {
+                name: {"background": background, **vars(self._results.get(name, _HookResult()))}
+                for name, _, background in self._hooks
+            },
+        }
@@ -16,7 +16,11 @@ from typing import Optional, Callable
 
 from crm_adapters import CRMAdapter, create_adapter
 from crypto_utils import decrypt_value
+from db_metrics import db_job, db_scope
+from leader_election import is_leader
+from shared_state import get_shared_state, subscribe
 from sync_status import SyncStatus
+from row_counts import record_sync_delta
 from agents.field_profiler import profile_entity_fields, upsert_field_profiles
 
 logger = logging.getLogger(__name__)
@@ -35,6 +39,15 @@ _active_full_syncs: dict[str, asyncio.Task] = {}
 # Default incremental sync interval (seconds)
 DEFAULT_SYNC_INTERVAL = 900  # 15 minutes
 
+# How often the leader re-checks crm_connections for loops to start (seconds)
+SYNC_RECONCILE_INTERVAL = 60
+
+# Broadcast by stop_all_syncs so the worker running the loop cancels it too
+SYNC_STOP_CHANNEL = "sync_stop"
+# An explicit stop keeps the reconciler from restarting the loop until the
+# next full sync (shared state key sync_paused:{tenant_id}:{crm_type or *})
+SYNC_PAUSE_TTL = 86_400
+
 # Batch size for upserts
 UPSERT_BATCH_SIZE = 500
 
@@ -331,6 +344,11 @@ class SyncEngine:
                 except Exception as inner_e:
                     failed_count += 1
                     logger.warning(f"Single upsert failed for {table_name} (id={record.get('external_id')}): {inner_e}")
+        written = len(records) - failed_count
+        record_sync_delta(self.tenant_id, self.crm_source, table_name, written)
+        if written > 0:
+            from agents.sql_engine import bump_data_version  # keeps sqlglot off the worker boot path
+            bump_data_version(self.tenant_id, self.crm_source)
         return failed_count
 
     async def _update_sync_status(self, entity: str, status: str, **kwargs):
@@ -434,6 +452,7 @@ async def trigger_full_sync(supabase, tenant_id: str, crm_type: str) -> dict:
         return {"status": "error", "error": str(e)}
 
     # Run sync
+    await _clear_sync_pause(tenant_id, crm_type)
     engine = SyncEngine(supabase, tenant_id, adapter, crm_type)
     sync_result = await engine.full_sync()
 
@@ -459,25 +478,26 @@ async def _recompute_revenue_background(supabase, tenant_id: str, crm_source: st
     """
     Fire-and-forget: recompute revenue snapshots for all standard timeframes
     after a CRM sync completes. Never raises — all exceptions are logged.
-    NOTE: compute_snapshot makes many sync Supabase calls internally,
-    so we yield control between timeframes to avoid starving the event loop.
+    Both timeframes run as one compute_snapshots() job so table counts and
+    samples are shared; the persisted alert set uses the 90d window.
     """
+    timeframes = ["30d", "90d"]
     try:
-        from revenue.compute import compute_snapshot
-        for timeframe in ["30d", "90d"]:
-            try:
-                await compute_snapshot(supabase, tenant_id, crm_source, timeframe)
-                logger.info(
-                    "Revenue snapshot refreshed after sync "
-                    "(tenant=%s, crm=%s, timeframe=%s)",
-                    tenant_id, crm_source, timeframe,
-                )
-            except Exception as e:
-                logger.warning(
-                    "Revenue snapshot recompute failed (tenant=%s, crm=%s, timeframe=%s): %s",
-                    tenant_id, crm_source, timeframe, e,
-                )
-            await asyncio.sleep(0)  # Yield to event loop between snapshots
+        from revenue.compute import compute_snapshots
+        try:
+            await compute_snapshots(
+                supabase, tenant_id, crm_source, timeframes, alert_timeframe="90d",
+            )
+            logger.info(
+                "Revenue snapshots refreshed after sync "
+                "(tenant=%s, crm=%s, timeframes=%s)",
+                tenant_id, crm_source, ",".join(timeframes),
+            )
+        except Exception as e:
+            logger.warning(
+                "Revenue snapshot recompute failed (tenant=%s, crm=%s, timeframes=%s): %s",
+                tenant_id, crm_source, ",".join(timeframes), e,
+            )
     except Exception as e:
         logger.warning("_recompute_revenue_background import failed: %s", e)
 
@@ -496,6 +516,8 @@ async def _recompute_revenue_background(supabase, tenant_id: str, crm_source: st
         logger.warning("CRM context compute failed (tenant=%s): %s", tenant_id, e)
 
 
+# Paged batch upserts repeat one query shape by design — no N+1 warnings for syncs
+@db_job("crm_full_sync", repeat_threshold=None)
 async def trigger_full_sync_background(supabase, tenant_id: str, crm_type: str):
     """Fire-and-forget wrapper for trigger_full_sync. Tracked so it can be cancelled."""
     sync_key = f"{tenant_id}:{crm_type}"
@@ -538,8 +560,13 @@ async def start_incremental_sync_loop(
     """
     Start a 15-min incremental sync loop for a tenant's CRM.
     Stores the task in _active_syncs for lifecycle management.
+    Only the elected leader runs loops; elsewhere this is a no-op and the
+    leader's reconciler picks the connection up.
     """
     sync_key = f"{tenant_id}:{crm_type}"
+    if not is_leader():
+        logger.info(f"Not the leader, leaving incremental sync loop for {sync_key} to the leader")
+        return
 
     # Stop existing loop if any
     if sync_key in _active_syncs:
@@ -550,28 +577,29 @@ async def start_incremental_sync_loop(
         while True:
             await asyncio.sleep(interval)
             try:
-                # Re-load credentials each time (they might have been refreshed)
-                result = await _db(lambda: supabase.table("crm_connections").select(
-                    "credentials, config"
-                ).eq("tenant_id", tenant_id).eq("crm_type", crm_type).eq("is_active", True).execute())
-
-                if not result.data:
-                    logger.info(f"CRM connection removed, stopping sync loop for {sync_key}")
-                    break
-
-                conn = result.data[0]
-                credentials = _decrypt_credentials(conn.get("credentials", {}))
-                config = conn.get("config", {})
-                adapter = create_adapter(crm_type, credentials, config)
-
-                engine = SyncEngine(supabase, tenant_id, adapter, crm_type)
-                await engine.incremental_sync()
-
-                # Update last_sync_at
-                now = datetime.now(timezone.utc).isoformat()
-                await _db(lambda: supabase.table("crm_connections").update(
-                    {"last_sync_at": now}
-                ).eq("tenant_id", tenant_id).eq("crm_type", crm_type).execute())
+                with db_scope("job:crm_incremental_sync", repeat_threshold=None):
+                    # Re-load credentials each time (they might have been refreshed)
+                    result = await _db(lambda: supabase.table("crm_connections").select(
+                        "credentials, config"
+                    ).eq("tenant_id", tenant_id).eq("crm_type", crm_type).eq("is_active", True).execute())
+
+                    if not result.data:
+                        logger.info(f"CRM connection removed, stopping sync loop for {sync_key}")
+                        break
+
+                    conn = result.data[0]
+                    credentials = _decrypt_credentials(conn.get("credentials", {}))
+                    config = conn.get("config", {})
+                    adapter = create_adapter(crm_type, credentials, config)
+
+                    engine = SyncEngine(supabase, tenant_id, adapter, crm_type)
+                    await engine.incremental_sync()
+
+                    # Update last_sync_at
+                    now = datetime.now(timezone.utc).isoformat()
+                    await _db(lambda: supabase.table("crm_connections").update(
+                        {"last_sync_at": now}
+                    ).eq("tenant_id", tenant_id).eq("crm_type", crm_type).execute())
 
             except asyncio.CancelledError:
                 logger.info(f"Incremental sync loop cancelled for {sync_key}")
@@ -601,7 +629,27 @@ async def stop_sync_loop(tenant_id: str, crm_type: str = None):
 
 
 async def stop_all_syncs(tenant_id: str, crm_type: str = None):
-    """Cancel ALL sync activity for a tenant — both full syncs and incremental loops."""
+    """Cancel ALL sync activity for a tenant — both full syncs and incremental loops — on every worker."""
+    cancelled = _cancel_local_syncs(tenant_id, crm_type)
+    state = get_shared_state()
+    state.publish_nowait(SYNC_STOP_CHANNEL, {"tenant_id": tenant_id, "crm_type": crm_type})
+    await state.set(f"sync_paused:{tenant_id}:{crm_type or '*'}", "1", ttl=SYNC_PAUSE_TTL)
+    return cancelled
+
+
+async def _is_sync_paused(tenant_id: str, crm_type: str) -> bool:
+    state = get_shared_state()
+    return (await state.exists(f"sync_paused:{tenant_id}:{crm_type}")
+            or await state.exists(f"sync_paused:{tenant_id}:*"))
+
+
+async def _clear_sync_pause(tenant_id: str, crm_type: str) -> None:
+    state = get_shared_state()
+    await state.pop(f"sync_paused:{tenant_id}:{crm_type}")
+    await state.pop(f"sync_paused:{tenant_id}:*")
+
+
+def _cancel_local_syncs(tenant_id: str, crm_type: str = None) -> list:
     keys_to_stop = []
     if crm_type:
         keys_to_stop = [f"{tenant_id}:{crm_type}"]
@@ -627,6 +675,14 @@ async def stop_all_syncs(tenant_id: str, crm_type: str = None):
     return cancelled
 
 
+def _on_sync_stop(data: dict) -> None:
+    if data.get("tenant_id"):
+        _cancel_local_syncs(data["tenant_id"], data.get("crm_type"))
+
+
+subscribe(SYNC_STOP_CHANNEL, _on_sync_stop)
+
+
 def is_sync_active(tenant_id: str) -> bool:
     """Check if any sync (full or incremental) is currently running for a tenant."""
     prefix = f"{tenant_id}:"
@@ -673,23 +729,32 @@ async def _cleanup_stale_syncs(supabase):
 async def resume_all_sync_loops(supabase):
     """
     Resume incremental sync loops for all active CRM connections.
-    Called on server startup.
+    Called when this worker is elected leader.
     """
     # First, clean up any syncs stuck in "syncing" from a previous crash
     await _cleanup_stale_syncs(supabase)
+    await reconcile_sync_loops(supabase)
+
 
+async def reconcile_sync_loops(supabase):
+    """Start loops for active connections (with a completed full sync) that have none running."""
     try:
         result = await _db(lambda: supabase.table("crm_connections").select(
             "tenant_id, crm_type"
         ).eq("is_active", True).execute())
 
         if not result.data:
-            logger.info("No active CRM connections to resume sync for")
+            logger.debug("No active CRM connections to resume sync for")
             return
 
         for conn in result.data:
             tenant_id = conn["tenant_id"]
             crm_type = conn["crm_type"]
+            running = _active_syncs.get(f"{tenant_id}:{crm_type}")
+            if running is not None and not running.done():
+                continue
+            if await _is_sync_paused(tenant_id, crm_type):
+                continue
 
             # Check if we have completed at least one full sync
             sync_check = await _db(lambda: supabase.table("crm_sync_status").select(
@@ -700,12 +765,32 @@ async def resume_all_sync_loops(supabase):
                 await start_incremental_sync_loop(supabase, tenant_id, crm_type)
                 logger.info(f"Resumed sync loop for {tenant_id}:{crm_type}")
             else:
-                logger.info(f"Skipping sync resume for {tenant_id}:{crm_type} — no completed full sync")
+                logger.debug(f"Skipping sync resume for {tenant_id}:{crm_type} — no completed full sync")
 
     except Exception as e:
         logger.error(f"Failed to resume sync loops: {e}")
 
 
+async def run_sync_reconciler(supabase, interval: int = SYNC_RECONCILE_INTERVAL):
+    """
+    Leader singleton job: resume every loop on election, then keep one loop
+    per active connection (new connects on other workers, crashed loops).
+    """
+    await resume_all_sync_loops(supabase)
+    while True:
+        await asyncio.sleep(interval)
+        with db_scope("job:sync_reconcile"):
+            await reconcile_sync_loops(supabase)
+
+
+async def stop_local_sync_loops():
+    """Cancel every incremental loop in this worker (on losing leadership)."""
+    for key, task in list(_active_syncs.items()):
+        task.cancel()
+        _active_syncs.pop(key, None)
+    logger.info("Stopped all local incremental sync loops")
+
+
 def get_active_syncs() -> dict:
     """Return info about active sync loops (for debugging/monitoring)."""
     return {
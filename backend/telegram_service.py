@@ -11,7 +11,8 @@ load_dotenv(ROOT_DIR / '.env')
 
 logger = logging.getLogger(__name__)
 
-TELEGRAM_API_BASE = "https://api.telegram.org/bot"
+TELEGRAM_API_URL = ((os.environ.get("TELEGRAM_API_URL") or "").strip() or "https://api.telegram.org").rstrip("/")
+TELEGRAM_API_BASE = f"{TELEGRAM_API_URL}/bot"
 
 
 async def send_message(bot_token: str, chat_id: int, text: str) -> bool:
@@ -0,0 +1,237 @@
+"""
+Telemetry Sink — buffered, batched writes for fire-and-forget telemetry.
+=======================================================================
+Token usage, agent traces and event logs used to be one synchronous
+supabase-py insert per event, run inside an asyncio task (so the blocking
+HTTP call stalled the event loop). Producers now append to an in-memory
+buffer; a background task flushes it every FLUSH_INTERVAL seconds, or as soon
+as a table reaches BATCH_SIZE rows, with one bulk write per table on a worker
+thread.
+
+    token_usage_logs   → record_token_usage_batch RPC (raw rows + rollups)
+    agent_traces       → bulk insert
+    event_logs         → bulk insert
+    conversation usage → increments summed per conversation, one
+                         increment_conversation_usage call per conversation
+
+The buffer is bounded (MAX_BUFFERED rows); rows beyond it are dropped and
+counted rather than growing memory under a DB outage. A failed chunk is
+retried once, then split in halves until only the rows that keep failing
+are left; those are logged and counted as failed — telemetry never breaks
+request handling.
+stop() drains the buffer on shutdown.
+
+Public surface
+--------------
+    sink = get_sink()
+    sink.bind(supabase)                       # first client wins
+    sink.enqueue("event_logs", row)
+    sink.add_conversation_usage(conv_id, input_tokens, output_tokens, cost_usd)
+    await sink.start() / await sink.flush() / await sink.stop()
+    sink.stats()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+from usage_ledger import record_usage_batch
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 2.0  # seconds
+BATCH_SIZE = 200  # rows per table that trigger an early flush
+MAX_BUFFERED = 10_000  # rows across all tables
+
+TOKEN_USAGE_TABLE = "token_usage_logs"
+
+
+class TelemetrySink:
+    """In-memory telemetry buffer with a background flusher."""
+
+    def __init__(
+        self,
+        supabase=None,
+        flush_interval: float = FLUSH_INTERVAL,
+        batch_size: int = BATCH_SIZE,
+        max_buffered: int = MAX_BUFFERED,
+    ):
+        self.supabase = supabase
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self._buffers: dict[str, list[dict]] = {}
+        self._conversation_usage: dict[str, list] = {}  # conv_id -> [in, out, cost]
+        self._buffered = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "flushes": 0}
+
+    # ------------------------------------------------------------------
+    # Producers (sync, non-blocking)
+    # ------------------------------------------------------------------
+
+    def bind(self, supabase) -> None:
+        """Attach the client used for flushing, unless one is already set."""
+        if self.supabase is None and supabase is not None:
+            self.supabase = supabase
+
+    def enqueue(self, table: str, row: dict) -> bool:
+        """Buffer one row for ``table``. Returns False if it was dropped."""
+        if self._buffered >= self.max_buffered:
+            self._stats["dropped"] += 1
+            return False
+        buf = self._buffers.setdefault(table, [])
+        buf.append(row)
+        self._buffered += 1
+        self._stats["enqueued"] += 1
+        self._ensure_running()
+        if len(buf) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+        return True
+
+    def add_conversation_usage(
+        self, conversation_id: str, input_tokens: int, output_tokens: int, cost_usd: float
+    ) -> None:
+        """Accumulate a per-conversation usage increment (summed until the next flush)."""
+        delta = self._conversation_usage.setdefault(conversation_id, [0, 0, 0.0])
+        delta[0] += input_tokens
+        delta[1] += output_tokens
+        delta[2] += cost_usd
+        self._ensure_running()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def _ensure_running(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (scripts/tests) — rows wait for an explicit flush
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def start(self) -> None:
+        self._ensure_running()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Telemetry flush loop error: {e}")
+
+    async def stop(self) -> None:
+        """Stop the background flusher and drain whatever is buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self.flush()
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    def _take(self) -> tuple[dict[str, list[dict]], dict[str, list]]:
+        buffers, self._buffers = self._buffers, {}
+        usage, self._conversation_usage = self._conversation_usage, {}
+        self._buffered = 0
+        return buffers, usage
+
+    async def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of rows written."""
+        if not self._buffers and not self._conversation_usage:
+            return 0
+        if self.supabase is None:
+            logger.debug("Telemetry flush skipped: no Supabase client bound")
+            return 0
+        lock = self._flush_lock
+        if lock is None:
+            return await asyncio.to_thread(self._write, *self._take())
+        async with lock:
+            return await asyncio.to_thread(self._write, *self._take())
+
+    def _write(self, buffers: dict[str, list[dict]], usage: dict[str, list]) -> int:
+        """Blocking bulk writes — runs on a worker thread."""
+        written = 0
+        for table, rows in buffers.items():
+            for start in range(0, len(rows), self.batch_size):
+                written += self._write_chunk(table, rows[start:start + self.batch_size])
+
+        for conversation_id, (input_tokens, output_tokens, cost_usd) in usage.items():
+            try:
+                self.supabase.rpc("increment_conversation_usage", {
+                    "p_conversation_id": conversation_id,
+                    "p_input_tokens": input_tokens,
+                    "p_output_tokens": output_tokens,
+                    "p_cost_usd": float(cost_usd),
+                }).execute()
+            except Exception as e:
+                logger.warning(f"Telemetry: conversation usage increment failed: {e}")
+
+        self._stats["written"] += written
+        self._stats["flushes"] += 1
+        return written
+
+    def _insert(self, table: str, rows: list[dict]) -> None:
+        if table == TOKEN_USAGE_TABLE:
+            record_usage_batch(self.supabase, rows)
+        else:
+            self.supabase.table(table).insert(rows).execute()
+
+    def _write_chunk(self, table: str, chunk: list[dict]) -> int:
+        """Write one chunk; on failure retry it once, then split it in halves so
+        only the rows that keep failing (a bad value, an FK to a deleted row)
+        are lost. Returns the rows written."""
+        try:
+            self._insert(table, chunk)
+            return len(chunk)
+        except Exception as e:
+            logger.warning(f"Telemetry: write of {len(chunk)} rows to {table} failed, retrying: {e}")
+        return self._write_or_split(table, chunk)
+
+    def _write_or_split(self, table: str, rows: list[dict]) -> int:
+        try:
+            self._insert(table, rows)
+            return len(rows)
+        except Exception as e:
+            if len(rows) == 1:
+                self._stats["failed"] += 1
+                logger.error(f"Telemetry: failed to write a row to {table}: {e}")
+                return 0
+        mid = len(rows) // 2
+        return self._write_or_split(table, rows[:mid]) + self._write_or_split(table, rows[mid:])
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "buffered": self._buffered,
+            "pending_conversations": len(self._conversation_usage),
+        }
+
+
+_sink: Optional[TelemetrySink] = None
+
+
+def get_sink() -> TelemetrySink:
+    """Process-wide telemetry sink."""
+    global _sink
+    if _sink is None:
+        _sink = TelemetrySink()
+    return _sink
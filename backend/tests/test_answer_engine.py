@@ -0,0 +1,230 @@
+"""
+Tests for backend/agents/answer_engine.py
+==========================================
+Covers:
+  - Intent parsing: entity (incl. SchemaProfile labels), measure, dimension,
+    time buckets, timeframe, top-N, won/open and rep filters, confidence
+  - SQL templates pass sql_engine validation
+  - try_answer: precomputed crm_context path, SQL path, low-confidence and
+    SQL-error fallbacks
+  - Date phrases parse_timeframe does not know defer to the LLM
+  - KPI short-circuit guard (is_qualified)
+
+Uses a lightweight mock-Supabase builder — no real DB required.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from datetime import date
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agents import SchemaProfile
+from agents import sql_engine
+from agents.anvar import DEFAULT_ALLOWED_FIELDS
+from agents.answer_engine import (
+    MIN_CONFIDENCE,
+    build_sql,
+    is_qualified,
+    parse_intent,
+    try_answer,
+)
+from agents.schema_context import SchemaContext
+from agents.sql_engine import validate_sql
+
+TENANT_ID = "tenant-aaa"
+TODAY = date(2026, 10, 18)
+REPS = {"1": "Aziz Karimov", "2": "Dilnoza Rahimova"}
+
+
+def _ctx(**profile) -> SchemaContext:
+    schema = SchemaProfile(
+        tenant_id=TENANT_ID, crm_source="bitrix",
+        amount_field="value", stage_field="stage", owner_field="assigned_to", **profile,
+    )
+    return SchemaContext(schema, {}, {}, DEFAULT_ALLOWED_FIELDS)
+
+
+def _parse(message, **kwargs):
+    return parse_intent(message, kwargs.pop("ctx", None) or _ctx(), REPS, today=TODAY)
+
+
+def _supabase(rpc_rows=None, crm_context=None, rpc_error: Exception | None = None):
+    sb = MagicMock()
+    chain = sb.table.return_value.select.return_value
+    chain.eq.return_value = chain
+    chain.limit.return_value = chain
+    chain.execute.return_value = MagicMock(data=[{"crm_context": crm_context}] if crm_context else [])
+    if rpc_error:
+        sb.rpc.return_value.execute.side_effect = rpc_error
+    else:
+        sb.rpc.return_value.execute.return_value = MagicMock(data=rpc_rows or [])
+    return sb
+
+
+@pytest.fixture(autouse=True)
+def _clear_sql_cache():
+    sql_engine._result_cache.clear()
+    yield
+    sql_engine._result_cache.clear()
+
+
+class TestParseIntent:
+    def test_rep_won_count_this_month(self):
+        intent = _parse("How many deals did Aziz close this month?")
+        assert intent.table == "crm_deals"
+        assert intent.kind == "scalar"
+        assert intent.won is True
+        assert intent.rep_ids == ["1"]
+        assert intent.date_field == "closed_at"
+        assert intent.start == date(2026, 10, 1)
+        assert intent.confidence >= MIN_CONFIDENCE
+
+    def test_top_n_records(self):
+        intent = _parse("top 5 deals")
+        assert intent.kind == "records"
+        assert intent.top_n == 5
+        assert intent.label_field == "title"
+
+    def test_breakdown_with_timeframe(self):
+        intent = _parse("leads by source this month")
+        assert (intent.table, intent.dimension, intent.kind) == ("crm_leads", "source", "breakdown")
+        assert intent.timeframe_label == "this month"
+
+    def test_entity_label_from_schema(self):
+        intent = _parse("how many students last month", ctx=_ctx(entity_labels={"leads": "Students"}))
+        assert intent.table == "crm_leads"
+        assert (intent.start, intent.end) == (date(2026, 9, 1), date(2026, 10, 1))
+        assert intent.confidence >= MIN_CONFIDENCE
+
+    def test_top_dimension_with_measure(self):
+        intent = _parse("top 3 reps by revenue")
+        assert (intent.table, intent.dimension, intent.measure, intent.top_n) == ("crm_deals", "assigned_to", "sum", 3)
+        assert intent.won is True
+
+    def test_time_bucket(self):
+        intent = _parse("leads by month")
+        assert intent.bucket == "month"
+        assert intent.start is not None
+
+    @pytest.mark.parametrize("message", [
+        "why did win rate drop?",
+        "compare leads vs deals",
+        "deals by favourite colour",
+        "show me deals",
+        "what should I focus on",
+    ])
+    def test_low_confidence(self, message):
+        assert _parse(message).confidence < MIN_CONFIDENCE
+
+
+class TestUnparsedTimeframe:
+    @pytest.mark.parametrize("message", [
+        "how many deals were created in march",
+        "how many deals last quarter",
+        "how many deals in 2025",
+        "how many leads since january",
+        "how many deals in q3",
+        "how many deals in september",
+        "how many leads did we get in the last two weeks",
+        "how many deals were won in october 2025",
+        "deals by stage in may",
+        "how many deals this month and last month",
+    ])
+    def test_defers_instead_of_dropping_the_period(self, message):
+        intent = _parse(message)
+        assert "unparsed timeframe" in intent.notes
+        assert intent.confidence < MIN_CONFIDENCE
+
+    @pytest.mark.asyncio
+    async def test_try_answer_returns_none(self):
+        sb = _supabase(rpc_rows=[{"value": 7}])
+        assert await try_answer(sb, TENANT_ID, "bitrix", "how many deals were won in october 2025", _ctx(), REPS) is None
+        sb.rpc.assert_not_called()
+
+    @pytest.mark.parametrize("message", [
+        "how many deals this month", "leads by source last 30 days", "leads by month", "top 5 deals",
+    ])
+    def test_known_timeframes_still_answer(self, message):
+        assert _parse(message).confidence >= MIN_CONFIDENCE
+
+    def test_rep_name_is_not_a_month(self):
+        intent = parse_intent("how many deals did May close this month", _ctx(), {"3": "May Lee"}, today=TODAY)
+        assert intent.rep_name == "May Lee" and intent.confidence >= MIN_CONFIDENCE
+
+
+class TestBuildSql:
+    @pytest.mark.parametrize("message", [
+        "How many deals did Aziz close this month?",
+        "top 5 deals",
+        "leads by source this month",
+        "total pipeline value by stage",
+        "average deal value last 30 days",
+        "how many calls this week",
+        "leads by week",
+        "open deals by stage",
+    ])
+    def test_templates_validate(self, message):
+        ctx = _ctx()
+        intent = parse_intent(message, ctx, REPS, today=TODAY)
+        ok, error, _ = validate_sql(build_sql(intent), ctx)
+        assert ok, error
+
+    def test_rep_filter_is_quoted(self):
+        intent = _parse("how many deals did Aziz close")
+        intent.rep_ids = ["1' OR '1'='1"]
+        assert "'1'' OR ''1''=''1'" in build_sql(intent)
+
+
+class TestTryAnswer:
+    @pytest.mark.asyncio
+    async def test_breakdown_from_crm_context(self):
+        crm_context = {"leads": {"by_source": [{"source": "Web", "count": 5}, {"source": "Ads", "count": 9}]}}
+        sb = _supabase(crm_context=crm_context)
+        answer = await try_answer(sb, TENANT_ID, "bitrix", "leads by source", _ctx(), REPS)
+        assert answer["agent_used"] == "answer_engine"
+        assert answer["sql"] is None
+        assert answer["charts"][0]["data"] == [{"label": "Ads", "value": 9}, {"label": "Web", "value": 5}]
+        sb.rpc.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_scalar_via_sql(self):
+        sb = _supabase(rpc_rows=[{"value": 7}])
+        answer = await try_answer(sb, TENANT_ID, "bitrix", "How many deals did Aziz close this month?", _ctx(), REPS)
+        assert answer["charts"] == [{"type": "kpi", "title": "Won Deals — Aziz Karimov (this month)", "value": "7"}]
+        assert "**Won Deals — Aziz Karimov (this month)**: 7" == answer["reply"]
+        assert sb.rpc.call_args[0][0] == "exec_readonly_sql"
+
+    @pytest.mark.asyncio
+    async def test_rep_breakdown_resolves_names(self):
+        sb = _supabase(rpc_rows=[{"label": "2", "value": 3}, {"label": "1", "value": 1}])
+        answer = await try_answer(sb, TENANT_ID, "bitrix", "deals by rep this month", _ctx(), REPS)
+        assert [d["label"] for d in answer["charts"][0]["data"]] == ["Dilnoza Rahimova", "Aziz Karimov"]
+
+    @pytest.mark.asyncio
+    async def test_low_confidence_returns_none(self):
+        sb = _supabase()
+        assert await try_answer(sb, TENANT_ID, "bitrix", "why are we losing deals?", _ctx(), REPS) is None
+        sb.rpc.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_sql_error_falls_back(self):
+        sb = _supabase(rpc_error=Exception("timeout"))
+        assert await try_answer(sb, TENANT_ID, "bitrix", "top 5 deals", _ctx(), REPS) is None
+
+
+class TestIsQualified:
+    def test_bare_kpi_question(self):
+        assert not is_qualified("how many deals")
+
+    @pytest.mark.parametrize("message", [
+        "how many deals this month", "how many deals did Aziz close", "deals by stage", "top 5 deals",
+        "how many deals in march", "how many leads last quarter",
+    ])
+    def test_qualified(self, message):
+        assert is_qualified(message)
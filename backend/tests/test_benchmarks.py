@@ -0,0 +1,184 @@
+"""
+Tests for backend/benchmarks/
+=============================
+Covers:
+  - synthetic_crm: sizes as documented, deterministic per (seed, day),
+    every row scoped to the benchmark tenant
+  - sqlite_backend: schema parsed from migrations/, build_database,
+    PostgREST filters / order / count / upsert / single-object over SQLite,
+    exec_readonly_sql scoped to the tenant, Postgres -> SQLite translation
+  - runner: compare() tolerance and slack, end-to-end measure through a real
+    supabase client against SqliteBackend
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.runner import BENCHMARK_KEY, compare, run
+from benchmarks.cases import select_cases
+from benchmarks.sqlite_backend import SqliteBackend, SqlitePostgrest, build_database, load_schema, translate_sql
+from benchmarks.synthetic_crm import CRM_SOURCE, TENANT_ID, dataset_spec, generate
+
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    path = tmp_path_factory.mktemp("bench") / "crm-1k.sqlite"
+    counts = build_database(path, generate("1k", seed=0, now=NOW))
+    return path, counts
+
+
+class TestSyntheticCrm:
+    def test_spec_sizes(self):
+        spec = dataset_spec("10k")
+        assert (spec.deals, spec.activities, spec.leads, spec.contacts, spec.companies) == (
+            10_000, 10_000, 5_000, 2_500, 250)
+        assert dataset_spec("1m").users == 250
+        with pytest.raises(ValueError):
+            dataset_spec("5k")
+
+    def test_deterministic_per_seed_and_day(self):
+        def deals(seed, now=NOW):
+            return [rows for table, rows in generate("1k", seed=seed, now=now) if table == "crm_deals"]
+
+        assert deals(0) == deals(0)
+        assert deals(0) != deals(1)
+        assert deals(0)[0][0]["created_at"] != deals(0, now=datetime(2026, 6, 2, tzinfo=timezone.utc))[0][0]["created_at"]
+
+    def test_rows_scoped_to_tenant(self):
+        totals = {}
+        for table, rows in generate("1k", now=NOW):
+            totals[table] = totals.get(table, 0) + len(rows)
+            assert all(row.get("tenant_id") == TENANT_ID for row in rows), table
+            if table.startswith("crm_"):
+                assert all(row["crm_source"] == CRM_SOURCE for row in rows), table
+        assert totals["crm_deals"] == totals["crm_activities"] == 1_000
+
+
+class TestSchema:
+    def test_tables_from_migrations(self):
+        schema = load_schema()
+        assert {"crm_deals", "crm_activities", "tenant_metrics", "revenue_snapshots"} <= set(schema)
+        assert schema["crm_deals"]["value"].sqlite_type == "REAL"
+        assert schema["crm_deals"]["won"].kind == "boolean"
+
+    def test_build_database(self, database):
+        path, counts = database
+        assert counts["crm_deals"] == 1_000 and counts["tenant_metrics"] > 0
+        assert path.stat().st_size > 0
+
+
+class TestSqlitePostgrest:
+    @pytest.fixture
+    def server(self, database, tmp_path):
+        copy = tmp_path / "crm.sqlite"
+        copy.write_bytes(database[0].read_bytes())
+        return SqlitePostgrest(str(copy))
+
+    @staticmethod
+    async def get(server, query, headers=None):
+        status, out_headers, body = await server.handle("GET", f"/rest/v1/{query}", headers or {}, b"")
+        return status, out_headers, json.loads(body) if body else None
+
+    @pytest.mark.asyncio
+    async def test_filters_order_count(self, server):
+        status, headers, rows = await self.get(
+            server, "crm_deals?select=id,value,won&won=is.true&value=gt.100&order=value.desc&limit=5",
+            {"prefer": "count=exact"})
+        assert status == 200 and len(rows) == 5
+        assert all(r["won"] is True and r["value"] > 100 for r in rows)
+        assert [r["value"] for r in rows] == sorted((r["value"] for r in rows), reverse=True)
+        assert headers["content-range"].startswith("0-4/")
+        _, _, rows = await self.get(server, "crm_deals?select=stage&stage=in.(WON,LOSE)&limit=50")
+        assert {r["stage"] for r in rows} <= {"WON", "LOSE"}
+
+    @pytest.mark.asyncio
+    async def test_max_rows_caps_reads(self, server):
+        server.max_rows = 7
+        _, headers, rows = await self.get(server, "crm_deals?select=id")
+        assert len(rows) == 7 and headers["content-range"] == "0-6/*"
+
+    @pytest.mark.asyncio
+    async def test_unknown_column_is_a_400(self, server):
+        status, _, body = await self.get(server, "crm_deals?select=id&nope=eq.1")
+        assert status == 400 and body["code"] == "PGRST100"
+
+    @pytest.mark.asyncio
+    async def test_upsert_and_single_object(self, server):
+        row = {"id": "11111111-0000-4000-8000-000000000001", "tenant_id": TENANT_ID, "crm_source": CRM_SOURCE,
+               "external_id": "x1", "title": "first"}
+        prefer = {"prefer": "resolution=merge-duplicates,return=representation"}
+        for title in ("first", "second"):
+            status, _, body = await server.handle("POST", "/rest/v1/crm_deals?on_conflict=id", prefer,
+                                                  json.dumps([{**row, "title": title}]).encode())
+            assert status == 201 and json.loads(body)[0]["title"] == title
+        accept = {"accept": "application/vnd.pgrst.object+json"}
+        status, _, found = await self.get(server, f"crm_deals?id=eq.{row['id']}", accept)
+        assert status == 200 and found["title"] == "second"
+        status, _, _ = await self.get(server, "crm_deals?won=is.true", accept)
+        assert status == 406
+
+    @pytest.mark.asyncio
+    async def test_exec_readonly_sql_is_tenant_scoped(self, server):
+        async def rpc(tenant, query):
+            params = {"p_tenant_id": tenant, "p_crm_source": CRM_SOURCE, "p_query": query}
+            status, _, body = await server.handle("POST", "/rest/v1/rpc/exec_readonly_sql", {},
+                                                  json.dumps(params).encode())
+            return status, json.loads(body)
+
+        status, rows = await rpc(TENANT_ID, "SELECT COUNT(*) AS n, SUM(value::numeric) AS total FROM crm_deals")
+        assert status == 200 and rows[0]["n"] == 1_000 and rows[0]["total"] > 0
+        assert (await rpc("someone-else", "SELECT COUNT(*) AS n FROM crm_deals"))[1] == [{"n": 0}]
+        assert (await rpc(TENANT_ID, "DELETE FROM crm_deals"))[0] == 400
+
+    def test_translate_sql(self):
+        assert translate_sql("SELECT (value)::numeric, x::int FROM t") == (
+            "SELECT CAST((value) AS REAL), CAST(x AS INTEGER) FROM t")
+        assert "LIKE" in translate_sql("WHERE title ILIKE '%a%'")
+        assert "strftime" in translate_sql("WHERE created_at > NOW()")
+        with pytest.raises(ValueError):
+            translate_sql("SELECT x::jsonb")
+
+
+class TestRunner:
+    def test_compare(self):
+        baseline = {"cases": {
+            "a": {"min_seconds": 0.100, "peak_kb": 1000.0, "queries": 4, "rows_read": 100},
+            "b": {"min_seconds": 0.001, "peak_kb": 10.0, "queries": 1, "rows_read": 5},
+            "gone": {"seconds": 1.0},
+        }}
+        steady = {"cases": {
+            "a": {"min_seconds": 0.180, "peak_kb": 1100.0, "queries": 4, "rows_read": 120},
+            "b": {"min_seconds": 0.004, "peak_kb": 200.0, "queries": 1, "rows_read": 5},  # within the slack
+        }}
+        assert compare(steady, baseline) == []
+        assert compare(steady, baseline, time_tolerance=0.25) == ["a min_seconds: 0.1 -> 0.18"]
+        worse = {"cases": {
+            "a": {"min_seconds": 0.250, "peak_kb": 1000.0, "queries": 5, "rows_read": 130},
+            "b": {"error": "RuntimeError: boom"},
+        }}
+        assert compare(worse, baseline) == [
+            "a min_seconds: 0.1 -> 0.25", "a queries: 4 -> 5", "a rows_read: 100 -> 130", "b: RuntimeError: boom"]
+
+    @pytest.mark.asyncio
+    async def test_end_to_end(self, database, tmp_path):
+        from supabase import create_client
+
+        copy = tmp_path / "crm.sqlite"
+        copy.write_bytes(database[0].read_bytes())
+        cases = select_cases(["compute_tenant_snapshot", "execute_chart_query"])
+        with SqliteBackend(copy) as backend:
+            report = await run(create_client(backend.url, BENCHMARK_KEY), "1k", cases, repeat=1, warmup=0)
+        assert set(report["cases"]) == {c.name for c in cases}
+        for name, result in report["cases"].items():
+            assert "error" not in result, name
+            assert result["queries"] > 0 and result["rows_read"] > 0 and result["peak_kb"] > 0
@@ -266,3 +266,167 @@ class TestToolDefinitions:
         from agents.bobur_v4 import TOOL_DEFINITIONS
         run_sql = next(t for t in TOOL_DEFINITIONS if t["function"]["name"] == "run_sql")
         assert "sql" in run_sql["function"]["parameters"]["required"]
+
+
+# ── Test 8: Concurrent tool calls + per-turn memoization ─────────────────
+
+class TestToolExecution:
+    def test_cache_key_canonicalizes_sql(self):
+        from agents.bobur_v4 import _tool_cache_key
+        a = _tool_cache_key("run_sql", {"sql": "select  count(*)\nfrom crm_deals;"})
+        b = _tool_cache_key("run_sql", {"sql": "SELECT COUNT(*) FROM crm_deals"})
+        assert a == b
+
+    def test_cache_key_ignores_arg_order(self):
+        from agents.bobur_v4 import _tool_cache_key
+        a = _tool_cache_key("get_metric", {"metric_key": "win_rate", "time_range_days": 30})
+        b = _tool_cache_key("get_metric", {"time_range_days": 30, "metric_key": "win_rate"})
+        assert a == b
+
+    @pytest.mark.asyncio
+    async def test_calls_run_concurrently(self):
+        import asyncio
+        import time
+        from agents import bobur_v4
+
+        async def slow_tool(name, args, *ctx):
+            await asyncio.sleep(0.2)
+            return {"tool": name}
+
+        calls = [("run_sql", {"sql": "SELECT 1"}), ("get_metric", {"metric_key": "x"}), ("list_alerts", {})]
+        with patch.object(bobur_v4, "_execute_tool", side_effect=slow_tool):
+            start = time.monotonic()
+            outcomes = await bobur_v4._execute_tool_calls(calls, {}, 10.0)
+            elapsed = time.monotonic() - start
+        assert elapsed < 0.5
+        assert [r["tool"] for r, _ in outcomes] == ["run_sql", "get_metric", "list_alerts"]
+        assert not any(cached for _, cached in outcomes)
+
+    @pytest.mark.asyncio
+    async def test_memo_serves_repeat_calls(self):
+        from agents import bobur_v4
+
+        mock = AsyncMock(return_value={"result": "ok"})
+        memo = {}
+        with patch.object(bobur_v4, "_execute_tool", mock):
+            await bobur_v4._execute_tool_calls([("get_metric", {"metric_key": "x"})], memo, 10.0)
+            outcomes = await bobur_v4._execute_tool_calls(
+                [("get_metric", {"metric_key": "x"}), ("get_metric", {"metric_key": "x"})], memo, 10.0,
+            )
+        assert mock.await_count == 1
+        assert outcomes == [({"result": "ok"}, True), ({"result": "ok"}, True)]
+
+    @pytest.mark.asyncio
+    async def test_duplicates_in_one_turn_execute_once(self):
+        from agents import bobur_v4
+
+        mock = AsyncMock(return_value={"charts": [1]})
+        with patch.object(bobur_v4, "_execute_tool", mock):
+            outcomes = await bobur_v4._execute_tool_calls(
+                [("design_chart", {"description": "a"}), ("design_chart", {"description": "a"})], {}, 10.0,
+            )
+        assert mock.await_count == 1
+        assert [cached for _, cached in outcomes] == [False, True]
+
+    @pytest.mark.asyncio
+    async def test_timeout_and_errors_are_not_memoized(self):
+        import asyncio
+        from agents import bobur_v4
+
+        async def hang(name, args, *ctx):
+            await asyncio.sleep(5)
+
+        memo = {}
+        with patch.object(bobur_v4, "_execute_tool", side_effect=hang), \
+             patch.object(bobur_v4, "MIN_TOOL_TIMEOUT_S", 0.05):
+            outcomes = await bobur_v4._execute_tool_calls([("run_sql", {"sql": "SELECT 1"})], memo, 0.0)
+        assert "timed out" in outcomes[0][0]["error"]
+        assert memo == {}
+
+        with patch.object(bobur_v4, "_execute_tool", AsyncMock(side_effect=RuntimeError("db down"))):
+            outcomes = await bobur_v4._execute_tool_calls([("list_alerts", {})], memo, 10.0)
+        assert outcomes[0][0] == {"error": "db down"}
+        assert memo == {}
+
+
+# ── Test 9: Streaming (on_event) ─────────────────────────────────────────
+
+def _chunk(content=None, tool_calls=None, usage=None):
+    from types import SimpleNamespace as NS
+    choices = [] if usage else [NS(delta=NS(content=content, tool_calls=tool_calls))]
+    return NS(choices=choices, usage=usage)
+
+
+def _tc_delta(index, id=None, name=None, arguments=None):
+    from types import SimpleNamespace as NS
+    return NS(index=index, id=id, function=NS(name=name, arguments=arguments))
+
+
+class _FakeStream:
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        return self._chunks.pop(0)
+
+
+class TestStreamingLoop:
+    @pytest.mark.asyncio
+    async def test_events_and_streamed_reply(self):
+        from types import SimpleNamespace as NS
+        from agents import bobur_v4
+        from agents.conversation_state import ConversationState
+        from llm_gateway import LLMGateway
+
+        turns = [
+            _FakeStream([
+                _chunk(tool_calls=[_tc_delta(0, id="c1", name="run_sql", arguments='{"sql": "SELECT 1"}')]),
+                _chunk(usage=NS(prompt_tokens=10, completion_tokens=5)),
+            ]),
+            _FakeStream([
+                _chunk(tool_calls=[_tc_delta(0, id="c2", name="respond", arguments='{"reply": "You have ')]),
+                _chunk(tool_calls=[_tc_delta(0, arguments='3 deals."}')]),
+            ]),
+        ]
+        create = AsyncMock(side_effect=turns)
+        events = []
+
+        async def on_event(event, data):
+            events.append((event, data))
+
+        schema_ctx = MagicMock()
+        schema_ctx.for_query_prompt.return_value = ""
+        openai_client = NS(chat=NS(completions=NS(create=create)))
+        with patch("llm_gateway.get_openai_client", return_value=openai_client), \
+             patch.object(bobur_v4, "get_gateway", return_value=LLMGateway()), \
+             patch.object(bobur_v4, "_build_system_prompt", return_value="sys"), \
+             patch.object(bobur_v4, "build_rep_name_map", AsyncMock(return_value={})), \
+             patch.object(bobur_v4, "_execute_tool", AsyncMock(return_value={
+                 "result": "1 row", "rows": [{"n": 3}], "row_count": 1, "sql_executed": "SELECT 1",
+             })), \
+             patch.object(bobur_v4, "log_token_usage_fire_and_forget") as log_usage:
+            result = await bobur_v4._agentic_loop(
+                MagicMock(), "t1", "bitrix", "how many deals?", [],
+                schema_ctx, None, None, "", ConversationState(), on_event=on_event,
+            )
+
+        assert result["reply"] == "You have 3 deals."
+        assert create.call_args.kwargs["stream"] is True
+        names = [e for e, _ in events]
+        assert names.index("tool_start") < names.index("tool_result") < names.index("sql")
+        assert "".join(d["text"] for e, d in events if e == "token") == "You have 3 deals."
+        assert log_usage.call_args.kwargs["request_type"] == "crm_chat"
+
+    @pytest.mark.asyncio
+    async def test_failing_consumer_does_not_break_loop(self):
+        from agents.bobur_v4 import _emit
+
+        async def broken(event, data):
+            raise RuntimeError("client gone")
+
+        await _emit(broken, "token", {"text": "x"})  # no exception
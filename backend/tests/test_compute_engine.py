@@ -414,3 +414,120 @@ def test_confidence_capped_on_caveats():
 
     evidence = DynamicMetricEvidence(row_count=100, caveats=["some issue"])
     assert _compute_confidence(evidence, 0.9) == 0.7
+
+
+# ── Test: recipe fusion ──────────────────────────────────────────────
+
+FUSION_METRICS = [
+    {"metric_key": "total_deals", "title": "Total Deals", "source_table": "crm_deals",
+     "computation": {"type": "count", "table": "crm_deals", "filters": {}},
+     "display_format": "number", "required_fields": [], "confidence": 0.9},
+    {"metric_key": "won_value", "title": "Won Value", "source_table": "crm_deals",
+     "computation": {"type": "sum", "table": "crm_deals", "field": "value", "filters": {"won": True}},
+     "display_format": "currency", "required_fields": ["value"], "confidence": 0.9},
+    {"metric_key": "win_rate", "title": "Win Rate", "source_table": "crm_deals",
+     "computation": {"type": "ratio", "multiply": 100,
+                     "numerator": {"table": "crm_deals", "filter": {"won": True}, "agg": "count"},
+                     "denominator": {"table": "crm_deals", "filter": {}, "agg": "count"}},
+     "display_format": "percentage", "required_fields": [], "confidence": 0.8},
+    {"metric_key": "total_leads", "title": "Total Leads", "source_table": "crm_leads",
+     "computation": {"type": "count", "table": "crm_leads", "filters": {"status__in": ["NEW", "O'Brien"]}},
+     "display_format": "number", "required_fields": [], "confidence": 0.9},
+    {"metric_key": "cycle", "title": "Cycle", "source_table": "crm_deals",
+     "computation": {"type": "duration", "table": "crm_deals"},
+     "display_format": "days", "required_fields": [], "confidence": 0.9},
+]
+
+
+def test_plan_recipes_groups_by_table_and_dedupes_aggregates():
+    from revenue.dynamic_compute import plan_recipes
+
+    plan = plan_recipes(FUSION_METRICS, 30)
+
+    assert set(plan.groups) == {"crm_deals", "crm_leads"}
+    assert set(plan.metrics) == {0, 1, 2, 3}  # duration is not fusable
+    deals = plan.groups["crm_deals"]
+    # COUNT(*) unfiltered is shared by total_deals and the ratio denominator
+    assert len([a for a in deals.aggregates if a.expr == "COUNT(*)" and a.where == "TRUE"]) == 1
+
+
+def test_compile_group_sql_uses_conditional_aggregates():
+    from revenue.dynamic_compute import plan_recipes, compile_group_sql
+
+    plan = plan_recipes(FUSION_METRICS, 30)
+    now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    sql = compile_group_sql(plan.groups["crm_leads"], 30, now)
+
+    assert sql.startswith("SELECT COUNT(*) FILTER (WHERE created_at >= '2026-01-30")
+    assert "a0_prev" in sql
+    assert "status IN ('NEW', 'O''Brien')" in sql
+    assert "WHERE created_at >= '2025-12-31" in sql
+
+
+def test_plan_recipes_skips_unsafe_identifiers():
+    from revenue.dynamic_compute import plan_recipes
+
+    bad = {"metric_key": "x", "computation": {
+        "type": "sum", "table": "crm_deals", "field": "value; drop", "filters": {}}}
+    plan = plan_recipes([bad], 30)
+    assert plan.metrics == {}
+    assert plan.groups == {}
+
+
+def _fusion_supabase(rpc_rows, calls):
+    sb = make_supabase({"tenant_metrics": {"data": FUSION_METRICS}})
+
+    def rpc(name, params):
+        calls.append(params["p_query"])
+        res = MagicMock()
+        table = params["p_query"].split(" FROM ")[1].split()[0]
+        if isinstance(rpc_rows, Exception):
+            res.execute.side_effect = rpc_rows
+        else:
+            res.execute.return_value = MagicMock(data=[rpc_rows[table]])
+        return res
+
+    sb.rpc = rpc
+    return sb
+
+
+@pytest.mark.asyncio
+async def test_compute_tenant_snapshot_fuses_queries():
+    from revenue.dynamic_compute import compute_tenant_snapshot
+
+    calls = []
+    sb = _fusion_supabase({
+        "crm_deals": {"a0_cur": 40, "a0_prev": 20, "a1_cur": 5000.5, "a1_prev": 0,
+                      "a2_cur": 10, "a2_prev": 8, "a3_cur": 10, "a3_prev": 5},
+        "crm_leads": {"a0_cur": 7, "a0_prev": 0},
+    }, calls)
+
+    with patch("revenue.dynamic_compute.load_allowed_fields",
+               AsyncMock(return_value={"crm_deals": ["value", "won"], "crm_leads": ["status"]})):
+        results = await compute_tenant_snapshot(sb, "t1", "bitrix24", 30)
+
+    assert len(calls) == 2
+    by_key = {r.metric_key: r for r in results}
+    assert [r.metric_key for r in results] == [m["metric_key"] for m in FUSION_METRICS]
+    assert by_key["total_deals"].value == 40
+    assert by_key["total_deals"].comparison == {"previous_value": 20}
+    assert by_key["won_value"].value == 5000.5
+    assert by_key["won_value"].comparison is None
+    assert by_key["win_rate"].value == 25.0
+    assert by_key["total_leads"].value == 7
+
+
+@pytest.mark.asyncio
+async def test_compute_tenant_snapshot_falls_back_when_fused_query_fails():
+    from revenue.dynamic_compute import compute_tenant_snapshot
+
+    calls = []
+    sb = _fusion_supabase(Exception("rpc missing"), calls)
+
+    with patch("revenue.dynamic_compute.load_allowed_fields",
+               AsyncMock(return_value={"crm_deals": ["value", "won"], "crm_leads": ["status"]})):
+        results = await compute_tenant_snapshot(sb, "t1", "bitrix24", 30)
+
+    assert len(calls) == 2
+    assert len(results) == len(FUSION_METRICS)
+    assert all(isinstance(r, DynamicMetricResult) for r in results)
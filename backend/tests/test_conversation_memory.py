@@ -0,0 +1,170 @@
+"""
+Tests for backend/conversation_memory.py
+=========================================
+Covers:
+  - Short conversations bypass the memory table
+  - Window selection from summarized_until; fold scheduling when saturated
+  - refresh_memory: incremental fold, persisted row, fail-open paths
+  - Prompt section rendering
+
+Uses a lightweight mock-Supabase builder and a fake gateway — no real DB/LLM.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import conversation_memory
+from conversation_memory import (
+    FETCH_WINDOW,
+    RECENT_WINDOW,
+    ConversationMemory,
+    build_context,
+    refresh_memory,
+)
+
+TENANT_ID = "tenant-aaa"
+CONV_ID = "conv-1"
+
+
+def _msg(i: int) -> dict:
+    return {
+        "sender_type": "agent" if i % 2 else "user",
+        "text": f"message {i}",
+        "created_at": f"2026-10-18T10:{i:02d}:00+00:00",
+    }
+
+
+def _supabase(memory_row=None, message_rows=None, upsert_error: Exception | None = None):
+    sb = MagicMock()
+    chains = {}
+
+    def table(name):
+        if name not in chains:
+            chain = MagicMock()
+            for method in ("select", "eq", "lt", "gt", "order", "limit"):
+                getattr(chain, method).return_value = chain
+            rows = [memory_row] if (name == "conversation_memories" and memory_row) else (message_rows or [])
+            chain.execute.return_value = MagicMock(data=rows)
+            if upsert_error:
+                chain.upsert.return_value.execute.side_effect = upsert_error
+            chains[name] = chain
+        return chains[name]
+
+    sb.table.side_effect = table
+    sb.chains = chains
+    return sb
+
+
+def _gateway(content: dict):
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+        usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20, prompt_tokens_details=None),
+    )
+    gateway = MagicMock()
+    gateway.chat_completion = AsyncMock(return_value=response)
+    return gateway
+
+
+@pytest.fixture(autouse=True)
+def _reset_inflight():
+    conversation_memory._inflight.clear()
+    yield
+    conversation_memory._inflight.clear()
+
+
+class TestBuildContext:
+    @pytest.mark.asyncio
+    async def test_short_conversation_skips_memory(self):
+        sb = _supabase()
+        history = [_msg(i) for i in range(FETCH_WINDOW - 1)]
+        window, memory = await build_context(sb, TENANT_ID, CONV_ID, history)
+        assert window == history and memory is None
+        sb.table.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_window_starts_after_summarized_until(self):
+        history = [_msg(i) for i in range(FETCH_WINDOW)]
+        row = {"conversation_id": CONV_ID, "summary": "Wants a sofa.", "key_facts": {"budget": "$500"},
+               "summarized_until": history[3]["created_at"], "summarized_count": 20}
+        with patch.object(conversation_memory, "schedule_refresh") as schedule:
+            window, memory = await build_context(_supabase(memory_row=row), TENANT_ID, CONV_ID, history)
+        assert window == history[4:]
+        assert memory.summary == "Wants a sofa."
+        schedule.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_saturated_window_schedules_fold(self):
+        history = [_msg(i) for i in range(FETCH_WINDOW)]
+        with patch.object(conversation_memory, "schedule_refresh") as schedule:
+            window, memory = await build_context(_supabase(), TENANT_ID, CONV_ID, history)
+        assert window == history and memory is None
+        cutoff = schedule.call_args[0][3]
+        assert cutoff == history[-RECENT_WINDOW]["created_at"]
+
+    @pytest.mark.asyncio
+    async def test_fold_is_single_flight(self):
+        sb = _supabase()
+        with patch.object(conversation_memory, "refresh_memory", AsyncMock()) as refresh:
+            assert conversation_memory.schedule_refresh(sb, TENANT_ID, CONV_ID, "t", None)
+            assert not conversation_memory.schedule_refresh(sb, TENANT_ID, CONV_ID, "t", None)
+            await asyncio.sleep(0)
+        assert refresh.await_count == 1
+        assert CONV_ID not in conversation_memory._inflight
+
+
+class TestRefreshMemory:
+    @pytest.mark.asyncio
+    async def test_incremental_fold_persists_row(self):
+        rows = [_msg(i) for i in range(6)]
+        sb = _supabase(message_rows=list(reversed(rows)))
+        previous = ConversationMemory(CONV_ID, "Asked about sofas.", {"name": "Ali"},
+                                      "2026-10-18T09:00:00+00:00", 10)
+        gateway = _gateway({"summary": "Asked about sofas; budget $500.", "facts": {"name": "Ali", "budget": "$500"}})
+        with patch.object(conversation_memory, "get_gateway", return_value=gateway), \
+                patch.object(conversation_memory, "log_token_usage_fire_and_forget"):
+            memory = await refresh_memory(sb, TENANT_ID, CONV_ID, "2026-10-18T11:00:00+00:00", previous)
+
+        assert memory.summarized_until == rows[-1]["created_at"]
+        assert memory.summarized_count == 16
+        assert memory.facts == {"name": "Ali", "budget": "$500"}
+        sb.chains["messages"].gt.assert_called_once_with("created_at", previous.summarized_until)
+        prompt = gateway.chat_completion.call_args.kwargs["messages"][1]["content"]
+        assert "Asked about sofas." in prompt and "customer: message 0" in prompt
+        upserted = sb.chains["conversation_memories"].upsert.call_args[0][0]
+        assert upserted["key_facts"] == memory.facts and upserted["tenant_id"] == TENANT_ID
+
+    @pytest.mark.asyncio
+    async def test_nothing_to_fold(self):
+        gateway = _gateway({})
+        with patch.object(conversation_memory, "get_gateway", return_value=gateway):
+            assert await refresh_memory(_supabase(), TENANT_ID, CONV_ID, "t") is None
+        gateway.chat_completion.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_write_failure_fails_open(self):
+        sb = _supabase(message_rows=[_msg(1)], upsert_error=Exception("db down"))
+        with patch.object(conversation_memory, "get_gateway", return_value=_gateway({"summary": "x"})), \
+                patch.object(conversation_memory, "log_token_usage_fire_and_forget"):
+            assert await refresh_memory(sb, TENANT_ID, CONV_ID, "t") is None
+
+
+class TestPromptSection:
+    def test_renders_summary_and_facts(self):
+        memory = ConversationMemory(CONV_ID, "Wants a\nsofa.", {"budget": "$500", "city": None})
+        section = memory.prompt_section()
+        assert section.splitlines() == [
+            "## EARLIER IN THIS CONVERSATION (summarized)", "Wants a sofa.", "Key facts:", "- budget: $500",
+        ]
+
+    def test_empty_memory(self):
+        assert ConversationMemory(CONV_ID).prompt_section() is None
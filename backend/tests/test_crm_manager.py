@@ -0,0 +1,137 @@
+"""
+Tests for backend/crm_manager.py
+================================
+Covers:
+  - Connect / disconnect through the CRM router (Freshsales) store and
+    soft-delete the crm_connections row and drop the cached connection list
+  - update_credentials() (OAuth token refresh) merges into the stored
+    credentials and invalidates the cache; a missing connection is a no-op
+  - The connection list is cached between reads
+
+The real supabase-py client answers from loadtest.fakes.Tables through an
+httpx MockTransport, so the PostgREST calls the manager makes are exercised.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from loadtest.fakes import Tables
+
+PLACEHOLDER_ENV = {
+    "SUPABASE_URL": "https://project.supabase.co",
+    "SUPABASE_SERVICE_KEY": "placeholder-service-key",
+    "JWT_SECRET": "placeholder-jwt-secret-for-crm-manager-tests",
+    "OPENAI_API_KEY": "sk-test",
+}
+TENANT = "11111111-1111-1111-1111-111111111111"
+USER = "22222222-2222-2222-2222-222222222222"
+
+
+def tables_handler(tables: Tables):
+    def handle(request: httpx.Request) -> httpx.Response:
+        table = request.url.path.split("/rest/v1/", 1)[1]
+        status, headers, body = tables.handle(
+            request.method, table, list(request.url.params.multi_items()), dict(request.headers), request.content
+        )
+        return httpx.Response(status, headers=headers, content=body)
+    return handle
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """server.app whose DB clients answer from an in-memory Tables."""
+    for key, value in PLACEHOLDER_ENV.items():
+        if not os.environ.get(key):
+            monkeypatch.setenv(key, value)
+    from fastapi.testclient import TestClient
+
+    import app_core
+    import crm_manager
+    import server
+    from routers import crm as crm_router
+
+    tables = Tables()
+    tables.seed({"users": [{"id": USER}]})
+    transports = [app_core.supabase.postgrest.session._transport, app_core._rest_client._transport]
+    originals = [t.inner for t in transports]
+    for transport in transports:
+        transport.inner = httpx.MockTransport(tables_handler(tables))
+    app_core._user_exists_cache.clear()
+    crm_manager._crm_connections_cache.clear()
+
+    monkeypatch.setattr(crm_router.FreshsalesCRM, "test_connection", AsyncMock(return_value={"ok": True}))
+    monkeypatch.setattr(crm_router, "trigger_full_sync_background", AsyncMock())
+    monkeypatch.setattr(crm_router, "stop_all_syncs", AsyncMock())
+    monkeypatch.setattr(crm_router, "_cleanup_crm_data", AsyncMock())
+
+    headers = {
+        "Authorization": f"Bearer {app_core.create_access_token(USER, TENANT, 'owner@example.com')}",
+        "Origin": "http://localhost:3000",  # csrf_origin_check on mutations
+    }
+    try:
+        yield TestClient(server.app), tables, headers, app_core.crm_manager
+    finally:
+        for transport, inner in zip(transports, originals):
+            transport.inner = inner
+        crm_manager._crm_connections_cache.clear()
+        for name in [m for m in sys.modules if m in ("server", "app_core") or m.startswith("routers")]:
+            del sys.modules[name]
+
+
+class TestConnectionLifecycle:
+    @pytest.mark.asyncio
+    async def test_connect_and_disconnect_through_router(self, app):
+        client, tables, headers, manager = app
+        assert await manager.get_active_connections(TENANT) == []  # cached empty list
+
+        response = client.post("/api/freshsales/connect", headers=headers,
+                               json={"domain": "acme", "api_key": "key-1"})
+        assert response.status_code == 200 and response.json()["success"] is True
+        [row] = tables.rows["crm_connections"]
+        assert row["tenant_id"] == TENANT and row["crm_type"] == "freshsales" and row["is_active"] is True
+        assert row["credentials"]["domain"] == "acme"
+        assert [c["crm_type"] for c in await manager.get_active_connections(TENANT)] == ["freshsales"]
+        assert client.get("/api/freshsales/status", headers=headers).json()["connected"] is True
+
+        # reconnecting updates the same row instead of inserting another
+        client.post("/api/freshsales/connect", headers=headers, json={"domain": "acme2", "api_key": "key-2"})
+        assert len(tables.rows["crm_connections"]) == 1
+        assert tables.rows["crm_connections"][0]["credentials"]["domain"] == "acme2"
+
+        response = client.post("/api/freshsales/disconnect", headers=headers)
+        assert response.status_code == 200 and response.json()["success"] is True
+        assert tables.rows["crm_connections"][0]["is_active"] is False
+        assert await manager.get_active_connections(TENANT) == []
+        assert client.get("/api/freshsales/status", headers=headers).json() == {"connected": False}
+
+    @pytest.mark.asyncio
+    async def test_update_credentials_merges_and_invalidates(self, app):
+        _, tables, _, manager = app
+        await manager.store_connection(TENANT, "hubspot", {"access_token": "old", "refresh_token": "r1",
+                                                           "portal": "p1"})
+        assert (await manager.get_active_connections(TENANT))[0]["credentials"]["access_token"] == "old"
+
+        assert await manager.update_credentials(TENANT, "hubspot", {"access_token": "new",
+                                                                   "token_expires_at": "2030-01-01"}) is True
+        credentials = tables.rows["crm_connections"][0]["credentials"]
+        assert credentials == {"access_token": "new", "refresh_token": "r1", "portal": "p1",
+                               "token_expires_at": "2030-01-01"}
+        assert (await manager.get_active_connections(TENANT))[0]["credentials"]["access_token"] == "new"
+
+        assert await manager.update_credentials(TENANT, "zoho", {"access_token": "x"}) is False
+
+    @pytest.mark.asyncio
+    async def test_connection_list_is_cached(self, app):
+        _, tables, _, manager = app
+        tables.seed({"crm_connections": [{"id": "c1", "tenant_id": TENANT, "crm_type": "zoho", "is_active": True}]})
+        assert len(await manager.get_active_connections(TENANT)) == 1
+        tables.rows["crm_connections"].clear()  # a write that bypassed the manager
+        assert len(await manager.get_active_connections(TENANT)) == 1
@@ -0,0 +1,289 @@
+"""
+Tests for backend/db_metrics.py
+================================
+Covers:
+  - Query shapes: filter values stripped, select/order kept, RPC paths
+  - Scope attribution (including asyncio.to_thread calls), blocking flag,
+    unscoped calls, @db_job scopes
+  - N+1 warning once per shape above the threshold
+  - Server-Timing header values and aggregated stats()
+  - query_budget() as a test helper, and DB call budgets for key endpoints
+    (/dashboard/widgets, /conversations, the Telegram webhook) driven
+    through the real supabase-py client against an httpx MockTransport
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import db_metrics
+from db_metrics import (
+    InstrumentedTransport,
+    db_job,
+    db_scope,
+    instrument_http_client,
+    query_budget,
+    query_shape,
+)
+
+BASE = "https://project.supabase.co/rest/v1"
+
+
+def rows_handler(tables=None):
+    """MockTransport handler: GET returns tables[table] (default []), writes echo []."""
+    tables = tables or {}
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        table, _ = query_shape(request.method, request.url)
+        rows = tables.get(table, []) if request.method == "GET" else []
+        return httpx.Response(200, json=rows, headers={"content-range": f"0-{max(len(rows) - 1, 0)}/{len(rows)}"})
+    return handle
+
+
+@pytest.fixture
+def client():
+    db_metrics.reset()
+    with instrument_http_client(httpx.Client(transport=httpx.MockTransport(rows_handler()))) as c:
+        yield c
+
+
+class TestQueryShape:
+    def test_filter_values_stripped(self):
+        table, shape = query_shape("GET", httpx.URL(f"{BASE}/leads?select=id,name&tenant_id=eq.t1&id=in.(1,2)&limit=5"))
+        assert table == "leads"
+        assert shape == "GET leads?id=in&limit&select=id,name&tenant_id=eq"
+
+    def test_same_query_different_values_share_a_shape(self):
+        a = query_shape("GET", httpx.URL(f"{BASE}/customers?id=eq.1&select=*"))
+        b = query_shape("GET", httpx.URL(f"{BASE}/customers?id=eq.2&select=*"))
+        assert a == b
+
+    def test_rpc_and_order(self):
+        table, shape = query_shape("POST", httpx.URL(f"{BASE}/rpc/acquire_worker_lease"))
+        assert (table, shape) == ("rpc/acquire_worker_lease", "POST rpc/acquire_worker_lease")
+        _, shape = query_shape("GET", httpx.URL(f"{BASE}/messages?order=created_at.desc&select=*"))
+        assert "order=created_at.desc" in shape
+
+
+class TestScopes:
+    def test_calls_attributed_to_scope(self, client):
+        with db_scope("GET /api/leads") as scope:
+            client.get(f"{BASE}/leads?tenant_id=eq.t1")
+            client.post(f"{BASE}/leads", json={})
+        assert scope.call_count == 2
+        assert [c.table for c in scope.calls] == ["leads", "leads"]
+        assert scope.calls[0].status == 200
+        assert scope.blocking_calls == 0  # no running loop here
+
+    @pytest.mark.asyncio
+    async def test_blocking_flag(self, client):
+        with db_scope("GET /api/conversations") as scope:
+            client.get(f"{BASE}/conversations")                             # sync call on the loop
+            await asyncio.to_thread(client.get, f"{BASE}/customers")       # off the loop
+        assert [c.blocking for c in scope.calls] == [True, False]
+        assert scope.blocking_calls == 1
+
+    def test_unscoped_and_closed_scopes(self, client):
+        with db_scope("GET /api/x") as scope:
+            pass
+        client.get(f"{BASE}/leads")
+        assert scope.call_count == 0
+        assert db_metrics.stats()["scopes"]["unscoped"]["calls"] == 1
+
+    @pytest.mark.asyncio
+    async def test_db_job(self, client):
+        @db_job("telegram_message")
+        async def job():
+            await asyncio.to_thread(client.get, f"{BASE}/conversations")
+            return "done"
+
+        assert await job() == "done"
+        entry = db_metrics.stats()["scopes"]["job:telegram_message"]
+        assert entry["scopes"] == 1 and entry["calls"] == 1
+
+    def test_errors_recorded_and_raised(self):
+        def boom(request):
+            raise httpx.ConnectError("down")
+
+        c = httpx.Client(transport=InstrumentedTransport(httpx.MockTransport(boom)))
+        with db_scope("GET /api/leads") as scope:
+            with pytest.raises(httpx.ConnectError):
+                c.get(f"{BASE}/leads")
+        assert scope.calls[0].error == "ConnectError"
+
+    def test_instrument_is_idempotent(self, client):
+        instrument_http_client(client)
+        assert not isinstance(client._transport.inner, InstrumentedTransport)
+
+
+class TestNPlusOne:
+    def test_warns_once_per_shape(self, client, caplog):
+        with db_scope("GET /api/conversations", repeat_threshold=3) as scope:
+            for i in range(6):
+                client.get(f"{BASE}/customers?id=eq.{i}")
+            client.get(f"{BASE}/leads")
+        assert scope.repeated == ["GET customers?id=eq"]
+        assert caplog.text.count("Possible N+1") == 1
+        assert db_metrics.stats()["scopes"]["GET /api/conversations"]["n_plus_one"] == 1
+
+    def test_disabled_threshold(self, client, caplog):
+        with db_scope("job:crm_full_sync", repeat_threshold=None) as scope:
+            for _ in range(10):
+                client.post(f"{BASE}/crm_leads", json=[])
+        assert scope.repeated == []
+        assert "Possible N+1" not in caplog.text
+
+
+class TestReporting:
+    def test_server_timing(self):
+        scope = db_metrics.DbScope("x")
+        assert scope.server_timing() == 'db;dur=0.0;desc="0 calls"'
+        scope.record(db_metrics.DbCall("GET", "leads", "GET leads", 0.012, blocking=True))
+        scope.record(db_metrics.DbCall("GET", "users", "GET users", 0.003, blocking=False))
+        assert scope.server_timing() == (
+            'db;dur=15.0;desc="2 calls", db-blocking;dur=12.0;desc="1 calls on event loop"'
+        )
+
+    def test_stats_aggregate_scopes_and_shapes(self, client):
+        for _ in range(2):
+            with db_scope("GET /api/leads"):
+                client.get(f"{BASE}/leads?tenant_id=eq.t1")
+                client.get(f"{BASE}/customers?id=eq.1")
+        stats = db_metrics.stats()
+        entry = stats["scopes"]["GET /api/leads"]
+        assert (entry["scopes"], entry["calls"], entry["max_calls"], entry["avg_calls"]) == (2, 4, 2, 2.0)
+        assert entry["tables"] == {"leads": 2, "customers": 2}
+        assert stats["top_shapes"]["GET leads?tenant_id=eq"]["calls"] == 2
+
+    def test_tracked_names_are_bounded(self, client, monkeypatch):
+        monkeypatch.setattr(db_metrics, "MAX_TRACKED", 2)
+        for i in range(5):
+            with db_scope(f"GET /api/{i}"):
+                pass
+        assert set(db_metrics.stats()["scopes"]) == {"GET /api/0", "GET /api/1", "other"}
+
+
+class TestQueryBudget:
+    def test_within_budget(self, client):
+        with query_budget(max_calls=2, max_repeats=1) as budget:
+            client.get(f"{BASE}/leads")
+            client.get(f"{BASE}/customers")
+        assert len(budget.calls) == 2
+
+    def test_over_budget(self, client):
+        with pytest.raises(AssertionError, match="3 DB calls > budget 2"):
+            with query_budget(max_calls=2):
+                for table in ("leads", "customers", "messages"):
+                    client.get(f"{BASE}/{table}")
+
+    def test_repeated_shape(self, client):
+        with pytest.raises(AssertionError, match="GET customers\\?id=eq"):
+            with query_budget(max_repeats=1):
+                for i in range(2):
+                    client.get(f"{BASE}/customers?id=eq.{i}")
+
+
+# ----------------------------------------------------------------------
+# Endpoint budgets — real handlers, real supabase-py, mocked HTTP
+# ----------------------------------------------------------------------
+
+PLACEHOLDER_ENV = {
+    "SUPABASE_URL": "https://project.supabase.co",
+    "SUPABASE_SERVICE_KEY": "placeholder-service-key",
+    "JWT_SECRET": "placeholder-jwt-secret-for-db-budget-tests",
+    "OPENAI_API_KEY": "sk-test",
+}
+TENANT = "11111111-1111-1111-1111-111111111111"
+USER = "22222222-2222-2222-2222-222222222222"
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """server.app with both DB clients answering from `tables` instead of the network."""
+    for key, value in PLACEHOLDER_ENV.items():
+        if not os.environ.get(key):
+            monkeypatch.setenv(key, value)
+    from fastapi.testclient import TestClient
+
+    import app_core
+    import server
+
+    tables = {"users": [{"id": USER}]}
+    transports = [app_core.supabase.postgrest.session._transport, app_core._rest_client._transport]
+    originals = [t.inner for t in transports]
+    for transport in transports:
+        transport.inner = httpx.MockTransport(rows_handler(tables))
+    app_core._user_exists_cache.clear()
+    headers = {"Authorization": f"Bearer {app_core.create_access_token(USER, TENANT, 'owner@example.com')}"}
+    try:
+        yield TestClient(server.app), tables, headers
+    finally:
+        for transport, inner in zip(transports, originals):
+            transport.inner = inner
+        # Leave later tests the same import conditions they had without this fixture
+        for name in [m for m in sys.modules if m in ("server", "app_core") or m.startswith("routers")]:
+            del sys.modules[name]
+
+
+class TestEndpointBudgets:
+    def test_conversations(self, app):
+        client, tables, headers = app
+        tables["conversations"] = [
+            {"id": f"c{i}", "tenant_id": TENANT, "customer_id": f"cust{i}", "last_message_at": "2026-01-01T00:00:00Z"}
+            for i in range(20)
+        ]
+        tables["customers"] = [{"id": f"cust{i}", "name": f"Customer {i}"} for i in range(20)]
+
+        # user check + page + customers + leads, independent of page size
+        with query_budget(max_calls=4, max_repeats=1) as budget:
+            response = client.get("/api/conversations", headers=headers)
+        assert response.status_code == 200
+        assert 'desc="4 calls"' in response.headers["Server-Timing"]
+        assert budget.scopes[0].name == "GET /api/conversations"
+
+    def test_dashboard_widgets_without_crm(self, app):
+        client, _, headers = app
+        with query_budget(max_calls=2, max_repeats=1):
+            response = client.get("/api/dashboard/widgets", headers=headers)
+        assert response.json() == {"widgets": []}
+
+    def test_dashboard_widgets_hydrated(self, app):
+        client, tables, headers = app
+        tables["crm_connections"] = [{"crm_type": "bitrix24"}]
+        tables["dashboard_widgets"] = [
+            {"id": f"w{i}", "chart_type": chart_type, "title": "Leads", "data_source": "crm_leads",
+             "x_field": "status", "aggregation": "count", "position": i}
+            for i, chart_type in enumerate(["bar", "kpi", "pie", "line"])
+        ]
+
+        # Current cost: hydration queries per widget (each chart re-reads
+        # crm_leads). A regression past this budget fails here first.
+        with query_budget(max_calls=11) as budget:
+            response = client.get("/api/dashboard/widgets", headers=headers)
+        assert response.status_code == 200
+        assert budget.shapes["GET crm_leads?crm_source=eq&limit&select=status&tenant_id=eq"] == 3
+
+    def test_telegram_webhook(self, app, monkeypatch):
+        import server
+
+        client, tables, _ = app
+        monkeypatch.setattr(server, "process_telegram_message", AsyncMock())
+        tables["telegram_bots"] = [{"id": "bot1", "tenant_id": TENANT, "bot_token": "123:abc", "webhook_secret": None}]
+        update = {
+            "update_id": 424242,
+            "message": {"message_id": 1, "text": "hi", "chat": {"id": 7, "type": "private"}, "from": {"id": 7}},
+        }
+
+        # bot lookup + last_webhook_at; the reply itself runs as a background job
+        with query_budget(max_calls=2, max_repeats=1):
+            response = client.post("/api/telegram/webhook/bot1", json=update)
+        assert response.json() == {"ok": True}
+        server.process_telegram_message.assert_awaited_once()
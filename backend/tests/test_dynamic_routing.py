@@ -2,11 +2,13 @@
 Phase 3 Tests — Dynamic Routing
 ================================
 Tests for dynamic patterns from entity_labels, record_query routing,
-backward-compat deal_query, and classifier prompt generation.
+backward-compat deal_query, classifier prompt generation, and the compiled
+per-tenant router (priority order, caching, hit/miss counters).
 """
 import pytest
 import sys
 import os
+from unittest.mock import AsyncMock, patch
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
@@ -14,8 +16,12 @@ from agents.bobur import (
     _build_dynamic_patterns,
     _build_classifier_prompt,
     route_message,
+    CompiledRouter,
+    get_router_stats,
+    _get_router,
     _CATALOG_METRIC_KEYS,
 )
+from agents import RouterResult
 
 
 class TestBuildDynamicPatterns:
@@ -152,3 +158,40 @@ class TestRouteMessageDynamic:
         )
         assert result.intent == "kpi_query"
         assert result.filters.get("kpi_pattern") == "total_deals"
+
+
+class TestCompiledRouter:
+    """Test the single-regex Tier 0 router and its cache / counters."""
+
+    def test_priority_beats_position(self):
+        # "show" (chart) appears before "risk" (alerts), but alerts has priority
+        router = CompiledRouter()
+        assert router.match("show me the risks") == ("revenue_alerts", None)
+
+    def test_dynamic_routes_come_first(self):
+        router = CompiledRouter({"deals": "Enrollments"})
+        assert router.match("how many enrollments this week") == ("dynamic_kpi_query", "deals")
+
+    def test_no_match_returns_none(self):
+        assert CompiledRouter().match("hello there") is None
+
+    def test_cached_per_tenant_until_labels_change(self):
+        first = _get_router("tenant-router", {"deals": "Enrollments"})
+        assert _get_router("tenant-router", {"deals": "Enrollments"}) is first
+        changed = _get_router("tenant-router", {"deals": "Admissions"})
+        assert changed is not first
+        assert changed.match("list admissions") == ("dynamic_record_query", "deals")
+
+    @pytest.mark.asyncio
+    async def test_counts_regex_hits_and_llm_fallbacks(self):
+        before = get_router_stats()
+        fallback = RouterResult(intent="general_chat", agent="bobur", filters={}, confidence=0.5)
+        with patch("agents.bobur._classify_intent", AsyncMock(return_value=fallback)) as classify:
+            await route_message("any risks?", tenant_id="tenant-router")
+            await route_message("hello there", tenant_id="tenant-router")
+        classify.assert_awaited_once()
+        after = get_router_stats()
+        assert after["regex"] == before["regex"] + 1
+        assert after["llm_classifier"] == before["llm_classifier"] + 1
+        assert after["intents"]["revenue_alerts"]["regex"] >= 1
+        assert after["intents"]["general_chat"]["llm"] >= 1
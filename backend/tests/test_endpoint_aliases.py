@@ -69,7 +69,7 @@ class TestDeprecationHeaders:
     """Test that _DEPRECATION_HEADERS dict has correct structure."""
 
     def test_deprecation_headers_defined(self):
-        from server import _DEPRECATION_HEADERS
+        from routers.revenue import _DEPRECATION_HEADERS
         assert _DEPRECATION_HEADERS["Deprecation"] == "true"
         assert "2026-04-01" in _DEPRECATION_HEADERS["Sunset"]
 
@@ -78,19 +78,19 @@ class TestSharedHandlerFunctions:
     """Test that shared _do_* functions are importable (exist)."""
 
     def test_do_recompute_exists(self):
-        from server import _do_recompute
+        from routers.revenue import _do_recompute
         assert callable(_do_recompute)
 
     def test_do_overview_exists(self):
-        from server import _do_overview
+        from routers.revenue import _do_overview
         assert callable(_do_overview)
 
     def test_do_alerts_list_exists(self):
-        from server import _do_alerts_list
+        from routers.revenue import _do_alerts_list
         assert callable(_do_alerts_list)
 
     def test_do_alert_dismiss_exists(self):
-        from server import _do_alert_dismiss
+        from routers.revenue import _do_alert_dismiss
         assert callable(_do_alert_dismiss)
 
 
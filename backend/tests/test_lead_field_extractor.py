@@ -0,0 +1,129 @@
+"""
+Tests for backend/lead_field_extractor.py
+==========================================
+Covers:
+  - Phone detection and E.164 normalization (UZ local/international, RU 8-prefix),
+    amounts and dates are not phones
+  - Email and name cues in EN / RU / UZ; "call me back / at 5" is not a name
+  - python-phonenumbers path when the library is installed
+  - Fallback decision against the responder's structured fields
+  - Layer merge priority (the model's name beats the regex layer's)
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import lead_field_extractor
+from lead_field_extractor import (
+    LocalExtraction,
+    extract_local_fields,
+    merge_extracted_fields,
+    needs_llm_fallback,
+)
+
+
+@pytest.fixture(autouse=True)
+def _regex_phone_rules(monkeypatch):
+    # Exercise the built-in numbering rules whether or not phonenumbers is installed
+    monkeypatch.setattr(lead_field_extractor, "phonenumbers", None)
+
+
+class TestLocalExtraction:
+    @pytest.mark.parametrize("text, phone", [
+        ("my number is +998 90 123 45 67", "+998901234567"),
+        ("raqamim 901234567", "+998901234567"),
+        ("тел 8 (912) 345-67-89", "+79123456789"),
+        ("+44 20 7946 0958 please", "+442079460958"),
+    ])
+    def test_phone_normalized(self, text, phone):
+        result = extract_local_fields(text)
+        assert result.fields["phone"] == phone
+        assert "phone" not in result.unresolved
+
+    @pytest.mark.parametrize("text", ["narxi 1 500 000 so'm", "delivery on 2026-10-18", "order 12345"])
+    def test_not_a_phone(self, text):
+        result = extract_local_fields(text)
+        assert "phone" not in result.fields and "phone" not in result.unresolved
+
+    def test_unparseable_number_is_unresolved(self):
+        result = extract_local_fields("call 12345678")
+        assert result.fields == {} and result.unresolved == {"phone"}
+
+    def test_email_lowercased(self):
+        assert extract_local_fields("write to John.Doe@Mail.com").fields == {"email": "john.doe@mail.com"}
+
+    @pytest.mark.parametrize("text, name", [
+        ("my name is ali valiyev and I need a sofa", "Ali Valiyev"),
+        ("Меня зовут Дилноза, хочу заказать", "Дилноза"),
+        ("Mening ismim G'ayrat bo'ladi", "G'ayrat"),
+    ])
+    def test_name_cues(self, text, name):
+        assert extract_local_fields(text).fields["name"] == name
+
+    def test_name_cue_without_name_is_unresolved(self):
+        result = extract_local_fields("my name is not important")
+        assert "name" not in result.fields and "name" in result.unresolved
+
+    @pytest.mark.parametrize("text", [
+        "call me back please", "call me at 5", "call me tomorrow please", "call me when you are free",
+    ])
+    def test_call_me_is_not_a_name_cue(self, text):
+        result = extract_local_fields(text)
+        assert "name" not in result.fields and "name" not in result.unresolved
+
+    def test_budget_and_timeline_cues(self):
+        assert extract_local_fields("budget 5 mln, ertaga kerak").unresolved == {"budget", "timeline"}
+
+
+class TestFallbackDecision:
+    def test_resolved_locally(self):
+        assert not needs_llm_fallback(extract_local_fields("+998901234567"), {})
+
+    def test_model_resolves_cue(self):
+        local = extract_local_fields("my budget is 5 mln")
+        assert not needs_llm_fallback(local, {"budget": "5 mln"})
+        assert needs_llm_fallback(local, {"budget": None})
+
+    def test_known_budget_skips_fallback(self):
+        local = extract_local_fields("around $500")
+        assert not needs_llm_fallback(local, {}, existing_fields={"budget": "$400"})
+
+
+class TestMerge:
+    def test_priority_and_empty_values(self):
+        local = LocalExtraction(fields={"phone": "+998901234567"})
+        merged = merge_extracted_fields(
+            {"phone": "90 123", "name": "Ali", "budget": None},
+            local,
+            {"budget": "5 mln", "name": "Alisher"},
+        )
+        assert merged == {"budget": "5 mln", "name": "Ali", "phone": "+998901234567"}
+
+    def test_model_name_beats_local_name(self):
+        local = LocalExtraction(fields={"name": "Ali", "phone": "+998901234567"})
+        merged = merge_extracted_fields({"name": "Ali Valiyev", "phone": "90 123"}, local)
+        assert merged == {"name": "Ali Valiyev", "phone": "+998901234567"}
+        assert merge_extracted_fields({"name": None}, local)["name"] == "Ali"
+
+
+class TestPhonenumbersLibrary:
+    @pytest.fixture(autouse=True)
+    def _regex_phone_rules(self, monkeypatch):
+        monkeypatch.setattr(lead_field_extractor, "phonenumbers", pytest.importorskip("phonenumbers"))
+
+    @pytest.mark.parametrize("text, phone", [
+        ("my number is +998 90 123 45 67", "+998901234567"),
+        ("raqamim 90 123 45 67", "+998901234567"),
+        ("+44 20 7946 0958 please", "+442079460958"),
+    ])
+    def test_phone_normalized(self, text, phone):
+        assert extract_local_fields(text).fields["phone"] == phone
+
+    def test_invalid_number_is_unresolved(self):
+        assert extract_local_fields("call +998 12 345 67 89").unresolved == {"phone"}
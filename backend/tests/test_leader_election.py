@@ -0,0 +1,170 @@
+"""
+Tests for backend/leader_election.py
+=====================================
+Covers:
+  - Lease transitions: elected -> jobs start, lost -> jobs cancelled + hooks
+  - Two electors sharing one lease: only one leads; failover after expiry
+  - Fail-open when the lease RPC is missing; step-down before expiry on errors
+  - Clean stop releases the lease
+  - sync_engine loops are leader-only
+
+Uses an in-memory lease table behind a mock Supabase rpc() — no real DB.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sync_engine
+from leader_election import LeaderElector, is_leader, set_elector
+
+
+class LeaseTable:
+    """acquire_worker_lease / release_worker_lease semantics from migration 023."""
+
+    def __init__(self):
+        self.rows = {}  # name -> (holder, expires_at)
+        self.now = 0.0
+        self.fail = None
+
+    def rpc(self, fn, params):
+        def execute():
+            if self.fail:
+                raise self.fail
+            name, holder = params["p_name"], params["p_holder"]
+            if fn == "acquire_worker_lease":
+                row = self.rows.get(name)
+                if row is None or row[0] == holder or row[1] < self.now:
+                    self.rows[name] = (holder, self.now + params["p_ttl_seconds"])
+                    return MagicMock(data=True)
+                return MagicMock(data=False)
+            if self.rows.get(name, (None,))[0] == holder:
+                del self.rows[name]
+            return MagicMock(data=True)
+
+        call = MagicMock()
+        call.execute.side_effect = execute
+        return call
+
+
+@pytest.fixture
+def lease():
+    return LeaseTable()
+
+
+def _elector(lease, holder):
+    sb = MagicMock()
+    sb.rpc.side_effect = lease.rpc
+    return LeaderElector(sb, ttl=30, renew_interval=10, holder_id=holder)
+
+
+class TestTransitions:
+    @pytest.mark.asyncio
+    async def test_elected_starts_jobs_and_loss_cancels_them(self, lease):
+        elector = _elector(lease, "w1")
+        started, demoted = asyncio.Event(), []
+
+        async def job():
+            started.set()
+            await asyncio.sleep(3600)
+
+        async def hook():
+            demoted.append(True)
+
+        elector.singleton("sync", job)
+        elector.on_demoted(hook)
+        await elector._tick()
+        await asyncio.wait_for(started.wait(), 1)
+        assert elector.is_leader and elector.stats()["jobs"] == ["sync"]
+
+        lease.rows["background_jobs"] = ("w2", 100.0)  # someone else took over
+        await elector._tick()
+        assert not elector.is_leader
+        assert elector.stats()["jobs"] == [] and demoted == [True]
+
+    @pytest.mark.asyncio
+    async def test_only_one_leader_and_failover(self, lease):
+        a, b = _elector(lease, "a"), _elector(lease, "b")
+        await a._tick()
+        await b._tick()
+        assert a.is_leader and not b.is_leader
+
+        lease.now += 31  # a stopped renewing
+        await b._tick()
+        await a._tick()
+        assert b.is_leader and not a.is_leader
+
+    @pytest.mark.asyncio
+    async def test_crashed_job_does_not_affect_leadership(self, lease):
+        elector = _elector(lease, "w1")
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        elector.singleton("broken", broken)
+        await elector._tick()
+        await asyncio.sleep(0)
+        assert elector.is_leader and elector.stats()["jobs"] == []
+
+
+class TestFailures:
+    @pytest.mark.asyncio
+    async def test_missing_rpc_runs_jobs_locally(self, lease):
+        lease.fail = Exception("function acquire_worker_lease does not exist")
+        elector = _elector(lease, "w1")
+        await elector._tick()
+        assert elector.is_leader and elector.stats()["lease_supported"] is None
+
+        lease.fail = None
+        lease.rows["background_jobs"] = ("w2", 100.0)
+        await elector._tick()
+        assert not elector.is_leader
+
+    @pytest.mark.asyncio
+    async def test_steps_down_before_lease_expires(self, lease):
+        elector = _elector(lease, "w1")
+        await elector._tick()
+        lease.fail = Exception("db unreachable")
+
+        await elector._tick()  # lease still valid for ~30s
+        assert elector.is_leader
+
+        elector._lease_valid_until = time.monotonic() + 5  # next renewal would be too late
+        await elector._tick()
+        assert not elector.is_leader
+
+
+class TestLifecycle:
+    @pytest.mark.asyncio
+    async def test_stop_releases_lease(self, lease):
+        elector = _elector(lease, "w1")
+        await elector.start()
+        for _ in range(50):
+            if elector.is_leader:
+                break
+            await asyncio.sleep(0.01)
+        assert lease.rows["background_jobs"][0] == "w1"
+        await elector.stop()
+        assert "background_jobs" not in lease.rows and not elector.is_leader
+
+    @pytest.mark.asyncio
+    async def test_sync_loops_only_start_on_leader(self, lease):
+        follower = _elector(lease, "f")
+        lease.rows["background_jobs"] = ("someone-else", 100.0)
+        await follower._tick()
+        set_elector(follower)
+        try:
+            assert not is_leader()
+            await sync_engine.start_incremental_sync_loop(MagicMock(), "tenant-1", "bitrix24")
+            assert "tenant-1:bitrix24" not in sync_engine._active_syncs
+        finally:
+            set_elector(None)
+        assert is_leader()
@@ -0,0 +1,303 @@
+"""
+Tests for backend/llm_gateway.py
+=================================
+Covers:
+  - Single-flight coalescing of identical in-flight requests; only the
+    leader's response carries usage; a cancelled leader hands over the call
+  - deadline bounds retries and backoff as a whole
+  - Hedged requests (second attempt wins when the first stalls)
+  - Transient-error retries; caller errors are not retried
+  - Circuit breaker per model and fallback to the faster model
+  - Latency-aware fallback when the primary's p95 passes its threshold
+  - Per-tenant concurrency budget and queue time
+  - served_model() for billing the model that answered, including the
+    streamed sales completion
+
+Provider calls are replaced with scripted coroutines — no network.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import llm_gateway
+from llm_gateway import (
+    BREAKER_FAILURES,
+    MIN_SAMPLES,
+    CircuitOpenError,
+    LLMGateway,
+    served_model,
+)
+
+TENANT_ID = "tenant-aaa"
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _response(model: str, text: str = "ok"):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2),
+    )
+
+
+class _ScriptedProvider:
+    """Stands in for LLMGateway._send; `script(model, n)` returns (delay, result-or-exception)."""
+
+    def __init__(self, script=None):
+        self.calls: list[str] = []
+        self.script = script or (lambda model, n: (0, None))
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, provider, model, messages, params):
+        self.calls.append(model)
+        delay, outcome = self.script(model, len(self.calls))
+        return self._run(model, delay, outcome)
+
+    async def _run(self, model, delay, outcome):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.active -= 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome or _response(model)
+
+
+def _gateway(provider: _ScriptedProvider, **kwargs) -> LLMGateway:
+    gw = LLMGateway(**kwargs)
+    gw._send = provider
+    return gw
+
+
+@pytest.fixture(autouse=True)
+def _fast_retries(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "RETRY_BACKOFF", 0)
+
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_identical_requests_share_one_call(self):
+        provider = _ScriptedProvider(lambda m, n: (0.05, None))
+        gw = _gateway(provider)
+        a, b = await asyncio.gather(
+            gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, tenant_id=TENANT_ID),
+            gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, tenant_id=TENANT_ID),
+        )
+        assert a.choices is b.choices
+        assert sorted((a.usage.prompt_tokens, b.usage.prompt_tokens)) == [0, 10]  # billed once
+        assert provider.calls == ["gpt-4o-mini"]
+        assert gw.stats()["coalesced"] == 1
+        assert gw.stats()["inflight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_leader_deadline_does_not_cancel_followers(self):
+        provider = _ScriptedProvider(lambda m, n: (0.05, None))
+        gw = _gateway(provider)
+        leader = asyncio.create_task(gw.chat_completion(
+            model="gpt-4o-mini", messages=MESSAGES, tenant_id=TENANT_ID, deadline=0.01))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(gw.chat_completion(
+            model="gpt-4o-mini", messages=MESSAGES, tenant_id=TENANT_ID))
+        with pytest.raises(asyncio.TimeoutError):
+            await leader
+        response = await asyncio.wait_for(follower, timeout=1)
+        assert response.usage.prompt_tokens == 10  # the follower made (and bills) the call itself
+        assert len(provider.calls) == 2 and gw.stats()["inflight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_different_tenants_are_not_shared(self):
+        provider = _ScriptedProvider(lambda m, n: (0.01, None))
+        gw = _gateway(provider)
+        await asyncio.gather(
+            gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, tenant_id="t1"),
+            gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, tenant_id="t2"),
+        )
+        assert len(provider.calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_streams_are_never_shared(self):
+        provider = _ScriptedProvider(lambda m, n: (0.01, None))
+        gw = _gateway(provider)
+        await asyncio.gather(
+            gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, stream=True),
+            gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, stream=True),
+        )
+        assert len(provider.calls) == 2
+
+
+class TestHedgingAndRetries:
+    @pytest.mark.asyncio
+    async def test_hedge_wins_when_first_attempt_stalls(self):
+        slow, fast = _response("gpt-4o-mini", "slow"), _response("gpt-4o-mini", "fast")
+        provider = _ScriptedProvider(lambda m, n: (5, slow) if n == 1 else (0, fast))
+        gw = _gateway(provider)
+        result = await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, hedge=True, hedge_after=0.01)
+        assert result is fast
+        assert gw.stats()["hedges"] == 1
+        assert gw.stats()["hedge_wins"] == 1
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_when_first_attempt_is_fast(self):
+        provider = _ScriptedProvider()
+        gw = _gateway(provider)
+        await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, hedge=True, hedge_after=1)
+        assert len(provider.calls) == 1
+        assert gw.stats()["hedges"] == 0
+
+    @pytest.mark.asyncio
+    async def test_transient_error_is_retried(self):
+        provider = _ScriptedProvider(lambda m, n: (0, _StatusError(503) if n == 1 else None))
+        gw = _gateway(provider)
+        result = await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES)
+        assert result.choices[0].message.content == "ok"
+        assert gw.stats()["retries"] == 1
+
+    @pytest.mark.asyncio
+    async def test_caller_error_is_not_retried(self):
+        provider = _ScriptedProvider(lambda m, n: (0, _StatusError(400)))
+        gw = _gateway(provider)
+        with pytest.raises(_StatusError):
+            await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES)
+        assert len(provider.calls) == 1
+        assert gw.health("gpt-4o-mini").breaker_state() == "closed"
+
+    @pytest.mark.asyncio
+    async def test_timeout_is_transient(self):
+        provider = _ScriptedProvider(lambda m, n: (1, None) if n == 1 else (0, None))
+        gw = _gateway(provider)
+        await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, timeout=0.01)
+        assert gw.stats()["retries"] == 1
+
+    @pytest.mark.asyncio
+    async def test_deadline_bounds_all_attempts(self, monkeypatch):
+        monkeypatch.setattr(llm_gateway, "RETRY_BACKOFF", 0.05)
+        provider = _ScriptedProvider(lambda m, n: (0.04, _StatusError(503)))
+        gw = _gateway(provider)
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            # per-attempt timeout alone would allow 3 attempts + 0.15s of backoff
+            await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES, timeout=0.04, deadline=0.1)
+        assert time.monotonic() - started < 0.2
+        assert gw.stats()["inflight"] == 0
+
+
+class TestBreakerAndFallback:
+    @pytest.mark.asyncio
+    async def test_breaker_opens_and_traffic_moves_to_fallback(self):
+        provider = _ScriptedProvider(lambda m, n: (0, _StatusError(500) if m == "gpt-4o" else None))
+        gw = _gateway(provider)
+        for _ in range(BREAKER_FAILURES):
+            gw.health("gpt-4o").record(0.1, ok=False)
+        assert gw.health("gpt-4o").breaker_state() == "open"
+        response = await gw.chat_completion(model="gpt-4o", messages=MESSAGES)
+        assert provider.calls == ["gpt-4o-mini"]
+        assert served_model(response, "gpt-4o") == "gpt-4o-mini"
+        assert gw.stats()["fallbacks"] == 1
+
+    @pytest.mark.asyncio
+    async def test_open_breaker_without_fallback_fails_fast(self):
+        provider = _ScriptedProvider()
+        gw = _gateway(provider)
+        for _ in range(BREAKER_FAILURES):
+            gw.health("gpt-4o-mini").record(0.1, ok=False)
+        with pytest.raises(CircuitOpenError):
+            await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES)
+        assert provider.calls == []
+
+    def test_half_open_admits_one_probe(self):
+        health = LLMGateway().health("gpt-4o")
+        for _ in range(BREAKER_FAILURES):
+            health.record(0.1, ok=False)
+        health.opened_at = time.monotonic() - llm_gateway.BREAKER_COOLDOWN - 1
+        assert health.allow()
+        assert not health.allow()
+        health.record(0.2, ok=True)
+        assert health.breaker_state() == "closed"
+
+    def test_high_p95_routes_to_faster_model(self):
+        gw = LLMGateway()
+        for _ in range(MIN_SAMPLES):
+            gw.health("gpt-4o").record(llm_gateway.P95_THRESHOLDS["gpt-4o"] + 5, ok=True)
+        assert gw.select_model("gpt-4o") == "gpt-4o-mini"
+        assert gw.select_model("anthropic/claude-sonnet-4-20250514") == "anthropic/claude-sonnet-4-20250514"
+
+    def test_provider_prefix_is_kept_on_fallback(self):
+        gw = LLMGateway()
+        for _ in range(BREAKER_FAILURES):
+            gw.health("anthropic/claude-sonnet-4-20250514").record(0.1, ok=False)
+        assert gw.select_model("anthropic/claude-sonnet-4-20250514") == "anthropic/claude-haiku-4-5-20251001"
+
+
+class TestBudgetsAndMetrics:
+    @pytest.mark.asyncio
+    async def test_tenant_budget_caps_concurrency(self):
+        provider = _ScriptedProvider(lambda m, n: (0.02, None))
+        gw = _gateway(provider, tenant_concurrency=2)
+        await asyncio.gather(*[
+            gw.chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": str(i)}],
+                               tenant_id=TENANT_ID)
+            for i in range(6)
+        ])
+        assert provider.peak == 2
+        assert gw.stats()["models"]["gpt-4o-mini"]["avg_queue_time"] > 0
+
+    @pytest.mark.asyncio
+    async def test_tokens_and_latency_recorded_per_model(self):
+        gw = _gateway(_ScriptedProvider())
+        await gw.chat_completion(model="gpt-4o-mini", messages=MESSAGES)
+        model = gw.stats()["models"]["gpt-4o-mini"]
+        assert (model["calls"], model["input_tokens"], model["output_tokens"]) == (1, 10, 2)
+        assert model["breaker"] == "closed"
+
+    def test_served_model_without_fallback(self):
+        assert served_model(_response("gpt-4o-2024-08-06"), "gpt-4o") == "gpt-4o"
+        assert served_model(_response("gpt-4o-mini-2024-07-18"), "gpt-4o") == "gpt-4o-mini"
+        assert served_model(SimpleNamespace(), "gpt-4o-mini") == "gpt-4o-mini"
+
+    @pytest.mark.asyncio
+    async def test_streamed_sales_completion_reports_served_model(self, monkeypatch):
+        for key, value in {"SUPABASE_URL": "https://project.supabase.co", "SUPABASE_SERVICE_KEY": "placeholder",
+                           "JWT_SECRET": "placeholder-jwt-secret-for-gateway-tests"}.items():
+            if not os.environ.get(key):
+                monkeypatch.setenv(key, value)
+        import server
+
+        async def stream():
+            for text in ('{"reply_text": "Hel', 'lo"}'):
+                yield SimpleNamespace(model="claude-haiku-4-5-20251001", usage=None,
+                                      choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+            yield SimpleNamespace(model="claude-haiku-4-5-20251001", choices=[],
+                                  usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2))
+
+        class _Gateway:
+            async def chat_completion(self, **kwargs):
+                return stream()
+
+        async def on_reply_text(text):
+            pass
+
+        monkeypatch.setattr(server, "get_gateway", lambda: _Gateway())
+        content, usage, model = await server._stream_sales_completion(
+            {"model": "anthropic/claude-sonnet-4-20250514", "messages": MESSAGES}, on_reply_text,
+            TENANT_ID, "claude-sonnet-4-20250514",
+        )
+        assert content == '{"reply_text": "Hello"}' and usage.prompt_tokens == 10
+        assert model == "claude-haiku-4-5-20251001"
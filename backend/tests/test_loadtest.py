@@ -0,0 +1,196 @@
+"""
+Tests for backend/loadtest/
+===========================
+Covers:
+  - Scenarios are deterministic per seed, ordered, and sized as documented
+    (bursts exceed the per-user limit, tenants get a bot and a config)
+  - Fake PostgREST: filters, order/limit, upserts, single-object requests
+  - Fake LLM: one JSON answer for every structured prompt, SSE streaming,
+    deterministic full-model share; fake Telegram counts replies per chat
+  - FakeServices runs the fakes in a child process over real HTTP
+  - deliver(): ack before BackgroundTasks finish, e2e after
+  - percentiles() and baseline comparison
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi import BackgroundTasks, FastAPI, Request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from loadtest.fakes import FakeConfig, FakeServices, FakeUpstreams, Tables
+from loadtest.runner import compare, deliver, percentiles
+from loadtest.scenarios import SCENARIOS, WEBHOOK_SECRET, Delivery, build
+
+
+class TestScenarios:
+    def test_deterministic_and_ordered(self):
+        a, b = build("mixed", seed=3), build("mixed", seed=3)
+        assert [d.update for d in a.updates] == [d.update for d in b.updates]
+        assert [d.at for d in a.updates] == sorted(d.at for d in a.updates)
+        assert build("mixed", seed=4).updates[0].update != a.updates[0].update
+
+    def test_every_scenario_builds_valid_updates(self):
+        for name in SCENARIOS:
+            scenario = build(name, scale=0.1)
+            bots = {bot["id"] for bot in scenario.seed_tables()["telegram_bots"]}
+            assert scenario.updates, name
+            assert {d.bot_id for d in scenario.updates} <= bots
+            assert len({d.update["update_id"] for d in scenario.updates}) == len(scenario.updates)
+            for d in scenario.updates:
+                message = d.update["message"]
+                assert message["chat"]["type"] == "private"
+                assert ("voice" in message) == (d.kind == "voice")
+
+    def test_burst_exceeds_per_user_limit(self):
+        scenario = build("burst")
+        per_chat = {}
+        for d in scenario.updates:
+            per_chat[d.update["message"]["chat"]["id"]] = per_chat.get(d.update["message"]["chat"]["id"], 0) + 1
+        assert min(per_chat.values()) > 10
+
+    def test_unknown_scenario(self):
+        with pytest.raises(ValueError, match="Unknown scenario"):
+            build("nope")
+
+
+class TestFakePostgrest:
+    @pytest.fixture
+    def tables(self):
+        t = Tables()
+        t.seed({"leads": [
+            {"id": "1", "tenant_id": "t1", "score": 10, "status": "new", "closed_at": None},
+            {"id": "2", "tenant_id": "t1", "score": 30, "status": "won", "closed_at": "2026-01-01"},
+            {"id": "3", "tenant_id": "t2", "score": 20, "status": "new", "closed_at": None},
+        ]})
+        return t
+
+    @staticmethod
+    def rows(response):
+        return json.loads(response[2])
+
+    def test_filters_order_limit(self, tables):
+        params = [("select", "*"), ("tenant_id", "eq.t1"), ("order", "score.desc"), ("limit", "1")]
+        status, headers, body = tables.handle("GET", "leads", params, {}, b"")
+        assert status == 200 and [r["id"] for r in json.loads(body)] == ["2"]
+        assert headers["content-range"] == "0-0/2"
+        assert [r["id"] for r in self.rows(tables.handle("GET", "leads", [("id", "in.(1,3)"), ("score", "gte.15")], {}, b""))] == ["3"]
+        assert [r["id"] for r in self.rows(tables.handle("GET", "leads", [("closed_at", "is.null")], {}, b""))] == ["1", "3"]
+        assert [r["id"] for r in self.rows(tables.handle("GET", "leads", [("status", "not.eq.new")], {}, b""))] == ["2"]
+
+    def test_writes(self, tables):
+        created = self.rows(tables.handle("POST", "leads", [], {}, json.dumps({"tenant_id": "t3"}).encode()))
+        assert created[0]["id"] and created[0]["created_at"]
+        upsert = {"prefer": "resolution=merge-duplicates,return=representation"}
+        tables.handle("POST", "leads", [("on_conflict", "id")], upsert, json.dumps([{"id": "1", "score": 99}]).encode())
+        tables.handle("PATCH", "leads", [("id", "eq.2")], {}, json.dumps({"status": "lost"}).encode())
+        tables.handle("DELETE", "leads", [("id", "eq.3")], {}, b"")
+        by_id = {r["id"]: r for r in tables.rows["leads"]}
+        assert by_id["1"]["score"] == 99 and by_id["2"]["status"] == "lost" and "3" not in by_id
+
+    def test_single_object(self, tables):
+        accept = {"accept": "application/vnd.pgrst.object+json"}
+        status, _, body = tables.handle("GET", "leads", [("id", "eq.1")], accept, b"")
+        assert status == 200 and json.loads(body)["id"] == "1"
+        status, _, body = tables.handle("GET", "leads", [("tenant_id", "eq.t1")], accept, b"")
+        assert status == 406 and json.loads(body)["code"] == "PGRST116"
+
+
+class TestFakeLLMAndTelegram:
+    @pytest.mark.asyncio
+    async def test_completion_answers_every_structured_prompt(self):
+        fake = FakeUpstreams(FakeConfig(llm_latency_ms=0, llm_jitter_ms=0))
+        request = json.dumps({"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]}).encode()
+        status, _, body = await fake.handle("POST", "/v1/chat/completions", {}, request)
+        content = json.loads(json.loads(body)["choices"][0]["message"]["content"])
+        assert status == 200
+        assert {"category", "route_to", "reply_text", "fields_collected"} <= set(content)
+        assert fake.stats()["calls"] == {"llm:chat": 1}
+
+    @pytest.mark.asyncio
+    async def test_stream(self):
+        fake = FakeUpstreams(FakeConfig(llm_latency_ms=0, llm_jitter_ms=0))
+        request = json.dumps({"model": "gpt-4o", "stream": True, "messages": [{"role": "user", "content": "hi"}]})
+        _, headers, stream = await fake.handle("POST", "/v1/chat/completions", {}, request.encode())
+        events = [chunk async for chunk in stream]
+        assert headers["content-type"] == "text/event-stream"
+        assert events[-1] == b"data: [DONE]\n\n"
+        deltas = [json.loads(e[6:])["choices"] for e in events[:-1]]
+        text = "".join(c[0]["delta"].get("content", "") for c in deltas if c)
+        assert json.loads(text)["reply_text"]
+
+    def test_full_ratio_is_deterministic(self):
+        from loadtest.fakes import _completion_content
+
+        routes = [json.loads(_completion_content([{"content": str(i)}], 0.5))["route_to"] for i in range(200)]
+        assert 60 < routes.count("full") < 140
+        assert routes == [json.loads(_completion_content([{"content": str(i)}], 0.5))["route_to"] for i in range(200)]
+
+    @pytest.mark.asyncio
+    async def test_telegram_replies_counted_per_chat(self):
+        fake = FakeUpstreams(FakeConfig(telegram_latency_ms=0))
+        for chat in (1, 1, 2):
+            status, _, body = await fake.handle("POST", "/bot1:x/sendMessage", {}, json.dumps({"chat_id": chat}).encode())
+            assert json.loads(body)["ok"] is True
+        _, _, body = await fake.handle("POST", "/bot1:x/getFile", {}, b"{}")
+        assert json.loads(body)["result"]["file_path"]
+        assert fake.stats()["replies"] == 3 and fake.stats()["chats_replied"] == 2
+
+
+class TestFakeServicesProcess:
+    def test_round_trip_over_http(self):
+        with FakeServices(llm_latency_ms=0, llm_jitter_ms=0, telegram_latency_ms=0) as fakes:
+            fakes.seed({"telegram_bots": [{"id": "b1", "tenant_id": "t1", "is_active": True}]})
+            with httpx.Client(base_url=fakes.url) as client:
+                rows = client.get("/rest/v1/telegram_bots", params={"id": "eq.b1", "is_active": "eq.true"}).json()
+                assert rows[0]["tenant_id"] == "t1"
+                client.post("/bot1:x/sendMessage", json={"chat_id": 7})
+            stats = fakes.stats()
+            assert stats["calls"] == {"postgrest": 1, "telegram:sendMessage": 1}
+            fakes.reset()
+            assert fakes.stats()["calls"] == {}
+
+
+class TestDeliver:
+    @pytest.mark.asyncio
+    async def test_ack_precedes_background_work(self):
+        app = FastAPI()
+        seen = {}
+
+        @app.post("/api/telegram/webhook/{bot_id}")
+        async def webhook(bot_id: str, request: Request, background_tasks: BackgroundTasks):
+            seen["secret"] = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+            seen["update"] = await request.json()
+            background_tasks.add_task(asyncio.sleep, 0.2)
+            return {"ok": True}
+
+        sample = await deliver(app, Delivery(0.0, "bot-1", {"update_id": 1}))
+        assert sample.status == 200 and sample.error is None
+        assert sample.ack < 0.1 <= 0.2 <= sample.e2e
+        assert seen == {"secret": WEBHOOK_SECRET, "update": {"update_id": 1}}
+
+
+class TestReporting:
+    def test_percentiles(self):
+        stats = percentiles([i / 1000 for i in range(1, 101)])
+        assert (stats["count"], stats["p50"], stats["p95"], stats["max"]) == (100, 51.0, 96.0, 100.0)
+        assert percentiles([]) == {"count": 0}
+
+    def test_compare(self):
+        baseline = {"throughput_per_s": 10.0, "e2e_ms": {"p50": 1000.0, "p95": 2000.0},
+                    "db": {"calls_per_message": 10.0}, "memory": {"growth_kb_per_message": 100.0}}
+        same = json.loads(json.dumps(baseline))
+        assert compare(same, baseline) == []
+
+        worse = json.loads(json.dumps(baseline))
+        worse["throughput_per_s"] = 7.0
+        worse["db"]["calls_per_message"] = 12.5
+        worse["e2e_ms"]["p95"] = 2440.0  # within 20% + 50ms slack
+        assert compare(worse, baseline) == ["throughput_per_s: 10.0 -> 7.0", "db.calls_per_message: 10.0 -> 12.5"]
@@ -0,0 +1,116 @@
+"""
+Tests for backend/loop_watchdog.py
+===================================
+Covers:
+  - A blocking call inside a coroutine is sampled while it stalls the loop
+    and attributed to its application call site (file:line function)
+  - Lag histogram / stall accounting; an idle loop records no stalls
+  - Attribution skips stdlib and site-packages frames
+  - Opt-in via LOOP_WATCHDOG_MS; clean stop
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+import traceback
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import loop_watchdog
+from loop_watchdog import APP_DIR, LoopWatchdog, attribute, get_loop_stats, start_watchdog, stop_watchdog
+
+
+def blocking_handler():
+    time.sleep(0.25)  # stands in for a sync supabase / bcrypt call
+
+
+class TestStallSampling:
+    @pytest.mark.asyncio
+    async def test_blocking_call_attributed_to_call_site(self):
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+        await watchdog.start()
+        try:
+            await asyncio.sleep(0.05)
+            blocking_handler()
+            await asyncio.sleep(0.05)
+        finally:
+            await watchdog.stop()
+
+        stats = watchdog.stats()
+        assert stats["stalls"] >= 1
+        assert stats["max_lag_ms"] >= 200
+        assert stats["lag_histogram"][">5000ms"] == 0
+        assert stats["lag_histogram"]["<=250ms"] + stats["lag_histogram"]["<=500ms"] >= 1
+
+        (site, entry), = [(s, e) for s, e in stats["sites"].items() if "blocking_handler" in s]
+        assert site.startswith(os.path.join("tests", "test_loop_watchdog.py") + ":")
+        assert entry["stalls"] == 1 and entry["samples"] >= 1
+        assert entry["stall_ms"] >= 200
+        assert any("test_blocking_call_attributed_to_call_site" in line for line in entry["stack"])
+
+    @pytest.mark.asyncio
+    async def test_idle_loop_has_no_stalls(self):
+        watchdog = LoopWatchdog(threshold=0.1, interval=0.01)
+        await watchdog.start()
+        await asyncio.sleep(0.1)
+        await watchdog.stop()
+
+        stats = watchdog.stats()
+        assert stats["beats"] >= 3
+        assert stats["stalls"] == 0 and stats["sites"] == {}
+
+    @pytest.mark.asyncio
+    async def test_stop_is_idempotent(self):
+        watchdog = LoopWatchdog(threshold=0.1, interval=0.01)
+        await watchdog.start()
+        await watchdog.stop()
+        await watchdog.stop()
+        assert watchdog._task is None and watchdog._thread is None
+
+
+class TestAttribution:
+    def test_innermost_app_frame_wins(self):
+        frames = traceback.StackSummary.from_list([
+            (os.path.join(APP_DIR, "server.py"), 100, "handler", None),
+            (os.path.join(APP_DIR, "app_core.py"), 200, "verify_password", None),
+            ("/usr/lib/python3.11/site-packages/bcrypt/__init__.py", 10, "checkpw", None),
+            ("/usr/lib/python3.11/ssl.py", 5, "recv", None),
+        ])
+        site, stack = attribute(frames)
+        assert site == "app_core.py:200 verify_password"
+        assert stack[-1] == "/usr/lib/python3.11/ssl.py:5 recv"
+
+    def test_no_app_frames_falls_back_to_innermost(self):
+        frames = traceback.StackSummary.from_list([("/usr/lib/python3.11/ssl.py", 5, "recv", None)])
+        assert attribute(frames)[0] == "/usr/lib/python3.11/ssl.py:5 recv"
+
+
+class TestOptIn:
+    @pytest.mark.asyncio
+    async def test_disabled_without_env(self, monkeypatch):
+        monkeypatch.delenv("LOOP_WATCHDOG_MS", raising=False)
+        await start_watchdog()
+        assert get_loop_stats()["enabled"] is False
+
+    @pytest.mark.asyncio
+    async def test_enabled_from_env(self, monkeypatch):
+        monkeypatch.setenv("LOOP_WATCHDOG_MS", "200")
+        await start_watchdog()
+        try:
+            stats = get_loop_stats()
+            assert stats["enabled"] is True
+            assert stats["threshold_ms"] == 200
+        finally:
+            await stop_watchdog()
+        assert loop_watchdog._watchdog is None
+
+    @pytest.mark.asyncio
+    async def test_invalid_env_ignored(self, monkeypatch):
+        monkeypatch.setenv("LOOP_WATCHDOG_MS", "fast")
+        await start_watchdog()
+        assert get_loop_stats()["enabled"] is False
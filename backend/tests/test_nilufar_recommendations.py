@@ -16,6 +16,7 @@ from agents import (
     AlertResult,
     Recommendation,
 )
+from ttl_cache import TTLCache
 
 
 # ── Test fixtures ────────────────────────────────────────────────────────
@@ -195,8 +196,9 @@ def test_recommendation_model():
 
 def test_cache_structure():
     from agents import nilufar
-    # Cache should be a dict
-    assert isinstance(nilufar._recommendation_cache, dict)
+    # Cache should be a bounded TTL cache
+    assert isinstance(nilufar._recommendation_cache, TTLCache)
+    assert nilufar._recommendation_cache.ttl == nilufar.CACHE_TTL
     assert nilufar.CACHE_TTL == 900
 
 
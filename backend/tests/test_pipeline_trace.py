@@ -0,0 +1,296 @@
+"""
+Tests for backend/pipeline_trace.py
+====================================
+Covers:
+  - Span trees: parenting through the ContextVar, W3C-format ids, errors,
+    annotate(), retroactive record_span(), no-ops outside a trace
+  - traced_pipeline(): root attributes from kwargs, webhook_ack / queue_wait
+  - Stage histograms by route and tenant, quantiles, SLO breaches, spans
+    that outlive their trace
+  - OpenTelemetry replay keeps the tree and timestamps
+  - process_channel_message end to end: every pipeline stage is a span of
+    one trace, bucketed by the final route (LLM calls mocked, DB via an
+    httpx MockTransport behind the real supabase-py client)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pipeline_trace
+from pipeline_trace import (
+    InMemoryExporter,
+    OpenTelemetryExporter,
+    StageHistograms,
+    add_exporter,
+    annotate,
+    get_pipeline_stats,
+    record_span,
+    remove_exporter,
+    span,
+    start_trace,
+    traced,
+    traced_pipeline,
+)
+
+
+@pytest.fixture
+def exporter():
+    pipeline_trace.reset_pipeline_stats()
+    exp = InMemoryExporter()
+    add_exporter(exp)
+    yield exp
+    remove_exporter(exp)
+
+
+class TestSpans:
+    def test_tree_and_ids(self, exporter):
+        with start_trace("message", tenant_id="t1") as root:
+            with span("customer_lookup") as lookup:
+                with span("db") as db:
+                    pass
+            with span("send"):
+                pass
+
+        (spans,) = exporter.traces
+        assert [s.name for s in spans] == ["message", "customer_lookup", "db", "send"]
+        assert re.fullmatch(r"[0-9a-f]{32}", root.trace_id)
+        assert all(re.fullmatch(r"[0-9a-f]{16}", s.span_id) for s in spans)
+        assert {s.trace_id for s in spans} == {root.trace_id}
+        assert db.parent_id == lookup.span_id and lookup.parent_id == root.span_id
+        assert all(s.end_ns >= s.start_ns for s in spans)
+
+    def test_noop_outside_trace(self, exporter):
+        with span("rag") as s:
+            assert s is None
+        record_span("queue_wait", 1, 2)
+        annotate(route="mini")
+        assert exporter.traces == []
+
+    def test_error_recorded_and_raised(self, exporter):
+        with pytest.raises(ValueError):
+            with start_trace("message"):
+                with span("llm"):
+                    raise ValueError("boom")
+        spans = exporter.traces[0]
+        assert [s.error for s in spans] == ["ValueError", "ValueError"]
+
+    @pytest.mark.asyncio
+    async def test_traced_and_concurrent_children(self, exporter):
+        @traced("rag")
+        async def rag():
+            await asyncio.sleep(0.01)
+
+        @traced("crm_query")
+        async def crm():
+            await asyncio.sleep(0.01)
+
+        with start_trace("message") as root:
+            await asyncio.gather(rag(), crm())
+        spans = {s.name: s for s in exporter.traces[0]}
+        assert spans["rag"].parent_id == spans["crm_query"].parent_id == root.span_id
+
+    @pytest.mark.asyncio
+    async def test_traced_pipeline_records_webhook_and_queue(self, exporter):
+        @traced_pipeline("message", "tenant_id", "channel")
+        async def process(tenant_id, channel, text):
+            annotate(route="mini")
+            return text.upper()
+
+        now = time.time_ns()
+        result = await process(tenant_id="t1", channel="telegram", text="hi",
+                               received_ns=now - 50_000_000, enqueued_ns=now - 40_000_000)
+        assert result == "HI"
+        spans = {s.name: s for s in exporter.traces[0]}
+        assert spans["message"].attributes == {"tenant_id": "t1", "channel": "telegram", "route": "mini"}
+        assert spans["webhook_ack"].duration_ms == pytest.approx(10, abs=0.1)
+        assert spans["queue_wait"].duration_ms >= 40
+
+
+class TestHistograms:
+    def test_by_route_and_tenant(self, exporter):
+        for route, tenant in (("mini", "t1"), ("mini", "t2"), ("full", "t1")):
+            with start_trace("message", tenant_id=tenant):
+                with span("llm"):
+                    pass
+                annotate(route=route)
+
+        stats = get_pipeline_stats()
+        assert stats["by_route"]["llm"]["mini"]["count"] == 2
+        assert stats["by_route"]["llm"]["full"]["count"] == 1
+        assert stats["by_tenant"]["message"]["t1"]["count"] == 2
+        assert set(get_pipeline_stats("t2")["by_tenant"]["llm"]) == {"t2"}
+
+    def test_quantiles_and_slo(self, caplog):
+        hist = StageHistograms(slos={"message": 1000})
+        root = pipeline_trace.Span("message", "a" * 32, "b" * 16, None, 0, attributes={"route": "full"})
+        for ms in (100, 200, 300, 4000):
+            root.end_ns = int(ms * 1e6)
+            with caplog.at_level(logging.WARNING):
+                hist.observe(root, root)
+
+        entry = hist.stats()["by_route"]["message"]["full"]
+        assert entry["count"] == 4
+        assert entry["p50_ms"] == 250.0  # upper edge of the bucket holding the median
+        assert entry["p95_ms"] == 5000.0
+        assert entry["max_ms"] == 4000.0
+        assert entry["slo_breaches"] == 1
+        assert "Pipeline SLO breach: message took 4000ms" in caplog.text
+
+    def test_parse_slos(self):
+        assert pipeline_trace._parse_slos("message=8000, llm=6000,bad=x,") == {"message": 8000.0, "llm": 6000.0}
+
+    @pytest.mark.asyncio
+    async def test_span_outliving_trace_still_counted(self, exporter):
+        release = asyncio.Event()
+
+        async def extraction():
+            with span("extraction"):
+                await release.wait()
+
+        with start_trace("message", tenant_id="t1"):
+            task = asyncio.create_task(extraction())
+            await asyncio.sleep(0)
+        assert "extraction" not in get_pipeline_stats()["by_route"]
+        release.set()
+        await task
+        assert get_pipeline_stats()["by_route"]["extraction"]["unknown"]["count"] == 1
+
+
+class TestOpenTelemetryExport:
+    def test_replay_keeps_tree_and_times(self):
+        otel_trace = pytest.importorskip("opentelemetry.trace")
+
+        started = []
+
+        class RecordingSpan(otel_trace.NonRecordingSpan):
+            def __init__(self, name, parent):
+                super().__init__(otel_trace.INVALID_SPAN_CONTEXT)
+                self.name, self.parent, self.end_time, self.status = name, parent, None, None
+
+            def end(self, end_time=None):
+                self.end_time = end_time
+
+            def set_status(self, status, description=None):
+                self.status = status
+
+        class RecordingTracer:
+            def start_span(self, name, context=None, start_time=None, attributes=None):
+                parent = otel_trace.get_current_span(context) if context is not None else None
+                s = RecordingSpan(name, parent)
+                s.start_time, s.attributes = start_time, attributes
+                started.append(s)
+                return s
+
+        exporter = OpenTelemetryExporter(tracer=RecordingTracer())
+        add_exporter(exporter)
+        try:
+            with start_trace("message", tenant_id="t1") as root:
+                with pytest.raises(RuntimeError):
+                    with span("llm"):
+                        raise RuntimeError("provider down")
+        finally:
+            remove_exporter(exporter)
+
+        message, llm = started
+        assert llm.parent is message and message.parent is None
+        assert message.start_time == root.start_ns and message.end_time == root.end_ns
+        assert message.attributes["tenant_id"] == "t1"
+        assert message.attributes["pipeline.trace_id"] == root.trace_id
+        assert llm.status.status_code == otel_trace.StatusCode.ERROR
+
+    def test_failing_exporter_does_not_break_pipeline(self, caplog):
+        class Broken:
+            def export(self, spans):
+                raise RuntimeError("collector down")
+
+        broken = Broken()
+        add_exporter(broken)
+        try:
+            with start_trace("message"):
+                pass
+        finally:
+            remove_exporter(broken)
+        assert "Trace export via Broken failed" in caplog.text
+
+
+# ----------------------------------------------------------------------
+# End to end through process_channel_message
+# ----------------------------------------------------------------------
+
+PLACEHOLDER_ENV = {
+    "SUPABASE_URL": "https://project.supabase.co",
+    "SUPABASE_SERVICE_KEY": "placeholder-service-key",
+    "JWT_SECRET": "placeholder-jwt-secret-for-pipeline-tests",
+    "OPENAI_API_KEY": "sk-test",
+}
+TENANT = "11111111-1111-1111-1111-111111111111"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """server with the DB answering [] and the LLM / RAG stages mocked."""
+    for key, value in PLACEHOLDER_ENV.items():
+        if not os.environ.get(key):
+            monkeypatch.setenv(key, value)
+    import app_core
+    import server
+
+    transport = app_core.supabase.postgrest.session._transport
+    original = transport.inner
+    transport.inner = httpx.MockTransport(lambda request: httpx.Response(200, json=[]))
+    monkeypatch.setattr(server, "_get_monthly_cost", lambda tenant_id: 0.0)
+    monkeypatch.setattr(server, "get_business_context_semantic", traced("rag")(AsyncMock(return_value=[])))
+    monkeypatch.setattr(server, "get_crm_context_for_query", traced("crm_query")(AsyncMock(return_value=None)))
+    monkeypatch.setattr(server, "get_media_context_for_ai", traced("media_context")(AsyncMock(return_value=None)))
+    monkeypatch.setattr(server, "should_force_full_model", lambda **kwargs: False)
+    monkeypatch.setattr(server, "call_sales_agent", AsyncMock(side_effect=AssertionError("full model not expected")))
+    monkeypatch.setattr(server, "classify_message_intent", traced("classifier")(AsyncMock(
+        return_value={"category": "faq", "confidence": 0.9, "route_to": "mini"})))
+    monkeypatch.setattr(server, "call_faq_responder", traced("faq_responder")(AsyncMock(
+        return_value={"reply_text": "Our shop is open 9 to 6 every day.", "fields_collected": {}})))
+    monkeypatch.setattr(server, "update_lead_from_llm", traced("lead_update")(AsyncMock()))
+    try:
+        yield server
+    finally:
+        transport.inner = original
+        for name in [m for m in sys.modules if m in ("server", "app_core") or m.startswith("routers")]:
+            del sys.modules[name]
+
+
+class TestMessagePipeline:
+    @pytest.mark.asyncio
+    async def test_stages_traced_and_bucketed_by_route(self, server, exporter):
+        send_fn = AsyncMock(return_value=True)
+        now = time.time_ns()
+        await server.process_channel_message(
+            tenant_id=TENANT, channel="telegram", sender_id="7", sender_username="u",
+            sender_name="U", text="When are you open?", language_code="en", send_fn=send_fn,
+            received_ns=now - 20_000_000, enqueued_ns=now - 10_000_000,
+        )
+
+        send_fn.assert_awaited_once_with("Our shop is open 9 to 6 every day.")
+        (spans,) = exporter.traces
+        names = [s.name for s in spans]
+        for stage in ("message", "webhook_ack", "queue_wait", "config_lookup", "customer_lookup",
+                      "history", "crm_query", "rag", "media_context", "classifier", "llm",
+                      "faq_responder", "send", "persistence", "lead_update"):
+            assert stage in names, stage
+        by_name = {s.name: s for s in spans}
+        assert by_name["faq_responder"].parent_id == by_name["llm"].span_id
+        assert by_name["message"].attributes == {"tenant_id": TENANT, "channel": "telegram", "route": "mini"}
+
+        stats = get_pipeline_stats(TENANT)
+        assert stats["by_route"]["send"]["mini"]["count"] == 1
+        assert stats["by_tenant"]["message"][TENANT]["count"] == 1
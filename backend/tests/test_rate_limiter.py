@@ -0,0 +1,151 @@
+"""
+Tests for backend/rate_limiter.py
+==================================
+Covers:
+  - Token bucket: burst capacity, refill, exact wait time
+  - Sliding-window counter: weighted previous window, per-call limit override,
+    wait time matches the moment a slot opens
+  - Bounded keys (LRU) and idle-key cleanup
+  - acquire(): FIFO wake-up order and a single timer per key
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rate_limiter import SlidingWindowLimiter, TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1200.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestTokenBucket:
+    def test_burst_then_refill(self, clock):
+        limiter = TokenBucketLimiter("t", rate=2, capacity=4, clock=clock)
+        assert all(limiter.try_acquire("k") for _ in range(4))
+        assert not limiter.try_acquire("k")
+        assert limiter.wait_time("k") == pytest.approx(0.5)
+        clock.advance(0.5)
+        assert limiter.try_acquire("k")
+        assert not limiter.try_acquire("k")
+
+    def test_keys_are_independent(self, clock):
+        limiter = TokenBucketLimiter("t", rate=1, capacity=1, clock=clock)
+        assert limiter.try_acquire("a")
+        assert limiter.try_acquire("b")
+        assert limiter.wait_time("unknown") == 0.0
+
+
+class TestSlidingWindow:
+    def test_limit_within_window(self, clock):
+        limiter = SlidingWindowLimiter("t", max_requests=3, window=60, clock=clock)
+        assert all(limiter.try_acquire("u") for _ in range(3))
+        assert not limiter.try_acquire("u")
+        assert limiter.stats()["limited"] == 1
+
+    def test_previous_window_is_weighted(self, clock):
+        limiter = SlidingWindowLimiter("t", max_requests=10, window=60, clock=clock)
+        for _ in range(10):
+            assert limiter.try_acquire("u")
+        clock.advance(60 + 30)  # next window, half of the previous still overlaps
+        allowed = sum(limiter.try_acquire("u") for _ in range(10))
+        assert allowed == 5
+
+    def test_wait_time_is_exact(self, clock):
+        limiter = SlidingWindowLimiter("t", max_requests=4, window=60, clock=clock)
+        for _ in range(4):
+            limiter.try_acquire("u")
+        wait = limiter.wait_time("u")
+        assert wait == pytest.approx(60 + 15)  # roll over, then 3 of 4 prev requests must decay
+        clock.advance(wait - 0.01)
+        assert not limiter.try_acquire("u")
+        clock.advance(0.02)
+        assert limiter.try_acquire("u")
+        assert limiter.retry_after("unknown") == 0
+
+    def test_per_call_limit_override(self, clock):
+        limiter = SlidingWindowLimiter("t", max_requests=10, window=60, clock=clock)
+        assert limiter.try_acquire("tenant", limit=1)
+        assert not limiter.try_acquire("tenant", limit=1)
+        assert limiter.try_acquire("tenant")
+
+    def test_long_idle_resets_counts(self, clock):
+        limiter = SlidingWindowLimiter("t", max_requests=2, window=60, clock=clock)
+        limiter.try_acquire("u")
+        limiter.try_acquire("u")
+        clock.advance(180)
+        assert limiter.try_acquire("u") and limiter.try_acquire("u")
+
+
+class TestBoundedState:
+    def test_max_keys_evicts_least_recent(self, clock):
+        limiter = SlidingWindowLimiter("t", max_requests=1, window=60, max_keys=2, clock=clock)
+        limiter.try_acquire("a")
+        limiter.try_acquire("b")
+        limiter.try_acquire("a")  # touch a
+        limiter.try_acquire("c")
+        assert limiter.stats()["keys"] == 2
+        assert limiter.stats()["evicted_keys"] == 1
+        assert limiter.wait_time("b") == 0.0  # b was evicted
+
+    def test_cleanup_drops_idle_keys(self, clock):
+        limiter = TokenBucketLimiter("t", rate=1, capacity=2, clock=clock)
+        limiter.try_acquire("a")
+        clock.advance(5)
+        limiter.try_acquire("b")
+        assert limiter.cleanup() == 1
+        assert limiter.stats()["keys"] == 1
+
+
+class TestAcquire:
+    @pytest.mark.asyncio
+    async def test_waiters_are_served_in_order(self):
+        limiter = TokenBucketLimiter("t", rate=100, capacity=1)
+        order = []
+
+        async def worker(i):
+            await limiter.acquire("k")
+            order.append(i)
+
+        await asyncio.gather(*(worker(i) for i in range(5)))
+        assert order == [0, 1, 2, 3, 4]
+        stats = limiter.stats()
+        assert stats["waited"] == 4 and stats["waiting"] == 0
+
+    @pytest.mark.asyncio
+    async def test_acquire_respects_rate(self):
+        loop = asyncio.get_running_loop()
+        limiter = TokenBucketLimiter("t", rate=50, capacity=1)
+        start = loop.time()
+        for _ in range(4):
+            await limiter.acquire("k")
+        assert loop.time() - start >= 3 / 50 - 0.005
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_is_skipped(self):
+        limiter = TokenBucketLimiter("t", rate=50, capacity=1)
+        await limiter.acquire("k")
+        cancelled = asyncio.create_task(limiter.acquire("k"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(limiter.acquire("k"), timeout=1)
+        assert cancelled.cancelled()
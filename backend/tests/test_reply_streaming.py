@@ -0,0 +1,172 @@
+"""
+Tests for backend/reply_streaming.py
+=====================================
+Covers:
+  - Incremental JSON string-field decoding across fragments
+  - Message splitting at Telegram's length limit
+  - Progressive Telegram delivery: first sentence, throttled edits,
+    429 back-off, final HTML edit with plain-text fallback, overflow messages
+
+Uses a recording fake HTTP client — no real Telegram calls.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from reply_streaming import (
+    JsonStringFieldStreamer,
+    TelegramProgressiveReply,
+    split_message,
+)
+
+
+class _Response:
+    def __init__(self, body: dict):
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class _FakeTelegram:
+    """Records Bot API calls; scripted error bodies are returned in order."""
+
+    def __init__(self, errors: list[dict] | None = None):
+        self.calls: list[tuple[str, dict]] = []
+        self.errors = list(errors or [])
+        self._next_id = 100
+
+    async def post(self, url: str, json: dict):
+        method = url.rsplit("/", 1)[1]
+        self.calls.append((method, json))
+        if self.errors:
+            return _Response(self.errors.pop(0))
+        if method == "sendMessage":
+            self._next_id += 1
+            return _Response({"ok": True, "result": {"message_id": self._next_id}})
+        return _Response({"ok": True, "result": True})
+
+    def methods(self) -> list[str]:
+        return [m for m, _ in self.calls]
+
+
+def _reply(client, **kwargs) -> TelegramProgressiveReply:
+    kwargs.setdefault("edit_interval", 0)
+    kwargs.setdefault("min_growth", 1)
+    return TelegramProgressiveReply("TOKEN", 42, http_client=client, **kwargs)
+
+
+class TestJsonStringFieldStreamer:
+    def test_decodes_across_fragments(self):
+        ex = JsonStringFieldStreamer("reply")
+        out = "".join(ex.feed(f) for f in ['{"rep', 'ly": "Win ', 'rate is \\', 'n42%', '\\u00e9\\"', 'x", "charts": []}'])
+        assert out == 'Win rate is \n42%é"x'
+        assert ex.done
+
+    def test_surrogate_pair_split(self):
+        ex = JsonStringFieldStreamer("reply")
+        out = "".join(ex.feed(f) for f in ['{"reply": "ok \\ud83d', '\\ude00"}'])
+        assert out == "ok 😀"
+
+    def test_ignores_other_keys(self):
+        ex = JsonStringFieldStreamer("reply_text")
+        assert ex.feed('{"sales_stage": "interest", "reply_text": "hi"}') == "hi"
+        assert ex.feed(' trailing') == ""
+
+
+class TestSplitMessage:
+    def test_short_text_is_one_chunk(self):
+        assert split_message("hello") == ["hello"]
+
+    def test_prefers_line_breaks(self):
+        text = "a" * 60 + "\n" + "b" * 60
+        assert split_message(text, limit=100) == ["a" * 60, "b" * 60]
+
+    def test_hard_cut_without_breaks(self):
+        assert split_message("x" * 250, limit=100) == ["x" * 100, "x" * 100, "x" * 50]
+
+
+class TestProgressiveReply:
+    @pytest.mark.asyncio
+    async def test_waits_for_first_sentence(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg)
+        await reply.update("Hello there")
+        assert tg.calls == [] and not reply.started
+        await reply.update("Hello there, thanks for asking. Our")
+        assert tg.calls == [("sendMessage", {"chat_id": 42, "text": "Hello there, thanks for asking."})]
+        assert reply.started
+
+    @pytest.mark.asyncio
+    async def test_edits_are_throttled(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg, edit_interval=60)
+        await reply.update("Hello there, thanks for asking. Our prices")
+        await reply.update("Hello there, thanks for asking. Our prices start at")
+        assert tg.methods() == ["sendMessage"]
+
+    @pytest.mark.asyncio
+    async def test_edit_grows_message_as_plain_text(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg)
+        await reply.update("Hello there, thanks for asking. Our")
+        await reply.update("Hello there, thanks for asking. Our <b>prices</b> start at <i")
+        method, payload = tg.calls[-1]
+        assert method == "editMessageText"
+        assert payload["text"] == "Hello there, thanks for asking. Our prices start at"
+        assert "parse_mode" not in payload
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_pauses_edits(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg)
+        await reply.update("Hello there, thanks for asking. Our")
+        tg.errors.append({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                          "parameters": {"retry_after": 30}})
+        await reply.update("Hello there, thanks for asking. More text")
+        await reply.update("Hello there, thanks for asking. More text and more")
+        assert tg.methods() == ["sendMessage", "editMessageText"]
+
+    @pytest.mark.asyncio
+    async def test_finalize_edits_with_validated_html(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg)
+        await reply.update("Hello there, thanks for asking. Our")
+        assert await reply.finalize("Hello there, thanks for asking. <b>Final</b> answer.")
+        method, payload = tg.calls[-1]
+        assert method == "editMessageText"
+        assert payload["parse_mode"] == "HTML"
+        assert payload["message_id"] == 101
+
+    @pytest.mark.asyncio
+    async def test_finalize_falls_back_to_plain_on_parse_error(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg)
+        await reply.update("Hello there, thanks for asking. Our")
+        tg.errors.append({"ok": False, "description": "Bad Request: can't parse entities"})
+        assert await reply.finalize("Hello <b>there")
+        assert tg.calls[-1] == ("editMessageText", {"chat_id": 42, "message_id": 101, "text": "Hello there"})
+
+    @pytest.mark.asyncio
+    async def test_not_modified_counts_as_success(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg)
+        await reply.update("Hello there, thanks for asking. Our")
+        tg.errors.append({"ok": False, "description": "Bad Request: message is not modified"})
+        assert await reply.finalize("Hello there, thanks for asking.")
+
+    @pytest.mark.asyncio
+    async def test_long_final_text_continues_in_new_message(self):
+        tg = _FakeTelegram()
+        reply = _reply(tg)
+        await reply.update("Hello there, thanks for asking. Our")
+        final = "Hello there.\n" + "x" * 5000
+        assert await reply.finalize(final)
+        assert tg.methods() == ["sendMessage", "editMessageText", "sendMessage"]
+        assert tg.calls[-1][1]["parse_mode"] == "HTML"
@@ -8,6 +8,7 @@ Covers:
   - All 5 alert rules (fired vs not fired)
   - compute_alerts orchestration (error isolation)
   - compute_snapshot (metrics + alerts + upsert)
+  - compute_snapshots (batched timeframes, shared counts, bulk alert insert)
   - Dismiss flow (endpoint logic via dismiss helper)
 
 Uses a lightweight mock-Supabase builder — no real DB required.
@@ -37,6 +38,7 @@ from revenue.compute import (
     _alert_concentration_risk,
     compute_alerts,
     compute_snapshot,
+    compute_snapshots,
     TIMEFRAME_DAYS,
 )
 
@@ -673,6 +675,111 @@ class TestComputeSnapshot:
         assert isinstance(snapshot, dict)
 
 
+# ---------------------------------------------------------------------------
+# compute_snapshots (batched)
+# ---------------------------------------------------------------------------
+
+class _RecordingSupabase:
+    """_mk_supabase variant that records counts, inserts and upserts."""
+
+    def __init__(self, tables: dict[str, list[dict]]):
+        self.tables = tables
+        self.count_queries: list[str] = []
+        self.inserts: list[tuple[str, object]] = []
+        self.upserts: list[dict] = []
+
+    def table(self, name: str):
+        sb = self
+        mock = _TableMock(self.tables.get(name, []))
+
+        def _select(*a, **kw):
+            if kw.get("count") == "exact":
+                sb.count_queries.append(name)
+            return mock
+
+        def _insert(payload, *a, **kw):
+            sb.inserts.append((name, payload))
+            return mock
+
+        def _upsert(payload, *a, **kw):
+            sb.upserts.append(payload)
+            return mock
+
+        mock.select = _select
+        mock.insert = _insert
+        mock.upsert = _upsert
+        return mock
+
+
+def _snapshot_tables() -> dict[str, list[dict]]:
+    deals = [
+        {"stage": "P", "won": False, "value": v, "created_at": NOW.isoformat(),
+         "modified_at": NOW.isoformat(), "closed_at": None, "assigned_to": rep,
+         "title": f"D{i}", "currency": "USD"}
+        for i, (v, rep) in enumerate([(9000, "Alice"), (500, "Bob"), (500, "Carol")])
+    ]
+    return {
+        "crm_deals": deals,
+        "crm_leads": [{"created_at": NOW.isoformat()}],
+        "crm_activities": [],
+        "revenue_models": [],
+        "revenue_snapshots": [],
+        "revenue_alerts": [],
+    }
+
+
+class TestComputeSnapshots:
+    @pytest.mark.asyncio
+    async def test_all_timeframes_by_default(self):
+        sb = _RecordingSupabase(_snapshot_tables())
+        snapshots = await compute_snapshots(sb, TENANT_ID, CRM_SOURCE)
+        assert set(snapshots) == set(TIMEFRAME_DAYS)
+        assert sorted(u["timeframe"] for u in sb.upserts) == sorted(TIMEFRAME_DAYS)
+
+    @pytest.mark.asyncio
+    async def test_row_counts_shared_across_metrics_and_timeframes(self):
+        import revenue.metric_catalog as mc
+        counted: list[str] = []
+        real_count = mc._count_rows_uncached
+
+        async def _tracking_count(supabase, tenant_id, crm_source, table):
+            counted.append(table)
+            return await real_count(supabase, tenant_id, crm_source, table)
+
+        sb = _RecordingSupabase(_snapshot_tables())
+        with patch.object(mc, "_count_rows_uncached", _tracking_count):
+            await compute_snapshots(sb, TENANT_ID, CRM_SOURCE)
+        # One catalog row count per distinct table for the whole job
+        assert counted
+        assert len(counted) == len(set(counted))
+
+    @pytest.mark.asyncio
+    async def test_alerts_written_in_single_bulk_insert(self):
+        sb = _RecordingSupabase(_snapshot_tables())
+        await compute_snapshots(sb, TENANT_ID, CRM_SOURCE, ["30d"])
+        alert_inserts = [p for name, p in sb.inserts if name == "revenue_alerts"]
+        assert len(alert_inserts) == 1
+        assert isinstance(alert_inserts[0], list)
+        assert any(r["alert_type"] == "concentration_risk" for r in alert_inserts[0])
+
+    @pytest.mark.asyncio
+    async def test_per_metric_timing_recorded(self):
+        sb = _RecordingSupabase(_snapshot_tables())
+        snapshot = await compute_snapshot(sb, TENANT_ID, CRM_SOURCE, "30d")
+        metrics = snapshot["snapshot_json"]
+        assert len(metrics) == 12
+        assert all(isinstance(m["compute_ms"], float) for m in metrics.values())
+
+    @pytest.mark.asyncio
+    async def test_metric_failure_isolated(self):
+        sb = _RecordingSupabase(_snapshot_tables())
+        with patch("revenue.metric_catalog.compute_metric", side_effect=Exception("boom")):
+            snapshot = await compute_snapshot(sb, TENANT_ID, CRM_SOURCE, "30d")
+        entries = snapshot["snapshot_json"].values()
+        assert all(e["available"] is False for e in entries)
+        assert snapshot["trust_score"] == 0.0
+
+
 # ---------------------------------------------------------------------------
 # AlertRecord data class
 # ---------------------------------------------------------------------------
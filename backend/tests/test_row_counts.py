@@ -0,0 +1,213 @@
+"""
+Tests for backend/row_counts.py
+================================
+Covers:
+  - CountMode → PostgREST count method mapping
+  - count_rows in EXACT / ESTIMATED / CACHED modes
+  - Cache invalidation via record_sync_delta / invalidate_counts, broadcast
+    to the other workers
+  - count_tables batching through exec_readonly_sql + per-table fallback
+
+Uses a lightweight mock-Supabase builder — no real DB required.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import row_counts
+from row_counts import (
+    CountMode,
+    count_rows,
+    count_tables,
+    invalidate_counts,
+    record_sync_delta,
+    _batch_count_sql,
+)
+
+TENANT_ID = "tenant-aaa"
+CRM_SOURCE = "bitrix"
+
+
+class _CountingSupabase:
+    """Mock whose table counts come from a dict; records every count method used."""
+
+    def __init__(self, counts: dict[str, int], rpc_row: dict | Exception | None = None):
+        self.counts = counts
+        self.rpc_row = rpc_row
+        self.count_calls: list[tuple[str, str]] = []
+        self.rpc_calls: list[dict] = []
+
+    def table(self, name: str):
+        sb = self
+        chain = MagicMock()
+
+        def _select(columns, count=None):
+            sb.count_calls.append((name, count))
+            return chain
+
+        def _execute():
+            res = MagicMock()
+            res.count = sb.counts.get(name, 0)
+            res.data = []
+            return res
+
+        chain.select.side_effect = _select
+        chain.eq.return_value = chain
+        chain.limit.return_value = chain
+        chain.execute.side_effect = _execute
+        return chain
+
+    def rpc(self, name: str, params: dict):
+        self.rpc_calls.append(params)
+        call = MagicMock()
+        if isinstance(self.rpc_row, Exception):
+            call.execute.side_effect = self.rpc_row
+        else:
+            call.execute.return_value = MagicMock(data=[self.rpc_row] if self.rpc_row else [])
+        return call
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    row_counts._count_cache.clear()
+    yield
+    row_counts._count_cache.clear()
+
+
+class TestCountMode:
+    def test_cached_uses_exact_postgrest_count(self):
+        assert CountMode.CACHED.postgrest == "exact"
+
+    def test_other_modes_pass_through(self):
+        assert CountMode.EXACT.postgrest == "exact"
+        assert CountMode.ESTIMATED.postgrest == "estimated"
+        assert CountMode.PLANNED.postgrest == "planned"
+
+
+class TestCountRows:
+    @pytest.mark.asyncio
+    async def test_exact_counts_every_call(self):
+        sb = _CountingSupabase({"crm_deals": 12})
+        assert await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE) == 12
+        assert await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE) == 12
+        assert sb.count_calls == [("crm_deals", "exact"), ("crm_deals", "exact")]
+
+    @pytest.mark.asyncio
+    async def test_estimated_mode_requests_estimate(self):
+        sb = _CountingSupabase({"crm_deals": 5})
+        await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.ESTIMATED)
+        assert sb.count_calls == [("crm_deals", "estimated")]
+
+    @pytest.mark.asyncio
+    async def test_cached_mode_hits_cache(self):
+        sb = _CountingSupabase({"crm_deals": 7})
+        for _ in range(3):
+            assert await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED) == 7
+        assert len(sb.count_calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_sync_delta_invalidates_cached_count(self):
+        sb = _CountingSupabase({"crm_deals": 7})
+        await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        sb.counts["crm_deals"] = 9
+        record_sync_delta(TENANT_ID, CRM_SOURCE, "crm_deals", changed=2)
+        assert await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED) == 9
+
+    @pytest.mark.asyncio
+    async def test_sync_delta_reaches_other_workers(self):
+        import json
+        from shared_state import InMemorySharedState, set_shared_state
+
+        leader = InMemorySharedState()
+        leader.publish_nowait = MagicMock()
+        previous = set_shared_state(leader)
+        try:
+            record_sync_delta(TENANT_ID, CRM_SOURCE, "crm_deals", changed=2)
+        finally:
+            set_shared_state(previous)
+        channel, message = leader.publish_nowait.call_args.args
+        assert channel == row_counts.COUNT_DELTA_CHANNEL
+
+        # A follower worker with a cached count receives the broadcast
+        sb = _CountingSupabase({"crm_deals": 7})
+        await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        sb.counts["crm_deals"] = 9
+        InMemorySharedState()._dispatch(channel, json.dumps({"origin": "leader", "data": message}))
+        assert await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED) == 9
+
+    @pytest.mark.asyncio
+    async def test_zero_delta_keeps_cache(self):
+        sb = _CountingSupabase({"crm_deals": 7})
+        await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        record_sync_delta(TENANT_ID, CRM_SOURCE, "crm_deals", changed=0)
+        await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        assert len(sb.count_calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_cache_is_tenant_scoped(self):
+        sb = _CountingSupabase({"crm_deals": 7})
+        await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        await count_rows(sb, "tenant-bbb", "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        assert len(sb.count_calls) == 2
+        invalidate_counts(TENANT_ID)
+        assert ("tenant-bbb", CRM_SOURCE, "crm_deals") in row_counts._count_cache
+        assert (TENANT_ID, CRM_SOURCE, "crm_deals") not in row_counts._count_cache
+
+    @pytest.mark.asyncio
+    async def test_error_returns_zero_and_is_not_cached(self):
+        sb = MagicMock()
+        sb.table.side_effect = Exception("boom")
+        assert await count_rows(sb, TENANT_ID, "crm_deals", crm_source=CRM_SOURCE, mode=CountMode.CACHED) == 0
+        assert len(row_counts._count_cache) == 0
+
+
+class TestCountTables:
+    TABLES = ["crm_leads", "crm_deals", "crm_contacts"]
+
+    @pytest.mark.asyncio
+    async def test_exact_counts_batched_into_one_rpc(self):
+        sb = _CountingSupabase({}, rpc_row={"crm_leads": 3, "crm_deals": 4, "crm_contacts": 0})
+        counts = await count_tables(sb, TENANT_ID, self.TABLES, crm_source=CRM_SOURCE)
+        assert counts == {"crm_leads": 3, "crm_deals": 4, "crm_contacts": 0}
+        assert len(sb.rpc_calls) == 1
+        assert sb.count_calls == []
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_per_table_counts(self):
+        sb = _CountingSupabase({"crm_leads": 1, "crm_deals": 2}, rpc_row=Exception("no rpc"))
+        counts = await count_tables(sb, TENANT_ID, self.TABLES, crm_source=CRM_SOURCE)
+        assert counts == {"crm_leads": 1, "crm_deals": 2, "crm_contacts": 0}
+        assert len(sb.count_calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_cached_mode_only_counts_misses(self):
+        sb = _CountingSupabase({}, rpc_row={"crm_leads": 3, "crm_deals": 4, "crm_contacts": 5})
+        await count_tables(sb, TENANT_ID, self.TABLES, crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        await count_tables(sb, TENANT_ID, self.TABLES, crm_source=CRM_SOURCE, mode=CountMode.CACHED)
+        assert len(sb.rpc_calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_tenant_wide_counts_do_not_batch(self):
+        sb = _CountingSupabase({"crm_leads": 1}, rpc_row={"crm_leads": 99})
+        counts = await count_tables(sb, TENANT_ID, ["crm_leads"])
+        assert counts == {"crm_leads": 1}
+        assert sb.rpc_calls == []
+
+    @pytest.mark.asyncio
+    async def test_planned_mode_runs_per_table(self):
+        sb = _CountingSupabase({"crm_leads": 100, "crm_deals": 200}, rpc_row={"crm_leads": 1})
+        await count_tables(sb, TENANT_ID, ["crm_leads", "crm_deals"], crm_source=CRM_SOURCE, mode=CountMode.PLANNED)
+        assert sb.rpc_calls == []
+        assert sorted(sb.count_calls) == [("crm_deals", "planned"), ("crm_leads", "planned")]
+
+    def test_batch_sql_escapes_literals(self):
+        sql = _batch_count_sql("t'1", "bit'rix", ["crm_deals"])
+        assert "tenant_id = 't''1'" in sql
+        assert "crm_source = 'bit''rix'" in sql
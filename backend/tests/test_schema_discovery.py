@@ -159,18 +159,15 @@ class TestLoadAllowedFields:
         assert "crm_leads" in result2  # Still has cached leads data
 
     @pytest.mark.asyncio
-    async def test_cache_expiry(self):
+    async def test_cache_expiry(self, monkeypatch):
         """After TTL expires, should re-query."""
         mock_sb = MockSupabaseQuery(data=[
             {"entity": "leads", "field_name": "status"},
         ])
         result1 = await load_allowed_fields(mock_sb, "t1", "bitrix24")
 
-        # Manually expire cache
-        _field_cache[("t1", "bitrix24")] = (
-            _field_cache[("t1", "bitrix24")][0],
-            time.time() - FIELD_CACHE_TTL - 1,
-        )
+        # Move the cache clock past the TTL
+        monkeypatch.setattr(_field_cache, "clock", lambda: time.monotonic() + FIELD_CACHE_TTL + 1)
 
         mock_sb2 = MockSupabaseQuery(data=[
             {"entity": "deals", "field_name": "stage"},
@@ -0,0 +1,147 @@
+"""
+Tests for backend/shared_state.py
+==================================
+Covers:
+  - The backend contract (set_if_absent / get / set / pop / exists, sliding
+    window rate limiting) against the in-memory backend, plus fakeredis and a
+    real server when available (TEST_REDIS_URL=redis://localhost:6379/15)
+  - Pub/sub envelope handling: own messages ignored, handlers isolated
+  - invalidate_everywhere and the MTD cost broadcast handler
+  - Redis errors fall back to per-worker state
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import shared_state
+import usage_ledger
+from shared_state import (
+    CACHE_INVALIDATION_CHANNEL,
+    InMemorySharedState,
+    RedisSharedState,
+    SharedRateLimiter,
+    invalidate_everywhere,
+    set_shared_state,
+)
+from ttl_cache import TTLCache
+
+
+@pytest_asyncio.fixture(params=["memory", "fakeredis", "redis"])
+async def state(request):
+    if request.param == "memory":
+        backend = InMemorySharedState()
+    elif request.param == "fakeredis":
+        fakeredis = pytest.importorskip("fakeredis")
+        backend = RedisSharedState("", prefix="test:", client=fakeredis.aioredis.FakeRedis(decode_responses=True))
+    else:
+        url = os.environ.get("TEST_REDIS_URL")
+        if not url:
+            pytest.skip("TEST_REDIS_URL not set")
+        pytest.importorskip("redis")
+        backend = RedisSharedState(url, prefix=f"test:{os.getpid()}:")
+    previous = set_shared_state(backend)
+    yield backend
+    set_shared_state(previous)
+    await backend.close()
+
+
+class TestContract:
+    @pytest.mark.asyncio
+    async def test_set_if_absent_is_first_writer_wins(self, state):
+        assert await state.set_if_absent("dedup:telegram:1", ttl=60) is True
+        assert await state.set_if_absent("dedup:telegram:1", ttl=60) is False
+        assert await state.exists("dedup:telegram:1")
+
+    @pytest.mark.asyncio
+    async def test_pop_is_one_time(self, state):
+        await state.set("link_code:ABC123", json.dumps({"tenant_id": "t1"}), ttl=60)
+        assert json.loads(await state.pop("link_code:ABC123")) == {"tenant_id": "t1"}
+        assert await state.pop("link_code:ABC123") is None
+        assert await state.get("link_code:ABC123") is None
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_counts_across_callers(self, state):
+        limiter = SharedRateLimiter("t_messages", max_requests=3, window=3600)
+        results = [await limiter.hit("user-1") for _ in range(4)]
+        assert [bool(r) for r in results] == [True, True, True, False]
+        assert results[-1].retry_after > 0
+        assert await limiter.hit("user-2")
+        assert not await limiter.hit("user-1", limit=1)
+
+
+class TestPubSub:
+    def test_own_messages_are_ignored(self, monkeypatch):
+        backend = InMemorySharedState()
+        received = []
+        monkeypatch.setitem(shared_state._handlers, "t_channel", [received.append])
+        backend._dispatch("t_channel", json.dumps({"origin": backend.instance_id, "data": {"x": 1}}))
+        backend._dispatch("t_channel", json.dumps({"origin": "other", "data": {"x": 2}}))
+        backend._dispatch("t_channel", "not json")
+        assert received == [{"x": 2}]
+
+    def test_failing_handler_does_not_block_others(self, monkeypatch):
+        backend = InMemorySharedState()
+        received = []
+
+        def broken(data):
+            raise ValueError("boom")
+
+        monkeypatch.setitem(shared_state._handlers, "t_channel", [broken, received.append])
+        backend._dispatch("t_channel", json.dumps({"origin": "other", "data": {"ok": True}}))
+        assert received == [{"ok": True}]
+        assert backend.stats()["handler_errors"] == 1
+
+    def test_remote_invalidation_pops_local_cache(self):
+        cache = TTLCache("t_shared_invalidate", ttl=60)
+        cache.set("tenant-1", "prefix")
+        InMemorySharedState()._dispatch(
+            CACHE_INVALIDATION_CHANNEL,
+            json.dumps({"origin": "other", "data": {"cache": cache.name, "key": "tenant-1"}}),
+        )
+        assert "tenant-1" not in cache
+
+    def test_invalidate_everywhere_publishes(self):
+        backend = InMemorySharedState()
+        backend.publish_nowait = MagicMock()
+        previous = set_shared_state(backend)
+        try:
+            cache = TTLCache("t_shared_publish", ttl=60)
+            cache.set("tenant-1", "creds")
+            assert invalidate_everywhere(cache, "tenant-1") == "creds"
+        finally:
+            set_shared_state(previous)
+        backend.publish_nowait.assert_called_once_with(
+            CACHE_INVALIDATION_CHANNEL, {"cache": "t_shared_publish", "key": "tenant-1"},
+        )
+
+    def test_remote_cost_updates_cached_total(self):
+        month = usage_ledger._month_start(usage_ledger.utc_today()).isoformat()
+        usage_ledger._mtd_cache.set("tenant-remote", (month, 1.0))
+        try:
+            usage_ledger._on_remote_cost({"tenant_id": "tenant-remote", "month": month, "cost": 0.25})
+            assert usage_ledger._mtd_cache.get("tenant-remote") == (month, 1.25)
+        finally:
+            usage_ledger._mtd_cache.pop("tenant-remote")
+
+
+class TestRedisFallback:
+    @pytest.mark.asyncio
+    async def test_errors_fall_back_to_local_state(self):
+        client = MagicMock()
+        client.set = AsyncMock(side_effect=ConnectionError("redis down"))
+        client.close = AsyncMock()
+        client.aclose = AsyncMock()
+        backend = RedisSharedState("", client=client)
+        assert await backend.set_if_absent("dedup:instagram:m1", ttl=60) is True
+        assert await backend.set_if_absent("dedup:instagram:m1", ttl=60) is False
+        stats = backend.stats()
+        assert stats["degraded"] is True and stats["fallbacks"] == 2
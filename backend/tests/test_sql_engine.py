@@ -244,3 +244,136 @@ class TestRepNameResolution:
         rows = [{"title": "Deal C", "value": "1000"}]
         result = _resolve_rep_names_in_rows(rows, {"1": "Alice"})
         assert result[0]["title"] == "Deal C"
+
+
+# ── Test: Canonical SQL + result cache ───────────────────────────────────
+
+class _RpcSupabase:
+    """Counts exec_readonly_sql calls and returns fixed rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def rpc(self, name, params):
+        sb = self
+
+        class _Call:
+            def execute(self):
+                sb.calls += 1
+                if isinstance(sb.rows, Exception):
+                    raise sb.rows
+                return type("R", (), {"data": sb.rows})()
+
+        return _Call()
+
+
+@pytest.fixture
+def clean_sql_cache():
+    from agents import sql_engine
+    sql_engine._result_cache.clear()
+    sql_engine._data_versions.clear()
+    yield sql_engine
+    sql_engine._result_cache.clear()
+    sql_engine._data_versions.clear()
+
+
+class TestCanonicalSql:
+    def test_case_and_whitespace(self):
+        from agents.sql_engine import canonical_sql
+        assert canonical_sql("select  Title,\n count(*) from CRM_DEALS group by Title;") == \
+            canonical_sql("SELECT title, COUNT(*) FROM crm_deals GROUP BY title")
+
+    def test_conjunct_order(self):
+        from agents.sql_engine import canonical_sql
+        assert canonical_sql("SELECT title FROM crm_deals WHERE won = true AND (value > 5 AND stage_id = 'X')") == \
+            canonical_sql("SELECT title FROM crm_deals WHERE stage_id = 'X' AND value > 5 AND won = true")
+
+    def test_literals_preserved(self):
+        from agents.sql_engine import canonical_sql
+        assert canonical_sql("SELECT title FROM crm_deals WHERE stage_id = 'Won'") != \
+            canonical_sql("SELECT title FROM crm_deals WHERE stage_id = 'won'")
+
+    def test_unparseable_falls_back(self):
+        from agents.sql_engine import canonical_sql
+        assert canonical_sql("not   sql (((") == "not sql ((("
+
+
+class TestResultCache:
+    @pytest.mark.asyncio
+    async def test_equivalent_sql_hits_cache(self, clean_sql_cache):
+        sb = _RpcSupabase([{"title": "A"}])
+        first = await clean_sql_cache.execute_sql(sb, "t1", "bitrix", "SELECT title FROM crm_deals LIMIT 100")
+        second = await clean_sql_cache.execute_sql(sb, "t1", "bitrix", "select title\nfrom crm_deals limit 100;")
+        assert sb.calls == 1
+        assert second == first
+
+    @pytest.mark.asyncio
+    async def test_scoped_by_tenant_and_source(self, clean_sql_cache):
+        sb = _RpcSupabase([{"title": "A"}])
+        sql = "SELECT title FROM crm_deals LIMIT 100"
+        await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql)
+        await clean_sql_cache.execute_sql(sb, "t2", "bitrix", sql)
+        await clean_sql_cache.execute_sql(sb, "t1", "hubspot", sql)
+        assert sb.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_data_version_bump_invalidates(self, clean_sql_cache):
+        sb = _RpcSupabase([{"title": "A"}])
+        sql = "SELECT title FROM crm_deals LIMIT 100"
+        await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql)
+        clean_sql_cache.bump_data_version("t1", "bitrix")
+        await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql)
+        assert sb.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_rep_name_map_contents_are_part_of_key(self, clean_sql_cache):
+        sb = _RpcSupabase([{"assigned_to": "7"}])
+        sql = "SELECT assigned_to FROM crm_deals LIMIT 100"
+        first = await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql, {"7": "Alice", "8": "Bob"})
+        renamed = await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql, {"7": "Alicia", "8": "Bob"})
+        swapped = await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql, {"7": "Bob", "8": "Alice"})
+        reordered = await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql, {"8": "Bob", "7": "Alice"})
+        assert sb.calls == 3
+        assert [r["rows"][0]["assigned_to"] for r in (first, renamed, swapped)] == ["Alice", "Alicia", "Bob"]
+        assert reordered == first
+
+    @pytest.mark.asyncio
+    async def test_data_version_bump_from_another_worker(self, clean_sql_cache):
+        import json
+        from shared_state import InMemorySharedState
+
+        sb = _RpcSupabase([{"title": "A"}])
+        sql = "SELECT title FROM crm_deals LIMIT 100"
+        await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql)
+        message = {"tenant_id": "t1", "crm_source": "bitrix"}
+        InMemorySharedState()._dispatch(clean_sql_cache.DATA_VERSION_CHANNEL,
+                                        json.dumps({"origin": "leader", "data": message}))
+        await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql)
+        assert sb.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_not_cached(self, clean_sql_cache):
+        sb = _RpcSupabase(Exception("timeout"))
+        sql = "SELECT title FROM crm_deals LIMIT 100"
+        assert (await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql))["error"] == "timeout"
+        await clean_sql_cache.execute_sql(sb, "t1", "bitrix", sql)
+        assert sb.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self, clean_sql_cache, monkeypatch):
+        monkeypatch.setattr(clean_sql_cache._result_cache, "max_entries", 2)
+        sb = _RpcSupabase([{"n": 1}])
+        for i in range(3):
+            await clean_sql_cache.execute_sql(sb, "t1", "bitrix", f"SELECT {i} FROM crm_deals")
+        assert len(clean_sql_cache._result_cache) == 2
+        await clean_sql_cache.execute_sql(sb, "t1", "bitrix", "SELECT 0 FROM crm_deals")
+        assert sb.calls == 4  # oldest entry was evicted
+
+    def test_parse_is_memoized(self):
+        from agents import sql_engine
+        sql = "SELECT title FROM crm_deals WHERE value > 12345"
+        validate_sql(sql, SCHEMA)
+        before = sql_engine._parse.cache_info().hits
+        validate_sql(sql, SCHEMA)
+        assert sql_engine._parse.cache_info().hits > before
@@ -0,0 +1,139 @@
+"""
+Tests for backend/startup_hooks.py
+===================================
+Covers:
+  - Blocking hooks run concurrently (boot time ~ slowest hook, not the sum)
+  - Background hooks don't delay run(); their failures are only logged
+  - A failing blocking hook fails run() after the others have finished
+  - stats() reports per-hook timings and errors
+  - Lazy heavy imports: importing the worker modules doesn't pull in
+    litellm / openai / tiktoken / sqlglot
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from startup_hooks import StartupHooks
+
+
+def sleeper(seconds, calls=None, name=None):
+    async def hook():
+        await asyncio.sleep(seconds)
+        if calls is not None:
+            calls.append(name)
+    hook.__name__ = name or f"sleep_{seconds}"
+    return hook
+
+
+class TestRun:
+    @pytest.mark.asyncio
+    async def test_blocking_hooks_run_concurrently(self):
+        startup = StartupHooks()
+        for i in range(4):
+            startup.hook(sleeper(0.1, name=f"hook_{i}"))
+
+        started = time.perf_counter()
+        await startup.run()
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < 0.3  # sequential would be 0.4s
+        assert startup.stats()["total_seconds"] == pytest.approx(elapsed, abs=0.05)
+
+    @pytest.mark.asyncio
+    async def test_background_hook_does_not_delay_run(self):
+        startup = StartupHooks()
+        calls = []
+        startup.hook(sleeper(0.2, calls, "webhook"), background=True)
+        startup.hook(sleeper(0.0, calls, "blacklist"))
+
+        started = time.perf_counter()
+        await startup.run()
+        assert time.perf_counter() - started < 0.1
+        assert calls == ["blacklist"]
+
+        await asyncio.sleep(0.3)
+        assert calls == ["blacklist", "webhook"]
+
+    @pytest.mark.asyncio
+    async def test_background_failure_is_logged_not_raised(self, caplog):
+        startup = StartupHooks()
+
+        @startup.hook(background=True)
+        async def flaky():
+            raise RuntimeError("telegram down")
+
+        await startup.run()
+        await asyncio.sleep(0)
+        assert "flaky failed" in caplog.text
+        assert startup.stats()["hooks"]["flaky"]["error"] == "RuntimeError: telegram down"
+
+    @pytest.mark.asyncio
+    async def test_blocking_failure_raised_after_others_finish(self):
+        startup = StartupHooks()
+        calls = []
+
+        @startup.hook
+        async def broken():
+            raise ValueError("bad config")
+
+        startup.hook(sleeper(0.05, calls, "slow"))
+
+        with pytest.raises(ValueError, match="bad config"):
+            await startup.run()
+        assert calls == ["slow"]
+
+
+class TestStats:
+    def test_before_run(self):
+        startup = StartupHooks()
+        startup.hook(sleeper(0, name="a"))
+        assert startup.stats() == {
+            "total_seconds": None,
+            "hooks": {"a": {"background": False, "seconds": None, "error": None}},
+        }
+
+    @pytest.mark.asyncio
+    async def test_after_run(self):
+        startup = StartupHooks()
+        startup.hook(sleeper(0.05, name="slow"))
+        startup.hook(sleeper(0, name="fast"))
+        await startup.run()
+
+        hooks = startup.stats()["hooks"]
+        assert hooks["slow"]["seconds"] >= 0.05
+        assert hooks["fast"]["seconds"] < 0.05
+        assert hooks["slow"]["error"] is None
+
+    def test_decorator_returns_function_unchanged(self):
+        startup = StartupHooks()
+
+        async def fn():
+            pass
+
+        assert startup.hook(fn) is fn
+        assert startup.hook(background=True)(fn) is fn
+
+
+class TestLazyImports:
+    def test_worker_modules_skip_heavy_dependencies(self):
+        code = (
+            "import sys, sync_engine, document_processor, llm_gateway, llm_service, google_sheets_service\n"
+            "print(','.join(m for m in ('litellm', 'openai', 'tiktoken', 'sqlglot', 'gspread', 'fitz', 'pandas')"
+            " if m in sys.modules))"
+        )
+        env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-test"))
+        proc = subprocess.run(
+            [sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), ".."),
+            env=env, capture_output=True, text=True,
+        )
+        assert proc.returncode == 0, proc.stderr
+        assert proc.stdout.strip() == ""
@@ -0,0 +1,223 @@
+"""
+Tests for backend/telemetry.py
+===============================
+Covers:
+  - Buffering and bulk flush per table (token usage via the batch RPC)
+  - Size-triggered flush by the background task
+  - Per-conversation usage increments summed before writing
+  - Bounded buffer with drop counter, failed writes counted not raised;
+    a failed chunk is retried, then split so one bad row loses only itself
+  - stop() drains the buffer
+  - token_logger / AgentTrace route through the sink
+
+Uses a lightweight mock-Supabase builder — no real DB required.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from telemetry import TOKEN_USAGE_TABLE, TelemetrySink
+
+TENANT_ID = "tenant-aaa"
+
+
+class _RecordingSupabase:
+    """Records bulk inserts and RPC calls."""
+
+    def __init__(self, fail_tables: set[str] | None = None, poisoned: list[dict] | None = None,
+                 transient_failures: int = 0):
+        self.inserts: list[tuple[str, list]] = []
+        self.rpcs: list[tuple[str, dict]] = []
+        self.fail_tables = fail_tables or set()
+        self.poisoned = poisoned or []  # rows that fail any insert containing them
+        self.transient_failures = transient_failures
+        self.attempts = 0
+
+    def table(self, name: str):
+        sb = self
+        chain = MagicMock()
+
+        def _insert(rows):
+            sb.attempts += 1
+            if name in sb.fail_tables or any(row in sb.poisoned for row in rows):
+                raise Exception("insert failed")
+            if sb.transient_failures:
+                sb.transient_failures -= 1
+                raise Exception("connection reset")
+            sb.inserts.append((name, rows))
+            return chain
+
+        chain.insert.side_effect = _insert
+        return chain
+
+    def rpc(self, name: str, params: dict):
+        self.rpcs.append((name, params))
+        return MagicMock()
+
+
+class TestBuffering:
+    @pytest.mark.asyncio
+    async def test_flush_writes_one_bulk_insert_per_table(self):
+        sb = _RecordingSupabase()
+        sink = TelemetrySink(sb, flush_interval=60)
+        for i in range(3):
+            sink.enqueue("event_logs", {"i": i})
+        sink.enqueue("agent_traces", {"t": 1})
+        assert await sink.flush() == 4
+        assert sorted((t, len(rows)) for t, rows in sb.inserts) == [("agent_traces", 1), ("event_logs", 3)]
+        await sink.stop()
+
+    @pytest.mark.asyncio
+    async def test_token_usage_goes_through_batch_rpc(self):
+        sb = _RecordingSupabase()
+        sink = TelemetrySink(sb, flush_interval=60)
+        sink.enqueue(TOKEN_USAGE_TABLE, {"tenant_id": TENANT_ID, "cost_usd": 0.1})
+        sink.enqueue(TOKEN_USAGE_TABLE, {"tenant_id": TENANT_ID, "cost_usd": 0.2})
+        await sink.flush()
+        assert sb.rpcs == [("record_token_usage_batch", {"p_rows": [
+            {"tenant_id": TENANT_ID, "cost_usd": 0.1}, {"tenant_id": TENANT_ID, "cost_usd": 0.2},
+        ]})]
+        assert sb.inserts == []
+        await sink.stop()
+
+    @pytest.mark.asyncio
+    async def test_chunks_large_buffers(self):
+        sb = _RecordingSupabase()
+        sink = TelemetrySink(sb, flush_interval=60, batch_size=2)
+        sink._ensure_running = lambda: None  # no background flush
+        for i in range(5):
+            sink.enqueue("event_logs", {"i": i})
+        await sink.flush()
+        assert [len(rows) for _, rows in sb.inserts] == [2, 2, 1]
+
+    @pytest.mark.asyncio
+    async def test_size_threshold_wakes_flusher(self):
+        sb = _RecordingSupabase()
+        sink = TelemetrySink(sb, flush_interval=60, batch_size=2)
+        sink.enqueue("event_logs", {"i": 1})
+        sink.enqueue("event_logs", {"i": 2})
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if sb.inserts:
+                break
+        assert sb.inserts == [("event_logs", [{"i": 1}, {"i": 2}])]
+        await sink.stop()
+
+    @pytest.mark.asyncio
+    async def test_conversation_usage_is_aggregated(self):
+        sb = _RecordingSupabase()
+        sink = TelemetrySink(sb, flush_interval=60)
+        sink.add_conversation_usage("c1", 10, 5, 0.1)
+        sink.add_conversation_usage("c1", 20, 5, 0.2)
+        sink.add_conversation_usage("c2", 1, 1, 0.01)
+        await sink.flush()
+        calls = {p["p_conversation_id"]: p for name, p in sb.rpcs if name == "increment_conversation_usage"}
+        assert len(calls) == 2
+        assert calls["c1"]["p_input_tokens"] == 30
+        assert calls["c1"]["p_output_tokens"] == 10
+        assert calls["c1"]["p_cost_usd"] == pytest.approx(0.3)
+        await sink.stop()
+
+
+class TestBoundsAndFailures:
+    def test_drops_beyond_capacity(self):
+        sink = TelemetrySink(_RecordingSupabase(), max_buffered=2)
+        assert sink.enqueue("event_logs", {})
+        assert sink.enqueue("event_logs", {})
+        assert not sink.enqueue("event_logs", {})
+        assert sink.stats()["dropped"] == 1
+        assert sink.stats()["buffered"] == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_write_is_counted_not_raised(self):
+        sb = _RecordingSupabase(fail_tables={"agent_traces"})
+        sink = TelemetrySink(sb, flush_interval=60)
+        sink.enqueue("agent_traces", {"t": 1})
+        sink.enqueue("event_logs", {"e": 1})
+        assert await sink.flush() == 1
+        assert sink.stats()["failed"] == 1
+        await sink.stop()
+
+    @pytest.mark.asyncio
+    async def test_poisoned_row_only_loses_itself(self):
+        bad = {"e": 37, "conversation_id": "deleted"}
+        sb = _RecordingSupabase(poisoned=[bad])
+        sink = TelemetrySink(sb, flush_interval=60, batch_size=100)
+        rows = [{"e": i} for i in range(100)]
+        rows[37] = bad
+        for row in rows:
+            sink.enqueue("event_logs", row)
+        assert await sink.flush() == 99
+        assert sink.stats()["failed"] == 1
+        written = [row for _, chunk in sb.inserts for row in chunk]
+        assert len(written) == 99 and bad not in written
+        assert sb.attempts <= 2 + 2 * 7  # first try, then one bisection path
+        await sink.stop()
+
+    @pytest.mark.asyncio
+    async def test_transient_failure_is_retried_whole(self):
+        sb = _RecordingSupabase(transient_failures=1)
+        sink = TelemetrySink(sb, flush_interval=60)
+        for i in range(10):
+            sink.enqueue("event_logs", {"e": i})
+        assert await sink.flush() == 10
+        assert sink.stats()["failed"] == 0
+        assert [len(chunk) for _, chunk in sb.inserts] == [10]
+        await sink.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_drains_buffer(self):
+        sb = _RecordingSupabase()
+        sink = TelemetrySink(sb, flush_interval=60)
+        sink.enqueue("event_logs", {"e": 1})
+        await sink.stop()
+        assert sb.inserts == [("event_logs", [{"e": 1}])]
+        assert sink.stats()["buffered"] == 0
+
+    @pytest.mark.asyncio
+    async def test_unbound_sink_keeps_rows(self):
+        sink = TelemetrySink(flush_interval=60)
+        sink.enqueue("event_logs", {"e": 1})
+        assert await sink.flush() == 0
+        assert sink.stats()["buffered"] == 1
+        sb = _RecordingSupabase()
+        sink.bind(sb)
+        await sink.stop()
+        assert len(sb.inserts) == 1
+
+
+class TestProducers:
+    @pytest.mark.asyncio
+    async def test_token_logger_buffers_row_and_conversation_usage(self):
+        import token_logger
+
+        sink = TelemetrySink(_RecordingSupabase(), flush_interval=60)
+        with patch.object(token_logger, "_get_supabase", return_value=MagicMock()), \
+             patch.object(token_logger, "get_sink", return_value=sink):
+            await token_logger.log_token_usage(
+                TENANT_ID, "gpt-4o-mini", "sales_agent_faq", 1000, 100, conversation_id="c1",
+            )
+        assert sink._buffers[TOKEN_USAGE_TABLE][0]["tenant_id"] == TENANT_ID
+        assert sink._conversation_usage["c1"][0] == 1000
+        await sink.stop()
+
+    @pytest.mark.asyncio
+    async def test_agent_trace_buffers_row(self):
+        import agent_trace
+
+        sink = TelemetrySink(flush_interval=60)
+        with patch.object(agent_trace, "get_sink", return_value=sink):
+            async with agent_trace.AgentTrace(_RecordingSupabase(), TENANT_ID, "bobur"):
+                pass
+        row = sink._buffers["agent_traces"][0]
+        assert row["agent_name"] == "bobur"
+        assert row["success"] is True
+        await sink.stop()
@@ -0,0 +1,71 @@
+"""
+Tests for backend/token_logger.py
+==================================
+Covers:
+  - Cost calculation with prompt-cache (cached input) pricing
+  - Reading cached prompt tokens from OpenAI / litellm / Anthropic-style usage
+  - cached_input_tokens carried on the buffered usage row
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import token_logger
+from telemetry import TOKEN_USAGE_TABLE, TelemetrySink
+from token_logger import cached_prompt_tokens, calculate_cost
+
+TENANT_ID = "tenant-aaa"
+
+
+class TestCalculateCost:
+    def test_uncached(self):
+        assert calculate_cost("gpt-4o", 1000, 100) == pytest.approx(0.0025 + 0.001)
+
+    def test_cached_input_billed_at_cached_rate(self):
+        assert calculate_cost("gpt-4o", 1000, 0, cached_input_tokens=800) == pytest.approx(0.0005 + 0.001)
+
+    def test_cached_never_exceeds_input(self):
+        assert calculate_cost("gpt-4o", 100, 0, cached_input_tokens=500) == calculate_cost("gpt-4o", 100, 0, 100)
+
+    def test_model_without_cached_rate(self):
+        assert calculate_cost("gemini-2.0-flash", 1000, 0, cached_input_tokens=1000) == calculate_cost(
+            "gemini-2.0-flash", 1000, 0)
+
+
+class TestCachedPromptTokens:
+    def test_openai_usage(self):
+        usage = SimpleNamespace(prompt_tokens=2000, prompt_tokens_details=SimpleNamespace(cached_tokens=1536))
+        assert cached_prompt_tokens(usage) == 1536
+
+    def test_dict_details(self):
+        assert cached_prompt_tokens(SimpleNamespace(prompt_tokens_details={"cached_tokens": 64})) == 64
+
+    def test_anthropic_style_usage(self):
+        assert cached_prompt_tokens(SimpleNamespace(cache_read_input_tokens=900)) == 900
+
+    def test_missing(self):
+        assert cached_prompt_tokens(None) == 0
+        assert cached_prompt_tokens(SimpleNamespace(prompt_tokens=10, prompt_tokens_details=None)) == 0
+
+
+class TestRow:
+    @pytest.mark.asyncio
+    async def test_cached_tokens_on_row(self):
+        sink = TelemetrySink(flush_interval=60)
+        with patch.object(token_logger, "_get_supabase", return_value=MagicMock()), \
+             patch.object(token_logger, "get_sink", return_value=sink):
+            await token_logger.log_token_usage(
+                TENANT_ID, "gpt-4o", "sales_agent", 1000, 100, cached_input_tokens=800,
+            )
+        row = sink._buffers[TOKEN_USAGE_TABLE][0]
+        assert row["cached_input_tokens"] == 800
+        assert row["cost_usd"] == pytest.approx(0.0005 + 0.001 + 0.001)
+        await sink.stop()
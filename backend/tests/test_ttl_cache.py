@@ -0,0 +1,253 @@
+"""
+Tests for backend/ttl_cache.py
+===============================
+Covers:
+  - TTL expiry (heap purge) and the mapping protocol on fresh entries
+  - LRU eviction by entry count and by byte size, on_evict callback
+  - add / replace / pop semantics used by the dedup and ledger call sites
+  - get_or_load: single-flight coalescing, stale-if-error, None handling,
+    a cancelled loader hands the load to a waiter instead of hanging it
+  - stats() and the module registry
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ttl_cache
+from ttl_cache import TTLCache, all_cache_stats, purge_all
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestExpiry:
+    def test_entry_expires_after_ttl(self, clock):
+        cache = TTLCache("t_expiry", ttl=10, clock=clock)
+        cache.set("a", 1)
+        clock.advance(9.9)
+        assert cache.get("a") == 1 and "a" in cache
+        clock.advance(0.2)
+        assert cache.get("a") is None and "a" not in cache
+        assert len(cache) == 0
+        assert cache.stats()["expirations"] == 1
+
+    def test_per_entry_ttl_and_no_ttl(self, clock):
+        cache = TTLCache("t_per_entry", ttl=10, clock=clock)
+        cache.set("short", 1, ttl=1)
+        cache.set("forever", 2, ttl=None)
+        clock.advance(5)
+        assert cache.keys() == ["forever"]
+
+    def test_overwrite_resets_expiry(self, clock):
+        cache = TTLCache("t_overwrite", ttl=10, clock=clock)
+        cache.set("a", 1)
+        clock.advance(8)
+        cache["a"] = 2
+        clock.advance(8)
+        assert cache["a"] == 2
+        assert cache.purge_expired() == 0
+
+    def test_missing_key_raises(self, clock):
+        cache = TTLCache("t_keyerror", ttl=10, clock=clock)
+        with pytest.raises(KeyError):
+            cache["nope"]
+        with pytest.raises(KeyError):
+            del cache["nope"]
+
+
+class TestBounds:
+    def test_lru_eviction_by_count(self, clock):
+        evicted = []
+        cache = TTLCache("t_lru", ttl=None, max_entries=2, clock=clock,
+                         on_evict=lambda k, v: evicted.append(k))
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # a is now most recently used
+        cache.set("c", 3)
+        assert cache.keys() == ["a", "c"]
+        assert evicted == ["b"]
+        assert cache.stats()["evictions"] == 1
+
+    def test_eviction_by_bytes(self, clock):
+        cache = TTLCache("t_bytes", ttl=None, max_bytes=100, sizeof=len, clock=clock)
+        cache.set("a", "x" * 60)
+        cache.set("b", "y" * 60)
+        assert cache.keys() == ["b"]
+        assert cache.stats()["bytes"] == 60
+
+    def test_oversized_single_entry_is_kept(self, clock):
+        cache = TTLCache("t_oversized", ttl=None, max_bytes=10, sizeof=len, clock=clock)
+        cache.set("a", "x" * 50)
+        assert cache.get("a") == "x" * 50
+
+
+class TestWrites:
+    def test_add_only_when_absent(self, clock):
+        cache = TTLCache("t_add", ttl=10, clock=clock)
+        assert cache.add("msg-1") is True
+        assert cache.add("msg-1") is False
+        clock.advance(11)
+        assert cache.add("msg-1") is True
+
+    def test_replace_keeps_expiry(self, clock):
+        cache = TTLCache("t_replace", ttl=10, clock=clock)
+        assert cache.replace("a", 1) is False
+        cache.set("a", 1)
+        clock.advance(6)
+        assert cache.replace("a", 2) is True
+        clock.advance(6)
+        assert cache.get("a") is None
+
+    def test_pop_and_invalidate(self, clock):
+        cache = TTLCache("t_pop", ttl=10, clock=clock)
+        cache.set("t1:a", 1)
+        cache.set("t1:b", 2)
+        cache.set("t2:a", 3)
+        assert cache.pop("t2:a") == 3
+        assert cache.pop("t2:a", "gone") == "gone"
+        assert cache.invalidate(lambda k: k.startswith("t1:")) == 2
+        assert len(cache) == 0
+
+    def test_stale_window(self, clock):
+        cache = TTLCache("t_stale", ttl=10, stale_ttl=30, clock=clock)
+        cache.set("a", 1)
+        clock.advance(20)
+        assert cache.get("a") is None
+        assert cache.get_stale("a") == 1
+        clock.advance(25)
+        assert cache.get_stale("a") is None
+
+
+class TestGetOrLoad:
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_load(self):
+        cache = TTLCache("t_single_flight", ttl=60)
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(5)))
+        assert results == ["value"] * 5
+        assert calls == 1
+        stats = cache.stats()
+        assert stats["loads"] == 1 and stats["coalesced"] == 4
+        assert await cache.get_or_load("k", loader) == "value"
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_value_served_on_loader_error(self, clock):
+        cache = TTLCache("t_stale_error", ttl=10, stale_ttl=60, clock=clock)
+        cache.set("k", "old")
+        clock.advance(15)
+
+        async def failing():
+            raise RuntimeError("backend down")
+
+        assert await cache.get_or_load("k", failing) == "old"
+        assert cache.stats()["load_errors"] == 1
+
+    @pytest.mark.asyncio
+    async def test_error_propagates_without_stale_value(self):
+        cache = TTLCache("t_error", ttl=10)
+
+        async def failing():
+            raise RuntimeError("backend down")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("k", failing)
+        assert not cache._loading
+
+    @pytest.mark.asyncio
+    async def test_cancelled_loader_does_not_hang_waiters(self):
+        cache = TTLCache("t_cancel", ttl=10)
+        started = asyncio.Event()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                started.set()
+                await asyncio.sleep(3600)
+            return "value"
+
+        leader = asyncio.create_task(cache.get_or_load("k", loader))
+        await started.wait()
+        followers = [asyncio.create_task(cache.get_or_load("k", loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await asyncio.wait_for(asyncio.gather(*followers), timeout=1) == ["value"] * 3
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert calls == 2 and cache.get("k") == "value" and not cache._loading
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_load_running(self):
+        cache = TTLCache("t_cancel_waiter", ttl=10)
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return "value"
+
+        leader = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        release.set()
+        assert await leader == "value"
+
+    @pytest.mark.asyncio
+    async def test_none_not_cached_by_default(self):
+        cache = TTLCache("t_none", ttl=10)
+
+        async def loader():
+            return None
+
+        assert await cache.get_or_load("k", loader) is None
+        assert "k" not in cache
+        await cache.get_or_load("k", loader, cache_none=True)
+        assert len(cache) == 1
+
+
+class TestRegistry:
+    def test_stats_and_purge_all(self, clock):
+        cache = TTLCache("t_registry", ttl=1, clock=clock)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        assert all_cache_stats()["t_registry"]["hit_rate"] == 0.5
+        clock.advance(2)
+        assert purge_all() >= 1
+        assert cache.stats()["entries"] == 0
+
+    def test_approx_size_counts_nested_values(self):
+        assert ttl_cache.approx_size({"k": ["x" * 100]}) > 100
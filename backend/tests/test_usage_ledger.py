@@ -0,0 +1,194 @@
+"""
+Tests for backend/usage_ledger.py
+==================================
+Covers:
+  - record_usage_batch → record_token_usage_batch RPC, raw-insert fallback only
+    when the RPC is missing
+  - Month-to-date cost: ledger read, caching, local bumps, fail-open
+  - Pure aggregation over rollup rows (summary, chart series, model distribution,
+    prompt-cache ratios)
+
+Uses a lightweight mock-Supabase builder — no real DB required.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from datetime import date
+from unittest.mock import MagicMock
+
+import pytest
+from postgrest.exceptions import APIError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import usage_ledger
+from usage_ledger import (
+    daily_series,
+    fetch_daily_rollups,
+    get_month_to_date_cost,
+    model_distribution,
+    note_local_cost,
+    prompt_cache_ratios,
+    record_usage_batch,
+    summarize_rollups,
+)
+
+TENANT_ID = "tenant-aaa"
+
+
+def _row(day, model, rt, inp, out, cost, n):
+    return {
+        "day": day, "model": model, "request_type": rt,
+        "input_tokens": inp, "output_tokens": out, "cost_usd": cost, "request_count": n,
+    }
+
+
+ROWS = [
+    _row("2026-10-16", "gpt-4o", "sales_agent", 1000, 200, 0.5, 4),
+    _row("2026-10-16", "gpt-4o-mini", "sales_agent_faq", 300, 100, 0.01, 6),
+    _row("2026-10-18", "gpt-4o-mini", "sales_agent_faq", 100, 50, 0.002, 2),
+    _row("2026-10-18", "gpt-4o", "sales_agent_escalated", 0, 0, 0, 1),
+]
+
+
+def _monthly_supabase(rows=None, error: Exception | None = None):
+    sb = MagicMock()
+    chain = sb.table.return_value.select.return_value
+    chain.eq.return_value = chain
+    chain.limit.return_value = chain
+    if error:
+        chain.execute.side_effect = error
+    else:
+        chain.execute.return_value = MagicMock(data=rows or [])
+    return sb
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    usage_ledger._mtd_cache.clear()
+    yield
+    usage_ledger._mtd_cache.clear()
+
+
+class TestRecordUsageBatch:
+    ROW = {"id": "u1", "tenant_id": TENANT_ID, "model": "gpt-4o", "request_type": "sales_agent",
+           "input_tokens": 10, "output_tokens": 5, "cost_usd": 0.25, "created_at": "2026-10-18T10:00:00+00:00"}
+
+    def test_calls_batch_rpc(self):
+        sb = MagicMock()
+        record_usage_batch(sb, [self.ROW, self.ROW])
+        sb.rpc.assert_called_once_with("record_token_usage_batch", {"p_rows": [self.ROW, self.ROW]})
+        sb.table.assert_not_called()
+
+    def test_falls_back_to_raw_bulk_insert_when_rpc_missing(self):
+        sb = MagicMock()
+        sb.rpc.return_value.execute.side_effect = APIError(
+            {"code": "PGRST202", "message": "Could not find the function public.record_token_usage_batch"})
+        record_usage_batch(sb, [self.ROW])
+        sb.table.assert_called_once_with("token_usage_logs")
+        sb.table.return_value.insert.assert_called_once_with([self.ROW])
+
+    @pytest.mark.parametrize("error", [
+        APIError({"code": "40P01", "message": "deadlock detected"}),
+        APIError({"code": "57014", "message": "canceling statement due to statement timeout"}),
+        TimeoutError("read timed out"),
+    ])
+    def test_other_errors_raise_without_raw_insert(self, error):
+        sb = MagicMock()
+        sb.rpc.return_value.execute.side_effect = error
+        with pytest.raises(type(error)):
+            record_usage_batch(sb, [self.ROW])
+        sb.table.assert_not_called()
+
+    def test_empty_batch_is_noop(self):
+        sb = MagicMock()
+        record_usage_batch(sb, [])
+        sb.rpc.assert_not_called()
+
+    def test_local_cost_bumps_cached_month_to_date(self):
+        sb = _monthly_supabase([{"cost_usd": 10}])
+        assert get_month_to_date_cost(sb, TENANT_ID) == 10
+        note_local_cost(TENANT_ID, 0.25)
+        assert get_month_to_date_cost(sb, TENANT_ID) == pytest.approx(10.25)
+        assert sb.table.call_count == 1
+
+
+class TestMonthToDateCost:
+    def test_reads_single_monthly_row(self):
+        sb = _monthly_supabase([{"cost_usd": "12.5"}])
+        assert get_month_to_date_cost(sb, TENANT_ID) == 12.5
+        sb.table.assert_called_once_with("token_usage_monthly_totals")
+
+    def test_no_row_means_no_usage(self):
+        assert get_month_to_date_cost(_monthly_supabase([]), TENANT_ID) == 0.0
+
+    def test_cached_within_ttl(self):
+        sb = _monthly_supabase([{"cost_usd": 3}])
+        get_month_to_date_cost(sb, TENANT_ID)
+        get_month_to_date_cost(sb, TENANT_ID)
+        assert sb.table.call_count == 1
+
+    def test_fails_open(self):
+        assert get_month_to_date_cost(_monthly_supabase(error=Exception("down")), TENANT_ID) == 0.0
+
+    def test_error_returns_stale_value(self, monkeypatch):
+        month = usage_ledger._month_start(usage_ledger.utc_today()).isoformat()
+        usage_ledger._mtd_cache.set(TENANT_ID, (month, 7.0))
+        expired = time.monotonic() + usage_ledger.MTD_CACHE_TTL + 1
+        monkeypatch.setattr(usage_ledger._mtd_cache, "clock", lambda: expired)
+        assert get_month_to_date_cost(_monthly_supabase(error=Exception("down")), TENANT_ID) == 7.0
+
+
+class TestFetchDailyRollups:
+    def test_filters_by_request_type(self):
+        sb = MagicMock()
+        chain = sb.table.return_value.select.return_value
+        chain.eq.return_value = chain
+        chain.gte.return_value = chain
+        chain.lte.return_value = chain
+        chain.in_.return_value = chain
+        chain.execute.return_value = MagicMock(data=ROWS)
+        rows = fetch_daily_rollups(sb, TENANT_ID, date(2026, 10, 12), date(2026, 10, 18), ["sales_agent"])
+        assert rows == ROWS
+        chain.gte.assert_called_once_with("day", "2026-10-12")
+        chain.lte.assert_called_once_with("day", "2026-10-18")
+        chain.in_.assert_called_once_with("request_type", ["sales_agent"])
+
+
+class TestAggregation:
+    def test_summarize(self):
+        totals = summarize_rollups(ROWS)
+        assert totals.tokens == 1750
+        assert totals.requests == 13
+        assert totals.cost == pytest.approx(0.512)
+        assert totals.model_counts == {"gpt-4o": 5, "gpt-4o-mini": 8}
+        assert totals.most_used_model == ("gpt-4o-mini", 62)
+
+    def test_summarize_empty(self):
+        assert summarize_rollups([]).most_used_model == ("None", 0)
+
+    def test_daily_series_zero_fills(self):
+        series = daily_series(ROWS, date(2026, 10, 18), 3)
+        assert [p["date"] for p in series] == ["2026-10-16", "2026-10-17", "2026-10-18"]
+        assert series[0] == {"date": "2026-10-16", "tokens": 1600, "cost": 0.51, "requests": 10}
+        assert series[1] == {"date": "2026-10-17", "tokens": 0, "cost": 0, "requests": 0}
+        assert series[2]["requests"] == 3
+
+    def test_model_distribution_routes(self):
+        models, routes = model_distribution(ROWS)
+        assert routes == {"mini": 8, "full": 4, "escalated": 1}
+        assert models["gpt-4o"] == {"requests": 4, "tokens": 1200, "cost": 0.5}
+        assert models["gpt-4o-mini"]["requests"] == 8
+
+    def test_prompt_cache_ratios(self):
+        rows = [
+            {**_row("2026-10-18", "gpt-4o", "sales_agent", 1000, 50, 0.1, 2), "cached_input_tokens": 600},
+            {**_row("2026-10-17", "gpt-4o", "sales_agent", 1000, 50, 0.1, 2), "cached_input_tokens": 200},
+            _row("2026-10-18", "gpt-4o-mini", "sales_agent_faq", 300, 20, 0.01, 1),
+        ]
+        ratios = prompt_cache_ratios(rows)
+        assert ratios["gpt-4o"] == {"input_tokens": 2000, "cached_input_tokens": 800, "cached_ratio": 0.4}
+        assert ratios["gpt-4o-mini"]["cached_ratio"] == 0.0
@@ -2,19 +2,25 @@
 Token Usage Logger for LLM API calls.
 
 Logs all token usage to the database for billing and transparency.
-Uses fire-and-forget pattern to avoid blocking API responses.
+Each call also updates the pre-aggregated rollups (see usage_ledger.py).
+Input tokens served from a provider prompt cache are recorded separately
+(cached_input_tokens) and priced at the cached rate.
+Rows are buffered in the telemetry sink and bulk-written in the background,
+so logging never blocks API responses.
 
 Uses Supabase REST client (not asyncpg) for reliable connection
 through Supabase's transaction pooler.
 """
 
-import asyncio
 import logging
 import os
 from datetime import datetime, timezone
 from typing import Optional
 from uuid import uuid4
 
+from telemetry import TOKEN_USAGE_TABLE, get_sink
+from usage_ledger import note_local_cost
+
 logger = logging.getLogger(__name__)
 
 # Check if Supabase is configured
@@ -46,18 +52,22 @@ PRICING = {
     "gpt-4o": {
         "input": 0.0025,    # $2.50 per 1M input tokens
         "output": 0.010,    # $10.00 per 1M output tokens
+        "cached_input": 0.00125,  # $1.25 per 1M cached input tokens
     },
     "gpt-4o-mini": {
         "input": 0.00015,   # $0.15 per 1M input tokens
         "output": 0.0006,   # $0.60 per 1M output tokens
+        "cached_input": 0.000075,  # $0.075 per 1M cached input tokens
     },
     "gpt-4.1": {
         "input": 0.002,     # $2.00 per 1M input tokens
         "output": 0.008,    # $8.00 per 1M output tokens
+        "cached_input": 0.0005,  # $0.50 per 1M cached input tokens
     },
     "gpt-4.1-mini": {
         "input": 0.0004,    # $0.40 per 1M input tokens
         "output": 0.0016,   # $1.60 per 1M output tokens
+        "cached_input": 0.0001,  # $0.10 per 1M cached input tokens
     },
     "text-embedding-3-small": {
         "input": 0.00002,   # $0.02 per 1M tokens
@@ -71,18 +81,22 @@ PRICING = {
     "claude-sonnet-4-20250514": {
         "input": 0.003,     # $3.00 per 1M input tokens
         "output": 0.015,    # $15.00 per 1M output tokens
+        "cached_input": 0.0003,  # $0.30 per 1M cache-read tokens
     },
     "claude-haiku-4-5-20251001": {
         "input": 0.0008,    # $0.80 per 1M input tokens
         "output": 0.004,    # $4.00 per 1M output tokens
+        "cached_input": 0.00008,  # $0.08 per 1M cache-read tokens
     },
     "claude-3-5-sonnet-20241022": {
         "input": 0.003,     # $3.00 per 1M input tokens
         "output": 0.015,    # $15.00 per 1M output tokens
+        "cached_input": 0.0003,  # $0.30 per 1M cache-read tokens
     },
     "claude-3-5-haiku-20241022": {
         "input": 0.0008,    # $0.80 per 1M input tokens
         "output": 0.004,    # $4.00 per 1M output tokens
+        "cached_input": 0.00008,  # $0.08 per 1M cache-read tokens
     },
     # Google Gemini models
     "gemini-2.0-flash": {
@@ -114,20 +128,44 @@ REQUEST_TYPES = {
 }
 
 
-def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate cost in USD based on model and token counts."""
+def calculate_cost(model: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0) -> float:
+    """Calculate cost in USD based on model and token counts.
+
+    cached_input_tokens is the part of input_tokens served from the provider's
+    prompt cache, billed at the model's cached_input rate when it has one."""
     pricing = PRICING.get(model, {"input": 0, "output": 0})
-    cost = (input_tokens * pricing["input"] / 1000) + (output_tokens * pricing["output"] / 1000)
+    cached = min(cached_input_tokens, input_tokens) if "cached_input" in pricing else 0
+    cost = (
+        ((input_tokens - cached) * pricing["input"] / 1000)
+        + (cached * pricing.get("cached_input", 0) / 1000)
+        + (output_tokens * pricing["output"] / 1000)
+    )
     return round(cost, 6)
 
 
+def cached_prompt_tokens(usage) -> int:
+    """Prompt tokens read from the provider cache, from an OpenAI or litellm usage object."""
+    if usage is None:
+        return 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None and isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    if cached is None:
+        cached = getattr(usage, "cache_read_input_tokens", None)  # Anthropic-style usage
+    try:
+        return int(cached or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
 def calculate_whisper_cost(duration_seconds: float) -> float:
     """Calculate Whisper transcription cost. $0.006 per minute."""
     minutes = duration_seconds / 60.0
     return round(minutes * 0.006, 6)
 
 
-async def log_token_usage(
+def _record_token_usage(
     tenant_id: str,
     model: str,
     request_type: str,
@@ -139,20 +177,19 @@ async def log_token_usage(
     route_decision: Optional[str] = None,
     classifier_category: Optional[str] = None,
     cost_override: Optional[float] = None,
+    cached_input_tokens: int = 0,
 ) -> None:
-    """
-    Log token usage to the database via Supabase REST client.
-
-    This function is designed to be called with asyncio.create_task()
-    for fire-and-forget logging that doesn't block the main response.
-    """
+    """Build the usage row and hand it to the telemetry sink (no I/O)."""
     sb = _get_supabase()
     if not sb:
         logger.debug("Token logging skipped: Supabase client not available")
         return
 
     try:
-        cost_usd = cost_override if cost_override is not None else calculate_cost(model, input_tokens, output_tokens)
+        cost_usd = (
+            cost_override if cost_override is not None
+            else calculate_cost(model, input_tokens, output_tokens, cached_input_tokens)
+        )
 
         row = {
             "id": str(uuid4()),
@@ -161,6 +198,7 @@ async def log_token_usage(
             "request_type": request_type,
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
+            "cached_input_tokens": cached_input_tokens,
             "cost_usd": float(cost_usd),
             "created_at": datetime.now(timezone.utc).isoformat(),
         }
@@ -175,20 +213,17 @@ async def log_token_usage(
         if classifier_category:
             row["classifier_category"] = classifier_category
 
-        sb.table('token_usage_logs').insert(row).execute()
-
-        # Increment conversation-level usage aggregates
+        # Raw log + rollups are written in bulk by the sink's next flush
+        sink = get_sink()
+        sink.bind(sb)
+        sink.enqueue(TOKEN_USAGE_TABLE, row)
         if conversation_id:
-            sb.rpc('increment_conversation_usage', {
-                'p_conversation_id': conversation_id,
-                'p_input_tokens': input_tokens,
-                'p_output_tokens': output_tokens,
-                'p_cost_usd': float(cost_usd),
-            }).execute()
+            sink.add_conversation_usage(conversation_id, input_tokens, output_tokens, float(cost_usd))
+        note_local_cost(tenant_id, float(cost_usd))
 
         logger.debug(
             f"Logged token usage: {model} | {request_type} | "
-            f"in={input_tokens} out={output_tokens} | cost=${cost_usd:.6f}"
+            f"in={input_tokens} (cached={cached_input_tokens}) out={output_tokens} | cost=${cost_usd:.6f}"
         )
 
     except Exception as e:
@@ -196,6 +231,42 @@ async def log_token_usage(
         logger.error(f"Failed to log token usage: {e}")
 
 
+async def log_token_usage(
+    tenant_id: str,
+    model: str,
+    request_type: str,
+    input_tokens: int,
+    output_tokens: int = 0,
+    agent_id: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    route_decision: Optional[str] = None,
+    classifier_category: Optional[str] = None,
+    cost_override: Optional[float] = None,
+    cached_input_tokens: int = 0,
+) -> None:
+    """
+    Log token usage via the batched telemetry sink.
+
+    Only buffers the row; the database write happens on the sink's
+    background flush, so awaiting this never blocks on I/O.
+    """
+    _record_token_usage(
+        tenant_id=tenant_id,
+        model=model,
+        request_type=request_type,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        agent_id=agent_id,
+        customer_id=customer_id,
+        conversation_id=conversation_id,
+        route_decision=route_decision,
+        classifier_category=classifier_category,
+        cost_override=cost_override,
+        cached_input_tokens=cached_input_tokens,
+    )
+
+
 def log_token_usage_fire_and_forget(
     tenant_id: str,
     model: str,
@@ -208,32 +279,28 @@ def log_token_usage_fire_and_forget(
     route_decision: Optional[str] = None,
     classifier_category: Optional[str] = None,
     cost_override: Optional[float] = None,
+    cached_input_tokens: int = 0,
 ) -> None:
     """
-    Fire-and-forget wrapper for log_token_usage.
+    Fire-and-forget token usage logging.
 
-    Use this function to log token usage without awaiting the result.
-    The logging happens in the background and doesn't block the response.
+    Buffers the row in the telemetry sink without creating a task per call;
+    the sink flushes in the background and doesn't block the response.
     """
     if not DB_AVAILABLE:
         return
 
-    try:
-        asyncio.create_task(
-            log_token_usage(
-                tenant_id=tenant_id,
-                model=model,
-                request_type=request_type,
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                agent_id=agent_id,
-                customer_id=customer_id,
-                conversation_id=conversation_id,
-                route_decision=route_decision,
-                classifier_category=classifier_category,
-                cost_override=cost_override,
-            )
-        )
-    except RuntimeError:
-        # No event loop running (shouldn't happen in async context)
-        logger.warning("No event loop available for fire-and-forget logging")
+    _record_token_usage(
+        tenant_id=tenant_id,
+        model=model,
+        request_type=request_type,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        agent_id=agent_id,
+        customer_id=customer_id,
+        conversation_id=conversation_id,
+        route_decision=route_decision,
+        classifier_category=classifier_category,
+        cost_override=cost_override,
+        cached_input_tokens=cached_input_tokens,
+    )
@@ -0,0 +1,372 @@
+"""
+TTL Cache — one bounded in-process cache primitive for every module cache.
+=========================================================================
+Module-level dict caches used to grow without bound and were swept by
+periodic_cleanup with O(n) scans. TTLCache replaces them:
+
+    expiry       a min-heap of expiry times, popped lazily on writes —
+                 O(log n) per entry, no full scans
+    bounds       max_entries and (optionally) max_bytes; least recently
+                 used entries are evicted first (OrderedDict, O(1))
+    stale        with stale_ttl, expired entries stay readable through
+                 get_stale() / get_or_load() for that long after expiry,
+                 so a failing backend can be served the last good value
+    single-flight  concurrent get_or_load() misses for one key share a
+                 single loader call (no thundering herd)
+    metrics      hits / misses / stale hits / loads / coalesced loads /
+                 evictions / expirations per cache, via stats() or
+                 all_cache_stats() for every registered cache
+
+ttl=None keeps entries until they are evicted or deleted (LRU only). The
+mapping protocol (`in`, [], del, get, pop, items) works on fresh entries, so
+existing dict call sites migrate without restructuring.
+
+Public surface
+--------------
+    cache = TTLCache("product_catalog", ttl=1800, max_entries=2048, stale_ttl=3600)
+    cache.get(key) / cache.set(key, value, ttl=None) / cache.add(key)
+    cache.replace(key, value)                       # keep the entry's expiry
+    cache.get_stale(key) / cache.pop(key) / cache.invalidate(predicate)
+    value = await cache.get_or_load(key, loader)    # async loader()
+    cache.purge_expired() / cache.clear() / cache.stats()
+    get_cache(name) / all_cache_stats() / purge_all()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+_registry: "weakref.WeakValueDictionary[str, TTLCache]" = weakref.WeakValueDictionary()
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Rough recursive byte size of a cached value (containers up to 4 levels deep)."""
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, _depth + 1) for v in value)
+    return size
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: Optional[float]  # None = no TTL
+    size: int
+    seq: int
+
+
+class TTLCache:
+    """Bounded TTL + LRU cache with stale reads and single-flight loading."""
+
+    def __init__(
+        self,
+        name: str,
+        ttl: Optional[float],
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        stale_ttl: float = 0.0,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.on_evict = on_evict
+        self.clock = clock
+        self._sizeof = sizeof or (approx_size if max_bytes else None)
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._heap: list[tuple[float, int, Hashable]] = []  # (drop_at, seq, key)
+        self._seq = itertools.count()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._loading: dict[Hashable, asyncio.Future] = {}
+        self._stats = {
+            "hits": 0, "misses": 0, "stale_hits": 0, "loads": 0, "load_errors": 0,
+            "coalesced": 0, "evictions": 0, "expirations": 0,
+        }
+        _registry[name] = self
+
+    # ------------------------------------------------------------------
+    # Internals (call with the lock held)
+    # ------------------------------------------------------------------
+
+    def _fresh(self, entry: _Entry, now: float) -> bool:
+        return entry.expires_at is None or now < entry.expires_at
+
+    def _readable(self, entry: _Entry, now: float) -> bool:
+        return entry.expires_at is None or now < entry.expires_at + self.stale_ttl
+
+    def _remove(self, key: Hashable) -> _Entry:
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    def _evict(self, key: Hashable) -> None:
+        entry = self._remove(key)
+        self._stats["evictions"] += 1
+        if self.on_evict:
+            try:
+                self.on_evict(key, entry.value)
+            except Exception as e:
+                logger.warning(f"Cache {self.name} on_evict failed: {e}")
+
+    def _purge(self, now: float) -> int:
+        purged = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._heap)
+            entry = self._data.get(key)
+            if entry is not None and entry.seq == seq:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                purged += 1
+        # Overwritten keys leave dead heap records behind; rebuild when they dominate
+        if len(self._heap) > 2 * len(self._data) + 64:
+            self._heap = [(e.expires_at + self.stale_ttl, e.seq, k)
+                          for k, e in self._data.items() if e.expires_at is not None]
+            heapq.heapify(self._heap)
+        return purged
+
+    def _enforce_bounds(self) -> None:
+        while len(self._data) > self.max_entries:
+            self._evict(next(iter(self._data)))
+        if self.max_bytes is not None:
+            while self._bytes > self.max_bytes and len(self._data) > 1:
+                self._evict(next(iter(self._data)))
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Fresh value for key (marks it recently used), else default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._fresh(entry, self.clock()):
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.value
+            self._stats["misses"] += 1
+            return default
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Value for key even if expired, while still within stale_ttl."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._readable(entry, self.clock()):
+                self._stats["stale_hits"] += 1
+                return entry.value
+            return default
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and self._fresh(entry, self.clock())
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge(self.clock())
+            return len(self._data)
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """Snapshot of fresh (key, value) pairs; does not touch recency."""
+        with self._lock:
+            now = self.clock()
+            return [(k, e.value) for k, e in self._data.items() if self._fresh(e, now)]
+
+    def keys(self) -> list[Hashable]:
+        return [k for k, _ in self.items()]
+
+    def values(self) -> list[Any]:
+        return [v for _, v in self.items()]
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.keys())
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = _MISSING) -> None:
+        """Store value; ttl overrides the cache default (None = no expiry)."""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        with self._lock:
+            now = self.clock()
+            self._purge(now)
+            if key in self._data:
+                self._remove(key)
+            seq = next(self._seq)
+            expires_at = now + ttl if ttl is not None else None
+            size = self._sizeof(value) if self._sizeof else 0
+            self._data[key] = _Entry(value, expires_at, size, seq)
+            self._bytes += size
+            if expires_at is not None:
+                heapq.heappush(self._heap, (expires_at + self.stale_ttl, seq, key))
+            self._enforce_bounds()
+
+    __setitem__ = set
+
+    def add(self, key: Hashable, value: Any = True, ttl: Optional[float] = _MISSING) -> bool:
+        """Store only if key has no fresh entry. True if stored (e.g. first sighting for dedup)."""
+        with self._lock:
+            if key in self:
+                return False
+            self.set(key, value, ttl)
+            return True
+
+    def replace(self, key: Hashable, value: Any) -> bool:
+        """Swap the value of a readable entry, keeping its expiry. False if absent."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or not self._readable(entry, self.clock()):
+                return False
+            size = self._sizeof(value) if self._sizeof else 0
+            self._bytes += size - entry.size
+            entry.value, entry.size = value, size
+            self._enforce_bounds()
+            return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            entry = self._remove(key)
+            return entry.value if self._fresh(entry, self.clock()) else default
+
+    def __delitem__(self, key: Hashable) -> None:
+        with self._lock:
+            if key not in self._data:
+                raise KeyError(key)
+            self._remove(key)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every key matching predicate (O(n) — for tenant-wide invalidation)."""
+        with self._lock:
+            doomed = [k for k in self._data if predicate(k)]
+            for key in doomed:
+                self._remove(key)
+            return len(doomed)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge(self.clock())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._heap.clear()
+            self._bytes = 0
+
+    # ------------------------------------------------------------------
+    # Single-flight loading
+    # ------------------------------------------------------------------
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = _MISSING,
+        cache_none: bool = False,
+    ) -> Any:
+        """
+        Fresh cached value, or the result of `await loader()` stored under
+        key. Concurrent misses for the same key await one loader call. If
+        the loader raises and a stale value is still readable it is returned
+        instead; otherwise the error propagates to every waiter. If the
+        loading task is cancelled, a waiter takes over the load.
+        """
+        while True:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            pending = self._loading.get(key)
+            if pending is None:
+                break
+            self._stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # this waiter was cancelled, not the load
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        self._stats["loads"] += 1
+        try:
+            value = await loader()
+        except Exception as e:
+            self._stats["load_errors"] += 1
+            stale = self.get_stale(key, _MISSING)
+            if stale is not _MISSING:
+                logger.warning(f"Cache {self.name} load failed, serving stale value: {e}")
+                future.set_result(stale)
+                return stale
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        except BaseException:
+            future.cancel()  # cancelled (or interpreter exit): wake the waiters
+            raise
+        else:
+            if value is not None or cache_none:
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            self._loading.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._data),
+                "bytes": self._bytes if self._sizeof else None,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+def get_cache(name: str) -> Optional[TTLCache]:
+    """The live TTLCache registered under name, if any."""
+    return _registry.get(name)
+
+
+def all_cache_stats() -> dict[str, dict]:
+    """stats() for every live TTLCache, keyed by cache name."""
+    return {name: cache.stats() for name, cache in sorted(_registry.items())}
+
+
+def purge_all() -> int:
+    """Drop expired entries from every registered cache. Returns entries removed."""
+    return sum(cache.purge_expired() for cache in list(_registry.values()))
@@ -0,0 +1,265 @@
+"""
+Usage Ledger — pre-aggregated token usage for dashboards and the cost cap.
+=========================================================================
+token_usage_logs keeps one row per LLM call (audit trail, /usage/logs). Reads
+go to two rollups that the record_token_usage[_batch] RPCs (migrations 018/019)
+maintain in the same transaction as the raw insert:
+
+    token_usage_daily_rollups   (tenant, day, model, request_type) → tokens, cost, requests
+    token_usage_monthly_totals  (tenant, month) → running month-to-date cost
+
+Dashboard reads touch at most days × models × request_types rows, so their
+cost no longer grows with call volume. Days are UTC calendar days.
+
+Public surface
+--------------
+    record_usage_batch(sb, rows)                               # telemetry flush
+    note_local_cost(tid, cost_usd)                             # token_logger
+    rows    = fetch_daily_rollups(sb, tid, start_day, end_day, request_types=None)
+    totals  = summarize_rollups(rows)
+    series  = daily_series(rows, end_day, days)
+    models  = model_distribution(rows)
+    cache   = prompt_cache_ratios(rows)                        # cached input share
+    cost    = get_month_to_date_cost(sb, tid)                  # cost-cap check
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from shared_state import get_shared_state, subscribe
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DAILY_TABLE = "token_usage_daily_rollups"
+MONTHLY_TABLE = "token_usage_monthly_totals"
+
+# Month-to-date cost is re-read from the ledger at most this often per tenant;
+# usage logged by this process — and, with a distributed shared-state backend,
+# by the other workers (MTD_COST_CHANNEL) — is added locally in between.
+MTD_CACHE_TTL = 300  # seconds
+# ...and the last value is still served for this long if the ledger is down
+MTD_STALE_TTL = 86_400
+
+# tenant_id -> (month_start_iso, cost_usd)
+_mtd_cache = TTLCache("month_to_date_cost", ttl=MTD_CACHE_TTL, max_entries=10_000, stale_ttl=MTD_STALE_TTL)
+MTD_COST_CHANNEL = "mtd_cost"
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def record_usage_batch(sb, rows: list[dict]) -> None:
+    """
+    Insert token_usage_logs rows and apply their rollup deltas atomically
+    (record_token_usage_batch, migration 019).
+
+    Falls back to a plain bulk insert only when the RPC does not exist
+    (migration 019 not applied) so raw usage is never lost. Any other error —
+    timeout, deadlock, a bad row — is raised with nothing written, so a retry
+    cannot leave the rollups behind token_usage_logs. The caller owns error
+    handling.
+    """
+    if not rows:
+        return
+    try:
+        sb.rpc("record_token_usage_batch", {"p_rows": rows}).execute()
+    except Exception as e:
+        if not _rpc_missing(e):
+            raise
+        logger.warning(f"record_token_usage_batch RPC missing, inserting raw logs only: {e}")
+        sb.table("token_usage_logs").insert(rows).execute()
+
+
+# PostgREST: no function with that name/signature; Postgres: undefined_function
+_MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+
+
+def _rpc_missing(error: Exception) -> bool:
+    return getattr(error, "code", None) in _MISSING_FUNCTION_CODES
+
+
+def _add_cost(tenant_id: str, month: str, cost_usd: float) -> None:
+    cached = _mtd_cache.get(tenant_id)
+    if cached and cached[0] == month:
+        _mtd_cache.replace(tenant_id, (month, cached[1] + cost_usd))
+
+
+def note_local_cost(tenant_id: str, cost_usd: float) -> None:
+    """Add cost logged by this process to the cached month-to-date total and tell the other workers."""
+    month = _month_start(utc_today()).isoformat()
+    _add_cost(tenant_id, month, cost_usd)
+    get_shared_state().publish_nowait(MTD_COST_CHANNEL, {"tenant_id": tenant_id, "month": month, "cost": cost_usd})
+
+
+def _on_remote_cost(data: dict) -> None:
+    if data.get("tenant_id") and data.get("month"):
+        _add_cost(data["tenant_id"], data["month"], float(data.get("cost") or 0))
+
+
+subscribe(MTD_COST_CHANNEL, _on_remote_cost)
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def get_month_to_date_cost(sb, tenant_id: str) -> float:
+    """
+    Current month's LLM cost for a tenant from the running monthly total.
+    Fails open: on error returns the last cached value, or 0.0.
+    """
+    month = _month_start(utc_today()).isoformat()
+    cached = _mtd_cache.get(tenant_id)
+    if cached and cached[0] == month:
+        return cached[1]
+
+    try:
+        result = sb.table(MONTHLY_TABLE).select("cost_usd").eq(
+            "tenant_id", tenant_id
+        ).eq("month", month).limit(1).execute()
+        rows = result.data or []
+        total = float(rows[0].get("cost_usd") or 0) if rows else 0.0
+    except Exception as e:
+        logger.warning(f"Monthly cost query failed for tenant {tenant_id[:8]}***: {e}")
+        stale = _mtd_cache.get_stale(tenant_id)
+        if stale and stale[0] == month:
+            return stale[1]
+        return 0.0
+
+    _mtd_cache.set(tenant_id, (month, total))
+    return total
+
+
+def fetch_daily_rollups(
+    sb,
+    tenant_id: str,
+    start_day: date,
+    end_day: date,
+    request_types: Optional[Iterable[str]] = None,
+) -> list[dict]:
+    """Rollup rows for [start_day, end_day] inclusive, optionally filtered by request_type."""
+    query = sb.table(DAILY_TABLE).select(
+        "day, model, request_type, input_tokens, output_tokens, cached_input_tokens, cost_usd, request_count"
+    ).eq("tenant_id", tenant_id).gte("day", start_day.isoformat()).lte("day", end_day.isoformat())
+    if request_types:
+        query = query.in_("request_type", list(request_types))
+    return query.execute().data or []
+
+
+# ---------------------------------------------------------------------------
+# Aggregation over rollup rows (pure)
+# ---------------------------------------------------------------------------
+
+@dataclass
+class UsageTotals:
+    tokens: int = 0
+    cost: float = 0.0
+    requests: int = 0
+    model_counts: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def most_used_model(self) -> tuple[str, int]:
+        """(model, percentage of requests) or ("None", 0) when there is no usage."""
+        if not self.model_counts:
+            return "None", 0
+        model, count = max(self.model_counts.items(), key=lambda x: x[1])
+        return model, round(count / self.requests * 100) if self.requests else 0
+
+
+def _tokens(row: dict) -> int:
+    return int(row.get("input_tokens") or 0) + int(row.get("output_tokens") or 0)
+
+
+def summarize_rollups(rows: Iterable[dict]) -> UsageTotals:
+    totals = UsageTotals()
+    for row in rows:
+        count = int(row.get("request_count") or 0)
+        totals.tokens += _tokens(row)
+        totals.cost += float(row.get("cost_usd") or 0)
+        totals.requests += count
+        model = row.get("model") or ""
+        totals.model_counts[model] = totals.model_counts.get(model, 0) + count
+    return totals
+
+
+def daily_series(rows: Iterable[dict], end_day: date, days: int) -> list[dict]:
+    """One chart point per day ending at end_day; days without usage are zero-filled."""
+    by_day: dict[str, dict] = {}
+    for row in rows:
+        key = str(row.get("day"))[:10]
+        point = by_day.setdefault(key, {"tokens": 0, "cost": 0.0, "requests": 0})
+        point["tokens"] += _tokens(row)
+        point["cost"] += float(row.get("cost_usd") or 0)
+        point["requests"] += int(row.get("request_count") or 0)
+
+    series = []
+    for i in range(days):
+        key = (end_day - timedelta(days=days - 1 - i)).isoformat()
+        point = by_day.get(key)
+        series.append({
+            "date": key,
+            "tokens": point["tokens"] if point else 0,
+            "cost": round(point["cost"], 4) if point else 0,
+            "requests": point["requests"] if point else 0,
+        })
+    return series
+
+
+def model_distribution(rows: Iterable[dict]) -> tuple[dict[str, dict], dict[str, int]]:
+    """
+    Per-model {requests, tokens, cost} plus routing counts (mini / full / escalated).
+
+    Escalation markers (sales_agent_escalated) carry no tokens; they count as
+    routes only, the escalated call itself is logged as sales_agent.
+    """
+    models: dict[str, dict] = {}
+    routes = {"mini": 0, "full": 0, "escalated": 0}
+    for row in rows:
+        rt = row.get("request_type") or ""
+        count = int(row.get("request_count") or 0)
+        if rt == "sales_agent_escalated":
+            routes["escalated"] += count
+            continue
+
+        model = row.get("model") or ""
+        entry = models.setdefault(model, {"requests": 0, "tokens": 0, "cost": 0})
+        entry["requests"] += count
+        entry["tokens"] += _tokens(row)
+        entry["cost"] += float(row.get("cost_usd") or 0)
+
+        if rt == "sales_agent_faq":
+            routes["mini"] += count
+        elif rt == "sales_agent":
+            routes["full"] += count
+
+    for entry in models.values():
+        entry["cost"] = round(entry["cost"], 4)
+    return models, routes
+
+
+def prompt_cache_ratios(rows: Iterable[dict]) -> dict[str, dict]:
+    """Per-model share of input tokens served from the provider prompt cache."""
+    models: dict[str, dict] = {}
+    for row in rows:
+        entry = models.setdefault(row.get("model") or "", {"input_tokens": 0, "cached_input_tokens": 0})
+        entry["input_tokens"] += int(row.get("input_tokens") or 0)
+        entry["cached_input_tokens"] += int(row.get("cached_input_tokens") or 0)
+    for entry in models.values():
+        entry["cached_ratio"] = (
+            round(entry["cached_input_tokens"] / entry["input_tokens"], 4) if entry["input_tokens"] else 0.0
+        )
+    return models
@@ -5,11 +5,10 @@ OAuth 2.0 with multi-datacenter support and single-use refresh tokens.
 
 import httpx
 import logging
-import asyncio
-import time
 import os
 from typing import Optional, Dict, Any, List
-from collections import defaultdict
+
+from rate_limiter import TokenBucketLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -31,30 +30,11 @@ ZOHO_DATACENTERS = {
 }
 
 
-class ZohoRateLimiter:
-    """Rate limiter for Zoho API calls."""
-
-    def __init__(self, max_requests: int = ZOHO_MAX_REQUESTS_PER_SECOND, window: float = ZOHO_RATE_LIMIT_WINDOW):
-        self.max_requests = max_requests
-        self.window = window
-        self._requests = defaultdict(list)
-        self._lock = asyncio.Lock()
-
-    async def acquire(self, key: str = "default"):
-        async with self._lock:
-            now = time.time()
-            self._requests[key] = [t for t in self._requests[key] if now - t < self.window]
-            if len(self._requests[key]) >= self.max_requests:
-                oldest = min(self._requests[key])
-                wait_time = self.window - (now - oldest)
-                if wait_time > 0:
-                    await asyncio.sleep(wait_time)
-                    now = time.time()
-                    self._requests[key] = [t for t in self._requests[key] if now - t < self.window]
-            self._requests[key].append(now)
-
-
-_zoho_rate_limiter = ZohoRateLimiter()
+_zoho_rate_limiter = TokenBucketLimiter(
+    "zoho",
+    rate=ZOHO_MAX_REQUESTS_PER_SECOND / ZOHO_RATE_LIMIT_WINDOW,
+    capacity=ZOHO_MAX_REQUESTS_PER_SECOND,
+)
 
 
 class ZohoAPIError(Exception):
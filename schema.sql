@@ -167,6 +167,8 @@ CREATE TABLE IF NOT EXISTS tenant_configs (
     closing_message TEXT,
     min_response_delay INTEGER DEFAULT 0,
     max_messages_per_minute INTEGER DEFAULT 20,
+    -- Stream sales-agent replies into Telegram via progressive edits
+    streaming_replies BOOLEAN DEFAULT FALSE,
     -- Bitrix24 CRM integration columns
     bitrix_webhook_url VARCHAR(500),
     bitrix_connected_at TIMESTAMPTZ,